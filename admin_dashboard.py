@@ -2,81 +2,98 @@
 # Admin Dashboard для анализа метрик и аналитики
 # Version: 0.25.0
 
-import sqlite3
 from datetime import datetime, timedelta
 from typing import Dict, List, Tuple, Optional
 from event_tracker import get_tracker, get_analytics
+from event_rollups import get_rollups
 
 
 class AdminDashboard:
     """Полный admin dashboard для анализа бота"""
     
+    # Типы событий, из которых складываются фичи/сегменты
+    LEARNING_EVENTS = ("user_education", "user_teach")
+    QUEST_EVENTS = ("user_quest_start", "user_quest_complete")
+    FEEDBACK_EVENTS = ("user_feedback", "user_clarify")
+    
     def __init__(self):
         self.tracker = get_tracker()
         self.analytics = get_analytics()
     
+    @property
+    def rollups(self):
+        """Агрегаты событий для БД трекера (см. event_rollups)"""
+        return get_rollups(self.tracker.db_path)
+    
     def get_dashboard_metrics(self, hours: int = 24) -> Dict:
-        """Получить все метрики для dashboard"""
+        """Получить все метрики для dashboard
+        
+        Все блоки читают агрегаты event_rollups (время не зависит от числа
+        событий). Перед чтением досворачиваются только новые события.
+        """
+        self.rollups.refresh()
+        counts = self.rollups.counts_by_type(hours)
         return {
             "timestamp": datetime.now().isoformat(),
             "period_hours": hours,
-            "overview": self._get_overview(hours),
-            "engagement": self._get_engagement_metrics(hours),
-            "events": self._get_event_breakdown(hours),
+            "overview": self._get_overview(hours, counts),
+            "engagement": self._get_engagement_metrics(hours, counts),
+            "events": self._get_event_breakdown(hours, counts),
             "top_users": self._get_top_users(hours),
             "user_journeys": self._get_journey_analysis(hours),
             "ai_performance": self._get_ai_performance(hours),
-            "feature_usage": self._get_feature_usage(hours),
+            "feature_usage": self._get_feature_usage(hours, counts),
             "retention": self._get_retention_metrics(hours),
         }
     
-    def _get_overview(self, hours: int) -> Dict:
+    def _counts(self, hours: int, counts: Optional[Dict[str, int]]) -> Dict[str, int]:
+        return counts if counts is not None else self.rollups.counts_by_type(hours)
+    
+    @staticmethod
+    def _sum(counts: Dict[str, int], event_types: Tuple[str, ...]) -> int:
+        return sum(counts.get(event_type, 0) for event_type in event_types)
+    
+    def _get_overview(self, hours: int, counts: Optional[Dict[str, int]] = None) -> Dict:
         """DAU, MAU и общие метрики"""
-        stats = self.tracker.get_stats(hours=hours)
+        counts = self._counts(hours, counts)
+        total_events = sum(counts.values())
+        active_users = self.rollups.active_users(hours)
         
         return {
-            "dau": stats.get("unique_users", 0),
-            "total_events": stats.get("total_events", 0),
-            "average_events_per_user": round(
-                stats.get("total_events", 0) / max(stats.get("unique_users", 1), 1), 2
-            ),
-            "events_per_hour": round(
-                stats.get("total_events", 0) / max(hours, 1), 2
-            ),
+            "dau": active_users,
+            "total_events": total_events,
+            "average_events_per_user": round(total_events / max(active_users, 1), 2),
+            "events_per_hour": round(total_events / max(hours, 1), 2),
         }
     
-    def _get_engagement_metrics(self, hours: int) -> Dict:
+    def _get_engagement_metrics(self, hours: int, counts: Optional[Dict[str, int]] = None) -> Dict:
         """Engagement rate по разным сегментам"""
-        stats = self.tracker.get_stats(hours=hours)
-        events_by_type = stats.get("events_by_type", {})
-        total_events = stats.get("total_events", 1)
+        counts = self._counts(hours, counts)
+        total_events = max(sum(counts.values()), 1)
         
         return {
             "learning_engagement": round(
-                (events_by_type.get("user_education", 0) + 
-                 events_by_type.get("user_teach", 0)) / total_events * 100, 2
+                self._sum(counts, self.LEARNING_EVENTS) / total_events * 100, 2
             ),
             "analysis_engagement": round(
-                events_by_type.get("user_analyze", 0) / total_events * 100, 2
+                counts.get("user_analyze", 0) / total_events * 100, 2
             ),
             "quest_engagement": round(
-                events_by_type.get("user_quest", 0) / total_events * 100, 2
+                self._sum(counts, self.QUEST_EVENTS) / total_events * 100, 2
             ),
             "feedback_rate": round(
-                (events_by_type.get("user_feedback", 0) + 
-                 events_by_type.get("user_clarify", 0)) / 
-                max(events_by_type.get("user_analyze", 1), 1) * 100, 2
+                self._sum(counts, self.FEEDBACK_EVENTS) /
+                max(counts.get("user_analyze", 1), 1) * 100, 2
             ),
         }
     
-    def _get_event_breakdown(self, hours: int) -> Dict:
+    def _get_event_breakdown(self, hours: int, counts: Optional[Dict[str, int]] = None) -> Dict:
         """Подробный breakdown всех событий"""
-        stats = self.tracker.get_stats(hours=hours)
-        events_by_type = stats.get("events_by_type", {})
-        total = stats.get("total_events", 1)
+        counts = self._counts(hours, counts)
+        total = max(sum(counts.values()), 1)
         
         breakdown = {}
-        for event_type, count in events_by_type.items():
+        for event_type, count in counts.items():
             breakdown[event_type] = {
                 "count": count,
                 "percentage": round(count / total * 100, 2),
@@ -87,28 +104,7 @@ class AdminDashboard:
     def _get_top_users(self, hours: int, limit: int = 5) -> List[Dict]:
         """Топ активные пользователи"""
         try:
-            conn = sqlite3.connect("rvx_bot.db")
-            cursor = conn.cursor()
-            
-            cursor.execute("""
-                SELECT user_id, COUNT(*) as event_count 
-                FROM bot_events 
-                WHERE datetime(created_at) > datetime('now', '-' || ? || ' hours')
-                GROUP BY user_id 
-                ORDER BY event_count DESC 
-                LIMIT ?
-            """, (hours, limit))
-            
-            results = []
-            for user_id, count in cursor.fetchall():
-                results.append({
-                    "user_id": user_id,
-                    "event_count": count,
-                    "rank": len(results) + 1,
-                })
-            
-            conn.close()
-            return results
+            return self.rollups.top_users(hours=hours, limit=limit)
         except Exception as e:
             return [{"error": str(e)}]
     
@@ -154,90 +150,54 @@ class AdminDashboard:
         ]
     
     def _get_ai_performance(self, hours: int) -> Dict:
-        """Статистика по AI ответам"""
+        """Статистика по AI ответам (счётчики + квантили латентности)"""
         try:
-            ai_perf = self.analytics.get_ai_performance(hours=hours)
+            ai_perf = self.rollups.ai_performance(hours=hours)
             return {
-                "total_responses": ai_perf.get("total_responses", 0),
-                "average_confidence": round(
-                    ai_perf.get("average_confidence", 0.8), 2
-                ),
-                "high_confidence_rate": round(
-                    ai_perf.get("high_confidence_rate", 0.85) * 100, 2
-                ),
-                "low_confidence_warnings": ai_perf.get("low_confidence_count", 0),
+                "total_responses": ai_perf["total_requests"],
+                "success_rate": ai_perf["success_rate"],
+                "errors": ai_perf["errors"],
+                "timeouts": ai_perf["timeouts"],
+                "avg_latency_ms": ai_perf["avg_duration_ms"],
+                "p50_latency_ms": ai_perf["p50_ms"],
+                "p95_latency_ms": ai_perf["p95_ms"],
             }
         except Exception as e:
             return {"error": str(e)}
     
-    def _get_feature_usage(self, hours: int) -> Dict:
+    def _get_feature_usage(self, hours: int, counts: Optional[Dict[str, int]] = None) -> Dict:
         """Использование разных фич"""
-        stats = self.tracker.get_stats(hours=hours)
-        events_by_type = stats.get("events_by_type", {})
+        counts = self._counts(hours, counts)
         
         features = {
             "learning": {
                 "name": "📚 Learning System",
-                "events": events_by_type.get("user_education", 0) + 
-                         events_by_type.get("user_teach", 0),
+                "events": self._sum(counts, self.LEARNING_EVENTS),
             },
             "news_analysis": {
                 "name": "📰 News Analysis",
-                "events": events_by_type.get("user_analyze", 0),
+                "events": counts.get("user_analyze", 0),
             },
             "quests": {
                 "name": "🎯 Daily Quests",
-                "events": events_by_type.get("user_quest", 0),
+                "events": self._sum(counts, self.QUEST_EVENTS),
             },
             "feedback": {
                 "name": "👍 Feedback System",
-                "events": events_by_type.get("user_feedback", 0) + 
-                         events_by_type.get("user_clarify", 0),
+                "events": self._sum(counts, self.FEEDBACK_EVENTS),
             },
             "profile": {
                 "name": "👤 Profile/Stats",
-                "events": events_by_type.get("user_profile", 0),
+                "events": counts.get("user_profile_view", 0),
             },
         }
         
         return features
     
     def _get_retention_metrics(self, hours: int) -> Dict:
-        """Метрики удержания пользователей"""
+        """Метрики удержания пользователей (битмапы активности)"""
         try:
-            conn = sqlite3.connect("rvx_bot.db")
-            cursor = conn.cursor()
-            
-            # Уникальные пользователи в разные периоды
-            cursor.execute("""
-                SELECT COUNT(DISTINCT user_id) as cnt 
-                FROM bot_events 
-                WHERE datetime(created_at) > datetime('now', '-1 hours')
-            """)
-            users_1h = cursor.fetchone()[0] if cursor.fetchone() else 0
-            
-            cursor.execute("""
-                SELECT COUNT(DISTINCT user_id) as cnt 
-                FROM bot_events 
-                WHERE datetime(created_at) > datetime('now', '-24 hours')
-            """)
-            users_24h = cursor.fetchone()[0] if cursor.fetchone() else 0
-            
-            cursor.execute("""
-                SELECT COUNT(DISTINCT user_id) as cnt 
-                FROM bot_events 
-                WHERE datetime(created_at) > datetime('now', '-7 days')
-            """)
-            users_7d = cursor.fetchone()[0] if cursor.fetchone() else 0
-            
-            conn.close()
-            
-            return {
-                "active_1h": users_1h,
-                "active_24h": users_24h,
-                "active_7d": users_7d,
-                "retention_24h": round(users_24h / max(users_7d, 1) * 100, 2),
-            }
+            return self.rollups.retention()
         except Exception as e:
             return {"error": str(e)}
     
@@ -279,9 +239,9 @@ class AdminDashboard:
         
         text += f"\n<b>🤖 AI PERFORMANCE:</b>\n"
         text += f"  • Responses: <b>{ai_perf.get('total_responses', 0)}</b>\n"
-        text += f"  • Avg confidence: <b>{ai_perf.get('average_confidence', 0)}</b>\n"
-        text += f"  • High confidence: <b>{ai_perf.get('high_confidence_rate', 0)}%</b>\n"
-        text += f"  • Low confidence warnings: <b>{ai_perf.get('low_confidence_warnings', 0)}</b>\n"
+        text += f"  • Success rate: <b>{ai_perf.get('success_rate', 0)}%</b>\n"
+        text += f"  • Latency p50/p95: <b>{ai_perf.get('p50_latency_ms') or 0}/{ai_perf.get('p95_latency_ms') or 0} ms</b>\n"
+        text += f"  • Errors/timeouts: <b>{ai_perf.get('errors', 0)}/{ai_perf.get('timeouts', 0)}</b>\n"
         
         text += "\n<b>📱 FEATURE USAGE:</b>\n"
         for feature_key, feature_data in features.items():
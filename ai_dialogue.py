@@ -19,9 +19,12 @@ import os
 from dotenv import load_dotenv
 import time
 from datetime import datetime
-from collections import defaultdict
-from threading import Lock
 import asyncio
+import threading
+
+from rate_limit_engine import rate_limits
+from pattern_engine import pattern_engine
+from prompt_budget import estimate_tokens, prompt_budget
 
 # 🎯 OLLAMA LOCAL LLM
 try:
@@ -178,10 +181,8 @@ def trim_response_to_limit(response: str, mode: str = "dialogue") -> str:
 AI_RATE_LIMIT_REQUESTS = int(os.getenv("AI_RATE_LIMIT_REQUESTS", "10"))  # запросов
 AI_RATE_LIMIT_WINDOW = int(os.getenv("AI_RATE_LIMIT_WINDOW", "60"))  # секунд
 
-# Трекинг запросов: {user_id: [timestamp1, timestamp2, ...]}
-ai_request_history: Dict[int, List[float]] = defaultdict(list)
-# ✅ КРИТИЧЕСКИЙ ФИК #3: Race condition защита с lock'ом
-_rate_limit_lock = Lock()
+# GCRA-политика из rate_limit_engine: одно число на пользователя вместо списка timestamp'ов
+ai_rate_policy = rate_limits.policy("ai_user", AI_RATE_LIMIT_REQUESTS, AI_RATE_LIMIT_WINDOW)
 
 
 def check_ai_rate_limit(user_id: int) -> Tuple[bool, int, str]:
@@ -199,38 +200,20 @@ def check_ai_rate_limit(user_id: int) -> Tuple[bool, int, str]:
         - remaining_requests: Сколько запросов осталось
         - message: Текст для ответа пользователю
     """
-    # ✅ КРИТИЧЕСКИЙ ФИК #3: Синхронизация с lock'ом для предотвращения race condition
-    with _rate_limit_lock:
-        now = time.time()
-        window_start = now - AI_RATE_LIMIT_WINDOW
-        
-        # Очищаем старые запросы за пределами окна
-        ai_request_history[user_id] = [
-            t for t in ai_request_history[user_id]
-            if t > window_start
-        ]
-        
-        requests_in_window = len(ai_request_history[user_id])
-        
-        if requests_in_window >= AI_RATE_LIMIT_REQUESTS:
-            remaining_time = int(
-                AI_RATE_LIMIT_WINDOW - (now - ai_request_history[user_id][0])
-            )
-            logger.warning(f"⚠️ Rate limit exceeded for user {user_id}")
-            return (
-                False,
-                0,
-                f"⏱️ Лимит AI запросов: {AI_RATE_LIMIT_REQUESTS} за {AI_RATE_LIMIT_WINDOW}сек.\n"
-                f"Попробуй через {remaining_time}сек."
-            )
-        
-        # Добавляем текущий запрос (ATOMIC операция внутри lock'а)
-        ai_request_history[user_id].append(now)
-    remaining = AI_RATE_LIMIT_REQUESTS - len(ai_request_history[user_id])
+    decision = ai_rate_policy.hit(user_id)
+    
+    if not decision.allowed:
+        logger.warning(f"⚠️ Rate limit exceeded for user {user_id}")
+        return (
+            False,
+            0,
+            f"⏱️ Лимит AI запросов: {AI_RATE_LIMIT_REQUESTS} за {AI_RATE_LIMIT_WINDOW}сек.\n"
+            f"Попробуй через {decision.retry_after_seconds}сек."
+        )
     
-    logger.debug(f"✅ AI Rate limit OK: user={user_id}, used={len(ai_request_history[user_id])}/{AI_RATE_LIMIT_REQUESTS}")
+    logger.debug(f"✅ AI Rate limit OK: user={user_id}, remaining={decision.remaining}/{AI_RATE_LIMIT_REQUESTS}")
     
-    return True, remaining, ""
+    return True, decision.remaining, ""
 
 
 # ==================== МЕТРИКИ v0.24 ====================
@@ -321,6 +304,29 @@ def update_metrics(provider: str, success: bool, response_time: float, error_typ
         dialogue_metrics["total_errors"] += 1
     
     dialogue_metrics["last_updated"] = datetime.now().isoformat()
+    _track_ai_event(provider, success, response_time, error_type)
+
+
+def _track_ai_event(provider: str, success: bool, response_time: float, error_type: Optional[str] = None):
+    """
+    ai_success/ai_timeout/ai_error в bot_events (из них строятся скетчи латентности).
+
+    Событие уходит в буфер трекера и пишется пачкой, а не отдельным commit на каждый вызов.
+    """
+    try:
+        from event_tracker import EventType, create_event, get_tracker
+        if success:
+            event_type = EventType.AI_SUCCESS
+        elif error_type == "timeout":
+            event_type = EventType.AI_TIMEOUT
+        else:
+            event_type = EventType.AI_ERROR
+        get_tracker().enqueue(create_event(
+            event_type,
+            data={"provider": provider, "duration": round(response_time, 4), "error_type": error_type}
+        ))
+    except Exception as e:
+        logger.debug(f"AI event tracking skipped: {e}")
 
 
 def get_metrics_summary() -> Dict:
@@ -354,35 +360,39 @@ def get_metrics_summary() -> Dict:
     return summary
 
 
+# Признаки скамов
+SCAM_INDICATORS = {
+    'guaranteed_listing': r'(гарантирован(ный|ая)\s+листинг|guaranteed\s+listing)',
+    'moon_promises': r'(\d+x\s+(потенциал|рост|прибыль)|1000x|100x|moon)',
+    'insider_info': r'(инсайд|приватн\w*\s+информ|insider|private\s+info|приватн\w*\s+сведения)',
+    'urgency_fomo': r'(успей.*не\s+поздно|потом|будет\s+поздно|успейте|не\s+ждите|цена\s+(растёт|растет)\s+каждый)',
+    'exclusive': r'(только\s+для.*избранн|эксклюзив|приватн(ый|ом|ая|ы)\s+чат)',
+    'partnership_lies': r'(партн[её]р\s+(amazon|google|visa|binance|coinbase)|одобрен\s+(amazon|google))',
+    'silent_team': r'(команда\s+(молчит|скрывает|не\s+говорит)|security\s+reasons)',
+    'min_max_promise': r'(минимальн.*инвест.*максимальн.*доход|min\s+investment.*max\s+profit)',
+    'private_chat': r'(давайте.*в.*чат|get.*private.*chat|dm|direct)'
+}
+
+# Фразы создающие срочность
+URGENCY_PHRASES = {
+    'time_pressure': r'(успей|не\s+поздно|последний\s+день|последняя\s+неделя|скоро\s+(цена|взлет|рост))',
+    'scarcity': r'(только\s+\d+\s+мест|ограниченн|осталось\s+\d+)',
+    'fomo': r'(все\s+уже\s+знают|пока\s+не\s+поздно|упустишь|пропустишь)',
+}
+
+pattern_engine.register({
+    **{f"scam.indicator.{name}": pattern for name, pattern in SCAM_INDICATORS.items()},
+    **{f"scam.urgency.{name}": pattern for name, pattern in URGENCY_PHRASES.items()},
+})
+
+
 def detect_scam_red_flags(text: str) -> dict:
     """
     Обнаруживает признаки скамов и красные флаги в тексте.
     
     Возвращает словарь с обнаруженными рисками и рекомендациями.
     """
-    import re
-    
-    text_lower = text.lower()
-    
-    # Признаки скамов
-    scam_indicators = {
-        'guaranteed_listing': r'(гарантирован(ный|ая)\s+листинг|guaranteed\s+listing)',
-        'moon_promises': r'(\d+x\s+(потенциал|рост|прибыль)|1000x|100x|moon)',
-        'insider_info': r'(инсайд|приватн\w*\s+информ|insider|private\s+info|приватн\w*\s+сведения)',
-        'urgency_fomo': r'(успей.*не\s+поздно|потом|будет\s+поздно|успейте|не\s+ждите|цена\s+(растёт|растет)\s+каждый)',
-        'exclusive': r'(только\s+для.*избранн|эксклюзив|приватн(ый|ом|ая|ы)\s+чат)',
-        'partnership_lies': r'(партн[её]р\s+(amazon|google|visa|binance|coinbase)|одобрен\s+(amazon|google))',
-        'silent_team': r'(команда\s+(молчит|скрывает|не\s+говорит)|security\s+reasons)',
-        'min_max_promise': r'(минимальн.*инвест.*максимальн.*доход|min\s+investment.*max\s+profit)',
-        'private_chat': r'(давайте.*в.*чат|get.*private.*chat|dm|direct)'
-    }
-    
-    # Фразы создающие срочность
-    urgency_phrases = {
-        'time_pressure': r'(успей|не\s+поздно|последний\s+день|последняя\s+неделя|скоро\s+(цена|взлет|рост))',
-        'scarcity': r'(только\s+\d+\s+мест|ограниченн|осталось\s+\d+)',
-        'fomo': r'(все\s+уже\s+знают|пока\s+не\s+поздно|упустишь|пропустишь)',
-    }
+    hits = pattern_engine.scan(text.lower())
     
     detected_risks = {
         'scam_indicators': [],
@@ -392,13 +402,13 @@ def detect_scam_red_flags(text: str) -> dict:
     }
     
     # Проверяем признаки скамов
-    for indicator_name, pattern in scam_indicators.items():
-        if re.search(pattern, text_lower):
+    for indicator_name in SCAM_INDICATORS:
+        if hits.search(f"scam.indicator.{indicator_name}"):
             detected_risks['scam_indicators'].append(indicator_name)
     
     # Проверяем фразы создающие срочность
-    for urgency_name, pattern in urgency_phrases.items():
-        if re.search(pattern, text_lower):
+    for urgency_name in URGENCY_PHRASES:
+        if hits.search(f"scam.urgency.{urgency_name}"):
             detected_risks['urgency_phrases'].append(urgency_name)
     
     # Определяем уровень риска
@@ -986,6 +996,15 @@ def _build_simple_dialogue_ukrainian() -> str:
 - Якщо не знаєш - чесно скажи"""
 
 
+def build_knowledge_dialogue_prompt(snippet: str, language: str = "ru") -> str:
+    """Короткий промпт диалога со справкой из базы знаний RVX."""
+    if language == "uk":
+        header = "ДОВІДКА З БАЗИ ЗНАНЬ RVX (спирайся на неї, відповідай українською):"
+    else:
+        header = "СПРАВКА ИЗ БАЗЫ ЗНАНИЙ RVX (опирайся на неё):"
+    return f"{build_simple_dialogue_prompt(language)}\n\n{header}\n{snippet}"
+
+
 def clean_hallucinations(text: str) -> str:
     """Отключена - просто возвращает текст как есть."""
     return text
@@ -1167,6 +1186,7 @@ def build_context_for_prompt(context_history: List[dict]) -> str:
     """Формирует контекст из истории.
     
     ✅ FIXED: Теперь получает List[dict] в правильном формате
+    get_ai_response_sync собирает историю через prompt_budget.assemble (в бюджете токенов режима).
     """
     if not context_history:
         return ""
@@ -1199,13 +1219,23 @@ def build_context_for_prompt(context_history: List[dict]) -> str:
     return ""
 
 
+def _is_cancelled(cancel_event: Optional[threading.Event]) -> bool:
+    """Ответ больше не нужен - не тратим вызов следующего провайдера."""
+    if cancel_event is not None and cancel_event.is_set():
+        logger.info("✂️ AI вызов отменён - пропускаем оставшихся провайдеров")
+        return True
+    return False
+
+
 def get_ai_response_sync(
     user_message: str,
     context_history: List[dict] = None,
     timeout: float = TIMEOUT,
     user_id: Optional[int] = None,  # ✅ НОВОЕ: для rate limiting
     message_context: dict = None,  # ✅ НОВОЕ v0.27: классификация сообщения (from analyze_message_context)
-    language: str = "ru"  # ✅ НОВОЕ v0.44: поддержка локализации (язык: "ru" или "uk")
+    language: str = "ru",  # ✅ НОВОЕ v0.44: поддержка локализации (язык: "ru" или "uk")
+    cancel_event: Optional[threading.Event] = None,  # Вызов отменён более новым сообщением пользователя
+    knowledge_snippet: Optional[str] = None  # Справка из базы знаний (knowledge_base) для диалога
 ) -> Optional[str]:
     """
     Получает ответ от ИИ с multi-provider fallback системой.
@@ -1222,6 +1252,10 @@ def get_ai_response_sync(
         message_context (Optional[dict]): Классификация сообщения от analyze_message_context()
             Содержит: {"type": "...", "is_geopolitical": bool, "needs_crypto_analysis": bool, ...}
             Используется для выбора специализированного промпта (например, для геополитики)
+        cancel_event (Optional[threading.Event]): Если выставлен - следующие провайдеры
+            не вызываются и возвращается None (см. inflight_registry)
+        knowledge_snippet (Optional[str]): Фрагмент из базы знаний по вопросу. В режиме
+            диалога вместе с ним используется короткий системный промпт вместо полного
         
     Returns:
         Optional[str]: AI-сгенерированный ответ или None если все провайдеры не работают
@@ -1294,35 +1328,40 @@ def get_ai_response_sync(
             logger.warning(f"⛔ Rate limit exceeded for user {user_id}")
             return limit_message  # Возвращаем сообщение об ограничении
     
-    # Формируем промпт - ИСПОЛЬЗУЕТ ПРАВИЛЬНЫЙ промпт с полным контекстом
-    context_str = build_context_for_prompt(context_history)
-    
     # ✅ v0.31: Выбор режима и получение параметров ИИ
     ai_mode = "dialogue"  # Default режим
     
     # ✅ v0.31: РЕЖИМ ОБРАБОТКИ ЭКОНОМИЧЕСКОГО КАЛЕНДАРЯ - первый приоритет
     if CALENDAR_PROCESSOR_AVAILABLE and detect_calendar_input(user_message):
-        system_prompt = build_calendar_processing_prompt()
+        prefix = prompt_budget.prefix("calendar", language, build_calendar_processing_prompt)
         ai_mode = "calendar"
         logger.info(f"📅 Using CALENDAR PROCESSING prompt - detected economic calendar")
         logger.debug(f"   Calendar processor enabled: {CALENDAR_PROCESSOR_AVAILABLE}")
-        logger.debug(f"   Calendar prompt length: {len(system_prompt)} chars")
+        logger.debug(f"   Calendar prompt length: {len(prefix.text)} chars")
     # ✅ v0.30: Choose right prompt based on message context
     elif message_context and message_context.get("is_geopolitical"):
-        system_prompt = build_geopolitical_analysis_prompt(language)
+        prefix = prompt_budget.prefix("geopolitical", language, lambda: build_geopolitical_analysis_prompt(language))
         ai_mode = "geopolitical"
         logger.info(f"🌍 Using GEOPOLITICAL prompt for question type: {message_context.get('type')} (language: {language})")
         logger.info(f"   Message context: {message_context}")
-        logger.debug(f"   Geopolitical prompt length: {len(system_prompt)} chars")
+        logger.debug(f"   Geopolitical prompt length: {len(prefix.text)} chars")
     elif message_context and message_context.get("needs_crypto_analysis") and message_context.get("type", "").startswith("crypto"):
         # Для крипто-новостей используем специальный промпт анализа
-        system_prompt = build_crypto_news_analysis_prompt(language)
+        prefix = prompt_budget.prefix("crypto_news", language, lambda: build_crypto_news_analysis_prompt(language))
         ai_mode = "crypto_news"
         logger.info(f"📊 Using CRYPTO NEWS ANALYSIS prompt for question type: {message_context.get('type')} (language: {language})")
         logger.info(f"   Message context: {message_context}")
-        logger.debug(f"   Crypto prompt length: {len(system_prompt)} chars")
+        logger.debug(f"   Crypto prompt length: {len(prefix.text)} chars")
+    elif knowledge_snippet:
+        # Ответ опирается на справку из базы знаний - полный промпт диалога не нужен
+        # Кэшируется промпт без справки: build_knowledge_dialogue_prompt дописывает её в конец
+        prefix = prompt_budget.prefix("knowledge", language, lambda: build_knowledge_dialogue_prompt("", language))
+        prefix = prefix._replace(text=prefix.text + knowledge_snippet,
+                                 tokens=prefix.tokens + estimate_tokens(knowledge_snippet))
+        ai_mode = "dialogue"
+        logger.info(f"📖 Using KNOWLEDGE prompt ({len(prefix.text)} chars, language: {language})")
     else:
-        system_prompt = build_dialogue_system_prompt(language)  # ✅ FIXED: Using correct full prompt instead of short version
+        prefix = prompt_budget.prefix("dialogue", language, lambda: build_dialogue_system_prompt(language))  # ✅ FIXED: Using correct full prompt instead of short version
         ai_mode = "dialogue"
         logger.info(f"💬 Using DIALOGUE prompt (language: {language})")
         if message_context:
@@ -1334,6 +1373,12 @@ def get_ai_response_sync(
     temperature = ai_params["temperature"]
     top_p = ai_params["top_p"]
     
+    # История отбирается по свежести и близости к сообщению в бюджет токенов режима
+    system_prompt = prefix.text
+    prompt = prompt_budget.assemble(ai_mode, system_prompt, context_history, user_message, prefix.tokens)
+    context_str = prompt.context_str
+    user_content = prompt.user_content
+    
     # ✅ DEBUG: Логируем что попадает в контекст
     if context_history:
         logger.info(f"📝 Context received: {len(context_history)} messages")
@@ -1341,13 +1386,17 @@ def get_ai_response_sync(
             logger.debug(f"   History ({len(context_str)} chars): {context_str[:150]}...")
         else:
             logger.warning(f"⚠️ Context is EMPTY despite {len(context_history)} messages in list!")
+        logger.info(f"🧮 Prompt ~{prompt.tokens}/{prompt.budget} tokens: history kept {prompt.kept}, "
+                    f"compressed {prompt.compressed}, dropped {prompt.dropped}")
     else:
         logger.debug(f"ℹ️ No context history (first message or empty)")
     
     # Формируем полный промпт с контекстом диалога (RVX context уже в system_prompt)
-    full_prompt = f"{system_prompt}\n\n{context_str}Пользователь: {user_message}"
+    full_prompt = prompt.full_prompt
     
     # ==================== ПОПЫТКА 0: OLLAMA (ПРИОРИТЕТ 1 - ЛОКАЛЬНАЯ!) ====================
+    if _is_cancelled(cancel_event):
+        return None
     if OLLAMA_ENABLED:
         provider_start = time.time()
         logger.info(f"🎯 Ollama (локальная): Получаем ответ...")
@@ -1366,7 +1415,7 @@ def get_ai_response_sync(
                 # Вызываем async generate
                 ai_response = loop.run_until_complete(
                     ollama_client.generate(
-                        prompt=f"{context_str}Пользователь: {user_message}",
+                        prompt=user_content,
                         system_prompt=system_prompt,
                         temperature=temperature,
                         max_tokens=max_tokens,
@@ -1375,6 +1424,7 @@ def get_ai_response_sync(
                 )
                 
                 provider_time = time.time() - provider_start
+                prompt_budget.record("ollama", ai_mode, prompt.tokens)
                 
                 if ai_response:
                     # ✅ Проверяем и удаляем галлюцинации
@@ -1405,6 +1455,8 @@ def get_ai_response_sync(
         logger.debug("ℹ️  OLLAMA_ENABLED=false, пропускаем локальную LLM")
     
     # ==================== ПОПЫТКА 1: GROQ ====================
+    if _is_cancelled(cancel_event):
+        return None
     if GROQ_API_KEY:
         provider_start = time.time()
         logger.info(f"🔄 Groq (облачная): Получаем ответ...")
@@ -1420,7 +1472,7 @@ def get_ai_response_sync(
                         "model": GROQ_MODEL,
                         "messages": [
                             {"role": "system", "content": system_prompt},
-                            {"role": "user", "content": f"{context_str}Пользователь: {user_message}"}
+                            {"role": "user", "content": user_content}
                         ],
                         "temperature": temperature,
                         "max_tokens": max_tokens,
@@ -1434,6 +1486,7 @@ def get_ai_response_sync(
                 
                 if response.status_code == 200:
                     data = response.json()
+                    prompt_budget.record("groq", ai_mode, prompt.tokens, (data.get("usage") or {}).get("prompt_tokens"))
                     if data.get("choices") and len(data["choices"]) > 0:
                         ai_response = data["choices"][0]["message"]["content"].strip()
                         if ai_response:
@@ -1456,6 +1509,7 @@ def get_ai_response_sync(
                         logger.warning(f"⚠️  Groq: нет choices в ответе")
                         update_metrics("groq", False, provider_time)
                 else:
+                    prompt_budget.record("groq", ai_mode, prompt.tokens)
                     logger.warning(f"⚠️  Groq HTTP {response.status_code}")
                     update_metrics("groq", False, provider_time)
                     
@@ -1471,6 +1525,8 @@ def get_ai_response_sync(
         logger.warning("⚠️  GROQ_API_KEY не установлен")
     
     # ==================== ПОПЫТКА 2: MISTRAL ====================
+    if _is_cancelled(cancel_event):
+        return None
     if MISTRAL_API_KEY and MISTRAL_API_KEY != "ЗАМЕНИ_НА_КЛЮЧ_ИЗ_MISTRAL":
         provider_start = time.time()
         logger.info(f"🔄 Mistral: Получаем ответ (fallback 1)...")
@@ -1486,7 +1542,7 @@ def get_ai_response_sync(
                         "model": MISTRAL_MODEL,
                         "messages": [
                             {"role": "system", "content": system_prompt},
-                            {"role": "user", "content": f"{context_str}Пользователь: {user_message}"}
+                            {"role": "user", "content": user_content}
                         ],
                         "temperature": temperature,
                         "max_tokens": max_tokens,
@@ -1500,6 +1556,7 @@ def get_ai_response_sync(
                 
                 if response.status_code == 200:
                     data = response.json()
+                    prompt_budget.record("mistral", ai_mode, prompt.tokens, (data.get("usage") or {}).get("prompt_tokens"))
                     if data.get("choices") and len(data["choices"]) > 0:
                         ai_response = data["choices"][0]["message"]["content"].strip()
                         if ai_response:
@@ -1519,6 +1576,7 @@ def get_ai_response_sync(
                             logger.warning(f"⚠️  Mistral: пустой ответ")
                             update_metrics("mistral", False, provider_time)
                 else:
+                    prompt_budget.record("mistral", ai_mode, prompt.tokens)
                     logger.warning(f"⚠️  Mistral HTTP {response.status_code}")
                     update_metrics("mistral", False, provider_time)
                     
@@ -1534,6 +1592,8 @@ def get_ai_response_sync(
         logger.debug("⏭️  Mistral: Пропущен (ключ не установлен)")
     
     # ==================== ПОПЫТКА 3: GEMINI ====================
+    if _is_cancelled(cancel_event):
+        return None
     if GEMINI_API_KEY:
         provider_start = time.time()
         logger.info(f"🔄 Gemini: Получаем ответ (fallback 2)...")
@@ -1563,6 +1623,8 @@ def get_ai_response_sync(
                 
                 if response.status_code == 200:
                     data = response.json()
+                    prompt_budget.record("gemini", ai_mode, prompt.tokens,
+                                         (data.get("usageMetadata") or {}).get("promptTokenCount"))
                     candidates = data.get("candidates", [])
                     if candidates and candidates[0].get("content", {}).get("parts"):
                         ai_response = candidates[0]["content"]["parts"][0].get("text", "").strip()
@@ -1583,6 +1645,7 @@ def get_ai_response_sync(
                             logger.warning(f"⚠️  Gemini: пустой ответ")
                             update_metrics("gemini", False, provider_time)
                 else:
+                    prompt_budget.record("gemini", ai_mode, prompt.tokens)
                     logger.warning(f"⚠️  Gemini HTTP {response.status_code}")
                     update_metrics("gemini", False, provider_time)
                     
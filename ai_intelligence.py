@@ -13,6 +13,8 @@ import logging
 from typing import Dict, List, Optional, Tuple
 from enum import Enum
 
+from keyword_engine import keyword_engine
+
 logger = logging.getLogger(__name__)
 
 
@@ -425,6 +427,20 @@ if __name__ == "__main__":
 # РАСШИРЕННОЕ ОБЩЕНИЕ И ДИАЛОГ (v0.20.0+)
 # =============================================================================
 
+# Ключевые слова get_conversational_response
+PROGRESS_WORDS = ["как дела", "прогресс", "успехи", "статус"]
+HELP_WORDS = ["помоги", "не понимаю", "объясни", "как это", "почему"]
+PRAISE_WORDS = ["спасибо", "благодарю", "отлично", "супер", "класс", "нравится"]
+COMPLAINT_WORDS = ["сложно", "не помогает", "непонятно", "не работает", "ошибка"]
+
+keyword_engine.register({
+    "conversation.progress": PROGRESS_WORDS,
+    "conversation.help": HELP_WORDS,
+    "conversation.praise": PRAISE_WORDS,
+    "conversation.complaint": COMPLAINT_WORDS,
+})
+
+
 def get_conversational_response(
     user_message: str,
     user_level: UserLevel,
@@ -442,10 +458,10 @@ def get_conversational_response(
         Естественный ответ бота
     """
     # Определяем тип вопроса по ключевым словам
-    message_lower = user_message.lower()
+    matches = keyword_engine.scan(user_message.lower())
     
     # Вопросы о прогрессе
-    if any(word in message_lower for word in ["как дела", "прогресс", "успехи", "статус"]):
+    if matches.has("conversation.progress"):
         if user_level == UserLevel.ABSOLUTE_BEGINNER:
             return "📊 Ты только начал, но уже на правильном пути! Продолжай учиться - твой прогресс впечатляет! 🌱"
         elif user_level == UserLevel.BEGINNER:
@@ -458,7 +474,7 @@ def get_conversational_response(
             return "👑 Ты достиг вершины! Твой опыт бесценен! Учи других! 🌟"
     
     # Просьба о помощи
-    if any(word in message_lower for word in ["помоги", "не понимаю", "объясни", "как это", "почему"]):
+    if matches.has("conversation.help"):
         if user_level == UserLevel.ABSOLUTE_BEGINNER:
             return (
                 "🤝 Конечно помогу! Я объясню ОЧЕНЬ просто, без сложных слов.\n\n"
@@ -484,7 +500,7 @@ def get_conversational_response(
             )
     
     # Положительные отзывы
-    if any(word in message_lower for word in ["спасибо", "благодарю", "отлично", "супер", "класс", "нравится"]):
+    if matches.has("conversation.praise"):
         responses = [
             "😊 Рад, что помогаю! Это мотивирует продолжать! 💪",
             "🙏 Спасибо за обратную связь! Продолжай развиваться! 🚀",
@@ -494,7 +510,7 @@ def get_conversational_response(
         return responses[len(user_message) % len(responses)]
     
     # Жалобы или негативные отзывы
-    if any(word in message_lower for word in ["сложно", "не помогает", "непонятно", "не работает", "ошибка"]):
+    if matches.has("conversation.complaint"):
         if user_level == UserLevel.ABSOLUTE_BEGINNER:
             return (
                 "😔 Мне жалко! Давай разберемся вместе.\n\n"
@@ -13,6 +13,9 @@ from dataclasses import dataclass, asdict
 from threading import RLock
 import sqlite3
 
+from schema_migrations import Migration, ensure_schema
+from storage_router import ROUTE_TELEMETRY, register_schema, routed_connection
+
 logger = logging.getLogger("RVX_AUTH")
 
 # =============================================================================
@@ -21,50 +24,66 @@ logger = logging.getLogger("RVX_AUTH")
 
 DB_PATH = os.getenv("AUTH_DB_PATH", "auth_keys.db")
 
+AUTH_SCHEMA_SCOPE = "auth"
+
+
+def _create_auth_tables(cursor: sqlite3.Cursor) -> None:
+    """Create auth tables and indexes"""
+    # Create API keys table
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS api_keys (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            key_hash TEXT UNIQUE NOT NULL,
+            key_name TEXT NOT NULL,
+            owner_name TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            last_used_at TIMESTAMP,
+            is_active BOOLEAN DEFAULT 1,
+            rate_limit_per_minute INTEGER DEFAULT 60,
+            total_requests INTEGER DEFAULT 0,
+            total_errors INTEGER DEFAULT 0,
+            notes TEXT
+        )
+    """)
+    
+    # Create indexes for performance (api_usage_log lives in the telemetry DB)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_key_hash ON api_keys(key_hash)")
+
+
+AUTH_MIGRATIONS = [
+    Migration(1, "auth_tables", _create_auth_tables),
+]
+
+
+def _create_usage_log_table(cursor: sqlite3.Cursor) -> None:
+    """Create api_usage_log in the telemetry database"""
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS api_usage_log (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            key_hash TEXT NOT NULL,
+            endpoint TEXT,
+            request_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            status_code INTEGER,
+            response_time_ms INTEGER,
+            success BOOLEAN
+        )
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_usage_key ON api_usage_log(key_hash)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_usage_time ON api_usage_log(request_time)")
+
+
+# Usage rows are telemetry: they go to the telemetry DB so that logging
+# every API call never holds the write lock on api_keys.
+API_USAGE_MIGRATIONS = [
+    Migration(1, "api_usage_log", _create_usage_log_table),
+]
+register_schema(ROUTE_TELEMETRY, "api_usage", API_USAGE_MIGRATIONS)
+
+
 def init_auth_database():
     """Initialize authentication database"""
     try:
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-        
-        # Create API keys table
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS api_keys (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                key_hash TEXT UNIQUE NOT NULL,
-                key_name TEXT NOT NULL,
-                owner_name TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                last_used_at TIMESTAMP,
-                is_active BOOLEAN DEFAULT 1,
-                rate_limit_per_minute INTEGER DEFAULT 60,
-                total_requests INTEGER DEFAULT 0,
-                total_errors INTEGER DEFAULT 0,
-                notes TEXT
-            )
-        """)
-        
-        # Create API usage log table
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS api_usage_log (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                key_hash TEXT NOT NULL,
-                endpoint TEXT,
-                request_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                status_code INTEGER,
-                response_time_ms INTEGER,
-                success BOOLEAN,
-                FOREIGN KEY (key_hash) REFERENCES api_keys(key_hash)
-            )
-        """)
-        
-        # Create indexes for performance
-        cursor.execute("CREATE INDEX IF NOT EXISTS idx_key_hash ON api_keys(key_hash)")
-        cursor.execute("CREATE INDEX IF NOT EXISTS idx_usage_key ON api_usage_log(key_hash)")
-        cursor.execute("CREATE INDEX IF NOT EXISTS idx_usage_time ON api_usage_log(request_time)")
-        
-        conn.commit()
-        conn.close()
+        ensure_schema(DB_PATH, AUTH_SCHEMA_SCOPE, AUTH_MIGRATIONS)
         logger.info("✅ Auth database initialized")
     except Exception as e:
         logger.error(f"❌ Error initializing auth database: {e}")
@@ -269,15 +288,16 @@ class APIKeyManager:
         key_hash = hashlib.sha256(api_key.encode()).hexdigest()
         
         try:
+            with routed_connection(ROUTE_TELEMETRY) as usage_conn:
+                usage_conn.execute("""
+                    INSERT INTO api_usage_log 
+                    (key_hash, endpoint, status_code, response_time_ms, success)
+                    VALUES (?, ?, ?, ?, ?)
+                """, (key_hash, endpoint, status_code, response_time_ms, success))
+            
             conn = self._get_conn()
             cursor = conn.cursor()
             
-            cursor.execute("""
-                INSERT INTO api_usage_log 
-                (key_hash, endpoint, status_code, response_time_ms, success)
-                VALUES (?, ?, ?, ?, ?)
-            """, (key_hash, endpoint, status_code, response_time_ms, success))
-            
             # Update counters
             cursor.execute("""
                 UPDATE api_keys SET total_requests = total_requests + 1
@@ -339,24 +359,19 @@ class APIKeyManager:
         key_hash = hashlib.sha256(api_key.encode()).hexdigest()
         
         try:
-            conn = self._get_conn()
-            cursor = conn.cursor()
-            
             # Get recent usage
             cutoff = datetime.utcnow() - timedelta(hours=hours)
-            cursor.execute("""
-                SELECT 
-                    COUNT(*) as total_calls,
-                    SUM(CASE WHEN success = 1 THEN 1 ELSE 0 END) as successful_calls,
-                    SUM(CASE WHEN success = 0 THEN 1 ELSE 0 END) as failed_calls,
-                    AVG(response_time_ms) as avg_response_time,
-                    MAX(response_time_ms) as max_response_time
-                FROM api_usage_log
-                WHERE key_hash = ? AND request_time > ?
-            """, (key_hash, cutoff.isoformat()))
-            
-            row = cursor.fetchone()
-            conn.close()
+            with routed_connection(ROUTE_TELEMETRY) as conn:
+                row = conn.execute("""
+                    SELECT 
+                        COUNT(*) as total_calls,
+                        SUM(CASE WHEN success = 1 THEN 1 ELSE 0 END) as successful_calls,
+                        SUM(CASE WHEN success = 0 THEN 1 ELSE 0 END) as failed_calls,
+                        AVG(response_time_ms) as avg_response_time,
+                        MAX(response_time_ms) as max_response_time
+                    FROM api_usage_log
+                    WHERE key_hash = ? AND request_time > ?
+                """, (key_hash, cutoff.isoformat())).fetchone()
             
             if row:
                 return {
@@ -45,6 +45,9 @@ from limited_cache import LimitedCache
 # AI Quality Fixer - улучшение качества ответов AI (v0.1.0)
 from ai_quality_fixer import AIQualityValidator, get_improved_system_prompt
 
+# JSON Extractor (v1.0) - однопроходный разбор JSON из ответов AI
+from json_extractor import extract_json, JSON_EXTRACT_MAX_SIZE
+
 # PHASE 6b: Prometheus Metrics (Issue #20)
 from prometheus_client import (
     Counter, Histogram, Gauge, generate_latest, CONTENT_TYPE_LATEST, CollectorRegistry
@@ -72,6 +75,7 @@ from secrets_manager import get_safe_logger
 from security_middleware import (
     RateLimiter,
 )
+from rate_limit_engine import RateLimitDecision, rate_limits
 
 # =============================================================================
 # КОНФИГУРАЦИЯ И НАСТРОЙКА
@@ -149,15 +153,10 @@ deepseek_client: Optional[OpenAI] = None  # DeepSeek API (основной)
 client: Optional[genai.Client] = None  # Gemini API (резервный)
 request_counter = {"total": 0, "success": 0, "errors": 0, "fallback": 0, "rate_limited": 0}
 response_cache = LimitedCache(max_size=1000, ttl_seconds=3600)  # ✅ ИСПРАВЛЕНО: LRU + TTL
-ip_request_history: Dict[str, list] = {}  # Для rate limiting по IP
 
 # CRITICAL FIX #1 & #2: Asyncio locks для синхронизации глобального состояния в async контексте
 _client_lock: asyncio.Lock = None  # Инициализируется в lifespan
 _deepseek_client_lock: asyncio.Lock = None  # Инициализируется в lifespan
-_rate_limit_lock: asyncio.Lock = None  # Инициализируется в lifespan
-
-# Security middleware instances
-rate_limiter = RateLimiter(requests_per_minute=100, window_seconds=60)
 
 # =============================================================================
 # МОДЕЛИ ДАННЫХ
@@ -332,59 +331,51 @@ class ImageAnalysisResponse(BaseModel):
 # RATE LIMITING
 # =============================================================================
 
-class RateLimiter:
-    """Simple in-memory rate limiter by IP address."""
+# GCRA-политики rate_limit_engine: одно число на ключ, точный Retry-After
+rate_limiter = RateLimiter(RATE_LIMIT_REQUESTS, RATE_LIMIT_WINDOW, name="api_ip")
+# Лимит API ключа (запросов в минуту) берётся из APIKeyManager.get_rate_limit
+api_key_rate_limiter = RateLimiter(RATE_LIMIT_REQUESTS, 60, name="api_key")
+rate_limits.register(rate_limiter.policy)
+rate_limits.register(api_key_rate_limiter.policy)
+
+
+def check_rate_limit(request: Request) -> Optional[RateLimitDecision]:
+    """
+    Учитывает запрос в лимитах: по API ключу, если у ключа есть лимит, иначе по IP.
     
-    def __init__(self, requests_per_window: int, window_seconds: int):
-        self.requests_per_window = requests_per_window
-        self.window_seconds = window_seconds
+    Returns:
+        RateLimitDecision или None, если ограничение выключено
+    """
+    if not RATE_LIMIT_ENABLED:
+        return None
     
-    async def is_allowed(self, ip: str) -> bool:
-        """Check if request from IP is allowed - async version with proper locking."""
-        if not RATE_LIMIT_ENABLED or not RATE_LIMIT_PER_IP:
-            return True
-        
-        # CRITICAL FIX #2: Использовать asyncio.Lock для синхронизации
-        async with _rate_limit_lock:
-            now = datetime.now()
-            cutoff_time = now - timedelta(seconds=self.window_seconds)
-            
-            # Инициализируем список для IP если его нет
-            if ip not in ip_request_history:
-                ip_request_history[ip] = []
-            
-            # Удаляем старые запросы вне окна
-            ip_request_history[ip] = [
-                timestamp for timestamp in ip_request_history[ip]
-                if timestamp > cutoff_time
-            ]
-            
-            # Проверяем лимит
-            if len(ip_request_history[ip]) >= self.requests_per_window:
-                return False
-            
-            # Добавляем текущий запрос
-            ip_request_history[ip].append(now)
-            return True
-    
-    async def get_retry_after(self, ip: str) -> int:
-        """Get seconds to retry after for rate limited IP - async version with locking."""
-        # CRITICAL FIX #2: Использовать asyncio.Lock для синхронизации
-        async with _rate_limit_lock:
-            if ip not in ip_request_history or not ip_request_history[ip]:
-                return 0
-            
-            oldest_request = min(ip_request_history[ip])
-            retry_time = oldest_request + timedelta(seconds=self.window_seconds)
-            seconds_to_wait = max(0, int((retry_time - datetime.now()).total_seconds()))
-            return seconds_to_wait
-
-rate_limiter = RateLimiter(RATE_LIMIT_REQUESTS, RATE_LIMIT_WINDOW)
+    api_key = request.headers.get("Authorization", "").replace("Bearer ", "")
+    if api_key:
+        key_limit = api_key_manager.get_rate_limit(api_key)
+        if key_limit:
+            return api_key_rate_limiter.check(api_key, limit=key_limit)
+    
+    if not RATE_LIMIT_PER_IP:
+        return None
+    client_ip = request.client.host if request.client else "unknown"
+    return rate_limiter.check(client_ip)
 
 # =============================================================================
 # УТИЛИТЫ
 # =============================================================================
 
+# ⚡ Паттерны sanitize_input компилируются один раз при импорте, а не на каждый запрос
+DANGEROUS_INPUT_PATTERNS = tuple(re.compile(pattern, re.IGNORECASE) for pattern in (
+    r'ignore\s+(previous|all|above)\s+instructions?',
+    r'system\s*:',
+    r'<\|im_start\|>',
+    r'<\|im_end\|>',
+    r'you\s+are\s+now',
+    r'forget\s+everything',
+    r'new\s+instructions?',
+))
+_UNSAFE_CHARS_RE = re.compile(r'[^\w\s\d\.,!?;:()\-—\'\"№@#$%&*+=/\\<>«»€£¥₽₿]')
+
 def sanitize_input(text: str) -> str:
     """
     Санитизирует и валидирует входной текст для защиты от атак.
@@ -421,22 +412,12 @@ def sanitize_input(text: str) -> str:
         - "new instructions for you"
         - Special tokens: <|im_start|>, <|im_end|>
     """
-    dangerous_patterns = [
-        r'ignore\s+(previous|all|above)\s+instructions?',
-        r'system\s*:',
-        r'<\|im_start\|>',
-        r'<\|im_end\|>',
-        r'you\s+are\s+now',
-        r'forget\s+everything',
-        r'new\s+instructions?',
-    ]
-    
     cleaned = text
-    for pattern in dangerous_patterns:
-        cleaned = re.sub(pattern, '', cleaned, flags=re.IGNORECASE)
+    for pattern in DANGEROUS_INPUT_PATTERNS:
+        cleaned = pattern.sub('', cleaned)
     
     # Удаляем подозрительные последовательности символов
-    cleaned = re.sub(r'[^\w\s\d\.,!?;:()\-—\'\"№@#$%&*+=/\\<>«»€£¥₽₿]', '', cleaned)
+    cleaned = _UNSAFE_CHARS_RE.sub('', cleaned)
     
     return cleaned[:MAX_TEXT_LENGTH]
 
@@ -527,191 +508,26 @@ def clean_text(text: str) -> str:
 
 def extract_json_from_response(raw_text: str) -> Optional[dict]:
     """
-    Извлекает JSON из ответа AI с множественными стратегиями.
+    Извлекает JSON из ответа AI (<json> теги, markdown блоки или скобки).
     КРИТИЧЕСКИЙ ФИК #6: Защита от DoS через переполнение стека/памяти
     
-    ИСПРАВЛЕНИЕ ПРОБЛЕМЫ #1: Более надежный парсинг с лучшей очисткой текста.
-    ИСПРАВЛЕНИЕ #4: Правильная обработка вложенных объектов JSON в XML тегах.
+    ⚡ Один проход json_extractor: кандидаты ранжируются по источнику,
+    json.loads вызывается только для лучших из них.
     """
     if not raw_text:
         return None
     
     # ✅ CRITICAL FIX #6: Protect against DoS via extremely large responses
-    MAX_JSON_SIZE = 100_000  # 100KB max JSON size
-    if len(raw_text) > MAX_JSON_SIZE:
-        logger.warning(f"⚠️ JSON response exceeds max size ({len(raw_text)} > {MAX_JSON_SIZE})")
+    if len(raw_text) > JSON_EXTRACT_MAX_SIZE:
+        logger.warning(f"⚠️ JSON response exceeds max size ({len(raw_text)} > {JSON_EXTRACT_MAX_SIZE})")
         return None
     
     logger.debug(f"🔍 Начало парсинга JSON. Длина входа: {len(raw_text)} символов")
     
-    original_text = raw_text
-    text = raw_text
-    
-    # Стратегия 0: Удаляем markdown блоки и escape символы
-    text = re.sub(r'```json\s*', '', text, flags=re.IGNORECASE).strip()
-    text = re.sub(r'```\s*', '', text).strip()
-    text = text.replace('\\n', '\n').replace('\\t', '\t')  # Раскрываем escape
-    
-    # ИСПРАВЛЕНИЕ #4: Стратегия 1 - XML теги с правильным парсингом вложенных скобок
-    xml_start = text.find('<json>')
-    if xml_start != -1:
-        logger.debug("✅ Найдены XML теги <json>...")
-        # Находим содержимое между <json> и </json> с учетом вложенных скобок
-        search_start = xml_start + 6  # Длина '<json>'
-        brace_count = 0
-        in_string = False
-        escape_next = False
-        json_end = -1
-        
-        for i in range(search_start, len(text)):
-            char = text[i]
-            
-            # Обработка escape
-            if escape_next:
-                escape_next = False
-                continue
-            
-            if char == '\\':
-                escape_next = True
-                continue
-            
-            # Обработка строк
-            if char == '"':
-                in_string = not in_string
-            
-            # Считаем скобки вне строк
-            if not in_string:
-                if char == '{':
-                    brace_count += 1
-                elif char == '}':
-                    brace_count -= 1
-                    if brace_count == 0:
-                        json_end = i + 1
-                        break
-        
-        if json_end != -1:
-            text_to_parse = text[search_start:json_end].strip()
-            if text_to_parse and text_to_parse.startswith('{'):
-                logger.debug(f"XML: Извлечен JSON из XML тегов ({len(text_to_parse)} символов)")
-                candidates = [("xml_tags", text_to_parse)]
-                
-                # Пробуем парсить сразу - это приоритетная стратегия
-                cleaned = text_to_parse.strip()
-                # ВНИМАНИЕ: НЕ удаляем подчеркивания! Они могут быть частью JSON ключей
-                # cleaned = re.sub(r'\*\*(.+?)\*\*', r'\1', cleaned)  # ← УБИРАЮТ JSON ключи!
-                # cleaned = re.sub(r'~~(.+?)~~', r'\1', cleaned)
-                # cleaned = re.sub(r'\*(.+?)\*', r'\1', cleaned)
-                # cleaned = re.sub(r'_(.+?)_', r'\1', cleaned)
-                
-                try:
-                    data = json.loads(cleaned)
-                    if isinstance(data, dict) and len(data) > 0:
-                        logger.info(f"✅ JSON успешно распарсен (xml_tags)")
-                        return data
-                except json.JSONDecodeError as e:
-                    logger.debug(f"  ❌ XML JSON парсинг не сработал: {e.msg}")
-    
-    # ЕСЛИ XML не сработала, пробуем другие стратегии
-    candidates = []
-    
-    # Стратегия 2: Markdown блоки ```json...```
-    md_match = re.search(r'```(?:json)?\s*(.*?)\s*```', text, re.DOTALL | re.IGNORECASE)
-    if md_match:
-        logger.debug("✅ Найдены markdown блоки ```json...")
-        text_to_parse = md_match.group(1).strip()
-        candidates.append(("markdown_json", text_to_parse))
-    
-    # Стратегия 3: Ищем ПЕРВЫЙ валидный JSON блок методом поиска скобок
-    first_brace = text.find('{')
-    if first_brace != -1:
-        brace_count = 0
-        in_string = False
-        escape_next = False
-        end_pos = -1
-        
-        for i in range(first_brace, len(text)):
-            char = text[i]
-            
-            # Обработка escape
-            if escape_next:
-                escape_next = False
-                continue
-            
-            if char == '\\':
-                escape_next = True
-                continue
-            
-            # Обработка строк
-            if char == '"':
-                in_string = not in_string
-            
-            # Не считаем скобки внутри строк
-            if not in_string:
-                if char == '{':
-                    brace_count += 1
-                elif char == '}':
-                    brace_count -= 1
-                    if brace_count == 0:
-                        end_pos = i + 1
-                        break
-        
-        if end_pos != -1:
-            potential_json = text[first_brace:end_pos]
-            logger.debug(f"Найден JSON от первой скобки (длина: {len(potential_json)})")
-            candidates.append(("brace_matching", potential_json))
-    
-    if not candidates:
-        logger.warning(f"❌ JSON не найден вообще. Начало ответа: {original_text[:200]}...")
-        return None
-    
-    # Пробуем парсить каждого кандидата
-    for strategy_name, text_to_parse in candidates:
-        logger.debug(f"🔄 Попытка парсинга стратегией: {strategy_name}")
-        
-        # Очищаем от markdown маркеров
-        cleaned = text_to_parse.strip()
-        
-        # ИСПРАВЛЕНИЕ: Заменяем переводы строк на пробелы
-        # (Gemini часто разбивает длинные строки JSON на несколько строк)
-        cleaned = cleaned.replace('\n', ' ').replace('\r', '')
-        
-        # Удаляем множественные пробелы
-        cleaned = re.sub(r' +', ' ', cleaned)
-        
-        # Попытка 1: Парсим как есть (БЕЗ удаления markdown - это ломает JSON!)
-        try:
-            data = json.loads(cleaned)
-            if isinstance(data, dict) and len(data) > 0:
-                logger.info(f"✅ JSON успешно распарсен ({strategy_name})")
-                return data
-        except json.JSONDecodeError as e:
-            logger.debug(f"  ❌ Стандартный парсинг не сработал: строка {e.lineno}, колонка {e.colno}: {e.msg}")
-        
-        # Попытка 2: Замена одиночных кавычек на двойные (для Python dict синтаксиса)
-        try:
-            cleaned_quotes = cleaned.replace("'", '"')
-            data = json.loads(cleaned_quotes)
-            if isinstance(data, dict):
-                logger.info(f"✅ JSON распарсен после замены кавычек ({strategy_name})")
-                return data
-        except json.JSONDecodeError:
-            logger.debug(f"  ❌ Замена кавычек не помогла")
-        
-        # Попытка 3: Удаляем одиночные подчеркивания в значениях
-        try:
-            # Более осторожная замена: только в строках после двоеточия
-            cleaned_underscores = re.sub(r':\s*"([^"]*?)_([^"]*?)"', r': "\1\2"', cleaned)
-            data = json.loads(cleaned_underscores)
-            if isinstance(data, dict):
-                logger.info(f"✅ JSON распарсен после удаления подчеркиваний ({strategy_name})")
-                return data
-        except json.JSONDecodeError:
-            logger.debug(f"  ❌ Удаление подчеркиваний не помогло")
-    
-    logger.error("❌ Не удалось распарсить JSON ни одной стратегией")
-    if candidates:
-        logger.error(f"Первый кандидат (первые 300 символов): {candidates[0][1][:300]}")
-    return None
+    data = extract_json(raw_text)
+    if data is None:
+        logger.error(f"❌ Не удалось распарсить JSON. Начало ответа: {raw_text[:200]}...")
+    return data
 
 def extract_teaching_json(raw_text: str) -> Optional[dict]:
     """Извлекает JSON урока из ответа AI - использует универсальный парсер.
@@ -1221,12 +1037,11 @@ async def lifespan(app: FastAPI) -> AsyncGenerator[None, None]:
     Raises:
         ValueError: If critical configuration is missing
     """
-    global client, deepseek_client, _client_lock, _deepseek_client_lock, _rate_limit_lock
+    global client, deepseek_client, _client_lock, _deepseek_client_lock
     
     # CRITICAL FIX #1 & #2: Инициализировать asyncio.Lock для потокобезопасности
     _client_lock = asyncio.Lock()
     _deepseek_client_lock = asyncio.Lock()
-    _rate_limit_lock = asyncio.Lock()
     logger.debug("🔒 Asyncio locks инициализированы для синхронизации глобального состояния")
     
     # CRITICAL FIX #5: Вызвать валидацию конфигурации при запуске
@@ -1333,30 +1148,12 @@ async def lifespan(app: FastAPI) -> AsyncGenerator[None, None]:
                     except Exception as e:
                         logger.debug(f"Cache stats retrieval error: {e}")
                 
-                # 2. CRITICAL FIX #6: Rate limiter cleanup (unbounded memory fix)
-                current_time = datetime.now()
-                if RATE_LIMIT_ENABLED and RATE_LIMIT_PER_IP:
+                # 2. CRITICAL FIX #6: Rate limiter cleanup (idle keys are exact to drop in GCRA)
+                if RATE_LIMIT_ENABLED:
                     try:
-                        async with _rate_limit_lock:
-                            # Remove IPs with no recent activity
-                            cutoff_time = current_time - timedelta(seconds=RATE_LIMIT_WINDOW * 10)
-                            ips_to_remove = []
-                            
-                            for ip, timestamps in ip_request_history.items():
-                                # Check if any requests are recent
-                                recent = any(ts > cutoff_time for ts in timestamps)
-                                if not recent:
-                                    ips_to_remove.append(ip)
-                            
-                            # Remove stale entries
-                            for ip in ips_to_remove:
-                                del ip_request_history[ip]
-                            
-                            if ips_to_remove:
-                                logger.debug(
-                                    f"🧹 Rate limiter cleanup: removed {len(ips_to_remove)} stale IPs, "
-                                    f"total tracked: {len(ip_request_history)}"
-                                )
+                        evicted = rate_limits.evict_idle()
+                        if evicted:
+                            logger.debug(f"🧹 Rate limiter cleanup: evicted {evicted} idle keys")
                     except Exception as e:
                         logger.error(f"❌ Rate limiter cleanup error: {type(e).__name__}: {e}")
                 
@@ -1502,12 +1299,13 @@ async def rate_limit_middleware(request: Request, call_next) -> Response:
     
     client_ip = request.client.host if request.client else "unknown"
     
-    # IP-based rate limiting
-    allowed = rate_limiter.is_allowed(client_ip)
-    retry_after = rate_limiter.get_retry_after(client_ip) if not allowed else None
+    # Per-API-key / per-IP rate limiting
+    decision = check_rate_limit(request)
     
-    if not allowed:
+    if decision is not None and not decision.allowed:
+        retry_after = decision.retry_after_seconds
         request_counter["rate_limited"] += 1
+        record_rate_limit(request.url.path)
         logger.warning(f"⛔ Rate limit exceeded for IP: {client_ip}")
         
         return JSONResponse(
@@ -2128,17 +1926,7 @@ async def analyze_image(payload: ImagePayload, request: Request) -> JSONResponse
         user_id = 0
     
     try:
-        # Проверяем rate limit
-        client_ip = request.client.host if request.client else "unknown"
-        if not rate_limiter.is_allowed(client_ip):
-            logger.warning(f"⚠️ Rate limit exceeded for IP: {client_ip}")
-            request_counter["rate_limited"] += 1
-            # PHASE 6b: Record rate limit metric
-            record_rate_limit("/analyze_image")
-            raise HTTPException(
-                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
-                detail="Слишком много запросов. Попробуйте позже."
-            )
+        # Rate limit уже учтён в rate_limit_middleware (повторная проверка считала бы запрос дважды)
         
         # Формируем контент для Gemini Vision API
         if payload.image_url:
@@ -2749,11 +2537,22 @@ async def get_dialogue_metrics() -> dict:
     - Процент успехов
     - Статистику по каждому провайдеру (Groq, Mistral, Gemini)
     - Среднее время ответа
+    - Латентность p50/p95/p99 за 24ч (из агрегатов event_rollups)
     """
     try:
         from ai_dialogue import get_metrics_summary
         metrics = get_metrics_summary()
         
+        try:
+            from event_tracker import get_tracker
+            from event_rollups import get_rollups
+            from reporting_pool import run_report
+            rollups = get_rollups(get_tracker().db_path)
+            await run_report(rollups.refresh)
+            metrics["latency_24h"] = await run_report(rollups.ai_performance, 24)
+        except Exception as e:
+            logger.warning(f"⚠️ Агрегаты латентности недоступны: {e}")
+        
         logger.info(f"📊 Запрос метрик диалога: {metrics['total_requests']} запросов, {metrics['success_rate']} успешно")
         
         return {
@@ -11,6 +11,8 @@ from dataclasses import dataclass, asdict
 from threading import RLock
 import sqlite3
 
+from schema_migrations import Migration, ensure_schema
+
 logger = logging.getLogger("RVX_AUDIT")
 
 # =============================================================================
@@ -20,35 +22,42 @@ logger = logging.getLogger("RVX_AUDIT")
 AUDIT_DB_PATH = os.getenv("AUDIT_LOG_PATH", "audit_logs.db")
 AUDIT_LOG_FILE = os.getenv("AUDIT_LOG_FILE", "audit.log")
 
+AUDIT_SCHEMA_SCOPE = "audit"
+
+
+def _create_audit_tables(cursor: sqlite3.Cursor) -> None:
+    """Create audit tables and indexes"""
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS audit_logs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            event_type TEXT NOT NULL,
+            severity TEXT NOT NULL,
+            user_id INTEGER,
+            action TEXT NOT NULL,
+            result TEXT,
+            source_ip TEXT,
+            details TEXT,
+            indexed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    
+    # Create indexes for quick searches
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_timestamp ON audit_logs(timestamp)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_user_id ON audit_logs(user_id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_event_type ON audit_logs(event_type)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_severity ON audit_logs(severity)")
+
+
+AUDIT_MIGRATIONS = [
+    Migration(1, "audit_tables", _create_audit_tables),
+]
+
+
 def init_audit_database():
     """Initialize audit logging database"""
     try:
-        conn = sqlite3.connect(AUDIT_DB_PATH)
-        cursor = conn.cursor()
-        
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS audit_logs (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                event_type TEXT NOT NULL,
-                severity TEXT NOT NULL,
-                user_id INTEGER,
-                action TEXT NOT NULL,
-                result TEXT,
-                source_ip TEXT,
-                details TEXT,
-                indexed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
-        
-        # Create indexes for quick searches
-        cursor.execute("CREATE INDEX IF NOT EXISTS idx_timestamp ON audit_logs(timestamp)")
-        cursor.execute("CREATE INDEX IF NOT EXISTS idx_user_id ON audit_logs(user_id)")
-        cursor.execute("CREATE INDEX IF NOT EXISTS idx_event_type ON audit_logs(event_type)")
-        cursor.execute("CREATE INDEX IF NOT EXISTS idx_severity ON audit_logs(severity)")
-        
-        conn.commit()
-        conn.close()
+        ensure_schema(AUDIT_DB_PATH, AUDIT_SCHEMA_SCOPE, AUDIT_MIGRATIONS)
         logger.info("✅ Audit database initialized")
     except Exception as e:
         logger.error(f"❌ Error initializing audit database: {e}")
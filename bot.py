@@ -10,7 +10,8 @@ import re
 import html
 import time
 import subprocess
-from typing import Optional, List, Tuple, Dict, Any, Callable
+import importlib.util
+from typing import TYPE_CHECKING, Optional, List, Tuple, Dict, Any, Callable, Union
 from datetime import datetime, timedelta
 import datetime as datetime_module
 from contextlib import contextmanager
@@ -21,13 +22,14 @@ from pydantic import BaseModel, field_validator, ValidationInfo, ValidationError
 
 # Импорт i18n для мультиязычной поддержки
 try:
-    from i18n import get_text, set_user_language, get_user_language as get_user_lang
+    from i18n import get_text, set_user_language, translate, get_user_language as get_user_lang
 except ImportError:
     logger = logging.getLogger(__name__)
     logger.warning("i18n module not found, will use stub functions")
     async def get_text(key, *args, **kwargs): return f"[{key}]"
     async def set_user_language(*args, **kwargs): return False
     def get_user_lang(*args, **kwargs): return "ru"
+    def translate(key, *args, **kwargs): return f"[{key}]"
 
 # ============================================================================
 # 🔧 CRITICAL: Clean up old bot processes on startup
@@ -37,7 +39,9 @@ def cleanup_stale_bot_processes() -> None:
     ULTRA-AGGRESSIVE cleanup to prevent 409 Conflicts (Python-only, no external commands)
     - Kills ALL bot.py processes except current
     - Kills ALL api_server/uvicorn processes
-    - Sleeps 3 seconds to let Telegram API release the lock
+    - Sleeps 3 seconds to let Telegram API release the lock (only if something was killed)
+    
+    Called from main() in polling mode, not at import time.
     
     Note: Uses Python's psutil/os module only - no external pkill/ps commands
     which may not exist in Docker slim images
@@ -50,6 +54,7 @@ def cleanup_stale_bot_processes() -> None:
         handler.setFormatter(logging.Formatter('%(asctime)s [%(levelname)s] %(message)s', datefmt='%H:%M:%S'))
         init_logger.addHandler(handler)
     
+    killed = 0
     try:
         current_pid = os.getpid()
         init_logger.info(f"CLEANUP: Current PID = {current_pid}")
@@ -68,6 +73,7 @@ def cleanup_stale_bot_processes() -> None:
                     if 'bot.py' in cmdline and pid != current_pid:
                         try:
                             os.kill(pid, 9)
+                            killed += 1
                             init_logger.debug(f"Killed stale bot process PID={pid}")
                         except ProcessLookupError:
                             pass
@@ -76,6 +82,7 @@ def cleanup_stale_bot_processes() -> None:
                     if 'api_server' in cmdline or 'uvicorn' in cmdline:
                         try:
                             os.kill(pid, 9)
+                            killed += 1
                             init_logger.debug(f"Killed api_server/uvicorn process PID={pid}")
                         except ProcessLookupError:
                             pass
@@ -86,15 +93,18 @@ def cleanup_stale_bot_processes() -> None:
             # psutil not available - just skip process killing
             init_logger.warning("psutil not available, skipping process killing")
         
-        # CRITICAL: Sleep to let Telegram release the polling lock
-        init_logger.debug("Waiting 3 seconds for Telegram polling lock to release...")
-        time.sleep(3)
+        # CRITICAL: Sleep to let Telegram release the polling lock of killed processes
+        if killed:
+            init_logger.debug("Waiting 3 seconds for Telegram polling lock to release...")
+            time.sleep(3)
         
     except Exception as e:
         init_logger.error(f"Cleanup warning: {e}")
 
-# Run cleanup BEFORE anything else - this is the very first thing that runs
-cleanup_stale_bot_processes()
+# Режим запуска: polling (один процесс), webhook (мастер кластера) или worker
+# (процесс кластера, см. webhook_cluster). Убивать "конкурентов" можно только
+# в polling - в кластере остальные bot.py это соседние воркеры.
+BOT_RUN_MODE = os.getenv("BOT_RUN_MODE", "polling").lower()
 
 # Fix SQLite3 datetime adapter deprecation warning (Python 3.12+)
 def _adapt_datetime(val: datetime) -> str:
@@ -114,9 +124,9 @@ else:
     load_dotenv(verbose=True)
 
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, BotCommand, CallbackQuery
-from telegram.ext import Application, CommandHandler, MessageHandler, CallbackQueryHandler, filters, ContextTypes
+from telegram.ext import Application, CommandHandler, MessageHandler, CallbackQueryHandler, ChatMemberHandler, filters, ContextTypes
 from telegram.error import TelegramError, TimedOut, NetworkError, Conflict
-from telegram.constants import ParseMode, ChatAction
+from telegram.constants import ParseMode, ChatAction, ChatType
 
 # ============================================================================
 # ✅ v0.25.0: CORE MODULES - Config, Messages, AI Honesty, Event Tracking
@@ -136,10 +146,14 @@ from ai_honesty import (
 from event_tracker import (
     get_tracker, create_event, EventType, get_analytics
 )
+from event_rollups import get_rollups
 
 # ✅ v1.0: Embedded News Analyzer - встроенный анализ без API
 # ============================================================================
-from embedded_news_analyzer import analyze_news
+# openai + google.genai грузятся ~2 с - модуль загружается при первом анализе
+# или фоновым прогревом в post_init (lazy_import)
+from lazy_import import lazy_callable, start_warm_up, stats as lazy_import_stats
+analyze_news = lazy_callable("embedded_news_analyzer", "analyze_news")
 
 # ✅ v0.25.0: Admin Dashboard
 from admin_dashboard import get_admin_dashboard
@@ -151,35 +165,38 @@ from conversation_context import (
 )
 
 # ✅ CRITICAL FIX #2: Input Validators - валидация входных данных
-from input_validators import validate_user_input, UserMessageInput
+from input_validators import validate_user_input, check_message
 
 # ✅ CRITICAL FIX #1: SQL Validator - защита от SQL injection
 
 # ✅ v0.28.0: Daily Digest Scheduler - ежедневный крипто-дайджест в 9:00
-from daily_digest_scheduler import initialize_digest_scheduler, stop_digest_scheduler
+initialize_digest_scheduler = lazy_callable("daily_digest_scheduler", "initialize_digest_scheduler")
+stop_digest_scheduler = lazy_callable("daily_digest_scheduler", "stop_digest_scheduler")
 
 # Новый модуль для обучения (v0.5.0)
 from education import (
     COURSES_DATA, XP_REWARDS, LEVEL_THRESHOLDS, BADGES,
     load_courses_to_db, get_user_knowledge_level, calculate_user_level_and_xp,
-    add_xp_to_user, get_user_badges, add_badge_to_user, get_lesson_content,
+    add_xp_to_user as education_add_xp_to_user, get_user_badges, add_badge_to_user, get_lesson_content,
     extract_quiz_from_lesson, get_faq_by_keyword, save_question_to_db,
     add_question_to_faq, get_user_course_progress, get_all_tools_db,
     get_educational_context, clean_lesson_content, split_lesson_content,
     get_next_lesson_info, build_user_context_prompt, get_user_course_summary,
+    course_store, get_lesson_view, get_lesson_quiz,
     # NEW v0.14.0: функции для лимитов на запросы
     XP_TIER_LIMITS, get_daily_limit_by_xp, get_remaining_requests,
     check_daily_limit, increment_daily_requests, reset_daily_requests
 )
 
 # ✅ NEW: Crypto Daily Digest (v0.27.0)
-try:
-    from crypto_digest import collect_digest_data
-    from digest_formatter import format_digest
-    CRYPTO_DIGEST_ENABLED = True
-except ImportError:
+CRYPTO_DIGEST_ENABLED = all(
+    importlib.util.find_spec(name) is not None for name in ("crypto_digest", "digest_formatter")
+)
+if CRYPTO_DIGEST_ENABLED:
+    collect_digest_data = lazy_callable("crypto_digest", "collect_digest_data")
+    format_digest = lazy_callable("digest_formatter", "format_digest")
+else:
     logger.warning("Crypto digest modules not available")
-    CRYPTO_DIGEST_ENABLED = False
 
 # Передовая система обучения (v0.21.0)
 from adaptive_learning import (
@@ -188,10 +205,46 @@ from adaptive_learning import (
 )
 
 # TIER 1 Optimizations (v0.22.0) - Type hints, Redis cache, connection pooling, structured logging
-from tier1_optimizations import DatabaseConnectionPool
+# (импортируется в init_db_pool: модуль при загрузке подключается к Redis)
+if TYPE_CHECKING:
+    from tier1_optimizations import DatabaseConnectionPool
+
+# ✅ Versioned schema migrations - быстрый старт при актуальной схеме
+from schema_migrations import Migration, apply_migrations, latest_version
+
+# ✅ Storage router - телеметрия и кэш в отдельных файлах БД
+from storage_router import (
+    ROUTE_MAIN, ROUTE_TELEMETRY, ROUTE_CACHE,
+    routed_connection, register_schema, get_pool, attach_alias
+)
+
+# ✅ Read-only пул для отчётов: аналитика не ждёт и не блокирует пользователей
+from reporting_pool import read_only_connection, run_report
+from broadcast_engine import format_progress, get_broadcast_engine, send_with_retry
+from subscription_store import SOURCE_ERROR, SubscriptionStore, get_subscription_store
+from session_store import SESSION_MAX_COUNT, SESSION_TTL_SECONDS, SessionStore
+from inflight_registry import DIALOGUE, CallSuperseded, inflight
+from outbound_queue import outbound
+from render_cache import RenderedView, render_cache, slot, static, t
+from keyword_engine import keyword_engine
+from secrets_manager import LOG_REDACTION_ENABLED, install_log_redaction
+from shared_state import get_shared_backend
+# aiohttp нужен только в режимах webhook/worker - webhook_cluster грузится при запуске кластера
+run_cluster = lazy_callable("webhook_cluster", "run_cluster")
+serve_worker = lazy_callable("webhook_cluster", "serve_worker")
+BOT_WORKER_ID = int(os.getenv("BOT_WORKER_ID", "0"))
+from update_dispatcher import (
+    UPDATE_CONCURRENCY, UPDATE_MAX_PENDING, UPDATE_RESUME_PENDING, BackpressureQueue, UpdateDispatcher
+)
+from exceptions import ReportTimeoutError, ReportsBusyError
 
 # Учительский модуль (v0.7.0) - ИИ преподает крипто, AI, Web3, трейдинг
-from teacher import teach_lesson, TEACHING_TOPICS, DIFFICULTY_LEVELS
+from teacher import teach_lesson, TEACHING_TOPICS, DIFFICULTY_LEVELS, lesson_cache
+from lesson_cache import LESSON_CACHE_WARM_INTERVAL, LESSON_CACHE_WARM_FIRST
+from knowledge_base import (
+    knowledge_base, faq_documents, embedded_lesson_documents, course_documents, KB_REFRESH_INTERVAL
+)
+from prompt_budget import prompt_budget
 
 # Модуль детектирования пропаганды и манипуляций (v0.32.0)
 from propaganda_detector import (
@@ -215,8 +268,9 @@ from ai_intelligence import (
 # Новая система адаптивных квестов v2 (v0.13.0)
 from daily_quests_v2 import (
     DAILY_QUESTS, get_user_level, get_level_name, get_level_info,
-    get_daily_quests_for_level, LEVEL_RANGES
+    get_daily_quests_for_level, get_quest_progress_today, LEVEL_RANGES
 )
+from gamification_engine import ACHIEVEMENT_BADGES, EVENT_XP, GamificationEngine
 from quest_handler_v2 import (
     start_quest, start_test, show_question, handle_answer
 )
@@ -238,8 +292,6 @@ REGENERATION_MODES = [
 # КОНФИГУРАЦИЯ
 # =============================================================================
 
-load_dotenv()
-
 # Основные настройки
 TELEGRAM_BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
 
@@ -301,6 +353,12 @@ MAX_REQUESTS_PER_DAY = int(os.getenv("MAX_REQUESTS_PER_DAY", "50"))
 BOT_START_TIME = datetime.now()
 GRACEFUL_SHUTDOWN_TIMEOUT = int(os.getenv("GRACEFUL_SHUTDOWN_TIMEOUT", "30"))  # Время для graceful shutdown
 HEALTH_CHECK_INTERVAL = int(os.getenv("HEALTH_CHECK_INTERVAL", "300"))  # Проверка здоровья каждые 5 минут
+ROLLUP_REFRESH_INTERVAL = int(os.getenv("ROLLUP_REFRESH_INTERVAL", "300"))  # Досворачивание bot_events в агрегаты
+SESSION_PERSIST = os.getenv("SESSION_PERSIST", "true").lower() == "true"  # Квиз/регенерация переживают рестарт
+SESSION_FLUSH_INTERVAL = int(os.getenv("SESSION_FLUSH_INTERVAL", "15"))  # Запись изменённых сессий в БД
+IS_CLUSTER_WORKER = BOT_RUN_MODE == "worker"
+RUNS_GLOBAL_JOBS = not IS_CLUSTER_WORKER or BOT_WORKER_ID == 0  # Глобальные задачи - в одном процессе кластера
+SHARED_STATE_PURGE_INTERVAL = int(os.getenv("SHARED_STATE_PURGE_INTERVAL", "600"))
 
 # =============================================================================
 # CRITICAL FIX #5: Centralized Authorization Decorator (Security)
@@ -366,72 +424,64 @@ NOTIFICATION_BATCH_SIZE = int(os.getenv("NOTIFICATION_BATCH_SIZE", "100"))  # Me
 # CHANNEL SUBSCRIPTION CHECK (v0.42.1 Mandatory Subscription)
 # =============================================================================
 
-# CRITICAL FIX #17: Extract cache TTL to env var
-_subscription_cache = {}
-_SUBSCRIPTION_CACHE_TTL = int(os.getenv("SUBSCRIPTION_CACHE_TTL", "300"))  # Subscription check cache TTL (seconds)
+def get_subscription_cache() -> SubscriptionStore:
+    """Хранилище подписок на MANDATORY_CHANNEL_ID (LRU + channel_subscriptions)."""
+    return get_subscription_store(DB_PATH, MANDATORY_CHANNEL_ID)
 
 async def clear_subscription_cache(user_id: int = None) -> None:
-    """Очищает кэш подписки для пользователя или всех пользователей"""
-    global _subscription_cache
+    """
+    Сбрасывает проверенные через API состояния подписки (одного или всех пользователей).
+    
+    Состояния из событий chat_member сохраняются - они перепроверяются по SUBSCRIPTION_VERIFY_TTL.
+    """
+    get_subscription_cache().invalidate(user_id, keep_events=True)
     if user_id is None:
-        _subscription_cache.clear()
         logger.info("🗑️  Cleared subscription cache for ALL users")
     else:
-        if user_id in _subscription_cache:
-            del _subscription_cache[user_id]
-            logger.info(f"🗑️  Cleared subscription cache for user {user_id}")
+        logger.debug(f"🗑️  Cleared subscription cache for user {user_id}")
 
-async def check_channel_subscription(user_id: int, context: ContextTypes.DEFAULT_TYPE) -> bool:
+async def check_channel_subscription(user_id: int, context: ContextTypes.DEFAULT_TYPE,
+                                     force: bool = False) -> bool:
     """
     Проверяет подписан ли пользователь на обязательный канал.
     
-    Результаты кэшируются на 5 минут для снижения нагрузки на API.
-    Если бот не может проверить членство через API - показывает подтверждение.
+    Состояние приходит из событий chat_member канала (handle_channel_member_update),
+    get_chat_member вызывается для пользователей без свежего состояния - см. subscription_store.
+    Ошибки API кэшируются коротко (SUBSCRIPTION_ERROR_TTL).
     
     Args:
         user_id: ID пользователя
         context: Telegram context для доступа к боту
+        force: спросить Telegram, не глядя в кэш (кнопка "проверить еще раз":
+            событие вступления могло прийти, пока бот был выключен)
     
     Returns:
         True если пользователь подписан, False если нет
     """
-    logger.debug(f"check_channel_subscription called for user {user_id}")
-    logger.debug(f"MANDATORY_CHANNEL_ID = {MANDATORY_CHANNEL_ID} (type: {type(MANDATORY_CHANNEL_ID).__name__})")
-    
     # ВАЖНО: Если MANDATORY_CHANNEL_ID не установлен - БЛОКИРУЕМ ВСЕ
     # Это значит что пока бот не в production режиме
     if not MANDATORY_CHANNEL_ID:
         logger.warning("⚠️ MANDATORY_CHANNEL_ID not set - blocking all access")
         return False  # Если канал не задан, блокируем всем
     
-    # Проверяем кэш
-    current_time = time.time()
-    if user_id in _subscription_cache:
-        is_subscribed, cache_time = _subscription_cache[user_id]
-        if current_time - cache_time < _SUBSCRIPTION_CACHE_TTL:
-            # CRITICAL FIX #13: Don't log every cache hit (hot path optimization)
-            if logger.isEnabledFor(logging.DEBUG):
-                logger.debug(f"🔄 Cache hit for user {user_id}: {is_subscribed}")
-            return is_subscribed  # Возвращаем закэшированный результат
+    store = get_subscription_cache()
+    state = None if force else store.get(user_id)
+    if state is not None:
+        # CRITICAL FIX #13: Don't log every cache hit (hot path optimization)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"🔄 Cache hit for user {user_id}: {state.is_subscribed} ({state.source})")
+        return state.is_subscribed
     
     try:
         logger.debug(f"🔍 Checking subscription for user {user_id} in channel {MANDATORY_CHANNEL_ID}")
-        
-        # Проверяем статус члена в канале
         member = await context.bot.get_chat_member(MANDATORY_CHANNEL_ID, user_id)
+        state = store.record_check(user_id, member.status)
         
-        # Пользователь является членом если статус: member, administrator, creator
-        is_subscribed = member.status in ["member", "administrator", "creator"]
-        
-        # Кэшируем результат
-        _subscription_cache[user_id] = (is_subscribed, current_time)
-        
-        if is_subscribed:
+        if state.is_subscribed:
             logger.info(f"✅ User {user_id} is subscribed (status: {member.status})")
-            return True
         else:
             logger.info(f"❌ User {user_id} is NOT subscribed (status: {member.status})")
-            return False
+        return state.is_subscribed
         
     except Exception as e:
         error_msg = str(e)
@@ -439,17 +489,30 @@ async def check_channel_subscription(user_id: int, context: ContextTypes.DEFAULT
         
         # Если ошибка 400 или "user not a member" - пользователь не подписан
         if "user is not a member" in error_msg.lower() or "not found" in error_msg.lower() or "400" in error_msg:
-            logger.debug(f"User not a member error, returning False")
             logger.info(f"⚠️ User {user_id} is not a member of the channel (API confirmed)")
-            _subscription_cache[user_id] = (False, current_time)  # Кэшируем что не подписан
+            store.record_check(user_id, "left")
             return False
         
-        # При других ошибках - требуем подписку (лучше требовать по ошибке чем разрешать)
-        logger.debug(f"API error (not member error), returning False")
+        # При других ошибках - требуем подписку (лучше требовать по ошибке чем разрешать),
+        # повторная проверка не раньше чем через SUBSCRIPTION_ERROR_TTL
         logger.warning(f"⚠️ Subscription check API error for user {user_id}, blocking access until retry: {error_msg}")
-        # Не кэшируем ошибки - пусть пользователь сможет попробовать еще раз
+        store.record_error(user_id)
         return False  # Блокируем доступ при ошибке API
 
+async def handle_channel_member_update(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """
+    Событие chat_member обязательного канала: вступление/выход применяется сразу.
+    
+    Приходит, только если бот - администратор канала (allowed_updates=ALL_TYPES).
+    """
+    member_update = update.chat_member
+    if member_update is None or member_update.chat.id != MANDATORY_CHANNEL_ID:
+        return
+    user_id = member_update.new_chat_member.user.id
+    status = member_update.new_chat_member.status
+    state = get_subscription_cache().record_event(user_id, status)
+    logger.info(f"📣 Channel membership update: user {user_id} -> {status} (subscribed={state.is_subscribed})")
+
 def require_channel_subscription(func: Callable) -> Callable:
     """
     Декоратор для проверки подписки на обязательный канал.
@@ -589,6 +652,10 @@ def setup_logger(name: Optional[str] = None, level: int = logging.INFO) -> loggi
     logger.addHandler(file_handler)
     logger.addHandler(console_handler)
     
+    # Маскирование токенов и ключей в каждой записи (secrets_manager)
+    if LOG_REDACTION_ENABLED:
+        install_log_redaction(logger)
+    
     return logger
 
 
@@ -708,56 +775,48 @@ class BotResponse(BaseModel):
         )
 
 # =============================================================================
-# IP-BASED RATE LIMITING (v0.39.0 - CRITICAL FIX #3: AsyncIO-safe version)
+# IP-BASED RATE LIMITING (v0.39.0, GCRA через rate_limit_engine)
 # =============================================================================
 
-from collections import defaultdict
 import asyncio
+from rate_limit_engine import RateLimitPolicy, rate_limits
 
 class IPRateLimiter:
     """
-    IP-based rate limiter for DDoS protection - ASYNC-SAFE VERSION.
+    IP-based rate limiter for DDoS protection.
     
-    Features:
-        - Per-IP rate limiting (configurable requests per time window)
-        - Automatic cleanup of old entries
-        - Asyncio-safe operations (uses asyncio.Lock instead of threading.Lock)
-        - Integration with logging
+    Обёртка над RateLimitPolicy (GCRA): одно число на ключ, шардированные
+    lock'и, неактивные ключи удаляются автоматически. Методы синхронные -
+    критическая секция не содержит await.
     
     Usage:
         limiter = IPRateLimiter(max_requests=30, window_seconds=60)
-        if await limiter.check_rate_limit(user_ip):  # Note: async
+        if limiter.check_rate_limit(user_ip):
             # Process request
         else:
             # Too many requests
     """
     
     def __init__(self, max_requests: int = 30, window_seconds: int = 60, 
-                 cleanup_interval: int = 300):
+                 cleanup_interval: int = 300, name: str = "bot_ip"):
         """
         Initialize rate limiter.
         
         Args:
             max_requests: Maximum requests allowed in time window (default: 30)
             window_seconds: Time window in seconds (default: 60)
-            cleanup_interval: Cleanup old entries every N seconds (default: 300)
+            cleanup_interval: Evict idle entries every N seconds (default: 300)
+            name: Policy name in rate_limits registry
         """
         self.max_requests = max_requests
         self.window_seconds = window_seconds
         self.cleanup_interval = cleanup_interval
-        
-        # IP -> list of timestamps (in seconds)
-        self.request_times: Dict[str, List[float]] = defaultdict(list)
-        
-        # CRITICAL FIX #3: Использовать asyncio.Lock вместо threading.Lock для async контекста
-        self.lock = asyncio.Lock()
-        
-        # Cleanup tracking
-        self.last_cleanup = time.time()
+        self.policy = RateLimitPolicy(name, max_requests, window_seconds,
+                                      sweep_interval=max(cleanup_interval, window_seconds))
     
-    async def check_rate_limit(self, ip_address: str) -> bool:
+    def check_rate_limit(self, ip_address: str) -> bool:
         """
-        Check if request from IP should be allowed - ASYNC VERSION.
+        Check if request from IP should be allowed.
         
         Args:
             ip_address: Client IP address (string)
@@ -765,103 +824,46 @@ class IPRateLimiter:
         Returns:
             True if request is allowed, False if rate limit exceeded
         """
-        async with self.lock:
-            current_time = time.time()
-            
-            # Auto-cleanup old entries periodically
-            if current_time - self.last_cleanup > self.cleanup_interval:
-                self._cleanup_old_entries(current_time)
-                self.last_cleanup = current_time
-            
-            # Get timestamps for this IP within the window
-            window_start = current_time - self.window_seconds
-            self.request_times[ip_address] = [
-                ts for ts in self.request_times[ip_address] 
-                if ts > window_start
-            ]
-            
-            # Check if limit exceeded
-            if len(self.request_times[ip_address]) >= self.max_requests:
-                logger.warning(
-                    f"Rate limit exceeded for IP {ip_address}: "
-                    f"{len(self.request_times[ip_address])}/{self.max_requests} "
-                    f"requests in {self.window_seconds}s"
-                )
-                return False
-            
-            # Add current request timestamp
-            self.request_times[ip_address].append(current_time)
-            return True
-    
-    async def get_remaining_requests(self, ip_address: str) -> int:
-        """
-        Get remaining requests for IP address - ASYNC VERSION.
-        
-        Args:
-            ip_address: Client IP address
-        
-        Returns:
-            Number of remaining requests before hitting limit
-        """
-        async with self.lock:
-            current_time = time.time()
-            window_start = current_time - self.window_seconds
-            
-            recent_requests = len([
-                ts for ts in self.request_times[ip_address] 
-                if ts > window_start
-            ])
-            
-            return max(0, self.max_requests - recent_requests)
-    
-    async def reset_ip(self, ip_address: str) -> None:
-        """Reset rate limit for specific IP (admin only) - ASYNC VERSION."""
-        async with self.lock:
-            if ip_address in self.request_times:
-                del self.request_times[ip_address]
-                logger.info(f"Rate limit reset for IP {ip_address}")
-    
-    async def get_stats(self) -> Dict[str, Any]:
-        """Get rate limiter statistics - ASYNC VERSION."""
-        async with self.lock:
-            total_ips = len(self.request_times)
-            blocked_ips = sum(
-                1 for requests in self.request_times.values()
-                if len(requests) >= self.max_requests
+        retry_after = self.policy.try_acquire(ip_address)
+        if retry_after:
+            logger.warning(
+                f"Rate limit exceeded for IP {ip_address}: "
+                f"{self.max_requests} requests in {self.window_seconds}s, retry in {retry_after:.1f}s"
             )
-            
-            return {
-                'total_tracked_ips': total_ips,
-                'blocked_ips': blocked_ips,
-                'max_requests_per_window': self.max_requests,
-                'window_seconds': self.window_seconds,
-                'cleanup_interval': self.cleanup_interval,
-            }
+            return False
+        return True
     
-    def _cleanup_old_entries(self, current_time: float) -> None:
-        """
-        Remove IPs with no recent activity.
-        Called periodically to prevent memory leaks.
-        """
-        window_start = current_time - self.window_seconds
-        cleanup_count = 0
-        
-        # Find IPs with no requests in current window
-        ips_to_remove = [
-            ip for ip, timestamps in self.request_times.items()
-            if not any(ts > window_start for ts in timestamps)
-        ]
-        
-        for ip in ips_to_remove:
-            del self.request_times[ip]
-            cleanup_count += 1
-        
-        if cleanup_count > 0:
-            logger.debug(f"Rate limiter cleanup: removed {cleanup_count} inactive IPs")
+    def get_remaining_requests(self, ip_address: str) -> int:
+        """Number of remaining requests before hitting limit."""
+        return self.policy.peek(ip_address).remaining
+    
+    def get_retry_after(self, ip_address: str) -> int:
+        """Seconds until the next request from IP is allowed (0 - allowed now)."""
+        return self.policy.peek(ip_address).retry_after_seconds
+    
+    def reset_ip(self, ip_address: str) -> None:
+        """Reset rate limit for specific IP (admin only)."""
+        self.policy.reset(ip_address)
+        logger.info(f"Rate limit reset for IP {ip_address}")
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Get rate limiter statistics."""
+        stats = self.policy.stats()
+        return {
+            'total_ips': stats['tracked_keys'],
+            'total_tracked_ips': stats['tracked_keys'],
+            'blocked_ips': self.policy.limited_keys(),
+            'total_requests': stats['allowed'] + stats['denied'],
+            'denied_requests': stats['denied'],
+            'max_requests_per_window': self.max_requests,
+            'window_seconds': self.window_seconds,
+            'cleanup_interval': self.cleanup_interval,
+        }
 
 
 # Global rate limiter instance (30 requests per minute per IP)
 rate_limiter = IPRateLimiter(max_requests=30, window_seconds=60)
+rate_limits.register(rate_limiter.policy)
 
 # =============================================================================
 # STANDARDIZED ERROR HANDLING SYSTEM (v0.23.0)
@@ -1177,9 +1179,15 @@ async def send_channel_post(
         return False
     
     try:
-        await context.bot.send_message(
-            chat_id=UPDATE_CHANNEL_ID,
-            text=text,
+        # Общий с рассылками bucket + повтор после RetryAfter/сетевых сбоев;
+        # числовой ID канала передаём числом, @username - как есть
+        channel_id: Union[int, str] = (
+            int(UPDATE_CHANNEL_ID) if UPDATE_CHANNEL_ID.lstrip("-").isdigit() else UPDATE_CHANNEL_ID
+        )
+        await send_with_retry(
+            context.bot,
+            channel_id,
+            text,
             parse_mode=parse_mode,
             disable_notification=silent
         )
@@ -1992,11 +2000,12 @@ async def send_success_with_next_steps(
 # =============================================================================
 
 # Global pool instance (using optimized DatabaseConnectionPool from tier1_optimizations)
-db_pool: Optional[DatabaseConnectionPool] = None
+db_pool: Optional["DatabaseConnectionPool"] = None
 
 def init_db_pool() -> None:
     """Initialize database pool on bot startup with TIER 1 optimization."""
     global db_pool
+    from tier1_optimizations import DatabaseConnectionPool
     db_pool = DatabaseConnectionPool(DB_PATH, pool_size=DB_POOL_SIZE)
     stats = db_pool.get_stats()
     logger.info(f"Database pool initialized: {stats}")
@@ -2007,7 +2016,7 @@ def init_db_pool() -> None:
 # =============================================================================
 
 @contextmanager
-def get_db() -> contextmanager:
+def get_db(route: str = ROUTE_MAIN) -> contextmanager:
     """Context manager для работы с БД с правильной обработкой ошибок и освобождением ресурсов.
     
     TIER 1 v0.22.0: Использует пул соединений для оптимизации производительности.
@@ -2016,8 +2025,19 @@ def get_db() -> contextmanager:
     
     CRITICAL FIX #16: Using async-safe DatabaseConnectionPool with get_connection_sync() wrapper.
     v0.26.0: Добавлен retry mechanism для "database is locked" ошибок с exponential backoff.
+    
+    Args:
+        route: ROUTE_MAIN (пользовательские данные), ROUTE_TELEMETRY (analytics,
+            audit_logs) или ROUTE_CACHE (кэш ответов). Телеметрия и кэш живут
+            в отдельных файлах со своим пулом и не держат блокировку записи
+            основной БД.
     """
-    conn = None
+    if route != ROUTE_MAIN:
+        with routed_connection(route, DB_PATH) as routed_conn:
+            yield routed_conn
+        return
+    
+    conn: Optional[sqlite3.Connection] = None
     max_retries = 5
     retry_delay = 0.1  # Start with 100ms
     attempt = 0
@@ -2111,1148 +2131,400 @@ def check_column_exists(cursor: sqlite3.Cursor, table: str, column: str) -> bool
     columns = [row[1] for row in cursor.fetchall()]
     return column in columns
 
-def migrate_database() -> None:
-    """Миграция базы данных к новой схеме v0.5.0."""
+def _ensure_conversation_history_columns(cursor: sqlite3.Cursor) -> None:
+    """Добавляет недостающие столбцы message_type/intent в conversation_history.
+    
+    TIER 1 v0.23.0: Enhanced with default values and data consistency fixes.
+    TIER 1 v0.24.0: More aggressive migration to fix Railway deployment issues.
+    """
+    # Проверяем существует ли таблица
+    cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='conversation_history'")
+    if not cursor.fetchone():
+        logger.info(f"Таблица conversation_history не существует, будет создана позже")
+        return
+    
+    # Получаем информацию о столбцах ДО миграции
+    cursor.execute("PRAGMA table_info(conversation_history)")
+    columns_before = {col[1] for col in cursor.fetchall()}
+    logger.info(f"📋 Столбцы ДО миграции: {sorted(columns_before)}")
+    
+    if 'message_type' not in columns_before:
+        logger.info("  ⚡ Добавляем столбец message_type в conversation_history...")
+        try:
+            cursor.execute("ALTER TABLE conversation_history ADD COLUMN message_type TEXT DEFAULT 'user'")
+            logger.info(f"Столбец message_type добавлен успешно")
+        except sqlite3.OperationalError as e:
+            if "duplicate column name" not in str(e).lower():
+                logger.error(f"Не удалось добавить message_type: {e}")
+            
+    if 'intent' not in columns_before:
+        logger.info("  ⚡ Добавляем столбец intent в conversation_history...")
+        try:
+            cursor.execute("ALTER TABLE conversation_history ADD COLUMN intent TEXT DEFAULT 'general'")
+            logger.info(f"Столбец intent добавлен успешно")
+        except sqlite3.OperationalError as e:
+            if "duplicate column name" not in str(e).lower():
+                logger.error(f"Не удалось добавить intent: {e}")
+    
+    # Финальная проверка
+    cursor.execute("PRAGMA table_info(conversation_history)")
+    columns_after = {col[1] for col in cursor.fetchall()}
+    logger.info(f"Столбцы ПОСЛЕ миграции: {sorted(columns_after)}")
+    
+    # Проверяем что все нужные столбцы есть
+    required_columns = {'id', 'user_id', 'message_type', 'content', 'intent', 'created_at'}
+    missing = required_columns - columns_after
+    if missing:
+        logger.error(f"🚨 КРИТИЧНО: Отсутствуют столбцы: {missing}")
+    else:
+        logger.info(f"УСПЕШНО: Все необходимые столбцы присутствуют")
+
+
+def ensure_conversation_history_columns() -> None:
+    """Проверяет и добавляет недостающие столбцы в conversation_history.
+    
+    ⚠️ ВАЖНО: Вызывается ПЕРЕД основной инициализацией!
+    CRITICAL FIX #14: Use validated DATABASE_PATH from config instead of raw os.getenv()
+    """
+    try:
+        # CRITICAL FIX #14: Открываем БД используя валидированный путь из конфига
+        conn = sqlite3.connect(DB_PATH)
+        try:
+            _ensure_conversation_history_columns(conn.cursor())
+            conn.commit()
+        finally:
+            conn.close()
+    except Exception as e:
+        logger.error(f"Критическая ошибка при миграции БД: {e}", exc_info=True)
+
+
+def _migrate_database(cursor: sqlite3.Cursor) -> None:
+    """Миграция колонок и таблиц старых БД к схеме v0.43.0 (идемпотентно)."""
     logger.info("Проверка необходимости миграции...")
     
-    with get_db() as conn:
-        cursor = conn.cursor()
-        
-        # 🆕 v0.37.14: CRITICAL FIX - Пересоздание таблицы users если она неполная
-        # (это может случиться если БД была создана старой версией кода)
-        logger.info("Проверка полноты схемы таблицы users...")
-        required_columns = {
-            'user_id', 'username', 'first_name', 'created_at', 'total_requests',
-            'last_request_at', 'is_banned', 'ban_reason', 'daily_requests',
-            'daily_reset_at', 'knowledge_level', 'xp', 'level', 'badges',
-            'requests_today', 'last_request_date', 'language'
-        }
-        
-        cursor.execute("PRAGMA table_info(users)")
-        existing_columns = {row[1] for row in cursor.fetchall()}
-        
-        missing_columns = required_columns - existing_columns
+    # 🆕 v0.37.14: CRITICAL FIX - Пересоздание таблицы users если она неполная
+    # (это может случиться если БД была создана старой версией кода)
+    logger.info("Проверка полноты схемы таблицы users...")
+    required_columns = {
+        'user_id', 'username', 'first_name', 'created_at', 'total_requests',
+        'last_request_at', 'is_banned', 'ban_reason', 'daily_requests',
+        'daily_reset_at', 'knowledge_level', 'xp', 'level', 'badges',
+        'requests_today', 'last_request_date', 'language'
+    }
+    
+    cursor.execute("PRAGMA table_info(users)")
+    existing_columns = {row[1] for row in cursor.fetchall()}
+    
+    missing_columns = required_columns - existing_columns
+    
+    if missing_columns:
+        logger.warning(f"КРИТИЧНО: В таблице users отсутствуют колонки: {missing_columns}")
+        logger.warning(f"Текущие колонки: {existing_columns}")
+        logger.warning("Пересоздаём таблицу users с полной схемой...")
         
-        if missing_columns:
-            logger.warning(f"КРИТИЧНО: В таблице users отсутствуют колонки: {missing_columns}")
-            logger.warning(f"Текущие колонки: {existing_columns}")
-            logger.warning("Пересоздаём таблицу users с полной схемой...")
+        try:
+            # Сохраняем существующие данные
+            cursor.execute("SELECT user_id, username FROM users")
+            existing_users = cursor.fetchall()
+            logger.info(f"Сохранено {len(existing_users)} пользователей")
+            
+            # Переименовываем старую таблицу
+            cursor.execute("ALTER TABLE users RENAME TO users_old")
+            
+            # Создаём новую таблицу с правильной схемой
+            cursor.execute("""
+                CREATE TABLE users (
+                    user_id INTEGER PRIMARY KEY,
+                    username TEXT,
+                    first_name TEXT,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    total_requests INTEGER DEFAULT 0,
+                    last_request_at TIMESTAMP,
+                    is_banned BOOLEAN DEFAULT 0,
+                    ban_reason TEXT,
+                    daily_requests INTEGER DEFAULT 0,
+                    daily_reset_at TIMESTAMP,
+                    knowledge_level TEXT DEFAULT 'unknown',
+                    xp INTEGER DEFAULT 0,
+                    level INTEGER DEFAULT 1,
+                    badges TEXT DEFAULT '[]',
+                    requests_today INTEGER DEFAULT 0,
+                    last_request_date TEXT,
+                    language TEXT DEFAULT 'ru'
+                )
+            """)
+            
+            # Мигрируем данные
+            for user_id, username in existing_users:
+                cursor.execute("""
+                    INSERT INTO users (user_id, username, created_at)
+                    VALUES (?, ?, CURRENT_TIMESTAMP)
+                """, (user_id, username))
+            
+            # Удаляем старую таблицу
+            cursor.execute("DROP TABLE users_old")
             
+            cursor.connection.commit()
+            logger.info("Таблица users успешно пересоздана с полной схемой!")
+            
+        except Exception as e:
+            logger.error(f"ОШИБКА при пересоздании таблицы users: {e}")
+            cursor.connection.rollback()
+            raise
+    else:
+        logger.info("Таблица users имеет полную схему")
+    
+    # Миграция users
+    migrations_needed = False
+    
+    if not check_column_exists(cursor, 'users', 'is_banned'):
+        logger.info("Добавление колонки is_banned...")
+        cursor.execute("ALTER TABLE users ADD COLUMN is_banned BOOLEAN DEFAULT 0")
+        migrations_needed = True
+    
+    if not check_column_exists(cursor, 'users', 'ban_reason'):
+        logger.info("Добавление колонки ban_reason...")
+        cursor.execute("ALTER TABLE users ADD COLUMN ban_reason TEXT")
+        migrations_needed = True
+    
+    if not check_column_exists(cursor, 'users', 'daily_requests'):
+        logger.info("Добавление колонки daily_requests...")
+        cursor.execute("ALTER TABLE users ADD COLUMN daily_requests INTEGER DEFAULT 0")
+        migrations_needed = True
+    
+    if not check_column_exists(cursor, 'users', 'daily_reset_at'):
+        logger.info("Добавление колонки daily_reset_at...")
+        cursor.execute("ALTER TABLE users ADD COLUMN daily_reset_at TIMESTAMP")
+        migrations_needed = True
+    
+    # NEW v0.5.0: Миграция новых полей для обучения
+    if not check_column_exists(cursor, 'users', 'knowledge_level'):
+        logger.info("Добавление колонки knowledge_level...")
+        cursor.execute("ALTER TABLE users ADD COLUMN knowledge_level TEXT DEFAULT 'unknown'")
+        migrations_needed = True
+    
+    if not check_column_exists(cursor, 'users', 'xp'):
+        logger.info("Добавление колонки xp...")
+        cursor.execute("ALTER TABLE users ADD COLUMN xp INTEGER DEFAULT 0")
+        migrations_needed = True
+    
+    if not check_column_exists(cursor, 'users', 'level'):
+        logger.info("Добавление колонки level...")
+        cursor.execute("ALTER TABLE users ADD COLUMN level INTEGER DEFAULT 1")
+        migrations_needed = True
+    
+    if not check_column_exists(cursor, 'users', 'badges'):
+        logger.info("  • Добавление колонки badges...")
+        cursor.execute("ALTER TABLE users ADD COLUMN badges TEXT DEFAULT '[]'")
+        migrations_needed = True
+    
+    # Миграция requests
+    if not check_column_exists(cursor, 'requests', 'processing_time_ms'):
+        logger.info("  • Добавление колонки processing_time_ms...")
+        cursor.execute("ALTER TABLE requests ADD COLUMN processing_time_ms REAL")
+        migrations_needed = True
+    
+    if not check_column_exists(cursor, 'requests', 'error_message'):
+        logger.info("  • Добавление колонки error_message...")
+        cursor.execute("ALTER TABLE requests ADD COLUMN error_message TEXT")
+        migrations_needed = True
+    
+    # Миграция feedback
+    if not check_column_exists(cursor, 'feedback', 'comment'):
+        logger.info("  • Добавление колонки comment в feedback...")
+        cursor.execute("ALTER TABLE feedback ADD COLUMN comment TEXT")
+        migrations_needed = True
+    
+    # Миграция cache
+    if not check_column_exists(cursor, 'cache', 'last_used_at'):
+        logger.info("  • Добавление колонки last_used_at в cache...")
+        cursor.execute("ALTER TABLE cache ADD COLUMN last_used_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP")
+        migrations_needed = True
+    
+    # NEW v0.6.0: Добавление course_name в user_progress для поддержки get_user_course_summary()
+    if not check_column_exists(cursor, 'user_progress', 'course_name'):
+        logger.info("  • Добавление колонки course_name в user_progress...")
+        cursor.execute("ALTER TABLE user_progress ADD COLUMN course_name TEXT")
+        migrations_needed = True
+    
+    # NEW v0.14.0: Добавление колонок для системы лимитов (XP-зависимые запросы)
+    if not check_column_exists(cursor, 'users', 'requests_today'):
+        logger.info("  • Добавление колонки requests_today...")
+        cursor.execute("ALTER TABLE users ADD COLUMN requests_today INTEGER DEFAULT 0")
+        migrations_needed = True
+    
+    if not check_column_exists(cursor, 'users', 'last_request_date'):
+        logger.info("  • Добавление колонки last_request_date...")
+        cursor.execute("ALTER TABLE users ADD COLUMN last_request_date TEXT")
+        migrations_needed = True
+    
+    # NEW v0.43.0: i18n support - Language column
+    if not check_column_exists(cursor, 'users', 'language'):
+        logger.info("  • Добавление колонки language для i18n поддержки...")
+        cursor.execute("ALTER TABLE users ADD COLUMN language TEXT DEFAULT 'ru'")
+        migrations_needed = True
+    
+    # NEW v0.19.0: Таблицы для Quiz System
+    # Эти таблицы должны быть созданы в init_database, но добавляем миграцию для старых БД
+    try:
+        cursor.execute("SELECT 1 FROM user_quiz_responses LIMIT 1")
+    except sqlite3.OperationalError:
+        logger.info("  • Создание таблицы user_quiz_responses...")
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS user_quiz_responses (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id INTEGER,
+                lesson_id INTEGER,
+                question_number INTEGER,
+                selected_answer_index INTEGER,
+                is_correct BOOLEAN,
+                xp_earned INTEGER DEFAULT 0,
+                answered_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (user_id) REFERENCES users(user_id),
+                FOREIGN KEY (lesson_id) REFERENCES lessons(id)
+            )
+        """)
+        migrations_needed = True
+    
+    try:
+        cursor.execute("SELECT 1 FROM user_quiz_stats LIMIT 1")
+    except sqlite3.OperationalError:
+        logger.info("  • Создание таблицы user_quiz_stats...")
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS user_quiz_stats (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id INTEGER,
+                lesson_id INTEGER,
+                total_questions INTEGER,
+                correct_answers INTEGER,
+                quiz_score REAL,
+                total_xp_earned INTEGER DEFAULT 0,
+                completed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                is_perfect_score BOOLEAN DEFAULT 0,
+                FOREIGN KEY (user_id) REFERENCES users(user_id),
+                FOREIGN KEY (lesson_id) REFERENCES lessons(id)
+            )
+        """)
+        migrations_needed = True
+    
+    # NEW v0.21.0: Таблицы для диалоговой системы
+    try:
+        cursor.execute("SELECT 1 FROM conversation_history LIMIT 1")
+    except sqlite3.OperationalError:
+        logger.info("  • Создание таблицы conversation_history...")
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS conversation_history (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id INTEGER,
+                message_type TEXT,
+                content TEXT,
+                intent TEXT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (user_id) REFERENCES users(user_id)
+            )
+        """)
+        migrations_needed = True
+    
+    try:
+        cursor.execute("SELECT 1 FROM user_profiles LIMIT 1")
+    except sqlite3.OperationalError:
+        logger.info("  • Создание таблицы user_profiles...")
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS user_profiles (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id INTEGER UNIQUE,
+                interests TEXT,
+                portfolio TEXT,
+                risk_tolerance TEXT,
+                preferred_language TEXT DEFAULT 'russian',
+                last_updated TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (user_id) REFERENCES users(user_id)
+            )
+        """)
+        migrations_needed = True
+    
+    # ✅ NEW v0.30.0: Миграция conversation_history к унифицированной схеме
+    # Конвертируем старую схему (message_type, created_at) в новую (role, timestamp)
+    try:
+        cursor.execute("PRAGMA table_info(conversation_history)")
+        columns = {row[1] for row in cursor.fetchall()}
+        
+        # Если таблица имеет старую схему, мигрируем её
+        if 'message_type' in columns and 'role' not in columns:
+            logger.warning("🔄 Миграция conversation_history к новой схеме...")
             try:
-                # Сохраняем существующие данные
-                cursor.execute("SELECT user_id, username FROM users")
-                existing_users = cursor.fetchall()
-                logger.info(f"Сохранено {len(existing_users)} пользователей")
-                
                 # Переименовываем старую таблицу
-                cursor.execute("ALTER TABLE users RENAME TO users_old")
+                cursor.execute("ALTER TABLE conversation_history RENAME TO conversation_history_old")
                 
                 # Создаём новую таблицу с правильной схемой
                 cursor.execute("""
-                    CREATE TABLE users (
-                        user_id INTEGER PRIMARY KEY,
-                        username TEXT,
-                        first_name TEXT,
-                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                        total_requests INTEGER DEFAULT 0,
-                        last_request_at TIMESTAMP,
-                        is_banned BOOLEAN DEFAULT 0,
-                        ban_reason TEXT,
-                        daily_requests INTEGER DEFAULT 0,
-                        daily_reset_at TIMESTAMP,
-                        knowledge_level TEXT DEFAULT 'unknown',
-                        xp INTEGER DEFAULT 0,
-                        level INTEGER DEFAULT 1,
-                        badges TEXT DEFAULT '[]',
-                        requests_today INTEGER DEFAULT 0,
-                        last_request_date TEXT,
-                        language TEXT DEFAULT 'ru'
+                    CREATE TABLE conversation_history (
+                        id INTEGER PRIMARY KEY AUTOINCREMENT,
+                        user_id INTEGER NOT NULL,
+                        role TEXT NOT NULL CHECK(role IN ('user', 'assistant')),
+                        content TEXT NOT NULL,
+                        intent TEXT,
+                        timestamp INTEGER DEFAULT (strftime('%s', 'now')),
+                        message_length INTEGER,
+                        tokens_estimate INTEGER,
+                        FOREIGN KEY (user_id) REFERENCES users(user_id) ON DELETE CASCADE
                     )
                 """)
                 
-                # Мигрируем данные
-                for user_id, username in existing_users:
-                    cursor.execute("""
-                        INSERT INTO users (user_id, username, created_at)
-                        VALUES (?, ?, CURRENT_TIMESTAMP)
-                    """, (user_id, username))
-                
-                # Удаляем старую таблицу
-                cursor.execute("DROP TABLE users_old")
+                # Создаём индексы
+                cursor.execute("CREATE INDEX IF NOT EXISTS idx_conv_user_id ON conversation_history(user_id)")
+                cursor.execute("CREATE INDEX IF NOT EXISTS idx_conv_timestamp ON conversation_history(timestamp)")
+                cursor.execute("CREATE INDEX IF NOT EXISTS idx_conv_role ON conversation_history(role)")
                 
-                conn.commit()
-                logger.info("Таблица users успешно пересоздана с полной схемой!")
+                # Мигрируем данные со старой таблицы
+                cursor.execute("""
+                    INSERT INTO conversation_history (id, user_id, role, content, intent, message_length)
+                    SELECT id, user_id, 
+                           CASE WHEN message_type = 'bot' THEN 'assistant' ELSE 'user' END as role,
+                           content, intent, LENGTH(content)
+                    FROM conversation_history_old
+                """)
                 
+                # Удаляем старую таблицу
+                cursor.execute("DROP TABLE conversation_history_old")
+                logger.info(f"Таблица conversation_history успешно мигрирована")
+                migrations_needed = True
             except Exception as e:
-                logger.error(f"ОШИБКА при пересоздании таблицы users: {e}")
-                conn.rollback()
-                raise
-        else:
-            logger.info("Таблица users имеет полную схему")
-        
-        # Миграция users
-        migrations_needed = False
-        
-        if not check_column_exists(cursor, 'users', 'is_banned'):
-            logger.info("Добавление колонки is_banned...")
-            cursor.execute("ALTER TABLE users ADD COLUMN is_banned BOOLEAN DEFAULT 0")
-            migrations_needed = True
-        
-        if not check_column_exists(cursor, 'users', 'ban_reason'):
-            logger.info("Добавление колонки ban_reason...")
-            cursor.execute("ALTER TABLE users ADD COLUMN ban_reason TEXT")
-            migrations_needed = True
-        
-        if not check_column_exists(cursor, 'users', 'daily_requests'):
-            logger.info("Добавление колонки daily_requests...")
-            cursor.execute("ALTER TABLE users ADD COLUMN daily_requests INTEGER DEFAULT 0")
-            migrations_needed = True
-        
-        if not check_column_exists(cursor, 'users', 'daily_reset_at'):
-            logger.info("Добавление колонки daily_reset_at...")
-            cursor.execute("ALTER TABLE users ADD COLUMN daily_reset_at TIMESTAMP")
-            migrations_needed = True
-        
-        # NEW v0.5.0: Миграция новых полей для обучения
-        if not check_column_exists(cursor, 'users', 'knowledge_level'):
-            logger.info("Добавление колонки knowledge_level...")
-            cursor.execute("ALTER TABLE users ADD COLUMN knowledge_level TEXT DEFAULT 'unknown'")
-            migrations_needed = True
-        
-        if not check_column_exists(cursor, 'users', 'xp'):
-            logger.info("Добавление колонки xp...")
-            cursor.execute("ALTER TABLE users ADD COLUMN xp INTEGER DEFAULT 0")
-            migrations_needed = True
-        
-        if not check_column_exists(cursor, 'users', 'level'):
-            logger.info("Добавление колонки level...")
-            cursor.execute("ALTER TABLE users ADD COLUMN level INTEGER DEFAULT 1")
-            migrations_needed = True
-        
-        if not check_column_exists(cursor, 'users', 'badges'):
-            logger.info("  • Добавление колонки badges...")
-            cursor.execute("ALTER TABLE users ADD COLUMN badges TEXT DEFAULT '[]'")
-            migrations_needed = True
-        
-        # Миграция requests
-        if not check_column_exists(cursor, 'requests', 'processing_time_ms'):
-            logger.info("  • Добавление колонки processing_time_ms...")
-            cursor.execute("ALTER TABLE requests ADD COLUMN processing_time_ms REAL")
-            migrations_needed = True
-        
-        if not check_column_exists(cursor, 'requests', 'error_message'):
-            logger.info("  • Добавление колонки error_message...")
-            cursor.execute("ALTER TABLE requests ADD COLUMN error_message TEXT")
-            migrations_needed = True
-        
-        # Миграция feedback
-        if not check_column_exists(cursor, 'feedback', 'comment'):
-            logger.info("  • Добавление колонки comment в feedback...")
-            cursor.execute("ALTER TABLE feedback ADD COLUMN comment TEXT")
-            migrations_needed = True
-        
-        # Миграция cache
-        if not check_column_exists(cursor, 'cache', 'last_used_at'):
-            logger.info("  • Добавление колонки last_used_at в cache...")
-            cursor.execute("ALTER TABLE cache ADD COLUMN last_used_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP")
-            migrations_needed = True
-        
-        # NEW v0.6.0: Добавление course_name в user_progress для поддержки get_user_course_summary()
-        if not check_column_exists(cursor, 'user_progress', 'course_name'):
-            logger.info("  • Добавление колонки course_name в user_progress...")
-            cursor.execute("ALTER TABLE user_progress ADD COLUMN course_name TEXT")
-            migrations_needed = True
-        
-        # NEW v0.14.0: Добавление колонок для системы лимитов (XP-зависимые запросы)
-        if not check_column_exists(cursor, 'users', 'requests_today'):
-            logger.info("  • Добавление колонки requests_today...")
-            cursor.execute("ALTER TABLE users ADD COLUMN requests_today INTEGER DEFAULT 0")
-            migrations_needed = True
-        
-        if not check_column_exists(cursor, 'users', 'last_request_date'):
-            logger.info("  • Добавление колонки last_request_date...")
-            cursor.execute("ALTER TABLE users ADD COLUMN last_request_date TEXT")
-            migrations_needed = True
-        
-        # NEW v0.43.0: i18n support - Language column
-        if not check_column_exists(cursor, 'users', 'language'):
-            logger.info("  • Добавление колонки language для i18n поддержки...")
-            cursor.execute("ALTER TABLE users ADD COLUMN language TEXT DEFAULT 'ru'")
-            migrations_needed = True
-        
-        # NEW v0.19.0: Таблицы для Quiz System
-        # Эти таблицы должны быть созданы в init_database, но добавляем миграцию для старых БД
-        try:
-            cursor.execute("SELECT 1 FROM user_quiz_responses LIMIT 1")
-        except sqlite3.OperationalError:
-            logger.info("  • Создание таблицы user_quiz_responses...")
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS user_quiz_responses (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    user_id INTEGER,
-                    lesson_id INTEGER,
-                    question_number INTEGER,
-                    selected_answer_index INTEGER,
-                    is_correct BOOLEAN,
-                    xp_earned INTEGER DEFAULT 0,
-                    answered_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    FOREIGN KEY (user_id) REFERENCES users(user_id),
-                    FOREIGN KEY (lesson_id) REFERENCES lessons(id)
-                )
-            """)
-            migrations_needed = True
-        
-        try:
-            cursor.execute("SELECT 1 FROM user_quiz_stats LIMIT 1")
-        except sqlite3.OperationalError:
-            logger.info("  • Создание таблицы user_quiz_stats...")
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS user_quiz_stats (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    user_id INTEGER,
-                    lesson_id INTEGER,
-                    total_questions INTEGER,
-                    correct_answers INTEGER,
-                    quiz_score REAL,
-                    total_xp_earned INTEGER DEFAULT 0,
-                    completed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    is_perfect_score BOOLEAN DEFAULT 0,
-                    FOREIGN KEY (user_id) REFERENCES users(user_id),
-                    FOREIGN KEY (lesson_id) REFERENCES lessons(id)
-                )
-            """)
-            migrations_needed = True
+                logger.error(f"Ошибка миграции conversation_history: {e}")
+    except Exception as e:
+        logger.debug(f"Не удалось проверить schema conversation_history: {e}")
+    
+    # Migration v0.26: Fix conversation_stats schema to match conversation_context.py expectations
+    try:
+        cursor.execute("PRAGMA table_info(conversation_stats)")
+        columns = {row[1] for row in cursor.fetchall()}
         
-        # NEW v0.21.0: Таблицы для диалоговой системы
-        try:
-            cursor.execute("SELECT 1 FROM conversation_history LIMIT 1")
-        except sqlite3.OperationalError:
-            logger.info("  • Создание таблицы conversation_history...")
+        # If old schema exists, recreate it with correct columns
+        if 'message_count' in columns or 'average_response_time' in columns:
+            logger.info("  • Миграция схемы conversation_stats на новые колонки...")
+            cursor.execute("DROP TABLE IF EXISTS conversation_stats")
             cursor.execute("""
-                CREATE TABLE IF NOT EXISTS conversation_history (
+                CREATE TABLE conversation_stats (
                     id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    user_id INTEGER,
-                    message_type TEXT,
-                    content TEXT,
-                    intent TEXT,
+                    user_id INTEGER NOT NULL UNIQUE,
+                    total_messages INTEGER DEFAULT 0,
+                    total_tokens INTEGER DEFAULT 0,
+                    last_message_time INTEGER,
                     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    FOREIGN KEY (user_id) REFERENCES users(user_id)
+                    FOREIGN KEY(user_id) REFERENCES users(user_id) ON DELETE CASCADE
                 )
             """)
             migrations_needed = True
-        
-        try:
-            cursor.execute("SELECT 1 FROM user_profiles LIMIT 1")
-        except sqlite3.OperationalError:
-            logger.info("  • Создание таблицы user_profiles...")
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS user_profiles (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    user_id INTEGER UNIQUE,
-                    interests TEXT,
-                    portfolio TEXT,
-                    risk_tolerance TEXT,
-                    preferred_language TEXT DEFAULT 'russian',
-                    last_updated TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    FOREIGN KEY (user_id) REFERENCES users(user_id)
-                )
-            """)
-            migrations_needed = True
-        
-        # ✅ NEW v0.30.0: Миграция conversation_history к унифицированной схеме
-        # Конвертируем старую схему (message_type, created_at) в новую (role, timestamp)
-        try:
-            cursor.execute("PRAGMA table_info(conversation_history)")
-            columns = {row[1] for row in cursor.fetchall()}
-            
-            # Если таблица имеет старую схему, мигрируем её
-            if 'message_type' in columns and 'role' not in columns:
-                logger.warning("🔄 Миграция conversation_history к новой схеме...")
-                try:
-                    # Переименовываем старую таблицу
-                    cursor.execute("ALTER TABLE conversation_history RENAME TO conversation_history_old")
-                    
-                    # Создаём новую таблицу с правильной схемой
-                    cursor.execute("""
-                        CREATE TABLE conversation_history (
-                            id INTEGER PRIMARY KEY AUTOINCREMENT,
-                            user_id INTEGER NOT NULL,
-                            role TEXT NOT NULL CHECK(role IN ('user', 'assistant')),
-                            content TEXT NOT NULL,
-                            intent TEXT,
-                            timestamp INTEGER DEFAULT (strftime('%s', 'now')),
-                            message_length INTEGER,
-                            tokens_estimate INTEGER,
-                            FOREIGN KEY (user_id) REFERENCES users(user_id) ON DELETE CASCADE
-                        )
-                    """)
-                    
-                    # Создаём индексы
-                    cursor.execute("CREATE INDEX IF NOT EXISTS idx_conv_user_id ON conversation_history(user_id)")
-                    cursor.execute("CREATE INDEX IF NOT EXISTS idx_conv_timestamp ON conversation_history(timestamp)")
-                    cursor.execute("CREATE INDEX IF NOT EXISTS idx_conv_role ON conversation_history(role)")
-                    
-                    # Мигрируем данные со старой таблицы
-                    cursor.execute("""
-                        INSERT INTO conversation_history (id, user_id, role, content, intent, message_length)
-                        SELECT id, user_id, 
-                               CASE WHEN message_type = 'bot' THEN 'assistant' ELSE 'user' END as role,
-                               content, intent, LENGTH(content)
-                        FROM conversation_history_old
-                    """)
-                    
-                    # Удаляем старую таблицу
-                    cursor.execute("DROP TABLE conversation_history_old")
-                    logger.info(f"Таблица conversation_history успешно мигрирована")
-                    migrations_needed = True
-                except Exception as e:
-                    logger.error(f"Ошибка миграции conversation_history: {e}")
-        except Exception as e:
-            logger.debug(f"Не удалось проверить schema conversation_history: {e}")
-        
-        # Migration v0.26: Fix conversation_stats schema to match conversation_context.py expectations
-        try:
-            cursor.execute("PRAGMA table_info(conversation_stats)")
-            columns = {row[1] for row in cursor.fetchall()}
-            
-            # If old schema exists, recreate it with correct columns
-            if 'message_count' in columns or 'average_response_time' in columns:
-                logger.info("  • Миграция схемы conversation_stats на новые колонки...")
-                cursor.execute("DROP TABLE IF EXISTS conversation_stats")
-                cursor.execute("""
-                    CREATE TABLE conversation_stats (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        user_id INTEGER NOT NULL UNIQUE,
-                        total_messages INTEGER DEFAULT 0,
-                        total_tokens INTEGER DEFAULT 0,
-                        last_message_time INTEGER,
-                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                        FOREIGN KEY(user_id) REFERENCES users(user_id) ON DELETE CASCADE
-                    )
-                """)
-                migrations_needed = True
-        except Exception as e:
-            logger.debug(f"Не удалось проверить schema conversation_stats: {e}")
-        
-        # NEW v0.37.0: Teaching Module Phase 1 improvements
-        try:
-            cursor.execute("SELECT 1 FROM teaching_lessons LIMIT 1")
-        except sqlite3.OperationalError:
-            logger.info("  • Создание таблицы teaching_lessons...")
-            cursor.execute("""
-                CREATE TABLE teaching_lessons (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    user_id INTEGER NOT NULL,
-                    topic TEXT NOT NULL,
-                    difficulty TEXT NOT NULL,
-                    title TEXT,
-                    completed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    quiz_score INTEGER,
-                    quiz_passed BOOLEAN DEFAULT 0,
-                    xp_earned INTEGER DEFAULT 50,
-                    repeat_count INTEGER DEFAULT 0,
-                    last_repeated_at TIMESTAMP,
-                    FOREIGN KEY (user_id) REFERENCES users(user_id) ON DELETE CASCADE,
-                    UNIQUE(user_id, topic, difficulty)
-                )
-            """)
-            cursor.execute("CREATE INDEX IF NOT EXISTS idx_teaching_lessons_user ON teaching_lessons(user_id, completed_at DESC)")
-            cursor.execute("CREATE INDEX IF NOT EXISTS idx_teaching_lessons_topic ON teaching_lessons(user_id, topic, difficulty)")
-            migrations_needed = True
-        
-        try:
-            cursor.execute("SELECT 1 FROM learning_paths LIMIT 1")
-        except sqlite3.OperationalError:
-            logger.info("  • Создание таблицы learning_paths...")
-            cursor.execute("""
-                CREATE TABLE learning_paths (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    path_name TEXT UNIQUE NOT NULL,
-                    path_title TEXT,
-                    description TEXT,
-                    difficulty_level TEXT,
-                    topics TEXT NOT NULL,
-                    prerequisites TEXT,
-                    estimated_time_hours INTEGER,
-                    total_xp_reward INTEGER,
-                    badge_reward TEXT,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            """)
-            migrations_needed = True
-        
-        try:
-            cursor.execute("SELECT 1 FROM user_learning_paths LIMIT 1")
-        except sqlite3.OperationalError:
-            logger.info("  • Создание таблицы user_learning_paths...")
-            cursor.execute("""
-                CREATE TABLE user_learning_paths (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    user_id INTEGER NOT NULL,
-                    path_name TEXT NOT NULL,
-                    started_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    completed_at TIMESTAMP,
-                    progress_percent REAL DEFAULT 0,
-                    total_xp_earned INTEGER DEFAULT 0,
-                    is_active BOOLEAN DEFAULT 1,
-                    FOREIGN KEY (user_id) REFERENCES users(user_id) ON DELETE CASCADE,
-                    FOREIGN KEY (path_name) REFERENCES learning_paths(path_name),
-                    UNIQUE(user_id, path_name)
-                )
-            """)
-            cursor.execute("CREATE INDEX IF NOT EXISTS idx_user_learning_paths_user ON user_learning_paths(user_id, is_active)")
-            migrations_needed = True
-        
-        try:
-            cursor.execute("SELECT 1 FROM user_badges LIMIT 1")
-        except sqlite3.OperationalError:
-            logger.info("  • Создание таблицы user_badges...")
-            cursor.execute("""
-                CREATE TABLE user_badges (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    user_id INTEGER NOT NULL,
-                    badge_id TEXT NOT NULL,
-                    badge_name TEXT,
-                    badge_emoji TEXT,
-                    badge_description TEXT,
-                    earned_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    condition_met TEXT,
-                    FOREIGN KEY (user_id) REFERENCES users(user_id) ON DELETE CASCADE,
-                    UNIQUE(user_id, badge_id)
-                )
-            """)
-            cursor.execute("CREATE INDEX IF NOT EXISTS idx_user_badges_user ON user_badges(user_id, earned_at DESC)")
-            migrations_needed = True
-        
-        # ============ NEW v0.43.0: CRITICAL INDICES FOR PERFORMANCE (10-100x speedup) ============
-        # These indices fix N+1 query patterns and full table scans
-        
-        # Index for lessons table (optimization for course content)
-        try:
-            cursor.execute("CREATE INDEX IF NOT EXISTS idx_lessons_course_id ON lessons(course_id, lesson_number)")
-            logger.info("✅ Created: idx_lessons_course_id (course queries optimization)")
-            migrations_needed = True
-        except sqlite3.OperationalError:
-            logger.debug("Index idx_lessons_course_id already exists or table missing")
-        
-        # Index for conversation history (optimization for user dialogue memory)
-        try:
-            cursor.execute("CREATE INDEX IF NOT EXISTS idx_conversation_history_user_timestamp ON conversation_history(user_id, timestamp DESC)")
-            logger.info("✅ Created: idx_conversation_history_user_timestamp (conversation queries)")
-            migrations_needed = True
-        except sqlite3.OperationalError:
-            logger.debug("Index idx_conversation_history_user_timestamp already exists or table missing")
-        
-        # Index for audit logs (optimization for security auditing)
-        try:
-            cursor.execute("CREATE INDEX IF NOT EXISTS idx_audit_logs_user_timestamp ON audit_logs(user_id, timestamp DESC)")
-            logger.info("✅ Created: idx_audit_logs_user_timestamp (audit log queries)")
-            migrations_needed = True
-        except sqlite3.OperationalError:
-            logger.debug("Index idx_audit_logs_user_timestamp already exists or table missing")
-        
-        # Index for daily tasks (optimization for quest system)
-        try:
-            cursor.execute("CREATE INDEX IF NOT EXISTS idx_daily_tasks_user_id ON daily_tasks(user_id, created_at DESC)")
-            logger.info("✅ Created: idx_daily_tasks_user_id (daily tasks queries)")
-            migrations_needed = True
-        except sqlite3.OperationalError:
-            logger.debug("Index idx_daily_tasks_user_id already exists or table missing")
-        
-        # Index for feedback (optimization for user feedback)
-        try:
-            cursor.execute("CREATE INDEX IF NOT EXISTS idx_feedback_user_id ON feedback(user_id, created_at DESC)")
-            logger.info("✅ Created: idx_feedback_user_id (feedback queries)")
-            migrations_needed = True
-        except sqlite3.OperationalError:
-            logger.debug("Index idx_feedback_user_id already exists or table missing")
-        
-        # Index for user progress (optimization for learning system)
-        try:
-            cursor.execute("CREATE INDEX IF NOT EXISTS idx_user_progress_user_lesson ON user_progress(user_id, lesson_id)")
-            logger.info("✅ Created: idx_user_progress_user_lesson (user progress queries)")
-            migrations_needed = True
-        except sqlite3.OperationalError:
-            logger.debug("Index idx_user_progress_user_lesson already exists or table missing")
-        
-        # Index for analytics (optimization for event tracking)
-        try:
-            cursor.execute("CREATE INDEX IF NOT EXISTS idx_analytics_user_type ON analytics(user_id, event_type, created_at DESC)")
-            logger.info("✅ Created: idx_analytics_user_type (analytics queries)")
-            migrations_needed = True
-        except sqlite3.OperationalError:
-            logger.debug("Index idx_analytics_user_type already exists or table missing")
-        
-        # Index for user courses (optimization for course enrollment)
-        try:
-            cursor.execute("CREATE INDEX IF NOT EXISTS idx_user_courses_user_id ON user_courses(user_id)")
-            logger.info("✅ Created: idx_user_courses_user_id (user courses queries)")
-            migrations_needed = True
-        except sqlite3.OperationalError:
-            logger.debug("Index idx_user_courses_user_id already exists or table missing")
-        
-        if migrations_needed:
-            logger.info(f"✅ Миграция успешно завершена (v0.43.0 - PERFORMANCE OPTIMIZATION with 8 critical indices)")
-        else:
-            logger.info(f"✅ Миграция не требуется, схема актуальна (v0.43.0)")
-        
-        # v0.43.0: Добавляем поддержку мультиязычности
-        if not check_column_exists(cursor, 'users', 'language'):
-            logger.info("Добавление колонки language для поддержки мультиязычности...")
-            cursor.execute("ALTER TABLE users ADD COLUMN language TEXT DEFAULT 'ru'")
-            conn.commit()
-            logger.info("Колонка language успешно добавлена")
-
-
-def create_database_indices() -> None:
-    """
-    🚀 QUICK WIN: Create critical database indices for performance.
-    
-    These indices significantly improve query performance:
-    - users: 10-50x faster leaderboard queries
-    - requests: 5-10x faster user request history  
-    - user_progress: 10-20x faster learning queries
-    - daily_tasks: 5x faster task lookups
-    - user_bookmarks_v2: 10x faster bookmark queries
-    - analytics: 5x faster stat aggregations
-    
-    Expected improvement: 10-100x speedup on popular queries
-    """
-    with get_db() as conn:
-        cursor = conn.cursor()
-        
-        try:
-            # Index 1: Leaderboard optimization (CRITICAL)
-            # Queries: "ORDER BY xp DESC, level DESC, created_at DESC"
-            cursor.execute("""
-                CREATE INDEX IF NOT EXISTS idx_users_leaderboard 
-                ON users(xp DESC, level DESC, created_at DESC)
-            """)
-            logger.info("  📊 Created: idx_users_leaderboard (leaderboard queries)")
-        except sqlite3.OperationalError as e:
-            logger.warning(f"  ⚠️ Could not create idx_users_leaderboard: {e}")
-        
-        try:
-            # Index 2: User requests lookup (HIGH)
-            # Queries: "WHERE user_id = ? ORDER BY created_at DESC"
-            cursor.execute("""
-                CREATE INDEX IF NOT EXISTS idx_requests_user_date 
-                ON requests(user_id, created_at DESC)
-            """)
-            logger.info("  📝 Created: idx_requests_user_date (user request history)")
-        except sqlite3.OperationalError as e:
-            logger.warning(f"  ⚠️ Could not create idx_requests_user_date: {e}")
-        
-        try:
-            # Index 3: User learning progress (HIGH)
-            # Queries: "WHERE user_id = ? AND course_id = ?"
-            # Check if course_id column exists first
-            cursor.execute("PRAGMA table_info(user_progress)")
-            columns = {row[1] for row in cursor.fetchall()}
-            if 'course_id' in columns and 'lesson_id' in columns:
-                cursor.execute("""
-                    CREATE INDEX IF NOT EXISTS idx_user_progress_lookup 
-                    ON user_progress(user_id, course_id, lesson_id)
-                """)
-                logger.info("  📚 Created: idx_user_progress_lookup (learning progress)")
-            else:
-                logger.warning(f"  ⚠️ Skipping idx_user_progress_lookup (missing columns)")
-        except sqlite3.OperationalError as e:
-            logger.warning(f"  ⚠️ Could not create idx_user_progress_lookup: {e}")
-        
-        try:
-            # Index 4: Daily tasks (MEDIUM)
-            # Queries: "WHERE user_id = ? AND completed = 0"
-            cursor.execute("""
-                CREATE INDEX IF NOT EXISTS idx_daily_tasks_user 
-                ON daily_tasks(user_id, completed, created_at DESC)
-            """)
-            logger.info("  ✅ Created: idx_daily_tasks_user (daily task queries)")
-        except sqlite3.OperationalError as e:
-            logger.warning(f"  ⚠️ Could not create idx_daily_tasks_user: {e}")
-        
-        try:
-            # Index 5: Bookmarks optimization (MEDIUM)
-            # Queries: "WHERE user_id = ? ORDER BY created_at DESC"
-            cursor.execute("""
-                CREATE INDEX IF NOT EXISTS idx_bookmarks_user 
-                ON user_bookmarks_v2(user_id, created_at DESC)
-            """)
-            logger.info("  🔖 Created: idx_bookmarks_user (bookmark queries)")
-        except sqlite3.OperationalError as e:
-            logger.warning(f"  ⚠️ Could not create idx_bookmarks_user: {e}")
-        
-        try:
-            # Index 6: Analytics (MEDIUM)
-            # Queries: "WHERE created_at > ? GROUP BY user_id"
-            cursor.execute("""
-                CREATE INDEX IF NOT EXISTS idx_analytics_date 
-                ON analytics(created_at DESC, user_id)
-            """)
-            logger.info("  📈 Created: idx_analytics_date (analytics queries)")
-        except sqlite3.OperationalError as e:
-            logger.warning(f"  ⚠️ Could not create idx_analytics_date: {e}")
-        
-        conn.commit()
-        logger.info(f"Database indices created successfully (v0.38.0 - QUICK WIN #2)")
-
-
-def verify_database_schema() -> dict:
-    """
-    Проверить что все необходимые таблицы существуют в БД.
-    
-    Returns:
-        dict: {
-            'valid': bool - все таблицы существуют,
-            'missing_tables': list - отсутствующие таблицы,
-            'existing_tables': list - существующие таблицы
-        }
-    """
-    REQUIRED_TABLES = [
-        'users', 'requests', 'feedback', 'cache', 'analytics',
-        'courses', 'lessons', 'user_progress', 'user_questions', 'faq',
-        'tools', 'user_bookmarks', 'daily_tasks',
-        'user_drop_subscriptions', 'drops_feed',
-        'conversation_history', 'conversation_stats', 
-        'user_badges', 'teaching_lessons', 'learning_paths'
-    ]
-    
-    try:
-        with get_db() as conn:
-            cursor = conn.cursor()
-            cursor.execute(
-                "SELECT name FROM sqlite_master WHERE type='table'"
-            )
-            existing = {row[0] for row in cursor.fetchall()}
-            
-            missing = [t for t in REQUIRED_TABLES if t not in existing]
-            
-            result = {
-                'valid': len(missing) == 0,
-                'missing_tables': missing,
-                'existing_tables': sorted(list(existing))
-            }
-            
-            if result['valid']:
-                logger.info(f"Database schema verified: {len(existing)} tables present")
-            else:
-                logger.warning(
-                    f"Database schema incomplete: missing {len(missing)} tables"
-                    f"\nMissing: {missing}"
-                    f"\nExisting: {result['existing_tables']}"
-                )
-            
-            return result
-            
-    except Exception as e:
-        logger.error(f"Database schema verification failed: {e}", exc_info=True)
-        return {
-            'valid': False,
-            'missing_tables': [],
-            'existing_tables': [],
-            'error': str(e)
-        }
-
-
-def init_database() -> None:
-    """
-    Инициализирует SQLite базу данных с полной схемой.
-    
-    Создает все необходимые таблицы и выполняет миграции схемы.
-    Выполняется при запуске бота, безопасна для повторных вызовов.
-    
-    Tables Created:
-        - users: Профили пользователей
-        - conversations: История разговоров
-        - conversation_stats: Статистика по разговорам
-        - analysis_cache: Кэш анализов
-        - feedback: Обратная связь
-        - learning_progress: Прогресс обучения
-        - events: Для аналитики
-        
-    Features:
-        - Idempotent: безопасно вызывать много раз
-        - Auto-migration: автомиграция схемы
-        - WAL mode: для лучшей производительности
-        - Indexes: оптимизированы на часто используемые колонки
-    """
-    with get_db() as conn:
-        cursor = conn.cursor()
-        
-        # Таблица пользователей (обновленная)
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS users (
-                user_id INTEGER PRIMARY KEY,
-                username TEXT,
-                first_name TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                total_requests INTEGER DEFAULT 0,
-                last_request_at TIMESTAMP,
-                is_banned BOOLEAN DEFAULT 0,
-                ban_reason TEXT,
-                daily_requests INTEGER DEFAULT 0,
-                daily_reset_at TIMESTAMP,
-                knowledge_level TEXT DEFAULT 'unknown',
-                xp INTEGER DEFAULT 0,
-                level INTEGER DEFAULT 1,
-                badges TEXT DEFAULT '[]',
-                requests_today INTEGER DEFAULT 0,
-                last_request_date TEXT,
-                language TEXT DEFAULT 'ru'
-            )
-        """)
-        
-        # Таблица запросов
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS requests (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER,
-                news_text TEXT,
-                response_text TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                from_cache BOOLEAN DEFAULT 0,
-                processing_time_ms REAL,
-                error_message TEXT,
-                FOREIGN KEY (user_id) REFERENCES users(user_id)
-            )
-        """)
-        
-        # Таблица фидбека
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS feedback (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER,
-                request_id INTEGER,
-                is_helpful BOOLEAN,
-                comment TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (user_id) REFERENCES users(user_id),
-                FOREIGN KEY (request_id) REFERENCES requests(id)
-            )
-        """)
-        
-        # Таблица кэша
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS cache (
-                cache_key TEXT PRIMARY KEY,
-                response_text TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                last_used_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                hit_count INTEGER DEFAULT 0
-            )
-        """)
-        
-        # Таблица аналитики
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS analytics (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                event_type TEXT,
-                user_id INTEGER,
-                data TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
-        
-        # ============ НОВЫЕ ТАБЛИЦЫ v0.5.0 ============
-        
-        # Таблица курсов
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS courses (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                name TEXT UNIQUE,
-                title TEXT,
-                level TEXT,
-                description TEXT,
-                total_lessons INTEGER,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
-        
-        # Таблица уроков
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS lessons (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                course_id INTEGER,
-                lesson_number INTEGER,
-                title TEXT,
-                content TEXT,
-                duration_minutes INTEGER,
-                quiz_json TEXT,
-                xp_reward INTEGER DEFAULT 10,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (course_id) REFERENCES courses(id)
-            )
-        """)
-        
-        # Таблица прогресса пользователя
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS user_progress (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER,
-                lesson_id INTEGER,
-                completed_at TIMESTAMP,
-                quiz_score INTEGER,
-                xp_earned INTEGER,
-                FOREIGN KEY (user_id) REFERENCES users(user_id),
-                FOREIGN KEY (lesson_id) REFERENCES lessons(id)
-            )
-        """)
-        
-        # Таблица вопросов и ответов
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS user_questions (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER,
-                question TEXT,
-                answer TEXT,
-                source TEXT,
-                is_in_faq BOOLEAN DEFAULT 0,
-                views INTEGER DEFAULT 0,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (user_id) REFERENCES users(user_id)
-            )
-        """)
-        
-        # Таблица FAQ
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS faq (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                question TEXT UNIQUE,
-                answer TEXT,
-                related_lesson_id INTEGER,
-                category TEXT,
-                views INTEGER DEFAULT 0,
-                helpful INTEGER DEFAULT 0,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (related_lesson_id) REFERENCES lessons(id)
-            )
-        """)
-        
-        # Таблица инструментов
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS tools (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                name TEXT UNIQUE,
-                description TEXT,
-                url TEXT,
-                category TEXT,
-                difficulty TEXT,
-                tutorial TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
-        
-        # Таблица избранных инструментов
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS user_bookmarks (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER,
-                tool_name TEXT,
-                added_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (user_id) REFERENCES users(user_id)
-            )
-        """)
-        
-        # Таблица ЕЖЕДНЕВНЫХ ЗАДАЧ (v0.11.0) - Самообучение & Геймификация
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS daily_tasks (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER,
-                task_type TEXT,
-                task_name TEXT,
-                xp_reward INTEGER,
-                progress INTEGER DEFAULT 0,
-                target INTEGER,
-                completed BOOLEAN DEFAULT 0,
-                completed_at TIMESTAMP,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                reset_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (user_id) REFERENCES users(user_id)
-            )
-        """)
-        
-        # ============ НОВЫЕ ТАБЛИЦЫ v0.15.0 (ДРОПЫ И АКТИВНОСТИ) ============
-        
-        # Таблица подписок на дропы
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS user_drop_subscriptions (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER,
-                chain TEXT,
-                notify_interval TEXT DEFAULT 'daily',
-                enabled BOOLEAN DEFAULT 1,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (user_id) REFERENCES users(user_id)
-            )
-        """)
-        
-        # Таблица AUDIT ЛОГОВ (v0.22.0) - полный трейл действий пользователей
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS audit_logs (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER,
-                username TEXT,
-                action TEXT,
-                command TEXT,
-                parameters TEXT,
-                result TEXT,
-                error_message TEXT,
-                ip_address TEXT,
-                client_version TEXT,
-                execution_time_ms REAL,
-                status TEXT,
-                timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (user_id) REFERENCES users(user_id)
-            )
-        """)
-
-        # Таблица истории дропов (кэш просмотренных)
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS drops_history (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER,
-                drop_name TEXT,
-                drop_type TEXT,
-                chain TEXT,
-                viewed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                is_new BOOLEAN DEFAULT 1,
-                FOREIGN KEY (user_id) REFERENCES users(user_id)
-            )
-        """)
-        
-        # Таблица кэша активностей
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS activities_cache (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                activity_type TEXT,
-                project_name TEXT,
-                activity_data TEXT,
-                chain TEXT,
-                cached_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                expires_at TIMESTAMP
-            )
-        """)
-        
-        # ============ НОВЫЕ ТАБЛИЦЫ v0.21.0 (ДИАЛОГОВАЯ СИСТЕМА) ============
-        
-        # Таблица истории диалогов (memory system) - UNIFIED SCHEMA
-        # ✅ UNIFIED: Используется одна схема для bot.py и conversation_context.py
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS conversation_history (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER NOT NULL,
-                role TEXT NOT NULL CHECK(role IN ('user', 'assistant')),
-                content TEXT NOT NULL,
-                intent TEXT,
-                timestamp INTEGER DEFAULT (strftime('%s', 'now')),
-                message_length INTEGER,
-                tokens_estimate INTEGER,
-                FOREIGN KEY (user_id) REFERENCES users(user_id) ON DELETE CASCADE
-            )
-        """)
-        
-        # ✅ FIX: Таблица статистики диалогов (fixes: no such table: conversation_stats)
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS conversation_stats (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER NOT NULL UNIQUE,
-                total_messages INTEGER DEFAULT 0,
-                total_tokens INTEGER DEFAULT 0,
-                last_message_time INTEGER,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY(user_id) REFERENCES users(user_id) ON DELETE CASCADE
-            )
-        """)
-        
-        # Таблица профилей пользователей (для персонализации)
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS user_profiles (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER UNIQUE,
-                interests TEXT,
-                portfolio TEXT,
-                risk_tolerance TEXT,
-                preferred_language TEXT DEFAULT 'russian',
-                last_updated TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (user_id) REFERENCES users(user_id)
-            )
-        """)
-        
-        # Индексы для дропов
-        cursor.execute("""
-            CREATE INDEX IF NOT EXISTS idx_user_drop_subscriptions
-            ON user_drop_subscriptions(user_id)
-        """)
-        cursor.execute("""
-            CREATE INDEX IF NOT EXISTS idx_drops_history_user
-            ON drops_history(user_id)
-        """)
-        cursor.execute("""
-            CREATE INDEX IF NOT EXISTS idx_activities_cache_expires
-            ON activities_cache(expires_at)
-        """)
-        
-        # ============ НОВЫЕ ТАБЛИЦЫ v0.17.0 (LEADERBOARD) ============
-        
-        # Таблица кэша рейтингов (обновляется каждый час)
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS leaderboard_cache (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                period TEXT NOT NULL,
-                rank INTEGER,
-                user_id INTEGER,
-                username TEXT,
-                xp INTEGER,
-                level INTEGER,
-                total_requests INTEGER,
-                cached_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (user_id) REFERENCES users(user_id),
-                UNIQUE(period, rank)
-            )
-        """)
-        
-        # Индекс для быстрого доступа к кэшу
-        cursor.execute("""
-            CREATE INDEX IF NOT EXISTS idx_leaderboard_cache_period
-            ON leaderboard_cache(period, cached_at)
-        """)
-        
-        # ============ НОВЫЕ ТАБЛИЦЫ v0.18.0 (BOOKMARKS) ============
-        
-        # Таблица закладок пользователей
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS user_bookmarks_v2 (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER,
-                bookmark_type TEXT NOT NULL,
-                content_title TEXT,
-                content_text TEXT,
-                content_source TEXT,
-                external_id TEXT,
-                rating INTEGER DEFAULT 0,
-                added_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                viewed_count INTEGER DEFAULT 0,
-                last_viewed_at TIMESTAMP,
-                FOREIGN KEY (user_id) REFERENCES users(user_id),
-                UNIQUE(user_id, bookmark_type, external_id)
-            )
-        """)
-        
-        # История просмотра закладок
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS bookmark_history (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER,
-                bookmark_id INTEGER,
-                action TEXT,
-                timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (user_id) REFERENCES users(user_id),
-                FOREIGN KEY (bookmark_id) REFERENCES user_bookmarks_v2(id)
-            )
-        """)
-        
-        # Индексы для быстрого поиска
-        cursor.execute("""
-            CREATE INDEX IF NOT EXISTS idx_bookmarks_user
-            ON user_bookmarks_v2(user_id, added_at DESC)
-        """)
-        
-        cursor.execute("""
-            CREATE INDEX IF NOT EXISTS idx_bookmarks_type
-            ON user_bookmarks_v2(user_id, bookmark_type)
-        """)
-        
-        cursor.execute("""
-            CREATE INDEX IF NOT EXISTS idx_bookmark_history
-            ON bookmark_history(user_id, timestamp DESC)
-        """)
-        
-        # ============ НОВЫЕ ТАБЛИЦЫ v0.19.0 (QUIZ SYSTEM) ============
-        
-        # Таблица для сохранения ответов на квизы
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS user_quiz_responses (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER,
-                lesson_id INTEGER,
-                question_number INTEGER,
-                selected_answer_index INTEGER,
-                is_correct BOOLEAN,
-                xp_earned INTEGER DEFAULT 0,
-                answered_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (user_id) REFERENCES users(user_id),
-                FOREIGN KEY (lesson_id) REFERENCES lessons(id)
-            )
-        """)
-        
-        # Таблица статистики квизов по уроках
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS user_quiz_stats (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER,
-                lesson_id INTEGER,
-                total_questions INTEGER,
-                correct_answers INTEGER,
-                quiz_score REAL,
-                total_xp_earned INTEGER DEFAULT 0,
-                completed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                is_perfect_score BOOLEAN DEFAULT 0,
-                FOREIGN KEY (user_id) REFERENCES users(user_id),
-                FOREIGN KEY (lesson_id) REFERENCES lessons(id)
-            )
-        """)
-        
-        # Индексы для быстрого доступа (оптимизация v0.21.0)
-        cursor.execute("""
-            CREATE INDEX IF NOT EXISTS idx_quiz_responses_user_lesson
-            ON user_quiz_responses(user_id, lesson_id)
-        """)
-        
-        cursor.execute("""
-            CREATE INDEX IF NOT EXISTS idx_quiz_stats_user_lesson
-            ON user_quiz_stats(user_id, lesson_id)
-        """)
-        
-        # Дополнительные индексы для production (v0.21.0 - Production Ready)
-        # WITH SAFE CHECKS - некоторые таблицы могут быть созданы в других местах
-        indices = [
-            ("idx_requests_user_id", "CREATE INDEX IF NOT EXISTS idx_requests_user_id ON requests(user_id)"),
-            ("idx_requests_created_at", "CREATE INDEX IF NOT EXISTS idx_requests_created_at ON requests(created_at)"),
-            ("idx_cache_created_at", "CREATE INDEX IF NOT EXISTS idx_cache_created_at ON cache(created_at)"),
-            ("idx_user_xp_user_id", "CREATE INDEX IF NOT EXISTS idx_user_xp_user_id ON user_xp(user_id)"),
-            ("idx_quests_user_id", "CREATE INDEX IF NOT EXISTS idx_quests_user_id ON user_daily_quests(user_id)"),
-            ("idx_bookmarks_user_id", "CREATE INDEX IF NOT EXISTS idx_bookmarks_user_id ON bookmarks(user_id)")
-        ]
-        
-        for idx_name, idx_query in indices:
-            try:
-                cursor.execute(idx_query)
-                logger.debug(f"✅ Index {idx_name} created/verified")
-            except sqlite3.OperationalError as e:
-                if "no such table" in str(e):
-                    logger.debug(f"Index {idx_name} skipped (table may not exist yet)")
-                else:
-                    logger.warning(f"Could not create index {idx_name}: {e}")
-            except Exception as e:
-                logger.warning(f"Unexpected error creating index {idx_name}: {e}")
-        
-        # ============ ТАБЛИЦА ПРОГРЕССА КУРСОВ (КРИТИЧНО) ============
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS user_courses (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER,
-                course_name TEXT,
-                completed_lessons INTEGER DEFAULT 0,
-                last_accessed TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (user_id) REFERENCES users(user_id)
-            )
-        """)
-        
-        # ============ НОВЫЕ ТАБЛИЦЫ v0.37.0 (TEACHING MODULE IMPROVEMENTS) ============
-        
-        # Таблица для отслеживания пройденных уроков (Phase 1 улучшений)
+    except Exception as e:
+        logger.debug(f"Не удалось проверить schema conversation_stats: {e}")
+    
+    # NEW v0.37.0: Teaching Module Phase 1 improvements
+    try:
+        cursor.execute("SELECT 1 FROM teaching_lessons LIMIT 1")
+    except sqlite3.OperationalError:
+        logger.info("  • Создание таблицы teaching_lessons...")
         cursor.execute("""
-            CREATE TABLE IF NOT EXISTS teaching_lessons (
+            CREATE TABLE teaching_lessons (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
                 user_id INTEGER NOT NULL,
                 topic TEXT NOT NULL,
@@ -3268,10 +2540,16 @@ def init_database() -> None:
                 UNIQUE(user_id, topic, difficulty)
             )
         """)
-        
-        # Таблица для системы рекомендаций и путей обучения
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_teaching_lessons_user ON teaching_lessons(user_id, completed_at DESC)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_teaching_lessons_topic ON teaching_lessons(user_id, topic, difficulty)")
+        migrations_needed = True
+    
+    try:
+        cursor.execute("SELECT 1 FROM learning_paths LIMIT 1")
+    except sqlite3.OperationalError:
+        logger.info("  • Создание таблицы learning_paths...")
         cursor.execute("""
-            CREATE TABLE IF NOT EXISTS learning_paths (
+            CREATE TABLE learning_paths (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
                 path_name TEXT UNIQUE NOT NULL,
                 path_title TEXT,
@@ -3285,10 +2563,14 @@ def init_database() -> None:
                 created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
             )
         """)
-        
-        # Таблица для отслеживания прогресса пути обучения
+        migrations_needed = True
+    
+    try:
+        cursor.execute("SELECT 1 FROM user_learning_paths LIMIT 1")
+    except sqlite3.OperationalError:
+        logger.info("  • Создание таблицы user_learning_paths...")
         cursor.execute("""
-            CREATE TABLE IF NOT EXISTS user_learning_paths (
+            CREATE TABLE user_learning_paths (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
                 user_id INTEGER NOT NULL,
                 path_name TEXT NOT NULL,
@@ -3302,10 +2584,15 @@ def init_database() -> None:
                 UNIQUE(user_id, path_name)
             )
         """)
-        
-        # Таблица для системы достижений (badges)
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_user_learning_paths_user ON user_learning_paths(user_id, is_active)")
+        migrations_needed = True
+    
+    try:
+        cursor.execute("SELECT 1 FROM user_badges LIMIT 1")
+    except sqlite3.OperationalError:
+        logger.info("  • Создание таблицы user_badges...")
         cursor.execute("""
-            CREATE TABLE IF NOT EXISTS user_badges (
+            CREATE TABLE user_badges (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
                 user_id INTEGER NOT NULL,
                 badge_id TEXT NOT NULL,
@@ -3318,89 +2605,899 @@ def init_database() -> None:
                 UNIQUE(user_id, badge_id)
             )
         """)
-        
-        # Индексы для оптимизации Phase 1
-        cursor.execute("""
-            CREATE INDEX IF NOT EXISTS idx_teaching_lessons_user
-            ON teaching_lessons(user_id, completed_at DESC)
-        """)
-        
-        cursor.execute("""
-            CREATE INDEX IF NOT EXISTS idx_teaching_lessons_topic
-            ON teaching_lessons(user_id, topic, difficulty)
-        """)
-        
-        cursor.execute("""
-            CREATE INDEX IF NOT EXISTS idx_user_learning_paths_user
-            ON user_learning_paths(user_id, is_active)
-        """)
-        
-        cursor.execute("""
-            CREATE INDEX IF NOT EXISTS idx_user_badges_user
-            ON user_badges(user_id, earned_at DESC)
-        """)
-        
-        # ============ КРИТИЧЕСКИЕ ИНДЕКСЫ v0.43.0 (PERFORMANCE OPTIMIZATION) ============
-        # Эти индексы улучшают производительность в 10-100 раз!
-        # Добавлены согласно аудиту производительности для исправления N+1 queries и полных сканирований
-        
-        # Индекс для таблицы lessons (быстрый поиск по course_id)
-        cursor.execute("""
-            CREATE INDEX IF NOT EXISTS idx_lessons_course_id
-            ON lessons(course_id, lesson_number)
-        """)
-        logger.debug("✅ Index idx_lessons_course_id created")
-        
-        # Индекс для таблицы conversation_history (быстрый поиск по user_id и timestamp)
-        cursor.execute("""
-            CREATE INDEX IF NOT EXISTS idx_conversation_history_user_timestamp
-            ON conversation_history(user_id, timestamp DESC)
-        """)
-        logger.debug("✅ Index idx_conversation_history_user_timestamp created")
-        
-        # Индекс для таблицы audit_logs (быстрый поиск по user_id и timestamp)
-        cursor.execute("""
-            CREATE INDEX IF NOT EXISTS idx_audit_logs_user_timestamp
-            ON audit_logs(user_id, timestamp DESC)
-        """)
-        logger.debug("✅ Index idx_audit_logs_user_timestamp created")
-        
-        # Индекс для таблицы daily_tasks (быстрый поиск пользовательских задач)
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_user_badges_user ON user_badges(user_id, earned_at DESC)")
+        migrations_needed = True
+    
+    # ============ NEW v0.43.0: CRITICAL INDICES FOR PERFORMANCE (10-100x speedup) ============
+    # These indices fix N+1 query patterns and full table scans
+    
+    # Index for lessons table (optimization for course content)
+    try:
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_lessons_course_id ON lessons(course_id, lesson_number)")
+        logger.info("✅ Created: idx_lessons_course_id (course queries optimization)")
+        migrations_needed = True
+    except sqlite3.OperationalError:
+        logger.debug("Index idx_lessons_course_id already exists or table missing")
+    
+    # Index for conversation history (optimization for user dialogue memory)
+    try:
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_conversation_history_user_timestamp ON conversation_history(user_id, timestamp DESC)")
+        logger.info("✅ Created: idx_conversation_history_user_timestamp (conversation queries)")
+        migrations_needed = True
+    except sqlite3.OperationalError:
+        logger.debug("Index idx_conversation_history_user_timestamp already exists or table missing")
+    
+    # Index for audit logs (optimization for security auditing)
+    try:
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_audit_logs_user_timestamp ON audit_logs(user_id, timestamp DESC)")
+        logger.info("✅ Created: idx_audit_logs_user_timestamp (audit log queries)")
+        migrations_needed = True
+    except sqlite3.OperationalError:
+        logger.debug("Index idx_audit_logs_user_timestamp already exists or table missing")
+    
+    # Index for daily tasks (optimization for quest system)
+    try:
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_daily_tasks_user_id ON daily_tasks(user_id, created_at DESC)")
+        logger.info("✅ Created: idx_daily_tasks_user_id (daily tasks queries)")
+        migrations_needed = True
+    except sqlite3.OperationalError:
+        logger.debug("Index idx_daily_tasks_user_id already exists or table missing")
+    
+    # Index for feedback (optimization for user feedback)
+    try:
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_feedback_user_id ON feedback(user_id, created_at DESC)")
+        logger.info("✅ Created: idx_feedback_user_id (feedback queries)")
+        migrations_needed = True
+    except sqlite3.OperationalError:
+        logger.debug("Index idx_feedback_user_id already exists or table missing")
+    
+    # Index for user progress (optimization for learning system)
+    try:
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_user_progress_user_lesson ON user_progress(user_id, lesson_id)")
+        logger.info("✅ Created: idx_user_progress_user_lesson (user progress queries)")
+        migrations_needed = True
+    except sqlite3.OperationalError:
+        logger.debug("Index idx_user_progress_user_lesson already exists or table missing")
+    
+    # Index for analytics (optimization for event tracking)
+    try:
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_analytics_user_type ON analytics(user_id, event_type, created_at DESC)")
+        logger.info("✅ Created: idx_analytics_user_type (analytics queries)")
+        migrations_needed = True
+    except sqlite3.OperationalError:
+        logger.debug("Index idx_analytics_user_type already exists or table missing")
+    
+    # Index for user courses (optimization for course enrollment)
+    try:
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_user_courses_user_id ON user_courses(user_id)")
+        logger.info("✅ Created: idx_user_courses_user_id (user courses queries)")
+        migrations_needed = True
+    except sqlite3.OperationalError:
+        logger.debug("Index idx_user_courses_user_id already exists or table missing")
+    
+    if migrations_needed:
+        logger.info(f"✅ Миграция успешно завершена (v0.43.0 - PERFORMANCE OPTIMIZATION with 8 critical indices)")
+    else:
+        logger.info(f"✅ Миграция не требуется, схема актуальна (v0.43.0)")
+    
+    # v0.43.0: Добавляем поддержку мультиязычности
+    if not check_column_exists(cursor, 'users', 'language'):
+        logger.info("Добавление колонки language для поддержки мультиязычности...")
+        cursor.execute("ALTER TABLE users ADD COLUMN language TEXT DEFAULT 'ru'")
+        cursor.connection.commit()
+        logger.info("Колонка language успешно добавлена")
+
+
+def migrate_database() -> None:
+    """Миграция базы данных к новой схеме v0.5.0."""
+    with get_db() as conn:
+        _migrate_database(conn.cursor())
+
+
+def _create_performance_indices(cursor: sqlite3.Cursor) -> None:
+    """
+    🚀 QUICK WIN: Create critical database indices for performance.
+    
+    These indices significantly improve query performance:
+    - users: 10-50x faster leaderboard queries
+    - requests: 5-10x faster user request history  
+    - user_progress: 10-20x faster learning queries
+    - daily_tasks: 5x faster task lookups
+    - user_bookmarks_v2: 10x faster bookmark queries
+    - analytics: 5x faster stat aggregations
+    
+    Expected improvement: 10-100x speedup on popular queries
+    """
+    
+    try:
+        # Index 1: Leaderboard optimization (CRITICAL)
+        # Queries: "ORDER BY xp DESC, level DESC, created_at DESC"
         cursor.execute("""
-            CREATE INDEX IF NOT EXISTS idx_daily_tasks_user_id
-            ON daily_tasks(user_id, created_at DESC)
+            CREATE INDEX IF NOT EXISTS idx_users_leaderboard 
+            ON users(xp DESC, level DESC, created_at DESC)
         """)
-        logger.debug("✅ Index idx_daily_tasks_user_id created")
-        
-        # Индекс для таблицы feedback (быстрый поиск отзывов)
+        logger.info("  📊 Created: idx_users_leaderboard (leaderboard queries)")
+    except sqlite3.OperationalError as e:
+        logger.warning(f"  ⚠️ Could not create idx_users_leaderboard: {e}")
+    
+    try:
+        # Index 2: User requests lookup (HIGH)
+        # Queries: "WHERE user_id = ? ORDER BY created_at DESC"
         cursor.execute("""
-            CREATE INDEX IF NOT EXISTS idx_feedback_user_id
-            ON feedback(user_id, created_at DESC)
+            CREATE INDEX IF NOT EXISTS idx_requests_user_date 
+            ON requests(user_id, created_at DESC)
         """)
-        logger.debug("✅ Index idx_feedback_user_id created")
-        
-        # Индекс для таблицы user_progress (быстрый поиск прогресса)
+        logger.info("  📝 Created: idx_requests_user_date (user request history)")
+    except sqlite3.OperationalError as e:
+        logger.warning(f"  ⚠️ Could not create idx_requests_user_date: {e}")
+    
+    try:
+        # Index 3: User learning progress (HIGH)
+        # Queries: "WHERE user_id = ? AND course_id = ?"
+        # Check if course_id column exists first
+        cursor.execute("PRAGMA table_info(user_progress)")
+        columns = {row[1] for row in cursor.fetchall()}
+        if 'course_id' in columns and 'lesson_id' in columns:
+            cursor.execute("""
+                CREATE INDEX IF NOT EXISTS idx_user_progress_lookup 
+                ON user_progress(user_id, course_id, lesson_id)
+            """)
+            logger.info("  📚 Created: idx_user_progress_lookup (learning progress)")
+        else:
+            logger.warning(f"  ⚠️ Skipping idx_user_progress_lookup (missing columns)")
+    except sqlite3.OperationalError as e:
+        logger.warning(f"  ⚠️ Could not create idx_user_progress_lookup: {e}")
+    
+    try:
+        # Index 4: Daily tasks (MEDIUM)
+        # Queries: "WHERE user_id = ? AND completed = 0"
         cursor.execute("""
-            CREATE INDEX IF NOT EXISTS idx_user_progress_user_lesson
-            ON user_progress(user_id, lesson_id)
+            CREATE INDEX IF NOT EXISTS idx_daily_tasks_user 
+            ON daily_tasks(user_id, completed, created_at DESC)
         """)
-        logger.debug("✅ Index idx_user_progress_user_lesson created")
-        
-        # Индекс для таблицы analytics (быстрый поиск событий)
+        logger.info("  ✅ Created: idx_daily_tasks_user (daily task queries)")
+    except sqlite3.OperationalError as e:
+        logger.warning(f"  ⚠️ Could not create idx_daily_tasks_user: {e}")
+    
+    try:
+        # Index 5: Bookmarks optimization (MEDIUM)
+        # Queries: "WHERE user_id = ? ORDER BY created_at DESC"
         cursor.execute("""
-            CREATE INDEX IF NOT EXISTS idx_analytics_user_type
-            ON analytics(user_id, event_type, created_at DESC)
+            CREATE INDEX IF NOT EXISTS idx_bookmarks_user 
+            ON user_bookmarks_v2(user_id, created_at DESC)
         """)
-        logger.debug("✅ Index idx_analytics_user_type created")
-        
-        # Индекс для таблицы user_courses (быстрый поиск курсов пользователя)
+        logger.info("  🔖 Created: idx_bookmarks_user (bookmark queries)")
+    except sqlite3.OperationalError as e:
+        logger.warning(f"  ⚠️ Could not create idx_bookmarks_user: {e}")
+    
+    try:
+        # Index 6: Analytics (MEDIUM)
+        # Queries: "WHERE created_at > ? GROUP BY user_id"
         cursor.execute("""
-            CREATE INDEX IF NOT EXISTS idx_user_courses_user_id
-            ON user_courses(user_id)
+            CREATE INDEX IF NOT EXISTS idx_analytics_date 
+            ON analytics(created_at DESC, user_id)
         """)
-        logger.debug("✅ Index idx_user_courses_user_id created")
+        logger.info("  📈 Created: idx_analytics_date (analytics queries)")
+    except sqlite3.OperationalError as e:
+        logger.warning(f"  ⚠️ Could not create idx_analytics_date: {e}")
+    
+    cursor.connection.commit()
+    logger.info(f"Database indices created successfully (v0.38.0 - QUICK WIN #2)")
+
+
+def create_database_indices() -> None:
+    """🚀 QUICK WIN: Create critical database indices (see _create_performance_indices)."""
+    with get_db() as conn:
+        _create_performance_indices(conn.cursor())
+
+
+def verify_database_schema() -> dict:
+    """
+    Проверить что все необходимые таблицы существуют в БД.
+    
+    Returns:
+        dict: {
+            'valid': bool - все таблицы существуют,
+            'missing_tables': list - отсутствующие таблицы,
+            'existing_tables': list - существующие таблицы
+        }
+    """
+    REQUIRED_TABLES = [
+        'users', 'requests', 'feedback', 'cache', 'analytics',
+        'courses', 'lessons', 'user_progress', 'user_questions', 'faq',
+        'tools', 'user_bookmarks', 'daily_tasks',
+        'user_drop_subscriptions', 'drops_feed',
+        'conversation_history', 'conversation_stats', 
+        'user_badges', 'teaching_lessons', 'learning_paths'
+    ]
+    
+    try:
+        with get_db() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                "SELECT name FROM sqlite_master WHERE type='table'"
+            )
+            existing = {row[0] for row in cursor.fetchall()}
+            
+            missing = [t for t in REQUIRED_TABLES if t not in existing]
+            
+            result = {
+                'valid': len(missing) == 0,
+                'missing_tables': missing,
+                'existing_tables': sorted(list(existing))
+            }
+            
+            if result['valid']:
+                logger.info(f"Database schema verified: {len(existing)} tables present")
+            else:
+                logger.warning(
+                    f"Database schema incomplete: missing {len(missing)} tables"
+                    f"\nMissing: {missing}"
+                    f"\nExisting: {result['existing_tables']}"
+                )
+            
+            return result
+            
+    except Exception as e:
+        logger.error(f"Database schema verification failed: {e}", exc_info=True)
+        return {
+            'valid': False,
+            'missing_tables': [],
+            'existing_tables': [],
+            'error': str(e)
+        }
+
+
+def _create_base_schema(cursor: sqlite3.Cursor) -> None:
+    """Создаёт все таблицы и индексы основной схемы (CREATE IF NOT EXISTS)."""
+    # Таблица пользователей (обновленная)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS users (
+            user_id INTEGER PRIMARY KEY,
+            username TEXT,
+            first_name TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            total_requests INTEGER DEFAULT 0,
+            last_request_at TIMESTAMP,
+            is_banned BOOLEAN DEFAULT 0,
+            ban_reason TEXT,
+            daily_requests INTEGER DEFAULT 0,
+            daily_reset_at TIMESTAMP,
+            knowledge_level TEXT DEFAULT 'unknown',
+            xp INTEGER DEFAULT 0,
+            level INTEGER DEFAULT 1,
+            badges TEXT DEFAULT '[]',
+            requests_today INTEGER DEFAULT 0,
+            last_request_date TEXT,
+            language TEXT DEFAULT 'ru'
+        )
+    """)
+    
+    # Таблица запросов
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS requests (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            news_text TEXT,
+            response_text TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            from_cache BOOLEAN DEFAULT 0,
+            processing_time_ms REAL,
+            error_message TEXT,
+            FOREIGN KEY (user_id) REFERENCES users(user_id)
+        )
+    """)
+    
+    # Таблица фидбека
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS feedback (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            request_id INTEGER,
+            is_helpful BOOLEAN,
+            comment TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users(user_id),
+            FOREIGN KEY (request_id) REFERENCES requests(id)
+        )
+    """)
+    
+    # Таблица кэша
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS cache (
+            cache_key TEXT PRIMARY KEY,
+            response_text TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            last_used_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            hit_count INTEGER DEFAULT 0
+        )
+    """)
+    
+    # Таблица аналитики
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS analytics (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            event_type TEXT,
+            user_id INTEGER,
+            data TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    
+    # ============ НОВЫЕ ТАБЛИЦЫ v0.5.0 ============
+    
+    # Таблица курсов
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS courses (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT UNIQUE,
+            title TEXT,
+            level TEXT,
+            description TEXT,
+            total_lessons INTEGER,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    
+    # Таблица уроков
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS lessons (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            course_id INTEGER,
+            lesson_number INTEGER,
+            title TEXT,
+            content TEXT,
+            duration_minutes INTEGER,
+            quiz_json TEXT,
+            xp_reward INTEGER DEFAULT 10,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (course_id) REFERENCES courses(id)
+        )
+    """)
+    
+    # Таблица прогресса пользователя
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS user_progress (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            lesson_id INTEGER,
+            completed_at TIMESTAMP,
+            quiz_score INTEGER,
+            xp_earned INTEGER,
+            FOREIGN KEY (user_id) REFERENCES users(user_id),
+            FOREIGN KEY (lesson_id) REFERENCES lessons(id)
+        )
+    """)
+    
+    # Таблица вопросов и ответов
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS user_questions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            question TEXT,
+            answer TEXT,
+            source TEXT,
+            is_in_faq BOOLEAN DEFAULT 0,
+            views INTEGER DEFAULT 0,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users(user_id)
+        )
+    """)
+    
+    # Таблица FAQ
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS faq (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            question TEXT UNIQUE,
+            answer TEXT,
+            related_lesson_id INTEGER,
+            category TEXT,
+            views INTEGER DEFAULT 0,
+            helpful INTEGER DEFAULT 0,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (related_lesson_id) REFERENCES lessons(id)
+        )
+    """)
+    
+    # Таблица инструментов
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS tools (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT UNIQUE,
+            description TEXT,
+            url TEXT,
+            category TEXT,
+            difficulty TEXT,
+            tutorial TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    
+    # Таблица избранных инструментов
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS user_bookmarks (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            tool_name TEXT,
+            added_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users(user_id)
+        )
+    """)
+    
+    # Таблица ЕЖЕДНЕВНЫХ ЗАДАЧ (v0.11.0) - Самообучение & Геймификация
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS daily_tasks (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            task_type TEXT,
+            task_name TEXT,
+            xp_reward INTEGER,
+            progress INTEGER DEFAULT 0,
+            target INTEGER,
+            completed BOOLEAN DEFAULT 0,
+            completed_at TIMESTAMP,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            reset_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users(user_id)
+        )
+    """)
+    
+    # ============ НОВЫЕ ТАБЛИЦЫ v0.15.0 (ДРОПЫ И АКТИВНОСТИ) ============
+    
+    # Таблица подписок на дропы
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS user_drop_subscriptions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            chain TEXT,
+            notify_interval TEXT DEFAULT 'daily',
+            enabled BOOLEAN DEFAULT 1,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users(user_id)
+        )
+    """)
+    
+    # Таблица AUDIT ЛОГОВ (v0.22.0) - полный трейл действий пользователей
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS audit_logs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            username TEXT,
+            action TEXT,
+            command TEXT,
+            parameters TEXT,
+            result TEXT,
+            error_message TEXT,
+            ip_address TEXT,
+            client_version TEXT,
+            execution_time_ms REAL,
+            status TEXT,
+            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users(user_id)
+        )
+    """)
+
+    # Таблица истории дропов (кэш просмотренных)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS drops_history (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            drop_name TEXT,
+            drop_type TEXT,
+            chain TEXT,
+            viewed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            is_new BOOLEAN DEFAULT 1,
+            FOREIGN KEY (user_id) REFERENCES users(user_id)
+        )
+    """)
+    
+    # Таблица кэша активностей
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS activities_cache (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            activity_type TEXT,
+            project_name TEXT,
+            activity_data TEXT,
+            chain TEXT,
+            cached_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            expires_at TIMESTAMP
+        )
+    """)
+    
+    # ============ НОВЫЕ ТАБЛИЦЫ v0.21.0 (ДИАЛОГОВАЯ СИСТЕМА) ============
+    
+    # Таблица истории диалогов (memory system) - UNIFIED SCHEMA
+    # ✅ UNIFIED: Используется одна схема для bot.py и conversation_context.py
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS conversation_history (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            role TEXT NOT NULL CHECK(role IN ('user', 'assistant')),
+            content TEXT NOT NULL,
+            intent TEXT,
+            timestamp INTEGER DEFAULT (strftime('%s', 'now')),
+            message_length INTEGER,
+            tokens_estimate INTEGER,
+            FOREIGN KEY (user_id) REFERENCES users(user_id) ON DELETE CASCADE
+        )
+    """)
+    
+    # ✅ FIX: Таблица статистики диалогов (fixes: no such table: conversation_stats)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS conversation_stats (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL UNIQUE,
+            total_messages INTEGER DEFAULT 0,
+            total_tokens INTEGER DEFAULT 0,
+            last_message_time INTEGER,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY(user_id) REFERENCES users(user_id) ON DELETE CASCADE
+        )
+    """)
+    
+    # Таблица профилей пользователей (для персонализации)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS user_profiles (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER UNIQUE,
+            interests TEXT,
+            portfolio TEXT,
+            risk_tolerance TEXT,
+            preferred_language TEXT DEFAULT 'russian',
+            last_updated TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users(user_id)
+        )
+    """)
+    
+    # Индексы для дропов
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_user_drop_subscriptions
+        ON user_drop_subscriptions(user_id)
+    """)
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_drops_history_user
+        ON drops_history(user_id)
+    """)
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_activities_cache_expires
+        ON activities_cache(expires_at)
+    """)
+    
+    # ============ НОВЫЕ ТАБЛИЦЫ v0.17.0 (LEADERBOARD) ============
+    
+    # Таблица кэша рейтингов (обновляется каждый час)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS leaderboard_cache (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            period TEXT NOT NULL,
+            rank INTEGER,
+            user_id INTEGER,
+            username TEXT,
+            xp INTEGER,
+            level INTEGER,
+            total_requests INTEGER,
+            cached_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users(user_id),
+            UNIQUE(period, rank)
+        )
+    """)
+    
+    # Индекс для быстрого доступа к кэшу
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_leaderboard_cache_period
+        ON leaderboard_cache(period, cached_at)
+    """)
+    
+    # ============ НОВЫЕ ТАБЛИЦЫ v0.18.0 (BOOKMARKS) ============
+    
+    # Таблица закладок пользователей
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS user_bookmarks_v2 (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            bookmark_type TEXT NOT NULL,
+            content_title TEXT,
+            content_text TEXT,
+            content_source TEXT,
+            external_id TEXT,
+            rating INTEGER DEFAULT 0,
+            added_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            viewed_count INTEGER DEFAULT 0,
+            last_viewed_at TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users(user_id),
+            UNIQUE(user_id, bookmark_type, external_id)
+        )
+    """)
+    
+    # История просмотра закладок
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS bookmark_history (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            bookmark_id INTEGER,
+            action TEXT,
+            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users(user_id),
+            FOREIGN KEY (bookmark_id) REFERENCES user_bookmarks_v2(id)
+        )
+    """)
+    
+    # Индексы для быстрого поиска
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_bookmarks_user
+        ON user_bookmarks_v2(user_id, added_at DESC)
+    """)
+    
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_bookmarks_type
+        ON user_bookmarks_v2(user_id, bookmark_type)
+    """)
+    
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_bookmark_history
+        ON bookmark_history(user_id, timestamp DESC)
+    """)
+    
+    # ============ НОВЫЕ ТАБЛИЦЫ v0.19.0 (QUIZ SYSTEM) ============
+    
+    # Таблица для сохранения ответов на квизы
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS user_quiz_responses (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            lesson_id INTEGER,
+            question_number INTEGER,
+            selected_answer_index INTEGER,
+            is_correct BOOLEAN,
+            xp_earned INTEGER DEFAULT 0,
+            answered_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users(user_id),
+            FOREIGN KEY (lesson_id) REFERENCES lessons(id)
+        )
+    """)
+    
+    # Таблица статистики квизов по уроках
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS user_quiz_stats (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            lesson_id INTEGER,
+            total_questions INTEGER,
+            correct_answers INTEGER,
+            quiz_score REAL,
+            total_xp_earned INTEGER DEFAULT 0,
+            completed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            is_perfect_score BOOLEAN DEFAULT 0,
+            FOREIGN KEY (user_id) REFERENCES users(user_id),
+            FOREIGN KEY (lesson_id) REFERENCES lessons(id)
+        )
+    """)
+    
+    # Индексы для быстрого доступа (оптимизация v0.21.0)
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_quiz_responses_user_lesson
+        ON user_quiz_responses(user_id, lesson_id)
+    """)
+    
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_quiz_stats_user_lesson
+        ON user_quiz_stats(user_id, lesson_id)
+    """)
+    
+    # Дополнительные индексы для production (v0.21.0 - Production Ready)
+    # WITH SAFE CHECKS - некоторые таблицы могут быть созданы в других местах
+    indices = [
+        ("idx_requests_user_id", "CREATE INDEX IF NOT EXISTS idx_requests_user_id ON requests(user_id)"),
+        ("idx_requests_created_at", "CREATE INDEX IF NOT EXISTS idx_requests_created_at ON requests(created_at)"),
+        ("idx_cache_created_at", "CREATE INDEX IF NOT EXISTS idx_cache_created_at ON cache(created_at)"),
+        ("idx_user_xp_user_id", "CREATE INDEX IF NOT EXISTS idx_user_xp_user_id ON user_xp(user_id)"),
+        ("idx_quests_user_id", "CREATE INDEX IF NOT EXISTS idx_quests_user_id ON user_daily_quests(user_id)"),
+        ("idx_bookmarks_user_id", "CREATE INDEX IF NOT EXISTS idx_bookmarks_user_id ON bookmarks(user_id)")
+    ]
+    
+    for idx_name, idx_query in indices:
+        try:
+            cursor.execute(idx_query)
+            logger.debug(f"✅ Index {idx_name} created/verified")
+        except sqlite3.OperationalError as e:
+            if "no such table" in str(e):
+                logger.debug(f"Index {idx_name} skipped (table may not exist yet)")
+            else:
+                logger.warning(f"Could not create index {idx_name}: {e}")
+        except Exception as e:
+            logger.warning(f"Unexpected error creating index {idx_name}: {e}")
+    
+    # ============ ТАБЛИЦА ПРОГРЕССА КУРСОВ (КРИТИЧНО) ============
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS user_courses (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            course_name TEXT,
+            completed_lessons INTEGER DEFAULT 0,
+            last_accessed TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users(user_id)
+        )
+    """)
+    
+    # ============ НОВЫЕ ТАБЛИЦЫ v0.37.0 (TEACHING MODULE IMPROVEMENTS) ============
+    
+    # Таблица для отслеживания пройденных уроков (Phase 1 улучшений)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS teaching_lessons (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            topic TEXT NOT NULL,
+            difficulty TEXT NOT NULL,
+            title TEXT,
+            completed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            quiz_score INTEGER,
+            quiz_passed BOOLEAN DEFAULT 0,
+            xp_earned INTEGER DEFAULT 50,
+            repeat_count INTEGER DEFAULT 0,
+            last_repeated_at TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users(user_id) ON DELETE CASCADE,
+            UNIQUE(user_id, topic, difficulty)
+        )
+    """)
+    
+    # Таблица для системы рекомендаций и путей обучения
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS learning_paths (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            path_name TEXT UNIQUE NOT NULL,
+            path_title TEXT,
+            description TEXT,
+            difficulty_level TEXT,
+            topics TEXT NOT NULL,
+            prerequisites TEXT,
+            estimated_time_hours INTEGER,
+            total_xp_reward INTEGER,
+            badge_reward TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    
+    # Таблица для отслеживания прогресса пути обучения
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS user_learning_paths (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            path_name TEXT NOT NULL,
+            started_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            completed_at TIMESTAMP,
+            progress_percent REAL DEFAULT 0,
+            total_xp_earned INTEGER DEFAULT 0,
+            is_active BOOLEAN DEFAULT 1,
+            FOREIGN KEY (user_id) REFERENCES users(user_id) ON DELETE CASCADE,
+            FOREIGN KEY (path_name) REFERENCES learning_paths(path_name),
+            UNIQUE(user_id, path_name)
+        )
+    """)
+    
+    # Таблица для системы достижений (badges)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS user_badges (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            badge_id TEXT NOT NULL,
+            badge_name TEXT,
+            badge_emoji TEXT,
+            badge_description TEXT,
+            earned_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            condition_met TEXT,
+            FOREIGN KEY (user_id) REFERENCES users(user_id) ON DELETE CASCADE,
+            UNIQUE(user_id, badge_id)
+        )
+    """)
+    
+    # Индексы для оптимизации Phase 1
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_teaching_lessons_user
+        ON teaching_lessons(user_id, completed_at DESC)
+    """)
+    
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_teaching_lessons_topic
+        ON teaching_lessons(user_id, topic, difficulty)
+    """)
+    
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_user_learning_paths_user
+        ON user_learning_paths(user_id, is_active)
+    """)
+    
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_user_badges_user
+        ON user_badges(user_id, earned_at DESC)
+    """)
+    
+    # ============ КРИТИЧЕСКИЕ ИНДЕКСЫ v0.43.0 (PERFORMANCE OPTIMIZATION) ============
+    # Эти индексы улучшают производительность в 10-100 раз!
+    # Добавлены согласно аудиту производительности для исправления N+1 queries и полных сканирований
+    
+    # Индекс для таблицы lessons (быстрый поиск по course_id)
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_lessons_course_id
+        ON lessons(course_id, lesson_number)
+    """)
+    logger.debug("✅ Index idx_lessons_course_id created")
+    
+    # Индекс для таблицы conversation_history (быстрый поиск по user_id и timestamp)
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_conversation_history_user_timestamp
+        ON conversation_history(user_id, timestamp DESC)
+    """)
+    logger.debug("✅ Index idx_conversation_history_user_timestamp created")
+    
+    # Индекс для таблицы audit_logs (быстрый поиск по user_id и timestamp)
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_audit_logs_user_timestamp
+        ON audit_logs(user_id, timestamp DESC)
+    """)
+    logger.debug("✅ Index idx_audit_logs_user_timestamp created")
+    
+    # Индекс для таблицы daily_tasks (быстрый поиск пользовательских задач)
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_daily_tasks_user_id
+        ON daily_tasks(user_id, created_at DESC)
+    """)
+    logger.debug("✅ Index idx_daily_tasks_user_id created")
+    
+    # Индекс для таблицы feedback (быстрый поиск отзывов)
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_feedback_user_id
+        ON feedback(user_id, created_at DESC)
+    """)
+    logger.debug("✅ Index idx_feedback_user_id created")
+    
+    # Индекс для таблицы user_progress (быстрый поиск прогресса)
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_user_progress_user_lesson
+        ON user_progress(user_id, lesson_id)
+    """)
+    logger.debug("✅ Index idx_user_progress_user_lesson created")
+    
+    # Индекс для таблицы analytics (быстрый поиск событий)
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_analytics_user_type
+        ON analytics(user_id, event_type, created_at DESC)
+    """)
+    logger.debug("✅ Index idx_analytics_user_type created")
+    
+    # Индекс для таблицы user_courses (быстрый поиск курсов пользователя)
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_user_courses_user_id
+        ON user_courses(user_id)
+    """)
+    logger.debug("✅ Index idx_user_courses_user_id created")
+    
+    logger.info(f"✅ PERFORMANCE OPTIMIZATION v0.43.0: 8 критических индексов добавлены для 10-100x ускорения БД запросов")
+
+
+def init_database() -> None:
+    """
+    Инициализирует SQLite базу данных с полной схемой.
+    
+    Создает все необходимые таблицы и выполняет миграции схемы.
+    Выполняется при запуске бота, безопасна для повторных вызовов.
+    
+    Tables Created:
+        - users: Профили пользователей
+        - conversations: История разговоров
+        - conversation_stats: Статистика по разговорам
+        - analysis_cache: Кэш анализов
+        - feedback: Обратная связь
+        - learning_progress: Прогресс обучения
+        - events: Для аналитики
         
-        logger.info(f"✅ PERFORMANCE OPTIMIZATION v0.43.0: 8 критических индексов добавлены для 10-100x ускорения БД запросов")
+    Features:
+        - Idempotent: безопасно вызывать много раз
+        - Auto-migration: автомиграция схемы
+        - WAL mode: для лучшей производительности
+        - Indexes: оптимизированы на часто используемые колонки
+    """
+    with get_db() as conn:
+        _create_base_schema(conn.cursor())
     
     # Инициализируем курсы (загружаем из markdown в БД)
     with get_db() as conn:
@@ -3410,6 +3507,136 @@ def init_database() -> None:
     # Выполняем миграцию существующих таблиц
     migrate_database()
 
+
+def _create_hot_query_indices(cursor: sqlite3.Cursor) -> None:
+    """
+    Индексы по отчёту query_plan_audit (горячие запросы на синтетической БД).
+
+    - user_questions(user_id): профиль считал вопросы полным сканом
+      user_questions (SCAN без индекса в get_user_profile_data);
+    - users(xp DESC, level DESC, total_requests DESC): порядок рейтинга в
+      get_leaderboard_data целиком из индекса, без temp b-tree. Заменяет
+      idx_users_leaderboard (xp, level, created_at), по created_at никто
+      не сортирует, а лишний индекс на users замедляет начисление XP.
+    """
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_user_questions_user
+        ON user_questions(user_id)
+    """)
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_users_leaderboard_order
+        ON users(xp DESC, level DESC, total_requests DESC)
+    """)
+    cursor.execute("DROP INDEX IF EXISTS idx_users_leaderboard")
+    cursor.execute("ANALYZE users")
+
+
+# =============================================================================
+# ВЕРСИОНИРОВАННЫЕ МИГРАЦИИ СХЕМЫ
+# =============================================================================
+
+BOT_SCHEMA_SCOPE = "bot"
+
+# Порядок важен: шаги применяются один раз, номер последнего хранится в
+# schema_version. Новые изменения схемы - только новым шагом в конце списка.
+BOT_MIGRATIONS = [
+    Migration(1, "conversation_history_columns", _ensure_conversation_history_columns),
+    Migration(2, "base_schema", _create_base_schema),
+    Migration(3, "seed_courses", load_courses_to_db),
+    Migration(4, "legacy_column_migrations", _migrate_database),
+    Migration(5, "performance_indices", _create_performance_indices),
+    Migration(6, "hot_query_indices", _create_hot_query_indices),
+]
+
+
+def _create_telemetry_schema(cursor: sqlite3.Cursor) -> None:
+    """Таблицы телеметрии бота в rvx_bot_telemetry.db."""
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS analytics (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            event_type TEXT,
+            user_id INTEGER,
+            data TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_analytics_user_type
+        ON analytics(user_id, event_type, created_at DESC)
+    """)
+    # Без FOREIGN KEY на users: таблица пользователей в другом файле
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS audit_logs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            username TEXT,
+            action TEXT,
+            command TEXT,
+            parameters TEXT,
+            result TEXT,
+            error_message TEXT,
+            ip_address TEXT,
+            client_version TEXT,
+            execution_time_ms REAL,
+            status TEXT,
+            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_audit_logs_user_timestamp
+        ON audit_logs(user_id, timestamp DESC)
+    """)
+
+
+def _create_cache_schema(cursor: sqlite3.Cursor) -> None:
+    """Кэш ответов ИИ в rvx_bot_cache.db."""
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS cache (
+            cache_key TEXT PRIMARY KEY,
+            response_text TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            last_used_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            hit_count INTEGER DEFAULT 0
+        )
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_cache_created_at ON cache(created_at)")
+
+
+# Таблицы analytics / audit_logs / cache в rvx_bot.db остаются как архив:
+# новые записи идут только в файлы маршрутов.
+BOT_TELEMETRY_MIGRATIONS = [
+    Migration(1, "telemetry_tables", _create_telemetry_schema),
+]
+BOT_CACHE_MIGRATIONS = [
+    Migration(1, "cache_table", _create_cache_schema),
+]
+register_schema(ROUTE_TELEMETRY, "bot_telemetry", BOT_TELEMETRY_MIGRATIONS)
+register_schema(ROUTE_CACHE, "bot_cache", BOT_CACHE_MIGRATIONS)
+
+
+def apply_schema_migrations() -> int:
+    """
+    Применяет недостающие миграции основной БД на одном соединении
+    и готовит файлы маршрутов телеметрии и кэша.
+    
+    При актуальной схеме выполняет единственный SELECT из schema_version.
+    
+    Returns:
+        int: количество применённых шагов (0 - схема актуальна)
+    """
+    started = time.perf_counter()
+    with get_db() as conn:
+        applied = apply_migrations(conn, BOT_SCHEMA_SCOPE, BOT_MIGRATIONS)
+    # Файлы телеметрии и кэша создаются и мигрируются при открытии пула
+    for route in (ROUTE_TELEMETRY, ROUTE_CACHE):
+        get_pool(route, DB_PATH)
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    if applied:
+        logger.info(f"✅ Схема БД обновлена до v{latest_version(BOT_MIGRATIONS)}: {applied} шаг(ов) за {elapsed_ms:.1f}ms")
+    else:
+        logger.info(f"✅ Схема БД актуальна (v{latest_version(BOT_MIGRATIONS)}), проверка за {elapsed_ms:.1f}ms")
+    return applied
+
 # =============================================================================
 # ФОРМАТИРОВАНИЕ ТЕКСТА
 # =============================================================================
@@ -3831,7 +4058,7 @@ def save_feedback(user_id: int, request_id: int, is_helpful: bool, comment: Opti
 
 def get_cache(cache_key: str) -> Optional[str]:
     """Получает ответ из кэша и обновляет статистику."""
-    with get_db() as conn:
+    with get_db(ROUTE_CACHE) as conn:
         cursor = conn.cursor()
         cursor.execute("""
             SELECT response_text FROM cache WHERE cache_key = ?
@@ -3850,7 +4077,7 @@ def get_cache(cache_key: str) -> Optional[str]:
 
 def set_cache(cache_key: str, response_text: str) -> None:
     """Сохраняет ответ в кэш."""
-    with get_db() as conn:
+    with get_db(ROUTE_CACHE) as conn:
         cursor = conn.cursor()
         cursor.execute("""
             INSERT INTO cache (cache_key, response_text)
@@ -3863,7 +4090,7 @@ def set_cache(cache_key: str, response_text: str) -> None:
 
 def cleanup_old_cache() -> None:
     """Удаляет старый и неиспользуемый кэш."""
-    with get_db() as conn:
+    with get_db(ROUTE_CACHE) as conn:
         cursor = conn.cursor()
         cutoff_date = datetime.now() - timedelta(days=CACHE_MAX_AGE_DAYS)
         
@@ -3899,77 +4126,6 @@ def get_user_history(user_id: int, limit: int = 10) -> List[Tuple]:
 
 # ==================== ДИАЛОГОВАЯ СИСТЕМА v0.21.0 ====================
 
-def ensure_conversation_history_columns() -> None:
-    """Проверяет и добавляет недостающие столбцы в conversation_history.
-    
-    ⚠️ ВАЖНО: Вызывается ПЕРЕД основной инициализацией!
-    TIER 1 v0.23.0: Enhanced with default values and data consistency fixes.
-    TIER 1 v0.24.0: More aggressive migration to fix Railway deployment issues.
-    CRITICAL FIX #14: Use validated DATABASE_PATH from config instead of raw os.getenv()
-    """
-    import sqlite3
-    try:
-        # CRITICAL FIX #14: Открываем БД используя валидированный путь из конфига
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-        conn.execute("PRAGMA foreign_keys=OFF")  # Отключаем внешние ключи во время миграции
-        
-        # Проверяем существует ли таблица
-        cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='conversation_history'")
-        if not cursor.fetchone():
-            logger.info(f"Таблица conversation_history не существует, будет создана позже")
-            conn.close()
-            return
-        
-        # Получаем информацию о столбцах ДО миграции
-        cursor.execute("PRAGMA table_info(conversation_history)")
-        columns_before = {col[1] for col in cursor.fetchall()}
-        logger.info(f"📋 Столбцы ДО миграции: {sorted(columns_before)}")
-        
-        # Проверяем и добавляем недостающие столбцы
-        needs_migration = False
-        
-        if 'message_type' not in columns_before:
-            logger.info("  ⚡ Добавляем столбец message_type в conversation_history...")
-            try:
-                cursor.execute("ALTER TABLE conversation_history ADD COLUMN message_type TEXT DEFAULT 'user'")
-                conn.commit()
-                logger.info(f"Столбец message_type добавлен успешно")
-                needs_migration = True
-            except sqlite3.OperationalError as e:
-                if "duplicate column name" not in str(e).lower():
-                    logger.error(f"Не удалось добавить message_type: {e}")
-                
-        if 'intent' not in columns_before:
-            logger.info("  ⚡ Добавляем столбец intent в conversation_history...")
-            try:
-                cursor.execute("ALTER TABLE conversation_history ADD COLUMN intent TEXT DEFAULT 'general'")
-                conn.commit()
-                logger.info(f"Столбец intent добавлен успешно")
-                needs_migration = True
-            except sqlite3.OperationalError as e:
-                if "duplicate column name" not in str(e).lower():
-                    logger.error(f"Не удалось добавить intent: {e}")
-        
-        # Финальная проверка
-        cursor.execute("PRAGMA table_info(conversation_history)")
-        columns_after = {col[1] for col in cursor.fetchall()}
-        logger.info(f"Столбцы ПОСЛЕ миграции: {sorted(columns_after)}")
-        
-        # Проверяем что все нужные столбцы есть
-        required_columns = {'id', 'user_id', 'message_type', 'content', 'intent', 'created_at'}
-        missing = required_columns - columns_after
-        if missing:
-            logger.error(f"🚨 КРИТИЧНО: Отсутствуют столбцы: {missing}")
-        else:
-            logger.info(f"УСПЕШНО: Все необходимые столбцы присутствуют")
-        
-        conn.execute("PRAGMA foreign_keys=ON")  # Включаем внешние ключи обратно
-        conn.close()
-        
-    except Exception as e:
-        logger.error(f"Критическая ошибка при миграции БД: {e}", exc_info=True)
-
 def save_conversation(user_id: int, message_type: str, content: str, intent: Optional[str] = None) -> None:
     """Сохраняет сообщение в историю диалога с правильным форматом."""
     try:
@@ -4097,32 +4253,40 @@ def update_user_profile(user_id: int, interests: Optional[str] = None, portfolio
         conn.commit()
         logger.debug(f"👤 Профиль обновлен: user_id={user_id}")
 
+# Ключевые слова classify_intent (порядок проверок важен: более специфичные первыми)
+# 1. Уточняющие вопросы (follow-up), включая короткие "Почему?", "Как?", "Где?", "Когда?"
+FOLLOWUP_KEYWORDS = ["еще", "подробнее", "расскажи больше", "непонятно", "уточни", "можешь повторить", 
+                     "а что", "и что", "поясни", "детальнее", "подробней", "почему?", "как?", "где?", 
+                     "когда?", "почему", "как ", "что это", "кто это"]
+# 2. Анализ новостей (требует ключевых слов о финансах/крипто)
+NEWS_INTENT_KEYWORDS = ["анализ", "новость", "криптовалюта", "биткойн", "bitcoin", "эфир", "ethereum", 
+                        "рынок", "цена", "тренд", "падение", "рост", "скачок", "окончательно", 
+                        "одобрен", "запущен", "приказ", "давит", "крах", "взлет", "что произошло", "произошло"]
+# 3. Вопросы об обучении (явные вопросительные слова)
+QUESTION_KEYWORDS = ["что такое", "как работает", "почему", "зачем", "какой", "какая", "какое",
+                     "чем отличается", "разница", "в чем", "опиши", "расскажи о", "объясни"]
+
+keyword_engine.register({
+    "intent.follow_up": FOLLOWUP_KEYWORDS,
+    "intent.news_analysis": NEWS_INTENT_KEYWORDS,
+    "intent.question": QUESTION_KEYWORDS,
+})
+
+
 def classify_intent(text: str) -> str:
     """
     Классификация намерения пользователя на основе ключевых слов.
     Порядок проверок важен: более специфичные проверяются первыми.
     """
-    text_lower = text.lower()
+    matches = keyword_engine.scan(text.lower())
     
-    # 1. Уточняющие вопросы (follow-up) - ПЕРВЫМ, так как это более специфично
-    # Включаем очень короткие follow-up вопросы типа "Почему?", "Как?", "Где?", "Когда?"
-    followup_keywords = ["еще", "подробнее", "расскажи больше", "непонятно", "уточни", "можешь повторить", 
-                        "а что", "и что", "поясни", "детальнее", "подробней", "почему?", "как?", "где?", 
-                        "когда?", "почему", "как ", "что это", "кто это"]
-    if any(kw in text_lower for kw in followup_keywords):
+    if matches.has("intent.follow_up"):
         return "follow_up"
     
-    # 2. Анализ новостей (требует ключевых слов о финансах/крипто)
-    news_keywords = ["анализ", "новость", "криптовалюта", "биткойн", "bitcoin", "эфир", "ethereum", 
-                    "рынок", "цена", "тренд", "падение", "рост", "скачок", "окончательно", 
-                    "одобрен", "запущен", "приказ", "давит", "крах", "взлет", "что произошло", "произошло"]
-    if any(kw in text_lower for kw in news_keywords):
+    if matches.has("intent.news_analysis"):
         return "news_analysis"
     
-    # 3. Вопросы об обучении (явные вопросительные слова)
-    question_keywords = ["что такое", "как работает", "почему", "зачем", "какой", "какая", "какое",
-                        "чем отличается", "разница", "в чем", "опиши", "расскажи о", "объясни"]
-    if any(kw in text_lower for kw in question_keywords):
+    if matches.has("intent.question"):
         return "question"
     
     # 4. Обнаружение вопросительных предложений (заканчиваются на ?)
@@ -4166,52 +4330,86 @@ def search_user_requests(user_id: int, search_text: str) -> List[Tuple]:
 
 # --- Статистика ---
 
+def _query_global_stats(conn: sqlite3.Connection) -> Dict[str, Any]:
+    """Агрегаты глобальной статистики на переданном соединении (кэш подключён через ATTACH)."""
+    cursor = conn.cursor()
+    cache_db = attach_alias(ROUTE_CACHE)
+    
+    # ✅ OPTIMIZATION: Get all aggregates in ONE query instead of 7 separate queries
+    cursor.execute(f"""
+        SELECT
+            (SELECT COUNT(*) FROM users) as total_users,
+            (SELECT COUNT(*) FROM requests WHERE error_message IS NULL) as total_requests,
+            (SELECT COUNT(*) FROM {cache_db}.cache) as cache_size,
+            (SELECT COALESCE(SUM(hit_count), 0) FROM {cache_db}.cache) as cache_hits,
+            (SELECT COUNT(*) FROM feedback WHERE is_helpful = 1) as helpful_count,
+            (SELECT COUNT(*) FROM feedback WHERE is_helpful = 0) as not_helpful_count,
+            (SELECT COALESCE(AVG(processing_time_ms), 0) FROM requests 
+                WHERE processing_time_ms IS NOT NULL AND from_cache = 0) as avg_processing_time
+    """)
+    
+    result = cursor.fetchone()
+    total_users, total_requests, cache_size, cache_hits, helpful_count, not_helpful_count, avg_processing_time = result
+    
+    # TOP-10 пользователей по XP (обновлено v0.9.0)
+    cursor.execute("""
+        SELECT username, first_name, xp, level
+        FROM users
+        WHERE is_banned = 0 AND xp > 0
+        ORDER BY xp DESC
+        LIMIT 10
+    """)
+    top_users = [tuple(row) for row in cursor.fetchall()]
+    
+    return {
+        "total_users": total_users,
+        "total_requests": total_requests,
+        "cache_size": cache_size,
+        "cache_hits": cache_hits,
+        "helpful": helpful_count,
+        "not_helpful": not_helpful_count,
+        "avg_processing_time": round(float(avg_processing_time or 0), 2),
+        "top_users": top_users
+    }
+
+
 def get_global_stats() -> Dict[str, Any]:
     """Получает глобальную статистику.
     
     v0.43.1: OPTIMIZED - Reduced from 8 queries to 2 (4x speedup)
     - Combined all COUNT/SUM/AVG aggregates into single query
     - Uses GROUP_CONCAT for stats collection
+    
+    Читает из read-only пула отчётов (один снимок БД, бюджет времени
+    REPORT_QUERY_TIMEOUT). Из async-кода вызывать через run_report().
     """
-    with get_db() as conn:
+    with read_only_connection(DB_PATH, attach=(ROUTE_CACHE,)) as conn:
+        return _query_global_stats(conn)
+
+
+def _collect_admin_stats() -> Dict[str, Any]:
+    """Глобальная статистика + админские счётчики из одного снимка БД."""
+    with read_only_connection(DB_PATH, attach=(ROUTE_CACHE,)) as conn:
+        stats = _query_global_stats(conn)
         cursor = conn.cursor()
         
-        # ✅ OPTIMIZATION: Get all aggregates in ONE query instead of 7 separate queries
+        # Активные пользователи (запросы за последние 7 дней)
         cursor.execute("""
-            SELECT
-                (SELECT COUNT(*) FROM users) as total_users,
-                (SELECT COUNT(*) FROM requests WHERE error_message IS NULL) as total_requests,
-                (SELECT COUNT(*) FROM cache) as cache_size,
-                (SELECT COALESCE(SUM(hit_count), 0) FROM cache) as cache_hits,
-                (SELECT COUNT(*) FROM feedback WHERE is_helpful = 1) as helpful_count,
-                (SELECT COUNT(*) FROM feedback WHERE is_helpful = 0) as not_helpful_count,
-                (SELECT COALESCE(AVG(processing_time_ms), 0) FROM requests 
-                    WHERE processing_time_ms IS NOT NULL AND from_cache = 0) as avg_processing_time
+            SELECT COUNT(DISTINCT user_id) FROM requests
+            WHERE created_at >= datetime('now', '-7 days')
         """)
+        stats["active_users"] = cursor.fetchone()[0]
         
-        result = cursor.fetchone()
-        total_users, total_requests, cache_size, cache_hits, helpful_count, not_helpful_count, avg_processing_time = result
-        
-        # TOP-10 пользователей по XP (обновлено v0.9.0)
+        # Ошибки
         cursor.execute("""
-            SELECT username, first_name, xp, level
-            FROM users
-            WHERE is_banned = 0 AND xp > 0
-            ORDER BY xp DESC
-            LIMIT 10
+            SELECT COUNT(*) FROM requests WHERE error_message IS NOT NULL
         """)
-        top_users = cursor.fetchall()
+        stats["error_count"] = cursor.fetchone()[0]
         
-        return {
-            "total_users": total_users,
-            "total_requests": total_requests,
-            "cache_size": cache_size,
-            "cache_hits": cache_hits,
-            "helpful": helpful_count,
-            "not_helpful": not_helpful_count,
-            "avg_processing_time": round(float(avg_processing_time or 0), 2),
-            "top_users": top_users
-        }
+        # Заблокированные
+        cursor.execute("SELECT COUNT(*) FROM users WHERE is_banned = 1")
+        stats["banned_count"] = cursor.fetchone()[0]
+    return stats
 
 def get_user_learning_style() -> dict:
     """Анализирует стиль обучения пользователя на основе фидбека. v0.10.0 - Самообучение."""
@@ -4489,7 +4687,7 @@ def log_analytics_event(event_type: str, user_id: Optional[int] = None, data: Op
     if not ENABLE_ANALYTICS:
         return
     
-    with get_db() as conn:
+    with get_db(ROUTE_TELEMETRY) as conn:
         cursor = conn.cursor()
         cursor.execute("""
             INSERT INTO analytics (event_type, user_id, data)
@@ -4549,7 +4747,7 @@ async def audit_log(
         if context and context.user_data:
             ip_address = context.user_data.get('client_ip')
         
-        with get_db() as conn:
+        with get_db(ROUTE_TELEMETRY) as conn:
             cursor = conn.cursor()
             cursor.execute("""
                 INSERT INTO audit_logs 
@@ -4590,153 +4788,170 @@ class BotState:
     Централизованное управление состоянием бота.
     Заменяет разрозненные глобальные переменные на один объект.
     
-    Преимущества:
-    - Легче отследить состояние
-    - Проще добавлять новые поля
-    - Лучше тестируемость
-    - Безопаснее с потокобезопасностью
+    Состояние пользователей лежит в session_store.SessionStore: одна
+    компактная сессия на пользователя, LRU-лимит SESSION_MAX_COUNT и
+    ленивое истечение через SESSION_TTL_SECONDS. Общего lock'а нет -
+    состояние меняется без await между чтением и записью, поэтому в
+    event loop операции атомарны. Квиз и текст для регенерации
+    сохраняются в БД, если включена персистентность (SESSION_PERSIST);
+    чтение и запись SQLite идут в потоке, не блокируя event loop.
     """
     
-    def __init__(self):
-        self._lock = asyncio.Lock()
-        
-        # Rate limiting & flood control
-        self.user_last_request: Dict[int, datetime] = {}
-        
-        # Последние новости (для регенерации)
-        self.user_last_news: Dict[int, str] = {}
-        
-        # Текущие курсы пользователей
-        self.user_current_course: Dict[int, str] = {}
-        
-        # Quiz state: user_id -> {lesson, questions, current_q, answers, score}
-        self.user_quiz_state: Dict[int, Dict[str, Any]] = {}
-        
-        # Попытки регенерации фидбека
-        self.feedback_attempts: Dict[int, int] = {}
-        
-        logger.info(f"BotState инициализирован")
+    def __init__(self, max_sessions: int = SESSION_MAX_COUNT, ttl_seconds: int = SESSION_TTL_SECONDS):
+        self.sessions = SessionStore(max_sessions=max_sessions, ttl_seconds=ttl_seconds)
+        logger.info(f"BotState инициализирован (до {max_sessions} сессий, TTL {ttl_seconds}s)")
     
     async def check_flood(self, user_id: int, cooldown: int = FLOOD_COOLDOWN_SECONDS) -> bool:
         """Проверяет flood control для пользователя."""
-        async with self._lock:
-            now: datetime = datetime.now()
-            
-            if user_id in self.user_last_request:
-                time_diff: float = (now - self.user_last_request[user_id]).total_seconds()
-                if time_diff < cooldown:
-                    return False
-            
-            self.user_last_request[user_id] = now
-            return True
+        session = await self.sessions.load_or_create(user_id)
+        if session.last_request is not None and session.last_seen - session.last_request < cooldown:
+            return False
+        session.last_request = session.last_seen
+        return True
     
     async def set_user_news(self, user_id: int, text: str) -> None:
         """Сохраняет последнюю новость пользователя."""
-        async with self._lock:
-            self.user_last_news[user_id] = text
+        (await self.sessions.load_or_create(user_id)).news = text
+        self.sessions.mark_dirty(user_id)
     
     async def get_user_news(self, user_id: int) -> Optional[str]:
         """Получает последнюю новость пользователя."""
-        async with self._lock:
-            return self.user_last_news.get(user_id)
+        session = await self.sessions.load(user_id)
+        return session.news if session else None
     
     async def clear_user_news(self, user_id: int) -> None:
         """Очищает последнюю новость пользователя."""
-        async with self._lock:
-            self.user_last_news.pop(user_id, None)
+        session = await self.sessions.load(user_id)
+        if session is not None and session.news is not None:
+            session.news = None
+            self.sessions.mark_dirty(user_id)
     
     async def set_user_course(self, user_id: int, course: str) -> None:
         """Сохраняет текущий курс пользователя."""
-        async with self._lock:
-            self.user_current_course[user_id] = course
+        (await self.sessions.load_or_create(user_id)).course = course
+        self.sessions.mark_dirty(user_id)
     
     async def get_user_course(self, user_id: int) -> Optional[str]:
         """Получает текущий курс пользователя."""
-        async with self._lock:
-            return self.user_current_course.get(user_id)
+        session = await self.sessions.load(user_id)
+        return session.course if session else None
     
     async def set_quiz_state(self, user_id: int, state: Dict[str, Any]) -> None:
-        """Сохраняет состояние квиза для пользователя."""
-        async with self._lock:
-            self.user_quiz_state[user_id] = state
+        """Сохраняет состояние квиза для пользователя (и после изменения на месте)."""
+        (await self.sessions.load_or_create(user_id)).quiz = state
+        self.sessions.mark_dirty(user_id)
     
     async def get_quiz_state(self, user_id: int) -> Optional[Dict[str, Any]]:
         """Получает состояние квиза для пользователя."""
-        async with self._lock:
-            return self.user_quiz_state.get(user_id)
+        session = await self.sessions.load(user_id)
+        return session.quiz if session else None
     
     async def clear_quiz_state(self, user_id: int) -> None:
         """Очищает состояние квиза для пользователя."""
-        async with self._lock:
-            self.user_quiz_state.pop(user_id, None)
+        session = await self.sessions.load(user_id)
+        if session is not None and session.quiz is not None:
+            session.quiz = None
+            self.sessions.mark_dirty(user_id)
     
     async def record_feedback_attempt(self, request_id: int) -> int:
         """Записывает попытку фидбека и возвращает номер попытки."""
-        async with self._lock:
-            attempt: int = self.feedback_attempts.get(request_id, 0) + 1
-            self.feedback_attempts[request_id] = attempt
-            return attempt
+        return self.sessions.record_feedback_attempt(request_id)
     
     async def clear_feedback_attempts(self, request_id: int) -> None:
         """Очищает попытки фидбека."""
-        async with self._lock:
-            self.feedback_attempts.pop(request_id, None)
+        self.sessions.clear_feedback_attempts(request_id)
     
     async def cleanup_user_data(self, user_id: int) -> None:
         """Очищает все данные пользователя (при logout/ban)."""
-        async with self._lock:
-            self.user_last_request.pop(user_id, None)
-            self.user_last_news.pop(user_id, None)
-            self.user_current_course.pop(user_id, None)
-            self.user_quiz_state.pop(user_id, None)
-            logger.info(f"🧹 Очищены данные пользователя {user_id}")
+        self.sessions.drop(user_id)
+        logger.info(f"🧹 Очищены данные пользователя {user_id}")
     
     def get_stats(self) -> Dict[str, int]:
         """Возвращает статистику состояния бота."""
-        return {
-            "active_users": len(self.user_last_request),
-            "users_in_news": len(self.user_last_news),
-            "users_in_course": len(self.user_current_course),
-            "users_in_quiz": len(self.user_quiz_state),
-            "pending_feedback": len(self.feedback_attempts)
+        stats = {
+            "active_users": 0,
+            "users_in_news": 0,
+            "users_in_course": 0,
+            "users_in_quiz": 0,
         }
+        for session in self.sessions:
+            stats["active_users"] += session.last_request is not None
+            stats["users_in_news"] += session.news is not None
+            stats["users_in_course"] += session.course is not None
+            stats["users_in_quiz"] += session.quiz is not None
+        stats.update(self.sessions.stats())
+        return stats
     
     async def cleanup_expired_sessions(self, timeout_seconds: int = 3600) -> int:
         """
         Очищает сессии пользователей которые не активны более timeout_seconds.
         Возвращает количество очищенных сессий.
         
+        Сессии и так истекают лениво при обращении; обход идёт только по
+        истёкшим (они в начале LRU), а не по всем пользователям.
+        
         Args:
             timeout_seconds: Время неактивности после которого сессия считается истекшей (default 1 час)
         
         Returns:
             int: Количество очищенных сессий
         """
-        async with self._lock:
-            now: datetime = datetime.now()
-            expired_users: list = []
-            
-            # Найди пользователей с истекшей сессией
-            for user_id, last_request in list(self.user_last_request.items()):
-                time_elapsed: float = (now - last_request).total_seconds()
-                if time_elapsed > timeout_seconds:
-                    expired_users.append(user_id)
-            
-            # Очищаем каждого истекшего пользователя
-            for user_id in expired_users:
-                self.user_last_request.pop(user_id, None)
-                self.user_last_news.pop(user_id, None)
-                self.user_current_course.pop(user_id, None)
-                self.user_quiz_state.pop(user_id, None)
-            
-            if expired_users:
-                logger.info(f"🧹 Очищено {len(expired_users)} истекших сессий (timeout: {timeout_seconds}s)")
-            
-            return len(expired_users)
+        expired = self.sessions.expire(timeout_seconds)
+        if expired:
+            logger.info(f"🧹 Очищено {expired} истекших сессий (timeout: {timeout_seconds}s)")
+        return expired
+    
+    async def aflush(self) -> int:
+        """Сохраняет изменённые сессии в БД (если персистентность включена) в потоке."""
+        return await self.sessions.aflush()
+    
+    def flush(self) -> int:
+        """Синхронный aflush() - когда event loop уже остановлен."""
+        return self.sessions.flush()
 
 # Global instance
 bot_state: BotState = BotState()
 
+# =============================================================================
+# КОНКУРЕНТНАЯ ОБРАБОТКА АПДЕЙТОВ - параллельно между пользователями,
+# по порядку внутри пользователя (update_dispatcher.py)
+# =============================================================================
+
+def on_update_enqueued(update: object) -> None:
+    """
+    Новое текстовое сообщение в личке сразу отменяет ещё идущий AI-диалог
+    пользователя - иначе оно ждало бы его завершения в очереди пользователя.
+    """
+    if not isinstance(update, Update) or update.effective_user is None:
+        return
+    message = update.message
+    if (message is not None and message.text and not message.text.startswith("/")
+            and message.chat.type == ChatType.PRIVATE):
+        inflight.cancel(update.effective_user.id, DIALOGUE)
+
+
+# Callback-кнопки, LLM-вызов которых дедуплицируется через inflight.claim
+INFLIGHT_CALLBACK_PREFIXES = ("feedback_not_helpful_", "tell_more_")
+
+
+def is_duplicate_callback(update: object) -> bool:
+    """
+    Повторное нажатие кнопки, LLM-вызов которой ещё идёт: обрабатывается вне
+    очереди пользователя и сразу присоединяется к выполняющемуся вызову.
+    """
+    query = getattr(update, "callback_query", None)
+    return (query is not None and query.from_user is not None
+            and inflight.get(query.from_user.id, query.data) is not None)
+
+
+update_dispatcher: UpdateDispatcher = UpdateDispatcher(
+    max_concurrent=UPDATE_CONCURRENCY,
+    max_pending=UPDATE_MAX_PENDING,
+    resume_pending=UPDATE_RESUME_PENDING,
+    on_enqueue=on_update_enqueued,
+    unordered=is_duplicate_callback,
+)
+
 # =============================================================================
 # SCHEDULED TASKS (v0.24.0) - Периодические задачи для cleanup
 # =============================================================================
@@ -4758,6 +4973,15 @@ async def periodic_session_cleanup(context: ContextTypes.DEFAULT_TYPE) -> None:
         )
         logger.error(f"Ошибка в periodic_session_cleanup: {error.message}")
 
+async def periodic_session_flush(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Сохраняет изменённые сессии (квиз, регенерация, курс) в БД."""
+    try:
+        saved = await bot_state.aflush()
+        if saved:
+            logger.debug(f"💾 Сохранено сессий: {saved}")
+    except Exception as e:
+        logger.error(f"Ошибка в periodic_session_flush: {e}")
+
 async def periodic_metrics_snapshot(context: ContextTypes.DEFAULT_TYPE) -> None:
     """
     Периодически логирует снимок метрик бота (запускается каждые 6 часов).
@@ -4765,9 +4989,31 @@ async def periodic_metrics_snapshot(context: ContextTypes.DEFAULT_TYPE) -> None:
     """
     try:
         bot_metrics.log_metrics_snapshot(compact=True)  # ← Компактный режим
+        logger.info(f"🔁 LLM вызовы: {inflight.stats()}")
+        logger.info(f"⚡ Очередь апдейтов: {update_dispatcher.stats()}")
+        logger.info(f"📤 Исходящие: {outbound.stats()}")
+        logger.info(f"🧩 Render cache: {render_cache.stats()}")
+        logger.info(f"📦 Ленивые модули: {lazy_import_stats()}")
     except Exception as e:
         logger.error(f"Ошибка при логировании метрик: {e}")
 
+async def periodic_rollup_refresh(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """
+    Досворачивает новые bot_events в почасовые/дневные агрегаты (каждые 5 минут)
+    и удаляет устаревшие почасовые строки. Выполняется в потоке отчётов.
+    Перед этим записывает накопленный буфер событий (tracker.enqueue).
+    """
+    try:
+        tracker = get_tracker()
+        await run_report(tracker.flush)
+        rollups = get_rollups(tracker.db_path)
+        processed: int = await run_report(rollups.refresh)
+        pruned: int = await run_report(rollups.prune)
+        if processed or pruned:
+            logger.info(f"📈 Rollups: +{processed} событий, удалено {pruned} устаревших строк")
+    except Exception as e:
+        logger.error(f"Ошибка в periodic_rollup_refresh: {e}")
+
 # =============================================================================
 # MONITORING & METRICS (v0.24.0) - Отслеживание производительности бота
 # =============================================================================
@@ -5123,13 +5369,22 @@ def list_backups() -> List[Dict[str, Any]]:
     return backups
 
 async def check_subscription(user_id: int, context: ContextTypes.DEFAULT_TYPE) -> bool:
-    """Проверяет подписку на обязательный канал."""
+    """
+    Проверяет подписку на обязательный канал (общий кэш с check_channel_subscription).
+    
+    В отличие от check_channel_subscription при ошибке API не блокирует пользователя.
+    """
     if not MANDATORY_CHANNEL_ID:
         return True
     
+    store = get_subscription_cache()
+    state = store.get(user_id)
+    if state is not None:
+        return state.is_subscribed or state.source == SOURCE_ERROR
+    
     try:
         member = await context.bot.get_chat_member(MANDATORY_CHANNEL_ID, user_id)
-        is_subscribed = member.status in ['member', 'administrator', 'creator']
+        is_subscribed = store.record_check(user_id, member.status).is_subscribed
         
         if ENABLE_ANALYTICS:
             log_analytics_event("subscription_check", user_id, {
@@ -5141,6 +5396,7 @@ async def check_subscription(user_id: int, context: ContextTypes.DEFAULT_TYPE) -
         return is_subscribed
     except TelegramError as e:
         logger.error(f"Ошибка проверки подписки для {user_id}: {e}")
+        store.record_error(user_id)
         return True  # В случае ошибки не блокируем пользователя
 
 def validate_api_response(api_response: dict) -> Optional[str]:
@@ -6359,6 +6615,147 @@ async def add_bookmark_command(update: Update, context: ContextTypes.DEFAULT_TYP
         )
 
 
+# =============================================================================
+# СТАТИЧНЫЕ ЭКРАНЫ (render_cache): собираются один раз на язык
+# =============================================================================
+
+def _language_keyboard(*extra_rows: list) -> InlineKeyboardMarkup:
+    return InlineKeyboardMarkup([
+        [
+            InlineKeyboardButton("🇷🇺 Русский", callback_data="lang_ru"),
+            InlineKeyboardButton("🇺🇦 Українська", callback_data="lang_uk")
+        ],
+        *extra_rows
+    ])
+
+
+@render_cache.view("language_select")
+def build_language_select_view(language: str) -> RenderedView:
+    # Пользователь ещё не выбрал язык - подсказка всегда на русском
+    return RenderedView(t("language.select_prompt", "ru"), _language_keyboard())
+
+
+@render_cache.view("start")
+def build_start_view(language: str) -> RenderedView:
+    """Приветствие /start: поля greeting, remaining, max_requests, level, xp, courses, tests."""
+    separator = "━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━"
+    text = (
+        f"{t('start.title', language)}\n"
+        f"{t('start.subtitle', language)}\n\n"
+        f"{slot('start.greeting', language)}\n\n"
+        f"{t('start.path_header', language)}\n\n"
+        f"{t('start.feature_analyze', language)}\n\n"
+        f"{t('start.feature_learn', language)}\n\n"
+        f"{t('start.feature_tasks', language)}\n\n"
+        f"{t('start.feature_leaderboard', language)}\n\n"
+        f"{separator}\n"
+        f"{t('start.profile_header', language)}\n"
+        f"{slot('start.limits', language)}\n"
+        f"{slot('start.level', language)}\n"
+        f"{slot('start.progress', language)}\n"
+        f"{separator}\n\n"
+        f"{t('start.benefits_header', language)}\n"
+        f"{t('start.benefit_1', language)}\n"
+        f"{t('start.benefit_2', language)}\n"
+        f"{t('start.benefit_3', language)}\n"
+        f"{t('start.benefit_4', language)}\n"
+        f"{t('start.benefit_5', language)}\n\n"
+        f"{t('start.cta_header', language)}\n"
+        f"{t('start.cta_text', language)}\n\n"
+        f"{t('start.cta_help', language)}\n"
+    )
+    
+    # Интерактивные кнопки основных функций (v0.26.0 красивый дизайн)
+    rows = [
+        (("menu.teach", "start_teach"), ("menu.learn", "start_learn")),
+        (("menu.stats", "start_stats"), ("menu.leaderboard", "start_leaderboard")),
+        (("menu.profile", "start_profile"), ("menu.quests", "start_quests")),
+        (("menu.resources", "start_resources"), ("menu.bookmarks", "start_bookmarks")),
+        (("menu.calculator", "start_calculator"), ("menu.airdrops", "start_airdrops")),
+        (("menu.activities", "start_activities"), ("menu.history", "start_history")),
+        (("menu.settings", "settings_menu"), ("menu.help_button", "help_menu")),
+    ]
+    keyboard = InlineKeyboardMarkup([
+        [InlineKeyboardButton(translate(key, language), callback_data=data) for key, data in row]
+        for row in rows
+    ])
+    return RenderedView(text, keyboard, templated=True)
+
+
+@render_cache.view("start_bonus")
+def build_start_bonus_view(language: str) -> RenderedView:
+    if not MANDATORY_CHANNEL_ID:
+        return RenderedView("")
+    return RenderedView(f"\n{translate('start.bonus', language, channel_link=MANDATORY_CHANNEL_LINK)}\n")
+
+
+@render_cache.view("help")
+def build_help_view(language: str) -> RenderedView:
+    help_text = MSG_HELP_EXTENDED
+    if MANDATORY_CHANNEL_ID:
+        help_text += f"\n\n📢 <b>Официальный канал:</b>\n{MANDATORY_CHANNEL_LINK}"
+    keyboard = InlineKeyboardMarkup([
+        [
+            InlineKeyboardButton(translate("button.start_learning", language), callback_data="start_teach"),
+            InlineKeyboardButton(translate("button.quests", language), callback_data="start_tasks")
+        ],
+        [
+            InlineKeyboardButton(translate("button.statistics", language), callback_data="show_stats"),
+            InlineKeyboardButton(translate("button.back", language), callback_data="back_to_start")
+        ]
+    ])
+    return RenderedView(help_text, keyboard)
+
+
+@render_cache.view("menu")
+def build_menu_view(language: str) -> RenderedView:
+    keyboard = InlineKeyboardMarkup([
+        [
+            InlineKeyboardButton(translate("button.courses", language), callback_data="menu_learn"),
+            InlineKeyboardButton(translate("button.tools", language), callback_data="menu_tools")
+        ],
+        [
+            InlineKeyboardButton(translate("button.ask_question", language), callback_data="menu_ask"),
+            InlineKeyboardButton(translate("button.history_btn", language), callback_data="menu_history")
+        ],
+        [
+            InlineKeyboardButton(translate("button.help_btn", language), callback_data="menu_help"),
+            InlineKeyboardButton(translate("button.status_btn", language), callback_data="menu_stats")
+        ],
+        [
+            InlineKeyboardButton(translate("button.back", language), callback_data="back_to_start")
+        ]
+    ])
+    return RenderedView("📋 **Главное меню RVX**", keyboard)
+
+
+@render_cache.view("settings")
+def build_settings_view(language: str) -> RenderedView:
+    text = f"<b>{translate('settings.menu_title', language)}</b>\n\n{translate('settings.language_select', language)}"
+    back = InlineKeyboardButton(translate("menu.back_button", language), callback_data="back_to_start")
+    return RenderedView(text, _language_keyboard([back]))
+
+
+@render_cache.view("resources")
+def build_resources_view(language: str) -> RenderedView:
+    keyboard = [
+        [InlineKeyboardButton(category, callback_data=f"resources_cat_{i}")]
+        for i, category in enumerate(FREE_RESOURCES.keys())
+    ]
+    keyboard.append([InlineKeyboardButton("⬅️ Назад", callback_data="back_to_start")])
+    text = (
+        "📚 <b>БЕСПЛАТНЫЕ РЕСУРСЫ ДЛЯ КРИПТОВАЛЮТ, AI И WEB3</b>\n\n"
+        "Здесь собраны лучшие бесплатные инструменты и ресурсы для:\n"
+        "🪙 Изучения криптовалют\n"
+        "📊 Анализа и трейдинга\n"
+        "🤖 Работы с AI и ML\n"
+        "🏦 DeFi и Web3\n"
+        "💻 Разработки смарт-контрактов\n\n"
+        "<b>Выберите интересующую вас категорию:</b>"
+    )
+    return RenderedView(text, InlineKeyboardMarkup(keyboard))
+
+
 @log_command
 async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """
@@ -6393,19 +6790,11 @@ async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
         save_user(user_id, user.username or "", user.first_name)
         
         # Показываем меню выбора языка
-        selection_prompt = await get_text("language.select_prompt", language="ru")
-        
-        keyboard = [
-            [
-                InlineKeyboardButton("🇷🇺 Русский", callback_data="lang_ru"),
-                InlineKeyboardButton("🇺🇦 Українська", callback_data="lang_uk")
-            ]
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
+        selection = render_cache.get("language_select")
         
         await update.message.reply_text(
-            selection_prompt,
-            reply_markup=reply_markup,
+            selection.render(),
+            reply_markup=selection.reply_markup,
             parse_mode=ParseMode.HTML
         )
         return  # Выходим, дальше пользователь выбирает язык и мы снова вызовем start_command
@@ -6469,6 +6858,12 @@ async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
     # Сохраняем пользователя
     save_user(user_id, user.username or "", user.first_name)
     
+    # /start после блокировки бота - снова включаем пользователя в рассылки
+    try:
+        get_broadcast_engine(DB_PATH).unmark_blocked(user_id)
+    except sqlite3.Error as e:
+        logger.warning(f"Не удалось снять отметку блокировки рассылок для {user_id}: {e}")
+    
     is_banned, ban_reason = check_user_banned(user_id)
     if is_banned:
         await update.message.reply_text(
@@ -6521,153 +6916,47 @@ async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
     daily_quests = get_daily_quests_for_level(user_quest_level)
     
     # Получаем выполненные квесты за сегодня
-    from daily_quests_v2 import get_completed_quests_today, get_daily_quest_xp_earned
     with get_db() as conn:
-        completed_quests = get_completed_quests_today(user_id, conn)
-        daily_xp_earned = get_daily_quest_xp_earned(user_id, conn)
-    
-    # Форматируем топ 3 задачи для отображения
-    quests_preview = ""
-    if daily_quests:
-        completed_count = len(completed_quests)
-        quests_preview = f"<b>🎯 СЕГОДНЯШНИЕ ЗАДАЧИ ({completed_count}/5):</b>\n"
-        for idx, quest in enumerate(daily_quests[:3], 1):
-            # Проверяем как строку (т.к. completed_quests содержит строки)
-            quest_completed = "✅" if str(quest.get('id', '')) in completed_quests else "⭕"
-            quests_preview += f"{quest_completed} {idx}. {quest['title']} <b>({quest['xp']} XP)</b>\n"
-        
-        # Добавляем информацию о заработках
-        if completed_count > 0:
-            quests_preview += f"\n💰 Заработано сегодня: <b>{daily_xp_earned} XP</b>"
-        else:
-            quests_preview += "\n💡 Начни с первой задачи!"
-        quests_preview += "\n"
-    
-    welcome_text = ""
-    
-    # Получаем все текстовые строки с локализацией
-    title = await get_text("start.title", user_id)
-    subtitle = await get_text("start.subtitle", user_id)
-    greeting = await get_text("start.greeting", user_id, greeting=adaptive_greeting)
-    path_header = await get_text("start.path_header", user_id)
-    feature_analyze = await get_text("start.feature_analyze", user_id)
-    feature_learn = await get_text("start.feature_learn", user_id)
-    feature_tasks = await get_text("start.feature_tasks", user_id)
-    feature_leaderboard = await get_text("start.feature_leaderboard", user_id)
-    profile_header = await get_text("start.profile_header", user_id)
-    limits_text = await get_text("start.limits", user_id, remaining=remaining, max_requests=MAX_REQUESTS_PER_DAY)
-    level_text = await get_text("start.level", user_id, level=level_name, xp=user_xp)
-    progress_text = await get_text("start.progress", user_id, courses=courses_completed, tests=tests_passed)
-    benefits_header = await get_text("start.benefits_header", user_id)
-    benefit_1 = await get_text("start.benefit_1", user_id)
-    benefit_2 = await get_text("start.benefit_2", user_id)
-    benefit_3 = await get_text("start.benefit_3", user_id)
-    benefit_4 = await get_text("start.benefit_4", user_id)
-    benefit_5 = await get_text("start.benefit_5", user_id)
-    cta_header = await get_text("start.cta_header", user_id)
-    cta_text = await get_text("start.cta_text", user_id)
-    cta_help = await get_text("start.cta_help", user_id)
-    bonus = await get_text("start.bonus", user_id, channel_link=MANDATORY_CHANNEL_LINK) if MANDATORY_CHANNEL_ID else None
-    
-    # Формируем основной текст приветствия
-    welcome_text = (
-        f"{title}\n"
-        f"{subtitle}\n\n"
-        f"{greeting}\n\n"
-        f"{path_header}\n\n"
-        f"{feature_analyze}\n\n"
-        f"{feature_learn}\n\n"
-        f"{feature_tasks}\n\n"
-        f"{feature_leaderboard}\n\n"
-        f"━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━\n"
-        f"{profile_header}\n"
-        f"{limits_text}\n"
-        f"{level_text}\n"
-        f"{progress_text}\n"
-        f"━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━\n\n"
-        f"{benefits_header}\n"
-        f"{benefit_1}\n"
-        f"{benefit_2}\n"
-        f"{benefit_3}\n"
-        f"{benefit_4}\n"
-        f"{benefit_5}\n\n"
-        f"{cta_header}\n"
-        f"{cta_text}\n\n"
-        f"{cta_help}\n"
+        completed_quests, daily_xp_earned = get_quest_progress_today(user_id, conn)
+    
+    # Статичная часть приветствия и клавиатура собраны заранее (render_cache),
+    # подставляются только поля пользователя
+    start_view = render_cache.get("start", user_language)
+    welcome_text = start_view.render(
+        greeting=adaptive_greeting,
+        remaining=remaining,
+        max_requests=MAX_REQUESTS_PER_DAY,
+        level=level_name,
+        xp=user_xp,
+        courses=courses_completed,
+        tests=tests_passed,
     )
     
     # Добавляем квесты если есть
     if daily_quests:
         completed_count = len(completed_quests)
-        quests_header = await get_text("start.quests_header", user_id, completed=completed_count, total=5)
+        quests_header = await get_text("start.quests_header", language=user_language, completed=completed_count, total=5)
         welcome_text += f"\n{quests_header}\n"
         for idx, quest in enumerate(daily_quests[:3], 1):
+            # Проверяем как строку (т.к. completed_quests содержит строки)
             quest_completed = "✅" if str(quest.get('id', '')) in completed_quests else "⭕"
             welcome_text += f"{quest_completed} {idx}. {quest['title']} <b>({quest['xp']} XP)</b>\n"
         
         if completed_count > 0:
-            earnings = await get_text("start.quest_earnings", user_id, xp=daily_xp_earned)
+            earnings = await get_text("start.quest_earnings", language=user_language, xp=daily_xp_earned)
             welcome_text += f"\n{earnings}"
         else:
-            hint = await get_text("start.quest_start_hint", user_id)
+            hint = await get_text("start.quest_start_hint", language=user_language)
             welcome_text += f"\n{hint}"
         welcome_text += "\n"
     
     # Добавляем бонус если канал настроен
-    if bonus:
-        welcome_text += f"\n{bonus}\n"
-    
-    # Интерактивные кнопки основных функций (v0.26.0 красивый дизайн)
-    teach_btn = await get_text("menu.teach", user_id)
-    learn_btn = await get_text("menu.learn", user_id)
-    stats_btn = await get_text("menu.stats", user_id)
-    leaderboard_btn = await get_text("menu.leaderboard", user_id)
-    profile_btn = await get_text("menu.profile", user_id)
-    quests_btn = await get_text("menu.quests", user_id)
-    resources_btn = await get_text("menu.resources", user_id)
-    bookmarks_btn = await get_text("menu.bookmarks", user_id)
-    calculator_btn = await get_text("menu.calculator", user_id)
-    airdrops_btn = await get_text("menu.airdrops", user_id)
-    activities_btn = await get_text("menu.activities", user_id)
-    history_btn = await get_text("menu.history", user_id)
-    settings_btn = await get_text("menu.settings", user_id)
-    help_btn = await get_text("menu.help_button", user_id)
-    
-    keyboard = [
-        [
-            InlineKeyboardButton(teach_btn, callback_data="start_teach"),
-            InlineKeyboardButton(learn_btn, callback_data="start_learn")
-        ],
-        [
-            InlineKeyboardButton(stats_btn, callback_data="start_stats"),
-            InlineKeyboardButton(leaderboard_btn, callback_data="start_leaderboard")
-        ],
-        [
-            InlineKeyboardButton(profile_btn, callback_data="start_profile"),
-            InlineKeyboardButton(quests_btn, callback_data="start_quests")
-        ],
-        [
-            InlineKeyboardButton(resources_btn, callback_data="start_resources"),
-            InlineKeyboardButton(bookmarks_btn, callback_data="start_bookmarks")
-        ],
-        [
-            InlineKeyboardButton(calculator_btn, callback_data="start_calculator"),
-            InlineKeyboardButton(airdrops_btn, callback_data="start_airdrops")
-        ],
-        [
-            InlineKeyboardButton(activities_btn, callback_data="start_activities"),
-            InlineKeyboardButton(history_btn, callback_data="start_history")
-        ],
-        [
-            InlineKeyboardButton(settings_btn, callback_data="settings_menu"),
-            InlineKeyboardButton(help_btn, callback_data="help_menu")
-        ]
-    ]
+    welcome_text += render_cache.get("start_bonus", user_language).render()
     
     await update.message.reply_text(
         welcome_text,
         parse_mode=ParseMode.HTML,
-        reply_markup=InlineKeyboardMarkup(keyboard)
+        reply_markup=start_view.reply_markup
     )
 
 @log_command
@@ -6693,29 +6982,10 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
     tracker = get_tracker()
     tracker.track(create_event(EventType.USER_HELP, user_id=user_id))
     
-    help_text = MSG_HELP_EXTENDED
-    
-    if MANDATORY_CHANNEL_ID:
-        help_text += f"\n\n📢 <b>Официальный канал:</b>\n{MANDATORY_CHANNEL_LINK}"
-    
-    start_learning_btn = await get_text("button.start_learning", user_id)
-    quests_btn = await get_text("button.quests", user_id)
-    stats_btn = await get_text("button.statistics", user_id)
-    back_btn = await get_text("button.back", user_id)
-    
-    keyboard = [
-        [
-            InlineKeyboardButton(start_learning_btn, callback_data="start_teach"),
-            InlineKeyboardButton(quests_btn, callback_data="start_tasks")
-        ],
-        [
-            InlineKeyboardButton(stats_btn, callback_data="show_stats"),
-            InlineKeyboardButton(back_btn, callback_data="back_to_start")
-        ]
-    ]
+    help_view = render_cache.get("help", get_user_lang(user_id))
     
     try:
-        await send_html_message(update, help_text, InlineKeyboardMarkup(keyboard))
+        await send_html_message(update, help_view.render(), help_view.reply_markup)
     except Exception as e:
         logger.error(f"Ошибка при отправке справки: {e}")
 
@@ -6890,37 +7160,12 @@ async def context_stats_command(update: Update, context: ContextTypes.DEFAULT_TY
 async def menu_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Показывает главное меню с быстрыми действиями (команда /menu)."""
     user_id = update.effective_user.id
-    
-    courses_btn = await get_text("button.courses", user_id)
-    tools_btn = await get_text("button.tools", user_id)
-    ask_btn = await get_text("button.ask_question", user_id)
-    history_btn = await get_text("button.history_btn", user_id)
-    help_btn = await get_text("button.help_btn", user_id)
-    status_btn = await get_text("button.status_btn", user_id)
-    back_btn = await get_text("button.back", user_id)
-    
-    keyboard = [
-        [
-            InlineKeyboardButton(courses_btn, callback_data="menu_learn"),
-            InlineKeyboardButton(tools_btn, callback_data="menu_tools")
-        ],
-        [
-            InlineKeyboardButton(ask_btn, callback_data="menu_ask"),
-            InlineKeyboardButton(history_btn, callback_data="menu_history")
-        ],
-        [
-            InlineKeyboardButton(help_btn, callback_data="menu_help"),
-            InlineKeyboardButton(status_btn, callback_data="menu_stats")
-        ],
-        [
-            InlineKeyboardButton(back_btn, callback_data="back_to_start")
-        ]
-    ]
+    menu_view = render_cache.get("menu", get_user_lang(user_id))
 
     try:
         await update.message.reply_text(
-            "📋 **Главное меню RVX**",
-            reply_markup=InlineKeyboardMarkup(keyboard),
+            menu_view.render(),
+            reply_markup=menu_view.reply_markup,
             parse_mode=ParseMode.MARKDOWN
         )
     except Exception:
@@ -6945,8 +7190,11 @@ async def admin_metrics_command(update: Update, context: ContextTypes.DEFAULT_TY
     try:
         # Получаем dashboard
         dashboard = get_admin_dashboard()
-        metrics = dashboard.get_dashboard_metrics(hours=24)
+        # Тяжёлые агрегаты - в потоке отчётов, event loop не блокируется
+        metrics = await run_report(dashboard.get_dashboard_metrics, hours=24)
         dashboard_text = dashboard.format_dashboard_for_telegram(metrics)
+        dashboard_text += format_lesson_cache_stats() + format_knowledge_base_stats() + format_prompt_budget_stats()
+        dashboard_text += format_gamification_stats()
         
         # Отправляем dashboard
         await update.message.reply_text(
@@ -7001,7 +7249,13 @@ async def stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
         # NEW v0.14.0: Получаем информацию о лимитах
         remaining, total_limit, tier_name = get_remaining_requests(cursor, user_id)
     
-    stats = get_global_stats()
+    try:
+        stats = await run_report(get_global_stats)
+    except (ReportTimeoutError, ReportsBusyError) as e:
+        logger.warning(f"Глобальная статистика недоступна: {e}")
+        message = update.callback_query.message if is_callback else update.message
+        await message.reply_text(e.to_user_message())
+        return
     
     # Get localized texts
     your_stats = await get_text("stats.user_statistics", user_id)
@@ -7397,7 +7651,7 @@ async def lesson_command(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         return
     
     # Проверяем, есть ли текущий курс у пользователя
-    if user_id not in bot_state.user_current_course:
+    if not await bot_state.get_user_course(user_id):
         await update.message.reply_text(
             "❌ <b>Сначала выберите курс!</b>\n\n"
             "Доступные команды:\n"
@@ -7443,21 +7697,17 @@ async def lesson_command(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         )
         return
     
-    # Получаем контент урока
-    lesson_content = get_lesson_content(course_name, lesson_num)
+    # Получаем урок из индекса курсов: уже очищенный и разделённый на текст и quiz
+    lesson_view = get_lesson_view(course_name, lesson_num)
     
-    if not lesson_content:
+    if not lesson_view:
         await update.message.reply_text(
             "❌ <b>Урок не найден</b>",
             parse_mode=ParseMode.HTML
         )
         return
     
-    # Очищаем контент от проблемных символов
-    lesson_content = clean_lesson_content(lesson_content)
-    
-    # Разделяем контент на основной текст и quiz
-    lesson_text, quiz_section = split_lesson_content(lesson_content)
+    lesson_text, quiz_section = lesson_view
     
     # Форматируем и отправляем урок (БЕЗ quiz секции)
     # Ограничиваем размер (Telegram лимит 4096 символов)
@@ -8017,38 +8267,20 @@ FREE_RESOURCES = {
 
 async def show_resources_menu(update: Update, query: Optional[CallbackQuery] = None) -> None:
     """Показывает главное меню ресурсов с категориями."""
-    keyboard = []
-    
-    # Создаём кнопки для каждой категории
-    for i, category in enumerate(FREE_RESOURCES.keys()):
-        callback_key = f"resources_cat_{i}"
-        keyboard.append([InlineKeyboardButton(category, callback_data=callback_key)])
-    
-    keyboard.append([InlineKeyboardButton("⬅️ Назад", callback_data="back_to_start")])
-    
-    text = (
-        "📚 <b>БЕСПЛАТНЫЕ РЕСУРСЫ ДЛЯ КРИПТОВАЛЮТ, AI И WEB3</b>\n\n"
-        "Здесь собраны лучшие бесплатные инструменты и ресурсы для:\n"
-        "🪙 Изучения криптовалют\n"
-        "📊 Анализа и трейдинга\n"
-        "🤖 Работы с AI и ML\n"
-        "🏦 DeFi и Web3\n"
-        "💻 Разработки смарт-контрактов\n\n"
-        "<b>Выберите интересующую вас категорию:</b>"
-    )
+    resources_view = render_cache.get("resources")
     
     try:
         if query:
             await query.edit_message_text(
-                text,
+                resources_view.render(),
                 parse_mode=ParseMode.HTML,
-                reply_markup=InlineKeyboardMarkup(keyboard)
+                reply_markup=resources_view.reply_markup
             )
         else:
             await update.message.reply_text(
-                text,
+                resources_view.render(),
                 parse_mode=ParseMode.HTML,
-                reply_markup=InlineKeyboardMarkup(keyboard)
+                reply_markup=resources_view.reply_markup
             )
     except Exception as e:
         logger.error(f"Ошибка при отправке меню ресурсов: {e}")
@@ -8214,38 +8446,25 @@ async def ask_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> Non
 
 # ════════════════ СИСТЕМА ДОСТИЖЕНИЙ (BADGES) v0.37.0 ════════════════
 
-ACHIEVEMENT_BADGES = {
-    'first_lesson': {
-        'name': '🎓 Первый шаг',
-        'emoji': '🎓',
-        'description': 'Пройди первый урок',
-        'condition': lambda completed, xp: len(completed) > 0
-    },
-    'expert_hunter': {
-        'name': '💎 Охотник за экспертизой',
-        'emoji': '💎',
-        'description': 'Пройди 5 уроков на уровне expert',
-        'condition': lambda completed, xp: sum(1 for t in completed.values() if 'expert' in t.get('difficulties', [])) >= 5
-    },
-    'topic_master': {
-        'name': '🏆 Мастер темы',
-        'emoji': '🏆',
-        'description': 'Пройди все уровни одной темы',
-        'condition': lambda completed, xp: any(len(t.get('difficulties', [])) == 4 for t in completed.values())
-    },
-    'all_rounder': {
-        'name': '🌟 Всесторонний специалист',
-        'emoji': '🌟',
-        'description': 'Пройди уроки по 5 разным темам',
-        'condition': lambda completed, xp: len(completed) >= 5
-    },
-    'xp_collector': {
-        'name': '⚡ Сборщик XP',
-        'emoji': '⚡',
-        'description': 'Накопи 500+ XP',
-        'condition': lambda completed, xp: xp >= 500
-    },
-}
+# Правила бейджей (ACHIEVEMENT_BADGES), уровней и задач считает gamification_engine
+# по снимку прогресса; запись XP, урока, задач и бейджей - одна транзакция
+gamification = GamificationEngine(get_db)
+
+# Пользователи, чей XP изменился после последнего пересчёта рейтинга
+leaderboard_changes: set = set()
+
+def on_gamification_event(event) -> None:
+    """Изменение XP делает кэш рейтинга устаревшим (см. update_leaderboard_cache)."""
+    if event.kind == EVENT_XP:
+        leaderboard_changes.add(event.user_id)
+
+gamification.subscribe(on_gamification_event)
+
+def add_xp_to_user(cursor, user_id: int, xp_amount: int, reason: str = "") -> None:
+    """education.add_xp_to_user + отметка для рейтинга (XP мимо gamification: задачи, квизы, уроки курсов)."""
+    education_add_xp_to_user(cursor, user_id, xp_amount, reason)
+    if xp_amount:
+        leaderboard_changes.add(user_id)
 
 def check_and_award_badges(user_id: int) -> list:
     """Проверяет и выдаёт новые badge'и пользователю.
@@ -8253,54 +8472,8 @@ def check_and_award_badges(user_id: int) -> list:
     Returns:
         list: Список новых полученных badge'ей [{'badge_id': ..., 'name': ...}, ...]
     """
-    new_badges = []
-    try:
-        completed = get_completed_topics(user_id)
-        
-        with get_db() as conn:
-            cursor = conn.cursor()
-            cursor.execute("SELECT xp FROM users WHERE user_id = ?", (user_id,))
-            result = cursor.fetchone()
-            user_xp = result[0] if result else 0
-        
-        # Получаем уже выданные badge'и пользователю
-        with get_db() as conn:
-            cursor = conn.cursor()
-            try:
-                cursor.execute("SELECT badge_id FROM user_badges WHERE user_id = ?", (user_id,))
-                earned_badges = set(row[0] for row in cursor.fetchall())
-            except sqlite3.OperationalError:
-                # Таблица не существует - пропускаем проверку badges
-                logger.debug(f"Таблица user_badges не существует, пропускаем проверку badges")
-                return new_badges
-        
-        # Проверяем каждый badge
-        for badge_id, badge_info in ACHIEVEMENT_BADGES.items():
-            if badge_id not in earned_badges:
-                # Проверяем условие badge'а
-                if badge_info['condition'](completed, user_xp):
-                    # Выдаём новый badge
-                    try:
-                        with get_db() as conn:
-                            cursor = conn.cursor()
-                            cursor.execute("""
-                                INSERT INTO user_badges (user_id, badge_id, badge_name, badge_emoji, badge_description, condition_met)
-                                VALUES (?, ?, ?, ?, ?, ?)
-                            """, (user_id, badge_id, badge_info['name'], badge_info['emoji'], badge_info['description'], 'auto_detected'))
-                        
-                        new_badges.append({
-                            'badge_id': badge_id,
-                            'name': badge_info['name'],
-                            'emoji': badge_info['emoji'],
-                            'description': badge_info['description']
-                        })
-                        logger.info(f"🏅 Новый badge для {user_id}: {badge_id}")
-                    except sqlite3.OperationalError:
-                        logger.debug(f"Не удалось выдать badge {badge_id} (таблица не готова)")
-    except Exception as e:
-        logger.warning(f"Ошибка при проверке badge'ей: {e}")
-    
-    return new_badges
+    result = gamification.process(user_id)
+    return result.new_badges if result else []
 
 def get_user_badges(user_id: int) -> list:
     """Получает все badge'и пользователя."""
@@ -8355,7 +8528,7 @@ def get_completed_topics(user_id: int) -> dict:
     
     return completed
 
-def get_recommended_lesson(user_id: int) -> dict:
+def get_recommended_lesson(user_id: int, snapshot=None) -> dict:
     """Рекомендует следующий урок на основе пройденных уроков и XP.
     
     Логика рекомендаций:
@@ -8363,18 +8536,18 @@ def get_recommended_lesson(user_id: int) -> dict:
     2. Если все сложности пройдены, рекомендовать новую тему
     3. Использовать XP для определения оптимального уровня сложности
     
+    Args:
+        snapshot: ProgressSnapshot из gamification, если уже прочитан (без запросов к БД)
+    
     Returns:
         dict: {'topic': str, 'difficulty': str, 'reason': str} или {} если нет рекомендаций
     """
     try:
-        completed = get_completed_topics(user_id)
-        
-        # Получаем XP пользователя для определения сложности
-        with get_db() as conn:
-            cursor = conn.cursor()
-            cursor.execute("SELECT xp FROM users WHERE user_id = ?", (user_id,))
-            result = cursor.fetchone()
-            user_xp = result[0] if result else 0
+        if snapshot is None:
+            snapshot = gamification.snapshot(user_id)
+        completed = snapshot.completed if snapshot else {}
+        # XP пользователя определяет сложность
+        user_xp = snapshot.xp if snapshot else 0
         
         # 🎯 Стратегия рекомендации:
         # XP < 100: beginner
@@ -8489,9 +8662,6 @@ async def _launch_teaching_lesson(update: Update, context: ContextTypes.DEFAULT_
                 logger.debug("Could not edit message (already deleted)")
             return
         
-        # Обновляем ежедневную задачу по обучению (v0.11.0)
-        update_task_progress(user_id, "lessons_2", 1)
-        
         # Форматируем ответ
         title = lesson.get('lesson_title', 'Урок')
         content = lesson.get('content', '')[:1000]  # Сокращаем до 1000 символов
@@ -8538,28 +8708,18 @@ async def _launch_teaching_lesson(update: Update, context: ContextTypes.DEFAULT_
             reply_markup=InlineKeyboardMarkup(keyboard)
         )
         
-        # Даем XP за прохождение урока и отслеживаем в БД (v0.37.0)
+        # XP за урок, запись урока, ежедневная задача "lessons_2" (v0.11.0),
+        # уровень и бейджи - одной транзакцией (gamification_engine)
         xp_reward = XP_REWARDS.get('lesson_completed', 50)
-        with get_db() as conn:
-            cursor = conn.cursor()
-            add_xp_to_user(cursor, user_id, xp_reward, "completed_teaching_lesson")
-            
-            # ✅ NEW v0.37.0: Отслеживаем пройденный урок в БД
-            try:
-                # Используем INSERT OR REPLACE для обновления существующей записи
-                cursor.execute("""
-                    INSERT OR REPLACE INTO teaching_lessons (user_id, topic, difficulty, title, xp_earned, quiz_passed, repeat_count, completed_at)
-                    SELECT ?, ?, ?, ?, ?, 1, COALESCE(repeat_count, 0) + 1, CURRENT_TIMESTAMP
-                    FROM (
-                        SELECT repeat_count FROM teaching_lessons 
-                        WHERE user_id = ? AND topic = ? AND difficulty = ?
-                        UNION ALL SELECT 0
-                        LIMIT 1
-                    )
-                """, (user_id, topic, difficulty, title, xp_reward, user_id, topic, difficulty))
-                logger.debug(f"✅ Урок отслежен: user_id={user_id}, topic={topic}, difficulty={difficulty}")
-            except Exception as e:
-                logger.warning(f"Ошибка отслеживания урока: {e}")
+        result = gamification.process(
+            user_id, xp_reward, "completed_teaching_lesson",
+            lesson={"topic": topic, "difficulty": difficulty, "title": title},
+            tasks={"lessons_2": 1}
+        )
+        if result:
+            # Новые бейджи и снимок прогресса нужны кнопке "✅ Понял!" (без повторного чтения БД)
+            context.user_data.setdefault("new_badges", []).extend(result.new_badges)
+            context.user_data["progress_snapshot"] = result.snapshot
         
         if ENABLE_ANALYTICS:
             log_analytics_event("teaching_lesson", user_id, {
@@ -8703,15 +8863,11 @@ async def learn_progress_command(update: Update, context: ContextTypes.DEFAULT_T
     logger.info(f"📊 Пользователь {user_id} открыл прогресс обучения")
     
     try:
-        completed = get_completed_topics(user_id)
+        snapshot = gamification.snapshot(user_id)
+        completed = snapshot.completed if snapshot else {}
+        user_xp = snapshot.xp if snapshot else 0
         badges = get_user_badges(user_id)
-        recommended = get_recommended_lesson(user_id)
-        
-        with get_db() as conn:
-            cursor = conn.cursor()
-            cursor.execute("SELECT xp FROM users WHERE user_id = ?", (user_id,))
-            result = cursor.fetchone()
-            user_xp = result[0] if result else 0
+        recommended = get_recommended_lesson(user_id, snapshot)
         
         # Формируем сообщение с прогрессом
         lines = [
@@ -8903,27 +9059,15 @@ async def test_digest_command(update: Update, context: ContextTypes.DEFAULT_TYPE
 @log_command
 async def admin_stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Детальная статистика для администраторов."""
-    stats = get_global_stats()
-    
-    with get_db() as conn:
-        cursor = conn.cursor()
-        
-        # Активные пользователи (запросы за последние 7 дней)
-        cursor.execute("""
-            SELECT COUNT(DISTINCT user_id) FROM requests
-            WHERE created_at >= datetime('now', '-7 days')
-        """)
-        active_users = cursor.fetchone()[0]
-        
-        # Ошибки
-        cursor.execute("""
-            SELECT COUNT(*) FROM requests WHERE error_message IS NOT NULL
-        """)
-        error_count = cursor.fetchone()[0]
-        
-        # Заблокированные
-        cursor.execute("SELECT COUNT(*) FROM users WHERE is_banned = 1")
-        banned_count = cursor.fetchone()[0]
+    try:
+        stats = await run_report(_collect_admin_stats)
+    except (ReportTimeoutError, ReportsBusyError) as e:
+        logger.warning(f"Админ-статистика недоступна: {e}")
+        await update.message.reply_text(e.to_user_message())
+        return
+    active_users = stats["active_users"]
+    error_count = stats["error_count"]
+    banned_count = stats["banned_count"]
     
     cache_hit_rate = 0
     if stats['total_requests'] > 0:
@@ -8971,6 +9115,23 @@ async def admin_stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE
         f"{feedback_not_helpful}\n"
     )
     
+    # Сэкономленные вызовы LLM: повторные нажатия и отменённые диалоги
+    llm_calls = inflight.stats()
+    admin_text += (
+        f"\n🔁 LLM: выполняется {llm_calls['in_flight']}, "
+        f"повторов присоединено {llm_calls['deduped']}, отменено {llm_calls['cancelled']}\n"
+    )
+    updates = update_dispatcher.stats()
+    admin_text += (
+        f"⚡ Апдейты: в очереди {updates['pending']} (макс. {updates['max_depth']}), "
+        f"ожидание p95 {updates['wait_p95_ms']} мс, backpressure {updates['backpressure_pauses']}\n"
+    )
+    sends = outbound.stats()
+    admin_text += (
+        f"📤 Исходящие: в очереди {sends['pending']}, задержка p95 {sends['latency_p95_ms']} мс, "
+        f"объединено правок {sends['coalesced']}, отброшено {sends['dropped']}, ошибок {sends['failed']}\n"
+    )
+    
     await update.message.reply_text(admin_text, parse_mode=ParseMode.MARKDOWN)
 
 @admin_only
@@ -9059,7 +9220,7 @@ async def clear_cache_command(update: Update, context: ContextTypes.DEFAULT_TYPE
     user_id = update.effective_user.id
     language = update.effective_user.language_code or "ru"
     
-    with get_db() as conn:
+    with get_db(ROUTE_CACHE) as conn:
         cursor = conn.cursor()
         cursor.execute("SELECT COUNT(*) FROM cache")
         cache_size = cursor.fetchone()[0]
@@ -9076,56 +9237,81 @@ async def clear_cache_command(update: Update, context: ContextTypes.DEFAULT_TYPE
 @admin_only
 @log_command
 async def broadcast_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    """Рассылка сообщения всем пользователям."""
+    """
+    Рассылка сообщения всем пользователям.
+    
+    Рассылка идёт в фоне через BroadcastEngine: общий token bucket под лимиты
+    Bot API, ограниченная параллельность, учёт RetryAfter, курсор в БД
+    (продолжается после перезапуска) и пропуск заблокировавших бота.
+    Прогресс обновляется в статус-сообщении.
+    """
     if not context.args:
         text = await get_text("error.broadcast_format", update.effective_user.id)
         await update.message.reply_text(f"❌ {text}")
         return
     
     message = " ".join(context.args)
+    admin_id = update.effective_user.id
+    engine = get_broadcast_engine(DB_PATH)
     
-    with get_db() as conn:
-        cursor = conn.cursor()
-        cursor.execute("""
-            SELECT user_id FROM users WHERE is_banned = 0
-        """)
-        users = cursor.fetchall()
-    
-    sent = 0
-    failed = 0
+    job_id = engine.create_job(
+        f"📢 **Объявление от администрации:**\n\n{message}",
+        created_by=admin_id,
+        parse_mode=ParseMode.MARKDOWN
+    )
+    job = engine.get_job(job_id)
+    if job is None:
+        logger.error(f"Рассылка #{job_id} не найдена сразу после создания")
+        await update.message.reply_text(f"❌ Не удалось запустить рассылку #{job_id}")
+        return
     
     status_msg = await update.message.reply_text(
-        f"📢 Начинаю рассылку для {len(users)} пользователей..."
+        f"📢 Начинаю рассылку #{job_id} для {job.total} пользователей..."
     )
+    engine.set_status_message(job_id, status_msg.chat_id, status_msg.message_id)
     
-    for (user_id,) in users:
-        try:
-            await context.bot.send_message(
-                chat_id=user_id,
-                text=f"📢 **Объявление от администрации:**\n\n{message}",
-                parse_mode=ParseMode.MARKDOWN
-            )
-            sent += 1
-            
-            # Небольшая задержка, чтобы не превысить rate limits Telegram
-            if sent % 20 == 0:
-                await asyncio.sleep(1)
+    async def on_progress(job, rate: float) -> None:
+        # Правки прогресса, не успевшие уйти, объединяются в очереди исходящих
+        outbound.edit(
+            context.bot, status_msg.chat_id, status_msg.message_id,
+            format_progress(job, rate), parse_mode=ParseMode.HTML
+        )
         
+        if job.status != "running":
+            log_analytics_event("broadcast_sent", admin_id, {
+                "job_id": job.id,
+                "sent": job.sent,
+                "failed": job.failed,
+                "blocked": job.blocked,
+                "message_length": len(message)
+            })
+    
+    engine.start_job(context.bot, job_id, on_progress)
+
+
+async def resume_broadcasts(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Продолжает рассылки, прерванные перезапуском бота (с сохранённого курсора)."""
+    bot_instance = context.bot
+    
+    async def on_progress(job, rate: float) -> None:
+        if not job.status_chat_id or not job.status_message_id:
+            return
+        try:
+            await bot_instance.edit_message_text(
+                chat_id=job.status_chat_id,
+                message_id=job.status_message_id,
+                text=format_progress(job, rate),
+                parse_mode=ParseMode.HTML
+            )
         except TelegramError as e:
-            logger.warning(f"Не удалось отправить {user_id}: {e}")
-            failed += 1
-    
-    await status_msg.edit_text(
-        f"✅ **Рассылка завершена**\n\n"
-        f"• Отправлено: {sent}\n"
-        f"• Не удалось: {failed}"
-    )
+            logger.debug(f"Не удалось обновить прогресс рассылки #{job.id}: {e}")
     
-    log_analytics_event("broadcast_sent", update.effective_user.id, {
-        "sent": sent,
-        "failed": failed,
-        "message_length": len(message)
-    })
+    try:
+        resumed = get_broadcast_engine(DB_PATH).resume_unfinished(bot_instance, on_progress)
+        if resumed:
+            logger.info(f"🔁 Возобновлено рассылок: {len(resumed)}")
+    except sqlite3.Error as e:
+        logger.error(f"❌ Не удалось возобновить рассылки: {e}")
 
 
 async def post_to_channel_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -9531,39 +9717,45 @@ async def activities_command(update: Update, context: ContextTypes.DEFAULT_TYPE)
 # QUIZ SYSTEM (v0.19.0) - ФУНКЦИИ ДЛЯ РАБОТЫ С ТЕСТАМИ
 # =============================================================================
 
+async def get_quiz_session(context: ContextTypes.DEFAULT_TYPE, user_id: int) -> Optional[Dict[str, Any]]:
+    """
+    Сессия квиза из context.user_data, а после перезапуска бота -
+    из bot_state (сохранённая копия).
+    """
+    quiz_session = context.user_data.get('quiz_session')
+    if quiz_session is None:
+        quiz_session = await bot_state.get_quiz_state(user_id)
+        if quiz_session is not None:
+            context.user_data['quiz_session'] = quiz_session
+    return quiz_session
+
+
+async def save_quiz_session(context: ContextTypes.DEFAULT_TYPE, user_id: int, quiz_session: Dict[str, Any]) -> None:
+    """Сохраняет сессию квиза в context.user_data и bot_state."""
+    context.user_data['quiz_session'] = quiz_session
+    await bot_state.set_quiz_state(user_id, quiz_session)
+
+
+async def clear_quiz_session(context: ContextTypes.DEFAULT_TYPE, user_id: int) -> None:
+    """Удаляет сессию квиза отовсюду."""
+    context.user_data.pop('quiz_session', None)
+    await bot_state.clear_quiz_state(user_id)
+
+
 async def show_quiz_for_lesson(update: Update, context: ContextTypes.DEFAULT_TYPE, course_name: str, lesson_num: int) -> None:
     """Показывает первый вопрос квиза для урока."""
     query = update.callback_query
     user = query.from_user
     
     try:
-        # Получаем контент урока с включением раздела тестов
-        lesson_content = get_lesson_content(course_name, lesson_num, include_tests=True)
+        # Вопросы из индекса курсов: quiz урока или раздел "ТЕСТЫ К КУРСУ"
+        questions = get_lesson_quiz(course_name, lesson_num)
         
-        if not lesson_content:
+        if questions is None:
             logger.error(f"Урок не найден: {course_name}, lesson {lesson_num}")
             await query.answer("❌ Урок не найден", show_alert=True)
             return
         
-        logger.info(f"Контент загружен: {len(lesson_content)} символов")
-        
-        # Извлекаем вопросы из quiz раздела
-        _, quiz_text = split_lesson_content(lesson_content)
-        
-        logger.info(f"Quiz текст: {len(quiz_text)} символов")
-        
-        # Если quiz не найден в уроке, ищем в разделе "ТЕСТЫ К КУРСУ"
-        if not quiz_text:
-            logger.info(f"⚠️ Quiz текст пуст, ищем в разделе ТЕСТЫ К КУРСУ для урока {lesson_num}")
-            questions = extract_quiz_from_lesson(
-                "",  # пустой quiz_text
-                lesson_number=lesson_num,
-                full_course_content=lesson_content  # передаем полный контент
-            )
-        else:
-            logger.info(f"Найден quiz текст, извлекаем вопросы")
-            questions = extract_quiz_from_lesson(quiz_text)
-        
         logger.info(f"Найдено вопросов: {len(questions)}")
         
         if not questions:
@@ -9571,15 +9763,15 @@ async def show_quiz_for_lesson(update: Update, context: ContextTypes.DEFAULT_TYP
             await query.answer("❌ Вопросы не найдены", show_alert=True)
             return
         
-        # Сохраняем сессию квиза в context
-        context.user_data['quiz_session'] = {
+        # Сохраняем сессию квиза в context и bot_state
+        await save_quiz_session(context, user.id, {
             'course': course_name,
             'lesson': lesson_num,
             'questions': questions,
             'current_q': 0,
             'responses': [],
             'correct_count': 0
-        }
+        })
         
         logger.info(f"Сессия квиза создана, переходим к первому вопросу")
         
@@ -9597,7 +9789,7 @@ async def show_quiz_question(update: Update, context: ContextTypes.DEFAULT_TYPE)
     user = query.from_user
     
     try:
-        quiz_session = context.user_data.get('quiz_session')
+        quiz_session = await get_quiz_session(context, user.id)
         
         if not quiz_session:
             logger.error(f"Сессия квиза потеряна")
@@ -9710,7 +9902,7 @@ async def handle_quiz_answer(update: Update, context: ContextTypes.DEFAULT_TYPE,
     query = update.callback_query
     user = query.from_user
     
-    quiz_session = context.user_data.get('quiz_session')
+    quiz_session = await get_quiz_session(context, user.id)
     
     if not quiz_session:
         await query.answer("❌ Сессия квиза потеряна", show_alert=True)
@@ -9757,6 +9949,7 @@ async def handle_quiz_answer(update: Update, context: ContextTypes.DEFAULT_TYPE,
     
     # Переходим к следующему вопросу
     quiz_session['current_q'] += 1
+    await save_quiz_session(context, user.id, quiz_session)
     
     keyboard = [[InlineKeyboardButton(next_btn, callback_data=f"quiz_next_{course_name}_{lesson_id}")]]
     
@@ -9772,7 +9965,7 @@ async def show_quiz_results(update: Update, context: ContextTypes.DEFAULT_TYPE)
     query = update.callback_query
     user = query.from_user
     
-    quiz_session = context.user_data.get('quiz_session')
+    quiz_session = await get_quiz_session(context, user.id)
     
     if not quiz_session:
         await query.answer("❌ Сессия квиза потеряна", show_alert=True)
@@ -9887,8 +10080,7 @@ async def show_quiz_results(update: Update, context: ContextTypes.DEFAULT_TYPE)
     )
     
     # Очищаем сессию
-    if 'quiz_session' in context.user_data:
-        del context.user_data['quiz_session']
+    await clear_quiz_session(context, user.id)
 
 
 # =============================================================================
@@ -10007,9 +10199,12 @@ async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         None
     """
     query = update.callback_query
-    await query.answer()
-    
     data = query.data
+    # Кнопки с LLM-вызовом отвечают сами после inflight.claim, чтобы повторное
+    # нажатие получило «уже готовлю» - на callback можно ответить только раз
+    if not data.startswith(INFLIGHT_CALLBACK_PREFIXES):
+        await query.answer()
+    
     user = query.from_user
     user_id = user.id
     
@@ -10024,6 +10219,8 @@ async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         is_subscribed = await check_channel_subscription(user_id, context)
         if not is_subscribed:
             logger.info(f"User {user_id} clicked button without channel subscription")
+            if data.startswith(INFLIGHT_CALLBACK_PREFIXES):
+                await query.answer()
             
             # Отправляем сообщение с кнопкой для подписки
             keyboard = [
@@ -10060,14 +10257,9 @@ async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
             # Подтверждаем нажатие кнопки
             await query.answer()
             
-            # Очищаем кэш подписки для этого пользователя
-            logger.info(f"Clearing subscription cache for user {user_id}")
-            if user_id in _subscription_cache:
-                del _subscription_cache[user_id]
-            
-            # Проверяем подписку еще раз
+            # Проверяем подписку еще раз через API, минуя кэш и состояния из событий
             logger.info(f"Re-checking subscription for user {user_id}...")
-            is_subscribed = await check_channel_subscription(user_id, context)
+            is_subscribed = await check_channel_subscription(user_id, context, force=True)
             logger.info(f"SUBSCRIPTION RESULT: {is_subscribed} for user {user_id}")
             
             if is_subscribed:
@@ -10699,24 +10891,11 @@ async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         logger.info(f"⚙️ Settings menu for user {user_id}, current language: {user_language}")
         
         try:
-            settings_text = await get_text("settings.menu_title", user_id)
-            lang_select_text = await get_text("settings.language_select", user_id)
-            back_text = await get_text("menu.back_button", user_id)
-            
-            # Меню выбора языка
-            keyboard = [
-                [
-                    InlineKeyboardButton("🇷🇺 Русский", callback_data="lang_ru"),
-                    InlineKeyboardButton("🇺🇦 Українська", callback_data="lang_uk")
-                ],
-                [InlineKeyboardButton(back_text, callback_data="back_to_start")]
-            ]
-            
-            message = f"<b>{settings_text}</b>\n\n{lang_select_text}"
+            settings_view = render_cache.get("settings", user_language)
             
             await query.edit_message_text(
-                message,
-                reply_markup=InlineKeyboardMarkup(keyboard),
+                settings_view.render(),
+                reply_markup=settings_view.reply_markup,
                 parse_mode=ParseMode.HTML
             )
             logger.info(f"✅ Settings menu shown to user {user_id}")
@@ -10985,8 +11164,7 @@ async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
             course_name = "_".join(parts_all[:-1]) if len(parts_all) > 1 else parts_all[0]
             
             logger.info(f"❌ Выход из квиза")
-            if 'quiz_session' in context.user_data:
-                del context.user_data['quiz_session']
+            await clear_quiz_session(context, query.from_user.id)
             
             await query.edit_message_text(
                 "❌ Тест отменен.\n\nВы можете повторить тест позже.",
@@ -11294,16 +11472,14 @@ async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
                 await query.answer("❌ Урок не найден", show_alert=True)
                 return
             
-            # Получаем контент урока
-            lesson_content = get_lesson_content(course_name, lesson_num)
+            # Получаем урок из индекса курсов (очищенный текст и quiz)
+            lesson_view = get_lesson_view(course_name, lesson_num)
             
-            if not lesson_content:
+            if not lesson_view:
                 await query.answer("❌ Урок не найден", show_alert=True)
                 return
             
-            # Очищаем контент
-            lesson_content = clean_lesson_content(lesson_content)
-            lesson_text, quiz_section = split_lesson_content(lesson_content)
+            lesson_text, quiz_section = lesson_view
             
             # Форматируем и отправляем
             max_length = 3500
@@ -12397,11 +12573,17 @@ async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         topic = data.replace("teach_understood_", "")
         await query.answer("✅ Отлично! Вы получили +50 XP!", show_alert=False)
         
-        # 🆕 v0.37.0: Проверяем и выдаём новые badge'и
-        new_badges = check_and_award_badges(user.id)
+        # 🆕 v0.37.0: Бейджи выданы вместе с XP за урок (gamification.process в _launch_teaching_lesson)
+        new_badges = list(context.user_data.pop("new_badges", None) or [])
+        snapshot = context.user_data.pop("progress_snapshot", None)
+        if snapshot is None or snapshot.user_id != user.id:
+            # Урок начислен в другом процессе или до перезапуска - проверяем правила сейчас
+            result = gamification.process(user.id)
+            new_badges += result.new_badges if result else []
+            snapshot = result.snapshot if result else None
         
-        # 🆕 v0.37.0: Показываем рекомендацию следующего урока
-        recommended = get_recommended_lesson(user.id)
+        # 🆕 v0.37.0: Показываем рекомендацию следующего урока (по снимку прогресса)
+        recommended = get_recommended_lesson(user.id, snapshot)
         
         if recommended:
             recommendation_text = (
@@ -12554,11 +12736,9 @@ async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         await query.edit_message_reply_markup(reply_markup=None)
         await query.message.reply_text(MSG_FEEDBACK_HELPFUL)
         
-        if user.id in bot_state.user_last_news:
-            await bot_state.clear_user_news(user.id)
+        await bot_state.clear_user_news(user.id)
         # Сбрасываем счётчик регенераций для этого запроса
-        if request_id in bot_state.feedback_attempts:
-            await bot_state.clear_feedback_attempts(request_id)
+        await bot_state.clear_feedback_attempts(request_id)
         
         if ENABLE_ANALYTICS:
             log_analytics_event("feedback_positive", user.id, {
@@ -12567,134 +12747,143 @@ async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     
     # Обработка фидбека "Не помогло" с регенерацией
     elif action == "feedback_not_helpful":
-        save_feedback(user.id, request_id, is_helpful=False)
-        
-        # ✅ v0.25.0: Track feedback event
-        tracker = get_tracker()
-        tracker.track(create_event(
-            EventType.USER_FEEDBACK,
-            user_id=user.id,
-            data={"rating": "unhelpful", "request_id": request_id}
-        ))
+        # Повторное нажатие, пока вариант ещё готовится: второй вызов LLM не нужен
+        regen_call = inflight.claim(user.id, data)
+        if regen_call is None:
+            await query.answer("⏳ Уже готовлю ответ...")
+            return
+        await query.answer()
+        try:
+            save_feedback(user.id, request_id, is_helpful=False)
         
-        if ENABLE_ANALYTICS:
-            log_analytics_event("feedback_negative", user.id, {
-                "request_id": request_id
-            })
+            # ✅ v0.25.0: Track feedback event
+            tracker = get_tracker()
+            tracker.track(create_event(
+                EventType.USER_FEEDBACK,
+                user_id=user.id,
+                data={"rating": "unhelpful", "request_id": request_id}
+            ))
         
-        # Проверяем, есть ли сохраненный текст для регенерации
-        original_text = await bot_state.get_user_news(user.id)
-        if not original_text:
-            await query.edit_message_reply_markup(reply_markup=None)
-            await query.message.reply_text(MSG_FEEDBACK_UNHELPFUL)
-            return
+            if ENABLE_ANALYTICS:
+                log_analytics_event("feedback_negative", user.id, {
+                    "request_id": request_id
+                })
+        
+            # Проверяем, есть ли сохраненный текст для регенерации
+            original_text = await bot_state.get_user_news(user.id)
+            if not original_text:
+                await query.edit_message_reply_markup(reply_markup=None)
+                await query.message.reply_text(MSG_FEEDBACK_UNHELPFUL)
+                return
 
-        # Подсчитываем попытку регенерации для данного request_id
-        attempt = await bot_state.record_feedback_attempt(request_id)
+            # Подсчитываем попытку регенерации для данного request_id
+            attempt = await bot_state.record_feedback_attempt(request_id)
 
-        # Если превысили лимит — эскалируем
-        if attempt > FEEDBACK_MAX_RETRIES:
-            await query.edit_message_reply_markup(reply_markup=None)
+            # Если превысили лимит — эскалируем
+            if attempt > FEEDBACK_MAX_RETRIES:
+                await query.edit_message_reply_markup(reply_markup=None)
             
-            # Создаём кнопки для предложенных действий
-            keyboard = [
-                [InlineKeyboardButton("💬 Задать вопрос", callback_data="ask_question")],
-                [InlineKeyboardButton("📌 Закладки", callback_data="start_bookmarks")],
-                [InlineKeyboardButton("⬅️ Назад в меню", callback_data="back_to_start")],
-            ]
+                # Создаём кнопки для предложенных действий
+                keyboard = [
+                    [InlineKeyboardButton("💬 Задать вопрос", callback_data="ask_question")],
+                    [InlineKeyboardButton("📌 Закладки", callback_data="start_bookmarks")],
+                    [InlineKeyboardButton("⬅️ Назад в меню", callback_data="back_to_start")],
+                ]
             
-            await query.message.reply_text(
-                f"😓 <b>Я исчерпал свои варианты объяснений</b> (попытка {attempt}/{FEEDBACK_MAX_RETRIES})\n\n"
-                "<i>Это может быть:</i>\n"
-                "🔸 Новость слишком сложная или специфичная\n"
-                "🔸 Нужна помощь эксперта\n\n"
-                "<b>Что делать дальше:</b>\n"
-                "💬 Задайте уточняющий вопрос\n"
-                "📌 Сохраните в закладки для последующего изучения\n"
-                "⬅️ Вернитесь в главное меню",
-                parse_mode=ParseMode.HTML,
-                reply_markup=InlineKeyboardMarkup(keyboard)
-            )
-            await bot_state.clear_feedback_attempts(request_id)
-            return
-
-        # Выбираем режим регенерации по попытке
-        mode_name, mode_desc = REGENERATION_MODES[min(attempt-1, len(REGENERATION_MODES)-1)]
+                await query.message.reply_text(
+                    f"😓 <b>Я исчерпал свои варианты объяснений</b> (попытка {attempt}/{FEEDBACK_MAX_RETRIES})\n\n"
+                    "<i>Это может быть:</i>\n"
+                    "🔸 Новость слишком сложная или специфичная\n"
+                    "🔸 Нужна помощь эксперта\n\n"
+                    "<b>Что делать дальше:</b>\n"
+                    "💬 Задайте уточняющий вопрос\n"
+                    "📌 Сохраните в закладки для последующего изучения\n"
+                    "⬅️ Вернитесь в главное меню",
+                    parse_mode=ParseMode.HTML,
+                    reply_markup=InlineKeyboardMarkup(keyboard)
+                )
+                await bot_state.clear_feedback_attempts(request_id)
+                return
 
-        await query.edit_message_text(
-            f"🔄 <b>Подготавливаю новый вариант объяснения...</b>\n"
-            f"📝 Режим: <code>{mode_name}</code>\n"
-            f"⏳ Попытка: {attempt}/{FEEDBACK_MAX_RETRIES}",
-            parse_mode=ParseMode.HTML
-        )
+            # Выбираем режим регенерации по попытке
+            mode_name, mode_desc = REGENERATION_MODES[min(attempt-1, len(REGENERATION_MODES)-1)]
 
-        try:
-            # Пытаемся взять предыдущий ответ (если есть) чтобы задать более точную задачу модели
-            prev = get_request_by_id(request_id)
-            prev_response_text = prev.get("response_text") if prev else ""
-
-            regen_prompt = (
-                "Пользователь отметил, что предыдущий ответ не помог. "
-                f"Требование: {mode_desc}\n\n"
-                "Исходная новость:\n" + original_text + "\n\n"
-                "Предыдущий анализ:\n" + (prev_response_text or "(не доступен)") + "\n\n"
-                "Перепиши анализ в соответствии с требованием выше. Будь максимально понятным и конкретным."
+            await query.edit_message_text(
+                f"🔄 <b>Подготавливаю новый вариант объяснения...</b>\n"
+                f"📝 Режим: <code>{mode_name}</code>\n"
+                f"⏳ Попытка: {attempt}/{FEEDBACK_MAX_RETRIES}",
+                parse_mode=ParseMode.HTML
             )
 
-            # Вызываем API с модифицированным вводом, чтобы получить альтернативный стиль ответа
-            simplified_text, proc_time, error = await call_api_with_retry(
-                regen_prompt,
-                user_id=user_id,
-                language=update.effective_user.language_code or "ru"
-            )
+            try:
+                # Пытаемся взять предыдущий ответ (если есть) чтобы задать более точную задачу модели
+                prev = get_request_by_id(request_id)
+                prev_response_text = prev.get("response_text") if prev else ""
+
+                regen_prompt = (
+                    "Пользователь отметил, что предыдущий ответ не помог. "
+                    f"Требование: {mode_desc}\n\n"
+                    "Исходная новость:\n" + original_text + "\n\n"
+                    "Предыдущий анализ:\n" + (prev_response_text or "(не доступен)") + "\n\n"
+                    "Перепиши анализ в соответствии с требованием выше. Будь максимально понятным и конкретным."
+                )
 
-            if not simplified_text:
-                raise ValueError(f"Ошибка API: {error}")
+                # Вызываем API с модифицированным вводом, чтобы получить альтернативный стиль ответа
+                simplified_text, proc_time, error = await call_api_with_retry(
+                    regen_prompt,
+                    user_id=user_id,
+                    language=update.effective_user.language_code or "ru"
+                )
 
-            # Сохраняем новый вариант ответа (для истории)
-            new_request_id = save_request(
-                user.id,
-                original_text,
-                simplified_text,
-                from_cache=False,
-                processing_time_ms=proc_time
-            )
+                if not simplified_text:
+                    raise ValueError(f"Ошибка API: {error}")
 
-            # Формируем ответ — оставляем callback на исходный request_id, чтобы отслеживать попытки
-            new_response = f"🤖 **RVX Скаут (альтернатива):**\n\n{simplified_text}"
+                # Сохраняем новый вариант ответа (для истории)
+                new_request_id = save_request(
+                    user.id,
+                    original_text,
+                    simplified_text,
+                    from_cache=False,
+                    processing_time_ms=proc_time
+                )
 
-            keyboard = [
-                [
-                    InlineKeyboardButton(
-                        "👍 Полезно",
-                        callback_data=f"feedback_helpful_{request_id}"
-                    ),
-                    InlineKeyboardButton(
-                        "👎 Не помогло",
-                        callback_data=f"feedback_not_helpful_{request_id}"
-                    )
+                # Формируем ответ — оставляем callback на исходный request_id, чтобы отслеживать попытки
+                new_response = f"🤖 **RVX Скаут (альтернатива):**\n\n{simplified_text}"
+
+                keyboard = [
+                    [
+                        InlineKeyboardButton(
+                            "👍 Полезно",
+                            callback_data=f"feedback_helpful_{request_id}"
+                        ),
+                        InlineKeyboardButton(
+                            "👎 Не помогло",
+                            callback_data=f"feedback_not_helpful_{request_id}"
+                        )
+                    ]
                 ]
-            ]
-            # Добавляем кнопку меню
-            keyboard.append([
-                InlineKeyboardButton("📋 Меню", callback_data="menu")
-            ])
-            reply_markup = InlineKeyboardMarkup(keyboard)
+                # Добавляем кнопку меню
+                keyboard.append([
+                    InlineKeyboardButton("📋 Меню", callback_data="menu")
+                ])
+                reply_markup = InlineKeyboardMarkup(keyboard)
 
-            await query.edit_message_text(
-                new_response,
-                reply_markup=reply_markup,
-                parse_mode=ParseMode.MARKDOWN
-            )
+                await query.edit_message_text(
+                    new_response,
+                    reply_markup=reply_markup,
+                    parse_mode=ParseMode.MARKDOWN
+                )
 
-            logger.info(f"Регенерация ({mode_name}) успешна для {user.id} (попытка {attempt})")
+                logger.info(f"Регенерация ({mode_name}) успешна для {user.id} (попытка {attempt})")
 
-        except Exception as e:
-            logger.error(f"Ошибка регенерации: {e}")
-            await query.edit_message_text(
-                "❌ Не удалось создать новый анализ.\n\n"
-                "Попробуйте отправить новость заново."
-            )
+            except Exception as e:
+                logger.error(f"Ошибка регенерации: {e}")
+                await query.edit_message_text(
+                    "❌ Не удалось создать новый анализ.\n\n"
+                    "Попробуйте отправить новость заново."
+                )
+        finally:
+            inflight.release(regen_call)
 
     # ============ DIALOGUE FEEDBACK CALLBACKS ============
     
@@ -12854,6 +13043,11 @@ async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     # ============ TELL MORE CALLBACK - Расширенный анализ новостей (v0.32.3) ============
     
     if data.startswith("tell_more_"):
+        # Повторное нажатие, пока анализ готовится: второй вызов LLM не нужен
+        tell_more_call = inflight.claim(user.id, data)
+        if tell_more_call is None:
+            await query.answer("⏳ Уже готовлю ответ...")
+            return
         try:
             # Парсим callback_data: tell_more_{request_id}_{user_id}
             parts_tell = data.replace("tell_more_", "").split("_")
@@ -12988,6 +13182,8 @@ async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
                 )
             except:
                 await query.answer("❌ Ошибка при подготовке расширенного анализа", show_alert=True)
+        finally:
+            inflight.release(tell_more_call)
         
         return
 
@@ -13099,6 +13295,30 @@ news_patterns = [
     re.compile(r"(регулятор|regulatory|sec|фца|центробанк|央行|regulat|compliance|регулятор)", re.IGNORECASE)
 ]
 
+# Короткие списки analyze_message_context
+GREETING_WORDS = ["привет", "hello", "hi", "пока", "bye", "привееет", "yo", "хай"]
+ABOUT_BOT_WORDS = ["что ты", "что умеешь", "кто ты", "возможности", 
+                   "что делаешь", "помощь", "как работать", "команды", "функции"]
+NEWS_EVENT_WORDS = ["упал", "взлетел", "пал", "вырос", "вырастет", 
+                    "объявила", "запустила", "закрыл", "хакнули",
+                    "скачку", "скачок", "в два раза", "мертва", "мертво",
+                    "выпустил", "выпустили", "угроза", "конкурент", "лидер",
+                    "переход", "миграция", "интеграция"]
+CONTEXT_QUESTION_WORDS = ["почему", "как это", "когда это", "где это", "что это", "что такое",
+                          "зачем", "для чего", "какой", "какая", "какое", "почему это"]
+
+keyword_engine.register({
+    "context.greeting": GREETING_WORDS,
+    "context.about_bot": ABOUT_BOT_WORDS,
+    "context.news_event": NEWS_EVENT_WORDS,
+    "context.crypto": crypto_words,
+    "context.tech": tech_keywords,
+    "context.finance": finance_words,
+    "context.geopolitical": geopolitical_words,
+    "context.action": action_words,
+    "context.question": CONTEXT_QUESTION_WORDS,
+})
+
 # =============================================================================
 # ГЛАВНЫЙ ОБРАБОТЧИК СООБЩЕНИЙ
 # =============================================================================
@@ -13139,37 +13359,33 @@ def analyze_message_context(text: str) -> dict:
     Анализирует контекст сообщения и возвращает детальную информацию.
     АГРЕССИВНАЯ СТРАТЕГИЯ: если есть хоть намек на финансовый контекст - отправляем на анализ.
     """
-    text_lower = text.lower().strip()
+    # Один результат поиска ключевых слов на текст (keyword_engine)
+    matches = keyword_engine.scan(text.lower().strip())
     
     # ✅ DEBUG: Логируем входящий текст
     logger.debug(f"📊 analyze_message_context for text ({len(text)} chars): {text[:80]}...")
     
     # Приветствие
-    if any(g in text_lower for g in ["привет", "hello", "hi", "пока", "bye", "привееет", "yo", "хай"]):
+    if matches.has("context.greeting"):
         result = {"type": "greeting", "needs_crypto_analysis": False}
         logger.debug(f"   → {result['type']}")
         return result
     
     # Вопрос о боте / возможностях (только если в начале/конце или явно вопрос)
-    if any(c in text_lower for c in ["что ты", "что умеешь", "кто ты", "возможности", 
-                                      "что делаешь", "помощь", "как работать", "команды", "функции"]):
+    if matches.has("context.about_bot"):
         # Но проверяем - это не новость
-        if not any(n in text_lower for n in ["упал", "взлетел", "пал", "вырос", "вырастет", 
-                                             "объявила", "запустила", "закрыл", "хакнули",
-                                             "скачку", "скачок", "в два раза", "мертва", "мертво",
-                                             "выпустил", "выпустили", "угроза", "конкурент", "лидер",
-                                             "переход", "миграция", "интеграция"]):
+        if not matches.has("context.news_event"):
             return {"type": "info_request", "needs_crypto_analysis": False}
     
     # ✅ FIXED: REMOVED EARLY RETURN - Analysis logic continues below
     # Ключевые слова для анализа контекста (встроено, не требует отдельного файла)
     # Для сложных сценариев используйте ai_dialogue.py
     
-    has_crypto = any(c in text_lower for c in crypto_words)
-    has_tech = any(t in text_lower for t in tech_keywords)
-    has_finance = any(f in text_lower for f in finance_words)
-    has_geopolitical = any(g in text_lower for g in geopolitical_words)
-    has_action = any(a in text_lower for a in action_words)
+    has_crypto = matches.has("context.crypto")
+    has_tech = matches.has("context.tech")
+    has_finance = matches.has("context.finance")
+    has_geopolitical = matches.has("context.geopolitical")
+    has_action = matches.has("context.action")
     
     # DEBUG логирование флагов
     logger.debug(f"   Flags: crypto={has_crypto}, tech={has_tech}, finance={has_finance}, geo={has_geopolitical}, action={has_action}")
@@ -13259,8 +13475,7 @@ def analyze_message_context(text: str) -> dict:
         }
     
     # ШЕСТАЯ ПРОВЕРКА: Вопрос о финансах/крипто/tech/геополитике = АНАЛИЗИРОВАТЬ
-    if any(q in text_lower for q in ["почему", "как это", "когда это", "где это", "что это", "что такое",
-                                     "зачем", "для чего", "какой", "какая", "какое", "почему это"]):
+    if matches.has("context.question"):
         if has_crypto or has_tech or has_finance or has_geopolitical:
             if has_finance:
                 msg_type = "finance_question"
@@ -13632,6 +13847,59 @@ async def handle_photo(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
         await update.message.reply_text(error_msg)
 
 
+async def send_dialogue_reply(bot, chat_id: int, text: str, reply_markup=None) -> None:
+    """
+    Отправляет HTML-ответ через очередь исходящих и ждёт первый кусок.
+
+    Ошибка первого куска (например, BadRequest на битом HTML из ответа ИИ)
+    не должна оставить пользователя без ответа: ответ повторяется простым
+    текстом, а если не уходит и он - исключение получает вызывающий хендлер.
+    Остальные куски не ждём - после неудачи одного следующие не отправляются.
+    """
+    chunks = outbound.send_chunks(bot, chat_id, text, chunk_size=4090,
+                                  reply_markup=reply_markup, parse_mode=ParseMode.HTML)
+    try:
+        await chunks[0]
+    except TelegramError as e:
+        logger.warning(f"⚠️ Ответ в {chat_id} не отправлен ({type(e).__name__}: {e}), повтор простым текстом")
+        plain_text = html.unescape(re.sub(r"<[^>]+>", "", text))
+        await outbound.send_chunks(bot, chat_id, plain_text, chunk_size=4090, reply_markup=reply_markup)[0]
+
+
+async def send_knowledge_answer(update: Update, context: ContextTypes.DEFAULT_TYPE, user_text: str,
+                                knowledge, intent: str) -> None:
+    """Ответ из базы знаний вместо вызова ИИ; "Что еще?" уточняет уже через ИИ."""
+    user = update.effective_user
+    document = knowledge.document
+    answer = markdown_to_html(html.escape(document.answer))
+    header = await get_text("ai_response.header", user.id)
+    divider = await get_text("ai_response.divider", user.id)
+    footer = await get_text("ai_response.footer", user.id)
+
+    keyboard = [[
+        InlineKeyboardButton("👍 Полезно", callback_data=f"feedback_helpful_{user.id}"),
+        InlineKeyboardButton("👎 Не помогло", callback_data=f"feedback_not_helpful_{user.id}")
+    ], [
+        InlineKeyboardButton("❓ Что еще?", callback_data=f"clarify_{user.id}"),
+        InlineKeyboardButton("📋 Меню", callback_data="menu")
+    ]]
+    outbound.send_chunks(
+        context.bot, update.effective_chat.id,
+        f"{header}\n{divider}\n\n📖 <b>{html.escape(document.title)}</b>\n\n{answer}\n\n{footer}",
+        chunk_size=4090, reply_markup=InlineKeyboardMarkup(keyboard), parse_mode=ParseMode.HTML
+    )
+
+    context.user_data["last_question"] = user_text
+    context.user_data["last_ai_response"] = answer
+    context.user_data["clarify_count"] = 0
+    add_ai_message(user.id, answer)
+    try:
+        save_conversation(user.id, "bot", answer, intent)
+    except Exception as e:
+        logger.warning(f"DB save failed (non-critical): {e}")
+    logger.info(f"📖 Ответ из базы знаний для {user.id}: {document.doc_id} (уверенность {knowledge.confidence:.2f})")
+
+
 async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """
     Обрабатывает текстовые сообщения пользователей.
@@ -13767,13 +14035,12 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         )
         return
     
-    # Парсим валидированный ввод
-    try:
-        input_data = UserMessageInput(text=update.message.text)
-        user_text = input_data.text
-    except Exception as e:
-        logger.error(f"Parsing error: {e}")
+    # Валидированный ввод: результат check_message уже в кэше после validate_user_input
+    input_check = check_message(update.message.text)
+    if not input_check.is_valid:
+        logger.error(f"Parsing error: {input_check.error}")
         return
+    user_text = input_check.text
     
     # ✅ v0.39.0: IP-BASED RATE LIMITING (DDoS Protection)
     client_ip = update.effective_user.id  # Use user_id as fallback if IP not available
@@ -13782,8 +14049,6 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         client_ip = str(update.message.from_user.id)
     
     if not rate_limiter.check_rate_limit(client_ip):
-        remaining = rate_limiter.get_remaining_requests(client_ip)
-        logger.warning(f"IP rate limit exceeded for {client_ip}: {remaining} requests left")
         limit_msg = await get_text("error.rate_limit", user_id)
         limit_info = await get_text("error.rate_limit_info", user_id)
         await update.message.reply_text(
@@ -13869,13 +14134,30 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
             # ✅ Получаем ИИ ответ с rate limiting (передаем user_id для проверки лимитов)
             # ✅ v0.44: Получаем язык пользователя и передаём в AI
             user_language = get_user_lang(user.id) if user.id else "ru"
-            ai_response = get_ai_response_sync(
+            
+            # 📖 Вопрос, на который уже есть ответ в FAQ / уроках / курсах, - без ИИ;
+            # менее уверенное совпадение уходит в ИИ справкой вместо полного промпта.
+            # Уточнения зависят от истории диалога - их база знаний не ищет
+            knowledge = knowledge_base.lookup(
+                user_text, allow_answer=intent == "question" and user_language == "ru"
+            ) if intent != "follow_up" else None
+            if knowledge and knowledge.answers_directly:
+                await send_knowledge_answer(update, context, user_text, knowledge, intent)
+                return
+            knowledge_snippet = knowledge.snippet if knowledge else None
+            
+            # Вызов в потоке не блокирует event loop; следующее сообщение
+            # пользователя отменяет его - старый ответ уже не нужен
+            ai_response = await inflight.run_latest(user.id, DIALOGUE, lambda call: asyncio.to_thread(
+                get_ai_response_sync,
                 user_text,
                 dialogue_context,
                 user_id=user.id,
                 message_context=msg_context,  # ✅ v0.27: Pass message context for prompt selection
-                language=user_language  # ✅ v0.44: Pass user's language preference
-            )
+                language=user_language,  # ✅ v0.44: Pass user's language preference
+                cancel_event=call.cancel_event,
+                knowledge_snippet=knowledge_snippet
+            ))
             
             if ai_response:
                 # ✅ Обрезаем до 1200 символов - достаточно для полного объяснения
@@ -13950,14 +14232,8 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
                     final_response = f"{low_conf_msg}\n\n{formatted_response}"
                 
                 # ✅ CRITICAL FIX: Split long responses to stay under 4096 char limit
-                response_chunks = split_message(final_response, chunk_size=4090)
-                
-                # Send first chunk with keyboard
-                if response_chunks:
-                    await update.message.reply_text(response_chunks[0], parse_mode=ParseMode.HTML, reply_markup=reply_markup)
-                    # Send remaining chunks without keyboard
-                    for chunk in response_chunks[1:]:
-                        await update.message.reply_text(chunk, parse_mode=ParseMode.HTML)
+                # Куски уходят через очередь исходящих (клавиатура на первом)
+                await send_dialogue_reply(context.bot, update.effective_chat.id, final_response, reply_markup)
                 
                 # ✅ v0.26.0: Добавляем ИИ ответ в контекст
                 add_ai_message(user.id, ai_response)
@@ -13978,6 +14254,10 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
                 )
                 return
                 
+        except CallSuperseded:
+            # Пользователь уже написал следующее сообщение - ответит его обработчик
+            logger.info(f"✂️ AI диалог для {user.id} заменён более новым сообщением")
+            return
         except Exception as e:
             logger.error(f"Error in AI dialogue: {type(e).__name__}: {str(e)}", exc_info=True)
             
@@ -14001,6 +14281,9 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     # ==================== ДАЛЬШЕ - ТОЛЬКО ДЛЯ КРИПТО НОВОСТЕЙ ====================
     # Это крипто-новость - нужна полная проверка
     
+    # Новое сообщение делает ответ на предыдущий диалог ненужным
+    inflight.cancel(user.id, DIALOGUE)
+    
     # Для крипто-новостей - проверим лимиты и валидацию
     # Проверка бана
     is_banned, ban_reason = check_user_banned(user.id)
@@ -14354,6 +14637,13 @@ async def update_leaderboard_cache(context: ContextTypes.DEFAULT_TYPE) -> None:
     """Обновляет кэш рейтингов каждый час (v0.17.0)."""
     logger.info("📊 Обновление кэша рейтингов...")
     try:
+        # XP изменился (события gamification, add_xp_to_user) - старый кэш пересчитывается заново
+        if leaderboard_changes:
+            changed = len(leaderboard_changes)
+            leaderboard_changes.clear()
+            with get_db() as conn:
+                conn.execute("DELETE FROM leaderboard_cache")
+            logger.info(f"   🔄 XP изменился у {changed} пользователей - кэш сброшен")
         # Обновляем для всех периодов
         for period in ["week", "month", "all"]:
             leaderboard_data, total_users = get_leaderboard_data(period, limit=50)
@@ -14408,10 +14698,8 @@ async def show_daily_quests_menu(update: Update, context: ContextTypes.DEFAULT_T
         row = cursor.fetchone()
         user_xp = row[0] if row else 0
         
-        # Получаем выполненные квесты
-        from daily_quests_v2 import get_completed_quests_today, get_daily_quest_xp_earned
-        completed_quests = get_completed_quests_today(user_id, conn)
-        daily_xp_earned = get_daily_quest_xp_earned(user_id, conn)
+        # Получаем выполненные квесты и XP за них одним запросом
+        completed_quests, daily_xp_earned = get_quest_progress_today(user_id, conn)
     
     # Определяем уровень и задачи
     user_quest_level = get_user_level(user_xp)
@@ -14538,6 +14826,102 @@ async def bot_health_check(context: ContextTypes.DEFAULT_TYPE) -> None:
     except Exception as e:
         logger.error(f"Health check failed: {e}")
 
+async def warm_up_lazy_modules(application) -> None:
+    """
+    post_init: фоновая догрузка тяжёлых модулей, которые понадобятся этому процессу.
+    
+    Не ждёт окончания загрузки - polling/воркер начинают принимать апдейты сразу.
+    """
+    # Анализ новостей - основной сценарий любого процесса с хендлерами
+    modules = ["embedded_news_analyzer"]
+    if RUNS_GLOBAL_JOBS and CRYPTO_DIGEST_ENABLED:
+        modules += ["crypto_digest", "digest_formatter"]
+    start_warm_up(modules)
+
+async def drain_outbound_queue(application) -> None:
+    """После остановки хендлеров дожидается отправки сообщений из очереди исходящих."""
+    if not await outbound.drain(timeout=GRACEFUL_SHUTDOWN_TIMEOUT):
+        logger.warning(f"📤 Не отправлено при остановке: {outbound.stats()['pending']} сообщений")
+
+async def periodic_lesson_cache_warm(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Догенерирует в фоне уроки /teach без встроенной версии (недостающие и устаревшие)."""
+    try:
+        if lesson_cache.start_warm():
+            logger.info(f"📚 Прогрев кэша уроков запущен: {len(lesson_cache.pending())} уроков в очереди")
+    except Exception as e:
+        logger.error(f"Ошибка прогрева кэша уроков: {e}")
+
+def load_knowledge_documents() -> list:
+    """Документы базы знаний: строки FAQ, встроенные уроки и разделы курсов."""
+    with get_db() as conn:
+        rows = conn.execute("SELECT id, question, answer FROM faq").fetchall()
+    return faq_documents(rows) + embedded_lesson_documents() + course_documents(course_store, COURSES_DATA)
+
+async def periodic_knowledge_base_refresh(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Перестраивает индекс базы знаний (новые ответы FAQ из /ask)."""
+    try:
+        await asyncio.to_thread(lambda: knowledge_base.rebuild(load_knowledge_documents()))
+    except Exception as e:
+        logger.error(f"Ошибка обновления базы знаний: {e}")
+
+def format_knowledge_base_stats() -> str:
+    """Блок базы знаний для /admin_metrics."""
+    stats = knowledge_base.stats()
+    return (
+        "\n\n<b>📖 База знаний (ответы без ИИ)</b>\n"
+        f"Документов: {stats['documents']}, запросов {stats['queries']}\n"
+        f"Без вызова ИИ: {stats['answered']} ({stats['llm_calls_avoided']:.0%}), со справкой {stats['snippets']}\n"
+        f"p50 ответа из базы: {stats['p50_answer_ms']:.2f} мс"
+    )
+
+def format_gamification_stats() -> str:
+    """Блок начислений геймификации для /admin_metrics."""
+    stats = gamification.stats()
+    return (
+        "\n\n<b>🏅 Геймификация</b>\n"
+        f"Начислений: {stats['processed']}, снимков {stats['snapshots']}, ошибок {stats['failed']}\n"
+        f"XP: +{stats['xp_awarded']}, уровней {stats['level_ups']}, бейджей {stats['badges_awarded']}, "
+        f"задач {stats['tasks_completed']}\n"
+        f"Событий: {stats['events']}, p50 начисления {stats['p50_process_ms']:.2f} мс"
+    )
+
+def format_prompt_budget_stats() -> str:
+    """Блок токенов промпта ИИ для /admin_metrics."""
+    stats = prompt_budget.stats()
+    lines = [
+        "\n\n<b>🧮 Токены промпта ИИ</b>",
+        f"Вызовов: {stats['calls']}, токенов отправлено: {stats['prompt_tokens']}",
+        f"История: целиком {stats['turns_kept'] - stats['turns_compressed']}, сжато {stats['turns_compressed']}, "
+        f"отброшено {stats['turns_dropped']} (сверх бюджета: {stats['over_budget']})",
+    ]
+    for mode, mode_stats in stats["modes"].items():
+        ratio = mode_stats["estimate_ratio"]
+        lines.append(
+            f"{mode}: ~{mode_stats['avg_prompt_tokens']}/{mode_stats['budget']} за вызов"
+            + (f", оценка/usage {ratio:.2f}" if ratio is not None else "")
+        )
+    return "\n".join(lines)
+
+def format_lesson_cache_stats() -> str:
+    """Блок кэша уроков /teach для /admin_metrics."""
+    stats = lesson_cache.stats()
+    return (
+        "\n\n<b>📚 Кэш уроков /teach</b>\n"
+        f"Покрытие: {stats['covered']}/{stats['expected']} ({stats['coverage']:.0%}), свежих {stats['fresh']}\n"
+        f"Hit rate: {stats['hit_rate']:.0%} (hit {stats['hits']}, stale {stats['stale_hits']}, miss {stats['misses']})\n"
+        f"Генераций: {stats['generated']}, обновлений {stats['refreshed']}, неудач {stats['failed']}"
+        + (", идёт прогрев" if stats["warming"] else "")
+    )
+
+async def periodic_shared_state_purge(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Удаляет истёкшие записи общего состояния кластера (лимиты и т.п.)."""
+    try:
+        removed = get_shared_backend().purge_expired()
+        if removed:
+            logger.info(f"🗄️ Общее состояние: удалено {removed} истёкших записей")
+    except Exception as e:
+        logger.error(f"Ошибка уборки общего состояния: {e}")
+
 async def graceful_shutdown(application) -> None:
     """Graceful shutdown с закрытием всех ресурсов."""
     logger.info("🛑 Инициирован graceful shutdown...")
@@ -14551,9 +14935,9 @@ async def graceful_shutdown(application) -> None:
         bot_metrics.log_metrics_snapshot(compact=True)
         logger.info(f"Финальные метрики сохранены")
         
-        # Очищаем сессии
-        cleaned = await bot_state.cleanup_expired_sessions(timeout_seconds=0)
-        logger.info(f"🧹 Очищено {cleaned} сессий")
+        # Сохраняем сессии (квизы в процессе продолжатся после перезапуска)
+        saved = await bot_state.aflush()
+        logger.info(f"💾 Сохранено {saved} сессий")
         
         # Создаем финальный бэкап
         try:
@@ -14630,43 +15014,60 @@ def main() -> None:
     print(f"✅ Analytics enabled: {FEATURE_ANALYTICS_ENABLED}")
     print("="*80 + "\n")
     
-    # 🔧 Сначала создаём БД, потом применяем миграции (order matters!)
-    ensure_conversation_history_columns()
+    # 🔧 Версионированные миграции: conversation_history колонки -> таблицы ->
+    # курсы -> legacy миграции -> индексы. При актуальной схеме - один SELECT.
+    applied_steps = apply_schema_migrations()
     
-    # Инициализация БД (создаёт все таблицы)
-    init_database()
-    
-    # Затем применяем миграции (после того как таблицы существуют)
-    migrate_database()  # ✅ v0.37.0: Миграция новых таблиц
-    
-    # ✅ v0.39.0: Verify database schema integrity
-    schema_check = verify_database_schema()
-    if not schema_check['valid']:
-        logger.warning(
-            f"Database schema incomplete. Missing tables: {schema_check['missing_tables']}"
-            f"\nAttempting to reinitialize..."
-        )
-        init_database()
+    # ✅ v0.39.0: Verify database schema integrity (только если схема менялась)
+    if applied_steps:
         schema_check = verify_database_schema()
         if not schema_check['valid']:
-            logger.error(
-                f"Critical: Database schema still invalid after reinitialization!"
-                f"\nMissing: {schema_check['missing_tables']}"
+            logger.warning(
+                f"Database schema incomplete. Missing tables: {schema_check['missing_tables']}"
+                f"\nAttempting to reinitialize..."
             )
-    
-    # � Создаем критические индексы (QUICK WIN v0.38.0)
-    create_database_indices()  # ✅ v0.38.0: Database indices for performance
+            init_database()
+            schema_check = verify_database_schema()
+            if not schema_check['valid']:
+                logger.error(
+                    f"Critical: Database schema still invalid after reinitialization!"
+                    f"\nMissing: {schema_check['missing_tables']}"
+                )
     
     # �💾 Инициализируем пул соединений (TIER 1 v0.22.0)
     init_db_pool()
     
-    # 💾 Создаем автоматический бэкап при старте (v0.22.0)
-    try:
-        import asyncio
-        asyncio.run(create_database_backup())
-        asyncio.run(cleanup_old_backups())
-    except Exception as e:
-        logger.warning(f"Не удалось создать бэкап при старте: {e}")
+    # 💾 Сессии (квиз, текст для регенерации) сохраняются между перезапусками
+    if SESSION_PERSIST:
+        bot_state.sessions.enable_persistence(DB_PATH)
+    
+    # 🧩 Статичные меню и тексты собираются один раз на язык
+    render_cache.warm()
+    
+    # 📚 Курсы разбираются в индекс уроков один раз (дальше - перезагрузка по mtime)
+    course_store.warm()
+    
+    # 🗄️ Воркеры кластера делят лимиты и сбросы кэша подписок через общий бэкенд
+    if IS_CLUSTER_WORKER:
+        shared_backend = get_shared_backend()
+        rate_limits.use_backend(shared_backend)
+        if MANDATORY_CHANNEL_ID:
+            get_subscription_cache().use_backend(shared_backend)
+    
+    # 💾 Создаем автоматический бэкап при старте (v0.22.0) - один раз на кластер, в мастере
+    if not IS_CLUSTER_WORKER:
+        try:
+            import asyncio
+            asyncio.run(create_database_backup())
+            asyncio.run(cleanup_old_backups())
+        except Exception as e:
+            logger.warning(f"Не удалось создать бэкап при старте: {e}")
+    
+    # 🌐 Мастер кластера: воркеры + приём webhook, сам апдейты не обрабатывает
+    if BOT_RUN_MODE == "webhook":
+        logger.info("🌐 Запуск в режиме webhook-кластера")
+        run_cluster(TELEGRAM_BOT_TOKEN)
+        return
     
     logger.info("=" * 70)
     logger.info("🚀 RVX Telegram Bot v0.7.0 запускается...")
@@ -14920,38 +15321,19 @@ def main() -> None:
     # Kill all stale processes before creating the Application instance
     # This prevents "409 Conflict: terminated by other getUpdates"
     # ================================================================
-    print("\n🔧 PRE-APPLICATION CLEANUP")
-    print("   Killing any competing bot/api processes...")
-    
-    # Try psutil-based cleanup
-    try:
-        import psutil  # type: ignore
-        current_pid = os.getpid()
-        for proc in psutil.process_iter(['pid', 'name', 'cmdline']):
-            try:
-                cmdline = ' '.join(proc.info['cmdline'] or [])
-                pid = proc.info['pid']
-                
-                if 'bot.py' in cmdline and pid != current_pid:
-                    try:
-                        os.kill(pid, 9)
-                        print(f"   🗑️ Killed old bot process PID={pid}")
-                    except ProcessLookupError:
-                        pass
-            except (psutil.NoSuchProcess, psutil.AccessDenied, psutil.ZombieProcess):
-                pass
-    except ImportError:
-        print("   ⚠️ psutil not available for pre-app cleanup")
-    except Exception as e:
-        print(f"   ⚠️ Pre-cleanup warning: {e}")
-    
-    # Wait for Telegram polling lock to release
-    print("   ⏳ Waiting 2 seconds for Telegram polling lock to release...")
-    time.sleep(2)
-    print("✅ Pre-application cleanup completed\n")
+    if BOT_RUN_MODE == "polling":
+        cleanup_stale_bot_processes()
     
     # Создание приложения
-    application = Application.builder().token(TELEGRAM_BOT_TOKEN).build()
+    application = (
+        Application.builder()
+        .token(TELEGRAM_BOT_TOKEN)
+        .concurrent_updates(update_dispatcher)
+        .update_queue(BackpressureQueue(update_dispatcher))
+        .post_init(warm_up_lazy_modules)
+        .post_stop(drain_outbound_queue)
+        .build()
+    )
     
     # Установка списка команд (показывается при вводе / в Telegram) - v0.11.0
     async def set_commands_on_start(context: ContextTypes.DEFAULT_TYPE):
@@ -15142,6 +15524,13 @@ def main() -> None:
     
     # Обработчики
     application.add_handler(CallbackQueryHandler(button_callback))
+    
+    # События вступления/выхода в обязательном канале обновляют кэш подписок
+    application.add_handler(ChatMemberHandler(
+        handle_channel_member_update,
+        ChatMemberHandler.CHAT_MEMBER,
+        chat_id=MANDATORY_CHANNEL_ID
+    ))
     # Анализ фото ОТКЛЮЧЕН на free tier (экономия квоты для текстовых новостей)
     # application.add_handler(MessageHandler(filters.PHOTO, handle_photo))
     # Handle text messages ONLY in private chats (not in channels/groups)
@@ -15157,7 +15546,7 @@ def main() -> None:
     # Фоновые задачи
     job_queue = application.job_queue
     
-    if ENABLE_AUTO_CACHE_CLEANUP:
+    if ENABLE_AUTO_CACHE_CLEANUP and RUNS_GLOBAL_JOBS:
         # Очистка кэша каждые 6 часов
         job_queue.run_repeating(
             periodic_cache_cleanup,
@@ -15166,6 +15555,14 @@ def main() -> None:
         )
         logger.info(f"Автоматическая очистка кэша настроена (каждые 6ч)")
     
+    # Индекс базы знаний - в каждом процессе, строится в потоке сразу после старта
+    job_queue.run_repeating(
+        periodic_knowledge_base_refresh,
+        interval=KB_REFRESH_INTERVAL,
+        first=1
+    )
+    logger.info(f"📖 Обновление базы знаний настроено (каждые {KB_REFRESH_INTERVAL} сек)")
+    
     # Периодическая очистка истекших сессий каждый час (v0.24.0)
     job_queue.run_repeating(
         periodic_session_cleanup,
@@ -15174,35 +15571,74 @@ def main() -> None:
     )
     logger.info(f"Периодическая очистка сессий настроена (каждый час)")
     
-    # Периодический снимок метрик каждые 6 часов (v0.24.0)
-    job_queue.run_repeating(
-        periodic_metrics_snapshot,
-        interval=21600,  # 6 часов
-        first=120  # Первый запуск через 2 минуты
-    )
-    logger.info(f"Периодическое логирование метрик настроено (каждые 6 часов)")
+    if SESSION_PERSIST:
+        job_queue.run_repeating(
+            periodic_session_flush,
+            interval=SESSION_FLUSH_INTERVAL,
+            first=SESSION_FLUSH_INTERVAL
+        )
+        logger.info(f"💾 Сохранение сессий настроено (каждые {SESSION_FLUSH_INTERVAL} сек)")
     
-    # Обновление кэша рейтингов каждый час (v0.17.0)
-    job_queue.run_repeating(
-        update_leaderboard_cache,
-        interval=3600,  # 1 час
-        first=30  # Первый запуск через 30 секунд
-    )
-    logger.info(f"Обновление рейтингов настроено (каждый час)")
+    # Глобальные задачи (БД, рассылки, команды бота) - в кластере только в воркере 0,
+    # сессии выше - в каждом процессе
+    if RUNS_GLOBAL_JOBS:
+        # Периодический снимок метрик каждые 6 часов (v0.24.0)
+        job_queue.run_repeating(
+            periodic_metrics_snapshot,
+            interval=21600,  # 6 часов
+            first=120  # Первый запуск через 2 минуты
+        )
+        logger.info(f"Периодическое логирование метрик настроено (каждые 6 часов)")
     
-    # Health check каждые 5 минут (v0.21.0 - Production Ready)
-    job_queue.run_repeating(
-        bot_health_check,
-        interval=HEALTH_CHECK_INTERVAL,  # 5 минут (300 секунд)
-        first=30  # Первый запуск через 30 секунд после старта
-    )
-    logger.info(f"💊 Health check настроен (каждые {HEALTH_CHECK_INTERVAL} сек)")
+        # Инкрементальные агрегаты событий для дашборда каждые 5 минут
+        job_queue.run_repeating(
+            periodic_rollup_refresh,
+            interval=ROLLUP_REFRESH_INTERVAL,
+            first=90  # Первый запуск через 90 секунд
+        )
+        logger.info(f"📈 Обновление агрегатов событий настроено (каждые {ROLLUP_REFRESH_INTERVAL} сек)")
+    
+        # Обновление кэша рейтингов каждый час (v0.17.0)
+        job_queue.run_repeating(
+            update_leaderboard_cache,
+            interval=3600,  # 1 час
+            first=30  # Первый запуск через 30 секунд
+        )
+        logger.info(f"Обновление рейтингов настроено (каждый час)")
+    
+        # Health check каждые 5 минут (v0.21.0 - Production Ready)
+        job_queue.run_repeating(
+            bot_health_check,
+            interval=HEALTH_CHECK_INTERVAL,  # 5 минут (300 секунд)
+            first=30  # Первый запуск через 30 секунд после старта
+        )
+        logger.info(f"💊 Health check настроен (каждые {HEALTH_CHECK_INTERVAL} сек)")
+    
+        # ✅ v0.28.0: Крипто дайджест теперь управляется через daily_digest_scheduler.py
+        # (удалена старая job_queue реализация - используется APScheduler для консистентности)
     
-    # ✅ v0.28.0: Крипто дайджест теперь управляется через daily_digest_scheduler.py
-    # (удалена старая job_queue реализация - используется APScheduler для консистентности)
+        # Установка списка команд при запуске бота
+        job_queue.run_once(set_commands_on_start, when=1)  # Запускаем через 1 секунду после старта
     
-    # Установка списка команд при запуске бота
-    job_queue.run_once(set_commands_on_start, when=1)  # Запускаем через 1 секунду после старта
+        # Незавершённые рассылки продолжаются с сохранённого курсора
+        job_queue.run_once(resume_broadcasts, when=5)
+        logger.info("📢 Возобновление незавершённых рассылок запланировано")
+        
+        # Уроки /teach от ИИ генерируются заранее, а не в ответ на запрос
+        job_queue.run_repeating(
+            periodic_lesson_cache_warm,
+            interval=LESSON_CACHE_WARM_INTERVAL,
+            first=LESSON_CACHE_WARM_FIRST
+        )
+        logger.info(f"📚 Прогрев кэша уроков настроен (каждые {LESSON_CACHE_WARM_INTERVAL} сек)")
+        
+        if IS_CLUSTER_WORKER:
+            job_queue.run_repeating(
+                periodic_shared_state_purge,
+                interval=SHARED_STATE_PURGE_INTERVAL,
+                first=SHARED_STATE_PURGE_INTERVAL
+            )
+            logger.info(f"🗄️ Уборка общего состояния настроена (каждые {SHARED_STATE_PURGE_INTERVAL} сек)")
     
     try:
         logger.info("🚀 БОТ ПОЛНОСТЬЮ ЗАПУЩЕН И ГОТОВ К РАБОТЕ")
@@ -15212,58 +15648,41 @@ def main() -> None:
         if sys.platform == 'win32':
             asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
         
-        # CRITICAL: Before starting polling, kill ALL other bot processes one more time
-        print("🔧 PRE-POLLING CLEANUP: Killing any competing bot instances...")
-        try:
-            import psutil  # type: ignore
-            current_pid = os.getpid()
-            for proc in psutil.process_iter(['pid', 'name', 'cmdline']):
-                try:
-                    cmdline = ' '.join(proc.info['cmdline'] or [])
-                    pid = proc.info['pid']
-                    if 'bot.py' in cmdline and pid != current_pid:
-                        try:
-                            os.kill(pid, 9)
-                            print(f"   🗑️ Killed bot process PID={pid}")
-                        except ProcessLookupError:
-                            pass
-                except (psutil.NoSuchProcess, psutil.AccessDenied, psutil.ZombieProcess):
-                    pass
-        except ImportError:
-            print("   ⚠️ psutil not available")
-        except Exception as e:
-            print(f"   ⚠️ Pre-polling cleanup warning: {e}")
-        
-        time.sleep(1)  # Wait for kill signal to propagate
-        
         loop = asyncio.new_event_loop()
         asyncio.set_event_loop(loop)
         try:
-            # ✅ v0.28.0: Initialize daily digest scheduler BEFORE polling
-            try:
-                async def init_scheduler():
-                    print("🚀 Initializing daily digest scheduler...")
-                    await initialize_digest_scheduler()
-                    print("✅ Daily digest scheduler started")
+            if RUNS_GLOBAL_JOBS:
+                # ✅ v0.28.0: Initialize daily digest scheduler BEFORE polling
+                try:
+                    async def init_scheduler():
+                        print("🚀 Initializing daily digest scheduler...")
+                        await initialize_digest_scheduler()
+                        print("✅ Daily digest scheduler started")
                 
-                loop.run_until_complete(init_scheduler())
-            except Exception as e:
-                logger.error(f"⚠️ Failed to initialize digest scheduler: {e}")
-                # Don't fail if digest scheduler fails - bot should still work
-            
-            # CRITICAL: Delete any webhook to ensure polling mode works
-            print("🔧 Ensuring polling mode (removing webhook if any)...")
-            try:
-                async def delete_webhook():
-                    await application.bot.delete_webhook(drop_pending_updates=True)
-                loop.run_until_complete(delete_webhook())
-                print("✅ Webhook deleted successfully")
-            except Exception as e:
-                print(f"⚠️ Webhook deletion warning: {e}")
+                    loop.run_until_complete(init_scheduler())
+                except Exception as e:
+                    logger.error(f"⚠️ Failed to initialize digest scheduler: {e}")
+                    # Don't fail if digest scheduler fails - bot should still work
+            
+            if IS_CLUSTER_WORKER:
+                # Апдейты приходят от мастера кластера (webhook_cluster), не из getUpdates
+                loop.run_until_complete(serve_worker(application))
+                saved = bot_state.flush()
+                logger.info(f"💾 Воркер {BOT_WORKER_ID}: сохранено {saved} сессий")
+            else:
+                # CRITICAL: Delete any webhook to ensure polling mode works
+                print("🔧 Ensuring polling mode (removing webhook if any)...")
+                try:
+                    async def delete_webhook():
+                        await application.bot.delete_webhook(drop_pending_updates=True)
+                    loop.run_until_complete(delete_webhook())
+                    print("✅ Webhook deleted successfully")
+                except Exception as e:
+                    print(f"⚠️ Webhook deletion warning: {e}")
             
-            # Run polling without closing loop (prevents "Event loop is closed" crash)
-            print("🚀 Starting polling...")
-            loop.run_until_complete(application.run_polling(allowed_updates=Update.ALL_TYPES, drop_pending_updates=True))
+                # Run polling without closing loop (prevents "Event loop is closed" crash)
+                print("🚀 Starting polling...")
+                loop.run_until_complete(application.run_polling(allowed_updates=Update.ALL_TYPES, drop_pending_updates=True))
         except Conflict as e:
             # Another bot instance is running - graceful exit
             logger.error(f"💥 CONFLICT: {e}")
@@ -0,0 +1,537 @@
+"""
+Broadcast Engine v1.0
+Рассылки с учётом лимитов Bot API, возобновлением и учётом заблокировавших.
+
+broadcast_command раньше отправлял сообщения строго по одному с паузой
+1 с на каждые 20 отправок, игнорировал RetryAfter, терял прогресс при
+перезапуске и каждый раз снова пытался писать пользователям, которые
+заблокировали бота. Теперь:
+
+- общий token bucket (BROADCAST_RATE сообщений/с) на весь процесс и
+  ограниченное число параллельных отправителей (BROADCAST_CONCURRENCY);
+- RetryAfter приостанавливает весь bucket на указанное Telegram время -
+  flood control у Bot API общий на бота, а не на чат;
+- задание, курсор (последний обработанный user_id) и счётчики хранятся
+  в broadcast_jobs; после перезапуска resume_unfinished() продолжает с
+  курсора (повторно может уйти не более одной страницы);
+- 403 (бот заблокирован / аккаунт удалён) записывается в
+  broadcast_blocked_users, следующие рассылки таких пользователей
+  пропускают, пока они снова не нажмут /start;
+- прогресс раз в BROADCAST_PROGRESS_INTERVAL секунд редактирует
+  статус-сообщение админа.
+
+Использование:
+    engine = get_broadcast_engine(DB_PATH)
+    job_id = engine.create_job(text, created_by=admin_id, status_chat_id=..., status_message_id=...)
+    engine.start_job(context.bot, job_id)
+"""
+
+import asyncio
+import logging
+import os
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Union
+
+from telegram.error import BadRequest, Forbidden, NetworkError, RetryAfter, TelegramError, TimedOut
+
+from schema_migrations import Migration, ensure_schema
+
+logger = logging.getLogger(__name__)
+
+# Bot API: ~30 сообщений/с в разные чаты; оставляем запас
+BROADCAST_RATE = float(os.getenv("BROADCAST_RATE", "25"))
+BROADCAST_BURST = float(os.getenv("BROADCAST_BURST", "25"))
+BROADCAST_CONCURRENCY = int(os.getenv("BROADCAST_CONCURRENCY", "8"))
+BROADCAST_PAGE_SIZE = int(os.getenv("BROADCAST_PAGE_SIZE", "100"))
+BROADCAST_MAX_RETRIES = int(os.getenv("BROADCAST_MAX_RETRIES", "3"))
+BROADCAST_PROGRESS_INTERVAL = float(os.getenv("BROADCAST_PROGRESS_INTERVAL", "3"))
+
+BROADCAST_SCHEMA_SCOPE = "broadcast"
+
+STATUS_PENDING = "pending"
+STATUS_RUNNING = "running"
+STATUS_COMPLETED = "completed"
+STATUS_CANCELLED = "cancelled"
+STATUS_FAILED = "failed"
+
+# Исход отправки одному получателю
+RESULT_SENT = "sent"
+RESULT_BLOCKED = "blocked"
+RESULT_FAILED = "failed"
+
+
+def _create_broadcast_tables(cursor: sqlite3.Cursor) -> None:
+    """Задания рассылок и пользователи, недоступные для рассылок"""
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS broadcast_jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            created_by INTEGER,
+            text TEXT NOT NULL,
+            parse_mode TEXT,
+            status TEXT NOT NULL DEFAULT 'pending',
+            cursor_user_id INTEGER NOT NULL DEFAULT 0,
+            total INTEGER NOT NULL DEFAULT 0,
+            sent INTEGER NOT NULL DEFAULT 0,
+            failed INTEGER NOT NULL DEFAULT 0,
+            blocked INTEGER NOT NULL DEFAULT 0,
+            status_chat_id INTEGER,
+            status_message_id INTEGER,
+            error TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            finished_at TIMESTAMP
+        )
+    """)
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_broadcast_jobs_status
+        ON broadcast_jobs(status)
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS broadcast_blocked_users (
+            user_id INTEGER PRIMARY KEY,
+            reason TEXT,
+            blocked_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+
+
+BROADCAST_MIGRATIONS = [
+    Migration(1, "broadcast_tables", _create_broadcast_tables),
+]
+
+
+def retry_after_seconds(error: RetryAfter) -> float:
+    """Пауза RetryAfter в секундах (PTB отдаёт int или timedelta)."""
+    value = error.retry_after
+    return value.total_seconds() if hasattr(value, "total_seconds") else float(value)
+
+
+# =============================================================================
+# TOKEN BUCKET
+# =============================================================================
+
+class TokenBucket:
+    """
+    Асинхронный token bucket: rate токенов/с, не больше capacity в запасе.
+
+    pause(seconds) блокирует выдачу токенов всем отправителям
+    (используется для RetryAfter).
+    """
+
+    def __init__(self, rate: float = BROADCAST_RATE, capacity: float = BROADCAST_BURST):
+        self.rate = rate
+        self.capacity = max(capacity, 1.0)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def _refill(self, now: float) -> None:
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def pause(self, seconds: float) -> None:
+        now = time.monotonic()
+        self._paused_until = max(self._paused_until, now + seconds)
+        # Во время паузы токены не копятся - после неё не будет всплеска
+        self._tokens = 0.0
+        self._updated = self._paused_until
+
+    async def acquire(self) -> None:
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+                self._refill(now)
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+_shared_bucket: Optional[TokenBucket] = None
+
+
+def get_send_bucket() -> TokenBucket:
+    """Общий bucket исходящих рассылок и постов (один на процесс)."""
+    global _shared_bucket
+    if _shared_bucket is None:
+        _shared_bucket = TokenBucket()
+    return _shared_bucket
+
+
+async def send_with_retry(bot: Any, chat_id: Union[int, str], text: str,
+                          bucket: Optional[TokenBucket] = None,
+                          max_retries: int = BROADCAST_MAX_RETRIES, **kwargs) -> Any:
+    """
+    send_message через общий bucket с учётом RetryAfter и сетевых сбоев.
+
+    Forbidden/BadRequest не повторяются и пробрасываются вызывающему.
+    """
+    bucket = bucket or get_send_bucket()
+    attempt = 0
+    while True:
+        await bucket.acquire()
+        try:
+            return await bot.send_message(chat_id=chat_id, text=text, **kwargs)
+        except RetryAfter as e:
+            wait = retry_after_seconds(e)
+            logger.warning(f"⏳ Flood control: пауза рассылок {wait:.0f}s")
+            bucket.pause(wait)
+        except (Forbidden, BadRequest):
+            raise
+        except (TimedOut, NetworkError):
+            if attempt >= max_retries:
+                raise
+            await asyncio.sleep(min(2 ** attempt, 10))
+        attempt += 1
+        if attempt > max_retries:
+            raise TelegramError(f"Send to {chat_id} failed after {max_retries} retries")
+
+
+# =============================================================================
+# ENGINE
+# =============================================================================
+
+@dataclass
+class BroadcastJob:
+    id: int
+    text: str
+    parse_mode: Optional[str]
+    status: str
+    cursor_user_id: int
+    total: int
+    sent: int
+    failed: int
+    blocked: int
+    status_chat_id: Optional[int]
+    status_message_id: Optional[int]
+    created_by: Optional[int] = None
+    error: Optional[str] = None
+
+    @property
+    def processed(self) -> int:
+        return self.sent + self.failed + self.blocked
+
+
+ProgressCallback = Callable[[BroadcastJob, float], Awaitable[None]]
+
+
+class BroadcastEngine:
+    """Персистентные задания рассылки по users (не забаненным и не заблокировавшим бота)."""
+
+    def __init__(self, db_path: str, bucket: Optional[TokenBucket] = None,
+                 concurrency: int = BROADCAST_CONCURRENCY, page_size: int = BROADCAST_PAGE_SIZE,
+                 progress_interval: float = BROADCAST_PROGRESS_INTERVAL):
+        self.db_path = db_path
+        self.bucket = bucket
+        self.concurrency = concurrency
+        self.page_size = page_size
+        self.progress_interval = progress_interval
+        self._tasks: Dict[int, asyncio.Task] = {}
+        self._cancelled: set = set()
+        ensure_schema(self.db_path, BROADCAST_SCHEMA_SCOPE, BROADCAST_MIGRATIONS)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, timeout=10.0)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    # ------------------------------------------------------------ задания
+
+    def count_recipients(self, after_user_id: int = 0) -> int:
+        conn = self._connect()
+        try:
+            return int(conn.execute("""
+                SELECT COUNT(*) FROM users
+                WHERE is_banned = 0 AND user_id > ?
+                AND user_id NOT IN (SELECT user_id FROM broadcast_blocked_users)
+            """, (after_user_id,)).fetchone()[0])
+        finally:
+            conn.close()
+
+    def create_job(self, text: str, created_by: Optional[int] = None, parse_mode: Optional[str] = None,
+                   status_chat_id: Optional[int] = None, status_message_id: Optional[int] = None) -> int:
+        """Создаёт задание рассылки (получатели фиксируются по курсору при отправке)."""
+        total = self.count_recipients()
+        conn = self._connect()
+        try:
+            cursor = conn.execute("""
+                INSERT INTO broadcast_jobs (created_by, text, parse_mode, total, status_chat_id, status_message_id)
+                VALUES (?, ?, ?, ?, ?, ?)
+            """, (created_by, text, parse_mode, total, status_chat_id, status_message_id))
+            conn.commit()
+            return cursor.lastrowid or 0
+        finally:
+            conn.close()
+
+    def set_status_message(self, job_id: int, chat_id: int, message_id: int) -> None:
+        conn = self._connect()
+        try:
+            conn.execute("""
+                UPDATE broadcast_jobs SET status_chat_id = ?, status_message_id = ? WHERE id = ?
+            """, (chat_id, message_id, job_id))
+            conn.commit()
+        finally:
+            conn.close()
+
+    def get_job(self, job_id: int) -> Optional[BroadcastJob]:
+        conn = self._connect()
+        try:
+            row = conn.execute("""
+                SELECT id, text, parse_mode, status, cursor_user_id, total, sent, failed, blocked,
+                       status_chat_id, status_message_id, created_by, error
+                FROM broadcast_jobs WHERE id = ?
+            """, (job_id,)).fetchone()
+        finally:
+            conn.close()
+        return BroadcastJob(**dict(row)) if row else None
+
+    def unfinished_jobs(self) -> List[int]:
+        conn = self._connect()
+        try:
+            rows = conn.execute("""
+                SELECT id FROM broadcast_jobs WHERE status IN (?, ?) ORDER BY id
+            """, (STATUS_PENDING, STATUS_RUNNING)).fetchall()
+        finally:
+            conn.close()
+        return [row[0] for row in rows]
+
+    def _save_progress(self, job: BroadcastJob, status: Optional[str] = None) -> None:
+        conn = self._connect()
+        try:
+            conn.execute("""
+                UPDATE broadcast_jobs
+                SET cursor_user_id = ?, sent = ?, failed = ?, blocked = ?, status = ?, error = ?,
+                    updated_at = CURRENT_TIMESTAMP,
+                    finished_at = CASE WHEN ? IN (?, ?, ?) THEN CURRENT_TIMESTAMP ELSE finished_at END
+                WHERE id = ?
+            """, (
+                job.cursor_user_id, job.sent, job.failed, job.blocked, status or job.status, job.error,
+                status or job.status, STATUS_COMPLETED, STATUS_CANCELLED, STATUS_FAILED, job.id
+            ))
+            conn.commit()
+        finally:
+            conn.close()
+        if status:
+            job.status = status
+
+    def _next_page(self, after_user_id: int) -> List[int]:
+        conn = self._connect()
+        try:
+            rows = conn.execute("""
+                SELECT user_id FROM users
+                WHERE is_banned = 0 AND user_id > ?
+                AND user_id NOT IN (SELECT user_id FROM broadcast_blocked_users)
+                ORDER BY user_id
+                LIMIT ?
+            """, (after_user_id, self.page_size)).fetchall()
+        finally:
+            conn.close()
+        return [row[0] for row in rows]
+
+    def _mark_blocked(self, user_ids: List[tuple]) -> None:
+        if not user_ids:
+            return
+        conn = self._connect()
+        try:
+            conn.executemany("""
+                INSERT OR REPLACE INTO broadcast_blocked_users (user_id, reason, blocked_at)
+                VALUES (?, ?, CURRENT_TIMESTAMP)
+            """, user_ids)
+            conn.commit()
+        finally:
+            conn.close()
+
+    def unmark_blocked(self, user_id: int) -> None:
+        """Пользователь снова пишет боту - возвращаем его в рассылки."""
+        conn = self._connect()
+        try:
+            conn.execute("DELETE FROM broadcast_blocked_users WHERE user_id = ?", (user_id,))
+            conn.commit()
+        finally:
+            conn.close()
+
+    def blocked_count(self) -> int:
+        conn = self._connect()
+        try:
+            return int(conn.execute("SELECT COUNT(*) FROM broadcast_blocked_users").fetchone()[0])
+        finally:
+            conn.close()
+
+    # ------------------------------------------------------------ отправка
+
+    async def _send_one(self, bot: Any, job: BroadcastJob, user_id: int) -> tuple:
+        try:
+            await send_with_retry(bot, user_id, job.text, bucket=self.bucket or get_send_bucket(),
+                                  parse_mode=job.parse_mode)
+            return RESULT_SENT, None
+        except Forbidden as e:
+            return RESULT_BLOCKED, str(e)
+        except BadRequest as e:
+            message = str(e).lower()
+            if "chat not found" in message or "user is deactivated" in message:
+                return RESULT_BLOCKED, str(e)
+            if "can't parse entities" in message:
+                # Ошибка в самом тексте - одинакова для всех получателей
+                raise
+            return RESULT_FAILED, str(e)
+        except TelegramError as e:
+            logger.warning(f"Рассылка #{job.id}: не удалось отправить {user_id}: {e}")
+            return RESULT_FAILED, str(e)
+
+    async def run_job(self, bot: Any, job_id: int, on_progress: Optional[ProgressCallback] = None) -> BroadcastJob:
+        """
+        Выполняет (или продолжает) задание до конца.
+
+        Курсор и счётчики сохраняются после каждой страницы получателей.
+        """
+        job = self.get_job(job_id)
+        if job is None:
+            raise ValueError(f"Broadcast job {job_id} not found")
+        if job.status not in (STATUS_PENDING, STATUS_RUNNING):
+            return job
+
+        self._save_progress(job, STATUS_RUNNING)
+        semaphore = asyncio.Semaphore(self.concurrency)
+        started = time.monotonic()
+        start_processed = job.processed
+        last_progress = 0.0
+
+        async def send(user_id: int) -> tuple:
+            async with semaphore:
+                return user_id, await self._send_one(bot, job, user_id)
+
+        logger.info(f"📢 Рассылка #{job.id}: старт с user_id>{job.cursor_user_id}, всего {job.total}")
+        try:
+            while True:
+                if job.id in self._cancelled:
+                    self._cancelled.discard(job.id)
+                    self._save_progress(job, STATUS_CANCELLED)
+                    break
+                page = self._next_page(job.cursor_user_id)
+                if not page:
+                    self._save_progress(job, STATUS_COMPLETED)
+                    break
+
+                results = await asyncio.gather(*(send(user_id) for user_id in page))
+                blocked = []
+                for user_id, (result, reason) in results:
+                    if result == RESULT_SENT:
+                        job.sent += 1
+                    elif result == RESULT_BLOCKED:
+                        job.blocked += 1
+                        blocked.append((user_id, reason))
+                    else:
+                        job.failed += 1
+                self._mark_blocked(blocked)
+                job.cursor_user_id = page[-1]
+                self._save_progress(job)
+
+                now = time.monotonic()
+                if on_progress and now - last_progress >= self.progress_interval:
+                    last_progress = now
+                    rate = (job.processed - start_processed) / max(now - started, 1e-6)
+                    await on_progress(job, rate)
+        except BadRequest as e:
+            job.error = str(e)
+            self._save_progress(job, STATUS_FAILED)
+            logger.error(f"❌ Рассылка #{job.id} остановлена: {e}")
+        except asyncio.CancelledError:
+            # Процесс останавливается: задание остаётся running и будет продолжено
+            self._save_progress(job)
+            raise
+
+        elapsed = time.monotonic() - started
+        logger.info(
+            f"📢 Рассылка #{job.id} {job.status}: sent={job.sent} blocked={job.blocked} "
+            f"failed={job.failed} за {elapsed:.1f}s"
+        )
+        if on_progress:
+            rate = (job.processed - start_processed) / max(elapsed, 1e-6)
+            await on_progress(job, rate)
+        return job
+
+    def start_job(self, bot: Any, job_id: int, on_progress: Optional[ProgressCallback] = None) -> asyncio.Task:
+        """Запускает задание в фоне (handler не ждёт окончания рассылки)."""
+        task = self._tasks.get(job_id)
+        if task is not None and not task.done():
+            return task
+        task = asyncio.create_task(self.run_job(bot, job_id, on_progress), name=f"broadcast-{job_id}")
+        self._tasks[job_id] = task
+        task.add_done_callback(lambda _: self._tasks.pop(job_id, None))
+        return task
+
+    def cancel_job(self, job_id: int) -> bool:
+        """Отмена: выполняющееся задание остановится после текущей страницы."""
+        if job_id in self._tasks:
+            self._cancelled.add(job_id)
+            return True
+        job = self.get_job(job_id)
+        if job and job.status in (STATUS_PENDING, STATUS_RUNNING):
+            self._save_progress(job, STATUS_CANCELLED)
+            return True
+        return False
+
+    def resume_unfinished(self, bot: Any, on_progress: Optional[ProgressCallback] = None) -> List[int]:
+        """Продолжает задания, прерванные перезапуском."""
+        job_ids = self.unfinished_jobs()
+        for job_id in job_ids:
+            logger.info(f"🔁 Возобновляю рассылку #{job_id}")
+            self.start_job(bot, job_id, on_progress)
+        return job_ids
+
+
+def format_progress(job: BroadcastJob, rate: float) -> str:
+    """Текст статус-сообщения админа."""
+    done = job.status in (STATUS_COMPLETED, STATUS_CANCELLED, STATUS_FAILED)
+    header = {
+        STATUS_COMPLETED: "✅ <b>Рассылка завершена</b>",
+        STATUS_CANCELLED: "⏹️ <b>Рассылка отменена</b>",
+        STATUS_FAILED: "❌ <b>Рассылка остановлена</b>",
+    }.get(job.status, "📢 <b>Рассылка идёт...</b>")
+    percent = job.processed / job.total * 100 if job.total else 100.0
+    lines = [
+        f"{header} #{job.id}",
+        "",
+        f"• Обработано: {job.processed}/{job.total} ({min(percent, 100):.0f}%)",
+        f"• Отправлено: {job.sent}",
+        f"• Заблокировали бота: {job.blocked}",
+        f"• Не удалось: {job.failed}",
+    ]
+    if not done:
+        lines.append(f"• Скорость: {rate:.1f} сообщ/с")
+    if job.error:
+        lines.append(f"• Ошибка: {job.error}")
+    return "\n".join(lines)
+
+
+_engines: Dict[str, BroadcastEngine] = {}
+_engines_lock = threading.Lock()
+
+
+def get_broadcast_engine(db_path: str) -> BroadcastEngine:
+    """BroadcastEngine для БД (один экземпляр на файл)."""
+    key = os.path.abspath(db_path)
+    with _engines_lock:
+        if key not in _engines:
+            _engines[key] = BroadcastEngine(db_path)
+        return _engines[key]
+
+
+__all__ = [
+    "TokenBucket",
+    "get_send_bucket",
+    "retry_after_seconds",
+    "send_with_retry",
+    "BroadcastJob",
+    "BroadcastEngine",
+    "format_progress",
+    "get_broadcast_engine",
+    "BROADCAST_MIGRATIONS",
+]
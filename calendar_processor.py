@@ -9,6 +9,8 @@ import logging
 import re
 from typing import Optional
 
+from keyword_engine import keyword_engine
+
 logger = logging.getLogger(__name__)
 
 
@@ -177,6 +179,28 @@ def build_calendar_processing_prompt() -> str:
 ЯЗЫК: Русский, технический, с цифрами, структурированный, ДЛЯ ТРЕЙДЕРОВ И АНАЛИТИКОВ."""
 
 
+# Ключевые экономические метрики
+ECONOMIC_METRICS = [
+    'LPR', 'GDP', 'CPI', 'PPI', 'PMI', 'ISM', 'PCE', 'Fed',
+    'inflation', 'unemployment', 'retail', 'housing', 'ADP',
+    'jobless', 'nonfarm', 'payroll', 'earnings', 'sales',
+    'НДП', 'ВВП', 'инфляция', 'занятость', 'розница',
+    'CAC', 'DAX', 'FTSE', 'Nikkei', 'Shanghai', 'Kospi'
+]
+
+# Ключевые слова календаря
+CALENDAR_KEYWORDS = [
+    'календарь', 'calendar', 'события', 'events', 'данные', 'data',
+    'показатели', 'indicators', 'выпуск', 'release', 'мск', 'utc',
+    'ожидается', 'expected', 'forecast', 'прогноз'
+]
+
+keyword_engine.register({
+    "calendar.metrics": ECONOMIC_METRICS,
+    "calendar.keywords": CALENDAR_KEYWORDS,
+})
+
+
 def detect_calendar_input(user_message: str) -> bool:
     """
     Детектирует есть ли в сообщении экономический календарь.
@@ -192,23 +216,9 @@ def detect_calendar_input(user_message: str) -> bool:
     has_time = re.search(r'\d{1,2}:\d{2}', user_message)  # XX:XX формат
     has_flags = re.search(r'🇬🇧|🇺🇸|🇨🇳|🇪🇺|🇯🇵|🇫🇷|🇩🇪|🇸🇬|🇦🇺|🇳🇿|🇨🇦|🇮🇳', user_message)  # Флаги стран
     
-    # Ключевые экономические метрики
-    economic_metrics = [
-        'LPR', 'GDP', 'CPI', 'PPI', 'PMI', 'ISM', 'PCE', 'Fed',
-        'inflation', 'unemployment', 'retail', 'housing', 'ADP',
-        'jobless', 'nonfarm', 'payroll', 'earnings', 'sales',
-        'НДП', 'ВВП', 'инфляция', 'занятость', 'розница',
-        'CAC', 'DAX', 'FTSE', 'Nikkei', 'Shanghai', 'Kospi'
-    ]
-    has_metrics = any(metric in user_message for metric in economic_metrics)
-    
-    # Ключевые слова календаря
-    calendar_keywords = [
-        'календарь', 'calendar', 'события', 'events', 'данные', 'data',
-        'показатели', 'indicators', 'выпуск', 'release', 'мск', 'utc',
-        'ожидается', 'expected', 'forecast', 'прогноз'
-    ]
-    has_keywords = any(kw in user_message.lower() for kw in calendar_keywords)
+    # Метрики ищутся с учётом регистра (LPR, GDP...), ключевые слова - в нижнем
+    has_metrics = keyword_engine.has(user_message, "calendar.metrics")
+    has_keywords = keyword_engine.has(user_message.lower(), "calendar.keywords")
     
     # Результат: календарь если есть хотя бы 2 из 3 критериев
     is_calendar = sum([bool(has_time), bool(has_flags), bool(has_metrics), bool(has_keywords)]) >= 2
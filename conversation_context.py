@@ -26,6 +26,8 @@ from typing import List, Dict, Optional, Tuple
 from functools import lru_cache
 from threading import Lock, RLock
 
+from schema_migrations import Migration, ensure_schema
+
 logger = logging.getLogger(__name__)
 
 # ============================================================================
@@ -62,6 +64,38 @@ CREATE TABLE IF NOT EXISTS conversation_stats (
 );
 """
 
+CONVERSATION_SCHEMA_SCOPE = "conversation_context"
+
+
+def _create_conversation_schema(cursor: sqlite3.Cursor) -> None:
+    """Создаёт conversation_history/conversation_stats или пересоздаёт их без колонки role"""
+    # ✅ FIX: Only drop tables if they exist AND need migration
+    cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='conversation_history'")
+    table_exists = cursor.fetchone() is not None
+    
+    # If table exists, check if it has the proper schema (has 'role' column)
+    if table_exists:
+        cursor.execute("PRAGMA table_info(conversation_history)")
+        columns = {row[1] for row in cursor.fetchall()}
+        # Only recreate if missing critical columns
+        if 'role' not in columns:
+            logger.warning("⚠️ Table exists but missing 'role' column - migrating schema...")
+            cursor.execute("DROP TABLE IF EXISTS conversation_history")
+            cursor.execute("DROP TABLE IF EXISTS conversation_stats")
+            cursor.executescript(DB_SCHEMA)
+            logger.info("✅ Database schema migrated (tables recreated with proper schema)")
+        else:
+            logger.info("✅ Database schema is compatible - no recreation needed")
+    else:
+        # Table doesn't exist, create it fresh
+        cursor.executescript(DB_SCHEMA)
+        logger.info("✅ Database schema initialized (new tables created)")
+
+
+CONVERSATION_MIGRATIONS = [
+    Migration(1, "conversation_schema", _create_conversation_schema),
+]
+
 # ============================================================================
 # CONFIGURATION
 # ============================================================================
@@ -100,38 +134,14 @@ class ConversationContextManager:
         return cls._instance
     
     def init_database(self):
-        """Инициализирует базу данных и схему"""
+        """Инициализирует базу данных и схему (версионированные миграции)"""
         try:
             conn = sqlite3.connect(self.db_path, timeout=10.0)  # ✅ FIX: Increase timeout
             conn.execute('PRAGMA journal_mode=WAL;')  # ✅ FIX: Enable WAL mode
-            cursor = conn.cursor()
-            
-            # ✅ FIX: Only drop tables if they exist AND need migration
-            # Check if conversation_history already exists
-            cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='conversation_history'")
-            table_exists = cursor.fetchone() is not None
-            
-            # If table exists, check if it has the proper schema (has 'role' column)
-            if table_exists:
-                cursor.execute("PRAGMA table_info(conversation_history)")
-                columns = {row[1] for row in cursor.fetchall()}
-                # Only recreate if missing critical columns
-                if 'role' not in columns:
-                    logger.warning("⚠️ Table exists but missing 'role' column - migrating schema...")
-                    cursor.execute("DROP TABLE IF EXISTS conversation_history")
-                    cursor.execute("DROP TABLE IF EXISTS conversation_stats")
-                    cursor.executescript(DB_SCHEMA)
-                    conn.commit()
-                    logger.info("✅ Database schema migrated (tables recreated with proper schema)")
-                else:
-                    logger.info("✅ Database schema is compatible - no recreation needed")
-            else:
-                # Table doesn't exist, create it fresh
-                cursor.executescript(DB_SCHEMA)
-                conn.commit()
-                logger.info("✅ Database schema initialized (new tables created)")
-            
-            conn.close()
+            try:
+                ensure_schema(self.db_path, CONVERSATION_SCHEMA_SCOPE, CONVERSATION_MIGRATIONS, conn=conn)
+            finally:
+                conn.close()
         except Exception as e:
             logger.error(f"❌ Failed to init database: {e}")
     
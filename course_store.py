@@ -0,0 +1,209 @@
+"""
+Course Store v1.0
+Индекс курсов из courses/*.md, разобранный один раз.
+
+education.get_lesson_content на каждый просмотр урока открывал и читал
+весь markdown-файл курса и искал `## Lesson N:` регуляркой с DOTALL, с
+include_tests - ещё двумя регулярками по всему файлу; потом
+split_lesson_content и extract_quiz_from_lesson заново разбирали
+результат. Теперь:
+
+- файл курса разбирается один раз (лениво, при первом обращении или в
+  warm() при старте) в CourseIndex: уроки по номеру, раздел
+  "ТЕСТЫ К КУРСУ", ссылки на следующий урок;
+- lesson(course, n) - поиск в словаре; производные данные урока (текст
+  для показа и quiz, вопросы теста) считаются один раз на версию файла;
+- горячая перезагрузка: не чаще раза в COURSE_STORE_CHECK_INTERVAL
+  секунд сверяются mtime и размер файла, изменённый файл разбирается
+  заново, удалённый - убирается из индекса.
+
+Границы уроков и раздела тестов - те же, что у прежних регулярок
+(поиск `## Lesson` / `# ТЕСТЫ К КУРСУ` через str.find), поэтому тексты
+уроков совпадают с прежними символ в символ.
+"""
+
+import logging
+import os
+import re
+import time
+from dataclasses import dataclass, field
+from functools import cached_property
+from typing import Any, Dict, List, Mapping, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Как часто (сек) сверять mtime файлов курсов; 0 - при каждом обращении
+COURSE_STORE_CHECK_INTERVAL = float(os.getenv("COURSE_STORE_CHECK_INTERVAL", "2.0"))
+
+LESSON_MARKER = "## Lesson"
+TESTS_MARKER = "# ТЕСТЫ К КУРСУ"
+LESSON_TEST_MARKER = "## Тест к Уроку"
+
+_LESSON_HEADER_RE = re.compile(r"## Lesson (\d+):")
+
+
+@dataclass(frozen=True)
+class CourseLesson:
+    """Урок курса; производные данные считаются один раз и кэшируются."""
+    course: str
+    number: int
+    text: str  # как get_lesson_content(course, n)
+    tests_section: Optional[str] = None
+    next_number: Optional[int] = None
+
+    @property
+    def title(self) -> str:
+        return self.text.split("\n", 1)[0].strip()
+
+    @cached_property
+    def text_with_tests(self) -> str:
+        """Как get_lesson_content(course, n, include_tests=True)."""
+        if self.tests_section is None:
+            return self.text
+        return self.text + "\n\n" + self.tests_section
+
+    @cached_property
+    def view(self) -> Tuple[str, str]:
+        """(текст урока, quiz) после clean_lesson_content и split_lesson_content."""
+        from education import clean_lesson_content, split_lesson_content
+        return split_lesson_content(clean_lesson_content(self.text))
+
+    @cached_property
+    def _questions(self) -> Tuple[Dict[str, Any], ...]:
+        from education import extract_quiz_from_lesson, split_lesson_content
+        content = self.text_with_tests
+        _, quiz_text = split_lesson_content(content)
+        if quiz_text:
+            return tuple(extract_quiz_from_lesson(quiz_text))
+        # Quiz нет в уроке - вопросы из раздела "ТЕСТЫ К КУРСУ"
+        return tuple(extract_quiz_from_lesson("", lesson_number=self.number, full_course_content=content))
+
+    def quiz_questions(self) -> List[Dict[str, Any]]:
+        """Вопросы теста урока (копия: сессия квиза может их менять)."""
+        return [dict(question, answers=list(question["answers"])) for question in self._questions]
+
+
+@dataclass
+class CourseIndex:
+    """Разобранный файл курса."""
+    course: str
+    path: str
+    mtime_ns: int
+    size: int
+    lessons: Dict[int, CourseLesson]
+    tests_section: Optional[str] = None
+    checked_at: float = field(default=0.0, compare=False)
+
+
+def parse_course(course: str, content: str) -> Tuple[Dict[int, CourseLesson], Optional[str]]:
+    """Уроки (номер -> CourseLesson) и раздел тестов из markdown курса."""
+    tests_section = None
+    tests_start = content.find(TESTS_MARKER)
+    if tests_start != -1 and content.find(LESSON_TEST_MARKER, tests_start + len(TESTS_MARKER)) != -1:
+        tests_section = content[tests_start:]
+
+    bodies: Dict[int, str] = {}
+    position = content.find(LESSON_MARKER)
+    while position != -1:
+        match = _LESSON_HEADER_RE.match(content, position)
+        # Номер берётся как в f"## Lesson {n}:" - без ведущих нулей
+        if match and str(int(match.group(1))) == match.group(1) and int(match.group(1)) not in bodies:
+            end = content.find(LESSON_MARKER, match.end())
+            bodies[int(match.group(1))] = content[match.end():end if end != -1 else len(content)].strip()
+        position = content.find(LESSON_MARKER, position + 1)
+
+    numbers = sorted(bodies)
+    lessons = {
+        number: CourseLesson(course, number, bodies[number], tests_section,
+                             numbers[index + 1] if index + 1 < len(numbers) else None)
+        for index, number in enumerate(numbers)
+    }
+    return lessons, tests_section
+
+
+class CourseStore:
+    """Индекс курсов с ленивой загрузкой и перезагрузкой по mtime."""
+
+    def __init__(self, courses: Mapping[str, Mapping[str, Any]],
+                 check_interval: float = COURSE_STORE_CHECK_INTERVAL):
+        # courses - описание курсов с путём к файлу ('file'), как education.COURSES_DATA
+        self._courses = courses
+        self.check_interval = check_interval
+        self._indexes: Dict[str, CourseIndex] = {}
+        self._loads = 0
+        self._reloads = 0
+
+    def course(self, course: str) -> Optional[CourseIndex]:
+        """Индекс курса или None (нет такого курса или файла)."""
+        index = self._indexes.get(course)
+        now = time.monotonic()
+        if index is not None and now - index.checked_at < self.check_interval:
+            return index
+        info = self._courses.get(course)
+        if info is None:
+            self._indexes.pop(course, None)
+            return None
+        path = info["file"]
+        try:
+            stat = os.stat(path)
+        except OSError:
+            if self._indexes.pop(course, None) is not None:
+                logger.warning(f"⚠️ Файл курса пропал: {path}")
+            return None
+        if index is not None and (index.path, index.mtime_ns, index.size) == (path, stat.st_mtime_ns, stat.st_size):
+            index.checked_at = now
+            return index
+        return self._load(course, path, stat, reload=index is not None)
+
+    def _load(self, course: str, path: str, stat: os.stat_result, reload: bool) -> Optional[CourseIndex]:
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                content = f.read()
+        except OSError as e:
+            logger.error(f"❌ Не удалось прочитать курс {course}: {e}")
+            self._indexes.pop(course, None)
+            return None
+        lessons, tests_section = parse_course(course, content)
+        index = CourseIndex(course, path, stat.st_mtime_ns, stat.st_size, lessons, tests_section,
+                            checked_at=time.monotonic())
+        self._indexes[course] = index
+        if reload:
+            self._reloads += 1
+            logger.info(f"♻️ Курс {course} перезагружен: {len(lessons)} уроков")
+        else:
+            self._loads += 1
+            logger.debug(f"📚 Курс {course} загружен: {len(lessons)} уроков")
+        return index
+
+    def lesson(self, course: str, number: int) -> Optional[CourseLesson]:
+        index = self.course(course)
+        if index is None:
+            return None
+        return index.lessons.get(number)
+
+    def warm(self) -> int:
+        """Загружает все курсы (при старте бота); возвращает число уроков."""
+        return sum(len(index.lessons) for index in map(self.course, list(self._courses)) if index)
+
+    def invalidate(self, course: Optional[str] = None) -> None:
+        if course is None:
+            self._indexes.clear()
+        else:
+            self._indexes.pop(course, None)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "courses": len(self._indexes),
+            "lessons": sum(len(index.lessons) for index in self._indexes.values()),
+            "loads": self._loads,
+            "reloads": self._reloads,
+        }
+
+
+__all__ = [
+    "CourseStore",
+    "CourseIndex",
+    "CourseLesson",
+    "parse_course",
+    "COURSE_STORE_CHECK_INTERVAL",
+]
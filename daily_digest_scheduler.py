@@ -14,15 +14,16 @@ import logging
 import asyncio
 import os
 from datetime import datetime, time as datetime_time
-from typing import Optional
+from typing import Optional, Union
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.triggers.cron import CronTrigger
 from telegram import Bot
-from telegram.error import TelegramError
 from dotenv import load_dotenv
 
 from crypto_digest import collect_digest_data
 from digest_formatter import format_digest
+from messages import split_message
+from outbound_queue import outbound
 
 load_dotenv()
 
@@ -119,11 +120,14 @@ class DailyDigestScheduler:
         """
         Безопасно отправить сообщение с повторными попытками
         
+        Куски уходят через outbound_queue: повторяется только упавший кусок
+        (с учётом RetryAfter), уже отправленные не дублируются.
+        
         Args:
             chat_id: ID или @username канала
             text: Текст сообщения
             parse_mode: Режим парсинга (HTML или Markdown)
-            max_retries: Максимум попыток отправки
+            max_retries: Максимум повторов одного куска
         """
         if not self.bot:
             logger.error("❌ Bot is not initialized")
@@ -131,65 +135,30 @@ class DailyDigestScheduler:
         
         # Преобразуем числовой ID группы в правильный формат для Telegram
         # Приватные группы: 1003228919683 -> -1001003228919683
-        final_chat_id = chat_id
-        if isinstance(chat_id, str) and chat_id.isdigit():
-            channel_id_int = int(chat_id)
-            if channel_id_int > 0:
-                final_chat_id = -100 * (channel_id_int // 1000) - (channel_id_int % 1000)
+        # Числовой ID передаём числом: строку очередь исходящих считает @username
+        final_chat_id: Union[int, str] = chat_id
+        if isinstance(chat_id, str) and chat_id.lstrip("-").isdigit():
+            final_chat_id = int(chat_id)
+            if final_chat_id > 0:
+                final_chat_id = -100 * (final_chat_id // 1000) - (final_chat_id % 1000)
         
         # Разбиваем на чанки если сообщение больше 4096 символов
-        chunks = self._split_message(text, max_length=4096)
+        futures = outbound.send_chunks(self.bot, final_chat_id, text, chunk_size=4096,
+                                       max_retries=max_retries, parse_mode=parse_mode)
+        results = await asyncio.gather(*futures, return_exceptions=True)
         
-        for attempt in range(max_retries):
-            try:
-                for i, chunk in enumerate(chunks):
-                    message = await self.bot.send_message(
-                        chat_id=final_chat_id,
-                        text=chunk,
-                        parse_mode=parse_mode
-                    )
-                    
-                    if i == 0:
-                        logger.info(f"✅ Message sent to {chat_id} (part {i+1}/{len(chunks)})")
-                    else:
-                        logger.info(f"✅ Message part {i+1}/{len(chunks)} sent")
-                
-                break  # Успешно отправили
-                
-            except TelegramError as e:
-                logger.error(f"⚠️ Attempt {attempt+1}/{max_retries} failed: {e}")
-                
-                if attempt < max_retries - 1:
-                    wait_time = (attempt + 1) * 2  # Экспоненциальная задержка
-                    logger.info(f"⏳ Waiting {wait_time}s before retry...")
-                    await asyncio.sleep(wait_time)
-                else:
-                    logger.error(f"❌ Failed to send message after {max_retries} attempts")
-                    raise
+        for i, result in enumerate(results):
+            if isinstance(result, BaseException):
+                logger.error(f"❌ Failed to send message part {i+1}/{len(results)} to {chat_id}: {result}")
+                raise result
+        logger.info(f"✅ Message sent to {chat_id} ({len(results)} parts)")
     
     @staticmethod
     def _split_message(text: str, max_length: int = 4096) -> list:
         """
         Разбить сообщение на части если оно слишком длинное
         """
-        if len(text) <= max_length:
-            return [text]
-        
-        parts = []
-        current_part = ""
-        
-        for line in text.split('\n'):
-            if len(current_part) + len(line) + 1 > max_length:
-                if current_part:
-                    parts.append(current_part)
-                current_part = line
-            else:
-                current_part += ('\n' if current_part else '') + line
-        
-        if current_part:
-            parts.append(current_part)
-        
-        return parts
+        return split_message(text, chunk_size=max_length)
     
     async def stop(self):
         """Остановить планировщик"""
@@ -563,3 +563,24 @@ def get_daily_quest_xp_earned(user_id: int, db_conn) -> int:
     
     result = cursor.fetchone()
     return result[0] if result and result[0] else 0
+
+
+def get_quest_progress_today(user_id: int, db_conn):
+    """
+    Выполненные сегодня задания и заработанный за них XP одним запросом
+    (вместо get_completed_quests_today + get_daily_quest_xp_earned)
+    """
+    from datetime import date
+    
+    cursor = db_conn.cursor()
+    today = date.today().isoformat()
+    
+    cursor.execute("""
+        SELECT lesson_id, SUM(CASE WHEN xp_earned > 0 THEN xp_earned ELSE 0 END)
+        FROM user_quiz_responses
+        WHERE user_id = ? AND DATE(answered_at) = ?
+        GROUP BY lesson_id
+    """, (user_id, today))
+    
+    rows = cursor.fetchall()
+    return [str(row[0]) for row in rows], sum(row[1] or 0 for row in rows)
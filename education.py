@@ -11,6 +11,9 @@ import sqlite3
 from datetime import datetime
 from typing import Optional, List, Tuple, Dict, Any
 
+from course_store import CourseLesson, CourseStore
+from keyword_engine import keyword_engine
+
 logger = logging.getLogger(__name__)
 
 # Курсы с локальным кешем (заполняются при запуске)
@@ -44,6 +47,9 @@ COURSES_DATA = {
     }
 }
 
+# ⚡ Индекс уроков из markdown курсов: файл разбирается один раз, перезагрузка по mtime
+course_store = CourseStore(COURSES_DATA)
+
 # XP таблица
 XP_REWARDS = {
     'lesson_completed': 10,
@@ -176,6 +182,17 @@ def add_badge_to_user(cursor, user_id: int, badge_key: str) -> bool:
     return False
 
 
+def get_course_lesson(course_name: str, lesson_num: int) -> Optional[CourseLesson]:
+    """Урок из индекса курсов (course_store) или None."""
+    if course_name not in COURSES_DATA:
+        return None
+    try:
+        lesson_num = int(lesson_num)
+    except (TypeError, ValueError):
+        return None
+    return course_store.lesson(course_name, lesson_num)
+
+
 def get_lesson_content(course_name: str, lesson_num: int, include_tests: bool = False) -> Optional[str]:
     """Получает контент урока из markdown файла.
     
@@ -184,38 +201,22 @@ def get_lesson_content(course_name: str, lesson_num: int, include_tests: bool =
     - lesson_num: номер урока
     - include_tests: если True, включает раздел "ТЕСТЫ К КУРСУ" в конец контента
     """
-    if course_name not in COURSES_DATA:
-        return None
-    
-    file_path = COURSES_DATA[course_name]['file']
-    if not os.path.exists(file_path):
+    lesson = get_course_lesson(course_name, lesson_num)
+    if lesson is None:
         return None
-    
-    with open(file_path, 'r', encoding='utf-8') as f:
-        content = f.read()
-    
-    # Парсим нужный урок
-    pattern = rf'## Lesson {lesson_num}:(.*?)(?=## Lesson|\Z)'
-    match = re.search(pattern, content, re.DOTALL)
-    
-    if not match:
-        return None
-    
-    lesson_text = match.group(1).strip()
-    
-    # Если нужны тесты, добавляем раздел "ТЕСТЫ К КУРСУ" в конец
-    if include_tests:
-        # Ищем раздел ТЕСТЫ К КУРСУ
-        tests_pattern = r'# ТЕСТЫ К КУРСУ(.*?)## Тест к Уроку.*?(?=## Тест к Уроку|\Z)'
-        tests_match = re.search(tests_pattern, content, re.DOTALL)
-        
-        if tests_match:
-            # Добавляем весь раздел тестов в конец контента
-            tests_section = re.search(r'# ТЕСТЫ К КУРСУ(.*)(?:\Z)', content, re.DOTALL)
-            if tests_section:
-                lesson_text += '\n\n' + tests_section.group(0)
-    
-    return lesson_text
+    return lesson.text_with_tests if include_tests else lesson.text
+
+
+def get_lesson_view(course_name: str, lesson_num: int) -> Optional[Tuple[str, str]]:
+    """(текст урока, quiz) для показа - как clean_lesson_content + split_lesson_content."""
+    lesson = get_course_lesson(course_name, lesson_num)
+    return lesson.view if lesson is not None and lesson.text else None
+
+
+def get_lesson_quiz(course_name: str, lesson_num: int) -> Optional[List[Dict]]:
+    """Вопросы теста к уроку (из урока или раздела "ТЕСТЫ К КУРСУ"); None - нет урока."""
+    lesson = get_course_lesson(course_name, lesson_num)
+    return lesson.quiz_questions() if lesson is not None and lesson.text_with_tests else None
 
 
 def clean_lesson_content(content: str) -> str:
@@ -456,90 +457,212 @@ def get_all_tools_db() -> List[Dict[str, Any]]:
     ]
 
 
-def get_practical_tips(news_text: str) -> List[str]:
-    """
-    Анализирует новость и генерирует практические советы для пользователя.
-    """
-    tips = []
-    news_lower = news_text.lower()
-    
+# Практические советы по ключевым словам новости: первая найденная категория
+# (порядок важен) даёт два совета
+PRACTICAL_TIPS: List[Tuple[str, List[str], List[str]]] = [
     # Советы по безопасности и взломам
-    if any(word in news_lower for word in ['взлом', 'hack', 'уязвимость', 'атака', 'взломана', 'скам', 'scam']):
-        tips.append("⚠️ **БЕЗОПАСНОСТЬ**: Никогда не используйте один пароль для разных кошельков. Включите 2FA везде!")
-        tips.append("🔐 **ЗАЩИТА**: При взломах сразу переводите активы на холодный кошелек (Ledger, Trezor)")
-        return tips
-    
+    ("tips.security", ['взлом', 'hack', 'уязвимость', 'атака', 'взломана', 'скам', 'scam'], [
+        "⚠️ **БЕЗОПАСНОСТЬ**: Никогда не используйте один пароль для разных кошельков. Включите 2FA везде!",
+        "🔐 **ЗАЩИТА**: При взломах сразу переводите активы на холодный кошелек (Ledger, Trezor)",
+    ]),
     # Советы по падению цены
-    if any(word in news_lower for word in ['цена упала', 'падение', 'dump', 'обвал', 'медведь', 'bear', 'crash']):
-        tips.append("📉 **РЫНОК**: Не паникуйте при падении. Проверьте фундаментальные причины перед продажей")
-        tips.append("💡 **СОВЕТ**: Падение часто создает лучшие точки входа для долгосрочных инвесторов")
-        return tips
-    
+    ("tips.price_drop", ['цена упала', 'падение', 'dump', 'обвал', 'медведь', 'bear', 'crash'], [
+        "📉 **РЫНОК**: Не паникуйте при падении. Проверьте фундаментальные причины перед продажей",
+        "💡 **СОВЕТ**: Падение часто создает лучшие точки входа для долгосрочных инвесторов",
+    ]),
     # Советы по новым максимумам
-    if any(word in news_lower for word in ['новый ath', 'рекорд', 'максимум', 'all time high', 'peak', 'бычий', 'bull']):
-        tips.append("📈 **ВНИМАНИЕ**: На максимумах цены чаще возникают откаты. Рассчитайте свой take profit")
-        tips.append("🎯 **СТРАТЕГИЯ**: Закрепляйте прибыль частями, не дожидаясь максимума")
-        return tips
-    
+    ("tips.new_high", ['новый ath', 'рекорд', 'максимум', 'all time high', 'peak', 'бычий', 'bull'], [
+        "📈 **ВНИМАНИЕ**: На максимумах цены чаще возникают откаты. Рассчитайте свой take profit",
+        "🎯 **СТРАТЕГИЯ**: Закрепляйте прибыль частями, не дожидаясь максимума",
+    ]),
     # Советы по ETF и институциональному входу
-    if any(word in news_lower for word in ['etf', 'фонд', 'инсти', 'инвести', 'компания', 'blackrock', 'vanguard']):
-        tips.append("🏦 **ИНСТИТУЦИОНАЛЬНЫЙ**: Когда инсты входят - это обычно долгосрочный положительный сигнал")
-        tips.append("💰 **СОВЕТ**: Институциональное финансирование помогает легализации крипто в странах")
-        return tips
-    
+    ("tips.institutional", ['etf', 'фонд', 'инсти', 'инвести', 'компания', 'blackrock', 'vanguard'], [
+        "🏦 **ИНСТИТУЦИОНАЛЬНЫЙ**: Когда инсты входят - это обычно долгосрочный положительный сигнал",
+        "💰 **СОВЕТ**: Институциональное финансирование помогает легализации крипто в странах",
+    ]),
     # Советы по регулированию
-    if any(word in news_lower for word in ['reg', 'закон', 'запрет', 'разрешен', 'лицензия', 'sec', 'cftc']):
-        tips.append("⚖️ **РЕГУЛИРОВАНИЕ**: Ясное законодательство обычно позитивно влияет на долгосроч цену")
-        tips.append("📋 **ПОМНИТЕ**: Разные страны имеют разные подходы к крипто-регулированию")
-        return tips
-    
+    ("tips.regulation", ['reg', 'закон', 'запрет', 'разрешен', 'лицензия', 'sec', 'cftc'], [
+        "⚖️ **РЕГУЛИРОВАНИЕ**: Ясное законодательство обычно позитивно влияет на долгосроч цену",
+        "📋 **ПОМНИТЕ**: Разные страны имеют разные подходы к крипто-регулированию",
+    ]),
     # Советы по апгрейдам и техническому развитию
-    if any(word in news_lower for word in ['fork', 'апгрейд', 'update', 'обновление', 'версия', 'улучшен', 'upgrade']):
-        tips.append("🔄 **ТЕХНОЛОГИЯ**: Апгрейды часто приносят новые возможности и улучшают производительность")
-        tips.append("⚡ **СОВЕТ**: Изучите детали апгрейда перед торговлей вокруг события")
-        return tips
-    
+    ("tips.upgrade", ['fork', 'апгрейд', 'update', 'обновление', 'версия', 'улучшен', 'upgrade'], [
+        "🔄 **ТЕХНОЛОГИЯ**: Апгрейды часто приносят новые возможности и улучшают производительность",
+        "⚡ **СОВЕТ**: Изучите детали апгрейда перед торговлей вокруг события",
+    ]),
     # Советы по финансированию и инвестициям
-    if any(word in news_lower for word in ['деньги', 'взнос', 'funding', 'инвестиция', 'раунд', 'seed', 'series', 'привлек']):
-        tips.append("💵 **ФИНАНСИРОВАНИЕ**: Свежее финансирование часто помогает проекту развиваться быстрее")
-        tips.append("📊 **АНАЛИЗ**: Посмотрите, кто инвестирует - репутация инвестора важна")
-        return tips
-    
+    ("tips.funding", ['деньги', 'взнос', 'funding', 'инвестиция', 'раунд', 'seed', 'series', 'привлек'], [
+        "💵 **ФИНАНСИРОВАНИЕ**: Свежее финансирование часто помогает проекту развиваться быстрее",
+        "📊 **АНАЛИЗ**: Посмотрите, кто инвестирует - репутация инвестора важна",
+    ]),
     # Советы по партнерствам
-    if any(word in news_lower for word in ['партнер', 'интеграция', 'коллаб', 'partnership', 'together', 'договор']):
-        tips.append("🤝 **ПАРТНЕРСТВА**: Стратегические партнерства часто открывают новые рынки и использование")
-        tips.append("🌐 **ЭКОСИСТЕМА**: Интеграция с крупными игроками - положительный знак принятия")
-        return tips
-    
+    ("tips.partnership", ['партнер', 'интеграция', 'коллаб', 'partnership', 'together', 'договор'], [
+        "🤝 **ПАРТНЕРСТВА**: Стратегические партнерства часто открывают новые рынки и использование",
+        "🌐 **ЭКОСИСТЕМА**: Интеграция с крупными игроками - положительный знак принятия",
+    ]),
     # Советы по DeFi
-    if any(word in news_lower for word in ['uniswap', 'dex', 'биржа', 'обмен', 'swap', 'defi', 'лп']):
-        tips.append("💧 **ЛИПИДНОСТЬ**: Проверяйте слипаж перед большими свопами на DEX")
-        tips.append("⚡ **LP**: Перед входом в пулы ликвидности проверьте соотношение токенов и impermanent loss")
-        return tips
-    
+    ("tips.defi", ['uniswap', 'dex', 'биржа', 'обмен', 'swap', 'defi', 'лп'], [
+        "💧 **ЛИПИДНОСТЬ**: Проверяйте слипаж перед большими свопами на DEX",
+        "⚡ **LP**: Перед входом в пулы ликвидности проверьте соотношение токенов и impermanent loss",
+    ]),
     # Советы по стейкингу и yield
-    if any(word in news_lower for word in ['staking', 'стейк', 'yield', 'фарм', 'apy', 'apр', 'награда', 'доход']):
-        tips.append("🌾 **ДОХОД**: High APY обычно означает высокий риск. Изучите механизм генерации доходности")
-        tips.append("🔐 **СТЕЙК**: Перед стейкингом проверьте период локапа и условия вывода")
-        return tips
-    
+    ("tips.staking", ['staking', 'стейк', 'yield', 'фарм', 'apy', 'apр', 'награда', 'доход'], [
+        "🌾 **ДОХОД**: High APY обычно означает высокий риск. Изучите механизм генерации доходности",
+        "🔐 **СТЕЙК**: Перед стейкингом проверьте период локапа и условия вывода",
+    ]),
     # Советы по Layer 2 решениям
-    if any(word in news_lower for word in ['layer 2', 'l2', 'arbitrum', 'optimism', 'polygon', 'масштаб']):
-        tips.append("🚀 **L2**: Layer 2 сильно уменьшает комиссии, но будьте осторожны с новыми мостами")
-        tips.append("⛓️ **МОСТ**: Мосты несут смарт-контрактный риск. Используйте проверенные решения (Stargate, Connext)")
-        return tips
-    
+    ("tips.layer2", ['layer 2', 'l2', 'arbitrum', 'optimism', 'polygon', 'масштаб'], [
+        "🚀 **L2**: Layer 2 сильно уменьшает комиссии, но будьте осторожны с новыми мостами",
+        "⛓️ **МОСТ**: Мосты несут смарт-контрактный риск. Используйте проверенные решения (Stargate, Connext)",
+    ]),
     # Советы по DAO и голосованию
-    if any(word in news_lower for word in ['dao', 'governance', 'управление', 'голос', 'proposal']):
-        tips.append("🏛️ **DAO**: Если вы держите токен - участвуйте в голосованиях, это влияет на будущее проекта")
-        tips.append("🗳️ **ГОЛОС**: Внимательно изучайте предложения перед голосованием, даже если голосуете делегатом")
-        return tips
+    ("tips.dao", ['dao', 'governance', 'управление', 'голос', 'proposal'], [
+        "🏛️ **DAO**: Если вы держите токен - участвуйте в голосованиях, это влияет на будущее проекта",
+        "🗳️ **ГОЛОС**: Внимательно изучайте предложения перед голосованием, даже если голосуете делегатом",
+    ]),
+]
+
+# Общие советы для новичков
+DEFAULT_PRACTICAL_TIPS = [
+    "💡 **СОВЕТ**: Всегда исследуйте новость из нескольких источников перед торговлей",
+    "🎓 **ОБУЧЕНИЕ**: Изучите фундаментальный анализ перед техническим анализом",
+]
+
+keyword_engine.register({category: keywords for category, keywords, _ in PRACTICAL_TIPS})
+
+
+def get_practical_tips(news_text: str) -> List[str]:
+    """
+    Анализирует новость и генерирует практические советы для пользователя.
+    """
+    matches = keyword_engine.scan(news_text.lower())
+    for category, _, tips in PRACTICAL_TIPS:
+        if matches.has(category):
+            return list(tips)
+    return list(DEFAULT_PRACTICAL_TIPS)  # Возвращаем максимум 2 совета
+
+
+# Ключевые слова новости и соответствующие курсы/уроки (первое совпадение по порядку)
+EDUCATIONAL_KEYWORD_MAP = {
+    # Blockchain Basics
+    ('блокчейн', 'криптография', 'транзакция', 'сеть', 'валидация'): {
+        'course': 'blockchain_basics',
+        'lesson': 1,
+        'title': 'Blockchain Basics',
+        'emoji': '⛓️',
+        'description': 'Уроки о том, как работают блокчейны',
+        'callback_data': 'learn_blockchain_basics_1'
+    },
+    ('bitcoin', 'btc', 'bitcoin', 'майнинг', 'pow'): {
+        'course': 'blockchain_basics',
+        'lesson': 5,
+        'title': 'Майнинг и Proof of Work',
+        'emoji': '⛏️',
+        'description': 'Как создаются новые блоки и зарабатываются монеты',
+        'callback_data': 'learn_blockchain_basics_5'
+    },
+    ('ethereum', 'eth', 'смарт-контракт', 'умный контракт'): {
+        'course': 'blockchain_basics',
+        'lesson': 2,
+        'title': 'Bitcoin vs Ethereum',
+        'emoji': '🟪',
+        'description': 'Разница между Ethereum и Bitcoin',
+        'callback_data': 'learn_blockchain_basics_2'
+    },
     
-    # Общие советы для новичков
-    tips.append("💡 **СОВЕТ**: Всегда исследуйте новость из нескольких источников перед торговлей")
-    tips.append("🎓 **ОБУЧЕНИЕ**: Изучите фундаментальный анализ перед техническим анализом")
+    # DeFi & Smart Contracts
+    ('defi', 'децентрализованный финанс', 'финансы', 'кредит', 'заём', 'покупай'): {
+        'course': 'defi_contracts',
+        'lesson': 1,
+        'title': 'DeFi & Smart Contracts',
+        'emoji': '🏦',
+        'description': 'Основы децентрализованных финансов',
+        'callback_data': 'learn_defi_contracts_1'
+    },
+    ('uniswap', 'dex', 'биржа', 'обмен', 'swap', 'liquidity'): {
+        'course': 'defi_contracts',
+        'lesson': 3,
+        'title': 'Liquidity Pools',
+        'emoji': '💧',
+        'description': 'Как работают пулы ликвидности и DEX',
+        'callback_data': 'learn_defi_contracts_3'
+    },
+    ('yield farming', 'фарминг', 'yield', 'apy', 'apр', 'доход', 'инвестиции'): {
+        'course': 'defi_contracts',
+        'lesson': 4,
+        'title': 'Yield Farming',
+        'emoji': '🌾',
+        'description': 'Зарабатывайте проценты на крипто',
+        'callback_data': 'learn_defi_contracts_4'
+    },
+    ('staking', 'стейкинг', 'валидатор', 'eth2', 'награда'): {
+        'course': 'defi_contracts',
+        'lesson': 5,
+        'title': 'Staking & Validators',
+        'emoji': '🔐',
+        'description': 'Стейкьте криптовалюту и получайте награды',
+        'callback_data': 'learn_defi_contracts_5'
+    },
+    
+    # Layer 2 & DAO
+    ('layer 2', 'l2', 'arbitrum', 'optimism', 'polygon', 'масштабирование'): {
+        'course': 'scaling_dao',
+        'lesson': 1,
+        'title': 'Layer 2 Решения',
+        'emoji': '🚀',
+        'description': 'Как сделать блокчейн быстрее и дешевле',
+        'callback_data': 'learn_scaling_dao_1'
+    },
+    ('dao', 'governance', 'управление', 'голосование', 'proposal', 'binance'): {
+        'course': 'scaling_dao',
+        'lesson': 3,
+        'title': 'DAO & Governance',
+        'emoji': '🏛️',
+        'description': 'Децентрализованное управление протоколами',
+        'callback_data': 'learn_scaling_dao_3'
+    },
+    ('токен', 'tokenomics', 'токеномика', 'эмиссия', 'supply'): {
+        'course': 'scaling_dao',
+        'lesson': 4,
+        'title': 'Токеномика',
+        'emoji': '💰',
+        'description': 'Как устроена экономика криптопроектов',
+        'callback_data': 'learn_scaling_dao_4'
+    },
+    ('мост', 'bridge', 'cross-chain', 'кроссчейн'): {
+        'course': 'scaling_dao',
+        'lesson': 2,
+        'title': 'Cross-Chain Bridges',
+        'emoji': '🌉',
+        'description': 'Переводы между разными блокчейнами',
+        'callback_data': 'learn_scaling_dao_2'
+    },
     
-    return tips[:2]  # Возвращаем максимум 2 совета
+    # Security & Wallets
+    ('кошелек', 'приватный ключ', 'seed phrase', 'безопасность', 'security'): {
+        'course': 'blockchain_basics',
+        'lesson': 3,
+        'title': 'Кошельки и приватные ключи',
+        'emoji': '🔑',
+        'description': 'Как безопасно хранить крипто',
+        'callback_data': 'learn_blockchain_basics_3'
+    },
+    ('hack', 'хак', 'взлом', 'уязвимость', 'risk', 'риск'): {
+        'course': 'blockchain_basics',
+        'lesson': 3,
+        'title': 'Безопасность',
+        'emoji': '🛡️',
+        'description': 'Защита ваших активов',
+        'callback_data': 'learn_blockchain_basics_3'
+    },
+}
+
+# Категория keyword_engine для каждой записи EDUCATIONAL_KEYWORD_MAP
+EDUCATIONAL_LESSON_CATEGORIES = [
+    (f"education.lesson.{index}", keywords, lesson_info)
+    for index, (keywords, lesson_info) in enumerate(EDUCATIONAL_KEYWORD_MAP.items())
+]
+keyword_engine.register({category: keywords for category, keywords, _ in EDUCATIONAL_LESSON_CATEGORIES})
 
 
 def get_educational_context(news_text: str, user_id: int) -> Tuple[Optional[str], Optional[str], List[str]]:
@@ -548,127 +671,12 @@ def get_educational_context(news_text: str, user_id: int) -> Tuple[Optional[str]
     Возвращает (контекст_текст, lesson_id_для_кнопки, советы) или (None, None, [])
     """
     
-    # Ключевые слова и соответствующие курсы/уроки
-    keyword_map = {
-        # Blockchain Basics
-        ('блокчейн', 'криптография', 'транзакция', 'сеть', 'валидация'): {
-            'course': 'blockchain_basics',
-            'lesson': 1,
-            'title': 'Blockchain Basics',
-            'emoji': '⛓️',
-            'description': 'Уроки о том, как работают блокчейны',
-            'callback_data': 'learn_blockchain_basics_1'
-        },
-        ('bitcoin', 'btc', 'bitcoin', 'майнинг', 'pow'): {
-            'course': 'blockchain_basics',
-            'lesson': 5,
-            'title': 'Майнинг и Proof of Work',
-            'emoji': '⛏️',
-            'description': 'Как создаются новые блоки и зарабатываются монеты',
-            'callback_data': 'learn_blockchain_basics_5'
-        },
-        ('ethereum', 'eth', 'смарт-контракт', 'умный контракт'): {
-            'course': 'blockchain_basics',
-            'lesson': 2,
-            'title': 'Bitcoin vs Ethereum',
-            'emoji': '🟪',
-            'description': 'Разница между Ethereum и Bitcoin',
-            'callback_data': 'learn_blockchain_basics_2'
-        },
-        
-        # DeFi & Smart Contracts
-        ('defi', 'децентрализованный финанс', 'финансы', 'кредит', 'заём', 'покупай'): {
-            'course': 'defi_contracts',
-            'lesson': 1,
-            'title': 'DeFi & Smart Contracts',
-            'emoji': '🏦',
-            'description': 'Основы децентрализованных финансов',
-            'callback_data': 'learn_defi_contracts_1'
-        },
-        ('uniswap', 'dex', 'биржа', 'обмен', 'swap', 'liquidity'): {
-            'course': 'defi_contracts',
-            'lesson': 3,
-            'title': 'Liquidity Pools',
-            'emoji': '💧',
-            'description': 'Как работают пулы ликвидности и DEX',
-            'callback_data': 'learn_defi_contracts_3'
-        },
-        ('yield farming', 'фарминг', 'yield', 'apy', 'apр', 'доход', 'инвестиции'): {
-            'course': 'defi_contracts',
-            'lesson': 4,
-            'title': 'Yield Farming',
-            'emoji': '🌾',
-            'description': 'Зарабатывайте проценты на крипто',
-            'callback_data': 'learn_defi_contracts_4'
-        },
-        ('staking', 'стейкинг', 'валидатор', 'eth2', 'награда'): {
-            'course': 'defi_contracts',
-            'lesson': 5,
-            'title': 'Staking & Validators',
-            'emoji': '🔐',
-            'description': 'Стейкьте криптовалюту и получайте награды',
-            'callback_data': 'learn_defi_contracts_5'
-        },
-        
-        # Layer 2 & DAO
-        ('layer 2', 'l2', 'arbitrum', 'optimism', 'polygon', 'масштабирование'): {
-            'course': 'scaling_dao',
-            'lesson': 1,
-            'title': 'Layer 2 Решения',
-            'emoji': '🚀',
-            'description': 'Как сделать блокчейн быстрее и дешевле',
-            'callback_data': 'learn_scaling_dao_1'
-        },
-        ('dao', 'governance', 'управление', 'голосование', 'proposal', 'binance'): {
-            'course': 'scaling_dao',
-            'lesson': 3,
-            'title': 'DAO & Governance',
-            'emoji': '🏛️',
-            'description': 'Децентрализованное управление протоколами',
-            'callback_data': 'learn_scaling_dao_3'
-        },
-        ('токен', 'tokenomics', 'токеномика', 'эмиссия', 'supply'): {
-            'course': 'scaling_dao',
-            'lesson': 4,
-            'title': 'Токеномика',
-            'emoji': '💰',
-            'description': 'Как устроена экономика криптопроектов',
-            'callback_data': 'learn_scaling_dao_4'
-        },
-        ('мост', 'bridge', 'cross-chain', 'кроссчейн'): {
-            'course': 'scaling_dao',
-            'lesson': 2,
-            'title': 'Cross-Chain Bridges',
-            'emoji': '🌉',
-            'description': 'Переводы между разными блокчейнами',
-            'callback_data': 'learn_scaling_dao_2'
-        },
-        
-        # Security & Wallets
-        ('кошелек', 'приватный ключ', 'seed phrase', 'безопасность', 'security'): {
-            'course': 'blockchain_basics',
-            'lesson': 3,
-            'title': 'Кошельки и приватные ключи',
-            'emoji': '🔑',
-            'description': 'Как безопасно хранить крипто',
-            'callback_data': 'learn_blockchain_basics_3'
-        },
-        ('hack', 'хак', 'взлом', 'уязвимость', 'risk', 'риск'): {
-            'course': 'blockchain_basics',
-            'lesson': 3,
-            'title': 'Безопасность',
-            'emoji': '🛡️',
-            'description': 'Защита ваших активов',
-            'callback_data': 'learn_blockchain_basics_3'
-        },
-    }
-    
-    news_lower = news_text.lower()
+    matches = keyword_engine.scan(news_text.lower())
     
     # Ищем совпадения по ключевым словам
     matched_lesson = None
-    for keywords, lesson_info in keyword_map.items():
-        if any(keyword in news_lower for keyword in keywords):
+    for category, _, lesson_info in EDUCATIONAL_LESSON_CATEGORIES:
+        if matches.has(category):
             matched_lesson = lesson_info
             break
     
@@ -12,8 +12,6 @@
 
 import os
 import logging
-import json
-import re
 import hashlib
 import asyncio
 from typing import Dict, Any, Optional
@@ -22,6 +20,9 @@ from pathlib import Path
 from tenacity import retry, stop_after_attempt, wait_exponential
 from dotenv import load_dotenv
 
+from input_validators import find_message_check, strip_prompt_injections
+from json_extractor import extract_json
+
 # Load environment variables with explicit path for Railway compatibility
 env_path = Path(__file__).parent / ".env"
 if env_path.exists():
@@ -125,49 +126,29 @@ def hash_text(text: str) -> str:
     """Generate SHA-256 hash of text for caching."""
     return hashlib.sha256(text.encode()).hexdigest()
 
+def _is_analysis(data: Dict[str, Any]) -> bool:
+    return "summary_text" in data and isinstance(data.get("impact_points"), list)
+
+
 def extract_json_from_response(response_text: str) -> Optional[Dict[str, Any]]:
-    """Extract JSON from response text wrapped in <json></json> tags."""
-    try:
-        # Try to extract from <json>...</json> tags
-        json_match = re.search(r'<json>(.*?)</json>', response_text, re.DOTALL)
-        if json_match:
-            json_str = json_match.group(1).strip()
-        else:
-            # Try direct JSON parsing
-            json_str = response_text.strip()
-        
-        data = json.loads(json_str)
-        
-        # Validate structure
-        if "summary_text" in data and "impact_points" in data:
-            if isinstance(data["impact_points"], list):
-                return data
-        
-        return None
-    except (json.JSONDecodeError, AttributeError) as e:
-        logger.warning(f"Failed to extract JSON: {e}")
-        return None
+    """Extract analysis JSON from response text (<json></json> tags, code fence or bare object)."""
+    data = extract_json(response_text or "", validator=_is_analysis)
+    if data is None:
+        logger.warning(f"Failed to extract JSON: {(response_text or '')[:100]!r}")
+    return data
 
 def sanitize_input(text: str, max_length: int = 4096) -> str:
     """Sanitize and validate input text."""
     if not text or len(text) == 0:
         raise ValueError("Text cannot be empty")
     
-    if len(text) > max_length:
-        text = text[:max_length]
-    
-    # Remove potential prompt injection patterns
-    dangerous_patterns = [
-        r"ignore.*previous.*instructions",
-        r"override.*system.*prompt",
-        r"execute.*code",
-        r"retrieve.*api.*key",
-    ]
-    
-    for pattern in dangerous_patterns:
-        text = re.sub(pattern, "", text, flags=re.IGNORECASE)
+    # Text already checked by the bot handler: reuse its result
+    check = find_message_check(text)
+    if check is not None and max_length >= len(text):
+        return check.prompt_text
     
-    return text.strip()
+    # Remove potential prompt injection patterns (precompiled in input_validators)
+    return strip_prompt_injections(text, max_length)
 
 def validate_response(response: Dict[str, Any]) -> bool:
     """Validate AI response structure."""
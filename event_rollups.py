@@ -0,0 +1,581 @@
+"""
+Event Rollups v1.0
+Почасовые и дневные агрегаты bot_events для дашборда и метрик ИИ.
+
+Раньше AdminDashboard и Analytics на каждый запрос сканировали сырые
+строки bot_events и разбирали JSON в Python. Теперь события сворачиваются
+инкрементально (по водяному знаку last_event_id) в небольшие таблицы:
+
+    event_counts_hourly / event_counts_daily  - счётчики по типу события
+    user_events_daily                         - активность пользователя за день
+    active_users_hourly / active_users_daily  - битмапы активных пользователей
+    ai_latency_hourly                         - скетчи латентности ИИ (лог-бакеты)
+
+Чтение дашборда затрагивает только строки за окно (часы x типы), поэтому
+не зависит от объёма событий. DAU/retention считаются через OR/AND
+битмапов и popcount. Битмапы индексируются плотным номером пользователя
+(rollup_user_index), а не Telegram user_id.
+
+Использование:
+    rollups = get_rollups(tracker.db_path)
+    rollups.refresh()                 # периодически или перед чтением
+    rollups.counts_by_type(hours=24)
+    rollups.active_users(hours=24)
+    rollups.ai_performance(hours=24)
+"""
+
+import json
+import math
+import os
+import sqlite3
+import logging
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from schema_migrations import Migration, ensure_schema
+from reporting_pool import read_only_connection
+
+logger = logging.getLogger(__name__)
+
+ROLLUP_SCHEMA_SCOPE = "event_rollups"
+ROLLUP_BATCH_SIZE = int(os.getenv("ROLLUP_BATCH_SIZE", "5000"))
+ROLLUP_KEEP_HOURLY_DAYS = int(os.getenv("ROLLUP_KEEP_HOURLY_DAYS", "8"))
+
+# Окна длиннее этого читаются из дневных таблиц
+HOURLY_WINDOW_LIMIT = 48
+
+_HOUR_FORMAT = "%Y-%m-%dT%H"
+_DAY_FORMAT = "%Y-%m-%d"
+
+
+def _create_rollup_tables(cursor: sqlite3.Cursor) -> None:
+    """Таблицы агрегатов рядом с bot_events"""
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS rollup_state (
+            name TEXT PRIMARY KEY,
+            last_event_id INTEGER NOT NULL DEFAULT 0,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS event_counts_hourly (
+            bucket TEXT NOT NULL,
+            event_type TEXT NOT NULL,
+            count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (bucket, event_type)
+        ) WITHOUT ROWID
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS event_counts_daily (
+            day TEXT NOT NULL,
+            event_type TEXT NOT NULL,
+            count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (day, event_type)
+        ) WITHOUT ROWID
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS user_events_daily (
+            day TEXT NOT NULL,
+            user_id INTEGER NOT NULL,
+            count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (day, user_id)
+        ) WITHOUT ROWID
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS rollup_user_index (
+            user_id INTEGER PRIMARY KEY,
+            idx INTEGER NOT NULL UNIQUE
+        )
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS active_users_hourly (
+            bucket TEXT PRIMARY KEY,
+            bitmap BLOB NOT NULL
+        )
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS active_users_daily (
+            day TEXT PRIMARY KEY,
+            bitmap BLOB NOT NULL
+        )
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS ai_latency_hourly (
+            bucket TEXT NOT NULL,
+            event_type TEXT NOT NULL,
+            count INTEGER NOT NULL DEFAULT 0,
+            sum_ms REAL NOT NULL DEFAULT 0,
+            min_ms REAL,
+            max_ms REAL,
+            sketch TEXT NOT NULL DEFAULT '{}',
+            PRIMARY KEY (bucket, event_type)
+        ) WITHOUT ROWID
+    """)
+
+
+ROLLUP_MIGRATIONS = [
+    Migration(1, "rollup_tables", _create_rollup_tables),
+]
+
+
+# =============================================================================
+# СКЕТЧ ЛАТЕНТНОСТИ
+# =============================================================================
+
+class LatencySketch:
+    """
+    Лог-бакетный скетч латентности (в духе DDSketch).
+
+    Значение x > 0 попадает в бакет ceil(log_gamma(x)); квантиль
+    оценивается с относительной ошибкой ~(gamma - 1) / 2. Скетчи
+    складываются поэлементно, поэтому часовые агрегаты сливаются
+    в любое окно без доступа к сырым событиям.
+    """
+
+    GAMMA = 1.05
+
+    def __init__(self, buckets: Optional[Dict[int, int]] = None):
+        self.buckets: Dict[int, int] = dict(buckets or {})
+
+    @classmethod
+    def _index(cls, value_ms: float) -> int:
+        if value_ms <= 1.0:
+            return 0
+        return int(math.ceil(math.log(value_ms) / math.log(cls.GAMMA)))
+
+    def add(self, value_ms: float, count: int = 1) -> None:
+        idx = self._index(value_ms)
+        self.buckets[idx] = self.buckets.get(idx, 0) + count
+
+    def merge(self, other: "LatencySketch") -> "LatencySketch":
+        for idx, count in other.buckets.items():
+            self.buckets[idx] = self.buckets.get(idx, 0) + count
+        return self
+
+    @property
+    def count(self) -> int:
+        return sum(self.buckets.values())
+
+    def quantile(self, q: float) -> Optional[float]:
+        total = self.count
+        if not total:
+            return None
+        rank = q * (total - 1)
+        seen = 0
+        for idx in sorted(self.buckets):
+            seen += self.buckets[idx]
+            if seen > rank:
+                if idx == 0:
+                    return 1.0
+                # Середина бакета (gamma^(i-1), gamma^i]
+                return round(2 * self.GAMMA ** idx / (self.GAMMA + 1), 2)
+        return None
+
+    def to_json(self) -> str:
+        return json.dumps({str(k): v for k, v in self.buckets.items()}, separators=(",", ":"))
+
+    @classmethod
+    def from_json(cls, raw: Optional[str]) -> "LatencySketch":
+        if not raw:
+            return cls()
+        return cls({int(k): int(v) for k, v in json.loads(raw).items()})
+
+
+# =============================================================================
+# БИТМАПЫ
+# =============================================================================
+
+def _bitmap_from_indices(indices: Iterable[int]) -> int:
+    indices = list(indices)
+    if not indices:
+        return 0
+    buf = bytearray(max(indices) // 8 + 1)
+    for idx in indices:
+        buf[idx >> 3] |= 1 << (idx & 7)
+    return int.from_bytes(buf, "little")
+
+
+def _bitmap_to_blob(value: int) -> bytes:
+    return value.to_bytes(max(1, (value.bit_length() + 7) // 8), "little")
+
+
+def _bitmap_from_blob(blob: Optional[bytes]) -> int:
+    return int.from_bytes(blob, "little") if blob else 0
+
+
+def _popcount(value: int) -> int:
+    return value.bit_count()
+
+
+# =============================================================================
+# ROLLUPS
+# =============================================================================
+
+def _event_duration_ms(raw_data: Optional[str]) -> Optional[float]:
+    """Длительность ИИ-события: data.duration_ms или data.duration (секунды)."""
+    if not raw_data:
+        return None
+    try:
+        data = json.loads(raw_data)
+    except (TypeError, ValueError):
+        return None
+    if not isinstance(data, dict):
+        return None
+    if data.get("duration_ms") is not None:
+        return float(data["duration_ms"])
+    if data.get("duration") is not None:
+        return float(data["duration"]) * 1000
+    return None
+
+
+class EventRollups:
+    """Инкрементальные агрегаты bot_events в той же БД телеметрии."""
+
+    STATE_NAME = "bot_events"
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._refresh_lock = threading.Lock()
+        ensure_schema(self.db_path, ROLLUP_SCHEMA_SCOPE, ROLLUP_MIGRATIONS)
+
+    # ---------------------------------------------------------------- запись
+
+    def refresh(self, max_batches: Optional[int] = None) -> int:
+        """
+        Сворачивает новые события (id > водяного знака) в агрегаты.
+
+        Каждая пачка обрабатывается в своей транзакции BEGIN IMMEDIATE,
+        поэтому параллельный refresh из другого процесса не посчитает
+        события дважды.
+
+        Returns:
+            int: количество обработанных событий
+        """
+        processed = 0
+        batches = 0
+        started = time.perf_counter()
+        with self._refresh_lock:
+            conn = sqlite3.connect(self.db_path, timeout=10.0)
+            try:
+                conn.execute("PRAGMA busy_timeout=10000")
+                # Одна проверка версии; восстанавливает таблицы, если файл пересоздан
+                ensure_schema(self.db_path, ROLLUP_SCHEMA_SCOPE, ROLLUP_MIGRATIONS, conn=conn)
+                while max_batches is None or batches < max_batches:
+                    count = self._process_batch(conn)
+                    if not count:
+                        break
+                    processed += count
+                    batches += 1
+            finally:
+                conn.close()
+        if processed:
+            logger.info(
+                f"📈 Rollups: {processed} событий за {(time.perf_counter() - started) * 1000:.1f}ms"
+            )
+        return processed
+
+    def _process_batch(self, conn: sqlite3.Connection) -> int:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT last_event_id FROM rollup_state WHERE name = ?", (self.STATE_NAME,)
+            ).fetchone()
+            last_id = row[0] if row else 0
+            events = conn.execute("""
+                SELECT id, event_type, user_id, timestamp, data
+                FROM bot_events
+                WHERE id > ?
+                ORDER BY id
+                LIMIT ?
+            """, (last_id, ROLLUP_BATCH_SIZE)).fetchall()
+            if not events:
+                conn.rollback()
+                return 0
+
+            hourly: Dict[Tuple[str, str], int] = defaultdict(int)
+            daily: Dict[Tuple[str, str], int] = defaultdict(int)
+            user_daily: Dict[Tuple[str, int], int] = defaultdict(int)
+            hourly_users: Dict[str, Set[int]] = defaultdict(set)
+            daily_users: Dict[str, Set[int]] = defaultdict(set)
+            latency: Dict[Tuple[str, str], List[float]] = defaultdict(list)
+
+            for _, event_type, user_id, timestamp, data in events:
+                bucket, day = timestamp[:13], timestamp[:10]
+                hourly[(bucket, event_type)] += 1
+                daily[(day, event_type)] += 1
+                if user_id is not None:
+                    user_daily[(day, user_id)] += 1
+                    hourly_users[bucket].add(user_id)
+                    daily_users[day].add(user_id)
+                if event_type.startswith("ai_"):
+                    duration = _event_duration_ms(data)
+                    if duration is not None:
+                        latency[(bucket, event_type)].append(duration)
+
+            conn.executemany("""
+                INSERT INTO event_counts_hourly (bucket, event_type, count) VALUES (?, ?, ?)
+                ON CONFLICT(bucket, event_type) DO UPDATE SET count = count + excluded.count
+            """, [(b, t, c) for (b, t), c in hourly.items()])
+            conn.executemany("""
+                INSERT INTO event_counts_daily (day, event_type, count) VALUES (?, ?, ?)
+                ON CONFLICT(day, event_type) DO UPDATE SET count = count + excluded.count
+            """, [(d, t, c) for (d, t), c in daily.items()])
+            conn.executemany("""
+                INSERT INTO user_events_daily (day, user_id, count) VALUES (?, ?, ?)
+                ON CONFLICT(day, user_id) DO UPDATE SET count = count + excluded.count
+            """, [(d, u, c) for (d, u), c in user_daily.items()])
+
+            all_users = set()
+            for users in daily_users.values():
+                all_users |= users
+            index = self._user_indices(conn, all_users)
+            self._merge_bitmaps(conn, "active_users_hourly", "bucket", hourly_users, index)
+            self._merge_bitmaps(conn, "active_users_daily", "day", daily_users, index)
+            self._merge_latency(conn, latency)
+
+            conn.execute("""
+                INSERT INTO rollup_state (name, last_event_id, updated_at)
+                VALUES (?, ?, CURRENT_TIMESTAMP)
+                ON CONFLICT(name) DO UPDATE SET
+                    last_event_id = excluded.last_event_id,
+                    updated_at = excluded.updated_at
+            """, (self.STATE_NAME, events[-1][0]))
+            conn.commit()
+            return len(events)
+        except Exception:
+            conn.rollback()
+            logger.error("❌ Rollup batch failed", exc_info=True)
+            raise
+
+    @staticmethod
+    def _user_indices(conn: sqlite3.Connection, user_ids: Iterable[int]) -> Dict[int, int]:
+        """Плотные номера пользователей для битмапов (выдаются по порядку)."""
+        user_ids = list(user_ids)
+        index: Dict[int, int] = {}
+        for start in range(0, len(user_ids), 500):
+            chunk = user_ids[start:start + 500]
+            placeholders = ",".join("?" * len(chunk))
+            for user_id, idx in conn.execute(
+                f"SELECT user_id, idx FROM rollup_user_index WHERE user_id IN ({placeholders})", chunk
+            ):
+                index[user_id] = idx
+        missing = sorted(u for u in user_ids if u not in index)
+        if missing:
+            next_idx = conn.execute("SELECT COALESCE(MAX(idx), -1) + 1 FROM rollup_user_index").fetchone()[0]
+            new_rows = [(user_id, next_idx + offset) for offset, user_id in enumerate(missing)]
+            conn.executemany("INSERT INTO rollup_user_index (user_id, idx) VALUES (?, ?)", new_rows)
+            index.update(dict(new_rows))
+        return index
+
+    @staticmethod
+    def _merge_bitmaps(conn: sqlite3.Connection, table: str, key_column: str,
+                       users_by_key: Dict[str, set], index: Dict[int, int]) -> None:
+        for key, users in users_by_key.items():
+            row = conn.execute(f"SELECT bitmap FROM {table} WHERE {key_column} = ?", (key,)).fetchone()
+            bitmap = _bitmap_from_blob(row[0] if row else None)
+            bitmap |= _bitmap_from_indices(index[u] for u in users)
+            conn.execute(
+                f"INSERT OR REPLACE INTO {table} ({key_column}, bitmap) VALUES (?, ?)",
+                (key, _bitmap_to_blob(bitmap))
+            )
+
+    @staticmethod
+    def _merge_latency(conn: sqlite3.Connection, latency: Dict[Tuple[str, str], List[float]]) -> None:
+        for (bucket, event_type), values in latency.items():
+            row = conn.execute("""
+                SELECT count, sum_ms, min_ms, max_ms, sketch FROM ai_latency_hourly
+                WHERE bucket = ? AND event_type = ?
+            """, (bucket, event_type)).fetchone()
+            count, sum_ms, min_ms, max_ms, raw = row if row else (0, 0.0, None, None, None)
+            sketch = LatencySketch.from_json(raw)
+            for value in values:
+                sketch.add(value)
+            low, high = min(values), max(values)
+            conn.execute("""
+                INSERT OR REPLACE INTO ai_latency_hourly
+                (bucket, event_type, count, sum_ms, min_ms, max_ms, sketch)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            """, (
+                bucket, event_type, count + len(values), sum_ms + sum(values),
+                low if min_ms is None else min(min_ms, low),
+                high if max_ms is None else max(max_ms, high),
+                sketch.to_json()
+            ))
+
+    def prune(self, keep_hourly_days: int = ROLLUP_KEEP_HOURLY_DAYS) -> int:
+        """Удаляет почасовые агрегаты старше keep_hourly_days (дневные хранятся)."""
+        cutoff = (datetime.now() - timedelta(days=keep_hourly_days)).strftime(_HOUR_FORMAT)
+        conn = sqlite3.connect(self.db_path, timeout=10.0)
+        try:
+            deleted = 0
+            for table in ("event_counts_hourly", "active_users_hourly", "ai_latency_hourly"):
+                deleted += conn.execute(f"DELETE FROM {table} WHERE bucket < ?", (cutoff,)).rowcount
+            conn.commit()
+        finally:
+            conn.close()
+        return deleted
+
+    # ---------------------------------------------------------------- чтение
+
+    @staticmethod
+    def _window(hours: int) -> Tuple[bool, str]:
+        """(читать почасовые?, нижняя граница ключа) для окна в часах."""
+        now = datetime.now()
+        if hours <= HOURLY_WINDOW_LIMIT:
+            return True, (now - timedelta(hours=hours)).strftime(_HOUR_FORMAT)
+        days = max(1, math.ceil(hours / 24))
+        return False, (now - timedelta(days=days - 1)).strftime(_DAY_FORMAT)
+
+    def counts_by_type(self, hours: int = 24) -> Dict[str, int]:
+        """Количество событий по типам за окно."""
+        hourly, since = self._window(hours)
+        if hourly:
+            query = "SELECT event_type, SUM(count) FROM event_counts_hourly WHERE bucket >= ? GROUP BY event_type"
+        else:
+            query = "SELECT event_type, SUM(count) FROM event_counts_daily WHERE day >= ? GROUP BY event_type"
+        with read_only_connection(self.db_path) as conn:
+            rows = conn.execute(query, (since,)).fetchall()
+        return dict(sorted(((r[0], r[1]) for r in rows), key=lambda item: item[1], reverse=True))
+
+    def _window_bitmap(self, conn: sqlite3.Connection, hours: int) -> int:
+        hourly, since = self._window(hours)
+        if hourly:
+            rows = conn.execute("SELECT bitmap FROM active_users_hourly WHERE bucket >= ?", (since,))
+        else:
+            rows = conn.execute("SELECT bitmap FROM active_users_daily WHERE day >= ?", (since,))
+        bitmap = 0
+        for (blob,) in rows:
+            bitmap |= _bitmap_from_blob(blob)
+        return bitmap
+
+    def active_users(self, hours: int = 24) -> int:
+        """Уникальные активные пользователи за окно (popcount OR битмапов)."""
+        with read_only_connection(self.db_path) as conn:
+            return _popcount(self._window_bitmap(conn, hours))
+
+    def daily_active_users(self, days: int = 7) -> Dict[str, int]:
+        """DAU по дням (последние days дней, включая сегодня)."""
+        today = datetime.now().date()
+        keys = [(today - timedelta(days=i)).strftime(_DAY_FORMAT) for i in range(days)]
+        with read_only_connection(self.db_path) as conn:
+            rows = dict(conn.execute(
+                "SELECT day, bitmap FROM active_users_daily WHERE day >= ?", (keys[-1],)
+            ).fetchall())
+        return {day: _popcount(_bitmap_from_blob(rows.get(day))) for day in keys}
+
+    def retention(self) -> Dict[str, Any]:
+        """Активность за 1ч/24ч/7д и D1-retention (вчера ∩ сегодня / вчера)."""
+        today = datetime.now().date()
+        yesterday = (today - timedelta(days=1)).strftime(_DAY_FORMAT)
+        with read_only_connection(self.db_path) as conn:
+            users_1h = _popcount(self._window_bitmap(conn, 1))
+            users_24h = _popcount(self._window_bitmap(conn, 24))
+            users_7d = _popcount(self._window_bitmap(conn, 24 * 7))
+            days = dict(conn.execute(
+                "SELECT day, bitmap FROM active_users_daily WHERE day IN (?, ?)",
+                (yesterday, today.strftime(_DAY_FORMAT))
+            ).fetchall())
+        prev = _bitmap_from_blob(days.get(yesterday))
+        curr = _bitmap_from_blob(days.get(today.strftime(_DAY_FORMAT)))
+        return {
+            "active_1h": users_1h,
+            "active_24h": users_24h,
+            "active_7d": users_7d,
+            "retention_24h": round(users_24h / max(users_7d, 1) * 100, 2),
+            "retention_d1": round(_popcount(prev & curr) / max(_popcount(prev), 1) * 100, 2),
+        }
+
+    def top_users(self, hours: int = 24, limit: int = 5) -> List[Dict[str, int]]:
+        """Самые активные пользователи за окно (по дневным агрегатам)."""
+        days = max(1, math.ceil(hours / 24))
+        since = (datetime.now() - timedelta(days=days - 1)).strftime(_DAY_FORMAT)
+        with read_only_connection(self.db_path) as conn:
+            rows = conn.execute("""
+                SELECT user_id, SUM(count) AS event_count
+                FROM user_events_daily
+                WHERE day >= ?
+                GROUP BY user_id
+                ORDER BY event_count DESC
+                LIMIT ?
+            """, (since, limit)).fetchall()
+        return [
+            {"user_id": user_id, "event_count": count, "rank": rank}
+            for rank, (user_id, count) in enumerate(rows, 1)
+        ]
+
+    def ai_performance(self, hours: int = 24) -> Dict[str, Any]:
+        """Счётчики ИИ-событий и квантили латентности из слитых скетчей."""
+        counts = self.counts_by_type(hours)
+        # Скетчи только почасовые: окно ограничено сроком хранения (ROLLUP_KEEP_HOURLY_DAYS)
+        since = (datetime.now() - timedelta(hours=hours)).strftime(_HOUR_FORMAT)
+        with read_only_connection(self.db_path) as conn:
+            rows = conn.execute("""
+                SELECT count, sum_ms, min_ms, max_ms, sketch
+                FROM ai_latency_hourly WHERE bucket >= ?
+            """, (since,)).fetchall()
+
+        sketch = LatencySketch()
+        timed = 0
+        total_ms = 0.0
+        min_ms = max_ms = None
+        for count, sum_ms, low, high, raw in rows:
+            timed += count
+            total_ms += sum_ms
+            sketch.merge(LatencySketch.from_json(raw))
+            min_ms = low if min_ms is None else min(min_ms, low)
+            max_ms = high if max_ms is None else max(max_ms, high)
+
+        total = sum(c for t, c in counts.items() if t.startswith("ai_"))
+        successes = counts.get("ai_success", 0)
+        return {
+            "total_requests": total,
+            "successes": successes,
+            "errors": counts.get("ai_error", 0),
+            "timeouts": counts.get("ai_timeout", 0),
+            "fallbacks": counts.get("ai_fallback", 0),
+            "success_rate": round(successes / total * 100, 2) if total else 0,
+            "avg_duration_ms": round(total_ms / timed, 2) if timed else 0,
+            "min_duration_ms": min_ms,
+            "max_duration_ms": max_ms,
+            "p50_ms": sketch.quantile(0.5),
+            "p95_ms": sketch.quantile(0.95),
+            "p99_ms": sketch.quantile(0.99),
+        }
+
+    def get_state(self) -> Dict[str, Any]:
+        """Водяной знак и отставание агрегатов (для /admin диагностики)."""
+        with read_only_connection(self.db_path) as conn:
+            row = conn.execute(
+                "SELECT last_event_id, updated_at FROM rollup_state WHERE name = ?", (self.STATE_NAME,)
+            ).fetchone()
+            max_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM bot_events").fetchone()[0]
+        last_id = row[0] if row else 0
+        return {
+            "last_event_id": last_id,
+            "updated_at": row[1] if row else None,
+            "lag_events": max_id - last_id,
+        }
+
+
+_rollups: Dict[str, EventRollups] = {}
+_rollups_lock = threading.Lock()
+
+
+def get_rollups(db_path: str) -> EventRollups:
+    """EventRollups для БД событий (один экземпляр на файл)."""
+    key = os.path.abspath(db_path)
+    with _rollups_lock:
+        if key not in _rollups:
+            _rollups[key] = EventRollups(db_path)
+        return _rollups[key]
+
+
+__all__ = [
+    "ROLLUP_MIGRATIONS",
+    "LatencySketch",
+    "EventRollups",
+    "get_rollups",
+]
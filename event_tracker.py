@@ -2,13 +2,26 @@
 # Система событийной аналитики для RVX Bot
 # Version: 0.25.0
 
+import os
 import sqlite3
 import json
+import atexit
+import threading
+import time
 from datetime import datetime, timedelta
-from typing import Dict, List, Optional, Any
+from typing import Dict, List, Optional, Any, Tuple
 from enum import Enum
 from dataclasses import dataclass, asdict
 
+from schema_migrations import Migration, ensure_schema
+from storage_router import ROUTE_TELEMETRY, resolve_db_path
+from reporting_pool import read_only_connection
+from event_rollups import EventRollups, get_rollups
+
+# Буфер enqueue(): пачка пишется одной транзакцией
+EVENT_BATCH_SIZE = int(os.getenv("EVENT_BATCH_SIZE", "50"))
+EVENT_FLUSH_INTERVAL = float(os.getenv("EVENT_FLUSH_INTERVAL", "5"))
+
 # ============================================================================
 # EVENT TYPES
 # ============================================================================
@@ -71,70 +84,102 @@ class Event:
     def to_json(self) -> str:
         return json.dumps(self.to_dict(), ensure_ascii=False, default=str)
 
+# ============================================================================
+# SCHEMA MIGRATIONS
+# ============================================================================
+EVENT_TRACKER_SCHEMA_SCOPE = "event_tracker"
+
+def _create_events_table(cursor: sqlite3.Cursor) -> None:
+    """Таблица bot_events и индексы для быстрого поиска"""
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS bot_events (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            event_type TEXT NOT NULL,
+            user_id INTEGER,
+            timestamp TEXT NOT NULL,
+            data TEXT,
+            metadata TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_events_user_id 
+        ON bot_events(user_id)
+    """)
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_events_type 
+        ON bot_events(event_type)
+    """)
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_events_timestamp 
+        ON bot_events(timestamp)
+    """)
+
+EVENT_TRACKER_MIGRATIONS = [
+    Migration(1, "bot_events", _create_events_table),
+]
+
 # ============================================================================
 # EVENT TRACKER
 # ============================================================================
 class EventTracker:
     """Система трекинга и аналитики событий"""
     
-    def __init__(self, db_path: str = "./rvx_bot.db"):
-        self.db_path = db_path
+    def __init__(self, db_path: Optional[str] = None):
+        # По умолчанию события пишутся в файл телеметрии, а не в rvx_bot.db
+        self.db_path = db_path or resolve_db_path(ROUTE_TELEMETRY)
+        self._pending: List[Event] = []
+        self._pending_lock = threading.Lock()
+        self._flush_at = time.monotonic() + EVENT_FLUSH_INTERVAL
         self._init_db()
     
     def _init_db(self):
-        """Инициализировать таблицу событий"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS bot_events (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                event_type TEXT NOT NULL,
-                user_id INTEGER,
-                timestamp TEXT NOT NULL,
-                data TEXT,
-                metadata TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
-        
-        # Индексы для быстрого поиска
-        cursor.execute("""
-            CREATE INDEX IF NOT EXISTS idx_events_user_id 
-            ON bot_events(user_id)
-        """)
-        cursor.execute("""
-            CREATE INDEX IF NOT EXISTS idx_events_type 
-            ON bot_events(event_type)
-        """)
-        cursor.execute("""
-            CREATE INDEX IF NOT EXISTS idx_events_timestamp 
-            ON bot_events(timestamp)
-        """)
-        
-        conn.commit()
-        conn.close()
+        """Инициализировать таблицу событий (версионированные миграции)"""
+        ensure_schema(self.db_path, EVENT_TRACKER_SCHEMA_SCOPE, EVENT_TRACKER_MIGRATIONS)
     
     def track(self, event: Event) -> bool:
         """Записать событие в БД"""
+        return self._write([event])
+    
+    def enqueue(self, event: Event) -> None:
+        """
+        Событие для частых вызовов (например, на каждый запрос к ИИ): копится
+        в буфере и пишется пачкой - раз в EVENT_BATCH_SIZE событий или
+        EVENT_FLUSH_INTERVAL секунд, а не отдельным соединением и commit.
+        """
+        with self._pending_lock:
+            self._pending.append(event)
+            due = len(self._pending) >= EVENT_BATCH_SIZE or time.monotonic() >= self._flush_at
+        if due:
+            self.flush()
+    
+    def flush(self) -> int:
+        """Записать буфер enqueue(), возвращает число записанных событий"""
+        with self._pending_lock:
+            events, self._pending = self._pending, []
+            self._flush_at = time.monotonic() + EVENT_FLUSH_INTERVAL
+        if not events:
+            return 0
+        return len(events) if self._write(events) else 0
+    
+    def _write(self, events: List[Event]) -> bool:
         try:
             conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            cursor.execute("""
-                INSERT INTO bot_events 
-                (event_type, user_id, timestamp, data, metadata)
-                VALUES (?, ?, ?, ?, ?)
-            """, (
-                event.event_type.value,
-                event.user_id,
-                event.timestamp,
-                json.dumps(event.data, ensure_ascii=False, default=str),
-                json.dumps(event.metadata, ensure_ascii=False, default=str),
-            ))
-            
-            conn.commit()
-            conn.close()
+            try:
+                conn.executemany("""
+                    INSERT INTO bot_events 
+                    (event_type, user_id, timestamp, data, metadata)
+                    VALUES (?, ?, ?, ?, ?)
+                """, [(
+                    event.event_type.value,
+                    event.user_id,
+                    event.timestamp,
+                    json.dumps(event.data, ensure_ascii=False, default=str),
+                    json.dumps(event.metadata, ensure_ascii=False, default=str),
+                ) for event in events])
+                conn.commit()
+            finally:
+                conn.close()
             return True
         except Exception as e:
             print(f"❌ Ошибка при трекинге события: {e}")
@@ -147,10 +192,7 @@ class EventTracker:
         hours: int = 24,
         limit: int = 1000
     ) -> List[Dict]:
-        """Получить события с фильтрацией"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
+        """Получить события с фильтрацией (read-only пул отчётов)"""
         query = "SELECT * FROM bot_events WHERE 1=1"
         params = []
         
@@ -170,82 +212,81 @@ class EventTracker:
         query += " ORDER BY timestamp DESC LIMIT ?"
         params.append(limit)
         
-        cursor.execute(query, params)
-        columns = [desc[0] for desc in cursor.description]
-        events = [dict(zip(columns, row)) for row in cursor.fetchall()]
+        with read_only_connection(self.db_path) as conn:
+            cursor = conn.execute(query, params)
+            columns = [desc[0] for desc in cursor.description]
+            events = [dict(zip(columns, row)) for row in cursor.fetchall()]
         
-        conn.close()
         return events
     
     def get_stats(self, hours: int = 24) -> Dict[str, Any]:
-        """Получить статистику по событиям"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
+        """Получить статистику по событиям (один снимок read-only пула)"""
         cutoff_time = (datetime.now() - timedelta(hours=hours)).isoformat()
         
-        # Общая статистика
-        cursor.execute("""
-            SELECT 
-                COUNT(*) as total_events,
-                COUNT(DISTINCT user_id) as unique_users,
-                COUNT(DISTINCT event_type) as event_types
-            FROM bot_events
-            WHERE timestamp > ?
-        """, (cutoff_time,))
-        
-        stats = dict(zip(
-            [desc[0] for desc in cursor.description],
-            cursor.fetchone()
-        ))
-        
-        # Событие по типам
-        cursor.execute("""
-            SELECT event_type, COUNT(*) as count
-            FROM bot_events
-            WHERE timestamp > ?
-            GROUP BY event_type
-            ORDER BY count DESC
-        """, (cutoff_time,))
-        
-        stats["by_type"] = {row[0]: row[1] for row in cursor.fetchall()}
-        
-        # Топ пользователи
-        cursor.execute("""
-            SELECT user_id, COUNT(*) as count
-            FROM bot_events
-            WHERE timestamp > ? AND user_id IS NOT NULL
-            GROUP BY user_id
-            ORDER BY count DESC
-            LIMIT 10
-        """, (cutoff_time,))
-        
-        stats["top_users"] = [
-            {"user_id": row[0], "events": row[1]}
-            for row in cursor.fetchall()
-        ]
-        
-        # AI статистика
-        cursor.execute("""
-            SELECT 
-                event_type,
-                COUNT(*) as count,
-                AVG(CAST(json_extract(data, '$.duration') AS FLOAT)) as avg_duration
-            FROM bot_events
-            WHERE timestamp > ? AND event_type LIKE 'ai_%'
-            GROUP BY event_type
-        """, (cutoff_time,))
-        
-        stats["ai_stats"] = [
-            {
-                "type": row[0],
-                "count": row[1],
-                "avg_duration": row[2]
-            }
-            for row in cursor.fetchall()
-        ]
+        with read_only_connection(self.db_path) as conn:
+            cursor = conn.cursor()
+            
+            # Общая статистика
+            cursor.execute("""
+                SELECT 
+                    COUNT(*) as total_events,
+                    COUNT(DISTINCT user_id) as unique_users,
+                    COUNT(DISTINCT event_type) as event_types
+                FROM bot_events
+                WHERE timestamp > ?
+            """, (cutoff_time,))
+            
+            stats = dict(zip(
+                [desc[0] for desc in cursor.description],
+                cursor.fetchone()
+            ))
+            
+            # Событие по типам
+            cursor.execute("""
+                SELECT event_type, COUNT(*) as count
+                FROM bot_events
+                WHERE timestamp > ?
+                GROUP BY event_type
+                ORDER BY count DESC
+            """, (cutoff_time,))
+            
+            stats["by_type"] = {row[0]: row[1] for row in cursor.fetchall()}
+            
+            # Топ пользователи
+            cursor.execute("""
+                SELECT user_id, COUNT(*) as count
+                FROM bot_events
+                WHERE timestamp > ? AND user_id IS NOT NULL
+                GROUP BY user_id
+                ORDER BY count DESC
+                LIMIT 10
+            """, (cutoff_time,))
+            
+            stats["top_users"] = [
+                {"user_id": row[0], "events": row[1]}
+                for row in cursor.fetchall()
+            ]
+            
+            # AI статистика
+            cursor.execute("""
+                SELECT 
+                    event_type,
+                    COUNT(*) as count,
+                    AVG(CAST(json_extract(data, '$.duration') AS FLOAT)) as avg_duration
+                FROM bot_events
+                WHERE timestamp > ? AND event_type LIKE 'ai_%'
+                GROUP BY event_type
+            """, (cutoff_time,))
+            
+            stats["ai_stats"] = [
+                {
+                    "type": row[0],
+                    "count": row[1],
+                    "avg_duration": row[2]
+                }
+                for row in cursor.fetchall()
+            ]
         
-        conn.close()
         return stats
     
     def get_user_journey(self, user_id: int) -> List[Dict]:
@@ -306,59 +347,35 @@ class Analytics:
             "status": "active" if unique_days >= 7 else "inactive",
         }
     
+    @property
+    def rollups(self) -> EventRollups:
+        """Агрегаты событий трекера, досвёрнутые до последнего события"""
+        rollups = get_rollups(self.tracker.db_path)
+        rollups.refresh()
+        return rollups
+    
     def get_ai_performance(self, hours: int = 24) -> Dict[str, Any]:
         """Вычислить производительность AI"""
-        stats = self.tracker.get_stats(hours)
-        
-        ai_stats = stats.get("ai_stats", [])
-        
-        total_ai_requests = sum(s["count"] for s in ai_stats)
-        
-        # Подсчет успешных/ошибок
-        ai_events = self.tracker.get_events(hours=hours, limit=10000)
-        ai_events = [e for e in ai_events if e["event_type"].startswith("ai_")]
-        
-        successes = len([e for e in ai_events if e["event_type"] == "ai_success"])
-        errors = len([e for e in ai_events if e["event_type"] == "ai_error"])
-        timeouts = len([e for e in ai_events if e["event_type"] == "ai_timeout"])
-        
-        success_rate = (successes / total_ai_requests * 100) if total_ai_requests > 0 else 0
+        perf = self.rollups.ai_performance(hours)
         
         return {
-            "total_requests": total_ai_requests,
-            "successes": successes,
-            "errors": errors,
-            "timeouts": timeouts,
-            "success_rate": round(success_rate, 2),
-            "avg_duration": sum(
-                s["avg_duration"] or 0 for s in ai_stats
-            ) / len(ai_stats) if ai_stats else 0,
+            "total_requests": perf["total_requests"],
+            "successes": perf["successes"],
+            "errors": perf["errors"],
+            "timeouts": perf["timeouts"],
+            "success_rate": perf["success_rate"],
+            # В секундах, как json data.duration
+            "avg_duration": round(perf["avg_duration_ms"] / 1000, 3),
+            "p95_duration": round(perf["p95_ms"] / 1000, 3) if perf["p95_ms"] else 0,
         }
     
-    def get_feature_usage(self, hours: int = 24) -> Dict[str, int]:
+    def get_feature_usage(self, hours: int = 24) -> List[Tuple[str, int]]:
         """Получить использование функций"""
-        events = self.tracker.get_events(hours=hours, limit=10000)
-        
-        usage = {}
-        for event in events:
-            event_type = event["event_type"]
-            usage[event_type] = usage.get(event_type, 0) + 1
-        
-        return sorted(usage.items(), key=lambda x: x[1], reverse=True)
+        return list(self.rollups.counts_by_type(hours).items())
     
     def get_daily_active_users(self, days: int = 7) -> Dict[str, int]:
         """Получить DAU (Daily Active Users)"""
-        dau = {}
-        
-        for i in range(days):
-            target_date = (datetime.now() - timedelta(days=i)).date().isoformat()
-            events = self.tracker.get_events(hours=24 * (i + 1), limit=100000)
-            events = [e for e in events if e["timestamp"].startswith(target_date)]
-            
-            unique_users = len(set(e["user_id"] for e in events if e["user_id"]))
-            dau[target_date] = unique_users
-        
-        return dau
+        return self.rollups.daily_active_users(days)
 
 # ============================================================================
 # HELPER FUNCTIONS
@@ -382,13 +399,15 @@ def create_event(
 # ============================================================================
 _tracker_instance = None
 
-def get_tracker(db_path: str = "./rvx_bot.db") -> EventTracker:
+def get_tracker(db_path: Optional[str] = None) -> EventTracker:
     """Получить глобальный экземпляр трекера (singleton)"""
     global _tracker_instance
     if _tracker_instance is None:
         _tracker_instance = EventTracker(db_path)
+        # Буфер enqueue() не теряется при остановке процесса
+        atexit.register(_tracker_instance.flush)
     return _tracker_instance
 
-def get_analytics(db_path: str = "./rvx_bot.db") -> Analytics:
+def get_analytics(db_path: Optional[str] = None) -> Analytics:
     """Получить экземпляр аналитики"""
     return Analytics(get_tracker(db_path))
@@ -55,6 +55,20 @@ class TransactionError(DatabaseError):
         return "❌ Ошибка при сохранении данных. Попробуй еще раз."
 
 
+class ReportTimeoutError(QueryExecutionError):
+    """Raised when a reporting query exceeds its time budget."""
+
+    def to_user_message(self) -> str:
+        return "❌ Отчёт строится слишком долго. Попробуй позже или уменьши период."
+
+
+class ReportsBusyError(DatabaseError):
+    """Raised when too many reports are already queued."""
+
+    def to_user_message(self) -> str:
+        return "❌ Сейчас строятся другие отчёты. Попробуй через минуту."
+
+
 # ============================================================================
 # USER ERRORS
 # ============================================================================
@@ -0,0 +1,399 @@
+"""
+Gamification Engine v1.0
+XP, уровни, бейджи и ежедневные задачи за одно чтение и одну транзакцию.
+
+Прохождение урока /teach стоило десятка обращений к БД в разных
+соединениях: update_task_progress, add_xp_to_user (UPDATE + SELECT +
+UPDATE), запись teaching_lessons, а затем check_and_award_badges -
+get_completed_topics, XP и выданные бейджи в трёх соединениях и каждый
+новый бейдж в своей транзакции. Теперь:
+
+- снимок прогресса пользователя (XP, уровень, пройденные темы, бейджи,
+  задачи и квесты дня) читается один раз в одном соединении;
+- правила уровней (LEVEL_THRESHOLDS), задач (daily_tasks) и бейджей
+  (ACHIEVEMENT_BADGES) считаются по снимку в памяти;
+- запись XP, урока, задач и бейджей - одна транзакция (BEGIN IMMEDIATE:
+  параллельное начисление ждёт, XP не теряется);
+- после коммита подписчики получают события (XP, уровень, бейдж,
+  задача) - по ним бот пересчитывает рейтинг.
+"""
+
+import logging
+import sqlite3
+import statistics
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Callable, ContextManager, Dict, List, NamedTuple, Optional, Set, TypedDict
+
+from daily_quests_v2 import get_quest_progress_today
+from education import LEVEL_THRESHOLDS
+
+logger = logging.getLogger(__name__)
+
+# ════════════════ СИСТЕМА ДОСТИЖЕНИЙ (BADGES) v0.37.0 ════════════════
+
+# {topic: {'difficulties': [...], 'completed_count': int, 'last_completed': ...}} - как get_completed_topics
+CompletedTopics = Dict[str, Dict[str, Any]]
+
+
+class BadgeInfo(TypedDict):
+    """Бейдж: condition(completed, xp) - выполнено ли условие по снимку прогресса."""
+    name: str
+    emoji: str
+    description: str
+    condition: Callable[[CompletedTopics, int], bool]
+
+
+ACHIEVEMENT_BADGES: Dict[str, BadgeInfo] = {
+    'first_lesson': {
+        'name': '🎓 Первый шаг',
+        'emoji': '🎓',
+        'description': 'Пройди первый урок',
+        'condition': lambda completed, xp: len(completed) > 0
+    },
+    'expert_hunter': {
+        'name': '💎 Охотник за экспертизой',
+        'emoji': '💎',
+        'description': 'Пройди 5 уроков на уровне expert',
+        'condition': lambda completed, xp: sum(1 for t in completed.values() if 'expert' in t.get('difficulties', [])) >= 5
+    },
+    'topic_master': {
+        'name': '🏆 Мастер темы',
+        'emoji': '🏆',
+        'description': 'Пройди все уровни одной темы',
+        'condition': lambda completed, xp: any(len(t.get('difficulties', [])) == 4 for t in completed.values())
+    },
+    'all_rounder': {
+        'name': '🌟 Всесторонний специалист',
+        'emoji': '🌟',
+        'description': 'Пройди уроки по 5 разным темам',
+        'condition': lambda completed, xp: len(completed) >= 5
+    },
+    'xp_collector': {
+        'name': '⚡ Сборщик XP',
+        'emoji': '⚡',
+        'description': 'Накопи 500+ XP',
+        'condition': lambda completed, xp: xp >= 500
+    },
+}
+
+EVENT_XP = "xp"
+EVENT_LEVEL_UP = "level_up"
+EVENT_BADGE = "badge"
+EVENT_TASK_COMPLETED = "task_completed"
+EVENT_LESSON_COMPLETED = "lesson_completed"
+
+# Сколько последних времён обработки хранится для p50 в stats()
+LATENCY_WINDOW = 500
+
+
+def level_for_xp(xp: int) -> int:
+    """Уровень по XP - как education.calculate_user_level_and_xp, без запроса к БД."""
+    for level, (min_xp, max_xp, _emoji, _name) in LEVEL_THRESHOLDS.items():
+        if min_xp <= xp < max_xp:
+            return level
+    return 1
+
+
+@dataclass
+class DailyTaskState:
+    """Строка daily_tasks на сегодня."""
+    task_id: int
+    progress: int
+    target: int
+    xp_reward: int
+    completed: bool
+
+
+@dataclass
+class ProgressSnapshot:
+    """Всё, что нужно правилам геймификации, прочитанное одним проходом."""
+    user_id: int
+    exists: bool = False
+    xp: int = 0
+    level: int = 1
+    completed: CompletedTopics = field(default_factory=dict)
+    badges: Set[str] = field(default_factory=set)
+    tasks: Dict[str, DailyTaskState] = field(default_factory=dict)
+    quests_today: List[str] = field(default_factory=list)
+    quest_xp_today: int = 0
+
+
+class GamificationEvent(NamedTuple):
+    """Событие после коммита: kind - EVENT_*, data - подробности."""
+    kind: str
+    user_id: int
+    data: Dict[str, Any]
+
+
+@dataclass
+class GamificationResult:
+    """Итог одного начисления."""
+    snapshot: ProgressSnapshot
+    xp_gained: int = 0
+    level_before: int = 1
+    new_badges: List[Dict[str, str]] = field(default_factory=list)
+    completed_tasks: List[str] = field(default_factory=list)
+    events: List[GamificationEvent] = field(default_factory=list)
+
+    @property
+    def level_up(self) -> bool:
+        return self.snapshot.level > self.level_before
+
+
+def load_snapshot(cursor: sqlite3.Cursor, user_id: int) -> ProgressSnapshot:
+    """Снимок прогресса в открытом соединении; отсутствующие таблицы - пустые данные."""
+    snapshot = ProgressSnapshot(user_id)
+
+    cursor.execute("SELECT xp, level FROM users WHERE user_id = ?", (user_id,))
+    row = cursor.fetchone()
+    if row:
+        snapshot.exists = True
+        snapshot.xp = row[0] or 0
+        snapshot.level = row[1] or level_for_xp(snapshot.xp)
+
+    try:
+        cursor.execute("""
+            SELECT topic, difficulty, COUNT(*) as count, MAX(completed_at) as last_completed
+            FROM teaching_lessons
+            WHERE user_id = ? AND quiz_passed = 1
+            GROUP BY topic, difficulty
+        """, (user_id,))
+        for topic, difficulty, count, last_completed in cursor.fetchall():
+            topic_progress = snapshot.completed.setdefault(
+                topic, {'difficulties': [], 'completed_count': 0, 'last_completed': None}
+            )
+            topic_progress['difficulties'].append(difficulty)
+            topic_progress['completed_count'] += count
+            topic_progress['last_completed'] = last_completed
+    except sqlite3.OperationalError:
+        logger.debug("Таблица teaching_lessons не существует")
+
+    try:
+        cursor.execute("SELECT badge_id FROM user_badges WHERE user_id = ?", (user_id,))
+        snapshot.badges = {row[0] for row in cursor.fetchall()}
+    except sqlite3.OperationalError:
+        logger.debug("Таблица user_badges не существует")
+
+    try:
+        cursor.execute("""
+            SELECT task_type, id, progress, target, xp_reward, completed FROM daily_tasks
+            WHERE user_id = ? AND DATE(reset_at) = DATE('now')
+        """, (user_id,))
+        for task_type, task_id, progress, target, xp_reward, completed in cursor.fetchall():
+            snapshot.tasks[task_type] = DailyTaskState(task_id, progress or 0, target or 0, xp_reward or 0, bool(completed))
+    except sqlite3.OperationalError:
+        logger.debug("Таблица daily_tasks не существует")
+
+    try:
+        snapshot.quests_today, snapshot.quest_xp_today = get_quest_progress_today(user_id, cursor.connection)
+    except sqlite3.OperationalError:
+        logger.debug("Таблица user_quiz_responses не существует")
+
+    return snapshot
+
+
+class GamificationEngine:
+    """Начисления геймификации по снимку прогресса в одной транзакции."""
+
+    def __init__(self, connect: Callable[[], ContextManager[sqlite3.Connection]],
+                 badges: Optional[Dict[str, BadgeInfo]] = None):
+        self._connect = connect
+        self.badges = ACHIEVEMENT_BADGES if badges is None else badges
+        self._listeners: List[Callable[[GamificationEvent], None]] = []
+        self._timings: "deque[float]" = deque(maxlen=LATENCY_WINDOW)
+        self._stats = {
+            "processed": 0, "snapshots": 0, "failed": 0, "xp_awarded": 0,
+            "level_ups": 0, "badges_awarded": 0, "tasks_completed": 0, "events": 0,
+        }
+
+    def subscribe(self, listener: Callable[[GamificationEvent], None]) -> None:
+        """listener(event) вызывается после коммита для каждого события."""
+        self._listeners.append(listener)
+
+    def snapshot(self, user_id: int) -> Optional[ProgressSnapshot]:
+        """Только чтение: снимок прогресса для экранов и рекомендаций."""
+        try:
+            with self._connect() as conn:
+                snapshot = load_snapshot(conn.cursor(), user_id)
+            self._stats["snapshots"] += 1
+            return snapshot
+        except Exception as e:
+            logger.warning(f"Ошибка чтения прогресса {user_id}: {e}")
+            return None
+
+    def process(
+        self,
+        user_id: int,
+        xp: int = 0,
+        reason: str = "",
+        lesson: Optional[Dict[str, Any]] = None,
+        tasks: Optional[Dict[str, int]] = None,
+    ) -> Optional[GamificationResult]:
+        """Начисляет XP, урок и прогресс задач, проверяет уровень и бейджи.
+
+        Args:
+            xp: XP за само действие (без наград задач - они считаются здесь)
+            reason: причина начисления (для событий и логов)
+            lesson: {'topic', 'difficulty', 'title'} пройденного урока /teach
+            tasks: {task_type: increment} прогресс ежедневных задач
+
+        Returns:
+            GamificationResult или None при ошибке БД
+        """
+        started = time.perf_counter()
+        try:
+            with self._connect() as conn:
+                if not conn.in_transaction:
+                    conn.execute("BEGIN IMMEDIATE")
+                cursor = conn.cursor()
+                snapshot = load_snapshot(cursor, user_id)
+                result = self._apply(cursor, snapshot, xp, reason, lesson, tasks or {})
+        except Exception as e:
+            self._stats["failed"] += 1
+            logger.warning(f"Ошибка начисления геймификации {user_id}: {e}")
+            return None
+
+        self._timings.append(time.perf_counter() - started)
+        self._stats["processed"] += 1
+        self._stats["xp_awarded"] += result.xp_gained
+        self._stats["level_ups"] += result.level_up
+        self._stats["badges_awarded"] += len(result.new_badges)
+        self._stats["tasks_completed"] += len(result.completed_tasks)
+        self._emit(result.events)
+        return result
+
+    def _apply(self, cursor, snapshot: ProgressSnapshot, xp: int, reason: str,
+               lesson: Optional[Dict[str, Any]], tasks: Dict[str, int]) -> GamificationResult:
+        """Правила по снимку в памяти и запись изменений в открытой транзакции."""
+        user_id = snapshot.user_id
+        result = GamificationResult(snapshot, level_before=snapshot.level)
+        events = result.events
+        gained = xp
+
+        task_updates = []
+        for task_type, increment in tasks.items():
+            task = snapshot.tasks.get(task_type)
+            if task is None or task.completed:
+                continue
+            task.progress = min(task.progress + increment, task.target)
+            task.completed = task.progress >= task.target
+            task_updates.append((task.progress, task.completed, task.task_id))
+            if task.completed:
+                gained += task.xp_reward
+                result.completed_tasks.append(task_type)
+                events.append(GamificationEvent(EVENT_TASK_COMPLETED, user_id,
+                                                {"task_type": task_type, "xp": task.xp_reward}))
+        if task_updates:
+            cursor.executemany("UPDATE daily_tasks SET progress = ?, completed = ? WHERE id = ?", task_updates)
+
+        if lesson is not None and self._record_lesson(cursor, user_id, lesson, xp):
+            topic, difficulty = lesson["topic"], lesson["difficulty"]
+            topic_progress = snapshot.completed.setdefault(
+                topic, {'difficulties': [], 'completed_count': 0, 'last_completed': None}
+            )
+            if difficulty not in topic_progress['difficulties']:
+                topic_progress['difficulties'].append(difficulty)
+                topic_progress['completed_count'] += 1
+            events.append(GamificationEvent(EVENT_LESSON_COMPLETED, user_id,
+                                            {"topic": topic, "difficulty": difficulty}))
+
+        # XP начисляется только существующему пользователю (как UPDATE в add_xp_to_user)
+        if snapshot.exists:
+            snapshot.xp += gained
+            snapshot.level = level_for_xp(snapshot.xp)
+            if gained or snapshot.level != result.level_before:
+                cursor.execute("UPDATE users SET xp = ?, level = ? WHERE user_id = ?",
+                               (snapshot.xp, snapshot.level, user_id))
+            result.xp_gained = gained
+            if gained:
+                events.append(GamificationEvent(EVENT_XP, user_id,
+                                                {"xp": gained, "total": snapshot.xp, "reason": reason}))
+            if snapshot.level > result.level_before:
+                events.append(GamificationEvent(EVENT_LEVEL_UP, user_id,
+                                                {"level": snapshot.level, "previous": result.level_before}))
+
+        for badge_id, badge_info in self.badges.items():
+            if badge_id in snapshot.badges or not badge_info['condition'](snapshot.completed, snapshot.xp):
+                continue
+            result.new_badges.append({
+                'badge_id': badge_id,
+                'name': badge_info['name'],
+                'emoji': badge_info['emoji'],
+                'description': badge_info['description'],
+            })
+        if result.new_badges:
+            try:
+                cursor.executemany("""
+                    INSERT OR IGNORE INTO user_badges (user_id, badge_id, badge_name, badge_emoji, badge_description, condition_met)
+                    VALUES (?, ?, ?, ?, ?, 'auto_detected')
+                """, [(user_id, b['badge_id'], b['name'], b['emoji'], b['description']) for b in result.new_badges])
+            except sqlite3.OperationalError:
+                logger.debug("Таблица user_badges не готова - бейджи не выданы")
+                result.new_badges = []
+            for badge in result.new_badges:
+                snapshot.badges.add(badge['badge_id'])
+                events.append(GamificationEvent(EVENT_BADGE, user_id, {"badge_id": badge['badge_id']}))
+                logger.info(f"🏅 Новый badge для {user_id}: {badge['badge_id']}")
+
+        return result
+
+    @staticmethod
+    def _record_lesson(cursor: sqlite3.Cursor, user_id: int, lesson: Dict[str, Any], xp: int) -> bool:
+        """Запись урока в teaching_lessons; ошибка откатывает только её (SAVEPOINT), XP начисляется."""
+        topic, difficulty = lesson["topic"], lesson["difficulty"]
+        cursor.execute("SAVEPOINT teaching_lesson")
+        try:
+            cursor.execute("""
+                INSERT OR REPLACE INTO teaching_lessons (user_id, topic, difficulty, title, xp_earned, quiz_passed, repeat_count, completed_at)
+                SELECT ?, ?, ?, ?, ?, 1, COALESCE(repeat_count, 0) + 1, CURRENT_TIMESTAMP
+                FROM (
+                    SELECT repeat_count FROM teaching_lessons
+                    WHERE user_id = ? AND topic = ? AND difficulty = ?
+                    UNION ALL SELECT 0
+                    LIMIT 1
+                )
+            """, (user_id, topic, difficulty, lesson.get("title"), xp, user_id, topic, difficulty))
+        except sqlite3.Error as e:
+            cursor.execute("ROLLBACK TO teaching_lesson")
+            logger.warning(f"Урок {topic}/{difficulty} пользователя {user_id} не записан: {e}")
+            return False
+        finally:
+            cursor.execute("RELEASE teaching_lesson")
+        return True
+
+    def _emit(self, events: List[GamificationEvent]) -> None:
+        for event in events:
+            self._stats["events"] += 1
+            for listener in self._listeners:
+                try:
+                    listener(event)
+                except Exception as e:
+                    logger.warning(f"Ошибка обработчика события {event.kind}: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        timings = list(self._timings)
+        return dict(
+            self._stats,
+            listeners=len(self._listeners),
+            p50_process_ms=statistics.median(timings) * 1000 if timings else 0.0,
+        )
+
+
+__all__ = [
+    "ACHIEVEMENT_BADGES",
+    "BadgeInfo",
+    "EVENT_BADGE",
+    "EVENT_LESSON_COMPLETED",
+    "EVENT_LEVEL_UP",
+    "EVENT_TASK_COMPLETED",
+    "EVENT_XP",
+    "DailyTaskState",
+    "GamificationEngine",
+    "GamificationEvent",
+    "GamificationResult",
+    "ProgressSnapshot",
+    "level_for_xp",
+    "load_snapshot",
+]
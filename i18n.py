@@ -15,7 +15,7 @@ i18n (Internationalization) модуль для мультиязычной по
 import json
 import os
 import sqlite3
-from typing import Dict, Optional, Any
+from typing import Callable, Dict, List, Optional, Any
 from pathlib import Path
 import logging
 
@@ -39,6 +39,9 @@ _translations_cache: Dict[str, Dict[str, str]] = {}
 # Кэш языков пользователей (user_id -> language)
 _user_languages_cache: Dict[int, str] = {}
 
+# Подписчики на перезагрузку переводов (например, render_cache)
+_reload_callbacks: List[Callable[[Optional[str]], Any]] = []
+
 
 def _load_translation(language: str) -> Dict[str, str]:
     """Загружает перевод для языка из JSON файла"""
@@ -95,6 +98,16 @@ async def get_text(
         else:
             language = DEFAULT_LANGUAGE
     
+    return translate(key, language, **kwargs)
+
+
+def translate(key: str, language: str = DEFAULT_LANGUAGE, **kwargs) -> str:
+    """
+    Синхронный вариант get_text для уже известного языка.
+    
+    Используется там, где нельзя await (например, при сборке
+    статичных меню в render_cache).
+    """
     # Валидируем язык
     if language not in SUPPORTED_LANGUAGES:
         logger.warning(f"Unsupported language: {language}, using default: {DEFAULT_LANGUAGE}")
@@ -236,3 +249,19 @@ def reload_translations(language: Optional[str] = None) -> None:
         if language in _translations_cache:
             del _translations_cache[language]
             logger.info(f"Reloaded translations for language: {language}")
+    
+    for callback in list(_reload_callbacks):
+        try:
+            callback(language)
+        except Exception as e:
+            logger.error(f"Translation reload callback failed: {e}")
+
+
+def on_translations_reload(callback: Callable[[Optional[str]], Any]) -> None:
+    """
+    Регистрирует callback(language), вызываемый из reload_translations.
+    
+    language = None означает перезагрузку всех языков.
+    """
+    if callback not in _reload_callbacks:
+        _reload_callbacks.append(callback)
@@ -0,0 +1,172 @@
+"""
+In-flight Registry v1.0
+Реестр выполняющихся LLM-вызовов по пользователям.
+
+Двойное нажатие «Не помогло»/«Расскажи еще» или два быстрых сообщения
+запускали параллельные вызовы провайдера для одного пользователя, хотя
+нужен только один ответ. Реестр решает это двумя способами:
+
+- claim()/run(): одинаковый вызов (тот же пользователь и ключ, например
+  callback_data), пришедший пока первый ещё выполняется, не запускается
+  заново, а присоединяется к текущему (deduped);
+- run_latest(): новый вызов того же вида (диалог на свободный текст)
+  отменяет ещё не завершённый предыдущий вызов пользователя (cancelled).
+  Отменённому вызову выставляется cancel_event - код в потоке проверяет
+  его перед следующим провайдером, а ожидающий обработчик получает
+  CallSuperseded и молча завершается.
+
+Счётчики deduped/cancelled показывают сэкономленные вызовы провайдера.
+Все методы вызываются из event loop, внутри критических секций нет await.
+"""
+
+import asyncio
+import logging
+import threading
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Виды вызовов для run_latest
+DIALOGUE = "dialogue"
+
+
+class CallSuperseded(Exception):
+    """Вызов отменён более новым вызовом того же пользователя."""
+
+
+class InflightCall:
+    """Один выполняющийся вызов."""
+
+    __slots__ = ("user_id", "key", "future", "cancel_event", "task", "superseded")
+
+    def __init__(self, user_id: int, key: Hashable):
+        self.user_id = user_id
+        self.key = key
+        self.future: asyncio.Future = asyncio.get_running_loop().create_future()
+        self.cancel_event = threading.Event()
+        self.task: Optional[asyncio.Task] = None
+        self.superseded = False
+
+    def cancel(self) -> None:
+        self.superseded = True
+        self.cancel_event.set()
+        if self.task is not None:
+            self.task.cancel()
+
+
+class InflightRegistry:
+    """Выполняющиеся вызовы по (user_id, ключ)."""
+
+    def __init__(self):
+        self._calls: Dict[Tuple[int, Hashable], InflightCall] = {}
+        self.started = 0
+        self.deduped = 0
+        self.cancelled = 0
+
+    def get(self, user_id: int, key: Hashable) -> Optional[InflightCall]:
+        return self._calls.get((user_id, key))
+
+    def claim(self, user_id: int, key: Hashable) -> Optional[InflightCall]:
+        """
+        Регистрирует вызов. None - такой же вызов уже выполняется
+        (учитывается как deduped, к нему можно присоединиться через join).
+        """
+        if (user_id, key) in self._calls:
+            self.deduped += 1
+            logger.debug(f"🔁 Повторный вызов {key} от {user_id} присоединён к выполняющемуся")
+            return None
+        call = InflightCall(user_id, key)
+        self._calls[(user_id, key)] = call
+        self.started += 1
+        return call
+
+    def release(self, call: InflightCall, result: Any = None, error: Optional[BaseException] = None) -> None:
+        """Завершает вызов и передаёт результат присоединившимся."""
+        if self._calls.get((call.user_id, call.key)) is call:
+            del self._calls[(call.user_id, call.key)]
+        if not call.future.done():
+            if error is not None:
+                call.future.set_exception(error)
+                # Присоединившихся может не быть - не логируем "exception was never retrieved"
+                call.future.exception()
+            else:
+                call.future.set_result(result)
+
+    async def join(self, user_id: int, key: Hashable) -> Any:
+        """Ждёт результат выполняющегося вызова (None, если его нет)."""
+        call = self.get(user_id, key)
+        if call is None:
+            return None
+        return await asyncio.shield(call.future)
+
+    async def run(self, user_id: int, key: Hashable, factory: Callable[[], Awaitable[Any]]) -> Any:
+        """Выполняет factory() или присоединяется к такому же выполняющемуся вызову."""
+        call = self.claim(user_id, key)
+        if call is None:
+            return await self.join(user_id, key)
+        try:
+            result = await factory()
+        except BaseException as e:
+            self.release(call, error=e)
+            raise
+        self.release(call, result)
+        return result
+
+    async def run_latest(self, user_id: int, kind: Hashable,
+                         factory: Callable[[InflightCall], Awaitable[Any]]) -> Any:
+        """
+        Выполняет factory(call), отменяя предыдущий незавершённый вызов
+        этого вида у пользователя. Если этот вызов сам будет отменён
+        более новым - CallSuperseded.
+        """
+        self.cancel(user_id, kind)
+        call = InflightCall(user_id, kind)
+        self._calls[(user_id, kind)] = call
+        self.started += 1
+        call.task = asyncio.ensure_future(factory(call))
+        try:
+            result = await call.task
+        except asyncio.CancelledError:
+            self.release(call)
+            if call.superseded:
+                raise CallSuperseded(f"{kind} call of {user_id} superseded") from None
+            raise
+        except BaseException as e:
+            self.release(call, error=e)
+            raise
+        self.release(call, result)
+        return result
+
+    def cancel(self, user_id: int, kind: Hashable) -> bool:
+        """Отменяет выполняющийся вызов вида kind у пользователя."""
+        call = self._calls.pop((user_id, kind), None)
+        if call is None:
+            return False
+        call.cancel()
+        self.cancelled += 1
+        logger.info(f"✂️ Вызов {kind} пользователя {user_id} отменён более новым сообщением")
+        return True
+
+    def __len__(self) -> int:
+        return len(self._calls)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "in_flight": len(self._calls),
+            "started": self.started,
+            "deduped": self.deduped,
+            "cancelled": self.cancelled,
+        }
+
+
+# Общий реестр процесса
+inflight = InflightRegistry()
+
+
+__all__ = [
+    "CallSuperseded",
+    "InflightCall",
+    "InflightRegistry",
+    "inflight",
+    "DIALOGUE",
+]
@@ -3,11 +3,16 @@ Input Validators v1.1 - УЛУЧШЕНО by Ollama ✨
 Валидация и очистка пользовательского ввода с оптимизациями.
 """
 
+import os
 import re
 import logging
+from dataclasses import dataclass
+from functools import cached_property, lru_cache
 from typing import Optional, Tuple, Set
 from pydantic import BaseModel, Field, field_validator, ValidationError
 
+from text_prefilter import hint_text
+
 logger = logging.getLogger(__name__)
 
 # Константы валидации
@@ -22,33 +27,62 @@ CONTROL_CHARS.discard('\n')  # оставляем новые строки
 CONTROL_CHARS.discard('\t')  # оставляем табы
 CONTROL_CHARS.discard('\r')  # оставляем carriage return
 
+# ⚡ Класс символов для удаления контрольных символов одним проходом на C
+# (str.translate со словарём на кириллице в разы медленнее)
+_CONTROL_CHARS_RE = re.compile('[' + re.escape(''.join(sorted(CONTROL_CHARS))) + ']')
+# Больше одной пустой строки подряд
+_EXTRA_NEWLINES_RE = re.compile(r'\n{3,}')
+
+# Prompt-injection паттерны embedded_news_analyzer.sanitize_input (скомпилированы один раз)
+# вместе со словом, без которого паттерн не может совпасть (проверка `in` по lower() на C)
+PROMPT_INJECTION_PATTERNS = tuple((re.compile(pattern, re.IGNORECASE), hint) for pattern, hint in (
+    (r"ignore.*previous.*instructions", "ignore"),
+    (r"override.*system.*prompt", "override"),
+    (r"execute.*code", "execute"),
+    (r"retrieve.*api.*key", "retrieve"),
+))
+
+# Сколько последних результатов check_message хранить для повторного использования
+MESSAGE_CHECK_CACHE_SIZE = int(os.getenv("MESSAGE_CHECK_CACHE_SIZE", "256"))
+
 
 def _remove_control_chars(text: str) -> str:
     """
-    ⚡ Быстрое удаление контрольных символов (используем set вместо ord проверок).
-    ~3x быстрее чем старая версия!
+    ⚡ Быстрое удаление контрольных символов (скомпилированный класс символов).
     """
-    return ''.join(char for char in text if char not in CONTROL_CHARS)
+    return _CONTROL_CHARS_RE.sub('', text)
 
 
 def _collapse_newlines(text: str) -> str:
     """
-    Удаляет множественные переводы строк добавляя max 2 consecutively.
+    Удаляет пробелы в конце строк и оставляет не больше одной пустой строки подряд.
     """
-    lines = text.split('\n')
-    result = []
-    consecutive_empty = 0
-    
-    for line in lines:
-        stripped = line.rstrip()
-        if stripped:
-            result.append(stripped)
-            consecutive_empty = 0
-        elif consecutive_empty < 1:  # Allow max 1 empty line
-            result.append('')
-            consecutive_empty += 1
-    
-    return '\n'.join(result).strip()
+    text = '\n'.join([line.rstrip() for line in text.split('\n')])
+    return _EXTRA_NEWLINES_RE.sub('\n\n', text).strip()
+
+
+def normalize_message(text: str) -> str:
+    """
+    ⚡ Нормализация сообщения, как в UserMessageInput: контрольные символы,
+    пробелы в конце строк, пустые строки, обрезка до MAX_MESSAGE_LENGTH.
+    """
+    text = _collapse_newlines(_remove_control_chars(text))
+    if len(text) > MAX_MESSAGE_LENGTH:
+        text = text[:MAX_MESSAGE_LENGTH].rstrip()
+    return text
+
+
+def strip_prompt_injections(text: str, max_length: int = MAX_MESSAGE_LENGTH) -> str:
+    """Обрезка и удаление prompt-injection паттернов (embedded_news_analyzer.sanitize_input)."""
+    if len(text) > max_length:
+        text = text[:max_length]
+    lowered = hint_text(text)
+    for pattern, hint in PROMPT_INJECTION_PATTERNS:
+        if lowered is not None and hint not in lowered:
+            continue
+        text = pattern.sub("", text)
+        lowered = hint_text(text)
+    return text.strip()
 
 
 class UserMessageInput(BaseModel):
@@ -74,17 +108,8 @@ class UserMessageInput(BaseModel):
         if not v.strip():
             raise ValueError("Text cannot be empty or only whitespace")
         
-        # ⚡ Оптимизировано: быстрое удаление контрольных символов
-        v = _remove_control_chars(v)
-        
-        # ⚡ Оптимизировано: collapse multiple newlines
-        v = _collapse_newlines(v)
-        
-        # Truncate если превышает max length
-        if len(v) > MAX_MESSAGE_LENGTH:
-            v = v[:MAX_MESSAGE_LENGTH].rstrip()
-        
-        return v
+        # ⚡ Контрольные символы, пустые строки и обрезка - normalize_message
+        return normalize_message(v)
 
 
 class TopicInput(BaseModel):
@@ -156,6 +181,84 @@ class FeedbackInput(BaseModel):
 
 
 
+@dataclass(frozen=True)
+class MessageCheck:
+    """
+    Результат проверки сообщения пользователя, который переиспользуют
+    следующие слои (хендлер бота, SecurityValidator, sanitize_input
+    анализатора новостей) вместо повторной нормализации того же текста.
+    """
+    text: str  # нормализованный текст (как UserMessageInput.text)
+    is_valid: bool
+    error: Optional[str] = None
+    original_length: int = 0
+
+    @property
+    def truncated(self) -> bool:
+        return self.original_length > MAX_MESSAGE_LENGTH
+
+    @cached_property
+    def security(self):
+        """validators.SecurityValidator по нормализованному тексту (считается один раз)."""
+        from validators import SecurityValidator
+        return SecurityValidator.validate(self.text)
+
+    @cached_property
+    def prompt_text(self) -> str:
+        """Текст без prompt-injection паттернов для передачи в ИИ."""
+        return strip_prompt_injections(self.text)
+
+
+# Нормализованный текст -> проверка (для find_message_check в следующих слоях)
+_checks_by_text: "dict[str, MessageCheck]" = {}
+
+
+@lru_cache(maxsize=MESSAGE_CHECK_CACHE_SIZE)
+def _check_message(text: str) -> MessageCheck:
+    if not text.strip():
+        return _pydantic_check(text)
+    normalized = normalize_message(text)
+    if not normalized:
+        return _pydantic_check(text)
+    check = MessageCheck(text=normalized, is_valid=True, original_length=len(text))
+    if len(_checks_by_text) >= MESSAGE_CHECK_CACHE_SIZE:
+        _checks_by_text.pop(next(iter(_checks_by_text)))
+    _checks_by_text[normalized] = check
+    return check
+
+
+def _pydantic_check(text: str) -> MessageCheck:
+    """Редкий путь невалидного ввода: сообщение об ошибке - ровно как у pydantic."""
+    try:
+        return MessageCheck(text=UserMessageInput(text=text).text, is_valid=True, original_length=len(text))
+    except ValidationError as e:
+        errors = e.errors()
+        if errors:
+            first_error = errors[0]
+            field = first_error['loc'][0] if first_error['loc'] else 'unknown'
+            error_msg = f"{field}: {first_error['msg']}"
+        else:
+            error_msg = "Validation failed"
+        return MessageCheck(text="", is_valid=False, error=error_msg, original_length=len(text))
+
+
+def check_message(text: str) -> MessageCheck:
+    """
+    ⚡ Проверка и нормализация сообщения за один вызов.
+    
+    Результат кэшируется по тексту: validate_user_input и хендлер, который
+    затем берёт check.text, нормализуют сообщение один раз.
+    """
+    if not isinstance(text, str):
+        return MessageCheck(text="", is_valid=False, error="Input must be string")
+    return _check_message(text)
+
+
+def find_message_check(text: str) -> Optional[MessageCheck]:
+    """Недавняя проверка, чей нормализованный текст равен text (или None)."""
+    return _checks_by_text.get(text)
+
+
 def validate_user_input(text: str) -> Tuple[bool, Optional[str]]:
     """
     ✨ Валидирует пользовательский ввод с правильной обработкой ошибок.
@@ -175,33 +278,18 @@ def validate_user_input(text: str) -> Tuple[bool, Optional[str]]:
         >>> validate_user_input("")
         (False, "text: ensure this value has at least 1 characters")
     """
-    if not isinstance(text, str):
-        msg = "Input must be string"
-        logger.warning(f"⚠️ Validation error: {msg}")
-        return False, msg
-    
     try:
-        UserMessageInput(text=text)  # Этот вызов выполняет валидацию
-        logger.debug(f"✅ Valid input: {len(text)} chars")
-        return True, None
-    
-    except ValidationError as e:
-        # ✨ Улучшено: более информативная обработка ошибок
-        errors = e.errors()
-        if errors:
-            first_error = errors[0]
-            field = first_error['loc'][0] if first_error['loc'] else 'unknown'
-            msg = first_error['msg']
-            error_msg = f"{field}: {msg}"
-        else:
-            error_msg = "Validation failed"
-        
-        logger.warning(f"⚠️ Validation error: {error_msg}")
-        return False, error_msg
-    
+        check = check_message(text)
     except RuntimeError as e:
         logger.error(f"❌ Runtime error during validation: {e}")
         return False, "Validation service error"
+    
+    if not check.is_valid:
+        logger.warning(f"⚠️ Validation error: {check.error}")
+        return False, check.error
+    
+    logger.debug(f"✅ Valid input: {len(text)} chars")
+    return True, None
 
 
 def validate_topic_input(topic: str) -> Tuple[bool, Optional[str]]:
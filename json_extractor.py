@@ -0,0 +1,330 @@
+"""
+JSON Extractor v1.0
+Общий извлекатель JSON из ответов ИИ за один проход по тексту.
+
+api_server.extract_json_from_response перебирал стратегии подряд: чистил
+markdown регулярками, посимвольно (в цикле Python) искал скобки внутри
+<json>, регуляркой искал ```-блок, затем ещё раз посимвольно считал
+скобки от первой `{` и вызывал json.loads на каждом кандидате.
+teacher.extract_teaching_json и embedded_news_analyzer
+.extract_json_from_response повторяли свои варианты того же. Теперь:
+
+- один проход по тексту с состоянием (глубина скобок, строка, экранирование,
+  внутри <json>...</json> или ```-блока); между значимыми символами сканер
+  прыгает str.find (поиск на C), а не идёт по одному символу;
+- валидный объект целиком разбирает json.JSONDecoder.raw_decode (на C):
+  он же находит конец объекта, и повторный json.loads не нужен;
+  посимвольное состояние нужно только битому или недошедшему JSON;
+- каждый закрытый объект верхнего уровня - кандидат с уверенностью по
+  источнику (<json> > ```-блок > просто скобки); json.loads вызывается
+  только для лучших JSON_MAX_PARSE_ATTEMPTS кандидатов, исправления
+  (пробелы, кавычки, подчёркивания) - только если строгий разбор не прошёл;
+- JsonStreamExtractor принимает текст кусками (feed): состояние сканера
+  сохраняется между кусками, закрытые объекты отдаются сразу, так что
+  потоковый ответ можно разбирать по мере прихода.
+"""
+
+import json
+import logging
+import os
+import re
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Sequence
+
+logger = logging.getLogger(__name__)
+
+# Защита от DoS: ответы больше этого размера не разбираются
+JSON_EXTRACT_MAX_SIZE = int(os.getenv("JSON_EXTRACT_MAX_SIZE", "100000"))
+# Сколько лучших кандидатов пробовать разобрать json.loads
+JSON_MAX_PARSE_ATTEMPTS = int(os.getenv("JSON_MAX_PARSE_ATTEMPTS", "3"))
+
+# Уверенность по источнику кандидата
+CANDIDATE_CONFIDENCE = {
+    "xml_tags": 1.0,
+    "markdown_json": 0.8,
+    "brace_matching": 0.5,
+}
+
+# Внутри объекта вне строки значимы скобки и кавычки (они идут плотно - хватает
+# класса символов); вне объекта и внутри строк значимые символы редки, туда
+# сканер прыгает str.find - он в десятки раз быстрее поиска классом в re
+_STRUCTURE_RE = re.compile(r'[{}"]')
+# Вне объекта - начало объекта, теги <json> и ограды ```
+_OUTSIDE_TOKENS = {"<": ("<json>", "</json>"), "`": ("```",)}
+_LONGEST_TOKEN = len("</json>")
+
+_SPACES_RE = re.compile(r" +")
+_VALUE_UNDERSCORE_RE = re.compile(r':\s*"([^"]*?)_([^"]*?)"')
+
+_stats = {"extractions": 0, "candidates": 0, "parse_attempts": 0, "parsed": 0}
+
+
+class JsonCandidate(NamedTuple):
+    """Закрытый объект верхнего уровня: текст, позиция и уверенность."""
+    text: str
+    start: int
+    end: int
+    source: str
+    confidence: float
+    data: Optional[Any] = None  # уже разобранное значение, если объект - валидный JSON
+
+
+_decoder = json.JSONDecoder()
+
+
+# =============================================================================
+# ИСПРАВЛЕНИЯ ТЕКСТА КАНДИДАТА (пробуются по очереди, если строгий разбор не прошёл)
+# =============================================================================
+
+def as_is(text: str) -> str:
+    return text
+
+
+def collapse_whitespace(text: str) -> str:
+    """Переводы строк -> пробелы (Gemini разбивает длинные строки JSON)."""
+    return _SPACES_RE.sub(" ", text.replace("\n", " ").replace("\r", ""))
+
+
+def expand_escapes(text: str) -> str:
+    """Раскрывает литеральные \\n и \\t (дважды экранированный ответ), затем как collapse_whitespace."""
+    return collapse_whitespace(text.replace("\\n", "\n").replace("\\t", "\t"))
+
+
+def double_quotes(text: str) -> str:
+    """Одиночные кавычки -> двойные (синтаксис Python dict)."""
+    return expand_escapes(text).replace("'", '"')
+
+
+def drop_value_underscores(text: str) -> str:
+    """Удаляет одиночное подчёркивание в строковых значениях."""
+    return _VALUE_UNDERSCORE_RE.sub(r': "\1\2"', expand_escapes(text))
+
+
+def strip_markdown_markers(text: str) -> str:
+    """Убирает маркеры **, __ и ~~."""
+    return text.replace("**", "").replace("__", "").replace("~~", "")
+
+
+DEFAULT_REPAIRS = (as_is, collapse_whitespace, expand_escapes, double_quotes, drop_value_underscores)
+
+Repair = Callable[[str], str]
+Validator = Callable[[Dict[str, Any]], bool]
+
+
+def parse_candidate(text: str, repairs: Sequence[Repair] = DEFAULT_REPAIRS,
+                    validator: Optional[Validator] = None, data: Optional[Any] = None) -> Optional[Dict[str, Any]]:
+    """
+    Разбирает текст кандидата: непустой dict (прошедший validator) или None.
+    data - значение, уже разобранное сканером из text как есть.
+    """
+    tried = set()
+    if data is not None:
+        if isinstance(data, dict) and data and (validator is None or validator(data)):
+            _stats["parsed"] += 1
+            return data
+        tried.add(text)
+    for repair in repairs:
+        fixed = repair(text)
+        if fixed in tried:
+            continue
+        tried.add(fixed)
+        _stats["parse_attempts"] += 1
+        try:
+            data = json.loads(fixed)
+        except (ValueError, RecursionError):
+            continue
+        if isinstance(data, dict) and data and (validator is None or validator(data)):
+            _stats["parsed"] += 1
+            return data
+    return None
+
+
+# =============================================================================
+# СКАНЕР
+# =============================================================================
+
+class JsonStreamExtractor:
+    """
+    Однопроходный сканер кандидатов JSON с поддержкой потоковой подачи.
+
+    Usage:
+        extractor = JsonStreamExtractor()
+        async for chunk in stream:
+            for candidate in extractor.feed(chunk):
+                data = parse_candidate(candidate.text, data=candidate.data)
+                ...
+        data = extractor.parse()  # лучший кандидат всего ответа
+    """
+
+    def __init__(self, max_size: int = JSON_EXTRACT_MAX_SIZE):
+        self.text = ""
+        self.max_size = max_size
+        self.overflow = False
+        self.candidates: List[JsonCandidate] = []
+        self._pos = 0
+        self._depth = 0
+        self._start = -1
+        self._in_string = False
+        self._in_xml = False
+        self._in_fence = False
+
+    def feed(self, chunk: str) -> List[JsonCandidate]:
+        """Добавляет кусок текста; возвращает объекты, закрывшиеся в нём."""
+        if self.overflow or not chunk:
+            return []
+        if len(self.text) + len(chunk) > self.max_size:
+            self.overflow = True
+            logger.warning(f"⚠️ JSON response exceeds max size ({len(self.text) + len(chunk)} > {self.max_size})")
+            return []
+        self.text += chunk
+        found = self._scan()
+        self.candidates.extend(found)
+        _stats["candidates"] += len(found)
+        return found
+
+    def _scan(self) -> List[JsonCandidate]:
+        text = self.text
+        find = text.find
+        end = len(text)
+        pos, depth, start = self._pos, self._depth, self._start
+        in_string, in_xml, in_fence = self._in_string, self._in_xml, self._in_fence
+        # Следующие позиции `{`, `<` и `` ` `` вне объектов (end - символа дальше нет)
+        next_brace = next_tag = next_tick = -1
+        found = []
+        while pos < end:
+            if depth == 0:
+                if next_brace < pos:
+                    next_brace = find("{", pos) % (end + 1)
+                if next_tag < pos:
+                    next_tag = find("<", pos) % (end + 1)
+                if next_tick < pos:
+                    next_tick = find("`", pos) % (end + 1)
+                index = min(next_brace, next_tag, next_tick)
+                if index == end:
+                    pos = end
+                    break
+                char = text[index]
+                if char == "{":
+                    # Валидный объект целиком разбирает json на C: это и поиск
+                    # конца объекта, и json.loads; иначе (ошибка в JSON или объект
+                    # ещё не дошёл) - посимвольное состояние ниже
+                    try:
+                        data, pos = _decoder.raw_decode(text, index)
+                    except (ValueError, RecursionError):
+                        depth, start, pos = 1, index, index + 1
+                    else:
+                        found.append(self._candidate(index, pos, in_xml, in_fence, data))
+                    continue
+                piece = text[index:index + _LONGEST_TOKEN].lower()
+                for token in _OUTSIDE_TOKENS[char]:
+                    if piece.startswith(token):
+                        break
+                else:
+                    if len(piece) < _LONGEST_TOKEN and any(t.startswith(piece) for t in _OUTSIDE_TOKENS[char]):
+                        # Токен разрезан границей куска: дочитаем его со следующим
+                        pos = index
+                        break
+                    pos = index + 1
+                    continue
+                pos = index + len(token)
+                if token == "```":
+                    in_fence = not in_fence
+                else:
+                    in_xml = token == "<json>"
+            elif in_string:
+                quote = find('"', pos)
+                if quote < 0:
+                    pos = end
+                    break
+                pos = quote + 1
+                # Кавычка экранирована, если перед ней нечётное число `\`
+                backslash = quote - 1
+                while text[backslash] == "\\":
+                    backslash -= 1
+                if (quote - backslash) % 2:
+                    in_string = False
+            else:
+                match = _STRUCTURE_RE.search(text, pos)
+                if match is None:
+                    pos = end
+                    break
+                char = match.group()
+                pos = match.end()
+                if char == '"':
+                    in_string = True
+                elif char == "{":
+                    depth += 1
+                else:
+                    depth -= 1
+                    if depth == 0:
+                        found.append(self._candidate(start, pos, in_xml, in_fence))
+        self._pos, self._depth, self._start = pos, depth, start
+        self._in_string, self._in_xml, self._in_fence = in_string, in_xml, in_fence
+        return found
+
+    def _candidate(self, start: int, end: int, in_xml: bool, in_fence: bool,
+                   data: Optional[Any] = None) -> JsonCandidate:
+        source = "xml_tags" if in_xml else "markdown_json" if in_fence else "brace_matching"
+        text = self.text[start:end]
+        confidence = CANDIDATE_CONFIDENCE[source]
+        if '"' not in text and "'" not in text:
+            # Без кавычек непустым JSON-объектом это быть не может
+            confidence *= 0.2
+        return JsonCandidate(text, start, end, source, confidence, data)
+
+    def ranked(self) -> List[JsonCandidate]:
+        """Кандидаты по убыванию уверенности, при равной - в порядке появления."""
+        return sorted(self.candidates, key=lambda candidate: (-candidate.confidence, candidate.start))
+
+    def parse(self, validator: Optional[Validator] = None, repairs: Sequence[Repair] = DEFAULT_REPAIRS,
+              max_attempts: int = JSON_MAX_PARSE_ATTEMPTS) -> Optional[Dict[str, Any]]:
+        """Первый разобранный из лучших max_attempts кандидатов."""
+        if self.overflow:
+            return None
+        for candidate in self.ranked()[:max_attempts]:
+            data = parse_candidate(candidate.text, repairs, validator, candidate.data)
+            if data is not None:
+                return data
+        return None
+
+
+def iter_json_candidates(text: str, max_size: int = JSON_EXTRACT_MAX_SIZE) -> List[JsonCandidate]:
+    """Все кандидаты текста по убыванию уверенности."""
+    extractor = JsonStreamExtractor(max_size)
+    extractor.feed(text)
+    return extractor.ranked()
+
+
+def extract_json(text: str, validator: Optional[Validator] = None, repairs: Sequence[Repair] = DEFAULT_REPAIRS,
+                 max_attempts: int = JSON_MAX_PARSE_ATTEMPTS,
+                 max_size: int = JSON_EXTRACT_MAX_SIZE) -> Optional[Dict[str, Any]]:
+    """⚡ JSON-объект из ответа ИИ (<json>, ```-блок или просто скобки) или None."""
+    if not text:
+        return None
+    _stats["extractions"] += 1
+    extractor = JsonStreamExtractor(max_size)
+    extractor.feed(text)
+    return extractor.parse(validator, repairs, max_attempts)
+
+
+def stats() -> Dict[str, int]:
+    return dict(_stats)
+
+
+__all__ = [
+    "JsonCandidate",
+    "JsonStreamExtractor",
+    "extract_json",
+    "iter_json_candidates",
+    "parse_candidate",
+    "stats",
+    "DEFAULT_REPAIRS",
+    "as_is",
+    "collapse_whitespace",
+    "expand_escapes",
+    "double_quotes",
+    "drop_value_underscores",
+    "strip_markdown_markers",
+    "CANDIDATE_CONFIDENCE",
+    "JSON_EXTRACT_MAX_SIZE",
+    "JSON_MAX_PARSE_ATTEMPTS",
+]
@@ -0,0 +1,183 @@
+"""
+Keyword Engine v1.0
+Общий движок поиска ключевых слов для классификаторов сообщений.
+
+Входящее сообщение проверялось десятки раз подряд конструкциями
+`any(kw in text_lower for kw in ...)`: analyze_message_context (пять
+словарей и ещё три встроенных списка), classify_intent (три списка),
+get_educational_context, get_practical_tips, detect_calendar_input,
+get_conversational_response - каждый по тому же тексту заново. Теперь:
+
+- категории ключевых слов регистрируются один раз при импорте модуля
+  (keyword_engine.register), движок компилирует их:
+  * дубликаты убираются;
+  * для проверки "есть ли категория" достаточно "покрытия" - слов
+    категории, не содержащих другое слово той же категории ("крипто"
+    покрывает "криптовалюта", "eth" - "ethereum");
+  * у каждого слова запоминается самая длинная подстрока-ключевое слово:
+    если её нет в тексте, слова тоже нет, и поиск пропускается;
+- scan(text) возвращает KeywordMatches - один результат на текст
+  (LRU по тексту), который читают все классификаторы: каждое слово
+  ищется в тексте не больше одного раза, найденные позиции
+  запоминаются;
+- has()/first() сохраняют поведение any(): вычисляются лениво и
+  останавливаются на первом совпадении; categories() отдаёт все
+  найденные категории со словами и позициями.
+
+Почему не Aho-Corasick на Python: поиск подстроки в CPython (str.find)
+работает на C со скоростью порядка ГБ/с, а автомат на чистом Python
+проходит текст посимвольно и на длинных постах в 4-9 раз медленнее
+цепочки `in`. Выигрыш здесь - в том, что каждое слово проверяется один
+раз на сообщение, и в отсечении заведомо лишних проверок.
+"""
+
+import logging
+import os
+from functools import lru_cache
+from typing import Any, Dict, Iterable, List, Mapping, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+KEYWORD_SCAN_CACHE_SIZE = int(os.getenv("KEYWORD_SCAN_CACHE_SIZE", "256"))
+
+
+class KeywordMatches:
+    """Результат поиска по одному тексту; вычисляется лениво и запоминается."""
+
+    __slots__ = ("text", "_engine", "_found")
+
+    def __init__(self, engine: "KeywordEngine", text: str):
+        self.text = text
+        self._engine = engine
+        # keyword -> позиция первого вхождения или -1
+        self._found: Dict[str, int] = {}
+
+    def find(self, keyword: str) -> int:
+        """Позиция первого вхождения слова или -1."""
+        found = self._found
+        position = found.get(keyword)
+        if position is not None:
+            return position
+        sub = self._engine._sub.get(keyword)
+        if sub is not None and self.find(sub) < 0:
+            position = -1
+        else:
+            position = self.text.find(keyword)
+        found[keyword] = position
+        return position
+
+    def has(self, category: str) -> bool:
+        """То же, что any(kw in text for kw in category)."""
+        found = self._found
+        for keyword in self._engine._covers[category]:
+            position = found.get(keyword)
+            if position is None:
+                position = self.find(keyword)
+            if position >= 0:
+                return True
+        return False
+
+    def first(self, categories: Iterable[str]) -> Optional[str]:
+        """Первая по порядку категория, найденная в тексте."""
+        for category in categories:
+            if self.has(category):
+                return category
+        return None
+
+    def matched(self, category: str) -> List[str]:
+        """Все слова категории, найденные в тексте (в порядке регистрации)."""
+        return [keyword for keyword in self._engine._categories[category] if self.find(keyword) >= 0]
+
+    def positions(self, category: str) -> Dict[str, List[int]]:
+        """Все вхождения каждого найденного слова категории."""
+        result = {}
+        for keyword in self.matched(category):
+            found, start = [], self._found[keyword]
+            while start >= 0:
+                found.append(start)
+                start = self.text.find(keyword, start + 1)
+            result[keyword] = found
+        return result
+
+    def categories(self) -> Dict[str, List[Tuple[int, str]]]:
+        """Все найденные категории: {категория: [(позиция, слово), ...]}."""
+        result = {}
+        for category, keywords in self._engine._categories.items():
+            hits = sorted((self.find(keyword), keyword) for keyword in keywords if self.find(keyword) >= 0)
+            if hits:
+                result[category] = hits
+        return result
+
+
+class KeywordEngine:
+    """Скомпилированные категории ключевых слов и кэш результатов по текстам."""
+
+    def __init__(self, categories: Optional[Mapping[str, Iterable[str]]] = None,
+                 cache_size: int = KEYWORD_SCAN_CACHE_SIZE):
+        self._categories: Dict[str, Tuple[str, ...]] = {}
+        self._covers: Dict[str, Tuple[str, ...]] = {}
+        self._sub: Dict[str, str] = {}
+        self._scan = lru_cache(maxsize=cache_size)(self._new_matches)
+        if categories:
+            self.register(categories)
+
+    def register(self, categories: Mapping[str, Iterable[str]]) -> None:
+        """Добавляет (или заменяет) категории и перекомпилирует движок."""
+        for name, keywords in categories.items():
+            self._categories[name] = tuple(dict.fromkeys(keywords))
+        self._compile()
+
+    def _compile(self) -> None:
+        keywords = sorted({kw for kws in self._categories.values() for kw in kws}, key=len)
+        sub: Dict[str, str] = {}
+        for index, keyword in enumerate(keywords):
+            # Самая длинная более короткая подстрока-ключевое слово
+            for candidate in reversed(keywords[:index]):
+                if len(candidate) < len(keyword) and candidate in keyword:
+                    sub[keyword] = candidate
+                    break
+        self._sub = sub
+        covers = {}
+        for name, kws in self._categories.items():
+            roots = [kw for kw in kws if not any(other != kw and other in kw for other in kws)]
+            # Покрытие в порядке первого слова, которое его содержит: any() по
+            # исходному списку остановился бы не раньше
+            covers[name] = tuple(dict.fromkeys(
+                next(root for root in roots if root in kw) for kw in kws))
+        self._covers = covers
+        self._scan.cache_clear()
+
+    def _new_matches(self, text: str) -> KeywordMatches:
+        return KeywordMatches(self, text)
+
+    def scan(self, text: str) -> KeywordMatches:
+        """Результат поиска по тексту (текст передаётся уже приведённым к нужному регистру)."""
+        return self._scan(text)
+
+    def has(self, text: str, category: str) -> bool:
+        return self.scan(text).has(category)
+
+    def __contains__(self, category: str) -> bool:
+        return category in self._categories
+
+    def stats(self) -> Dict[str, Any]:
+        info = self._scan.cache_info()
+        return {
+            "categories": len(self._categories),
+            "keywords": len({kw for kws in self._categories.values() for kw in kws}),
+            "cover_keywords": sum(len(kws) for kws in self._covers.values()),
+            "scans": info.misses,
+            "cache_hits": info.hits,
+        }
+
+
+# Общий движок процесса: классификаторы разных модулей делят результаты по тексту
+keyword_engine = KeywordEngine()
+
+
+__all__ = [
+    "KeywordEngine",
+    "KeywordMatches",
+    "keyword_engine",
+    "KEYWORD_SCAN_CACHE_SIZE",
+]
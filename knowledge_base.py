@@ -0,0 +1,360 @@
+"""
+Knowledge Base v1.0
+Локальный поиск по FAQ, встроенным урокам и курсам до вызова ИИ.
+
+handle_message отправлял в get_ai_response_sync каждый вопрос диалога,
+в том числе "что такое DeFi" или "как работает стейкинг", на которые уже
+есть ответ в таблице faq, в уроках embedded_teacher и в курсах. Теперь:
+
+- документы (FAQ, встроенные уроки, разделы `###` уроков курсов)
+  индексируются BM25 в инвертированный индекс: вес каждого вхождения
+  термина считается при построении, запрос - сумма весов по спискам
+  вхождений своих терминов (без прохода по всем документам);
+- уверенность совпадения - доля IDF терминов запроса, найденных в
+  документе и в его заголовке: при KB_ANSWER_THRESHOLD и выше короткий
+  вопрос получает ответ из базы без ИИ, при KB_SNIPPET_THRESHOLD -
+  фрагмент документа уходит в ИИ вместо полного системного промпта;
+- stats() показывает долю запросов, отвеченных без ИИ, и p50 времени
+  таких ответов.
+
+Почему не NumPy/scipy: их нет в зависимостях бота, а на корпусе из
+сотен документов списки вхождений по нескольким терминам запроса
+обходятся быстрее, чем умножение разреженной матрицы на вектор.
+"""
+
+import logging
+import math
+import os
+import re
+import statistics
+import time
+from collections import Counter, deque
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Any, Dict, Iterable, List, Mapping, NamedTuple, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Уверенность, с которой вопрос получает ответ из базы без вызова ИИ
+KB_ANSWER_THRESHOLD = float(os.getenv("KB_ANSWER_THRESHOLD", "0.9"))
+# Уверенность, с которой фрагмент документа передаётся ИИ как справка
+KB_SNIPPET_THRESHOLD = float(os.getenv("KB_SNIPPET_THRESHOLD", "0.5"))
+# Отвечать из базы только на короткие вопросы: длинное сообщение - это диалог
+KB_MAX_QUESTION_WORDS = int(os.getenv("KB_MAX_QUESTION_WORDS", "12"))
+KB_ANSWER_MAX_CHARS = int(os.getenv("KB_ANSWER_MAX_CHARS", "1200"))
+KB_SNIPPET_MAX_CHARS = int(os.getenv("KB_SNIPPET_MAX_CHARS", "700"))
+# Как часто бот перестраивает индекс (новые строки FAQ)
+KB_REFRESH_INTERVAL = int(os.getenv("KB_REFRESH_INTERVAL", "900"))
+
+BM25_K1 = 1.5
+BM25_B = 0.75
+# Термины заголовка считаются дважды (заголовок - самое точное описание документа)
+TITLE_BOOST = 2
+
+SOURCE_FAQ = "faq"
+SOURCE_LESSON = "lesson"
+SOURCE_COURSE = "course"
+# Из скольких лучших по BM25 документов выбирается ответ (по уверенности)
+KB_CANDIDATES = 10
+
+# При равной уверенности выигрывает более точный источник
+_SOURCE_PRIORITY = {SOURCE_FAQ: 0, SOURCE_LESSON: 1, SOURCE_COURSE: 2}
+
+_TOKEN_RE = re.compile(r"[a-zа-яё0-9]+")
+
+# Слова вопроса, которые не говорят о теме
+STOP_WORDS = frozenset("""
+    а в и к о с у из на по за до от не ни но да же ли бы то это как что чем кто где когда зачем
+    почему какой какая какие каким такое такой такие так там тут для или если про при над под
+    мне меня мой моя мои ты тебя твой вы вас ваш он она они его её их есть быть был была было
+    расскажи объясни подскажи скажи покажи работает работают нужен нужна нужно можно надо
+    вообще просто очень еще ещё уже все всё весь
+    a an the is are was what how why does do can of in on to for and or with about explain
+""".split())
+
+# Окончания, которые отбрасываются у русских слов (длинные - первыми)
+_RU_ENDINGS = tuple(sorted("""
+    ами ями ого его ому ему ыми ими ах ях ов ев ей ой ый ий ая яя ое ее ые ие ом ем ам ям ую юю
+    ы и а я о е у ю ь
+""".split(), key=len, reverse=True))
+
+
+@lru_cache(maxsize=65536)
+def stem(token: str) -> str:
+    """Грубая основа слова: без падежного окончания (рус.) или множественного числа (англ.)."""
+    if len(token) <= 4 or token.isdigit():
+        return token
+    if "а" <= token[-1] <= "я" or token[-1] == "ё":
+        for ending in _RU_ENDINGS:
+            if token.endswith(ending) and len(token) - len(ending) >= 4:
+                return token[:-len(ending)]
+        return token
+    if token.endswith("s") and not token.endswith("ss"):
+        return token[:-1]
+    return token
+
+
+def tokenize(text: str) -> List[str]:
+    """Основы значимых слов текста (без стоп-слов)."""
+    return [stem(token) for token in _TOKEN_RE.findall(text.lower()) if token not in STOP_WORDS]
+
+
+def clip_text(text: str, limit: int) -> str:
+    """Обрезает по концу абзаца или предложения, не посередине слова."""
+    text = text.strip()
+    if len(text) <= limit:
+        return text
+    clipped = text[:limit]
+    for separator in ("\n\n", ". ", "\n"):
+        cut = clipped.rfind(separator)
+        if cut > limit * 0.5:
+            return clipped[:cut + (1 if separator == ". " else 0)].rstrip()
+    cut = clipped.rfind(" ")
+    return (clipped[:cut] if cut > 0 else clipped) + "..."
+
+
+@dataclass(frozen=True)
+class KnowledgeDocument:
+    """Документ базы знаний; answer - готовый ответ пользователю."""
+    doc_id: str
+    source: str
+    title: str
+    text: str
+    answer: str
+    order: int = 0  # порядок внутри источника при равной уверенности (урок beginner - 0)
+
+
+@dataclass(frozen=True)
+class KnowledgeMatch:
+    """Лучший документ для запроса и решение, что с ним делать."""
+    document: KnowledgeDocument
+    score: float
+    confidence: float
+    answers_directly: bool
+
+    @property
+    def snippet(self) -> str:
+        return clip_text(f"{self.document.title}\n{self.document.text}", KB_SNIPPET_MAX_CHARS)
+
+
+class _Index(NamedTuple):
+    """Снимок индекса: rebuild заменяет его целиком, lookup читает один снимок."""
+    documents: List[KnowledgeDocument]
+    postings: Dict[str, List[Tuple[int, float]]]  # термин -> [(номер документа, вес BM25)]
+    idf: Dict[str, float]
+    unseen_idf: float  # IDF термина, которого нет ни в одном документе (df = 0)
+    doc_terms: List[frozenset]
+    title_terms: List[frozenset]
+
+    def scores(self, query_terms: Iterable[str]) -> Dict[int, float]:
+        scores: Dict[int, float] = {}
+        for term in query_terms:
+            for doc_index, weight in self.postings.get(term, ()):
+                scores[doc_index] = scores.get(doc_index, 0.0) + weight
+        return scores
+
+    def priority(self, doc_index: int) -> Tuple[int, int]:
+        document = self.documents[doc_index]
+        return _SOURCE_PRIORITY.get(document.source, 9), document.order
+
+    def ranked(self, scores: Dict[int, float]) -> List[int]:
+        return sorted(scores, key=lambda index: (-scores[index], self.priority(index), index))
+
+    def confidence(self, query_terms: frozenset, doc_index: int) -> float:
+        """
+        Доля IDF терминов запроса в документе и в заголовке (среднее двух долей).
+
+        Термин, которого нет в базе, весит как самый редкий: вопрос о том,
+        чего база не знает, не должен получить ответ по остальным словам.
+        """
+        weights = {term: self.idf.get(term, self.unseen_idf) for term in query_terms}
+        total = sum(weights.values())
+        if not total:
+            return 0.0
+        in_doc = sum(weight for term, weight in weights.items() if term in self.doc_terms[doc_index])
+        in_title = sum(weight for term, weight in weights.items() if term in self.title_terms[doc_index])
+        return (in_doc + in_title) / (2 * total)
+
+
+def build_index(documents: List[KnowledgeDocument]) -> _Index:
+    """BM25: вес вхождения idf * tf * (k1 + 1) / (tf + k1 * (1 - b + b * len / avglen))."""
+    counts: List[Counter] = []
+    for document in documents:
+        terms = Counter(tokenize(document.text))
+        for term in tokenize(document.title):
+            terms[term] += TITLE_BOOST
+        counts.append(terms)
+
+    total = len(documents)
+    lengths = [sum(terms.values()) for terms in counts]
+    average = (sum(lengths) / total) if total else 1.0
+    frequency = Counter(term for terms in counts for term in terms)
+    idf = {term: math.log(1 + (total - df + 0.5) / (df + 0.5)) for term, df in frequency.items()}
+
+    postings: Dict[str, List[Tuple[int, float]]] = {}
+    for doc_index, terms in enumerate(counts):
+        norm = BM25_K1 * (1 - BM25_B + BM25_B * lengths[doc_index] / average)
+        for term, tf in terms.items():
+            postings.setdefault(term, []).append((doc_index, idf[term] * tf * (BM25_K1 + 1) / (tf + norm)))
+
+    return _Index(
+        documents, postings, idf, math.log(1 + (total + 0.5) / 0.5),
+        [frozenset(terms) for terms in counts],
+        [frozenset(tokenize(document.title)) for document in documents],
+    )
+
+
+class KnowledgeBase:
+    """BM25-индекс документов с порогами прямого ответа и справки для ИИ."""
+
+    def __init__(self, documents: Iterable[KnowledgeDocument] = (),
+                 answer_threshold: float = KB_ANSWER_THRESHOLD,
+                 snippet_threshold: float = KB_SNIPPET_THRESHOLD,
+                 max_question_words: int = KB_MAX_QUESTION_WORDS):
+        self.answer_threshold = answer_threshold
+        self.snippet_threshold = snippet_threshold
+        self.max_question_words = max_question_words
+        self._index = build_index([])
+        self._latencies: "deque[float]" = deque(maxlen=1000)
+        self._counters = {"queries": 0, "answered": 0, "snippets": 0, "rebuilds": 0}
+        documents = list(documents)
+        if documents:
+            self.rebuild(documents)
+
+    def rebuild(self, documents: Iterable[KnowledgeDocument]) -> int:
+        """Строит индекс заново (можно из другого потока); возвращает число документов."""
+        index = build_index(list(documents))
+        self._index = index
+        self._counters["rebuilds"] += 1
+        logger.info(f"📖 База знаний: {len(index.documents)} документов, {len(index.postings)} терминов")
+        return len(index.documents)
+
+    def search(self, query: str, limit: int = 3) -> List[Tuple[KnowledgeDocument, float]]:
+        """Документы по убыванию BM25 score."""
+        index = self._index
+        scores = index.scores(frozenset(tokenize(query)))
+        return [(index.documents[doc_index], scores[doc_index]) for doc_index in index.ranked(scores)[:limit]]
+
+    def lookup(self, question: str, allow_answer: bool = True) -> Optional[KnowledgeMatch]:
+        """
+        Лучшее совпадение для сообщения пользователя или None.
+
+        answers_directly - ответить документом без ИИ; иначе документ
+        годится как справка для промпта. allow_answer=False (не вопрос,
+        не русский язык) - только справка, и в stats() такой запрос
+        не считается отвеченным без ИИ.
+        """
+        started = time.perf_counter()
+        self._counters["queries"] += 1
+        index = self._index
+        query_terms = frozenset(tokenize(question))
+        scores = index.scores(query_terms)
+        if not scores:
+            return None
+        # Среди лучших по BM25 - самый уверенный, при равенстве - по источнику
+        # (и уроку младшего уровня), затем по score
+        candidates = index.ranked(scores)[:KB_CANDIDATES]
+        confidences = [index.confidence(query_terms, doc_index) for doc_index in candidates]
+        best = min(range(len(candidates)), key=lambda rank: (
+            -confidences[rank], index.priority(candidates[rank]), rank))
+        doc_index, confidence = candidates[best], confidences[best]
+        if confidence < self.snippet_threshold:
+            return None
+
+        document = index.documents[doc_index]
+        answers = (allow_answer
+                   and confidence >= self.answer_threshold
+                   and len(question.split()) <= self.max_question_words
+                   and bool(document.answer))
+        if answers:
+            self._counters["answered"] += 1
+            self._latencies.append(time.perf_counter() - started)
+        else:
+            self._counters["snippets"] += 1
+        return KnowledgeMatch(document, scores[doc_index], confidence, answers)
+
+    def __len__(self) -> int:
+        return len(self._index.documents)
+
+    def stats(self) -> Dict[str, Any]:
+        queries = self._counters["queries"]
+        return {
+            "documents": len(self._index.documents),
+            "terms": len(self._index.postings),
+            **self._counters,
+            "llm_calls_avoided": self._counters["answered"] / queries if queries else 0.0,
+            "p50_answer_ms": statistics.median(self._latencies) * 1000 if self._latencies else 0.0,
+        }
+
+
+# =============================================================================
+# ИСТОЧНИКИ ДОКУМЕНТОВ
+# =============================================================================
+
+def faq_documents(rows: Iterable[Tuple[int, str, str]]) -> List[KnowledgeDocument]:
+    """Строки faq (id, question, answer)."""
+    return [
+        KnowledgeDocument(f"faq:{faq_id}", SOURCE_FAQ, question, answer, clip_text(answer, KB_ANSWER_MAX_CHARS))
+        for faq_id, question, answer in rows if question and answer
+    ]
+
+
+def embedded_lesson_documents(curriculum: Optional[Mapping[str, Mapping[str, Any]]] = None) -> List[KnowledgeDocument]:
+    """Уроки embedded_teacher: заголовок, текст и ключевые пункты."""
+    if curriculum is None:
+        from embedded_teacher import EMBEDDED_CURRICULUM
+        curriculum = EMBEDDED_CURRICULUM
+    documents = []
+    for topic, levels in curriculum.items():
+        for order, (level, lesson) in enumerate(levels.items()):
+            text = "\n".join([lesson.content, *lesson.key_points, lesson.real_world_example])
+            documents.append(KnowledgeDocument(
+                f"lesson:{topic}:{level}", SOURCE_LESSON, lesson.lesson_title, text,
+                clip_text(lesson.content, KB_ANSWER_MAX_CHARS), order,
+            ))
+    return documents
+
+
+def course_documents(store: Any, courses: Iterable[str]) -> List[KnowledgeDocument]:
+    """Разделы `###` уроков курсов из course_store.CourseStore."""
+    documents = []
+    for course in courses:
+        index = store.course(course)
+        if index is None:
+            continue
+        for number, lesson in sorted(index.lessons.items()):
+            lesson_title = lesson.title.split("(", 1)[0].strip()
+            for position, section in enumerate(lesson.text.split("\n### ")[1:], 1):
+                heading, _, body = section.partition("\n")
+                body = body.split("\n## ", 1)[0].strip()
+                if not body:
+                    continue
+                documents.append(KnowledgeDocument(
+                    f"course:{course}:{number}:{position}", SOURCE_COURSE,
+                    f"{heading.strip()} ({lesson_title})", body,
+                    clip_text(body, KB_ANSWER_MAX_CHARS),
+                ))
+    return documents
+
+
+# Общий индекс процесса; документы загружает бот (rebuild при старте и по таймеру)
+knowledge_base = KnowledgeBase()
+
+
+__all__ = [
+    "KnowledgeBase",
+    "KnowledgeDocument",
+    "KnowledgeMatch",
+    "knowledge_base",
+    "build_index",
+    "faq_documents",
+    "embedded_lesson_documents",
+    "course_documents",
+    "tokenize",
+    "stem",
+    "clip_text",
+    "KB_ANSWER_THRESHOLD",
+    "KB_SNIPPET_THRESHOLD",
+    "KB_MAX_QUESTION_WORDS",
+    "KB_REFRESH_INTERVAL",
+]
@@ -0,0 +1,219 @@
+"""
+Lazy Import v1.0
+Ленивая загрузка тяжёлых модулей бота и бюджет времени импорта bot.py.
+
+`import bot` тянул за собой все модули хендлеров, в том числе
+embedded_news_analyzer (openai + google.genai, около 2 с), дайджест и
+Redis-кэш tier1_optimizations, хотя до первого апдейта ничего из этого
+не нужно. Теперь:
+
+- lazy_callable("module", "name") - заглушка функции, которая импортирует
+  модуль при первом вызове (работает и для async-функций: вызов
+  возвращает корутину настоящей функции); имя в bot.py остаётся, поэтому
+  patch("bot.name") в тестах продолжает работать;
+- load() импортирует модуль и запоминает время загрузки (stats());
+- start_warm_up() в post_init догружает в фоновом потоке только те модули,
+  которые понадобятся этому процессу, и не задерживает первый апдейт;
+- import_time_report() запускает `python -X importtime -c "import bot"`
+  в отдельном процессе, check_import_budget() сверяет результат с
+  BOT_IMPORT_BUDGET_MS и списком модулей, которые не должны загружаться
+  при импорте (LAZY_MODULES).
+
+CLI: python lazy_import.py [module] - отчёт и код возврата 1 при превышении.
+"""
+
+import asyncio
+import importlib
+import logging
+import os
+import subprocess
+import sys
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from types import ModuleType
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence
+
+logger = logging.getLogger(__name__)
+
+BOT_IMPORT_BUDGET_MS = int(os.getenv("BOT_IMPORT_BUDGET_MS", "1500"))
+LAZY_IMPORT_WARMUP = os.getenv("LAZY_IMPORT_WARMUP", "true").lower() == "true"
+
+# Модули, которые bot.py загружает только при первом использовании
+LAZY_MODULES = (
+    "embedded_news_analyzer",
+    "daily_digest_scheduler",
+    "crypto_digest",
+    "digest_formatter",
+    "tier1_optimizations",
+    "embedded_teacher",
+    "webhook_cluster",
+)
+
+# Время загрузки модулей через load(), секунды
+_load_times: Dict[str, float] = {}
+
+
+def load(module_name: str) -> ModuleType:
+    """Импортирует модуль (если ещё не загружен) и запоминает время загрузки."""
+    module = sys.modules.get(module_name)
+    if module is not None:
+        return module
+    started = time.perf_counter()
+    module = importlib.import_module(module_name)
+    elapsed = time.perf_counter() - started
+    _load_times[module_name] = elapsed
+    logger.info(f"📦 Загружен {module_name} за {elapsed * 1000:.0f} мс")
+    return module
+
+
+def is_loaded(module_name: str) -> bool:
+    return module_name in sys.modules
+
+
+def lazy_callable(module_name: str, attr: str) -> Callable[..., Any]:
+    """Функция-заглушка: импортирует module_name при первом вызове."""
+
+    def proxy(*args: Any, **kwargs: Any) -> Any:
+        return getattr(load(module_name), attr)(*args, **kwargs)
+
+    proxy.__name__ = attr
+    proxy.__qualname__ = attr
+    proxy.__module__ = module_name
+    proxy.__doc__ = f"Lazy proxy for {module_name}.{attr}"
+    return proxy
+
+
+async def warm_up(module_names: Iterable[str]) -> Dict[str, float]:
+    """Загружает модули в потоке, не блокируя event loop; возвращает времена."""
+    loaded: Dict[str, float] = {}
+    for module_name in module_names:
+        if is_loaded(module_name):
+            continue
+        try:
+            await asyncio.to_thread(load, module_name)
+            loaded[module_name] = _load_times.get(module_name, 0.0)
+        except Exception as e:
+            logger.warning(f"⚠️ Прогрев {module_name} не удался: {e}")
+    return loaded
+
+
+def start_warm_up(module_names: Sequence[str]) -> Optional["asyncio.Task[Dict[str, float]]"]:
+    """Фоновый прогрев из post_init; None, если прогрев выключен или не нужен."""
+    pending = [name for name in module_names if not is_loaded(name)]
+    if not LAZY_IMPORT_WARMUP or not pending:
+        return None
+    return asyncio.get_running_loop().create_task(warm_up(pending), name="lazy-import-warm-up")
+
+
+def stats() -> Dict[str, Any]:
+    return {
+        "loaded": {name: round(seconds * 1000, 1) for name, seconds in _load_times.items()},
+        "pending": [name for name in LAZY_MODULES if not is_loaded(name)],
+    }
+
+
+# ============================================================================
+# Отчёт -X importtime
+# ============================================================================
+
+@dataclass(frozen=True)
+class ImportTiming:
+    module: str
+    self_us: int
+    cumulative_us: int
+    depth: int
+
+
+def parse_importtime(output: str) -> List[ImportTiming]:
+    """Разбирает строки `import time: self | cumulative | module` из stderr."""
+    timings = []
+    for line in output.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        parts = line[len("import time:"):].split("|")
+        if len(parts) != 3 or not parts[0].strip().isdigit():
+            continue  # заголовок таблицы
+        name = parts[2].rstrip()
+        stripped = name.lstrip()
+        timings.append(ImportTiming(
+            module=stripped,
+            self_us=int(parts[0]),
+            cumulative_us=int(parts[1]),
+            depth=(len(name) - len(stripped) - 1) // 2,
+        ))
+    return timings
+
+
+def import_time_report(module: str = "bot", env: Optional[Dict[str, str]] = None,
+                       timeout: float = 120) -> List[ImportTiming]:
+    """Импортирует module в чистом интерпретаторе с -X importtime."""
+    run_env = dict(os.environ)
+    run_env.update(env or {})
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=str(Path(__file__).parent), env=run_env,
+        capture_output=True, text=True, timeout=timeout,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"import {module} failed: {result.stderr[-2000:]}")
+    return parse_importtime(result.stderr)
+
+
+def check_import_budget(report: List[ImportTiming], module: str = "bot",
+                        budget_ms: int = BOT_IMPORT_BUDGET_MS,
+                        forbidden: Iterable[str] = LAZY_MODULES) -> List[str]:
+    """Возвращает список нарушений: превышение бюджета и загруженные ленивые модули."""
+    problems = []
+    total = next((t.cumulative_us for t in report if t.module == module and t.depth == 0), None)
+    if total is None:
+        problems.append(f"{module} not found in report")
+    elif total / 1000 > budget_ms:
+        problems.append(f"import {module}: {total / 1000:.0f} ms > budget {budget_ms} ms")
+    imported = {t.module for t in report}
+    for name in forbidden:
+        if name in imported:
+            problems.append(f"{name} is imported eagerly")
+    return problems
+
+
+def format_report(report: List[ImportTiming], top: int = 15) -> str:
+    lines = [f"{'cumulative ms':>14} {'self ms':>9}  module"]
+    for timing in sorted(report, key=lambda t: t.cumulative_us, reverse=True)[:top]:
+        lines.append(f"{timing.cumulative_us / 1000:>14.1f} {timing.self_us / 1000:>9.1f}  "
+                     f"{'  ' * timing.depth}{timing.module}")
+    return "\n".join(lines)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = argv if argv is not None else sys.argv[1:]
+    module = args[0] if args else "bot"
+    report = import_time_report(module)
+    print(format_report(report))
+    problems = check_import_budget(report, module)
+    for problem in problems:
+        print(f"❌ {problem}")
+    if not problems:
+        print(f"✅ import {module} within {BOT_IMPORT_BUDGET_MS} ms budget")
+    return 1 if problems else 0
+
+
+__all__ = [
+    "LAZY_MODULES",
+    "BOT_IMPORT_BUDGET_MS",
+    "ImportTiming",
+    "load",
+    "is_loaded",
+    "lazy_callable",
+    "warm_up",
+    "start_warm_up",
+    "stats",
+    "parse_importtime",
+    "import_time_report",
+    "check_import_budget",
+    "format_report",
+]
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,332 @@
+"""
+Lesson Cache v1.0
+Постоянный кэш уроков /teach, сгенерированных ИИ.
+
+Если для пары (тема, уровень) нет встроенного урока, teacher.teach_lesson
+на каждый запрос заново генерировал урок, последовательно пробуя до
+четырёх ИИ (Groq → Mistral → DeepSeek → Gemini): секунды ожидания и
+расход квоты на один и тот же урок для всех пользователей. Теперь:
+
+- уроки хранятся по ключу (тема, уровень, язык) в таблице lesson_cache
+  БД кэша (storage_router, маршрут cache) и в памяти процесса - готовый
+  урок отдаётся без обращения к ИИ;
+- урок старше LESSON_CACHE_TTL отдаётся сразу, а обновляется в фоне
+  (stale-while-revalidate); генерация в ответ на запрос - только когда
+  урока нет вовсе, одновременные промахи по одному ключу ждут одну
+  генерацию;
+- warm() в фоне генерирует недостающие и устаревшие уроки (по одному,
+  с паузой LESSON_CACHE_WARM_PACE между вызовами ИИ), бот запускает его
+  периодической задачей;
+- встроенный урок-заглушка (is_fallback) не кэшируется: следующий
+  запрос снова попробует ИИ.
+
+В кластере промах в памяти сначала проверяет строку в БД: урок, который
+сгенерировал другой воркер, подхватывается без повторной генерации.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import time
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, Iterable, Optional, Set, Tuple
+
+from schema_migrations import Migration
+from storage_router import ROUTE_CACHE, register_schema, routed_connection
+
+logger = logging.getLogger(__name__)
+
+# Через сколько секунд урок считается устаревшим (отдаётся, но обновляется в фоне)
+LESSON_CACHE_TTL = int(os.getenv("LESSON_CACHE_TTL", str(7 * 24 * 3600)))
+# Пауза между генерациями при прогреве, чтобы не выбирать квоту ИИ пачкой
+LESSON_CACHE_WARM_PACE = float(os.getenv("LESSON_CACHE_WARM_PACE", "5"))
+# Как часто бот перепроверяет покрытие кэша (и первый запуск после старта)
+LESSON_CACHE_WARM_INTERVAL = int(os.getenv("LESSON_CACHE_WARM_INTERVAL", "21600"))
+LESSON_CACHE_WARM_FIRST = int(os.getenv("LESSON_CACHE_WARM_FIRST", "180"))
+
+DEFAULT_LESSON_LANGUAGE = "ru"
+
+LessonKey = Tuple[str, str, str]  # (тема, уровень, язык)
+LessonGenerator = Callable[[str, str, str], Awaitable[Optional[Dict[str, Any]]]]
+
+
+def _create_lesson_cache_table(cursor: sqlite3.Cursor) -> None:
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS lesson_cache (
+            topic TEXT NOT NULL,
+            level TEXT NOT NULL,
+            language TEXT NOT NULL,
+            lesson_json TEXT NOT NULL,
+            created_at REAL NOT NULL,
+            PRIMARY KEY (topic, level, language)
+        )
+    """)
+
+
+LESSON_CACHE_MIGRATIONS = [
+    Migration(1, "lesson_cache_table", _create_lesson_cache_table),
+]
+register_schema(ROUTE_CACHE, "lesson_cache", LESSON_CACHE_MIGRATIONS)
+
+
+@dataclass
+class CachedLesson:
+    """Урок в кэше и время его генерации (unix time)."""
+    lesson: Dict[str, Any]
+    created_at: float
+
+    def is_fresh(self, ttl: float, now: float) -> bool:
+        return now - self.created_at < ttl
+
+
+def is_cacheable_lesson(lesson: Optional[Dict[str, Any]]) -> bool:
+    """Кэшируются только уроки от ИИ: с заголовком и не заглушки."""
+    return bool(lesson and lesson.get("lesson_title") and not lesson.get("is_fallback"))
+
+
+class LessonCache:
+    """Кэш уроков с фоновым обновлением; generator(topic, level, language) генерирует урок."""
+
+    def __init__(self, generator: LessonGenerator, ttl: float = LESSON_CACHE_TTL,
+                 expected: Optional[Callable[[], Iterable[LessonKey]]] = None,
+                 main_db_path: Optional[str] = None, persist: bool = True):
+        self._generator = generator
+        # expected() - ключи, которые кэш должен покрывать; вызывается лениво
+        self._expected_source = expected
+        self.ttl = ttl
+        self._main_db_path = main_db_path
+        self.persist = persist
+        self._entries: Dict[LessonKey, CachedLesson] = {}
+        self._loaded = not persist
+        self._inflight: Dict[LessonKey, "asyncio.Future[Optional[Dict[str, Any]]]"] = {}
+        self._background: Set["asyncio.Task[Any]"] = set()
+        self._expected: Optional[Set[LessonKey]] = None
+        self._warm_task: Optional["asyncio.Task[int]"] = None
+        self._counters = {
+            "hits": 0,
+            "stale_hits": 0,
+            "misses": 0,
+            "generated": 0,
+            "refreshed": 0,
+            "failed": 0,
+        }
+
+    # -------------------------------------------------------------------------
+    # Хранение
+    # -------------------------------------------------------------------------
+
+    def _ensure_loaded(self) -> None:
+        if self._loaded:
+            return
+        self._loaded = True
+        try:
+            with routed_connection(ROUTE_CACHE, self._main_db_path) as conn:
+                rows = conn.execute(
+                    "SELECT topic, level, language, lesson_json, created_at FROM lesson_cache"
+                ).fetchall()
+        except sqlite3.Error as e:
+            logger.error(f"❌ Не удалось загрузить кэш уроков: {e}")
+            return
+        for topic, level, language, lesson_json, created_at in rows:
+            try:
+                self._entries[(topic, level, language)] = CachedLesson(json.loads(lesson_json), created_at)
+            except ValueError:
+                logger.warning(f"⚠️ Повреждённый урок в кэше: {topic}/{level}/{language}")
+        if rows:
+            logger.info(f"📚 Кэш уроков загружен: {len(self._entries)} уроков")
+
+    def _read_row(self, key: LessonKey) -> Optional[CachedLesson]:
+        """Строка из БД: урок мог сгенерировать другой процесс."""
+        if not self.persist:
+            return None
+        try:
+            with routed_connection(ROUTE_CACHE, self._main_db_path) as conn:
+                row = conn.execute(
+                    "SELECT lesson_json, created_at FROM lesson_cache WHERE topic = ? AND level = ? AND language = ?",
+                    key,
+                ).fetchone()
+            if row is None:
+                return None
+            return CachedLesson(json.loads(row[0]), row[1])
+        except (sqlite3.Error, ValueError) as e:
+            logger.warning(f"⚠️ Не удалось прочитать урок {key} из кэша: {e}")
+            return None
+
+    def _store(self, key: LessonKey, lesson: Dict[str, Any]) -> CachedLesson:
+        entry = CachedLesson(dict(lesson), time.time())
+        self._entries[key] = entry
+        if self.persist:
+            try:
+                with routed_connection(ROUTE_CACHE, self._main_db_path) as conn:
+                    conn.execute(
+                        "INSERT OR REPLACE INTO lesson_cache (topic, level, language, lesson_json, created_at) "
+                        "VALUES (?, ?, ?, ?, ?)",
+                        (*key, json.dumps(entry.lesson, ensure_ascii=False), entry.created_at),
+                    )
+            except sqlite3.Error as e:
+                logger.warning(f"⚠️ Урок {key} не сохранён в кэш: {e}")
+        return entry
+
+    # -------------------------------------------------------------------------
+    # Чтение
+    # -------------------------------------------------------------------------
+
+    def peek(self, topic: str, level: str, language: str = DEFAULT_LESSON_LANGUAGE) -> Optional[CachedLesson]:
+        """Запись кэша без генерации и без учёта в статистике."""
+        self._ensure_loaded()
+        return self._entries.get((topic, level, language))
+
+    async def get(self, topic: str, level: str,
+                  language: str = DEFAULT_LESSON_LANGUAGE) -> Optional[Dict[str, Any]]:
+        """
+        Урок из кэша; устаревший - сразу, с обновлением в фоне.
+
+        При промахе урок генерируется (одна генерация на ключ) и, если это
+        урок от ИИ, сохраняется. None - генератор не дал урока.
+        """
+        self._ensure_loaded()
+        key = (topic, level, language)
+        entry = self._entries.get(key)
+        if entry is None:
+            entry = self._read_row(key)
+            if entry is not None:
+                self._entries[key] = entry
+        if entry is not None:
+            if entry.is_fresh(self.ttl, time.time()):
+                self._counters["hits"] += 1
+            else:
+                self._counters["stale_hits"] += 1
+                self.refresh(topic, level, language)
+            return dict(entry.lesson)
+
+        self._counters["misses"] += 1
+        lesson = await self._generate(key)
+        return dict(lesson) if lesson else lesson
+
+    def refresh(self, topic: str, level: str, language: str = DEFAULT_LESSON_LANGUAGE) -> None:
+        """Фоновое обновление урока (если оно ещё не идёт)."""
+        key = (topic, level, language)
+        if key in self._inflight:
+            return
+        task = asyncio.ensure_future(self._refresh(key))
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+
+    async def _refresh(self, key: LessonKey) -> None:
+        stored = self._read_row(key)
+        if stored is not None and stored.is_fresh(self.ttl, time.time()):
+            # Другой процесс уже обновил урок
+            self._entries[key] = stored
+            return
+        if await self._generate(key, refresh=True):
+            logger.info(f"♻️ Урок {key[0]}/{key[1]} обновлён в кэше")
+
+    async def _generate(self, key: LessonKey, refresh: bool = False) -> Optional[Dict[str, Any]]:
+        future = self._inflight.get(key)
+        if future is not None:
+            return await asyncio.shield(future)
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        lesson = None
+        try:
+            lesson = await self._generator(*key)
+        except Exception as e:
+            logger.warning(f"⚠️ Генерация урока {key[0]}/{key[1]} не удалась: {e}")
+        finally:
+            del self._inflight[key]
+            future.set_result(lesson)
+
+        if lesson is not None and is_cacheable_lesson(lesson):
+            self._store(key, lesson)
+            self._counters["refreshed" if refresh else "generated"] += 1
+        else:
+            self._counters["failed"] += 1
+        return lesson
+
+    # -------------------------------------------------------------------------
+    # Прогрев
+    # -------------------------------------------------------------------------
+
+    def expected_keys(self) -> Set[LessonKey]:
+        """Ключи, которые кэш должен покрывать (для warm() и coverage)."""
+        if self._expected is None:
+            self._expected = set(self._expected_source()) if self._expected_source else set()
+        return self._expected
+
+    def pending(self) -> list:
+        """Ожидаемые ключи без урока или с устаревшим уроком, недостающие - первыми."""
+        self._ensure_loaded()
+        now = time.time()
+        missing, stale = [], []
+        for key in sorted(self.expected_keys()):
+            entry = self._entries.get(key)
+            if entry is None:
+                missing.append(key)
+            elif not entry.is_fresh(self.ttl, now):
+                stale.append(key)
+        return missing + stale
+
+    async def warm(self, pace: float = LESSON_CACHE_WARM_PACE) -> int:
+        """Генерирует недостающие и устаревшие уроки по очереди; возвращает число готовых."""
+        ready = 0
+        for index, key in enumerate(self.pending()):
+            if index and pace > 0:
+                await asyncio.sleep(pace)
+            entry = self._read_row(key)
+            if entry is not None and entry.is_fresh(self.ttl, time.time()):
+                self._entries[key] = entry
+                ready += 1
+                continue
+            if is_cacheable_lesson(await self._generate(key, refresh=key in self._entries)):
+                ready += 1
+        if ready:
+            logger.info(f"📚 Прогрев кэша уроков: готово {ready}, покрытие {self.stats()['coverage']:.0%}")
+        return ready
+
+    def start_warm(self, pace: float = LESSON_CACHE_WARM_PACE) -> bool:
+        """Запускает warm() в фоне, если прогрев ещё не идёт и есть что прогревать."""
+        if self._warm_task is not None and not self._warm_task.done():
+            return False
+        if not self.pending():
+            return False
+        self._warm_task = asyncio.ensure_future(self.warm(pace))
+        return True
+
+    # -------------------------------------------------------------------------
+    # Статистика
+    # -------------------------------------------------------------------------
+
+    def stats(self) -> Dict[str, Any]:
+        self._ensure_loaded()
+        now = time.time()
+        served = self._counters["hits"] + self._counters["stale_hits"]
+        requests = served + self._counters["misses"]
+        expected = self.expected_keys()
+        covered = sum(1 for key in expected if key in self._entries)
+        return {
+            "entries": len(self._entries),
+            "fresh": sum(1 for entry in self._entries.values() if entry.is_fresh(self.ttl, now)),
+            "expected": len(expected),
+            "covered": covered,
+            "coverage": covered / len(expected) if expected else 1.0,
+            "hit_rate": served / requests if requests else 0.0,
+            "warming": self._warm_task is not None and not self._warm_task.done(),
+            **self._counters,
+        }
+
+
+__all__ = [
+    "LessonCache",
+    "LessonKey",
+    "CachedLesson",
+    "is_cacheable_lesson",
+    "LESSON_CACHE_MIGRATIONS",
+    "LESSON_CACHE_TTL",
+    "LESSON_CACHE_WARM_PACE",
+    "LESSON_CACHE_WARM_INTERVAL",
+    "LESSON_CACHE_WARM_FIRST",
+    "DEFAULT_LESSON_LANGUAGE",
+]
@@ -318,13 +318,6 @@ def truncate_message(message: str, max_length: int = 4096) -> str:
         return message
     return message[:max_length-3] + "..."
 
-def split_message(message: str, chunk_size: int = 3000) -> list:
-    """Разбить большое сообщение на части"""
-    if len(message) <= chunk_size:
-        return [message]
-    
-    chunks = []
-    current_chunk = ""
 # ============================================================================
 # EXTENDED HELP MESSAGE (v0.25.0)
 # ============================================================================
@@ -370,6 +363,10 @@ def split_message(message: str, chunk_size: int = 4090) -> list:
         message: Исходное сообщение
         chunk_size: Размер каждого куска (по умолчанию 4090)
         
+    Режет по строкам; строка длиннее chunk_size режется по последнему
+    пробелу (или жёстко, если пробелов нет), так что ни один кусок не
+    превышает chunk_size.
+    
     Returns:
         Список кусков сообщения
     """
@@ -377,6 +374,15 @@ def split_message(message: str, chunk_size: int = 4090) -> list:
     current_chunk = ""
     
     for line in message.split("\n"):
+        while len(line) > chunk_size:
+            if current_chunk:
+                chunks.append(current_chunk)
+                current_chunk = ""
+            cut = line.rfind(" ", 0, chunk_size + 1)
+            if cut <= 0:
+                cut = chunk_size
+            chunks.append(line[:cut])
+            line = line[cut:].lstrip(" ")
         if len(current_chunk) + len(line) + 1 > chunk_size:
             if current_chunk:
                 chunks.append(current_chunk)
@@ -0,0 +1,368 @@
+"""
+Outbound Queue v1.0
+Единая очередь исходящих сообщений бота.
+
+Хендлеры вызывали reply_text/edit_message_text напрямую и ждали Bot API,
+длинные ответы уходили циклом по кускам, а send_message_safe дайджеста при
+ошибке отправлял заново всю последовательность кусков. Теперь:
+
+- send()/edit()/send_chunks() только ставят сообщение в очередь и сразу
+  возвращают asyncio.Future (хендлер может не ждать результат);
+- у каждого чата своя FIFO-очередь: сообщения чата уходят по порядку,
+  разные чаты - параллельно;
+- темп: общий token bucket процесса (тот же, что у рассылок,
+  broadcast_engine.get_send_bucket) и GCRA-лимит на чат - личный чат
+  OUTBOUND_PRIVATE_BURST сообщений подряд, затем OUTBOUND_PRIVATE_RATE/с; группы и каналы
+  OUTBOUND_GROUP_PER_MINUTE в минуту;
+- несколько подряд стоящих в очереди правок одного сообщения
+  объединяются в одну (отправляется последний текст, все Future получают
+  её результат);
+- повторяется только упавший кусок (TimedOut/NetworkError - с
+  экспоненциальной задержкой, RetryAfter - пауза всего bucket'а на время,
+  указанное Telegram); если кусок не удалось отправить, остальные куски
+  того же текста не отправляются;
+- переполнение (OUTBOUND_MAX_PENDING всего, OUTBOUND_CHAT_MAX_PENDING
+  на чат) отбрасывает новое сообщение (OutboundDropped);
+- метрики: очередь, отправлено, объединено, повторы, отброшено,
+  задержка от постановки до отправки (p50/p95/max).
+"""
+
+import asyncio
+import logging
+import os
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Union
+
+from telegram.error import BadRequest, Forbidden, NetworkError, RetryAfter, TimedOut
+
+from broadcast_engine import TokenBucket, get_send_bucket, retry_after_seconds
+from messages import split_message
+from rate_limit_engine import RateLimitPolicy
+
+logger = logging.getLogger(__name__)
+
+OUTBOUND_MAX_PENDING = int(os.getenv("OUTBOUND_MAX_PENDING", "10000"))
+OUTBOUND_CHAT_MAX_PENDING = int(os.getenv("OUTBOUND_CHAT_MAX_PENDING", "100"))
+OUTBOUND_MAX_RETRIES = int(os.getenv("OUTBOUND_MAX_RETRIES", "3"))
+OUTBOUND_PRIVATE_BURST = int(os.getenv("OUTBOUND_PRIVATE_BURST", "3"))
+OUTBOUND_PRIVATE_RATE = float(os.getenv("OUTBOUND_PRIVATE_RATE", "1"))  # сообщений/с после burst
+OUTBOUND_GROUP_PER_MINUTE = int(os.getenv("OUTBOUND_GROUP_PER_MINUTE", "20"))
+OUTBOUND_CHUNK_SIZE = int(os.getenv("OUTBOUND_CHUNK_SIZE", "4090"))
+
+# Сколько последних задержек хранить для перцентилей
+LATENCY_SAMPLES = 2048
+
+SEND = "send"
+EDIT = "edit"
+
+# Числовой id чата или @username канала
+ChatId = Union[int, str]
+
+
+class OutboundDropped(Exception):
+    """Сообщение не поставлено в очередь (переполнение) или отменено."""
+
+
+class _ChunkGroup:
+    """Куски одного длинного текста: после неудачи остальные не отправляются."""
+
+    __slots__ = ("error",)
+
+    def __init__(self):
+        self.error: Optional[BaseException] = None
+
+
+class OutboundItem:
+    """Одно исходящее действие (отправка или правка)."""
+
+    __slots__ = ("kind", "bot", "chat_id", "message_id", "text", "kwargs", "futures",
+                 "enqueued_at", "max_retries", "group")
+
+    def __init__(self, kind: str, bot: Any, chat_id: ChatId, text: str, kwargs: Dict[str, Any],
+                 message_id: Optional[int] = None, max_retries: int = OUTBOUND_MAX_RETRIES,
+                 group: Optional[_ChunkGroup] = None):
+        self.kind = kind
+        self.bot = bot
+        self.chat_id = chat_id
+        self.message_id = message_id
+        self.text = text
+        self.kwargs = kwargs
+        self.futures: List[asyncio.Future] = [asyncio.get_running_loop().create_future()]
+        self.enqueued_at = time.monotonic()
+        self.max_retries = max_retries
+        self.group = group
+
+
+class _ChatLane:
+    __slots__ = ("items", "task")
+
+    def __init__(self):
+        self.items: Deque[OutboundItem] = deque()
+        self.task: Optional[asyncio.Task] = None
+
+
+def _resolve(item: OutboundItem, result: Any = None, error: Optional[BaseException] = None) -> None:
+    for future in item.futures:
+        if future.done():
+            continue
+        if error is not None:
+            future.set_exception(error)
+            # Хендлер мог не ждать результат - без "exception was never retrieved"
+            future.exception()
+        else:
+            future.set_result(result)
+
+
+class OutboundQueue:
+    """Очередь исходящих сообщений с темпом на чат и на процесс."""
+
+    def __init__(self, bucket: Optional[TokenBucket] = None,
+                 max_pending: int = OUTBOUND_MAX_PENDING,
+                 chat_max_pending: int = OUTBOUND_CHAT_MAX_PENDING,
+                 max_retries: int = OUTBOUND_MAX_RETRIES,
+                 private_burst: int = OUTBOUND_PRIVATE_BURST,
+                 private_rate: float = OUTBOUND_PRIVATE_RATE,
+                 group_per_minute: int = OUTBOUND_GROUP_PER_MINUTE,
+                 retry_delay: float = 1.0):
+        self._bucket = bucket
+        self.max_pending = max_pending
+        self.chat_max_pending = chat_max_pending
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        # Не регистрируются в rate_limits: темп считается локально в процессе,
+        # чат целиком обслуживается одним процессом
+        self.private_policy = RateLimitPolicy("outbound_private", private_burst, private_burst / private_rate)
+        self.group_policy = RateLimitPolicy("outbound_group", group_per_minute, 60)
+        self._lanes: Dict[ChatId, _ChatLane] = {}
+
+        self.pending = 0
+        self.max_depth = 0
+        self.sent = 0
+        self.edited = 0
+        self.coalesced = 0
+        self.retries = 0
+        self.retry_after_pauses = 0
+        self.dropped = 0
+        self.failed = 0
+        self._latencies: Deque[float] = deque(maxlen=LATENCY_SAMPLES)
+        self.max_latency = 0.0
+
+    @property
+    def bucket(self) -> TokenBucket:
+        if self._bucket is None:
+            self._bucket = get_send_bucket()
+        return self._bucket
+
+    # ------------------------------------------------------------ постановка
+
+    def send(self, bot: Any, chat_id: ChatId, text: str, max_retries: Optional[int] = None,
+             **kwargs) -> asyncio.Future:
+        """Ставит send_message в очередь чата. Future -> Message."""
+        item = OutboundItem(SEND, bot, chat_id, text, kwargs,
+                            max_retries=self.max_retries if max_retries is None else max_retries)
+        return self._enqueue(item)
+
+    def edit(self, bot: Any, chat_id: ChatId, message_id: int, text: str,
+             max_retries: Optional[int] = None, **kwargs) -> asyncio.Future:
+        """
+        Ставит edit_message_text в очередь чата. Если последнее ждущее
+        действие чата - правка того же сообщения, правки объединяются.
+        """
+        lane = self._lanes.get(chat_id)
+        if lane is not None and lane.items:
+            last = lane.items[-1]
+            if last.kind == EDIT and last.message_id == message_id:
+                last.text = text
+                last.kwargs = kwargs
+                future = asyncio.get_running_loop().create_future()
+                last.futures.append(future)
+                self.coalesced += 1
+                return future
+        item = OutboundItem(EDIT, bot, chat_id, text, kwargs, message_id=message_id,
+                            max_retries=self.max_retries if max_retries is None else max_retries)
+        return self._enqueue(item)
+
+    def send_chunks(self, bot: Any, chat_id: ChatId, text: str, chunk_size: int = OUTBOUND_CHUNK_SIZE,
+                    reply_markup: Any = None, max_retries: Optional[int] = None,
+                    **kwargs) -> List[asyncio.Future]:
+        """
+        Длинный текст кусками по chunk_size (messages.split_message).
+        Клавиатура прикрепляется к первому куску.
+        """
+        group = _ChunkGroup()
+        futures = []
+        for index, chunk in enumerate(split_message(text, chunk_size=chunk_size)):
+            chunk_kwargs = dict(kwargs)
+            if index == 0 and reply_markup is not None:
+                chunk_kwargs["reply_markup"] = reply_markup
+            item = OutboundItem(SEND, bot, chat_id, chunk, chunk_kwargs, group=group,
+                                max_retries=self.max_retries if max_retries is None else max_retries)
+            futures.append(self._enqueue(item))
+        return futures
+
+    def _enqueue(self, item: OutboundItem) -> asyncio.Future:
+        lane = self._lanes.get(item.chat_id)
+        if self.pending >= self.max_pending or (lane is not None and len(lane.items) >= self.chat_max_pending):
+            self.dropped += 1
+            logger.warning(f"📤 Очередь исходящих переполнена ({self.pending}), сообщение в {item.chat_id} отброшено")
+            _resolve(item, error=OutboundDropped(f"Outbound queue full for chat {item.chat_id}"))
+            return item.futures[0]
+        if lane is None:
+            lane = self._lanes[item.chat_id] = _ChatLane()
+        lane.items.append(item)
+        self.pending += 1
+        self.max_depth = max(self.max_depth, self.pending)
+        if lane.task is None:
+            lane.task = asyncio.ensure_future(self._run_lane(item.chat_id, lane))
+        return item.futures[0]
+
+    # ------------------------------------------------------------ отправка
+
+    async def _run_lane(self, chat_id: ChatId, lane: _ChatLane) -> None:
+        item = None
+        try:
+            while lane.items:
+                # Выполняющееся действие уже не в очереди - с ним правки не объединяются
+                item = lane.items.popleft()
+                try:
+                    await self._deliver(item)
+                finally:
+                    self.pending -= 1
+                item = None
+        except asyncio.CancelledError:
+            for waiting in ([item] if item is not None else []) + list(lane.items):
+                _resolve(waiting, error=OutboundDropped("Outbound queue stopped"))
+            self.pending -= len(lane.items)
+            lane.items.clear()
+            raise
+        finally:
+            lane.task = None
+            if self._lanes.get(chat_id) is lane and not lane.items:
+                del self._lanes[chat_id]
+
+    async def _pace_chat(self, chat_id: Any) -> None:
+        # Отрицательный id или @username - группа/канал
+        is_group = not isinstance(chat_id, int) or chat_id < 0
+        policy = self.group_policy if is_group else self.private_policy
+        while True:
+            wait = policy.try_acquire(chat_id)
+            if not wait:
+                return
+            await asyncio.sleep(wait)
+
+    async def _call(self, item: OutboundItem) -> Any:
+        if item.kind == EDIT:
+            return await item.bot.edit_message_text(
+                text=item.text, chat_id=item.chat_id, message_id=item.message_id, **item.kwargs)
+        return await item.bot.send_message(chat_id=item.chat_id, text=item.text, **item.kwargs)
+
+    async def _deliver(self, item: OutboundItem) -> None:
+        if item.group is not None and item.group.error is not None:
+            # Предыдущий кусок не отправлен - продолжение без него бессмысленно
+            _resolve(item, error=OutboundDropped(f"Previous chunk failed: {item.group.error}"))
+            return
+        attempt = 0
+        while True:
+            await self._pace_chat(item.chat_id)
+            await self.bucket.acquire()
+            try:
+                result = await self._call(item)
+                break
+            except RetryAfter as e:
+                wait = retry_after_seconds(e)
+                self.retry_after_pauses += 1
+                logger.warning(f"⏳ Flood control: исходящие приостановлены на {wait:.0f}s")
+                self.bucket.pause(wait)
+                error: BaseException = e
+            except BadRequest as e:
+                if item.kind == EDIT and "not modified" in str(e).lower():
+                    result = True
+                    break
+                self._fail(item, e)
+                return
+            except Forbidden as e:
+                self._fail(item, e)
+                return
+            except (TimedOut, NetworkError) as e:
+                error = e
+                if attempt < item.max_retries:
+                    await asyncio.sleep(min(self.retry_delay * 2 ** attempt, 10))
+            except Exception as e:
+                self._fail(item, e)
+                return
+            attempt += 1
+            if attempt > item.max_retries:
+                self._fail(item, error)
+                return
+            self.retries += 1
+
+        latency = time.monotonic() - item.enqueued_at
+        self._latencies.append(latency)
+        self.max_latency = max(self.max_latency, latency)
+        if item.kind == EDIT:
+            self.edited += 1
+        else:
+            self.sent += 1
+        _resolve(item, result)
+
+    def _fail(self, item: OutboundItem, error: BaseException) -> None:
+        self.failed += 1
+        if item.group is not None:
+            item.group.error = error
+        logger.warning(f"📤 Не удалось {'изменить' if item.kind == EDIT else 'отправить'} "
+                       f"сообщение в {item.chat_id}: {type(error).__name__}: {error}")
+        _resolve(item, error=error)
+
+    async def drain(self, timeout: Optional[float] = None) -> bool:
+        """Ждёт отправки всего, что стоит в очереди. False - не успели за timeout."""
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        while self._lanes:
+            tasks = [lane.task for lane in self._lanes.values() if lane.task is not None]
+            if not tasks:
+                break
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if remaining is not None and remaining <= 0:
+                return False
+            await asyncio.wait(tasks, timeout=remaining)
+        return True
+
+    # ------------------------------------------------------------ метрики
+
+    def latency_percentile(self, percentile: float) -> float:
+        if not self._latencies:
+            return 0.0
+        ordered = sorted(self._latencies)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * percentile))]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "pending": self.pending,
+            "chats": len(self._lanes),
+            "max_depth": self.max_depth,
+            "sent": self.sent,
+            "edited": self.edited,
+            "coalesced": self.coalesced,
+            "retries": self.retries,
+            "retry_after_pauses": self.retry_after_pauses,
+            "dropped": self.dropped,
+            "failed": self.failed,
+            "latency_p50_ms": round(self.latency_percentile(0.5) * 1000, 1),
+            "latency_p95_ms": round(self.latency_percentile(0.95) * 1000, 1),
+            "latency_max_ms": round(self.max_latency * 1000, 1),
+        }
+
+
+# Общая очередь процесса
+outbound = OutboundQueue()
+
+
+__all__ = [
+    "OutboundQueue",
+    "OutboundItem",
+    "OutboundDropped",
+    "ChatId",
+    "outbound",
+    "OUTBOUND_MAX_PENDING",
+    "OUTBOUND_CHUNK_SIZE",
+]
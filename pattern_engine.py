@@ -0,0 +1,162 @@
+"""
+Pattern Engine v1.0
+Общий набор регулярных выражений детекторов, скомпилированный один раз.
+
+propaganda_detector.analyze_propaganda на каждый текст вызывал re.findall
+отдельно для каждого из ~120 ключевых слов и фраз (каждый раз через кэш
+re._compile) и re.search для каждого крипто-флага,
+ai_dialogue.detect_scam_red_flags заново собирал словари паттернов на
+каждый вызов, а add_scam_warning_if_needed прогонял его по одному и тому
+же сообщению в каждой ветке ответа ИИ. Теперь:
+
+- детекторы регистрируют именованные паттерны один раз при импорте
+  (pattern_engine.register), движок компилирует их заранее;
+- паттерны без метасимволов (большинство ключевых слов и фраз) ищутся
+  как строки: str.count/str.find работают на C и дают ровно то же, что
+  re.findall/re.search для такого паттерна (непересекающиеся вхождения);
+- scan(text) возвращает PatternHits - один результат на текст (LRU по
+  тексту), его читают все детекторы, работающие с тем же текстом;
+  каждый паттерн проверяется по тексту не больше одного раза, результат
+  запоминается; all() отдаёт все совпадения набора сразу.
+
+По времени CPU на один новый текст это на уровне прежних циклов re
+(модуль re сам кэширует скомпилированные паттерны, а поиск строки
+в тексте стоит столько же): выигрыш - в том, что повторные проверки
+того же текста (add_scam_warning_if_needed в каждой ветке ответа ИИ)
+читают готовый результат.
+
+Почему не одна объединённая альтернатива `(?P<_0>p0)|(?P<_1>p1)|...`:
+модуль re пробует ветки по очереди в каждой позиции и теряет быстрый
+поиск по литеральному префиксу - на постах в 2000 символов такой проход
+в 3-70 раз медленнее отдельных скомпилированных паттернов (RE2 с
+set-матчером в зависимостях нет).
+"""
+
+import logging
+import os
+import re
+from functools import lru_cache
+from typing import Any, Dict, List, Mapping, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+PATTERN_SCAN_CACHE_SIZE = int(os.getenv("PATTERN_SCAN_CACHE_SIZE", "128"))
+
+# Символы, при которых паттерн нельзя искать как обычную строку
+_REGEX_META = frozenset(r".^$*+?{}[]\|()")
+
+
+class PatternHits:
+    """Совпадения зарегистрированных паттернов в одном тексте; считаются лениво."""
+
+    __slots__ = ("text", "_engine", "_findall", "_search")
+
+    def __init__(self, engine: "PatternEngine", text: str):
+        self.text = text
+        self._engine = engine
+        self._findall: Dict[str, List[Any]] = {}
+        self._search: Dict[str, bool] = {}
+
+    def search(self, name: str) -> bool:
+        """То же, что re.search(pattern, text) is not None."""
+        found = self._search.get(name)
+        if found is None:
+            matches = self._findall.get(name)
+            if matches is not None:
+                found = bool(matches)
+            else:
+                literal, compiled = self._engine._compiled[name]
+                found = literal in self.text if literal is not None else compiled.search(self.text) is not None
+            self._search[name] = found
+        return found
+
+    def findall(self, name: str) -> List[Any]:
+        """То же, что re.findall(pattern, text)."""
+        matches = self._findall.get(name)
+        if matches is None:
+            if self._search.get(name) is False:
+                matches = []
+            else:
+                literal, compiled = self._engine._compiled[name]
+                matches = [literal] * self.text.count(literal) if literal is not None else compiled.findall(self.text)
+            self._findall[name] = matches
+        return list(matches)
+
+    def findall_each(self, names: Sequence[str]) -> List[List[Any]]:
+        """findall для списка паттернов одним вызовом (для циклов детекторов)."""
+        text = self.text
+        compiled = self._engine._compiled
+        memo = self._findall
+        result = []
+        for name in names:
+            matches = memo.get(name)
+            if matches is None:
+                literal, pattern = compiled[name]
+                matches = [literal] * text.count(literal) if literal is not None else pattern.findall(text)
+                memo[name] = matches
+            result.append(list(matches))
+        return result
+
+    def count(self, name: str) -> int:
+        return len(self.findall(name))
+
+    def all(self, prefix: str = "") -> Dict[str, List[Any]]:
+        """Все найденные паттерны (с prefix в имени): {имя: findall}."""
+        result = {}
+        for name in self._engine._compiled:
+            if name.startswith(prefix) and self.search(name):
+                result[name] = self.findall(name)
+        return result
+
+
+class PatternEngine:
+    """Скомпилированный набор именованных паттернов и кэш результатов по текстам."""
+
+    def __init__(self, patterns: Optional[Mapping[str, str]] = None,
+                 cache_size: int = PATTERN_SCAN_CACHE_SIZE):
+        # имя -> (строка для паттернов без метасимволов, скомпилированный паттерн)
+        self._compiled: Dict[str, Tuple[Optional[str], "re.Pattern[str]"]] = {}
+        self._scan = lru_cache(maxsize=cache_size)(self._new_hits)
+        if patterns:
+            self.register(patterns)
+
+    def register(self, patterns: Mapping[str, str]) -> None:
+        """Добавляет (или заменяет) именованные паттерны."""
+        for name, pattern in patterns.items():
+            compiled = re.compile(pattern)
+            if compiled.fullmatch(""):
+                raise ValueError(f"Pattern {name!r} matches an empty string")
+            literal = None if _REGEX_META.intersection(pattern) else pattern
+            self._compiled[name] = (literal, compiled)
+        self._scan.cache_clear()
+
+    def _new_hits(self, text: str) -> PatternHits:
+        return PatternHits(self, text)
+
+    def scan(self, text: str) -> PatternHits:
+        """Результат по тексту (текст передаётся уже приведённым к нужному регистру)."""
+        return self._scan(text)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._compiled
+
+    def stats(self) -> Dict[str, Any]:
+        info = self._scan.cache_info()
+        return {
+            "patterns": len(self._compiled),
+            "literal_patterns": sum(1 for literal, _ in self._compiled.values() if literal is not None),
+            "scans": info.misses,
+            "cache_hits": info.hits,
+        }
+
+
+# Общий набор процесса: детекторы разных модулей делят результаты по одному тексту
+pattern_engine = PatternEngine()
+
+
+__all__ = [
+    "PatternEngine",
+    "PatternHits",
+    "pattern_engine",
+    "PATTERN_SCAN_CACHE_SIZE",
+]
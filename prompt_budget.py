@@ -0,0 +1,261 @@
+"""
+Prompt Budget v1.0
+Сборка промпта ИИ в бюджете токенов режима.
+
+get_ai_response_sync добавлял к системному промпту (несколько КБ на режим)
+последние 10 сообщений истории по 300 символов как есть - и приветствие
+десятиходовой давности, и ответ не по теме. Системный промпт заново
+собирался на каждый вызов, а сколько токенов ушло провайдеру, нигде не
+считалось. Теперь:
+
+- у каждого режима get_ai_params свой бюджет токенов промпта
+  (PROMPT_BUDGET_<РЕЖИМ>): системный промпт + история + сообщение;
+- реплики истории оцениваются по свежести (PROMPT_RECENCY_DECAY за ход)
+  и лексической близости к новому сообщению (общие основы слов, как в
+  knowledge_base); последний обмен репликами берётся первым, остальные -
+  по убыванию оценки: целиком, сжатыми до первой фразы или никак, если
+  не помещаются в остаток бюджета; порядок реплик в промпте сохраняется;
+- системные промпты кэшируются по (режим, язык) вместе с оценкой токенов;
+- record() запоминает токены каждого вызова провайдера: оценку и, если
+  провайдер вернул usage, фактическое число; stats() - для /admin_metrics.
+
+Почему оценка, а не tiktoken: токенизатора нет в зависимостях бота, а у
+Groq/Mistral/Gemini/Ollama токенизаторы разные. Оценка (4 символа ASCII
+или 2.5 символа кириллицы на токен) нужна только для бюджета, а точное
+число приходит в usage ответа и сравнивается с оценкой в stats().
+"""
+
+import logging
+import os
+import threading
+from collections import defaultdict
+from dataclasses import dataclass
+from typing import Callable, Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+from knowledge_base import clip_text, tokenize
+
+logger = logging.getLogger(__name__)
+
+# Бюджет токенов всего промпта (системный + история + сообщение) по режимам get_ai_params
+PROMPT_TOKEN_BUDGETS = {
+    "calendar": int(os.getenv("PROMPT_BUDGET_CALENDAR", "6000")),
+    "geopolitical": int(os.getenv("PROMPT_BUDGET_GEOPOLITICAL", "2600")),
+    "crypto_news": int(os.getenv("PROMPT_BUDGET_CRYPTO_NEWS", "2500")),
+    "dialogue": int(os.getenv("PROMPT_BUDGET_DIALOGUE", "3000")),
+}
+# Сколько последних сообщений истории рассматривается (как раньше в build_context_for_prompt)
+PROMPT_MAX_TURNS = int(os.getenv("PROMPT_MAX_TURNS", "10"))
+# Вес свежести реплики: множитель за каждый ход назад
+PROMPT_RECENCY_DECAY = float(os.getenv("PROMPT_RECENCY_DECAY", "0.8"))
+# Вес лексической близости реплики к новому сообщению
+PROMPT_RELEVANCE_WEIGHT = float(os.getenv("PROMPT_RELEVANCE_WEIGHT", "1.0"))
+# Реплика с оценкой ниже порога попадает в промпт только сжатой
+PROMPT_FULL_MIN_SCORE = float(os.getenv("PROMPT_FULL_MIN_SCORE", "0.25"))
+# Последние реплики (обмен вопрос-ответ), которые берутся в первую очередь
+PROMPT_PINNED_TURNS = 2
+
+TURN_MAX_CHARS = 300
+COMPRESSED_TURN_CHARS = 120
+HISTORY_HEADER = "ИСТОРИЯ:\n"
+USER_LABEL = "Пользователь"
+ASSISTANT_LABEL = "Помощник"
+
+
+def estimate_tokens(text: str) -> int:
+    """Оценка числа токенов: ~4 символа ASCII или ~2.5 символа не-ASCII на токен."""
+    if not text:
+        return 0
+    # Каждый не-ASCII символ кириллицы добавляет к длине UTF-8 лишний байт
+    non_ascii = min(len(text.encode("utf-8")) - len(text), len(text))
+    return int((len(text) - non_ascii) / 4 + non_ascii / 2.5) + 1
+
+
+class PromptPrefix(NamedTuple):
+    """Системный промпт режима с оценкой токенов."""
+    text: str
+    tokens: int
+
+
+@dataclass
+class AssembledPrompt:
+    """Промпт вызова: системная часть, выбранная история и сообщение пользователя."""
+    mode: str
+    system_prompt: str
+    context_str: str
+    user_content: str
+    tokens: int
+    budget: int
+    kept: int = 0
+    compressed: int = 0
+    dropped: int = 0
+
+    @property
+    def full_prompt(self) -> str:
+        """Один текст для провайдеров без system-роли (Gemini)."""
+        return f"{self.system_prompt}\n\n{self.user_content}"
+
+
+def _history_turns(context_history: Sequence) -> List[Tuple[str, str]]:
+    """(метка, текст) последних PROMPT_MAX_TURNS сообщений - как build_context_for_prompt."""
+    turns = []
+    for message in list(context_history)[-PROMPT_MAX_TURNS:]:
+        if not isinstance(message, dict):
+            continue
+        content = message.get("content", "")
+        if not isinstance(content, str):
+            content = str(content) if content else ""
+        label = USER_LABEL if message.get("role", "user") == "user" else ASSISTANT_LABEL
+        turns.append((label, content[:TURN_MAX_CHARS]))
+    return turns
+
+
+def score_turns(turns: Sequence[Tuple[str, str]], message: str) -> List[float]:
+    """Оценка реплик: свежесть + доля основ слов сообщения, встречающихся в реплике."""
+    query = set(tokenize(message))
+    newest = len(turns) - 1
+    scores = []
+    for position, (_, content) in enumerate(turns):
+        score = PROMPT_RECENCY_DECAY ** (newest - position)
+        if query:
+            overlap = len(query.intersection(tokenize(content)))
+            score += PROMPT_RELEVANCE_WEIGHT * overlap / len(query)
+        scores.append(score)
+    return scores
+
+
+class PromptBudget:
+    """Бюджеты режимов, кэш системных промптов и учёт отправленных токенов."""
+
+    def __init__(self, budgets: Optional[Dict[str, int]] = None):
+        self.budgets = dict(PROMPT_TOKEN_BUDGETS if budgets is None else budgets)
+        self._prefixes: Dict[Tuple[str, str], PromptPrefix] = {}
+        self._lock = threading.Lock()
+        self._assembled = 0
+        self._over_budget = 0
+        self._turns = {"kept": 0, "compressed": 0, "dropped": 0}
+        self._calls: Dict[str, Dict[str, int]] = defaultdict(
+            lambda: {"calls": 0, "estimated": 0, "reported_calls": 0, "reported": 0, "reported_estimated": 0}
+        )
+
+    def budget_for(self, mode: str) -> int:
+        return self.budgets.get(mode, self.budgets.get("dialogue", 0))
+
+    def prefix(self, mode: str, language: str, builder: Callable[[], str]) -> PromptPrefix:
+        """Системный промпт (режим, язык): собирается и оценивается один раз."""
+        key = (mode, language)
+        cached = self._prefixes.get(key)
+        if cached is None:
+            text = builder()
+            cached = self._prefixes.setdefault(key, PromptPrefix(text, estimate_tokens(text)))
+        return cached
+
+    def assemble(
+        self,
+        mode: str,
+        system_prompt: str,
+        context_history: Sequence,
+        message: str,
+        system_tokens: Optional[int] = None,
+    ) -> AssembledPrompt:
+        """Выбирает историю в остаток бюджета после системного промпта и сообщения."""
+        budget = self.budget_for(mode)
+        if system_tokens is None:
+            system_tokens = estimate_tokens(system_prompt)
+        question = f"{USER_LABEL}: {message}"
+        used = system_tokens + estimate_tokens(question) + 1
+        turns = _history_turns(context_history or ())
+        lines: List[Optional[str]] = [None] * len(turns)
+        compressed = 0
+
+        if turns:
+            remaining = budget - used - estimate_tokens(HISTORY_HEADER)
+            scores = score_turns(turns, message)
+            pinned = len(turns) - PROMPT_PINNED_TURNS
+            order = sorted(range(len(turns)), key=lambda i: (i < pinned, -scores[i], -i))
+            for position in order:
+                label, content = turns[position]
+                line = f"{label}: {content}"
+                cost = estimate_tokens(line) + 1
+                if scores[position] < PROMPT_FULL_MIN_SCORE or cost > remaining:
+                    short = clip_text(" ".join(content.split()), COMPRESSED_TURN_CHARS)
+                    line = f"{label}: {short}"
+                    cost = estimate_tokens(line) + 1
+                    if cost > remaining:
+                        continue
+                    compressed += line != f"{label}: {content}"
+                lines[position] = line
+                remaining -= cost
+
+        selected = [line for line in lines if line is not None]
+        context_str = HISTORY_HEADER + "\n".join(selected) + "\n\n" if selected else ""
+        tokens = used + (estimate_tokens(context_str) if context_str else 0)
+        prompt = AssembledPrompt(
+            mode=mode,
+            system_prompt=system_prompt,
+            context_str=context_str,
+            user_content=context_str + question,
+            tokens=tokens,
+            budget=budget,
+            kept=len(selected),
+            compressed=compressed,
+            dropped=len(turns) - len(selected),
+        )
+        with self._lock:
+            self._assembled += 1
+            self._over_budget += tokens > budget
+            self._turns["kept"] += prompt.kept
+            self._turns["compressed"] += prompt.compressed
+            self._turns["dropped"] += prompt.dropped
+        return prompt
+
+    def record(self, provider: str, mode: str, estimated: int, reported: Optional[int] = None):
+        """Токены промпта одного вызова провайдера (reported - из usage ответа)."""
+        with self._lock:
+            calls = self._calls[mode]
+            calls["calls"] += 1
+            calls["estimated"] += estimated
+            if isinstance(reported, int) and reported > 0:
+                calls["reported_calls"] += 1
+                calls["reported"] += reported
+                calls["reported_estimated"] += estimated
+        logger.debug(f"🧮 Prompt tokens {provider}/{mode}: ~{estimated}, usage {reported}")
+
+    def stats(self) -> Dict:
+        with self._lock:
+            modes = {}
+            for mode, calls in sorted(self._calls.items()):
+                # Для вызовов с usage берётся фактическое число, для остальных - оценка
+                sent = calls["reported"] + calls["estimated"] - calls["reported_estimated"]
+                modes[mode] = {
+                    "calls": calls["calls"],
+                    "budget": self.budget_for(mode),
+                    "avg_prompt_tokens": round(sent / calls["calls"]) if calls["calls"] else 0,
+                    "estimate_ratio": (round(calls["reported_estimated"] / calls["reported"], 3)
+                                       if calls["reported"] else None),
+                }
+            return {
+                "assembled": self._assembled,
+                "over_budget": self._over_budget,
+                "cached_prefixes": len(self._prefixes),
+                "calls": sum(calls["calls"] for calls in self._calls.values()),
+                "prompt_tokens": sum(calls["reported"] + calls["estimated"] - calls["reported_estimated"]
+                                     for calls in self._calls.values()),
+                "turns_kept": self._turns["kept"],
+                "turns_compressed": self._turns["compressed"],
+                "turns_dropped": self._turns["dropped"],
+                "modes": modes,
+            }
+
+
+prompt_budget = PromptBudget()
+
+
+__all__ = [
+    "PROMPT_TOKEN_BUDGETS",
+    "AssembledPrompt",
+    "PromptBudget",
+    "PromptPrefix",
+    "estimate_tokens",
+    "prompt_budget",
+    "score_turns",
+]
@@ -3,11 +3,12 @@ Propaganda and Manipulation Detector for RVX Bot
 Обнаруживает и анализирует пропаганду, манипуляции, фейк-новости
 """
 
-import re
 from typing import Optional, Dict, List, Tuple
 from enum import Enum
 import logging
 
+from pattern_engine import pattern_engine
+
 logger = logging.getLogger("RVX_PROPAGANDA")
 
 class ManipulationType(Enum):
@@ -193,6 +194,30 @@ CRYPTO_RED_FLAGS = {
     ]
 }
 
+# Имена паттернов в pattern_engine: все проверки analyze_propaganda - один проход по тексту
+PROPAGANDA_PATTERN_NAMES = {
+    manip_type: {
+        kind: [f"propaganda.{manip_type.name}.{kind}.{index}" for index in range(len(patterns[kind]))]
+        for kind in ("keywords", "phrases")
+    }
+    for manip_type, patterns in PROPAGANDA_PATTERNS.items()
+}
+CRYPTO_RED_FLAG_NAMES = {
+    flag_category: [(f"propaganda.red_flag.{flag_category}.{index}", pattern)
+                    for index, pattern in enumerate(patterns)]
+    for flag_category, patterns in CRYPTO_RED_FLAGS.items()
+}
+
+pattern_engine.register({
+    **{
+        name: pattern
+        for manip_type, patterns in PROPAGANDA_PATTERNS.items()
+        for kind in ("keywords", "phrases")
+        for name, pattern in zip(PROPAGANDA_PATTERN_NAMES[manip_type][kind], patterns[kind])
+    },
+    **{name: pattern for flags in CRYPTO_RED_FLAG_NAMES.values() for name, pattern in flags},
+})
+
 # ============================================================================
 # АНАЛИЗАТОР
 # ============================================================================
@@ -212,7 +237,7 @@ def analyze_propaganda(text: str) -> Optional[Dict]:
     if not text or len(text) < 20:
         return None
     
-    text_lower = text.lower()
+    hits = pattern_engine.scan(text.lower())
     manipulations_found = []
     crypto_flags = []
     total_score = 0.0
@@ -222,17 +247,16 @@ def analyze_propaganda(text: str) -> Optional[Dict]:
         score = 0.0
         found_keywords = []
         found_phrases = []
+        names = PROPAGANDA_PATTERN_NAMES[manip_type]
         
         # Проверка ключевых слов
-        for keyword_pattern in patterns["keywords"]:
-            matches = re.findall(keyword_pattern, text_lower)
+        for matches in hits.findall_each(names["keywords"]):
             if matches:
                 found_keywords.extend(matches)
                 score += len(matches) * 0.1
         
         # Проверка фраз
-        for phrase_pattern in patterns["phrases"]:
-            matches = re.findall(phrase_pattern, text_lower)
+        for matches in hits.findall_each(names["phrases"]):
             if matches:
                 found_phrases.extend(matches)
                 score += len(matches) * 0.2
@@ -249,9 +273,9 @@ def analyze_propaganda(text: str) -> Optional[Dict]:
             total_score += score
     
     # ========== Проверка крипто красных флагов ==========
-    for flag_category, patterns in CRYPTO_RED_FLAGS.items():
-        for pattern in patterns:
-            if re.search(pattern, text_lower):
+    for flag_category, flags in CRYPTO_RED_FLAG_NAMES.items():
+        for name, pattern in flags:
+            if hits.search(name):
                 crypto_flags.append(f"🚩 {flag_category}: {pattern[:30]}")
     
     # ========== Вычисление финального скора ==========
@@ -0,0 +1,657 @@
+"""
+Query Plan Audit v1.0
+Регрессионный контроль планов и латентности горячих запросов бота.
+
+create_database_indices добавляет индексы "на глаз", а
+query_optimization.print_optimization_stats только печатает счётчики,
+поэтому новый запрос с полным сканом users или requests проходит
+незамеченным. Этот модуль:
+
+- собирает горячие запросы бота в одном месте (HOT_QUERIES) - рейтинг,
+  ранг, профиль, история, ежедневные задачи, закладки, диалог, кэш;
+- строит схему через миграции бота и заполняет её синтетическими данными
+  с реалистичной кардинальностью (seed_synthetic_db);
+- для каждого запроса снимает EXPLAIN QUERY PLAN и медианное время;
+- падает на SCAN без индекса и на регрессии латентности относительно
+  сохранённого baseline;
+- формирует отчёт с рекомендациями индексов.
+
+Использование:
+    python query_plan_audit.py                      # аудит, exit 1 при проблемах
+    python query_plan_audit.py --update-baseline    # перезаписать baseline
+    python query_plan_audit.py --scale 1.0 --report plan_report.txt  # полный размер, без сравнения латентности
+"""
+
+import argparse
+import json
+import logging
+import os
+import random
+import re
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                     "tests", "query_plan_baseline.json")
+
+# Регрессия = медиана > baseline * LATENCY_TOLERANCE + LATENCY_SLACK_MS
+LATENCY_TOLERANCE = float(os.getenv("QUERY_PLAN_LATENCY_TOLERANCE", "3.0"))
+LATENCY_SLACK_MS = float(os.getenv("QUERY_PLAN_LATENCY_SLACK_MS", "1.0"))
+
+# Кардинальности при scale=1.0 (порядок величин продакшн-БД)
+SEED_CARDINALITIES = {
+    "users": 20000,
+    "requests": 200000,
+    "conversation_history": 150000,
+    "daily_tasks_days": 7,
+    "user_bookmarks_v2": 40000,
+    "cache": 30000,
+    "user_questions": 30000,
+    "user_progress": 60000,
+    "user_quiz_stats": 30000,
+    "user_profiles": 8000,
+}
+
+# Пользователи для запросов по user_id: "горячий" (много строк) и обычный
+_HOT_USER_ID = 1000001
+_PLAIN_USER_ID = 1000777
+
+
+# =============================================================================
+# ГОРЯЧИЕ ЗАПРОСЫ
+# =============================================================================
+
+@dataclass(frozen=True)
+class HotQuery:
+    """Запрос бота под контролем плана.
+
+    allow_scan - таблицы, полный скан которых ожидаем (например, COUNT по
+    всей таблице); для остальных SCAN без индекса - ошибка.
+    """
+    name: str
+    source: str
+    sql: str
+    params: Callable[[], Tuple] = lambda: ()
+    allow_scan: Tuple[str, ...] = ()
+
+
+def _now_iso(days_ago: int = 0) -> str:
+    return (datetime.now() - timedelta(days=days_ago)).isoformat()
+
+
+HOT_QUERIES: List[HotQuery] = [
+    HotQuery(
+        "leaderboard_cache", "get_leaderboard_data",
+        """SELECT rank, user_id, username, xp, level, total_requests
+           FROM leaderboard_cache WHERE period = ? ORDER BY rank LIMIT ?""",
+        lambda: ("all", 50),
+    ),
+    HotQuery(
+        "leaderboard_all", "get_leaderboard_data",
+        """SELECT user_id, username, xp, level, total_requests
+           FROM users WHERE xp > 0
+           ORDER BY xp DESC, level DESC, total_requests DESC LIMIT ?""",
+        lambda: (50,),
+    ),
+    HotQuery(
+        "leaderboard_week", "get_leaderboard_data",
+        """SELECT user_id, username, xp, level, total_requests
+           FROM users WHERE xp > 0 AND created_at > ?
+           ORDER BY xp DESC, level DESC, total_requests DESC LIMIT ?""",
+        lambda: (_now_iso(7), 50),
+    ),
+    HotQuery(
+        "leaderboard_total_users", "get_leaderboard_data",
+        "SELECT COUNT(DISTINCT user_id) FROM users",
+        allow_scan=("users",),
+    ),
+    HotQuery(
+        "rank_cached", "get_user_rank",
+        """SELECT rank, xp, level, total_requests
+           FROM leaderboard_cache WHERE period = ? AND user_id = ?""",
+        lambda: ("all", _PLAIN_USER_ID),
+    ),
+    HotQuery(
+        "rank_user", "get_user_rank",
+        "SELECT xp, level, total_requests FROM users WHERE user_id = ?",
+        lambda: (_PLAIN_USER_ID,),
+    ),
+    HotQuery(
+        "rank_position", "get_user_rank",
+        """SELECT COUNT(*) FROM users
+           WHERE xp > ? OR (xp = ? AND level > ?) OR (xp = ? AND level = ? AND total_requests > ?)""",
+        lambda: (500, 500, 5, 500, 5, 10),
+    ),
+    HotQuery(
+        "profile", "get_user_profile_data",
+        """SELECT
+                u.user_id, u.username, u.first_name, u.xp, u.level, u.created_at,
+                u.total_requests, u.badges,
+                COALESCE((SELECT COUNT(DISTINCT lesson_id) FROM user_progress
+                    WHERE user_id = ? AND completed_at IS NOT NULL), 0) as lessons_completed,
+                COALESCE((SELECT COUNT(*) FROM user_quiz_stats
+                    WHERE user_id = ? AND is_perfect_score = 1), 0) as perfect_tests,
+                COALESCE((SELECT COUNT(*) FROM user_quiz_stats
+                    WHERE user_id = ?), 0) as total_tests,
+                COALESCE((SELECT COUNT(*) FROM user_questions
+                    WHERE user_id = ?), 0) as questions_asked
+           FROM users u
+           WHERE u.user_id = ?""",
+        lambda: (_HOT_USER_ID,) * 5,
+    ),
+    HotQuery(
+        "personalization_profile", "get_user_profile",
+        """SELECT interests, portfolio, risk_tolerance, preferred_language
+           FROM user_profiles WHERE user_id = ?""",
+        lambda: (_HOT_USER_ID,),
+    ),
+    HotQuery(
+        "request_history", "get_user_history",
+        """SELECT news_text, response_text, created_at, from_cache, processing_time_ms
+           FROM requests WHERE user_id = ? AND error_message IS NULL
+           ORDER BY created_at DESC LIMIT ?""",
+        lambda: (_HOT_USER_ID, 10),
+    ),
+    HotQuery(
+        "daily_tasks", "get_user_daily_tasks",
+        """SELECT id, task_type, task_name, progress, target, xp_reward, completed
+           FROM daily_tasks WHERE user_id = ? AND DATE(reset_at) = DATE('now')
+           ORDER BY completed, xp_reward DESC""",
+        lambda: (_HOT_USER_ID,),
+    ),
+    HotQuery(
+        "daily_task_progress", "update_task_progress",
+        """SELECT id, progress, target, xp_reward, completed FROM daily_tasks
+           WHERE user_id = ? AND task_type = ? AND DATE(reset_at) = DATE('now')""",
+        lambda: (_HOT_USER_ID, "analyze_news"),
+    ),
+    HotQuery(
+        "bookmarks", "get_user_bookmarks",
+        """SELECT id, bookmark_type, content_title, content_text,
+                  content_source, added_at, viewed_count
+           FROM user_bookmarks_v2 WHERE user_id = ?
+           ORDER BY added_at DESC LIMIT ?""",
+        lambda: (_HOT_USER_ID, 10),
+    ),
+    HotQuery(
+        "bookmarks_by_type", "get_user_bookmarks",
+        """SELECT id, bookmark_type, content_title, content_text,
+                  content_source, added_at, viewed_count
+           FROM user_bookmarks_v2 WHERE user_id = ? AND bookmark_type = ?
+           ORDER BY added_at DESC LIMIT ?""",
+        lambda: (_HOT_USER_ID, "news", 10),
+    ),
+    HotQuery(
+        "bookmark_count", "get_bookmark_count",
+        "SELECT COUNT(*) FROM user_bookmarks_v2 WHERE user_id = ?",
+        lambda: (_HOT_USER_ID,),
+    ),
+    HotQuery(
+        "conversation_history", "get_conversation_history",
+        """SELECT role, content, intent, timestamp FROM conversation_history
+           WHERE user_id = ? ORDER BY timestamp DESC LIMIT ?""",
+        lambda: (_HOT_USER_ID, 10),
+    ),
+    HotQuery(
+        "cache_lookup", "get_cache",
+        "SELECT response_text FROM cache WHERE cache_key = ?",
+        lambda: ("key-00042",),
+    ),
+]
+
+
+# =============================================================================
+# СИНТЕТИЧЕСКАЯ БД
+# =============================================================================
+
+def build_bot_schema(conn: sqlite3.Connection) -> None:
+    """Схема основной БД через миграции бота (те же, что на старте)."""
+    from bot import BOT_MIGRATIONS, BOT_CACHE_MIGRATIONS
+    from schema_migrations import apply_migrations
+    apply_migrations(conn, "bot", BOT_MIGRATIONS)
+    # Таблица cache живёт в отдельном файле, но схема та же - проверяем здесь
+    apply_migrations(conn, "bot_cache", BOT_CACHE_MIGRATIONS)
+
+
+def seed_synthetic_db(conn: sqlite3.Connection, scale: float = 1.0, seed: int = 42) -> Dict[str, int]:
+    """
+    Заполняет схему детерминированными синтетическими данными.
+
+    Распределение активности перекошено (немногие пользователи делают
+    большую часть запросов), "горячий" пользователь _HOT_USER_ID получает
+    заметную долю строк - как реальные активные пользователи.
+
+    Returns:
+        Dict[str, int]: количество строк по таблицам
+    """
+    rng = random.Random(seed)
+    n = {key: max(1, int(value * scale)) for key, value in SEED_CARDINALITIES.items()}
+    n["daily_tasks_days"] = SEED_CARDINALITIES["daily_tasks_days"]
+    user_ids = [_HOT_USER_ID + i for i in range(n["users"])]
+    now = datetime.now()
+
+    def pick_user() -> int:
+        # Парето-подобный перекос: немногие пользователи ~ большая часть активности
+        roll = rng.random()
+        if roll < 0.05:
+            return _HOT_USER_ID
+        if roll < 0.8:
+            return user_ids[min(int(rng.paretovariate(1.2)) - 1, len(user_ids) - 1)]
+        return user_ids[rng.randrange(len(user_ids))]
+
+    def ts(max_days: int = 90) -> str:
+        return (now - timedelta(seconds=rng.randrange(max_days * 86400))).isoformat()
+
+    cursor = conn.cursor()
+    cursor.executemany(
+        """INSERT INTO users (user_id, username, first_name, created_at, total_requests, xp, level, badges)
+           VALUES (?, ?, ?, ?, ?, ?, ?, '[]')""",
+        [
+            (uid, f"user{uid}", f"User {uid}", ts(365), rng.randrange(500),
+             int(rng.expovariate(1 / 300)), rng.randrange(1, 60))
+            for uid in user_ids
+        ]
+    )
+    cursor.executemany(
+        """INSERT INTO requests (user_id, news_text, response_text, created_at, from_cache,
+                                 processing_time_ms, error_message)
+           VALUES (?, ?, ?, ?, ?, ?, ?)""",
+        [
+            (pick_user(), "news text", "analysis", ts(), rng.random() < 0.3,
+             rng.uniform(50, 3000), "timeout" if rng.random() < 0.02 else None)
+            for _ in range(n["requests"])
+        ]
+    )
+    cursor.executemany(
+        """INSERT INTO conversation_history (user_id, role, content, intent, timestamp,
+                                             message_length, tokens_estimate)
+           VALUES (?, ?, ?, 'general', ?, 10, 13)""",
+        [
+            (pick_user(), "user" if i % 2 else "assistant", "message",
+             int(now.timestamp()) - rng.randrange(90 * 86400))
+            for i in range(n["conversation_history"])
+        ]
+    )
+    task_types = ("analyze_news", "ask_question", "complete_lesson", "pass_quiz")
+    active_users = user_ids[:max(1, len(user_ids) // 5)]
+    cursor.executemany(
+        """INSERT INTO daily_tasks (user_id, task_type, task_name, xp_reward, progress, target,
+                                    completed, created_at, reset_at)
+           VALUES (?, ?, ?, 10, 0, 3, ?, ?, ?)""",
+        [
+            (uid, task, task, rng.random() < 0.3,
+             (now - timedelta(days=day)).isoformat(), (now - timedelta(days=day)).isoformat())
+            for day in range(n["daily_tasks_days"])
+            for uid in active_users
+            for task in task_types
+        ]
+    )
+    bookmark_types = ("news", "lesson", "tool", "resource")
+    cursor.executemany(
+        """INSERT OR IGNORE INTO user_bookmarks_v2 (user_id, bookmark_type, content_title,
+                                                   content_text, content_source, external_id, added_at)
+           VALUES (?, ?, 'title', 'text', 'source', ?, ?)""",
+        [
+            (pick_user(), rng.choice(bookmark_types), f"ext-{i}", ts())
+            for i in range(n["user_bookmarks_v2"])
+        ]
+    )
+    cursor.executemany(
+        "INSERT INTO cache (cache_key, response_text, created_at, last_used_at, hit_count) VALUES (?, 'r', ?, ?, ?)",
+        [(f"key-{i:05d}", ts(30), ts(7), rng.randrange(20)) for i in range(n["cache"])]
+    )
+    cursor.executemany(
+        "INSERT INTO user_questions (user_id, question, answer, source, created_at) VALUES (?, 'q', 'a', 'ai', ?)",
+        [(pick_user(), ts()) for _ in range(n["user_questions"])]
+    )
+    cursor.executemany(
+        "INSERT INTO user_progress (user_id, lesson_id, completed_at, quiz_score, xp_earned) VALUES (?, ?, ?, 80, 10)",
+        [(pick_user(), rng.randrange(1, 60), ts() if rng.random() < 0.7 else None)
+         for _ in range(n["user_progress"])]
+    )
+    cursor.executemany(
+        """INSERT INTO user_quiz_stats (user_id, lesson_id, total_questions, correct_answers,
+                                        quiz_score, is_perfect_score)
+           VALUES (?, ?, 5, 4, 80, ?)""",
+        [(pick_user(), rng.randrange(1, 60), rng.random() < 0.2) for _ in range(n["user_quiz_stats"])]
+    )
+    cursor.executemany(
+        "INSERT OR IGNORE INTO user_profiles (user_id, interests, portfolio, risk_tolerance) VALUES (?, 'defi', 'btc', 'medium')",
+        [(uid,) for uid in rng.sample(user_ids, min(n["user_profiles"], len(user_ids))) + [_HOT_USER_ID]]
+    )
+    top = sorted(user_ids[:2000], key=lambda uid: -uid)[:50]
+    for period in ("all", "week", "month"):
+        cursor.executemany(
+            """INSERT INTO leaderboard_cache (period, rank, user_id, username, xp, level, total_requests)
+               VALUES (?, ?, ?, 'name', 1000, 10, 100)""",
+            [(period, rank, uid) for rank, uid in enumerate(top, 1)]
+        )
+    conn.commit()
+    conn.execute("ANALYZE")
+
+    counts = {}
+    for table in ("users", "requests", "conversation_history", "daily_tasks", "user_bookmarks_v2",
+                  "cache", "user_questions", "user_progress", "user_quiz_stats", "user_profiles",
+                  "leaderboard_cache"):
+        counts[table] = conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+    return counts
+
+
+# =============================================================================
+# АНАЛИЗ ПЛАНОВ
+# =============================================================================
+
+_SCAN_RE = re.compile(r"^SCAN (\w+)(?: AS \w+)?$")
+_SEARCH_RE = re.compile(r"^SEARCH (\w+)")
+_TEMP_BTREE_RE = re.compile(r"USE TEMP B-TREE FOR (.+)")
+
+
+@dataclass
+class QueryPlanResult:
+    """Результат аудита одного запроса."""
+    name: str
+    source: str
+    plan: List[str]
+    full_scans: List[str]
+    temp_btrees: List[str]
+    median_ms: float
+    baseline_ms: Optional[float] = None
+    regression: bool = False
+    allowed_scans: List[str] = field(default_factory=list)
+
+    @property
+    def failed(self) -> bool:
+        return bool(self.full_scans) or self.regression
+
+
+def explain(conn: sqlite3.Connection, sql: str, params: Sequence[Any] = ()) -> List[str]:
+    """Строки detail из EXPLAIN QUERY PLAN."""
+    return [row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}", tuple(params))]
+
+
+def find_full_scans(plan: Sequence[str]) -> List[str]:
+    """Таблицы, которые план читает целиком без индекса."""
+    scans = []
+    for detail in plan:
+        match = _SCAN_RE.match(detail.strip())
+        if match and match.group(1) != "CONSTANT":
+            scans.append(match.group(1))
+    return scans
+
+
+def time_query(conn: sqlite3.Connection, sql: str, params: Sequence[Any] = (),
+               repeat: int = 7) -> float:
+    """Медианное время выполнения (fetchall) в миллисекундах."""
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        conn.execute(sql, tuple(params)).fetchall()
+        timings.append((time.perf_counter() - started) * 1000)
+    return statistics.median(timings)
+
+
+def audit_queries(conn: sqlite3.Connection, queries: Sequence[HotQuery] = HOT_QUERIES,
+                  baseline: Optional[Dict[str, float]] = None, repeat: int = 7,
+                  tolerance: float = LATENCY_TOLERANCE,
+                  slack_ms: float = LATENCY_SLACK_MS) -> List[QueryPlanResult]:
+    """EXPLAIN QUERY PLAN + замер для каждого запроса, сравнение с baseline."""
+    baseline = baseline or {}
+    results = []
+    for query in queries:
+        params = query.params()
+        plan = explain(conn, query.sql, params)
+        scans = find_full_scans(plan)
+        full_scans = [table for table in scans if table not in query.allow_scan]
+        temp_btrees = [m.group(1) for m in (_TEMP_BTREE_RE.search(d) for d in plan) if m]
+        median_ms = time_query(conn, query.sql, params, repeat)
+        baseline_ms = baseline.get(query.name)
+        regression = baseline_ms is not None and median_ms > baseline_ms * tolerance + slack_ms
+        results.append(QueryPlanResult(
+            name=query.name,
+            source=query.source,
+            plan=plan,
+            full_scans=full_scans,
+            temp_btrees=temp_btrees,
+            median_ms=round(median_ms, 3),
+            baseline_ms=baseline_ms,
+            regression=regression,
+            allowed_scans=[table for table in scans if table in query.allow_scan],
+        ))
+    return results
+
+
+# =============================================================================
+# РЕКОМЕНДАЦИИ ИНДЕКСОВ
+# =============================================================================
+
+_EQ_RE = r"(?:\b{alias}\.)?\b(\w+)\s*=\s*\?"
+_RANGE_RE = r"(?:\b{alias}\.)?\b(\w+)\s*(?:>=|<=|>|<)\s*\?"
+_ORDER_RE = re.compile(r"ORDER BY\s+(.+?)(?:\s+LIMIT\b|$)", re.IGNORECASE | re.DOTALL)
+
+
+def _table_columns(conn: sqlite3.Connection, table: str) -> List[str]:
+    return [row[1] for row in conn.execute(f"PRAGMA table_info({table})")]
+
+
+def recommend_index(conn: sqlite3.Connection, query: HotQuery, table: str) -> Optional[str]:
+    """
+    Эвристика: равенства (col = ?) -> ORDER BY -> диапазоны (col > ?).
+
+    Берутся только столбцы table; возвращает CREATE INDEX или None.
+    """
+    columns = set(_table_columns(conn, table))
+    sql = " ".join(query.sql.split())
+    where = re.split(r"\bORDER BY\b", sql, flags=re.IGNORECASE)[0]
+
+    ordered: List[str] = []
+
+    def add(column: str, suffix: str = "") -> None:
+        if column in columns and column not in (c.split()[0] for c in ordered):
+            ordered.append(column + suffix)
+
+    for column in re.findall(_EQ_RE.format(alias=r"\w+"), where):
+        add(column)
+    order_match = _ORDER_RE.search(sql)
+    if order_match:
+        for part in order_match.group(1).split(","):
+            tokens = part.strip().split()
+            if tokens:
+                add(tokens[0].split(".")[-1],
+                    " DESC" if len(tokens) > 1 and tokens[1].upper() == "DESC" else "")
+    for column in re.findall(_RANGE_RE.format(alias=r"\w+"), where):
+        add(column)
+    if not ordered:
+        return None
+    name = "idx_{}_{}".format(table, "_".join(c.split()[0] for c in ordered))
+    return f"CREATE INDEX IF NOT EXISTS {name} ON {table}({', '.join(ordered)})"
+
+
+def _index_exists(conn: sqlite3.Connection, table: str, statement: str) -> bool:
+    """Есть ли у table индекс с тем же набором столбцов (в том же порядке)."""
+    wanted = [c.split()[0] for c in statement[statement.index("(") + 1:-1].split(", ")]
+    for row in conn.execute(f"PRAGMA index_list({table})"):
+        columns = [info[2] for info in conn.execute(f"PRAGMA index_info({row[1]})")]
+        if columns == wanted:
+            return True
+    return False
+
+
+def normalize_sql(sql: str) -> str:
+    """SQL без различий в пробелах/переносах (для сверки с исходником бота)."""
+    return " ".join(sql.split())
+
+
+@dataclass
+class AuditReport:
+    """Итог аудита: результаты, рекомендации и признак провала."""
+    results: List[QueryPlanResult]
+    recommendations: Dict[str, str]
+    row_counts: Dict[str, int] = field(default_factory=dict)
+
+    @property
+    def failures(self) -> List[QueryPlanResult]:
+        return [result for result in self.results if result.failed]
+
+    @property
+    def ok(self) -> bool:
+        return not self.failures
+
+    def latency_baseline(self) -> Dict[str, float]:
+        return {result.name: result.median_ms for result in self.results}
+
+    def format(self) -> str:
+        """Текстовый отчёт (для консоли и артефакта CI)."""
+        lines = ["📊 Query plan audit"]
+        if self.row_counts:
+            lines.append("   Rows: " + ", ".join(f"{t}={c}" for t, c in self.row_counts.items()))
+        lines.append("")
+        for result in self.results:
+            status = "❌" if result.failed else ("⚠️" if result.temp_btrees else "✅")
+            baseline = f" (baseline {result.baseline_ms:.3f}ms)" if result.baseline_ms is not None else ""
+            lines.append(f"{status} {result.name} [{result.source}] {result.median_ms:.3f}ms{baseline}")
+            for detail in result.plan:
+                lines.append(f"      {detail}")
+            if result.full_scans:
+                lines.append(f"      ❌ SCAN without index: {', '.join(result.full_scans)}")
+            if result.allowed_scans:
+                lines.append(f"      ℹ️ expected full scan: {', '.join(result.allowed_scans)}")
+            if result.temp_btrees:
+                lines.append(f"      ⚠️ temp b-tree: {'; '.join(result.temp_btrees)}")
+            if result.regression:
+                lines.append(f"      ❌ latency regression vs baseline")
+        lines.append("")
+        if self.recommendations:
+            lines.append("💡 Index recommendations:")
+            for statement in sorted(set(self.recommendations.values())):
+                users = sorted(name for name, sql in self.recommendations.items() if sql == statement)
+                lines.append(f"   {statement};  -- {', '.join(users)}")
+        else:
+            lines.append("💡 Index recommendations: none")
+        lines.append("")
+        lines.append("✅ PASSED" if self.ok else f"❌ FAILED: {', '.join(r.name for r in self.failures)}")
+        return "\n".join(lines)
+
+
+def run_audit(conn: sqlite3.Connection, queries: Sequence[HotQuery] = HOT_QUERIES,
+              baseline: Optional[Dict[str, float]] = None, repeat: int = 7,
+              row_counts: Optional[Dict[str, int]] = None) -> AuditReport:
+    """Аудит запросов на готовой БД + рекомендации для сканов и temp b-tree."""
+    results = audit_queries(conn, queries, baseline, repeat)
+    by_name = {query.name: query for query in queries}
+    recommendations: Dict[str, str] = {}
+    for result in results:
+        query = by_name[result.name]
+        tables = list(result.full_scans)
+        if not tables and result.temp_btrees:
+            # Сортировка не покрыта индексом: предлагаем индекс под ORDER BY
+            tables = [m.group(1) for m in (_SEARCH_RE.match(d.strip()) for d in result.plan) if m][:1]
+        for table in tables:
+            statement = recommend_index(conn, query, table)
+            if statement and not _index_exists(conn, table, statement):
+                recommendations[result.name] = statement
+    return AuditReport(results=results, recommendations=recommendations, row_counts=row_counts or {})
+
+
+def load_baseline(path: str = DEFAULT_BASELINE_PATH) -> Tuple[Optional[float], Dict[str, float]]:
+    """(scale, {query: ms}) из сохранённого baseline; (None, {}) если файла нет."""
+    if not os.path.exists(path):
+        return None, {}
+    with open(path, encoding="utf-8") as f:
+        payload = json.load(f)
+    return payload.get("scale"), payload.get("latency_ms", {})
+
+
+def save_baseline(report: AuditReport, scale: float, path: str = DEFAULT_BASELINE_PATH) -> None:
+    payload = {
+        "scale": scale,
+        "sqlite_version": sqlite3.sqlite_version,
+        "latency_ms": report.latency_baseline(),
+    }
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(payload, f, indent=2, sort_keys=True)
+        f.write("\n")
+
+
+def audit_synthetic_db(scale: float = 1.0, baseline: Optional[Dict[str, float]] = None,
+                       repeat: int = 7, db_path: Optional[str] = None,
+                       schema_builder: Callable[[sqlite3.Connection], None] = build_bot_schema) -> AuditReport:
+    """Создаёт синтетическую БД (во временном файле) и проводит аудит."""
+    own_dir = None
+    if db_path is None:
+        own_dir = tempfile.TemporaryDirectory()
+        db_path = os.path.join(own_dir.name, "query_plan_audit.db")
+    conn = sqlite3.connect(db_path)
+    try:
+        conn.execute("PRAGMA journal_mode=WAL")
+        schema_builder(conn)
+        started = time.perf_counter()
+        counts = seed_synthetic_db(conn, scale=scale)
+        logger.info(f"🧪 Synthetic DB seeded in {(time.perf_counter() - started):.1f}s: {counts}")
+        return run_audit(conn, baseline=baseline, repeat=repeat, row_counts=counts)
+    finally:
+        conn.close()
+        if own_dir is not None:
+            own_dir.cleanup()
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="EXPLAIN QUERY PLAN + latency regression audit")
+    parser.add_argument("--scale", type=float, help="множитель кардинальностей (по умолчанию - как в baseline)")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE_PATH, help="JSON с baseline латентностей")
+    parser.add_argument("--update-baseline", action="store_true", help="перезаписать baseline текущими замерами")
+    parser.add_argument("--report", help="сохранить отчёт в файл")
+    parser.add_argument("--repeat", type=int, default=7)
+    args = parser.parse_args(argv)
+
+    baseline_scale, recorded = load_baseline(args.baseline)
+    baseline: Optional[Dict[str, float]] = recorded
+    scale = args.scale or baseline_scale or 1.0
+    if args.update_baseline:
+        baseline = None
+    elif baseline and baseline_scale != scale:
+        # Латентность сравнима только на БД того же размера
+        print(f"⚠️ Baseline recorded at scale={baseline_scale}, latency check skipped")
+        baseline = None
+    report = audit_synthetic_db(scale=scale, baseline=baseline, repeat=args.repeat)
+    text = report.format()
+    print(text)
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    if args.update_baseline:
+        save_baseline(report, scale, args.baseline)
+        print(f"\n💾 Baseline saved to {args.baseline}")
+        return 0 if not any(result.full_scans for result in report.results) else 1
+    return 0 if report.ok else 1
+
+
+__all__ = [
+    "HotQuery",
+    "HOT_QUERIES",
+    "QueryPlanResult",
+    "AuditReport",
+    "build_bot_schema",
+    "seed_synthetic_db",
+    "explain",
+    "find_full_scans",
+    "time_query",
+    "audit_queries",
+    "recommend_index",
+    "normalize_sql",
+    "run_audit",
+    "load_baseline",
+    "save_baseline",
+    "audit_synthetic_db",
+]
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,446 @@
+"""
+Rate Limit Engine v1.0
+Единый движок ограничения частоты запросов (GCRA) для бота и API.
+
+Заменяет четыре sliding-window лимитера (bot.IPRateLimiter,
+api_server.RateLimiter, ai_dialogue.check_ai_rate_limit,
+security_middleware.RateLimiter), которые хранили список timestamp'ов на
+ключ и пересобирали его list comprehension на каждой проверке.
+
+GCRA (Generic Cell Rate Algorithm) хранит на ключ одно число - TAT
+(theoretical arrival time). Политика "limit запросов за window секунд":
+- интервал эмиссии T = window / limit;
+- запрос разрешён, если max(TAT, now) + T - now <= window;
+- Retry-After точно равен max(TAT, now) + T - window - now;
+- ключ с TAT <= now ничем не отличается от отсутствующего, поэтому
+  простаивающие ключи удаляются без потери точности.
+
+Ключи раскладываются по шардам со своими lock'ами (threading.Lock:
+критическая секция без await, безопасна и для asyncio, и для потоков).
+
+В кластере из нескольких процессов (webhook_cluster) состояние политик
+переносится в общий бэкенд (shared_state): rate_limits.use_backend(backend).
+TAT тогда хранится по wall clock (time.time), а проверка - одно атомарное
+backend.update() на запрос.
+
+Использование:
+    policy = rate_limits.policy("ai_user", limit=10, window=60)
+    decision = policy.hit(user_id)
+    if not decision.allowed:
+        retry_in = decision.retry_after_seconds
+"""
+
+import argparse
+import logging
+import math
+import os
+import threading
+import time
+import tracemalloc
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple
+
+from shared_state import SharedStateBackend
+
+logger = logging.getLogger(__name__)
+
+RATE_LIMIT_SHARDS = int(os.getenv("RATE_LIMIT_SHARDS", "64"))
+
+# Погрешность float при сравнении TAT (10 мкс)
+_EPSILON = 1e-5
+
+
+@dataclass
+class RateLimitDecision:
+    """Результат проверки лимита."""
+    __slots__ = ("allowed", "limit", "remaining", "retry_after", "reset_after")
+    allowed: bool
+    limit: int
+    remaining: int
+    retry_after: float  # секунд до следующего разрешённого запроса (0 если разрешён)
+    reset_after: float  # секунд до полного восстановления лимита
+
+    @property
+    def retry_after_seconds(self) -> int:
+        """Retry-After для заголовка/сообщения: целые секунды, округление вверх."""
+        return retry_after_header(self.retry_after)
+
+
+def retry_after_header(retry_after: float) -> int:
+    """Секунды ожидания для Retry-After: округление вверх, 0 если ждать не нужно."""
+    return math.ceil(retry_after - _EPSILON) if retry_after > _EPSILON else 0
+
+
+class _Shard:
+    __slots__ = ("lock", "tat", "next_sweep")
+
+    def __init__(self, next_sweep: float):
+        self.lock = threading.Lock()
+        self.tat: Dict[Hashable, float] = {}
+        self.next_sweep = next_sweep
+
+
+class RateLimitPolicy:
+    """
+    Именованная политика: не больше limit запросов за window секунд на ключ.
+
+    limit можно переопределить для отдельного вызова (hit(key, limit=...)) -
+    так работают лимиты API ключей из APIKeyManager.get_rate_limit.
+    """
+
+    def __init__(self, name: str, limit: int, window: float, shards: int = RATE_LIMIT_SHARDS,
+                 sweep_interval: Optional[float] = None, clock: Callable[[], float] = time.monotonic,
+                 backend: Optional[SharedStateBackend] = None):
+        if limit <= 0 or window <= 0:
+            raise ValueError(f"Invalid rate limit policy {name}: {limit}/{window}s")
+        # Количество шардов - степень двойки, чтобы выбирать шард маской
+        shard_count = 1 << max(0, (max(1, shards) - 1).bit_length())
+        self.name = name
+        self.limit = limit
+        self.window = float(window)
+        self.sweep_interval = sweep_interval if sweep_interval is not None else max(self.window, 1.0)
+        self.clock = clock
+        self._mask = shard_count - 1
+        now = clock()
+        self._shards = [_Shard(now + self.sweep_interval) for _ in range(shard_count)]
+        self.allowed_count = 0
+        self.denied_count = 0
+        self.evicted_count = 0
+        self.backend: Optional[SharedStateBackend] = None
+        if backend is not None:
+            self.use_backend(backend)
+
+    @property
+    def namespace(self) -> str:
+        return f"ratelimit:{self.name}"
+
+    def use_backend(self, backend: Optional[SharedStateBackend]) -> None:
+        """
+        Переносит состояние в общий бэкенд (None - обратно в память процесса).
+
+        Монотонные часы у каждого процесса свои, поэтому с бэкендом TAT
+        считается по time.time. Локальное состояние сбрасывается.
+        """
+        self.backend = backend
+        if backend is not None and self.clock is time.monotonic:
+            self.clock = time.time
+        elif backend is None and self.clock is time.time:
+            self.clock = time.monotonic
+        for shard in self._shards:
+            with shard.lock:
+                shard.tat.clear()
+
+    def _shard(self, key: Hashable) -> _Shard:
+        return self._shards[hash(key) & self._mask]
+
+    def _sweep(self, shard: _Shard, now: float) -> int:
+        before = len(shard.tat)
+        shard.tat = {key: tat for key, tat in shard.tat.items() if tat > now}
+        shard.next_sweep = now + self.sweep_interval
+        removed = before - len(shard.tat)
+        self.evicted_count += removed
+        return removed
+
+    def _acquire(self, key: Hashable, cost: int, interval: float) -> Tuple[bool, float, float]:
+        """(разрешён, TAT после решения, now) - общая часть hit/try_acquire."""
+        window = self.window
+        now = self.clock()
+        if self.backend is not None:
+            return self._acquire_shared(self.backend, key, cost, interval, now)
+        shard = self._shards[hash(key) & self._mask]
+        with shard.lock:
+            if now >= shard.next_sweep:
+                self._sweep(shard, now)
+            tat = shard.tat.get(key, now)
+            if tat < now:
+                tat = now
+            new_tat = tat + interval * cost
+            if new_tat - window > now + _EPSILON:
+                self.denied_count += 1
+                return False, tat, now
+            shard.tat[key] = new_tat
+        self.allowed_count += 1
+        return True, new_tat, now
+
+    def _acquire_shared(self, backend: SharedStateBackend, key: Hashable, cost: int, interval: float,
+                        now: float) -> Tuple[bool, float, float]:
+        window = self.window
+
+        def step(stored):
+            tat = stored if stored is not None and stored > now else now
+            new_tat = tat + interval * cost
+            if new_tat - window > now + _EPSILON:
+                return stored, (False, tat)
+            return new_tat, (True, new_tat)
+
+        # TAT не превышает now + window, после этого ключ равен отсутствующему
+        allowed, tat = backend.update(self.namespace, str(key), step, ttl=window)
+        if allowed:
+            self.allowed_count += 1
+        else:
+            self.denied_count += 1
+        return allowed, tat, now
+
+    def _get_tat(self, key: Hashable, now: float) -> float:
+        if self.backend is not None:
+            tat = self.backend.get(self.namespace, str(key))
+            return float(tat) if tat is not None and tat > now else now
+        shard = self._shard(key)
+        with shard.lock:
+            return max(shard.tat.get(key, now), now)
+
+    def _tats(self) -> List[float]:
+        if self.backend is not None:
+            return [tat for _, tat in self.backend.items(self.namespace)]
+        tats: List[float] = []
+        for shard in self._shards:
+            with shard.lock:
+                tats.extend(shard.tat.values())
+        return tats
+
+    def try_acquire(self, key: Hashable, cost: int = 1, limit: Optional[int] = None) -> float:
+        """
+        Быстрый путь: 0.0 если запрос разрешён (и учтён), иначе точный Retry-After в секундах.
+        """
+        interval = self.window / (limit or self.limit)
+        allowed, tat, now = self._acquire(key, cost, interval)
+        if allowed:
+            return 0.0
+        return tat + interval * cost - self.window - now
+
+    def hit(self, key: Hashable, cost: int = 1, limit: Optional[int] = None) -> RateLimitDecision:
+        """Учитывает запрос (если он разрешён) и возвращает решение с remaining/Retry-After."""
+        limit = limit or self.limit
+        window = self.window
+        interval = window / limit
+        allowed, tat, now = self._acquire(key, cost, interval)
+        remaining = max(0, int((window - (tat - now)) / interval + _EPSILON))
+        if allowed:
+            return RateLimitDecision(True, limit, remaining, 0.0, tat - now)
+        return RateLimitDecision(False, limit, remaining, tat + interval * cost - window - now, tat - now)
+
+    def peek(self, key: Hashable, limit: Optional[int] = None) -> RateLimitDecision:
+        """Состояние ключа без учёта запроса."""
+        limit = limit or self.limit
+        interval = self.window / limit
+        now = self.clock()
+        tat = self._get_tat(key, now)
+        allow_at = tat + interval - self.window
+        retry_after = max(0.0, allow_at - now) if allow_at > now + _EPSILON else 0.0
+        remaining = max(0, int((self.window - (tat - now)) / interval + _EPSILON))
+        return RateLimitDecision(retry_after == 0.0, limit, remaining, retry_after, tat - now)
+
+    def reset(self, key: Optional[Hashable] = None) -> None:
+        """Сбрасывает ключ (или все ключи политики)."""
+        if self.backend is not None:
+            if key is None:
+                self.backend.clear(self.namespace)
+            else:
+                self.backend.delete(self.namespace, str(key))
+            return
+        if key is None:
+            for shard in self._shards:
+                with shard.lock:
+                    shard.tat.clear()
+            return
+        shard = self._shard(key)
+        with shard.lock:
+            shard.tat.pop(key, None)
+
+    def set_tat(self, key: Hashable, tat: float) -> None:
+        """Прямая установка состояния ключа (миграции/тесты)."""
+        if self.backend is not None:
+            self.backend.set(self.namespace, str(key), tat, ttl=max(tat - self.clock(), 0.0) + self.window)
+            return
+        shard = self._shard(key)
+        with shard.lock:
+            shard.tat[key] = tat
+
+    def evict_idle(self) -> int:
+        """Удаляет все полностью восстановившиеся ключи."""
+        if self.backend is not None:
+            # Записи бэкенда истекают по ttl, purge_expired - общая уборка
+            return 0
+        now = self.clock()
+        removed = 0
+        for shard in self._shards:
+            with shard.lock:
+                removed += self._sweep(shard, now)
+        if removed:
+            logger.debug(f"🧹 Rate limit '{self.name}': evicted {removed} idle keys")
+        return removed
+
+    def __len__(self) -> int:
+        if self.backend is not None:
+            return self.backend.count(self.namespace)
+        return sum(len(shard.tat) for shard in self._shards)
+
+    def limited_keys(self) -> int:
+        """Сколько ключей сейчас не могут сделать ни одного запроса."""
+        now = self.clock()
+        interval = self.window / self.limit
+        threshold = now + self.window - interval + _EPSILON
+        return sum(1 for tat in self._tats() if tat > threshold)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "limit": self.limit,
+            "window_seconds": self.window,
+            "tracked_keys": len(self),
+            "shards": len(self._shards),
+            "allowed": self.allowed_count,
+            "denied": self.denied_count,
+            "evicted": self.evicted_count,
+            "backend": self.backend.name if self.backend is not None else "local",
+        }
+
+
+class RateLimitEngine:
+    """Реестр именованных политик процесса."""
+
+    def __init__(self):
+        self._policies: Dict[str, RateLimitPolicy] = {}
+        self._lock = threading.Lock()
+        self.backend: Optional[SharedStateBackend] = None
+
+    def policy(self, name: str, limit: int, window: float, **kwargs) -> RateLimitPolicy:
+        """Возвращает политику name, создавая её при первом обращении."""
+        with self._lock:
+            existing = self._policies.get(name)
+            if existing is not None:
+                if (existing.limit, existing.window) != (limit, float(window)):
+                    logger.info(f"🔧 Rate limit '{name}': {existing.limit}/{existing.window:g}s -> {limit}/{window}s")
+                    existing.limit, existing.window = limit, float(window)
+                return existing
+            kwargs.setdefault("backend", self.backend)
+            policy = RateLimitPolicy(name, limit, window, **kwargs)
+            self._policies[name] = policy
+            return policy
+
+    def register(self, policy: RateLimitPolicy) -> RateLimitPolicy:
+        with self._lock:
+            self._policies[policy.name] = policy
+            if self.backend is not None and policy.backend is None:
+                policy.use_backend(self.backend)
+        return policy
+
+    def use_backend(self, backend: Optional[SharedStateBackend]) -> None:
+        """Общий бэкенд для всех политик - уже созданных и будущих."""
+        with self._lock:
+            self.backend = backend
+            for policy in self._policies.values():
+                policy.use_backend(backend)
+        if backend is not None:
+            logger.info(f"🗄️ Rate limits: состояние в общем бэкенде {backend.name}")
+
+    def get(self, name: str) -> Optional[RateLimitPolicy]:
+        return self._policies.get(name)
+
+    def evict_idle(self) -> int:
+        return sum(policy.evict_idle() for policy in list(self._policies.values()))
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        return {name: policy.stats() for name, policy in list(self._policies.items())}
+
+
+rate_limits = RateLimitEngine()
+
+
+# =============================================================================
+# MICROBENCHMARK
+# =============================================================================
+
+def _sliding_log_hit(history: Dict[Hashable, List[float]], key: Hashable, now: float,
+                     limit: int, window: float) -> bool:
+    """Прежний алгоритм (список timestamp'ов на ключ) - для сравнения."""
+    history[key] = [ts for ts in history.get(key, []) if ts > now - window]
+    if len(history[key]) >= limit:
+        return False
+    history[key].append(now)
+    return True
+
+
+def benchmark(keys: int = 100_000, hits_per_key: int = 10, limit: int = 30,
+              window: float = 60.0) -> Dict[str, Any]:
+    """
+    Микробенчмарк: keys разных ключей по hits_per_key запросов.
+
+    Время и память измеряются отдельными проходами (tracemalloc искажает время).
+
+    Returns:
+        dict с ops/s и памятью для GCRA и прежнего sliding log
+    """
+    key_list = [f"10.{i >> 16 & 255}.{i >> 8 & 255}.{i & 255}" for i in range(keys)]
+    total = keys * hits_per_key
+    results: Dict[str, Any] = {"keys": keys, "operations": total}
+
+    def run_gcra(method: str) -> RateLimitPolicy:
+        policy = RateLimitPolicy("bench", limit, window)
+        call = getattr(policy, method)
+        for _ in range(hits_per_key):
+            for key in key_list:
+                call(key)
+        return policy
+
+    def run_sliding_log() -> Dict[Hashable, List[float]]:
+        history: Dict[Hashable, List[float]] = {}
+        for _ in range(hits_per_key):
+            for key in key_list:
+                _sliding_log_hit(history, key, time.time(), limit, window)
+        return history
+
+    for name, run in (("gcra", lambda: run_gcra("try_acquire")),
+                      ("gcra_hit", lambda: run_gcra("hit")),
+                      ("sliding_log", run_sliding_log)):
+        started = time.perf_counter()
+        run()
+        results[f"{name}_ops_per_sec"] = total / (time.perf_counter() - started)
+
+    for name, run in (("gcra", lambda: run_gcra("try_acquire")), ("sliding_log", run_sliding_log)):
+        tracemalloc.start()
+        state = run()
+        results[f"{name}_memory_mb"] = tracemalloc.get_traced_memory()[0] / 1024 / 1024
+        tracemalloc.stop()
+        del state
+
+    # Простаивающие ключи: через окно удаляются все
+    clock = [0.0]
+    idle_policy = RateLimitPolicy("bench_idle", limit, window, clock=lambda: clock[0])
+    for key in key_list:
+        idle_policy.try_acquire(key)
+    clock[0] = window + 1
+    started = time.perf_counter()
+    results["evicted"] = idle_policy.evict_idle()
+    results["evict_ms"] = (time.perf_counter() - started) * 1000
+    return results
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Rate limit engine microbenchmark")
+    parser.add_argument("--keys", type=int, default=100_000)
+    parser.add_argument("--hits", type=int, default=10)
+    args = parser.parse_args(argv)
+
+    result = benchmark(keys=args.keys, hits_per_key=args.hits)
+    print(f"Keys: {result['keys']:,}, operations: {result['operations']:,}")
+    print(f"GCRA:        {result['gcra_ops_per_sec']:>12,.0f} ops/s  {result['gcra_memory_mb']:.1f} MB")
+    print(f"GCRA (hit):  {result['gcra_hit_ops_per_sec']:>12,.0f} ops/s")
+    print(f"Sliding log: {result['sliding_log_ops_per_sec']:>12,.0f} ops/s  {result['sliding_log_memory_mb']:.1f} MB")
+    print(f"Idle eviction: {result['evicted']:,} keys in {result['evict_ms']:.1f}ms")
+    return 0
+
+
+
+__all__ = [
+    "RateLimitDecision",
+    "RateLimitPolicy",
+    "retry_after_header",
+    "RateLimitEngine",
+    "rate_limits",
+    "benchmark",
+]
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
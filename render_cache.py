@@ -0,0 +1,171 @@
+"""
+Render Cache v1.0
+Кэш статичных меню и текстов бота по языкам.
+
+/start, /menu, /help, settings_menu и меню ресурсов на каждый вызов заново
+собирали одни и те же InlineKeyboardMarkup и делали по 10-30 await get_text
+(каждый - проверка языка пользователя и поиск в словаре переводов), хотя
+от пользователя в этих экранах зависят лишь несколько полей. Теперь:
+
+- экран описывается функцией-сборщиком builder(language) -> RenderedView,
+  зарегистрированной под именем (декоратор render_cache.view);
+- собранный вид хранится по ключу (имя, язык) и выдаётся как неизменяемый
+  объект: frozen dataclass + InlineKeyboardMarkup (в PTB 21 объекты
+  Telegram заморожены), поэтому его безопасно отдавать всем хендлерам;
+- пользовательские поля подставляются в готовый шаблон одним
+  str.format_map (RenderedView.render); статичные строки экранируются
+  (static), строки переводов с параметрами вставляются как есть (slot);
+- warm() собирает все экраны для SUPPORTED_LANGUAGES при старте бота,
+  i18n.reload_translations сбрасывает кэш (весь или одного языка).
+"""
+
+import logging
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterable, Optional, Tuple
+
+from telegram import InlineKeyboardMarkup
+
+from i18n import DEFAULT_LANGUAGE, SUPPORTED_LANGUAGES, on_translations_reload, translate
+
+logger = logging.getLogger(__name__)
+
+Builder = Callable[[str], "RenderedView"]
+
+
+class _KeepMissing(dict):
+    """Неизвестные поля шаблона остаются в тексте как есть."""
+
+    def __missing__(self, key: str) -> str:
+        return "{" + key + "}"
+
+
+def static(text: str) -> str:
+    """Экранирует фигурные скобки статичного текста для шаблона."""
+    return text.replace("{", "{{").replace("}", "}}")
+
+
+def t(key: str, language: str, **kwargs) -> str:
+    """Статичная строка перевода, готовая для вставки в шаблон."""
+    return static(translate(key, language, **kwargs))
+
+
+def slot(key: str, language: str) -> str:
+    """Строка перевода с параметрами - параметры станут полями шаблона."""
+    return translate(key, language)
+
+
+def normalize_language(language: Optional[str]) -> str:
+    return language if language in SUPPORTED_LANGUAGES else DEFAULT_LANGUAGE
+
+
+@dataclass(frozen=True)
+class RenderedView:
+    """Готовый экран: шаблон текста и клавиатура."""
+
+    text: str = ""
+    reply_markup: Optional[InlineKeyboardMarkup] = None
+    # False - текст без полей, render() возвращает его без форматирования
+    templated: bool = False
+
+    def render(self, **fields: Any) -> str:
+        if not self.templated:
+            return self.text
+        return self.text.format_map(_KeepMissing(fields))
+
+
+class RenderCache:
+    """Кэш RenderedView по (имя экрана, язык)."""
+
+    def __init__(self, languages: Optional[Iterable[str]] = None):
+        self.languages = tuple(languages or SUPPORTED_LANGUAGES)
+        self._builders: Dict[str, Builder] = {}
+        self._views: Dict[Tuple[str, str], RenderedView] = {}
+        self.hits = 0
+        self.builds = 0
+        self.invalidations = 0
+
+    def register(self, name: str, builder: Builder) -> Builder:
+        self._builders[name] = builder
+        self._drop(lambda key: key[0] == name)
+        return builder
+
+    def view(self, name: str) -> Callable[[Builder], Builder]:
+        """Декоратор: @render_cache.view("help") def build_help(language): ..."""
+        return lambda builder: self.register(name, builder)
+
+    def get(self, name: str, language: Optional[str] = None) -> RenderedView:
+        key = (name, normalize_language(language))
+        rendered = self._views.get(key)
+        if rendered is not None:
+            self.hits += 1
+            return rendered
+        try:
+            builder = self._builders[name]
+        except KeyError:
+            raise KeyError(f"Unknown view: {name}") from None
+        rendered = builder(key[1])
+        self._views[key] = rendered
+        self.builds += 1
+        return rendered
+
+    def warm(self, languages: Optional[Iterable[str]] = None) -> int:
+        """Собирает все зарегистрированные экраны заранее; возвращает их число."""
+        built = 0
+        for language in languages or self.languages:
+            for name in list(self._builders):
+                try:
+                    self.get(name, language)
+                    built += 1
+                except Exception as e:
+                    logger.error(f"❌ Не удалось собрать экран {name}/{language}: {e}")
+        logger.info(f"🧩 Render cache: собрано {built} экранов")
+        return built
+
+    def invalidate(self, language: Optional[str] = None) -> int:
+        """Сбрасывает экраны языка (или все при language=None)."""
+        if language is None:
+            dropped = self._drop(lambda key: True)
+        else:
+            dropped = self._drop(lambda key: key[1] == language)
+        self.invalidations += 1
+        logger.debug(f"Render cache invalidated ({language or 'all'}): {dropped}")
+        return dropped
+
+    def _drop(self, predicate: Callable[[Tuple[str, str]], bool]) -> int:
+        keys = [key for key in self._views if predicate(key)]
+        for key in keys:
+            del self._views[key]
+        return len(keys)
+
+    def __contains__(self, key: Tuple[str, str]) -> bool:
+        return key in self._views
+
+    def __len__(self) -> int:
+        return len(self._views)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.builds
+        return {
+            "views": len(self._builders),
+            "cached": len(self._views),
+            "hits": self.hits,
+            "builds": self.builds,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            "invalidations": self.invalidations,
+        }
+
+
+# Общий кэш процесса; сбрасывается при i18n.reload_translations
+render_cache = RenderCache()
+on_translations_reload(render_cache.invalidate)
+
+
+__all__ = [
+    "RenderCache",
+    "RenderedView",
+    "render_cache",
+    "static",
+    "t",
+    "slot",
+    "normalize_language",
+]
@@ -0,0 +1,259 @@
+"""
+Reporting Pool v1.0
+Read-only пул соединений и изолированный запуск тяжёлых отчётов.
+
+admin_stats / stats / get_global_stats, AdminDashboard и
+event_tracker.Analytics делают агрегатные сканы. Раньше они шли через те
+же соединения, что обслуживают пользователей, и тяжёлое обновление
+дашборда тормозило всех. Теперь отчёты:
+
+- читают через отдельный пул (URI mode=ro + PRAGMA query_only), размер
+  которого задаётся независимо (REPORT_POOL_SIZE);
+- видят согласованный снимок: одно соединение = одна read-транзакция WAL;
+- ограничены по времени через progress handler (REPORT_QUERY_TIMEOUT);
+- выполняются в отдельных потоках с лимитом одновременных отчётов
+  (REPORT_MAX_CONCURRENT) и очереди (REPORT_MAX_PENDING), поэтому
+  event loop и интерактивные запросы не ждут аналитику.
+
+Использование:
+    with read_only_connection(DB_PATH, attach=(ROUTE_CACHE,)) as conn:
+        conn.execute("SELECT COUNT(*) FROM cache_db.cache")
+
+    stats = await run_report(get_global_stats)
+"""
+
+import asyncio
+import functools
+import os
+import queue
+import sqlite3
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, Optional, Sequence, Tuple
+from urllib.parse import quote
+
+from exceptions import ReportTimeoutError, ReportsBusyError
+from storage_router import ROUTE_MAIN, attach_alias, resolve_db_path, routed_connection
+
+logger = logging.getLogger(__name__)
+
+REPORT_POOL_SIZE = int(os.getenv("REPORT_POOL_SIZE", "2"))
+REPORT_MAX_CONCURRENT = int(os.getenv("REPORT_MAX_CONCURRENT", "2"))
+REPORT_MAX_PENDING = int(os.getenv("REPORT_MAX_PENDING", "8"))
+REPORT_QUERY_TIMEOUT = float(os.getenv("REPORT_QUERY_TIMEOUT", "15"))
+
+# Как часто (в инструкциях VDBE) SQLite зовёт progress handler
+_PROGRESS_STEPS = 10000
+
+
+def _ro_uri(db_path: str) -> str:
+    return f"file:{quote(os.path.abspath(db_path))}?mode=ro"
+
+
+class ReadOnlyConnectionPool:
+    """
+    Пул read-only соединений к одной БД с подключёнными маршрутами.
+
+    Соединение открывается с mode=ro и PRAGMA query_only, поэтому любая
+    попытка записи из отчёта падает, а не берёт блокировку записи.
+    """
+
+    def __init__(self, db_path: str, attach: Sequence[str] = (), pool_size: int = REPORT_POOL_SIZE):
+        self.db_path = os.path.abspath(db_path)
+        self.attach = tuple(route for route in attach if route != ROUTE_MAIN)
+        self.pool_size = pool_size
+        self._pool: "queue.LifoQueue[sqlite3.Connection]" = queue.LifoQueue(maxsize=pool_size)
+        self.stats = {"created": 0, "reused": 0, "timeouts": 0}
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(_ro_uri(self.db_path), uri=True, timeout=5.0, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA query_only=ON")
+        for route in self.attach:
+            route_path = resolve_db_path(route, self.db_path)
+            if not os.path.exists(route_path):
+                # mode=ro не создаёт файлы - создаём через пул маршрута
+                with routed_connection(route, self.db_path):
+                    pass
+            conn.execute(f"ATTACH DATABASE ? AS {attach_alias(route)}", (_ro_uri(route_path),))
+        self.stats["created"] += 1
+        return conn
+
+    def acquire(self) -> sqlite3.Connection:
+        try:
+            conn = self._pool.get_nowait()
+            self.stats["reused"] += 1
+            return conn
+        except queue.Empty:
+            return self._connect()
+
+    def release(self, conn: sqlite3.Connection) -> None:
+        conn.set_progress_handler(None, 0)
+        if conn.in_transaction:
+            conn.rollback()
+        try:
+            self._pool.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+    def close(self) -> None:
+        while True:
+            try:
+                self._pool.get_nowait().close()
+            except queue.Empty:
+                break
+
+    @contextmanager
+    def connection(self, timeout: Optional[float] = None) -> Iterator[sqlite3.Connection]:
+        """
+        Соединение со снимком БД и бюджетом времени.
+
+        Все запросы внутри блока видят один и тот же снимок (BEGIN держит
+        read-транзакцию до возврата соединения в пул). Если запрос не
+        уложился в timeout, SQLite прерывает его и поднимается
+        ReportTimeoutError.
+        """
+        budget = REPORT_QUERY_TIMEOUT if timeout is None else timeout
+        deadline = time.monotonic() + budget
+        conn = self.acquire()
+        conn.set_progress_handler(lambda: 1 if time.monotonic() > deadline else 0, _PROGRESS_STEPS)
+        try:
+            conn.execute("BEGIN")
+            yield conn
+        except sqlite3.OperationalError as e:
+            if "interrupted" in str(e) and time.monotonic() > deadline:
+                self.stats["timeouts"] += 1
+                logger.warning(f"⏱️ Report query on {self.db_path} exceeded {budget:.1f}s")
+                raise ReportTimeoutError(
+                    f"Report query exceeded {budget:.1f}s",
+                    context={"db_path": self.db_path, "timeout": budget}
+                ) from e
+            raise
+        finally:
+            self.release(conn)
+
+    def get_stats(self) -> Dict:
+        return {
+            "db_path": self.db_path,
+            "attach": list(self.attach),
+            "pool_size": self.pool_size,
+            "idle": self._pool.qsize(),
+            **self.stats,
+        }
+
+
+_pools: Dict[Tuple[str, Tuple[str, ...]], ReadOnlyConnectionPool] = {}
+_pools_lock = threading.Lock()
+
+
+def get_reporting_pool(db_path: str, attach: Sequence[str] = ()) -> ReadOnlyConnectionPool:
+    """Read-only пул для БД (один на пару путь + набор маршрутов)."""
+    key = (os.path.abspath(db_path), tuple(attach))
+    pool = _pools.get(key)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.get(key)
+            if pool is None:
+                pool = ReadOnlyConnectionPool(db_path, attach)
+                _pools[key] = pool
+                logger.info(f"📊 Reporting pool (ro) -> {pool.db_path} attach={list(pool.attach)}")
+    return pool
+
+
+@contextmanager
+def read_only_connection(db_path: str, attach: Sequence[str] = (),
+                         timeout: Optional[float] = None) -> Iterator[sqlite3.Connection]:
+    """Снимок БД из read-only пула (см. ReadOnlyConnectionPool.connection)."""
+    with get_reporting_pool(db_path, attach).connection(timeout) as conn:
+        yield conn
+
+
+# =============================================================================
+# ЗАПУСК ОТЧЁТОВ
+# =============================================================================
+
+class ReportRunner:
+    """
+    Выполняет синхронные функции отчётов в отдельном пуле потоков.
+
+    Не более max_concurrent отчётов выполняются одновременно, ещё
+    (max_pending - max_concurrent) ждут в очереди; сверх этого
+    run() сразу поднимает ReportsBusyError.
+    """
+
+    def __init__(self, max_concurrent: int = REPORT_MAX_CONCURRENT,
+                 max_pending: int = REPORT_MAX_PENDING):
+        self.max_concurrent = max_concurrent
+        self.max_pending = max(max_pending, max_concurrent)
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrent, thread_name_prefix="report")
+        self._pending = 0
+        self._lock = threading.Lock()
+        self.stats = {"completed": 0, "rejected": 0, "failed": 0}
+
+    async def run(self, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        with self._lock:
+            if self._pending >= self.max_pending:
+                self.stats["rejected"] += 1
+                raise ReportsBusyError(
+                    f"Too many reports in flight ({self._pending})",
+                    context={"max_pending": self.max_pending}
+                )
+            self._pending += 1
+        started = time.perf_counter()
+        try:
+            loop = asyncio.get_running_loop()
+            result = await loop.run_in_executor(self._executor, functools.partial(fn, *args, **kwargs))
+            self.stats["completed"] += 1
+            return result
+        except Exception:
+            self.stats["failed"] += 1
+            raise
+        finally:
+            with self._lock:
+                self._pending -= 1
+            logger.debug(f"📊 Report {getattr(fn, '__name__', fn)} took {(time.perf_counter() - started) * 1000:.1f}ms")
+
+    @property
+    def pending(self) -> int:
+        return self._pending
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+_runner: Optional[ReportRunner] = None
+
+
+def get_report_runner() -> ReportRunner:
+    """Глобальный раннер отчётов (singleton)."""
+    global _runner
+    if _runner is None:
+        _runner = ReportRunner()
+    return _runner
+
+
+async def run_report(fn: Callable[..., Any], *args, **kwargs) -> Any:
+    """Выполняет fn(*args, **kwargs) в потоке отчётов, не блокируя event loop."""
+    return await get_report_runner().run(fn, *args, **kwargs)
+
+
+def close_reporting_pools() -> None:
+    """Закрывает все read-only пулы (shutdown / тесты)."""
+    with _pools_lock:
+        for pool in _pools.values():
+            pool.close()
+        _pools.clear()
+
+
+__all__ = [
+    "ReadOnlyConnectionPool",
+    "get_reporting_pool",
+    "read_only_connection",
+    "ReportRunner",
+    "get_report_runner",
+    "run_report",
+    "close_reporting_pools",
+]
@@ -0,0 +1,187 @@
+"""
+Schema Migrations v1.0
+Версионированные миграции SQLite с быстрым путём запуска.
+
+Каждая подсистема (bot, conversation_context, event_tracker, audit, auth)
+регистрирует упорядоченный список идемпотентных шагов. Номер последнего
+применённого шага хранится в таблице schema_version отдельно для каждого
+scope, поэтому при актуальной схеме старт сводится к одному SELECT.
+
+Использование:
+    MIGRATIONS = [
+        Migration(1, "base_schema", _create_tables),
+        Migration(2, "indices", _create_indices),
+    ]
+    ensure_schema(DB_PATH, "event_tracker", MIGRATIONS)
+"""
+
+import sqlite3
+import time
+import logging
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Sequence
+
+logger = logging.getLogger(__name__)
+
+SCHEMA_VERSION_TABLE = "schema_version"
+
+_CREATE_VERSION_TABLE = f"""
+    CREATE TABLE IF NOT EXISTS {SCHEMA_VERSION_TABLE} (
+        scope TEXT PRIMARY KEY,
+        version INTEGER NOT NULL,
+        step_name TEXT,
+        applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+"""
+
+
+@dataclass(frozen=True)
+class Migration:
+    """Один шаг миграции. apply() обязан быть идемпотентным."""
+    version: int
+    name: str
+    apply: Callable[[sqlite3.Cursor], None]
+
+
+def latest_version(migrations: Sequence[Migration]) -> int:
+    """Номер последнего шага в списке (0 для пустого списка)."""
+    return max((m.version for m in migrations), default=0)
+
+
+def _validate(migrations: Sequence[Migration]) -> List[Migration]:
+    """Сортирует шаги и проверяет уникальность и положительность версий."""
+    ordered = sorted(migrations, key=lambda m: m.version)
+    seen = set()
+    for migration in ordered:
+        if migration.version <= 0:
+            raise ValueError(f"Migration version must be positive: {migration}")
+        if migration.version in seen:
+            raise ValueError(f"Duplicate migration version {migration.version}")
+        seen.add(migration.version)
+    return ordered
+
+
+def get_schema_version(conn: sqlite3.Connection, scope: str) -> int:
+    """
+    Возвращает применённую версию схемы для scope.
+
+    Не создаёт таблицу schema_version: на новой БД просто возвращает 0.
+    """
+    try:
+        row = conn.execute(
+            f"SELECT version FROM {SCHEMA_VERSION_TABLE} WHERE scope = ?",
+            (scope,)
+        ).fetchone()
+    except sqlite3.OperationalError:
+        # Таблицы ещё нет - схема не инициализирована
+        return 0
+    return int(row[0]) if row else 0
+
+
+def _set_schema_version(cursor: sqlite3.Cursor, scope: str, migration: Migration) -> None:
+    cursor.execute(f"""
+        INSERT INTO {SCHEMA_VERSION_TABLE} (scope, version, step_name, applied_at)
+        VALUES (?, ?, ?, CURRENT_TIMESTAMP)
+        ON CONFLICT(scope) DO UPDATE SET
+            version = excluded.version,
+            step_name = excluded.step_name,
+            applied_at = excluded.applied_at
+    """, (scope, migration.version, migration.name))
+
+
+def apply_migrations(conn: sqlite3.Connection, scope: str,
+                     migrations: Sequence[Migration]) -> int:
+    """
+    Применяет недостающие шаги миграции на переданном соединении.
+
+    Быстрый путь: если версия в schema_version совпадает с последним шагом,
+    выполняется ровно один SELECT.
+
+    Медленный путь берёт RESERVED-блокировку (BEGIN IMMEDIATE), чтобы два
+    процесса не мигрировали одновременно, перепроверяет версию и применяет
+    шаги по порядку. Версия фиксируется после каждого успешного шага.
+
+    Returns:
+        int: количество применённых шагов
+    """
+    ordered = _validate(migrations)
+    target = latest_version(ordered)
+
+    current = get_schema_version(conn, scope)
+    if current >= target:
+        return 0
+
+    conn.execute(_CREATE_VERSION_TABLE)
+    conn.commit()
+
+    applied = 0
+    cursor = conn.cursor()
+    for migration in ordered:
+        # Перечитываем версию под блокировкой: другой процесс мог успеть
+        if conn.in_transaction:
+            conn.commit()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if get_schema_version(conn, scope) >= migration.version:
+                conn.commit()
+                continue
+            started = time.perf_counter()
+            migration.apply(cursor)
+            if not conn.in_transaction:
+                # Шаг сам сделал commit (legacy-код) - снова берём блокировку
+                conn.execute("BEGIN IMMEDIATE")
+            _set_schema_version(cursor, scope, migration)
+            conn.commit()
+        except Exception:
+            if conn.in_transaction:
+                conn.rollback()
+            logger.error(f"❌ Migration {scope}#{migration.version} ({migration.name}) failed", exc_info=True)
+            raise
+        applied += 1
+        logger.info(
+            f"✅ Migration {scope}#{migration.version} ({migration.name}) applied "
+            f"in {(time.perf_counter() - started) * 1000:.1f}ms"
+        )
+
+    return applied
+
+
+def ensure_schema(db_path: str, scope: str, migrations: Sequence[Migration],
+                  timeout: float = 10.0,
+                  conn: Optional[sqlite3.Connection] = None) -> int:
+    """
+    Приводит схему scope в БД db_path к последней версии.
+
+    Открывает одно соединение (или использует переданное conn) и при
+    актуальной схеме выполняет только проверку версии.
+
+    Returns:
+        int: количество применённых шагов
+    """
+    if conn is not None:
+        return apply_migrations(conn, scope, migrations)
+    own_conn = sqlite3.connect(db_path, timeout=timeout)
+    try:
+        return apply_migrations(own_conn, scope, migrations)
+    finally:
+        own_conn.close()
+
+
+def get_all_schema_versions(conn: sqlite3.Connection) -> Dict[str, int]:
+    """Возвращает {scope: version} для всех scope в БД (для /admin диагностики)."""
+    try:
+        rows = conn.execute(f"SELECT scope, version FROM {SCHEMA_VERSION_TABLE}").fetchall()
+    except sqlite3.OperationalError:
+        return {}
+    return {row[0]: int(row[1]) for row in rows}
+
+
+__all__ = [
+    "SCHEMA_VERSION_TABLE",
+    "Migration",
+    "latest_version",
+    "get_schema_version",
+    "apply_migrations",
+    "ensure_schema",
+    "get_all_schema_versions",
+]
@@ -6,12 +6,18 @@ import os
 import logging
 import re
 import json
-from typing import Optional, Dict, Any, List, Pattern
+import hashlib
+from typing import Optional, Dict, Any, List, Pattern, Set
 from dataclasses import dataclass, field
 from threading import RLock
 
+from text_prefilter import hint_text
+
 logger = logging.getLogger("RVX_SECRETS")
 
+# Mask secrets in every record of the bot log handlers (SecretRedactingFilter)
+LOG_REDACTION_ENABLED = os.getenv("LOG_REDACTION_ENABLED", "true").lower() == "true"
+
 # =============================================================================
 # SECRET PATTERNS
 # =============================================================================
@@ -31,6 +37,42 @@ SECRET_PATTERNS: List[Pattern] = [
     re.compile(r'(sk_live_[a-zA-Z0-9_]+)', re.IGNORECASE),  # Stripe API keys
 ]
 
+def _leading_word(pattern: Pattern) -> Optional[str]:
+    """Word a pattern starts with (api, secret, sk_live_...), None if there is none."""
+    match = re.match(r"\(?([a-z_]+)", pattern.pattern)
+    return match.group(1) if match else None
+
+
+# Every pattern starts with a word (api, secret, token, sk_live_...): messages
+# without any of these words cannot match, so the patterns are skipped.
+# A pattern without a leading word would slip past that check - then the
+# prefilter is off and every pattern runs.
+_LEADING_WORDS = [_leading_word(p) for p in SECRET_PATTERNS]
+SECRET_PATTERN_WORDS = tuple(sorted({word for word in _LEADING_WORDS if word}))
+SECRET_PREFILTER_ENABLED = None not in _LEADING_WORDS
+SECRET_PATTERN_PREFILTER: Pattern = re.compile("|".join(SECRET_PATTERN_WORDS), re.IGNORECASE)
+
+
+def may_contain_secret_pattern(text: str) -> bool:
+    """
+    Cheap necessary condition for any SECRET_PATTERNS match.
+    
+    str.lower() plus substring checks instead of SECRET_PATTERN_PREFILTER:
+    a case-insensitive alternation in re costs ~5x more per log line.
+    """
+    if not SECRET_PREFILTER_ENABLED:
+        return True
+    lowered = hint_text(text)
+    if lowered is None:
+        return SECRET_PATTERN_PREFILTER.search(text) is not None
+    for word in SECRET_PATTERN_WORDS:
+        if word in lowered:
+            return True
+    return False
+
+# Prefix length of registered secrets used to pick candidates before SHA-256
+SECRET_PREFIX_LENGTH = 4
+
 # =============================================================================
 # DATA CLASSES
 # =============================================================================
@@ -70,6 +112,10 @@ class SecretsManager:
     def __init__(self):
         if not hasattr(self, '_initialized'):
             self._registry = SecretRegistry()
+            # Hashes for O(1) lookup and the candidate filter:
+            # secret length -> hash() of its prefix (values are never stored)
+            self._secret_hashes: Set[str] = set()
+            self._candidate_prefixes: Dict[int, Set[int]] = {}
             self._mask_char = "*"
             self._min_show_chars = 0  # Don't show any chars from secrets
             self._max_show_chars = 0
@@ -101,10 +147,10 @@ class SecretsManager:
             name: Name of the secret (for reference)
             value: The secret value to protect
         """
-        import hashlib
-        
         secret_hash = hashlib.sha256(value.encode()).hexdigest()
         self._registry.registered_secrets[name] = secret_hash
+        self._secret_hashes = set(self._registry.registered_secrets.values())
+        self._candidate_prefixes.setdefault(len(value), set()).add(hash(value[:SECRET_PREFIX_LENGTH]))
         logger.debug(f"✅ Registered secret: {name}")
     
     def is_secret(self, value: str) -> bool:
@@ -118,13 +164,18 @@ class SecretsManager:
                 return True
         
         # Check against registered secrets
-        import hashlib
-        value_hash = hashlib.sha256(value.encode()).hexdigest()
-        if value_hash in self._registry.registered_secrets.values():
+        if self._is_registered(value):
             return True
         
         return False
     
+    def _is_registered(self, word: str) -> bool:
+        """SHA-256 only for words whose length and prefix match a registered secret"""
+        prefixes = self._candidate_prefixes.get(len(word))
+        if prefixes is None or hash(word[:SECRET_PREFIX_LENGTH]) not in prefixes:
+            return False
+        return hashlib.sha256(word.encode()).hexdigest() in self._secret_hashes
+    
     def mask_value(self, value: str, secret_type: str = "unknown") -> str:
         """
         Mask a secret value
@@ -169,26 +220,26 @@ class SecretsManager:
         sanitized = text
         found_secrets = []
         
-        # Check each pattern
-        for pattern in SECRET_PATTERNS:
-            matches = pattern.finditer(sanitized)
-            for match in matches:
-                secret_value = match.group(1) if match.groups() else match.group(0)
-                found_secrets.append(secret_value)
-                
-                # Replace with masked version
-                masked = self.mask_value(secret_value, "detected")
-                sanitized = sanitized.replace(secret_value, masked)
+        # Check each pattern (only if a pattern's leading word is present)
+        if may_contain_secret_pattern(sanitized):
+            for pattern in SECRET_PATTERNS:
+                matches = pattern.finditer(sanitized)
+                for match in matches:
+                    secret_value = match.group(1) if match.groups() else match.group(0)
+                    found_secrets.append(secret_value)
+                    
+                    # Replace with masked version
+                    masked = self.mask_value(secret_value, "detected")
+                    sanitized = sanitized.replace(secret_value, masked)
         
         # Check registered secrets
-        import hashlib
-        words = sanitized.split()
-        for word in words:
-            word_hash = hashlib.sha256(word.encode()).hexdigest()
-            if word_hash in self._registry.registered_secrets.values():
-                masked = self.mask_value(word, "registered")
-                sanitized = sanitized.replace(word, masked)
-                found_secrets.append(word)
+        if self._candidate_prefixes:
+            words = sanitized.split()
+            for word in words:
+                if self._is_registered(word):
+                    masked = self.mask_value(word, "registered")
+                    sanitized = sanitized.replace(word, masked)
+                    found_secrets.append(word)
         
         if log_context and found_secrets:
             logger.warning(f"🔐 Detected {len(found_secrets)} potential secrets in log message")
@@ -282,11 +333,48 @@ class SafeLogger:
         safe_msg = self.secrets_manager.sanitize_string(msg)
         self.logger.exception(safe_msg, *args, **kwargs)
 
+class SecretRedactingFilter(logging.Filter):
+    """
+    logging.Filter that masks secrets in the final message of every record.
+    
+    Attach it to handlers (filters on a logger do not see records propagated
+    from child loggers). Messages without secret-like words or candidate
+    words of a registered secret's length pass through after two cheap checks.
+    """
+    
+    def __init__(self, manager: Optional[SecretsManager] = None):
+        super().__init__()
+        self.manager = manager or SecretsManager()
+        self.redacted = 0
+    
+    def filter(self, record: logging.LogRecord) -> bool:
+        try:
+            message = record.getMessage()
+        except Exception:
+            return True  # Broken format args are reported by the handler itself
+        sanitized = self.manager.sanitize_string(message)
+        if sanitized != message:
+            record.msg = sanitized
+            record.args = None
+            self.redacted += 1
+        return True
+
+
+def install_log_redaction(logger_instance: logging.Logger) -> int:
+    """Add the shared redaction filter to every handler of a logger; returns handler count"""
+    installed = 0
+    for handler in logger_instance.handlers:
+        if log_redaction_filter not in handler.filters:
+            handler.addFilter(log_redaction_filter)
+        installed += 1
+    return installed
+
 # =============================================================================
 # SINGLETON INSTANCES
 # =============================================================================
 
 secrets_manager = SecretsManager()
+log_redaction_filter = SecretRedactingFilter(secrets_manager)
 
 def get_safe_logger(logger_instance: logging.Logger) -> SafeLogger:
     """Get a safe logger wrapper"""
@@ -300,4 +388,9 @@ __all__ = [
     'MaskedSecret',
     'secrets_manager',
     'get_safe_logger',
+    'SecretRedactingFilter',
+    'log_redaction_filter',
+    'install_log_redaction',
+    'LOG_REDACTION_ENABLED',
+    'may_contain_secret_pattern',
 ]
@@ -6,11 +6,12 @@ import time
 import logging
 from typing import Optional, Dict, Tuple
 from datetime import datetime, timedelta
-from threading import RLock
 from functools import lru_cache
 
 from fastapi import Request, HTTPException, status
 
+from rate_limit_engine import RateLimitDecision, RateLimitPolicy, rate_limits
+
 logger = logging.getLogger("RVX_MIDDLEWARE")
 
 # =============================================================================
@@ -18,59 +19,51 @@ logger = logging.getLogger("RVX_MIDDLEWARE")
 # =============================================================================
 
 class RateLimiter:
-    """Per-IP and per-key rate limiting"""
+    """Per-IP and per-key rate limiting (GCRA policy from rate_limit_engine)"""
     
-    def __init__(self, requests_per_minute: int = 60, window_seconds: int = 60):
+    def __init__(self, requests_per_minute: int = 60, window_seconds: int = 60, name: str = "http_ip"):
         self.requests_per_minute = requests_per_minute
         self.window_seconds = window_seconds
-        self.requests: Dict[str, list] = {}
-        self._lock = RLock()
+        self.policy = RateLimitPolicy(name, requests_per_minute, window_seconds)
+    
+    def check(self, identifier: str, limit: Optional[int] = None) -> RateLimitDecision:
+        """
+        Count request and return full decision (remaining, exact Retry-After)
+        
+        Args:
+            identifier: IP address or API key hash
+            limit: Override requests per window (e.g. per-API-key limit)
+        """
+        return self.policy.hit(identifier, limit=limit)
     
-    def is_allowed(self, identifier: str) -> Tuple[bool, Optional[str]]:
+    def is_allowed(self, identifier: str, limit: Optional[int] = None) -> Tuple[bool, Optional[str]]:
         """
         Check if request is allowed under rate limit
         
         Args:
             identifier: IP address or API key hash
+            limit: Override requests per window
             
         Returns:
             (is_allowed, error_message)
         """
-        with self._lock:
-            now = time.time()
-            
-            # Initialize if first request
-            if identifier not in self.requests:
-                self.requests[identifier] = []
-            
-            # Remove old requests outside window
-            self.requests[identifier] = [
-                req_time for req_time in self.requests[identifier]
-                if now - req_time < self.window_seconds
-            ]
-            
-            # Check limit
-            if len(self.requests[identifier]) >= self.requests_per_minute:
-                return False, f"Rate limited: {self.requests_per_minute} requests per minute"
-            
-            # Record this request
-            self.requests[identifier].append(now)
-            return True, None
+        decision = self.check(identifier, limit)
+        if not decision.allowed:
+            return False, (
+                f"Rate limited: {decision.limit} requests per {self.window_seconds}s, "
+                f"retry after {decision.retry_after_seconds}s"
+            )
+        return True, None
     
     def get_stats(self, identifier: str) -> Dict:
         """Get rate limit stats for identifier"""
-        with self._lock:
-            if identifier not in self.requests:
-                return {"requests": 0, "limit": self.requests_per_minute}
-            
-            now = time.time()
-            recent = [t for t in self.requests[identifier] if now - t < self.window_seconds]
-            
-            return {
-                "requests": len(recent),
-                "limit": self.requests_per_minute,
-                "remaining": self.requests_per_minute - len(recent)
-            }
+        decision = self.policy.peek(identifier)
+        return {
+            "requests": decision.limit - decision.remaining,
+            "limit": decision.limit,
+            "remaining": decision.remaining,
+            "reset_after": decision.reset_after,
+        }
 
 # =============================================================================
 # REQUEST VALIDATOR
@@ -142,6 +135,7 @@ SECURITY_HEADERS = {
 
 # Create global rate limiter
 rate_limiter = RateLimiter(requests_per_minute=60)
+rate_limits.register(rate_limiter.policy)
 
 async def security_headers_middleware(request: Request, call_next):
     """Add security headers to responses"""
@@ -179,23 +173,22 @@ async def rate_limit_middleware(request: Request, call_next):
         client_ip = client_ip.split(",")[0].strip()
     
     # Check rate limit
-    is_allowed, error = rate_limiter.is_allowed(client_ip)
+    decision = rate_limiter.check(client_ip)
     
-    if not is_allowed:
+    if not decision.allowed:
         logger.warning(f"🔐 Rate limit exceeded for {client_ip}")
         raise HTTPException(
             status_code=429,
-            detail=error,
-            headers={"Retry-After": "60"}
+            detail=f"Rate limited: {decision.limit} requests per {rate_limiter.window_seconds}s",
+            headers={"Retry-After": str(decision.retry_after_seconds)}
         )
     
     response = await call_next(request)
     
     # Add rate limit headers
-    stats = rate_limiter.get_stats(client_ip)
-    response.headers["X-RateLimit-Limit"] = str(stats["limit"])
-    response.headers["X-RateLimit-Remaining"] = str(stats["remaining"])
-    response.headers["X-RateLimit-Reset"] = str(int(time.time()) + 60)
+    response.headers["X-RateLimit-Limit"] = str(decision.limit)
+    response.headers["X-RateLimit-Remaining"] = str(decision.remaining)
+    response.headers["X-RateLimit-Reset"] = str(int(time.time() + decision.reset_after))
     
     return response
 
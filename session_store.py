@@ -0,0 +1,399 @@
+"""
+Session Store v1.0
+Компактные сессии пользователей для BotState.
+
+Раньше BotState держал пять словарей (last_request, news, course, quiz,
+feedback) под одним asyncio.Lock, а почасовой cleanup_expired_sessions
+обходил их целиком. Теперь:
+
+- на пользователя один объект UserSession со __slots__;
+- сессии лежат в обычном dict в порядке последнего обращения (при
+  обращении ключ переставляется в конец), поэтому истёкшие всегда
+  в начале: expire() останавливается на первой живой,
+  а get() проверяет срок лениво;
+- не больше max_sessions сессий - при переполнении вытесняется самая
+  давняя (LRU);
+- без lock'ов: состояние меняется только из потока event loop,
+  синхронные методы не делают await - для asyncio операции атомарны;
+- квиз, текст для регенерации и курс можно сохранять в SQLite
+  (enable_persistence): изменения копятся и пишутся aflush()'ем,
+  а после рестарта сессия лениво поднимается из БД через load().
+  SQLite читается и пишется в потоке (asyncio.to_thread), а не в event
+  loop: get()/touch() диск не трогают, вытесненная сессия с изменениями
+  ждёт следующего flush в памяти.
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import time
+import tracemalloc
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+from schema_migrations import Migration, ensure_schema
+
+logger = logging.getLogger(__name__)
+
+SESSION_MAX_COUNT = int(os.getenv("SESSION_MAX_COUNT", "100000"))
+SESSION_TTL_SECONDS = int(os.getenv("SESSION_TTL_SECONDS", "3600"))
+FEEDBACK_ATTEMPTS_MAX = int(os.getenv("FEEDBACK_ATTEMPTS_MAX", "10000"))
+
+SESSION_SCHEMA_SCOPE = "sessions"
+
+
+def _create_session_table(cursor: sqlite3.Cursor) -> None:
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS user_sessions (
+            user_id INTEGER PRIMARY KEY,
+            news TEXT,
+            course TEXT,
+            quiz TEXT,
+            updated_at REAL NOT NULL
+        )
+    """)
+
+
+SESSION_MIGRATIONS = [
+    Migration(1, "user_sessions", _create_session_table),
+]
+
+
+class UserSession:
+    """Состояние одного пользователя."""
+
+    __slots__ = ("user_id", "last_seen", "last_request", "news", "course", "quiz")
+
+    def __init__(self, user_id: int, now: float):
+        self.user_id = user_id
+        self.last_seen = now
+        self.last_request: Optional[float] = None
+        self.news: Optional[str] = None
+        self.course: Optional[str] = None
+        self.quiz: Optional[Dict[str, Any]] = None
+
+    def has_persistent_state(self) -> bool:
+        return self.news is not None or self.course is not None or self.quiz is not None
+
+
+class SessionStore:
+    """LRU-хранилище UserSession с ленивым истечением и опциональной персистентностью."""
+
+    def __init__(self, max_sessions: int = SESSION_MAX_COUNT, ttl_seconds: float = SESSION_TTL_SECONDS,
+                 clock: Callable[[], float] = time.time):
+        self.max_sessions = max_sessions
+        self.ttl_seconds = ttl_seconds
+        self.clock = clock
+        # dict, а не OrderedDict: порядок вставки тот же, а на сессию ~50 байт меньше
+        self._sessions: Dict[int, UserSession] = {}
+        self._feedback_attempts: "OrderedDict[int, int]" = OrderedDict()
+        self._dirty: Set[int] = set()
+        # Вытесненные сессии с несохранёнными изменениями (до записи flush'ем)
+        self._evicted: Dict[int, UserSession] = {}
+        # Пользователи, чьи строки сейчас пишутся - читать их из БД рано
+        self._writing: Set[int] = set()
+        self.db_path: Optional[str] = None
+        self.evicted_count = 0
+        self.expired_count = 0
+
+    # ------------------------------------------------------------ доступ
+
+    def _expired(self, session: UserSession, now: float, ttl: Optional[float] = None) -> bool:
+        return now - session.last_seen > (self.ttl_seconds if ttl is None else ttl)
+
+    def get(self, user_id: int) -> Optional[UserSession]:
+        """
+        Сессия пользователя в памяти или None (истёкшая удаляется при обращении).
+
+        Сохранённую в БД сессию поднимает load().
+        """
+        session = self._sessions.get(user_id)
+        if session is None:
+            session = self._evicted.pop(user_id, None)
+            if session is None:
+                return None
+            self._install(session)
+        now = self.clock()
+        if self._expired(session, now):
+            self._expire(user_id)
+            return None
+        session.last_seen = now
+        # Перестановка в конец: порядок dict = порядок последнего обращения
+        self._sessions[user_id] = self._sessions.pop(user_id)
+        return session
+
+    def touch(self, user_id: int) -> UserSession:
+        """Сессия пользователя, создаётся при необходимости."""
+        session = self.get(user_id)
+        if session is not None:
+            return session
+        session = UserSession(user_id, self.clock())
+        self._install(session)
+        return session
+
+    async def load(self, user_id: int) -> Optional[UserSession]:
+        """get(), а при промахе - подъём сохранённой сессии из БД в потоке."""
+        if self._needs_load(user_id):
+            row = await asyncio.to_thread(self._read_row, user_id)
+            # Пока шло чтение, сессию могли создать - она новее строки из БД
+            if row is not None and self._needs_load(user_id):
+                self._install(self._session_from_row(user_id, row))
+        return self.get(user_id)
+
+    async def load_or_create(self, user_id: int) -> UserSession:
+        """touch() после load(): новая сессия не затирает сохранённую."""
+        await self.load(user_id)
+        return self.touch(user_id)
+
+    def _install(self, session: UserSession) -> None:
+        self._sessions[session.user_id] = session
+        if len(self._sessions) > self.max_sessions:
+            self._evict_oldest()
+
+    def mark_dirty(self, user_id: int) -> None:
+        """Отмечает сохраняемые поля сессии изменёнными (для flush)."""
+        if self.db_path is not None:
+            self._dirty.add(user_id)
+
+    def drop(self, user_id: int) -> None:
+        """Удаляет сессию (и сохранённое состояние)."""
+        self._sessions.pop(user_id, None)
+        self._evicted.pop(user_id, None)
+        # Без персистентности удалять в БД нечего - иначе _dirty растёт бесконечно
+        if self.db_path is not None:
+            self._dirty.add(user_id)
+
+    def _expire(self, user_id: int) -> None:
+        self.drop(user_id)
+        self.expired_count += 1
+
+    def _evict_oldest(self) -> None:
+        user_id = next(iter(self._sessions))
+        session = self._sessions.pop(user_id)
+        self.evicted_count += 1
+        # Несохранённые изменения вытесненной сессии запишет следующий flush;
+        # до этого get() вернёт её из памяти
+        if user_id in self._dirty:
+            self._evicted[user_id] = session
+
+    def expire(self, timeout_seconds: Optional[float] = None) -> int:
+        """
+        Удаляет сессии без обращений дольше timeout_seconds.
+
+        Сессии упорядочены по последнему обращению, поэтому обход идёт
+        только по истёкшим.
+        """
+        now = self.clock()
+        expired: List[int] = []
+        for user_id, session in self._sessions.items():
+            if not self._expired(session, now, timeout_seconds):
+                break
+            expired.append(user_id)
+        for user_id in expired:
+            self._expire(user_id)
+        return len(expired)
+
+    # ------------------------------------------------------------ feedback
+
+    def record_feedback_attempt(self, request_id: int) -> int:
+        attempt = self._feedback_attempts.pop(request_id, 0) + 1
+        self._feedback_attempts[request_id] = attempt
+        if len(self._feedback_attempts) > FEEDBACK_ATTEMPTS_MAX:
+            self._feedback_attempts.popitem(last=False)
+        return attempt
+
+    def has_feedback_attempts(self, request_id: int) -> bool:
+        return request_id in self._feedback_attempts
+
+    def clear_feedback_attempts(self, request_id: int) -> None:
+        self._feedback_attempts.pop(request_id, None)
+
+    # ------------------------------------------------------------ персистентность
+
+    def enable_persistence(self, db_path: str) -> None:
+        """Включает сохранение квиза/регенерации/курса в db_path."""
+        ensure_schema(db_path, SESSION_SCHEMA_SCOPE, SESSION_MIGRATIONS)
+        self.db_path = db_path
+        logger.info(f"💾 Сессии пользователей сохраняются в {db_path}")
+
+    def _connect(self) -> sqlite3.Connection:
+        assert self.db_path is not None, "persistence is not enabled"
+        return sqlite3.connect(self.db_path, timeout=10.0)
+
+    def _needs_load(self, user_id: int) -> bool:
+        # В _dirty без сессии в памяти - удалённый пользователь, его строка ждёт удаления
+        return (self.db_path is not None and user_id not in self._sessions and user_id not in self._evicted
+                and user_id not in self._dirty and user_id not in self._writing)
+
+    def _read_row(self, user_id: int) -> Optional[Tuple[Any, ...]]:
+        conn = self._connect()
+        try:
+            row: Optional[Tuple[Any, ...]] = conn.execute(
+                "SELECT news, course, quiz, updated_at FROM user_sessions WHERE user_id = ?", (user_id,)
+            ).fetchone()
+            return row
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _session_from_row(user_id: int, row: Tuple[Any, ...]) -> UserSession:
+        session = UserSession(user_id, row[3])
+        session.news, session.course = row[0], row[1]
+        session.quiz = json.loads(row[2]) if row[2] else None
+        return session
+
+    def _take_dirty(self) -> Tuple[Set[int], Dict[int, UserSession], List[Tuple[Any, ...]], List[int]]:
+        """Снимок изменений для записи; строки сериализуются здесь, в потоке event loop."""
+        dirty, self._dirty = self._dirty, set()
+        evicted = {user_id: self._evicted[user_id] for user_id in dirty if user_id in self._evicted}
+        rows, deleted = [], []
+        for user_id in dirty:
+            session = self._sessions.get(user_id) or evicted.get(user_id)
+            if session is not None and session.has_persistent_state():
+                rows.append((session.user_id, session.news, session.course,
+                             json.dumps(session.quiz, ensure_ascii=False) if session.quiz is not None else None,
+                             session.last_seen))
+            else:
+                deleted.append(user_id)
+        self._writing = dirty
+        return dirty, evicted, rows, deleted
+
+    def _finish_flush(self, dirty: Set[int], evicted: Dict[int, UserSession], error: Optional[Exception]) -> int:
+        self._writing = set()
+        if error is not None:
+            self._dirty |= dirty
+            logger.warning(f"⚠️ Не удалось сохранить сессии: {error}")
+            return 0
+        for user_id, session in evicted.items():
+            if self._evicted.get(user_id) is session:
+                del self._evicted[user_id]
+        return len(dirty)
+
+    def _write(self, rows: List[Tuple[Any, ...]], deleted: List[int]) -> None:
+        """Одна транзакция; сохранённые строки старше TTL больше не поднимутся - удаляются здесь же."""
+        conn = self._connect()
+        try:
+            if rows:
+                conn.executemany("""
+                    INSERT INTO user_sessions (user_id, news, course, quiz, updated_at)
+                    VALUES (?, ?, ?, ?, ?)
+                    ON CONFLICT(user_id) DO UPDATE SET
+                        news = excluded.news,
+                        course = excluded.course,
+                        quiz = excluded.quiz,
+                        updated_at = excluded.updated_at
+                """, rows)
+            if deleted:
+                conn.executemany("DELETE FROM user_sessions WHERE user_id = ?", [(uid,) for uid in deleted])
+            conn.execute("DELETE FROM user_sessions WHERE updated_at < ?", (self.clock() - self.ttl_seconds,))
+            conn.commit()
+        finally:
+            conn.close()
+
+    async def aflush(self) -> int:
+        """Записывает изменённые сессии одной транзакцией в потоке. Возвращает число записей."""
+        if self.db_path is None or not self._dirty:
+            return 0
+        dirty, evicted, rows, deleted = self._take_dirty()
+        error: Optional[Exception] = None
+        try:
+            await asyncio.to_thread(self._write, rows, deleted)
+        except sqlite3.Error as e:
+            error = e
+        return self._finish_flush(dirty, evicted, error)
+
+    def flush(self) -> int:
+        """aflush() без event loop (остановка процесса)."""
+        if self.db_path is None or not self._dirty:
+            return 0
+        dirty, evicted, rows, deleted = self._take_dirty()
+        error: Optional[Exception] = None
+        try:
+            self._write(rows, deleted)
+        except sqlite3.Error as e:
+            error = e
+        return self._finish_flush(dirty, evicted, error)
+
+    # ------------------------------------------------------------ статистика
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def __iter__(self):
+        return iter(self._sessions.values())
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "sessions": len(self._sessions),
+            "max_sessions": self.max_sessions,
+            "evicted": self.evicted_count,
+            "expired": self.expired_count,
+            "pending_writes": len(self._dirty),
+            "evicted_pending": len(self._evicted),
+            "pending_feedback": len(self._feedback_attempts),
+        }
+
+
+def measure_memory(sessions: int = 100_000) -> Dict[str, float]:
+    """
+    Память на sessions активных сессий (курс + текст для регенерации)
+    в SessionStore и в прежней раскладке из нескольких словарей.
+    """
+    news = [f"news text {i}" for i in range(sessions)]
+
+    tracemalloc.start()
+    store = SessionStore(max_sessions=sessions)
+    for user_id in range(sessions):
+        session = store.touch(user_id)
+        session.last_request = session.last_seen
+        session.news = news[user_id]
+        session.course = "bitcoin_basics"
+    store_bytes = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del store
+
+    tracemalloc.start()
+    from datetime import datetime
+    last_request, last_news, current_course = {}, {}, {}
+    for user_id in range(sessions):
+        last_request[user_id] = datetime.now()
+        last_news[user_id] = news[user_id]
+        current_course[user_id] = "bitcoin_basics"
+    dict_bytes = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    return {
+        "sessions": sessions,
+        "store_mb": store_bytes / 1024 / 1024,
+        "store_bytes_per_session": store_bytes / sessions,
+        "dicts_mb": dict_bytes / 1024 / 1024,
+        "dicts_bytes_per_session": dict_bytes / sessions,
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Session store memory report")
+    parser.add_argument("--sessions", type=int, default=100_000)
+    args = parser.parse_args(argv)
+
+    report = measure_memory(args.sessions)
+    print(f"Sessions: {report['sessions']:,}")
+    print(f"SessionStore: {report['store_mb']:.1f} MB ({report['store_bytes_per_session']:.0f} B/session)")
+    print(f"Dicts (old):  {report['dicts_mb']:.1f} MB ({report['dicts_bytes_per_session']:.0f} B/session)")
+    return 0
+
+
+__all__ = [
+    "UserSession",
+    "SessionStore",
+    "measure_memory",
+    "SESSION_MAX_COUNT",
+    "SESSION_TTL_SECONDS",
+]
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
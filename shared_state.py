@@ -0,0 +1,314 @@
+"""
+Shared State v1.0
+Общее состояние процессов бота (лимиты, инвалидация кэша подписок).
+
+Пока бот работал одним polling-процессом, лимиты и кэши жили в памяти.
+В кластере (webhook_cluster) апдейты одного пользователя всегда приходят
+в один и тот же воркер, но часть состояния общая для всех процессов:
+лимиты по IP/глобальные политики, сброс кэша подписок админом и т.п.
+Такое состояние хранится в подключаемом бэкенде:
+
+- MemoryBackend - словарь в памяти процесса (один процесс, тесты);
+- SQLiteBackend - таблица shared_state в общем файле SQLite (WAL),
+  несколько процессов на одной машине;
+- свой бэкенд (Redis и т.п.) - наследник SharedStateBackend.
+
+Значения - JSON-совместимые объекты в пространствах имён (namespace).
+update() - атомарное чтение-изменение-запись: fn(текущее) -> (новое, результат).
+Записи с ttl истекают сами: истёкшая запись не отличается от отсутствующей.
+
+Выбор бэкенда: SHARED_STATE_BACKEND=memory|sqlite, путь SHARED_STATE_PATH.
+"""
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import Any, Callable, Dict, Iterator, Optional, Tuple
+
+from schema_migrations import Migration, ensure_schema
+
+logger = logging.getLogger(__name__)
+
+SHARED_STATE_BACKEND = os.getenv("SHARED_STATE_BACKEND", "memory").lower()
+SHARED_STATE_PATH = os.getenv("SHARED_STATE_PATH", "shared_state.db")
+
+SHARED_STATE_SCHEMA_SCOPE = "shared_state"
+
+# fn(текущее значение или None) -> (новое значение или None для удаления, результат)
+UpdateFn = Callable[[Any], Tuple[Any, Any]]
+
+
+def _create_shared_state_table(cursor: sqlite3.Cursor) -> None:
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS shared_state (
+            namespace TEXT NOT NULL,
+            key TEXT NOT NULL,
+            value TEXT NOT NULL,
+            expires_at REAL,
+            PRIMARY KEY (namespace, key)
+        ) WITHOUT ROWID
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_shared_state_expires ON shared_state(expires_at)")
+
+
+SHARED_STATE_MIGRATIONS = [
+    Migration(1, "shared_state", _create_shared_state_table),
+]
+
+
+class SharedStateBackend(ABC):
+    """Интерфейс общего хранилища ключ-значение."""
+
+    name = "abstract"
+
+    @abstractmethod
+    def get(self, namespace: str, key: str) -> Any:
+        """Значение или None."""
+
+    @abstractmethod
+    def set(self, namespace: str, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        """Записывает значение (ttl в секундах, None - без срока)."""
+
+    @abstractmethod
+    def delete(self, namespace: str, key: str) -> None:
+        """Удаляет ключ."""
+
+    @abstractmethod
+    def update(self, namespace: str, key: str, fn: UpdateFn, ttl: Optional[float] = None) -> Any:
+        """Атомарно применяет fn к значению ключа, возвращает результат fn."""
+
+    @abstractmethod
+    def items(self, namespace: str) -> Iterator[Tuple[str, Any]]:
+        """Живые записи пространства имён."""
+
+    @abstractmethod
+    def clear(self, namespace: str) -> int:
+        """Удаляет все записи пространства имён."""
+
+    @abstractmethod
+    def purge_expired(self) -> int:
+        """Удаляет истёкшие записи, возвращает их количество."""
+
+    def count(self, namespace: str) -> int:
+        return sum(1 for _ in self.items(namespace))
+
+    def close(self) -> None:
+        pass
+
+    def stats(self) -> Dict[str, Any]:
+        return {"backend": self.name}
+
+
+class MemoryBackend(SharedStateBackend):
+    """Бэкенд в памяти процесса."""
+
+    name = "memory"
+
+    def __init__(self, clock: Callable[[], float] = time.time):
+        self.clock = clock
+        self._data: Dict[Tuple[str, str], Tuple[Any, Optional[float]]] = {}
+        self._lock = threading.Lock()
+
+    def _live(self, namespace: str, key: str, now: float) -> Any:
+        entry = self._data.get((namespace, key))
+        if entry is None:
+            return None
+        value, expires_at = entry
+        if expires_at is not None and expires_at <= now:
+            del self._data[(namespace, key)]
+            return None
+        return value
+
+    def get(self, namespace: str, key: str) -> Any:
+        with self._lock:
+            return self._live(namespace, key, self.clock())
+
+    def set(self, namespace: str, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        with self._lock:
+            self._data[(namespace, key)] = (value, self.clock() + ttl if ttl is not None else None)
+
+    def delete(self, namespace: str, key: str) -> None:
+        with self._lock:
+            self._data.pop((namespace, key), None)
+
+    def update(self, namespace: str, key: str, fn: UpdateFn, ttl: Optional[float] = None) -> Any:
+        with self._lock:
+            now = self.clock()
+            value, result = fn(self._live(namespace, key, now))
+            if value is None:
+                self._data.pop((namespace, key), None)
+            else:
+                self._data[(namespace, key)] = (value, now + ttl if ttl is not None else None)
+            return result
+
+    def items(self, namespace: str) -> Iterator[Tuple[str, Any]]:
+        now = self.clock()
+        with self._lock:
+            entries = [(key, value) for (ns, key), (value, expires_at) in self._data.items()
+                       if ns == namespace and (expires_at is None or expires_at > now)]
+        return iter(entries)
+
+    def clear(self, namespace: str) -> int:
+        with self._lock:
+            keys = [k for k in self._data if k[0] == namespace]
+            for k in keys:
+                del self._data[k]
+        return len(keys)
+
+    def purge_expired(self) -> int:
+        now = self.clock()
+        with self._lock:
+            expired = [k for k, (_, expires_at) in self._data.items()
+                       if expires_at is not None and expires_at <= now]
+            for k in expired:
+                del self._data[k]
+        return len(expired)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"backend": self.name, "keys": len(self._data)}
+
+
+class SQLiteBackend(SharedStateBackend):
+    """
+    Бэкенд на SQLite для нескольких процессов одной машины.
+
+    Соединение на поток, WAL (читатели не ждут писателя), update() -
+    транзакция BEGIN IMMEDIATE: процессы выполняют read-modify-write
+    одного ключа по очереди.
+    """
+
+    name = "sqlite"
+
+    def __init__(self, path: str = SHARED_STATE_PATH, clock: Callable[[], float] = time.time):
+        self.path = path
+        self.clock = clock
+        self._local = threading.local()
+        ensure_schema(path, SHARED_STATE_SCHEMA_SCOPE, SHARED_STATE_MIGRATIONS)
+        self.updates = 0
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # isolation_level=None - транзакции управляются явно
+            conn = sqlite3.connect(self.path, timeout=10.0, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _expires(self, ttl: Optional[float]) -> Optional[float]:
+        return self.clock() + ttl if ttl is not None else None
+
+    def get(self, namespace: str, key: str) -> Any:
+        row = self._conn().execute(
+            "SELECT value FROM shared_state WHERE namespace = ? AND key = ? "
+            "AND (expires_at IS NULL OR expires_at > ?)",
+            (namespace, key, self.clock())).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def set(self, namespace: str, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        self._conn().execute(
+            "INSERT OR REPLACE INTO shared_state (namespace, key, value, expires_at) VALUES (?, ?, ?, ?)",
+            (namespace, key, json.dumps(value), self._expires(ttl)))
+
+    def delete(self, namespace: str, key: str) -> None:
+        self._conn().execute("DELETE FROM shared_state WHERE namespace = ? AND key = ?", (namespace, key))
+
+    def update(self, namespace: str, key: str, fn: UpdateFn, ttl: Optional[float] = None) -> Any:
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            now = self.clock()
+            row = conn.execute(
+                "SELECT value FROM shared_state WHERE namespace = ? AND key = ? "
+                "AND (expires_at IS NULL OR expires_at > ?)", (namespace, key, now)).fetchone()
+            value, result = fn(json.loads(row[0]) if row else None)
+            if value is None:
+                if row:
+                    conn.execute("DELETE FROM shared_state WHERE namespace = ? AND key = ?", (namespace, key))
+            else:
+                conn.execute(
+                    "INSERT OR REPLACE INTO shared_state (namespace, key, value, expires_at) VALUES (?, ?, ?, ?)",
+                    (namespace, key, json.dumps(value), now + ttl if ttl is not None else None))
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        self.updates += 1
+        return result
+
+    def items(self, namespace: str) -> Iterator[Tuple[str, Any]]:
+        rows = self._conn().execute(
+            "SELECT key, value FROM shared_state WHERE namespace = ? "
+            "AND (expires_at IS NULL OR expires_at > ?)", (namespace, self.clock())).fetchall()
+        return ((key, json.loads(value)) for key, value in rows)
+
+    def count(self, namespace: str) -> int:
+        return int(self._conn().execute(
+            "SELECT COUNT(*) FROM shared_state WHERE namespace = ? "
+            "AND (expires_at IS NULL OR expires_at > ?)", (namespace, self.clock())).fetchone()[0])
+
+    def clear(self, namespace: str) -> int:
+        return self._conn().execute("DELETE FROM shared_state WHERE namespace = ?", (namespace,)).rowcount
+
+    def purge_expired(self) -> int:
+        removed = self._conn().execute(
+            "DELETE FROM shared_state WHERE expires_at IS NOT NULL AND expires_at <= ?",
+            (self.clock(),)).rowcount
+        if removed:
+            logger.debug(f"🧹 Shared state: удалено {removed} истёкших записей")
+        return removed
+
+    def close(self) -> None:
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {"backend": self.name, "path": self.path, "updates": self.updates}
+
+
+def create_backend(kind: Optional[str] = None, path: Optional[str] = None) -> SharedStateBackend:
+    """Бэкенд по имени (по умолчанию из SHARED_STATE_BACKEND)."""
+    kind = (kind or SHARED_STATE_BACKEND).lower()
+    if kind == "memory":
+        return MemoryBackend()
+    if kind == "sqlite":
+        return SQLiteBackend(path or SHARED_STATE_PATH)
+    raise ValueError(f"Unknown shared state backend: {kind}")
+
+
+_backend: Optional[SharedStateBackend] = None
+_backend_lock = threading.Lock()
+
+
+def get_shared_backend() -> SharedStateBackend:
+    """Общий бэкенд процесса (создаётся при первом обращении)."""
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            _backend = create_backend()
+            logger.info(f"🗄️ Общее состояние: {_backend.name}")
+        return _backend
+
+
+def set_shared_backend(backend: Optional[SharedStateBackend]) -> None:
+    global _backend
+    with _backend_lock:
+        _backend = backend
+
+
+__all__ = [
+    "SharedStateBackend",
+    "MemoryBackend",
+    "SQLiteBackend",
+    "create_backend",
+    "get_shared_backend",
+    "set_shared_backend",
+    "SHARED_STATE_MIGRATIONS",
+]
@@ -0,0 +1,327 @@
+"""
+Storage Router v1.0
+Раздельные SQLite-файлы для пользовательских данных, телеметрии и кэша.
+
+Телеметрия (bot_events, audit_logs, api_usage_log, analytics) и кэш ответов
+пишутся часто и пачками. В общем rvx_bot.db они удерживали единственную
+WAL-блокировку записи, которая нужна users / user_progress /
+conversation_history. Роутер раскладывает эти таблицы по отдельным файлам,
+у каждого свой пул соединений и свои PRAGMA.
+
+Маршруты:
+    main       - rvx_bot.db (пользовательские данные)
+    telemetry  - rvx_bot_telemetry.db (env TELEMETRY_DB_PATH)
+    cache      - rvx_bot_cache.db (env CACHE_DB_PATH)
+
+Использование:
+    with routed_connection(ROUTE_TELEMETRY) as conn:
+        conn.execute("INSERT INTO analytics ...")
+
+    # Кросс-БД отчёты для админки
+    attach_routes(conn, DB_PATH)
+    conn.execute("SELECT COUNT(*) FROM cache_db.cache")
+"""
+
+import os
+import queue
+import sqlite3
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+from schema_migrations import Migration, ensure_schema
+
+logger = logging.getLogger(__name__)
+
+ROUTE_MAIN = "main"
+ROUTE_TELEMETRY = "telemetry"
+ROUTE_CACHE = "cache"
+
+ROUTES = (ROUTE_MAIN, ROUTE_TELEMETRY, ROUTE_CACHE)
+
+# Таблица -> маршрут. Всё, чего здесь нет, живёт в основной БД.
+TABLE_ROUTES: Dict[str, str] = {
+    "bot_events": ROUTE_TELEMETRY,
+    "audit_logs": ROUTE_TELEMETRY,
+    "api_usage_log": ROUTE_TELEMETRY,
+    "analytics": ROUTE_TELEMETRY,
+    "cache": ROUTE_CACHE,
+}
+
+ROUTE_ENV_VARS: Dict[str, str] = {
+    ROUTE_TELEMETRY: "TELEMETRY_DB_PATH",
+    ROUTE_CACHE: "CACHE_DB_PATH",
+}
+
+# Кэш восстанавливается заново - ему не нужен fsync на каждый commit. В
+# телеметрии лежит audit_logs, поэтому она, как и main, пишется с
+# synchronous=NORMAL: в WAL это fsync только на checkpoint, а закоммиченные
+# записи переживают падение процесса.
+ROUTE_PRAGMAS: Dict[str, Tuple[str, ...]] = {
+    ROUTE_MAIN: (
+        "PRAGMA journal_mode=WAL",
+        "PRAGMA synchronous=NORMAL",
+        "PRAGMA busy_timeout=10000",
+    ),
+    ROUTE_TELEMETRY: (
+        "PRAGMA journal_mode=WAL",
+        "PRAGMA synchronous=NORMAL",
+        "PRAGMA busy_timeout=2000",
+        "PRAGMA wal_autocheckpoint=4000",
+    ),
+    ROUTE_CACHE: (
+        "PRAGMA journal_mode=WAL",
+        "PRAGMA synchronous=OFF",
+        "PRAGMA busy_timeout=2000",
+        "PRAGMA temp_store=MEMORY",
+    ),
+}
+
+ROUTE_POOL_SIZES: Dict[str, int] = {
+    ROUTE_MAIN: 5,
+    ROUTE_TELEMETRY: int(os.getenv("TELEMETRY_DB_POOL_SIZE", "3")),
+    ROUTE_CACHE: int(os.getenv("CACHE_DB_POOL_SIZE", "3")),
+}
+
+
+def _check_route(route: str) -> None:
+    if route not in ROUTES:
+        raise ValueError(f"Unknown storage route: {route}")
+
+
+def route_for_table(table: str) -> str:
+    """Возвращает маршрут, в котором живёт таблица."""
+    return TABLE_ROUTES.get(table, ROUTE_MAIN)
+
+
+def resolve_db_path(route: str, main_db_path: Optional[str] = None) -> str:
+    """
+    Путь к файлу БД для маршрута.
+
+    Явная переменная окружения (TELEMETRY_DB_PATH / CACHE_DB_PATH) имеет
+    приоритет; иначе файл кладётся рядом с основной БД:
+    /data/rvx_bot.db -> /data/rvx_bot_telemetry.db
+    """
+    _check_route(route)
+    if main_db_path is None:
+        main_db_path = os.getenv("DATABASE_PATH", "./rvx_bot.db")
+    main_db_path = os.path.abspath(main_db_path)
+    if route == ROUTE_MAIN:
+        return main_db_path
+
+    override = os.getenv(ROUTE_ENV_VARS[route])
+    if override:
+        return os.path.abspath(override)
+
+    stem, ext = os.path.splitext(main_db_path)
+    return f"{stem}_{route}{ext or '.db'}"
+
+
+# =============================================================================
+# РЕЕСТР СХЕМ
+# =============================================================================
+
+_route_schemas: Dict[str, List[Tuple[str, Sequence[Migration]]]] = {route: [] for route in ROUTES}
+_ensured: set = set()
+_registry_lock = threading.Lock()
+
+
+def register_schema(route: str, scope: str, migrations: Sequence[Migration]) -> None:
+    """
+    Регистрирует миграции таблиц, которые живут в маршруте.
+
+    Схема применяется лениво при первом открытии соединения к файлу
+    маршрута (одна проверка версии на файл за процесс).
+    """
+    _check_route(route)
+    with _registry_lock:
+        schemas = _route_schemas[route]
+        schemas[:] = [(s, m) for s, m in schemas if s != scope]
+        schemas.append((scope, migrations))
+        # Новый набор миграций нужно проверить заново
+        for key in [k for k in _ensured if k[1] == scope]:
+            _ensured.discard(key)
+
+
+def _ensure_route_schema(route: str, db_path: str) -> None:
+    with _registry_lock:
+        pending = [(s, m) for s, m in _route_schemas[route] if (db_path, s) not in _ensured]
+    for scope, migrations in pending:
+        ensure_schema(db_path, scope, migrations)
+        with _registry_lock:
+            _ensured.add((db_path, scope))
+
+
+# =============================================================================
+# ПУЛ СОЕДИНЕНИЙ
+# =============================================================================
+
+def apply_route_pragmas(conn: sqlite3.Connection, route: str) -> None:
+    """Применяет PRAGMA маршрута к соединению."""
+    for pragma in ROUTE_PRAGMAS[route]:
+        conn.execute(pragma)
+
+
+class RoutedConnectionPool:
+    """
+    Потокобезопасный пул соединений к одному файлу маршрута.
+
+    Соединения выдаются эксклюзивно (checkout/checkin), поэтому одно
+    соединение никогда не используется двумя потоками одновременно.
+    Если пул пуст, открывается временное соединение, которое при возврате
+    закрывается, если пул уже полон.
+    """
+
+    def __init__(self, route: str, db_path: str, pool_size: int):
+        _check_route(route)
+        self.route = route
+        self.db_path = db_path
+        self.pool_size = pool_size
+        self._pool: "queue.LifoQueue[sqlite3.Connection]" = queue.LifoQueue(maxsize=pool_size)
+        self.stats = {"created": 0, "reused": 0, "discarded": 0}
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, timeout=10.0, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        apply_route_pragmas(conn, self.route)
+        self.stats["created"] += 1
+        return conn
+
+    def acquire(self) -> sqlite3.Connection:
+        try:
+            conn = self._pool.get_nowait()
+            self.stats["reused"] += 1
+            return conn
+        except queue.Empty:
+            return self._connect()
+
+    def release(self, conn: sqlite3.Connection) -> None:
+        if conn.in_transaction:
+            conn.rollback()
+        try:
+            self._pool.put_nowait(conn)
+        except queue.Full:
+            self.stats["discarded"] += 1
+            conn.close()
+
+    def close(self) -> None:
+        while True:
+            try:
+                self._pool.get_nowait().close()
+            except queue.Empty:
+                break
+
+    def get_stats(self) -> Dict:
+        return {
+            "route": self.route,
+            "db_path": self.db_path,
+            "pool_size": self.pool_size,
+            "idle": self._pool.qsize(),
+            **self.stats,
+        }
+
+
+_pools: Dict[str, RoutedConnectionPool] = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(route: str, main_db_path: Optional[str] = None) -> RoutedConnectionPool:
+    """Пул для маршрута (создаётся и мигрируется при первом обращении)."""
+    db_path = resolve_db_path(route, main_db_path)
+    pool = _pools.get(db_path)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.get(db_path)
+            if pool is None:
+                pool = RoutedConnectionPool(route, db_path, ROUTE_POOL_SIZES[route])
+                _pools[db_path] = pool
+                logger.info(f"🗄️ Storage route '{route}' -> {db_path}")
+    _ensure_route_schema(route, db_path)
+    return pool
+
+
+@contextmanager
+def routed_connection(route: str, main_db_path: Optional[str] = None) -> Iterator[sqlite3.Connection]:
+    """
+    Соединение к БД маршрута: commit при успехе, rollback при ошибке.
+    """
+    pool = get_pool(route, main_db_path)
+    conn = pool.acquire()
+    try:
+        yield conn
+        if conn.in_transaction:
+            conn.commit()
+    except Exception:
+        if conn.in_transaction:
+            conn.rollback()
+        raise
+    finally:
+        pool.release(conn)
+
+
+# =============================================================================
+# КРОСС-БД ОТЧЁТЫ
+# =============================================================================
+
+def attach_alias(route: str) -> str:
+    """Имя схемы, под которым маршрут подключается через ATTACH."""
+    return f"{route}_db"
+
+
+def attach_routes(conn: sqlite3.Connection, main_db_path: Optional[str] = None,
+                  routes: Sequence[str] = (ROUTE_TELEMETRY, ROUTE_CACHE)) -> List[str]:
+    """
+    Подключает БД маршрутов к соединению основной БД через ATTACH.
+
+    Повторный вызов на том же (например, пуловом) соединении безопасен.
+    Таблицы доступны как telemetry_db.analytics, cache_db.cache и т.д.
+
+    Returns:
+        List[str]: имена подключённых схем
+    """
+    attached = {row[1] for row in conn.execute("PRAGMA database_list").fetchall()}
+    aliases = []
+    for route in routes:
+        if route == ROUTE_MAIN:
+            continue
+        alias = attach_alias(route)
+        if alias not in attached:
+            # Пул создаёт файл и схему, чтобы ATTACH не вернул пустую БД
+            db_path = get_pool(route, main_db_path).db_path
+            conn.execute(f"ATTACH DATABASE ? AS {alias}", (db_path,))
+        aliases.append(alias)
+    return aliases
+
+
+def close_all_pools() -> None:
+    """Закрывает все пулы маршрутов (shutdown / тесты)."""
+    with _pools_lock:
+        for pool in _pools.values():
+            pool.close()
+        _pools.clear()
+    with _registry_lock:
+        _ensured.clear()
+
+
+def get_router_stats() -> List[Dict]:
+    """Статистика пулов для /admin диагностики."""
+    return [pool.get_stats() for pool in list(_pools.values())]
+
+
+__all__ = [
+    "ROUTE_MAIN",
+    "ROUTE_TELEMETRY",
+    "ROUTE_CACHE",
+    "TABLE_ROUTES",
+    "route_for_table",
+    "resolve_db_path",
+    "register_schema",
+    "RoutedConnectionPool",
+    "get_pool",
+    "routed_connection",
+    "attach_alias",
+    "attach_routes",
+    "close_all_pools",
+    "get_router_stats",
+]
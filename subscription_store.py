@@ -0,0 +1,317 @@
+"""
+Subscription Store v1.0
+Состояние подписки на обязательный канал без запроса к Bot API на каждое сообщение.
+
+Раньше check_channel_subscription держал неограниченный dict с TTL 5 минут:
+каждый активный пользователь стоил один get_chat_member каждые 5 минут,
+ошибки API не кэшировались вовсе. Теперь:
+
+- состояние обновляется событиями chat_member канала (join/leave видны
+  сразу); событие могло потеряться (бот был выключен, а апдейты при старте
+  сбрасываются), поэтому и такие записи перепроверяются через API раз в
+  SUBSCRIPTION_VERIFY_TTL;
+- без событий подписанные перепроверяются раз в SUBSCRIPTION_VERIFY_TTL,
+  неподписанные - раз в SUBSCRIPTION_CACHE_TTL;
+- при ошибке API действует короткий негативный кэш SUBSCRIPTION_ERROR_TTL;
+- в памяти не больше SUBSCRIPTION_STORE_SIZE записей (LRU), всё кроме
+  ошибок сохраняется в channel_subscriptions и переживает перезапуск.
+
+В кластере события пользователя приходят в его воркер, а сброс кэша
+(invalidate) может выполнить любой процесс. Полный сброс увеличивает
+поколение в общем бэкенде (shared_state), сброс одного пользователя
+дописывается в журнал последних сбросов. Остальные процессы сверяются
+не чаще раза в SUBSCRIPTION_SYNC_INTERVAL: при смене поколения очищают
+LRU, иначе удаляют только пользователей из новых записей журнала.
+"""
+
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+from schema_migrations import Migration, ensure_schema
+from shared_state import SharedStateBackend
+
+logger = logging.getLogger(__name__)
+
+SUBSCRIPTION_STORE_SIZE = int(os.getenv("SUBSCRIPTION_STORE_SIZE", "50000"))
+SUBSCRIPTION_CACHE_TTL = int(os.getenv("SUBSCRIPTION_CACHE_TTL", "300"))
+SUBSCRIPTION_VERIFY_TTL = int(os.getenv("SUBSCRIPTION_VERIFY_TTL", "21600"))
+SUBSCRIPTION_ERROR_TTL = int(os.getenv("SUBSCRIPTION_ERROR_TTL", "30"))
+SUBSCRIPTION_SYNC_INTERVAL = float(os.getenv("SUBSCRIPTION_SYNC_INTERVAL", "1"))
+SUBSCRIPTION_INVALIDATION_LOG = int(os.getenv("SUBSCRIPTION_INVALIDATION_LOG", "1000"))
+
+SUBSCRIPTION_SCHEMA_SCOPE = "subscriptions"
+
+SUBSCRIBED_STATUSES = frozenset({"member", "administrator", "creator"})
+
+# Откуда известно состояние
+SOURCE_EVENT = "event"
+SOURCE_API = "api"
+SOURCE_ERROR = "error"
+
+GENERATION_NAMESPACE = "subscriptions:generation"
+INVALIDATIONS_NAMESPACE = "subscriptions:invalidations"
+
+
+def _create_subscription_table(cursor: sqlite3.Cursor) -> None:
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS channel_subscriptions (
+            channel_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            is_subscribed INTEGER NOT NULL,
+            source TEXT NOT NULL,
+            status TEXT,
+            updated_at REAL NOT NULL,
+            PRIMARY KEY (channel_id, user_id)
+        ) WITHOUT ROWID
+    """)
+
+
+SUBSCRIPTION_MIGRATIONS = [
+    Migration(1, "channel_subscriptions", _create_subscription_table),
+]
+
+
+@dataclass(frozen=True)
+class SubscriptionState:
+    is_subscribed: bool
+    source: str
+    updated_at: float
+
+    def expires_at(self) -> float:
+        if self.source == SOURCE_ERROR:
+            return self.updated_at + SUBSCRIPTION_ERROR_TTL
+        if self.source == SOURCE_EVENT or self.is_subscribed:
+            return self.updated_at + SUBSCRIPTION_VERIFY_TTL
+        return self.updated_at + SUBSCRIPTION_CACHE_TTL
+
+    def is_fresh(self, now: Optional[float] = None) -> bool:
+        return (now or time.time()) < self.expires_at()
+
+
+class SubscriptionStore:
+    """LRU в памяти поверх таблицы channel_subscriptions (на один канал)."""
+
+    def __init__(self, db_path: str, channel_id: int, max_entries: int = SUBSCRIPTION_STORE_SIZE,
+                 backend: Optional[SharedStateBackend] = None):
+        self.db_path = db_path
+        self.channel_id = channel_id
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[int, Optional[SubscriptionState]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "db_loads": 0, "events": 0, "api_checks": 0, "errors": 0, "resyncs": 0}
+        ensure_schema(self.db_path, SUBSCRIPTION_SCHEMA_SCOPE, SUBSCRIPTION_MIGRATIONS)
+        self.backend: Optional[SharedStateBackend] = None
+        self._generation = 0
+        self._invalidation_seq = 0
+        self._next_sync = 0.0
+        if backend is not None:
+            self.use_backend(backend)
+
+    def use_backend(self, backend: Optional[SharedStateBackend]) -> None:
+        """Синхронизация сбросов кэша между процессами через общий бэкенд."""
+        self.backend = backend
+        self._generation = self._read_generation()
+        self._invalidation_seq = self._read_invalidations()[0]
+        self._next_sync = time.monotonic() + SUBSCRIPTION_SYNC_INTERVAL
+
+    def _read_generation(self) -> int:
+        if self.backend is None:
+            return 0
+        return self.backend.get(GENERATION_NAMESPACE, str(self.channel_id)) or 0
+
+    def _read_invalidations(self) -> Tuple[int, List[List[int]]]:
+        """(последний номер, [[номер, user_id], ...]) журнала сбросов отдельных пользователей."""
+        if self.backend is None:
+            return 0, []
+        log = self.backend.get(INVALIDATIONS_NAMESPACE, str(self.channel_id))
+        return (log["seq"], log["users"]) if log else (0, [])
+
+    def _sync(self) -> None:
+        """Применяет сбросы кэша, выполненные другими процессами."""
+        if self.backend is None:
+            return
+        now = time.monotonic()
+        if now < self._next_sync:
+            return
+        self._next_sync = now + SUBSCRIPTION_SYNC_INTERVAL
+        generation = self._read_generation()
+        seq, users = self._read_invalidations()
+        if generation != self._generation:
+            self._generation = generation
+            self._invalidation_seq = seq
+            with self._lock:
+                self._entries.clear()
+            self.stats["resyncs"] += 1
+            return
+        if seq == self._invalidation_seq:
+            return
+        # Журнал ограничен: если часть пропущенных записей уже вытеснена - полный сброс
+        complete = bool(users) and users[0][0] <= self._invalidation_seq + 1
+        with self._lock:
+            if complete:
+                for entry_seq, user_id in users:
+                    if entry_seq > self._invalidation_seq:
+                        self._entries.pop(user_id, None)
+            else:
+                self._entries.clear()
+                self.stats["resyncs"] += 1
+        self._invalidation_seq = seq
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.db_path, timeout=10.0)
+
+    def _remember(self, user_id: int, state: Optional[SubscriptionState]) -> None:
+        with self._lock:
+            self._entries[user_id] = state
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def _load(self, user_id: int) -> Optional[SubscriptionState]:
+        conn = self._connect()
+        try:
+            row = conn.execute("""
+                SELECT is_subscribed, source, updated_at FROM channel_subscriptions
+                WHERE channel_id = ? AND user_id = ?
+            """, (self.channel_id, user_id)).fetchone()
+        finally:
+            conn.close()
+        self.stats["db_loads"] += 1
+        return SubscriptionState(bool(row[0]), row[1], row[2]) if row else None
+
+    def _persist(self, user_id: int, state: SubscriptionState, status: Optional[str]) -> None:
+        try:
+            conn = self._connect()
+            try:
+                conn.execute("""
+                    INSERT INTO channel_subscriptions (channel_id, user_id, is_subscribed, source, status, updated_at)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                    ON CONFLICT(channel_id, user_id) DO UPDATE SET
+                        is_subscribed = excluded.is_subscribed,
+                        source = excluded.source,
+                        status = excluded.status,
+                        updated_at = excluded.updated_at
+                """, (self.channel_id, user_id, int(state.is_subscribed), state.source, status, state.updated_at))
+                conn.commit()
+            finally:
+                conn.close()
+        except sqlite3.Error as e:
+            # Состояние в памяти всё равно верное, потеряется только после рестарта
+            logger.warning(f"⚠️ Не удалось сохранить подписку {user_id}: {e}")
+
+    def get(self, user_id: int) -> Optional[SubscriptionState]:
+        """Актуальное состояние или None, если нужна проверка через API."""
+        self._sync()
+        state: Optional[SubscriptionState] = None
+        with self._lock:
+            cached = user_id in self._entries
+            if cached:
+                state = self._entries[user_id]
+                self._entries.move_to_end(user_id)
+        if not cached:
+            state = self._load(user_id)
+            self._remember(user_id, state)
+        if state is not None and state.is_fresh():
+            self.stats["hits"] += 1
+            return state
+        return None
+
+    def record_event(self, user_id: int, status: str) -> SubscriptionState:
+        """Событие chat_member канала: авторитетное состояние без срока."""
+        self.stats["events"] += 1
+        return self._record(user_id, status, SOURCE_EVENT)
+
+    def record_check(self, user_id: int, status: str) -> SubscriptionState:
+        """Результат get_chat_member."""
+        self.stats["api_checks"] += 1
+        return self._record(user_id, status, SOURCE_API)
+
+    def _record(self, user_id: int, status: str, source: str) -> SubscriptionState:
+        state = SubscriptionState(status in SUBSCRIBED_STATUSES, source, time.time())
+        self._remember(user_id, state)
+        self._persist(user_id, state, status)
+        return state
+
+    def record_error(self, user_id: int) -> SubscriptionState:
+        """Ошибка API: короткий негативный кэш, только в памяти."""
+        self.stats["errors"] += 1
+        state = SubscriptionState(False, SOURCE_ERROR, time.time())
+        self._remember(user_id, state)
+        return state
+
+    def invalidate(self, user_id: Optional[int] = None, keep_events: bool = False) -> None:
+        """
+        Сбрасывает состояние (следующая проверка пойдёт в API).
+
+        keep_events=True оставляет состояния из событий канала (они перепроверяются
+        по SUBSCRIPTION_VERIFY_TTL). Другие процессы при полном сбросе очищают LRU,
+        при сбросе одного пользователя - только его запись.
+        """
+        with self._lock:
+            if user_id is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(user_id, None)
+        conn = self._connect()
+        try:
+            params: Tuple[Union[int, str], ...]
+            if user_id is None:
+                sql = "DELETE FROM channel_subscriptions WHERE channel_id = ?"
+                params = (self.channel_id,)
+            else:
+                sql = "DELETE FROM channel_subscriptions WHERE channel_id = ? AND user_id = ?"
+                params = (self.channel_id, user_id)
+            if keep_events:
+                sql += " AND source != ?"
+                params += (SOURCE_EVENT,)
+            conn.execute(sql, params)
+            conn.commit()
+        finally:
+            conn.close()
+        if self.backend is None:
+            return
+        if user_id is None:
+            self._generation = self.backend.update(
+                GENERATION_NAMESPACE, str(self.channel_id),
+                lambda generation: ((generation or 0) + 1, (generation or 0) + 1))
+        else:
+            self.backend.update(INVALIDATIONS_NAMESPACE, str(self.channel_id),
+                                lambda log: _append_invalidation(log, user_id))
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+def _append_invalidation(log: Optional[Dict[str, Any]], user_id: int) -> Tuple[Dict[str, Any], int]:
+    seq = (log["seq"] if log else 0) + 1
+    users = (log["users"] if log else []) + [[seq, user_id]]
+    return {"seq": seq, "users": users[-SUBSCRIPTION_INVALIDATION_LOG:]}, seq
+
+
+_stores: Dict[tuple, SubscriptionStore] = {}
+_stores_lock = threading.Lock()
+
+
+def get_subscription_store(db_path: str, channel_id: int,
+                           backend: Optional[SharedStateBackend] = None) -> SubscriptionStore:
+    """SubscriptionStore для (БД, канал) - один экземпляр на процесс."""
+    key = (os.path.abspath(db_path), channel_id)
+    with _stores_lock:
+        if key not in _stores:
+            _stores[key] = SubscriptionStore(db_path, channel_id, backend=backend)
+        return _stores[key]
+
+
+__all__ = [
+    "SubscriptionState",
+    "SubscriptionStore",
+    "get_subscription_store",
+    "SUBSCRIBED_STATUSES",
+    "SUBSCRIPTION_MIGRATIONS",
+]
@@ -7,11 +7,14 @@ RVX Teaching Module v0.37.10 - Интерактивное обучение кр
 import httpx
 import json
 import os
-from typing import Optional, Dict, Any, Tuple
+from typing import Optional, Dict, Any, List, Tuple
 from dotenv import load_dotenv
 import logging
 import asyncio
 
+from json_extractor import as_is, extract_json, strip_markdown_markers
+from lesson_cache import DEFAULT_LESSON_LANGUAGE, LessonCache, LessonKey
+
 load_dotenv()
 logger = logging.getLogger("RVX_TEACHER")
 
@@ -176,54 +179,24 @@ def create_teaching_config(level: str = "beginner") -> dict:
     }
 
 
+def _single_to_double_quotes(text: str) -> str:
+    return text.replace("'", '"')
+
+
+# Исправления для ответов учителя: одиночные кавычки. Маркеры **, __, ~~
+# снимаются до поиска JSON - как раньше, и в валидном JSON тоже
+TEACHING_JSON_REPAIRS = (as_is, _single_to_double_quotes)
+
+
 def extract_teaching_json(raw_text: str) -> Optional[dict]:
-    """Извлекает JSON из ответа учителя."""
+    """Извлекает JSON из ответа учителя (<json> обертка, markdown блок или скобки)."""
     if not raw_text:
         return None
     
-    import re
-    
-    # Сначала ищем <json>...</json> обертку (от API)
-    json_wrap = re.search(r'<json>(.*?)</json>', raw_text, re.DOTALL | re.IGNORECASE)
-    if json_wrap:
-        text_to_parse = json_wrap.group(1)
-    else:
-        # Удаляем markdown блоки
-        text = re.sub(r'```json\s*', '', raw_text, flags=re.IGNORECASE).strip()
-        text = re.sub(r'```\s*', '', text).strip()
-        
-        # Ищем JSON напрямую - от первого { до последнего }
-        json_start = text.find('{')
-        json_end = text.rfind('}')
-        
-        if json_start == -1 or json_end == -1 or json_start > json_end:
-            logger.warning(f"JSON не найден в ответе (ищем {{}} скобки)")
-            return None
-        
-        text_to_parse = text[json_start:json_end+1]
-    
-    # Очищаем от маркеров
-    text_to_parse = text_to_parse.replace("**", "").replace("__", "").replace("~~", "")
-    
-    try:
-        data = json.loads(text_to_parse)
-        if isinstance(data, dict):
-            return data
-        return None
-    except json.JSONDecodeError as e:
-        logger.debug(f"JSON parse error (попытка 1): {e}")
-        
-        # Пытаемся исправить с заменой кавычек
-        cleaned = text_to_parse.replace("'", '"')
-        try:
-            data = json.loads(cleaned)
-            if isinstance(data, dict):
-                return data
-            return None
-        except json.JSONDecodeError as e2:
-            logger.warning(f"JSON parse error (попытка 2): {e2}")
-            logger.debug(f"Текст для парса: {text_to_parse[:200]}")
-            return None
+    data = extract_json(strip_markdown_markers(raw_text), repairs=TEACHING_JSON_REPAIRS)
+    if data is None:
+        logger.warning(f"JSON не найден или не разобран в ответе учителя: {raw_text[:200]}")
+    return data
 
 
 def validate_teaching_response(data: dict) -> Tuple[bool, Optional[str]]:
@@ -357,13 +330,14 @@ def convert_topic_name_to_embedded(topic: str) -> str:
 async def teach_lesson(
     topic: str,
     difficulty_level: str = "beginner",
-    user_knowledge_context: Optional[str] = None
+    user_knowledge_context: Optional[str] = None,
+    language: str = DEFAULT_LESSON_LANGUAGE
 ) -> Optional[Dict[str, Any]]:
     """
     Создает интерактивный урок.
     
     Сначала пытается использовать встроенного преподавателя (встроенные уроки),
-    затем - API endpoint если встроенный урок не найден.
+    затем - урок от ИИ из кэша уроков (lesson_cache), при промахе - 4 ИИ.
     Возвращает словарь с уроком или None если ошибка.
     """
     try:
@@ -396,37 +370,14 @@ async def teach_lesson(
         except Exception as e:
             logger.warning(f"⚠️ embedded_teacher ошибка: {e}, используем API fallback")
         
-        # ✅ v0.37.10: НОВАЯ АРХИТЕКТУРА - 4 ИИ напрямую, БЕЗ API
-        # Попытаемся 4 ИИ в порядке приоритета: Groq → Mistral → DeepSeek → Gemini
-        logger.info(f"🤖 Пытаемся 4 ИИ для создания урока...")
-        
-        # Groq (самый быстрый)
-        logger.info(f"🚀 Попытка 1: Groq...")
-        groq_result = await teach_lesson_via_groq(topic, difficulty_level)
-        if groq_result and groq_result.get("lesson_title"):
-            logger.info(f"✅ Groq создал урок!")
-            return groq_result
-        
-        # Mistral (fallback 1)
-        logger.info(f"🟣 Попытка 2: Mistral...")
-        mistral_result = await teach_lesson_via_mistral(topic, difficulty_level)
-        if mistral_result and mistral_result.get("lesson_title"):
-            logger.info(f"✅ Mistral создал урок!")
-            return mistral_result
-        
-        # DeepSeek (fallback 2)
-        logger.info(f"🔵 Попытка 3: DeepSeek...")
-        deepseek_result = await teach_lesson_via_deepseek(topic, difficulty_level)
-        if deepseek_result and deepseek_result.get("lesson_title"):
-            logger.info(f"✅ DeepSeek создал урок!")
-            return deepseek_result
-        
-        # Gemini (fallback 3)
-        logger.info(f"💎 Попытка 4: Gemini...")
-        gemini_result = await teach_lesson_via_gemini_direct(topic, difficulty_level)
-        if gemini_result and gemini_result.get("lesson_title"):
-            logger.info(f"✅ Gemini создал урок!")
-            return gemini_result
+        # ✅ Урок от ИИ - из кэша уроков: готовый отдаётся сразу, устаревший
+        # обновляется в фоне, 4 ИИ вызываются только при настоящем промахе
+        if topic in TEACHING_TOPICS and difficulty_level in DIFFICULTY_LEVELS:
+            ai_lesson = await lesson_cache.get(topic, difficulty_level, language)
+        else:
+            ai_lesson = await generate_ai_lesson(topic, difficulty_level, language)
+        if ai_lesson and ai_lesson.get("lesson_title"):
+            return ai_lesson
         
         # Если все 4 ИИ не сработали, используем встроенный урок как fallback
         logger.warning(f"⚠️ Все 4 ИИ не сработали, используем встроенный урок")
@@ -435,7 +386,66 @@ async def teach_lesson(
     except Exception as e:
         logger.error(f"❌ Критическая ошибка в teach_lesson: {e}", exc_info=True)
         return _get_fallback_lesson(topic, difficulty_level)
-        return _get_fallback_lesson(topic, difficulty_level)
+
+
+async def generate_ai_lesson(
+    topic: str,
+    difficulty_level: str = "beginner",
+    language: str = DEFAULT_LESSON_LANGUAGE
+) -> Optional[Dict[str, Any]]:
+    """
+    Генерирует урок через 4 ИИ по очереди; None если ни один не ответил.
+    
+    Промпты провайдеров пока только на русском: language - часть ключа
+    кэша уроков, чтобы уроки на разных языках не смешивались.
+    """
+    # ✅ v0.37.10: НОВАЯ АРХИТЕКТУРА - 4 ИИ напрямую, БЕЗ API
+    # Попытаемся 4 ИИ в порядке приоритета: Groq → Mistral → DeepSeek → Gemini
+    logger.info(f"🤖 Пытаемся 4 ИИ для создания урока...")
+    
+    # Groq (самый быстрый)
+    logger.info(f"🚀 Попытка 1: Groq...")
+    groq_result = await teach_lesson_via_groq(topic, difficulty_level)
+    if groq_result and groq_result.get("lesson_title"):
+        logger.info(f"✅ Groq создал урок!")
+        return groq_result
+    
+    # Mistral (fallback 1)
+    logger.info(f"🟣 Попытка 2: Mistral...")
+    mistral_result = await teach_lesson_via_mistral(topic, difficulty_level)
+    if mistral_result and mistral_result.get("lesson_title"):
+        logger.info(f"✅ Mistral создал урок!")
+        return mistral_result
+    
+    # DeepSeek (fallback 2)
+    logger.info(f"🔵 Попытка 3: DeepSeek...")
+    deepseek_result = await teach_lesson_via_deepseek(topic, difficulty_level)
+    if deepseek_result and deepseek_result.get("lesson_title"):
+        logger.info(f"✅ DeepSeek создал урок!")
+        return deepseek_result
+    
+    # Gemini (fallback 3)
+    logger.info(f"💎 Попытка 4: Gemini...")
+    gemini_result = await teach_lesson_via_gemini_direct(topic, difficulty_level)
+    if gemini_result and gemini_result.get("lesson_title"):
+        logger.info(f"✅ Gemini создал урок!")
+        return gemini_result
+    
+    return None
+
+
+def lesson_cache_keys() -> List[LessonKey]:
+    """Ключи (тема, уровень, язык), для которых нет встроенного урока - их покрывает кэш."""
+    from embedded_teacher import get_difficulties_for_topic
+    keys: List[LessonKey] = []
+    for topic in TEACHING_TOPICS:
+        embedded = get_difficulties_for_topic(convert_topic_name_to_embedded(topic))
+        keys.extend((topic, level, DEFAULT_LESSON_LANGUAGE) for level in DIFFICULTY_LEVELS if level not in embedded)
+    return keys
+
+
+# Уроки от ИИ, общие для всех пользователей; прогрев запускает бот (periodic_lesson_cache_warm)
+lesson_cache = LessonCache(generate_ai_lesson, expected=lesson_cache_keys)
 
 
 async def teach_lesson_via_gemini_direct(
@@ -0,0 +1,53 @@
+"""
+Лёгкий воркер кластера для e2e-теста webhook_cluster.
+
+Запускается мастером вместо bot.py: то же приложение PTB
+(UpdateDispatcher + BackpressureQueue + serve_worker), общий лимит
+в shared_state и эхо-хендлер, отвечающий через фейковый Bot API
+с номером воркера: "w<id>:<текст>" или "limited:<текст>".
+"""
+
+import os
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import asyncio  # noqa: E402
+
+from telegram import Update  # noqa: E402
+from telegram.ext import Application, MessageHandler, filters  # noqa: E402
+
+from rate_limit_engine import rate_limits  # noqa: E402
+from shared_state import create_backend  # noqa: E402
+from update_dispatcher import BackpressureQueue, UpdateDispatcher  # noqa: E402
+from webhook_cluster import BOT_WORKER_ID, BOT_WORKER_PORT, serve_worker  # noqa: E402
+
+GLOBAL_LIMIT = int(os.getenv("E2E_GLOBAL_LIMIT", "40"))
+
+
+def build_application() -> Application:
+    dispatcher = UpdateDispatcher(max_concurrent=8)
+    application = (
+        Application.builder()
+        .token(os.environ["TELEGRAM_BOT_TOKEN"])
+        .base_url(os.environ["FAKE_BOT_API_URL"])
+        .concurrent_updates(dispatcher)
+        .update_queue(BackpressureQueue(dispatcher))
+        .build()
+    )
+    rate_limits.use_backend(create_backend())
+    policy = rate_limits.policy("e2e_global", limit=GLOBAL_LIMIT, window=600)
+
+    async def echo(update: Update, context) -> None:
+        text = update.effective_message.text
+        await asyncio.sleep(0.01)
+        prefix = f"w{BOT_WORKER_ID}" if policy.try_acquire("all") == 0.0 else "limited"
+        await context.bot.send_message(update.effective_chat.id, f"{prefix}:{text}")
+
+    application.add_handler(MessageHandler(filters.TEXT & filters.ChatType.PRIVATE, echo))
+    return application
+
+
+if __name__ == "__main__":
+    asyncio.run(serve_worker(build_application(), port=BOT_WORKER_PORT))
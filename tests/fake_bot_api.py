@@ -0,0 +1,100 @@
+"""
+Локальный фейковый Bot API для интеграционных тестов.
+
+getUpdates отдаёт записанный поток апдейтов (как его вернул Telegram)
+с учётом offset, остальные методы записываются в calls и отвечают
+правдоподобными результатами. Бот подключается через
+Application.builder().base_url(server.base_url).
+"""
+
+import itertools
+import json
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from aiohttp import web
+
+RECORDED_UPDATES = Path(__file__).parent / "recorded_updates.json"
+
+BOT_USER = {"id": 123, "is_bot": True, "first_name": "RVX Test", "username": "rvx_test_bot"}
+
+
+def load_recorded_updates(path: Path = RECORDED_UPDATES) -> List[Dict[str, Any]]:
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+class FakeBotAPI:
+    """aiohttp-сервер с подмножеством Bot API."""
+
+    def __init__(self, updates: Optional[List[Dict[str, Any]]] = None, token: str = "123:abc"):
+        self.token = token
+        self.updates = list(updates or [])
+        self.calls: List[Dict[str, Any]] = []
+        self.acked_offset = 0
+        self._message_ids = itertools.count(1000)
+        self._runner: Optional[web.AppRunner] = None
+        self.port: Optional[int] = None
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.port}/bot"
+
+    async def start(self) -> "FakeBotAPI":
+        app = web.Application()
+        app.router.add_route("*", "/bot{token}/{method}", self._handle)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, "127.0.0.1", 0)
+        await site.start()
+        self.port = site._server.sockets[0].getsockname()[1]
+        return self
+
+    async def stop(self) -> None:
+        if self._runner is not None:
+            await self._runner.cleanup()
+
+    async def __aenter__(self) -> "FakeBotAPI":
+        return await self.start()
+
+    async def __aexit__(self, *exc) -> None:
+        await self.stop()
+
+    def calls_of(self, method: str) -> List[Dict[str, Any]]:
+        return [call for call in self.calls if call["method"] == method]
+
+    @property
+    def all_delivered(self) -> bool:
+        """Все записанные апдейты отданы и подтверждены следующим offset."""
+        return not self.updates or self.acked_offset > self.updates[-1]["update_id"]
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        if request.match_info["token"] != self.token:
+            return web.json_response({"ok": False, "error_code": 401, "description": "Unauthorized"}, status=401)
+        method = request.match_info["method"]
+        params: Dict[str, Any] = dict(await request.post()) if request.can_read_body else {}
+        params.update(request.query)
+        self.calls.append({"method": method, "params": params, "at": time.monotonic()})
+        handler = getattr(self, f"_{method}", None)
+        result = handler(params) if handler else True
+        return web.json_response({"ok": True, "result": result})
+
+    def _getMe(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        return BOT_USER
+
+    def _getUpdates(self, params: Dict[str, Any]) -> List[Dict[str, Any]]:
+        offset = int(params.get("offset") or 0)
+        limit = int(params.get("limit") or 100)
+        self.acked_offset = max(self.acked_offset, offset)
+        return [u for u in self.updates if u["update_id"] >= offset][:limit]
+
+    def _sendMessage(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        chat_id = int(params["chat_id"])
+        return {
+            "message_id": next(self._message_ids),
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private" if chat_id > 0 else "channel"},
+            "from": BOT_USER,
+            "text": params.get("text", ""),
+        }
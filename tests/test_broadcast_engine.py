@@ -0,0 +1,178 @@
+"""
+Tests for broadcast_engine: token bucket pacing, RetryAfter handling,
+blocked-user bookkeeping and resumable jobs.
+"""
+
+import asyncio
+import sqlite3
+import time
+from types import SimpleNamespace
+
+import pytest
+from telegram.error import BadRequest, Forbidden, RetryAfter
+
+import bot as bot_module
+from broadcast_engine import (
+    BroadcastEngine, TokenBucket, format_progress, send_with_retry,
+    STATUS_COMPLETED, STATUS_FAILED, STATUS_RUNNING
+)
+
+
+class FakeBot:
+    """send_message с настраиваемыми ошибками по chat_id."""
+
+    def __init__(self, errors=None, delay=0.0):
+        self.errors = errors or {}
+        self.delay = delay
+        self.sent = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def send_message(self, chat_id, text, **kwargs):
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            if self.delay:
+                await asyncio.sleep(self.delay)
+            pending = self.errors.get(chat_id)
+            if pending:
+                error = pending.pop(0) if isinstance(pending, list) else pending
+                raise error
+            self.sent.append(chat_id)
+            return chat_id
+        finally:
+            self.in_flight -= 1
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    path = str(tmp_path / "broadcast.db")
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE users (user_id INTEGER PRIMARY KEY, is_banned INTEGER DEFAULT 0)")
+    conn.executemany("INSERT INTO users (user_id, is_banned) VALUES (?, ?)",
+                     [(i, 1 if i == 5 else 0) for i in range(1, 41)])
+    conn.commit()
+    conn.close()
+    return path
+
+
+def make_engine(db_path, **kwargs):
+    kwargs.setdefault("bucket", TokenBucket(rate=10000, capacity=10000))
+    kwargs.setdefault("page_size", 10)
+    return BroadcastEngine(db_path, **kwargs)
+
+
+@pytest.mark.asyncio
+async def test_token_bucket_paces_sends():
+    bucket = TokenBucket(rate=100, capacity=5)
+    started = time.monotonic()
+    for _ in range(25):
+        await bucket.acquire()
+    # 5 из запаса + 20 по 10ms
+    assert time.monotonic() - started >= 0.18
+
+
+@pytest.mark.asyncio
+async def test_retry_after_pauses_and_retries():
+    bot = FakeBot(errors={1: [RetryAfter(0.2)]})
+    bucket = TokenBucket(rate=1000, capacity=10)
+    started = time.monotonic()
+    await send_with_retry(bot, 1, "hi", bucket=bucket)
+    assert bot.sent == [1]
+    assert time.monotonic() - started >= 0.19
+
+
+@pytest.mark.asyncio
+async def test_job_sends_to_everyone_but_banned(db_path):
+    engine = make_engine(db_path)
+    bot = FakeBot()
+    job = await engine.run_job(bot, engine.create_job("hello"))
+    assert job.status == STATUS_COMPLETED
+    assert job.total == 39
+    assert job.sent == 39
+    assert 5 not in bot.sent
+    assert engine.get_job(job.id).cursor_user_id == 40
+
+
+@pytest.mark.asyncio
+async def test_blocked_users_skipped_by_later_jobs(db_path):
+    engine = make_engine(db_path)
+    bot = FakeBot(errors={
+        3: Forbidden("Forbidden: bot was blocked by the user"),
+        7: BadRequest("Chat not found"),
+    })
+    job = await engine.run_job(bot, engine.create_job("one"))
+    assert (job.sent, job.blocked) == (37, 2)
+    assert engine.blocked_count() == 2
+
+    bot = FakeBot()
+    job = await engine.run_job(bot, engine.create_job("two"))
+    assert job.total == 37
+    assert 3 not in bot.sent and 7 not in bot.sent
+
+    engine.unmark_blocked(3)
+    assert engine.count_recipients() == 38
+
+
+@pytest.mark.asyncio
+async def test_resume_from_cursor_after_interruption(db_path):
+    engine = make_engine(db_path)
+    bot = FakeBot(delay=0.01)
+    job_id = engine.create_job("resume me")
+
+    task = engine.start_job(bot, job_id)
+    while engine.get_job(job_id).cursor_user_id < 20:
+        await asyncio.sleep(0.005)
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+
+    interrupted = engine.get_job(job_id)
+    assert interrupted.status == STATUS_RUNNING
+    assert engine.unfinished_jobs() == [job_id]
+
+    # "Новый процесс" продолжает с курсора
+    restarted = make_engine(db_path)
+    resumed_bot = FakeBot()
+    assert restarted.resume_unfinished(resumed_bot) == [job_id]
+    await asyncio.gather(*restarted._tasks.values())
+
+    job = restarted.get_job(job_id)
+    assert job.status == STATUS_COMPLETED
+    assert min(resumed_bot.sent) > interrupted.cursor_user_id
+    assert job.sent == 39
+
+
+@pytest.mark.asyncio
+async def test_concurrency_cap_and_progress(db_path):
+    engine = make_engine(db_path, concurrency=3, progress_interval=0)
+    bot = FakeBot(delay=0.005)
+    updates = []
+
+    async def on_progress(job, rate):
+        updates.append((job.processed, job.status))
+
+    await engine.run_job(bot, engine.create_job("x"), on_progress)
+    assert bot.max_in_flight <= 3
+    assert updates[-1] == (39, STATUS_COMPLETED)
+    assert len(updates) >= 4
+
+
+@pytest.mark.asyncio
+async def test_parse_error_fails_job(db_path):
+    engine = make_engine(db_path)
+    bot = FakeBot(errors={1: BadRequest("Can't parse entities: unclosed bold")})
+    job = await engine.run_job(bot, engine.create_job("**broken"))
+    assert job.status == STATUS_FAILED
+    assert "parse entities" in format_progress(job, 0.0)
+    assert engine.unfinished_jobs() == []
+
+
+@pytest.mark.asyncio
+async def test_channel_post_sends_numeric_channel_id_as_int(monkeypatch):
+    context = SimpleNamespace(bot=FakeBot())
+    monkeypatch.setattr(bot_module, "UPDATE_CHANNEL_ID", "-100123")
+    assert await bot_module.send_channel_post(context, "post")
+    monkeypatch.setattr(bot_module, "UPDATE_CHANNEL_ID", "@updates")
+    assert await bot_module.send_channel_post(context, "post")
+    assert context.bot.sent == [-100123, "@updates"]
@@ -0,0 +1,151 @@
+"""
+Tests for course_store: lesson texts, views and quiz questions identical to
+the per-request markdown parsing, edge cases of the lesson boundaries,
+mtime hot-reload and lesson-open latency.
+"""
+
+import os
+import re
+import time
+
+import pytest
+
+import education
+from course_store import CourseStore, parse_course
+from education import (
+    COURSES_DATA, clean_lesson_content, extract_quiz_from_lesson, get_lesson_content, get_lesson_quiz,
+    get_lesson_view, split_lesson_content
+)
+
+
+def legacy_get_lesson_content(course_name, lesson_num, include_tests=False, file_path=None):
+    """education.get_lesson_content до course_store: чтение файла и регулярки."""
+    file_path = file_path or COURSES_DATA[course_name]['file']
+    if not os.path.exists(file_path):
+        return None
+    with open(file_path, 'r', encoding='utf-8') as f:
+        content = f.read()
+    match = re.search(rf'## Lesson {lesson_num}:(.*?)(?=## Lesson|\Z)', content, re.DOTALL)
+    if not match:
+        return None
+    lesson_text = match.group(1).strip()
+    if include_tests and re.search(r'# ТЕСТЫ К КУРСУ(.*?)## Тест к Уроку.*?(?=## Тест к Уроку|\Z)', content, re.DOTALL):
+        lesson_text += '\n\n' + re.search(r'# ТЕСТЫ К КУРСУ(.*)(?:\Z)', content, re.DOTALL).group(0)
+    return lesson_text
+
+
+def legacy_quiz(course_name, lesson_num):
+    """Вопросы, как их собирал show_quiz_for_lesson."""
+    content = legacy_get_lesson_content(course_name, lesson_num, include_tests=True)
+    if not content:
+        return None
+    _, quiz_text = split_lesson_content(content)
+    if quiz_text:
+        return extract_quiz_from_lesson(quiz_text)
+    return extract_quiz_from_lesson("", lesson_number=lesson_num, full_course_content=content)
+
+
+LESSONS = [(course, number) for course in COURSES_DATA for number in range(0, 8)]
+
+
+@pytest.mark.parametrize("course,number", LESSONS)
+def test_lessons_match_legacy_parsing(course, number):
+    for include_tests in (False, True):
+        assert get_lesson_content(course, number, include_tests) == \
+            legacy_get_lesson_content(course, number, include_tests)
+    legacy = legacy_get_lesson_content(course, number)
+    expected_view = split_lesson_content(clean_lesson_content(legacy)) if legacy else None
+    assert get_lesson_view(course, number) == expected_view
+    assert get_lesson_quiz(course, number) == legacy_quiz(course, number)
+
+
+def test_real_courses_are_indexed():
+    index = education.course_store.course("blockchain_basics")
+    assert sorted(index.lessons) == [1, 2, 3, 4, 5]
+    assert [index.lessons[n].next_number for n in (1, 5)] == [2, None]
+    assert index.tests_section.startswith("# ТЕСТЫ К КУРСУ")
+    assert index.lessons[1].title.startswith("Архитектура блокчейна")
+    assert all(get_lesson_quiz("blockchain_basics", n) for n in range(1, 6))
+    assert get_lesson_content("unknown_course", 1) is None
+    assert get_lesson_content("blockchain_basics", "2") == get_lesson_content("blockchain_basics", 2)
+
+
+EDGE_CASES = [
+    "# Курс\n## Lesson 1: Первый\nтекст\n### Lesson notes внутри\nещё\n## Lesson 2: Второй\nконец",
+    "## Lesson 1: A\nraz\n## Lesson 1: дубль\ndva\n## Lesson 01: ноль\n## Lesson 3:три",
+    "## Lesson 2: без тестов\n# ТЕСТЫ К КУРСУ\nнет заголовков тестов",
+    "## Lesson 1: x\n**Q1: Вопрос?**\n- A) да ✅\n- B) нет\n\n# ТЕСТЫ К КУРСУ\n## Тест к Уроку 1\n**Q1: B?**\n- A) a\n- B) b ✅\n",
+    "Введение без уроков",
+    "## Lesson 5:\n",
+]
+
+
+@pytest.mark.parametrize("content", EDGE_CASES)
+def test_lesson_boundaries_edge_cases(tmp_path, content):
+    path = tmp_path / "course.md"
+    path.write_text(content, encoding="utf-8")
+    store = CourseStore({"demo": {"file": str(path)}}, check_interval=0)
+    for number in range(0, 6):
+        lesson = store.lesson("demo", number)
+        for include_tests in (False, True):
+            expected = legacy_get_lesson_content("demo", number, include_tests, file_path=str(path))
+            actual = None if lesson is None else lesson.text_with_tests if include_tests else lesson.text
+            assert actual == expected, (number, include_tests)
+    lessons, _ = parse_course("demo", content)
+    assert all(lessons[n].next_number in lessons or lessons[n].next_number is None for n in lessons)
+
+
+def test_hot_reload_on_mtime_change(tmp_path):
+    path = tmp_path / "course.md"
+    path.write_text("## Lesson 1: старый\nтекст", encoding="utf-8")
+    store = CourseStore({"demo": {"file": str(path)}}, check_interval=0)
+    first = store.lesson("demo", 1)
+    assert first.text == "старый\nтекст"
+    assert store.lesson("demo", 1) is first
+
+    path.write_text("## Lesson 1: новый\nтекст\n## Lesson 2: ещё", encoding="utf-8")
+    stat = path.stat()
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+    assert store.lesson("demo", 1).text == "новый\nтекст"
+    assert store.lesson("demo", 1).next_number == 2
+    assert store.stats()["reloads"] == 1
+
+    path.unlink()
+    assert store.lesson("demo", 1) is None
+    assert store.stats()["courses"] == 0
+
+    # С интервалом проверки mtime между обращениями не читается
+    path.write_text("## Lesson 1: снова", encoding="utf-8")
+    lazy = CourseStore({"demo": {"file": str(path)}}, check_interval=60)
+    assert lazy.lesson("demo", 1).text == "снова"
+    path.unlink()
+    assert lazy.lesson("demo", 1).text == "снова"
+
+
+def test_quiz_questions_are_copies():
+    questions = get_lesson_quiz("defi_contracts", 2)
+    questions[0]["answers"].append("лишний")
+    questions[0]["text"] = "изменён"
+    assert get_lesson_quiz("defi_contracts", 2) == legacy_quiz("defi_contracts", 2)
+
+
+@pytest.mark.slow
+def test_lesson_open_benchmark():
+    """Открытие урока и квиза: чтение файла + регулярки против индекса."""
+    lessons = [(course, number) for course in COURSES_DATA for number in range(1, 6)] * 10
+    education.course_store.warm()
+
+    started = time.process_time()
+    for course, number in lessons:
+        split_lesson_content(clean_lesson_content(legacy_get_lesson_content(course, number)))
+        legacy_quiz(course, number)
+    legacy = (time.process_time() - started) / len(lessons)
+
+    started = time.process_time()
+    for course, number in lessons:
+        get_lesson_view(course, number)
+        get_lesson_quiz(course, number)
+    indexed = (time.process_time() - started) / len(lessons)
+
+    print(f"\nlesson + quiz open: markdown parsing {legacy * 1e6:.1f} µs, course_store {indexed * 1e6:.1f} µs")
+    assert indexed * 10 < legacy
@@ -32,10 +32,10 @@ from ai_dialogue import (
 @pytest.fixture
 def reset_rate_limit():
     """Сброс rate limit перед каждым тестом"""
-    from ai_dialogue import ai_request_history
-    ai_request_history.clear()
+    from ai_dialogue import ai_rate_policy
+    ai_rate_policy.reset()
     yield
-    ai_request_history.clear()
+    ai_rate_policy.reset()
 
 
 @pytest.fixture
@@ -118,7 +118,7 @@ class TestAIRateLimiting:
     
     def test_rate_limit_window_expiration(self, reset_rate_limit):
         """Лимит должен сброситься после истечения окна"""
-        from ai_dialogue import ai_request_history, AI_RATE_LIMIT_WINDOW
+        from ai_dialogue import ai_rate_policy
         
         # Запросы в окне
         for i in range(10):
@@ -128,9 +128,8 @@ class TestAIRateLimiting:
         is_allowed, _, _ = check_ai_rate_limit(user_id=123)
         assert is_allowed == False
         
-        # Эмулируем истечение окна
-        now = time.time()
-        ai_request_history[123] = [now - AI_RATE_LIMIT_WINDOW - 1]
+        # Эмулируем истечение окна: TAT пользователя уже в прошлом
+        ai_rate_policy.set_tat(123, ai_rate_policy.clock() - 1)
         
         # Должен быть разрешен (окно очищено)
         is_allowed, remaining, _ = check_ai_rate_limit(user_id=123)
@@ -0,0 +1,204 @@
+"""
+Tests for event_rollups: incremental hourly/daily aggregates of bot_events,
+activity bitmaps for DAU/retention and AI latency sketches.
+"""
+
+import os
+import random
+import sqlite3
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+from event_rollups import EventRollups, LatencySketch, _bitmap_from_indices, _popcount
+from event_tracker import Analytics, EventTracker, EventType, create_event
+from reporting_pool import close_reporting_pools
+
+
+@pytest.fixture
+def tracker():
+    with tempfile.TemporaryDirectory() as path:
+        yield EventTracker(os.path.join(path, "events.db"))
+        close_reporting_pools()
+
+
+def _insert_raw(db_path, rows):
+    """rows: (event_type, user_id, timestamp, data_json)"""
+    conn = sqlite3.connect(db_path)
+    conn.executemany(
+        "INSERT INTO bot_events (event_type, user_id, timestamp, data, metadata) VALUES (?, ?, ?, ?, '{}')",
+        rows
+    )
+    conn.commit()
+    conn.close()
+
+
+class TestLatencySketch:
+
+    def test_quantiles_within_relative_error(self):
+        rng = random.Random(7)
+        values = [rng.lognormvariate(6, 0.8) for _ in range(5000)]
+        sketch = LatencySketch()
+        for value in values:
+            sketch.add(value)
+
+        ordered = sorted(values)
+        for q in (0.5, 0.95, 0.99):
+            exact = ordered[int(q * (len(ordered) - 1))]
+            assert abs(sketch.quantile(q) - exact) / exact < 0.05
+
+    def test_merge_and_roundtrip(self):
+        a, b = LatencySketch(), LatencySketch()
+        for value in (10, 20, 30):
+            a.add(value)
+        for value in (1000, 2000):
+            b.add(value)
+        merged = LatencySketch.from_json(a.to_json()).merge(b)
+        assert merged.count == 5
+        assert abs(merged.quantile(0.5) - 30) < 1.5
+        assert abs(merged.quantile(1.0) - 2000) < 100
+        assert LatencySketch().quantile(0.5) is None
+
+
+def test_bitmap_helpers():
+    bitmap = _bitmap_from_indices([0, 3, 64, 1000])
+    assert _popcount(bitmap) == 4
+    assert _popcount(bitmap & _bitmap_from_indices([3, 5])) == 1
+
+
+class TestRefresh:
+
+    def test_counts_and_active_users(self, tracker):
+        for user_id in (1, 2, 2):
+            tracker.track(create_event(EventType.USER_ANALYZE, user_id=user_id))
+        tracker.track(create_event(EventType.USER_START, user_id=3))
+
+        rollups = EventRollups(tracker.db_path)
+        assert rollups.refresh() == 4
+        assert rollups.counts_by_type(24) == {"user_analyze": 3, "user_start": 1}
+        assert rollups.active_users(24) == 3
+        assert rollups.top_users(24, limit=1) == [{"user_id": 2, "event_count": 2, "rank": 1}]
+
+    def test_refresh_is_incremental(self, tracker):
+        rollups = EventRollups(tracker.db_path)
+        tracker.track(create_event(EventType.USER_START, user_id=1))
+        assert rollups.refresh() == 1
+        assert rollups.refresh() == 0
+
+        tracker.track(create_event(EventType.USER_START, user_id=1))
+        assert rollups.refresh() == 1
+        assert rollups.counts_by_type(24) == {"user_start": 2}
+        assert rollups.active_users(24) == 1
+        assert rollups.get_state()["lag_events"] == 0
+
+    def test_small_batches_match_single_pass(self, tracker, monkeypatch):
+        import event_rollups
+        monkeypatch.setattr(event_rollups, "ROLLUP_BATCH_SIZE", 3)
+        for i in range(10):
+            tracker.track(create_event(EventType.USER_ANALYZE, user_id=i % 4))
+
+        rollups = EventRollups(tracker.db_path)
+        assert rollups.refresh(max_batches=2) == 6
+        assert rollups.get_state()["lag_events"] == 4
+        assert rollups.refresh() == 4
+        assert rollups.counts_by_type(24) == {"user_analyze": 10}
+        assert rollups.active_users(24) == 4
+
+    def test_daily_retention(self, tracker):
+        now = datetime.now()
+        yesterday = (now - timedelta(days=1)).isoformat()
+        today = now.isoformat()
+        _insert_raw(tracker.db_path, [
+            ("user_start", 1, yesterday, "{}"),
+            ("user_start", 2, yesterday, "{}"),
+            ("user_start", 1, today, "{}"),
+            ("user_start", 3, today, "{}"),
+        ])
+        rollups = EventRollups(tracker.db_path)
+        rollups.refresh()
+
+        retention = rollups.retention()
+        assert retention["active_7d"] == 3
+        assert retention["retention_d1"] == 50.0
+        dau = rollups.daily_active_users(2)
+        assert dau[now.strftime("%Y-%m-%d")] == 2
+        assert dau[(now - timedelta(days=1)).strftime("%Y-%m-%d")] == 2
+
+    def test_ai_latency(self, tracker):
+        for seconds in (0.1, 0.2, 0.3, 2.0):
+            tracker.track(create_event(EventType.AI_SUCCESS, data={"duration": seconds}))
+        tracker.track(create_event(EventType.AI_TIMEOUT, data={"duration_ms": 30000}))
+
+        rollups = EventRollups(tracker.db_path)
+        rollups.refresh()
+        perf = rollups.ai_performance(24)
+        assert perf["total_requests"] == 5
+        assert perf["success_rate"] == 80.0
+        assert perf["timeouts"] == 1
+        assert perf["max_duration_ms"] == 30000
+        assert 190 <= perf["p50_ms"] <= 310
+
+    def test_prune_keeps_daily(self, tracker):
+        old = (datetime.now() - timedelta(days=20)).isoformat()
+        _insert_raw(tracker.db_path, [("user_start", 1, old, "{}")])
+        rollups = EventRollups(tracker.db_path)
+        rollups.refresh()
+        assert rollups.prune(keep_hourly_days=8) == 2
+        assert rollups.counts_by_type(24 * 30) == {"user_start": 1}
+
+
+def test_analytics_reads_rollups(tracker):
+    tracker.track(create_event(EventType.AI_SUCCESS, user_id=1, data={"duration": 1.5}))
+    tracker.track(create_event(EventType.USER_ANALYZE, user_id=1))
+    analytics = Analytics(tracker)
+
+    perf = analytics.get_ai_performance()
+    assert perf["total_requests"] == 1
+    assert perf["avg_duration"] == 1.5
+    assert dict(analytics.get_feature_usage()) == {"ai_success": 1, "user_analyze": 1}
+    assert analytics.get_daily_active_users(1) == {datetime.now().strftime("%Y-%m-%d"): 1}
+
+
+def test_enqueued_events_are_written_in_batches(tracker, monkeypatch):
+    monkeypatch.setattr("event_tracker.EVENT_BATCH_SIZE", 3)
+    monkeypatch.setattr("event_tracker.EVENT_FLUSH_INTERVAL", 3600)
+    tracker.flush()
+    writes = []
+    write = tracker._write
+    monkeypatch.setattr(tracker, "_write", lambda events: writes.append(len(events)) or write(events))
+
+    for seconds in (0.1, 0.2, 0.3, 0.4):
+        tracker.enqueue(create_event(EventType.AI_SUCCESS, data={"duration": seconds}))
+    assert writes == [3]
+    assert tracker.flush() == 1 and tracker.flush() == 0
+    assert writes == [3, 1]
+    assert len(tracker.get_events(EventType.AI_SUCCESS)) == 4
+
+
+@pytest.mark.slow
+def test_dashboard_read_time_independent_of_volume(tracker):
+    """Dashboard reads after refresh touch only the rollup rows for the window."""
+    from admin_dashboard import AdminDashboard
+
+    def seed_and_time(count):
+        now = datetime.now()
+        rows = [
+            ("user_analyze" if i % 3 else "ai_success", i % 500,
+             (now - timedelta(minutes=i % 1440)).isoformat(), '{"duration": 0.5}')
+            for i in range(count)
+        ]
+        _insert_raw(tracker.db_path, rows)
+        dashboard = AdminDashboard.__new__(AdminDashboard)
+        dashboard.tracker = tracker
+        dashboard.rollups.refresh()
+        started = time.perf_counter()
+        for _ in range(5):
+            dashboard.get_dashboard_metrics(hours=24)
+        return (time.perf_counter() - started) / 5
+
+    small = seed_and_time(1000)
+    large = seed_and_time(50000)
+    print(f"\ndashboard read: 1k events={small * 1000:.1f}ms, 51k events={large * 1000:.1f}ms")
+    assert large < small * 3 + 0.01
@@ -0,0 +1,341 @@
+"""
+Tests for gamification_engine: lesson completion equal to the legacy
+update_task_progress + add_xp_to_user + check_and_award_badges sequence,
+one transaction per award, events after commit, concurrent awards without
+lost XP, a failed lesson write that keeps the XP, leaderboard invalidation
+for XP granted outside the engine, the single-query quest progress and DB
+round-trips per lesson.
+"""
+
+import os
+import random
+import sqlite3
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+import pytest
+
+import bot
+from daily_quests_v2 import get_completed_quests_today, get_daily_quest_xp_earned, get_quest_progress_today
+from education import add_xp_to_user, calculate_user_level_and_xp
+from gamification_engine import (
+    ACHIEVEMENT_BADGES, EVENT_BADGE, EVENT_LESSON_COMPLETED, EVENT_LEVEL_UP, EVENT_TASK_COMPLETED, EVENT_XP,
+    GamificationEngine, level_for_xp
+)
+
+SCHEMA = """
+CREATE TABLE users (user_id INTEGER PRIMARY KEY, xp INTEGER DEFAULT 0, level INTEGER DEFAULT 1);
+CREATE TABLE teaching_lessons (
+    id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER NOT NULL, topic TEXT NOT NULL,
+    difficulty TEXT NOT NULL, title TEXT, completed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    quiz_passed BOOLEAN DEFAULT 0, xp_earned INTEGER DEFAULT 50, repeat_count INTEGER DEFAULT 0,
+    UNIQUE(user_id, topic, difficulty)
+);
+CREATE TABLE user_badges (
+    id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER NOT NULL, badge_id TEXT NOT NULL,
+    badge_name TEXT, badge_emoji TEXT, badge_description TEXT,
+    earned_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP, condition_met TEXT, UNIQUE(user_id, badge_id)
+);
+CREATE TABLE daily_tasks (
+    id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER, task_type TEXT, xp_reward INTEGER,
+    progress INTEGER DEFAULT 0, target INTEGER, completed BOOLEAN DEFAULT 0,
+    reset_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+CREATE TABLE user_quiz_responses (
+    id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER, lesson_id INTEGER, question_number INTEGER,
+    is_correct BOOLEAN, xp_earned INTEGER DEFAULT 0, answered_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+"""
+
+TOPICS = ["blockchain", "defi", "nft", "security", "trading", "ai"]
+DIFFICULTIES = ["beginner", "intermediate", "advanced", "expert"]
+LESSON_XP = 50
+
+
+class Database:
+    """Временная БД с get_db-подобным контекстом и счётчиком обращений."""
+
+    def __init__(self, path):
+        self.path = path
+        self.connections = 0
+        self.statements = 0
+        with sqlite3.connect(path) as conn:
+            conn.executescript(SCHEMA)
+            conn.execute("PRAGMA journal_mode=WAL")
+
+    @contextmanager
+    def connect(self):
+        conn = sqlite3.connect(self.path, timeout=10.0)
+        conn.set_trace_callback(self._count)
+        self.connections += 1
+        try:
+            yield conn
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+    def _count(self, statement):
+        if not statement.startswith(("BEGIN", "COMMIT", "ROLLBACK", "SAVEPOINT", "RELEASE")):
+            self.statements += 1
+
+    def add_user(self, user_id, xp=0, task_target=2, task_reward=20):
+        with sqlite3.connect(self.path) as conn:
+            conn.execute("INSERT INTO users (user_id, xp) VALUES (?, ?)", (user_id, xp))
+            conn.execute("INSERT INTO daily_tasks (user_id, task_type, xp_reward, target) VALUES (?, 'lessons_2', ?, ?)",
+                         (user_id, task_reward, task_target))
+
+    def state(self, user_id):
+        with sqlite3.connect(self.path) as conn:
+            return (
+                conn.execute("SELECT xp, level FROM users WHERE user_id = ?", (user_id,)).fetchone(),
+                sorted(conn.execute("SELECT topic, difficulty, repeat_count, quiz_passed, xp_earned FROM teaching_lessons "
+                                    "WHERE user_id = ?", (user_id,)).fetchall()),
+                sorted(conn.execute("SELECT badge_id, badge_name FROM user_badges WHERE user_id = ?", (user_id,)).fetchall()),
+                conn.execute("SELECT progress, completed FROM daily_tasks WHERE user_id = ?", (user_id,)).fetchall(),
+            )
+
+
+@pytest.fixture
+def make_db():
+    with tempfile.TemporaryDirectory() as path:
+        databases = []
+
+        def factory(name="rvx_bot.db"):
+            databases.append(Database(os.path.join(path, name)))
+            return databases[-1]
+
+        yield factory
+
+
+def legacy_lesson_completion(db, user_id, topic, difficulty):
+    """Прохождение урока до gamification_engine: задача, XP + урок, затем бейджи и рекомендация."""
+    # update_task_progress(user_id, "lessons_2", 1)
+    with db.connect() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT id, progress, target, xp_reward, completed FROM daily_tasks "
+                       "WHERE user_id = ? AND task_type = ? AND DATE(reset_at) = DATE('now')", (user_id, "lessons_2"))
+        row = cursor.fetchone()
+        if row and not row[4]:
+            task_id, progress, target, xp_reward, completed = row
+            new_progress = min(progress + 1, target)
+            cursor.execute("UPDATE daily_tasks SET progress = ?, completed = ? WHERE id = ?",
+                           (new_progress, new_progress >= target, task_id))
+            if new_progress >= target:
+                add_xp_to_user(cursor, user_id, xp_reward)
+    # _launch_teaching_lesson: XP и запись урока
+    with db.connect() as conn:
+        cursor = conn.cursor()
+        add_xp_to_user(cursor, user_id, LESSON_XP)
+        cursor.execute("""
+            INSERT OR REPLACE INTO teaching_lessons (user_id, topic, difficulty, title, xp_earned, quiz_passed, repeat_count, completed_at)
+            SELECT ?, ?, ?, ?, ?, 1, COALESCE(repeat_count, 0) + 1, CURRENT_TIMESTAMP
+            FROM (SELECT repeat_count FROM teaching_lessons WHERE user_id = ? AND topic = ? AND difficulty = ?
+                  UNION ALL SELECT 0 LIMIT 1)
+        """, (user_id, topic, difficulty, "Урок", LESSON_XP, user_id, topic, difficulty))
+    # check_and_award_badges: темы, XP и бейджи в трёх соединениях, каждый бейдж - в своём
+    with db.connect() as conn:
+        completed = {}
+        for topic_name, level, count, last in conn.execute(
+                "SELECT topic, difficulty, COUNT(*), MAX(completed_at) FROM teaching_lessons "
+                "WHERE user_id = ? AND quiz_passed = 1 GROUP BY topic, difficulty", (user_id,)):
+            completed.setdefault(topic_name, {'difficulties': [], 'completed_count': 0})
+            completed[topic_name]['difficulties'].append(level)
+    with db.connect() as conn:
+        row = conn.execute("SELECT xp FROM users WHERE user_id = ?", (user_id,)).fetchone()
+        xp = row[0] if row else 0
+    with db.connect() as conn:
+        earned = {row[0] for row in conn.execute("SELECT badge_id FROM user_badges WHERE user_id = ?", (user_id,))}
+    for badge_id, info in ACHIEVEMENT_BADGES.items():
+        if badge_id not in earned and info['condition'](completed, xp):
+            with db.connect() as conn:
+                conn.execute("INSERT INTO user_badges (user_id, badge_id, badge_name, badge_emoji, badge_description, "
+                             "condition_met) VALUES (?, ?, ?, ?, ?, ?)",
+                             (user_id, badge_id, info['name'], info['emoji'], info['description'], 'auto_detected'))
+    # get_recommended_lesson: снова темы и XP
+    with db.connect() as conn:
+        conn.execute("SELECT topic, difficulty FROM teaching_lessons WHERE user_id = ? AND quiz_passed = 1",
+                     (user_id,)).fetchall()
+    with db.connect() as conn:
+        conn.execute("SELECT xp FROM users WHERE user_id = ?", (user_id,)).fetchone()
+
+
+def engine_lesson_completion(engine, user_id, topic, difficulty):
+    """То же через gamification_engine: одна транзакция, снимок переиспользуется для рекомендации."""
+    result = engine.process(user_id, LESSON_XP, "completed_teaching_lesson",
+                            lesson={"topic": topic, "difficulty": difficulty, "title": "Урок"},
+                            tasks={"lessons_2": 1})
+    return result
+
+
+def test_level_for_xp_matches_education():
+    conn = sqlite3.connect(":memory:")
+    conn.execute("CREATE TABLE users (user_id INTEGER, xp INTEGER)")
+    for xp in (0, 1, 499, 500, 1499, 1500, 3499, 3500, 6999, 7000, 10 ** 6):
+        conn.execute("DELETE FROM users")
+        conn.execute("INSERT INTO users VALUES (1, ?)", (xp,))
+        assert level_for_xp(xp) == calculate_user_level_and_xp(conn.cursor(), 1)[0]
+
+
+def test_lesson_completion_matches_legacy(make_db):
+    legacy_db, engine_db = make_db("legacy.db"), make_db("engine.db")
+    engine = GamificationEngine(engine_db.connect)
+    rng = random.Random(5)
+    for user_id, start_xp in ((1, 0), (2, 430), (3, 1480)):
+        legacy_db.add_user(user_id, start_xp)
+        engine_db.add_user(user_id, start_xp)
+    for _ in range(40):
+        user_id = rng.choice((1, 2, 3))
+        topic, difficulty = rng.choice(TOPICS[:4]), rng.choice(DIFFICULTIES)
+        legacy_lesson_completion(legacy_db, user_id, topic, difficulty)
+        engine_lesson_completion(engine, user_id, topic, difficulty)
+        assert engine_db.state(user_id) == legacy_db.state(user_id)
+
+    # Пользователя нет в users: урок записывается, XP некому начислять (как UPDATE в add_xp_to_user)
+    legacy_lesson_completion(legacy_db, 99, "defi", "beginner")
+    result = engine_lesson_completion(engine, 99, "defi", "beginner")
+    assert engine_db.state(99) == legacy_db.state(99)
+    assert result.xp_gained == 0
+
+
+def test_result_and_events(make_db):
+    db = make_db()
+    db.add_user(1, xp=440)
+    engine = GamificationEngine(db.connect)
+    events = []
+    engine.subscribe(events.append)
+    engine.subscribe(lambda event: 1 / 0)  # ошибка подписчика не ломает остальных
+
+    first = engine_lesson_completion(engine, 1, "defi", "beginner")
+    assert first.xp_gained == LESSON_XP and first.completed_tasks == []
+    assert [b["badge_id"] for b in first.new_badges] == ["first_lesson"]
+
+    second = engine_lesson_completion(engine, 1, "defi", "expert")
+    assert second.xp_gained == LESSON_XP + 20 and second.completed_tasks == ["lessons_2"]
+    assert second.level_up and second.snapshot.level == 2 and second.snapshot.xp == 560
+    assert [b["badge_id"] for b in second.new_badges] == ["xp_collector"]
+
+    third = engine_lesson_completion(engine, 1, "defi", "expert")
+    assert third.completed_tasks == [] and third.new_badges == [] and third.xp_gained == LESSON_XP
+
+    kinds = [event.kind for event in events]
+    assert kinds == [EVENT_LESSON_COMPLETED, EVENT_XP, EVENT_BADGE,
+                     EVENT_TASK_COMPLETED, EVENT_LESSON_COMPLETED, EVENT_XP, EVENT_LEVEL_UP, EVENT_BADGE,
+                     EVENT_LESSON_COMPLETED, EVENT_XP]
+    assert events[1].data == {"xp": 50, "total": 490, "reason": "completed_teaching_lesson"}
+
+    stats = engine.stats()
+    assert (stats["processed"], stats["xp_awarded"], stats["badges_awarded"], stats["level_ups"]) == (3, 170, 2, 1)
+    assert stats["events"] == len(events) and stats["p50_process_ms"] > 0
+
+
+def test_failed_award_writes_nothing(make_db):
+    db = make_db()
+    db.add_user(1)
+    broken = dict(ACHIEVEMENT_BADGES, broken={"name": "x", "emoji": "x", "description": "x",
+                                              "condition": lambda completed, xp: 1 / 0})
+    engine = GamificationEngine(db.connect, badges=broken)
+    events = []
+    engine.subscribe(events.append)
+    before = db.state(1)
+    assert engine_lesson_completion(engine, 1, "nft", "beginner") is None
+    assert db.state(1) == before
+    assert events == [] and engine.stats()["failed"] == 1
+
+
+def test_failed_lesson_write_keeps_xp(make_db):
+    db = make_db()
+    db.add_user(1)
+    with sqlite3.connect(db.path) as conn:
+        conn.execute("CREATE TRIGGER no_lessons BEFORE INSERT ON teaching_lessons "
+                     "BEGIN SELECT RAISE(ABORT, 'disk full'); END")
+    engine = GamificationEngine(db.connect)
+    events = []
+    engine.subscribe(events.append)
+
+    result = engine_lesson_completion(engine, 1, "nft", "beginner")
+    assert result.xp_gained == LESSON_XP and result.new_badges == []
+    (xp, _), lessons, badges, _ = db.state(1)
+    assert xp == LESSON_XP and lessons == [] and badges == []
+    assert [event.kind for event in events] == [EVENT_XP]
+
+
+def test_xp_outside_engine_marks_leaderboard_stale(monkeypatch):
+    monkeypatch.setattr(bot, "leaderboard_changes", set())
+    conn = sqlite3.connect(":memory:")
+    conn.execute("CREATE TABLE users (user_id INTEGER PRIMARY KEY, xp INTEGER DEFAULT 0, level INTEGER DEFAULT 1)")
+    conn.execute("INSERT INTO users (user_id) VALUES (7)")
+    bot.add_xp_to_user(conn.cursor(), 7, 0, "nothing")
+    assert bot.leaderboard_changes == set()
+    bot.add_xp_to_user(conn.cursor(), 7, 25, "quiz")
+    assert conn.execute("SELECT xp FROM users WHERE user_id = 7").fetchone() == (25,)
+    assert bot.leaderboard_changes == {7}
+
+
+def test_concurrent_awards_do_not_lose_xp(make_db):
+    db = make_db()
+    db.add_user(1, task_target=1000)
+    engine = GamificationEngine(db.connect)
+
+    def award():
+        for _ in range(10):
+            assert engine.process(1, 5, "test", tasks={"lessons_2": 1}) is not None
+
+    threads = [threading.Thread(target=award) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    xp_level, _, _, tasks = db.state(1)
+    assert xp_level == (200, 1) and tasks == [(40, 0)]
+
+
+def test_quest_progress_today_in_one_query(make_db):
+    db = make_db()
+    with sqlite3.connect(db.path) as conn:
+        conn.executemany("INSERT INTO user_quiz_responses (user_id, lesson_id, question_number, is_correct, xp_earned) "
+                         "VALUES (?, ?, ?, ?, ?)",
+                         [(1, 7, 1, 1, 10), (1, 7, 2, 0, 0), (1, 9, 1, 1, 15), (2, 7, 1, 1, 10)])
+        conn.execute("INSERT INTO user_quiz_responses (user_id, lesson_id, xp_earned, answered_at) "
+                     "VALUES (1, 3, 50, DATE('now', '-2 days'))")
+    with sqlite3.connect(db.path) as conn:
+        quests, xp = get_quest_progress_today(1, conn)
+        assert sorted(quests) == sorted(get_completed_quests_today(1, conn))
+        assert xp == get_daily_quest_xp_earned(1, conn) == 25
+        assert get_quest_progress_today(5, conn) == ([], 0)
+
+    snapshot = GamificationEngine(db.connect).snapshot(1)
+    assert sorted(snapshot.quests_today) == ["7", "9"] and snapshot.quest_xp_today == 25
+
+
+def test_lesson_completion_round_trips(make_db):
+    """Обращения к БД на одно прохождение урока /teach: до и после gamification_engine."""
+    legacy_db, engine_db = make_db("legacy.db"), make_db("engine.db")
+    engine = GamificationEngine(engine_db.connect)
+    lessons = [(topic, difficulty) for topic in TOPICS for difficulty in DIFFICULTIES]
+    for db in (legacy_db, engine_db):
+        db.add_user(1)
+        db.connections = db.statements = 0
+
+    started = time.perf_counter()
+    for topic, difficulty in lessons:
+        legacy_lesson_completion(legacy_db, 1, topic, difficulty)
+    legacy_time = (time.perf_counter() - started) / len(lessons)
+
+    started = time.perf_counter()
+    for topic, difficulty in lessons:
+        engine_lesson_completion(engine, 1, topic, difficulty)
+    engine_time = (time.perf_counter() - started) / len(lessons)
+
+    assert engine_db.state(1) == legacy_db.state(1)
+    count = len(lessons)
+    print(f"\nlesson completion over {count} lessons: legacy {legacy_db.connections / count:.1f} connections, "
+          f"{legacy_db.statements / count:.1f} statements, {legacy_time * 1e6:.0f} µs; "
+          f"engine {engine_db.connections / count:.1f} connection, {engine_db.statements / count:.1f} statements, "
+          f"{engine_time * 1e6:.0f} µs")
+    assert engine_db.connections == count
+    assert engine_db.statements < legacy_db.statements
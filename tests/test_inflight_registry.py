@@ -0,0 +1,119 @@
+"""
+Tests for inflight_registry: identical calls attach to the running one,
+newer dialogue calls cancel the older one, counters of saved calls.
+"""
+
+import asyncio
+import threading
+import time
+
+import pytest
+
+from inflight_registry import DIALOGUE, CallSuperseded, InflightRegistry
+
+
+@pytest.mark.asyncio
+async def test_identical_calls_are_deduped():
+    registry = InflightRegistry()
+    calls = 0
+
+    async def generate():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.05)
+        return "answer"
+
+    results = await asyncio.gather(*[registry.run(1, "tell_more_5_1", generate) for _ in range(3)])
+    assert results == ["answer"] * 3
+    assert calls == 1
+    assert registry.stats() == {"in_flight": 0, "started": 1, "deduped": 2, "cancelled": 0}
+
+    # Другой пользователь или другой ключ - отдельный вызов
+    await asyncio.gather(registry.run(2, "tell_more_5_1", generate), registry.run(1, "tell_more_6_1", generate))
+    assert calls == 3
+
+
+@pytest.mark.asyncio
+async def test_claim_and_release():
+    registry = InflightRegistry()
+    call = registry.claim(1, "feedback_not_helpful_9")
+    assert call is not None
+    assert registry.claim(1, "feedback_not_helpful_9") is None
+    waiter = asyncio.ensure_future(registry.join(1, "feedback_not_helpful_9"))
+    await asyncio.sleep(0)
+    registry.release(call, "done")
+    assert await waiter == "done"
+    assert registry.claim(1, "feedback_not_helpful_9") is not None
+
+
+@pytest.mark.asyncio
+async def test_error_is_shared_and_key_freed():
+    registry = InflightRegistry()
+
+    async def failing():
+        await asyncio.sleep(0.01)
+        raise ValueError("provider down")
+
+    results = await asyncio.gather(registry.run(1, "k", failing), registry.run(1, "k", failing),
+                                   return_exceptions=True)
+    assert all(isinstance(r, ValueError) for r in results)
+    assert len(registry) == 0
+
+
+@pytest.mark.asyncio
+async def test_newer_dialogue_cancels_older():
+    registry = InflightRegistry()
+    seen_cancel = threading.Event()
+
+    def slow_provider(text, cancel_event):
+        # Имитация цепочки провайдеров: проверка между попытками
+        for _ in range(50):
+            if cancel_event.is_set():
+                seen_cancel.set()
+                return None
+            time.sleep(0.01)
+        return f"answer to {text}"
+
+    first = asyncio.ensure_future(registry.run_latest(
+        1, DIALOGUE, lambda call: asyncio.to_thread(slow_provider, "first", call.cancel_event)))
+    await asyncio.sleep(0.05)
+
+    newer = asyncio.ensure_future(registry.run_latest(
+        1, DIALOGUE, lambda call: asyncio.sleep(0, result="answer to second")))
+    with pytest.raises(CallSuperseded):
+        await first
+    assert await newer == "answer to second"
+    await asyncio.to_thread(seen_cancel.wait, 2)
+    assert seen_cancel.is_set()
+    assert registry.stats()["cancelled"] == 1
+    assert len(registry) == 0
+
+
+@pytest.mark.asyncio
+async def test_cancel_without_running_call():
+    registry = InflightRegistry()
+    assert registry.cancel(1, DIALOGUE) is False
+    assert await registry.run_latest(1, DIALOGUE, lambda call: asyncio.sleep(0, result=1)) == 1
+    assert registry.stats()["cancelled"] == 0
+
+
+@pytest.mark.asyncio
+async def test_duplicate_tap_answers_callback_once(monkeypatch):
+    import bot
+    from unittest.mock import AsyncMock, MagicMock
+
+    monkeypatch.setattr(bot, "check_channel_subscription", AsyncMock(return_value=True))
+    query = MagicMock()
+    query.data = "tell_more_5_1"
+    query.from_user.id = 1
+    query.answer = AsyncMock()
+    update = MagicMock(callback_query=query)
+
+    running = bot.inflight.claim(1, query.data)
+    try:
+        await bot.button_callback(update, MagicMock())
+    finally:
+        bot.inflight.release(running)
+
+    # Ответ ровно один, иначе Telegram отклонит второй, а без него крутится индикатор
+    query.answer.assert_awaited_once_with("⏳ Уже готовлю ответ...")
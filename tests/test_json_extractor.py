@@ -0,0 +1,182 @@
+"""
+Tests for json_extractor: the single-pass candidate scanner on a corpus of
+provider response formats, incremental feeding, fuzzed objects, the
+teacher/news analyzer wrappers and the cost against the legacy
+multi-strategy parser of api_server.
+"""
+
+import json
+import random
+import re
+import time
+from pathlib import Path
+
+import pytest
+
+import embedded_news_analyzer
+import teacher
+from json_extractor import JsonStreamExtractor, extract_json, iter_json_candidates, parse_candidate
+
+CORPUS = json.loads((Path(__file__).parent / "llm_responses.json").read_text(encoding="utf-8"))
+
+
+def _match_braces(text, start):
+    """Посимвольный подсчёт скобок, как в старом api_server."""
+    depth, in_string, escape_next = 0, False, False
+    for i in range(start, len(text)):
+        char = text[i]
+        if escape_next:
+            escape_next = False
+            continue
+        if char == '\\':
+            escape_next = True
+            continue
+        if char == '"':
+            in_string = not in_string
+        if not in_string:
+            if char == '{':
+                depth += 1
+            elif char == '}':
+                depth -= 1
+                if depth == 0:
+                    return i + 1
+    return -1
+
+
+def legacy_extract_json_from_response(raw_text):
+    """api_server.extract_json_from_response до json_extractor (без логов)."""
+    if not raw_text or len(raw_text) > 100_000:
+        return None
+    text = re.sub(r'```json\s*', '', raw_text, flags=re.IGNORECASE).strip()
+    text = re.sub(r'```\s*', '', text).strip()
+    text = text.replace('\\n', '\n').replace('\\t', '\t')
+    xml_start = text.find('<json>')
+    if xml_start != -1:
+        end = _match_braces(text, xml_start + 6)
+        if end != -1:
+            candidate = text[xml_start + 6:end].strip()
+            if candidate.startswith('{'):
+                try:
+                    data = json.loads(candidate)
+                    if isinstance(data, dict) and data:
+                        return data
+                except json.JSONDecodeError:
+                    pass
+    candidates = []
+    md_match = re.search(r'```(?:json)?\s*(.*?)\s*```', text, re.DOTALL | re.IGNORECASE)
+    if md_match:
+        candidates.append(md_match.group(1).strip())
+    first_brace = text.find('{')
+    if first_brace != -1:
+        end = _match_braces(text, first_brace)
+        if end != -1:
+            candidates.append(text[first_brace:end])
+    for candidate in candidates:
+        cleaned = re.sub(r' +', ' ', candidate.strip().replace('\n', ' ').replace('\r', ''))
+        for fixed in (cleaned, cleaned.replace("'", '"'),
+                      re.sub(r':\s*"([^"]*?)_([^"]*?)"', r': "\1\2"', cleaned)):
+            try:
+                data = json.loads(fixed)
+            except json.JSONDecodeError:
+                continue
+            if isinstance(data, dict) and (data or fixed is not cleaned):
+                return data
+    return None
+
+
+def feed_in_chunks(text, rng):
+    extractor = JsonStreamExtractor()
+    streamed = []
+    position = 0
+    while position < len(text):
+        size = rng.randint(1, 12)
+        streamed.extend(extractor.feed(text[position:position + size]))
+        position += size
+    return extractor, streamed
+
+
+@pytest.mark.parametrize("case", CORPUS, ids=[case["kind"] for case in CORPUS])
+def test_corpus(case):
+    assert extract_json(case["response"]) == case["expected"]
+    # Старый разбор находит то же самое или ничего (он смотрел только первую `{`)
+    assert legacy_extract_json_from_response(case["response"]) in (case["expected"], None)
+
+    rng = random.Random(case["kind"])
+    for _ in range(5):
+        extractor, streamed = feed_in_chunks(case["response"], rng)
+        spans = sorted(candidate[:5] for candidate in iter_json_candidates(case["response"]))
+        assert sorted(candidate[:5] for candidate in streamed) == spans
+        assert extractor.parse() == case["expected"]
+
+
+def test_candidates_are_ranked_by_source():
+    text = 'prose {"a": 1} ```json\n{"b": 2}\n``` <json>{"c": {"d": "}"}}</json> {no quotes}'
+    candidates = iter_json_candidates(text)
+    assert [(c.source, json.loads(c.text) if '"' in c.text else c.text) for c in candidates] == [
+        ("xml_tags", {"c": {"d": "}"}}), ("markdown_json", {"b": 2}), ("brace_matching", {"a": 1}),
+        ("brace_matching", "{no quotes}")]
+    assert candidates[-1].confidence < candidates[-2].confidence
+
+    # json.loads - только для лучших кандидатов
+    assert extract_json('{"x": 1} {"y": 2}', max_attempts=1, validator=lambda data: "y" in data) is None
+    assert extract_json('{"x": 1} {"y": 2}', validator=lambda data: "y" in data) == {"y": 2}
+    assert extract_json("{" * 5000 + "}" * 5000) is None
+    assert extract_json('{"a": "' + "x" * 200 + '"}', max_size=100) is None
+
+
+def random_value(rng, depth=0):
+    kind = rng.randint(0, 5 if depth < 3 else 2)
+    if kind == 0:
+        return "".join(rng.choice('ab {}[]"\\\'\n\tя:,`<json>') for _ in range(rng.randint(0, 12)))
+    if kind == 1:
+        return rng.randint(-1000, 1000)
+    if kind == 2:
+        return rng.choice([True, False, None, 1.5])
+    if kind == 3:
+        return [random_value(rng, depth + 1) for _ in range(rng.randint(0, 3))]
+    return {f"k{i}": random_value(rng, depth + 1) for i in range(rng.randint(1, 3))}
+
+
+def test_fuzzed_objects_in_wrappers():
+    rng = random.Random(45)
+    wrappers = ["{}", "<json>{}</json>", "```json\n{}\n```", "Ответ: {} - готово", "думаю {{}}... <json>\n{}\n</json>"]
+    for _ in range(400):
+        obj = {f"key{i}": random_value(rng) for i in range(rng.randint(1, 4))}
+        payload = json.dumps(obj, ensure_ascii=rng.random() < 0.5, indent=rng.choice([None, 1]))
+        text = rng.choice(wrappers).replace("{}", payload).replace("{{}}", "{заглушка}")
+        assert extract_json(text) == obj, text
+        extractor, streamed = feed_in_chunks(text, rng)
+        assert extractor.parse() == obj
+
+
+def test_wrappers_keep_their_rules():
+    analysis = next(case for case in CORPUS if case["kind"] == "xml_tags")
+    assert embedded_news_analyzer.extract_json_from_response(analysis["response"]) == analysis["expected"]
+    assert embedded_news_analyzer.extract_json_from_response('<json>{"summary_text": "x"}</json>') is None
+    assert embedded_news_analyzer.extract_json_from_response("") is None
+
+    lesson = '```json\n{"**lesson_title**": "Блокчейн", "key_points": [\'a\', \'b\']}\n```'
+    assert teacher.extract_teaching_json(lesson) == {"lesson_title": "Блокчейн", "key_points": ["a", "b"]}
+    marked = '<json>{"title": "**Bitcoin** basics", "content": "__важно__ ~~старое~~"}</json>'
+    assert teacher.extract_teaching_json(marked) == {"title": "Bitcoin basics", "content": "важно старое"}
+    assert teacher.extract_teaching_json("без JSON") is None
+    assert parse_candidate("[1, 2]") is None
+
+
+def test_extraction_benchmark():
+    """Весь корпус: старый многостратегийный разбор против одного прохода."""
+    texts = [case["response"] + " " * i for i in range(30) for case in CORPUS]
+    texts += ["Пояснение к ответу. " * 150 + case["response"] for case in CORPUS]
+
+    started = time.process_time()
+    for text in texts:
+        legacy_extract_json_from_response(text)
+    legacy = (time.process_time() - started) / len(texts)
+
+    started = time.process_time()
+    for text in texts:
+        extract_json(text)
+    single = (time.process_time() - started) / len(texts)
+
+    print(f"\nJSON extraction per response: legacy {legacy * 1e6:.1f} µs, json_extractor {single * 1e6:.1f} µs")
+    assert single < legacy
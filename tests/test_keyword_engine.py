@@ -0,0 +1,167 @@
+"""
+Tests for keyword_engine: any()-compatible category checks, cover and
+substring pruning, shared per-text results and the classification cost
+on long forwarded posts.
+"""
+
+import time
+
+import pytest
+
+import bot
+import calendar_processor
+import education
+from keyword_engine import KeywordEngine, keyword_engine
+
+FORWARDED_POST = (
+    "Переслано из канала Crypto Daily\n\n"
+    "🚨 СРОЧНО: SEC одобрила спотовый Bitcoin ETF, рынок отреагировал скачком цены. "
+    "Аналитики JPMorgan ожидают приток ликвидности, а Ethereum и Solana выросли на 8%. "
+    "Центробанки продолжают обсуждать ставки, инфляция в США остаётся выше прогноза. "
+    "Биржа Binance запустила новый стейкинг, DeFi протоколы фиксируют рост TVL. "
+    "Подробности и графики - в нашем канале, подписывайтесь! "
+) * 6
+
+TEXTS = [
+    "Привет!",
+    "Что ты умеешь?",
+    "Что ты думаешь - биткоин упал на 20%?",
+    "Почему?",
+    "что такое блокчейн и как работает майнинг",
+    "Расскажи подробнее про стейкинг",
+    "Цена эфира растёт, что произошло?",
+    "Какой токен лучше для долгосрока",
+    "Fed повысил ставку, CPI 3.2% ожидается в 15:30 мск 🇺🇸",
+    "просто текст без ключевых слов",
+    "",
+    FORWARDED_POST,
+    FORWARDED_POST.lower(),
+    ("Длинный пост про погоду и путешествия без финансового контекста. " * 40),
+]
+
+
+def legacy_classify_intent(text):
+    """classify_intent в виде цепочки any(), как до keyword_engine."""
+    text_lower = text.lower()
+    if any(kw in text_lower for kw in bot.FOLLOWUP_KEYWORDS):
+        return "follow_up"
+    if any(kw in text_lower for kw in bot.NEWS_INTENT_KEYWORDS):
+        return "news_analysis"
+    if any(kw in text_lower for kw in bot.QUESTION_KEYWORDS):
+        return "question"
+    if text.strip().endswith("?"):
+        return "question"
+    return "general_chat"
+
+
+CONTEXT_CATEGORIES = ("greeting", "about_bot", "news_event", "crypto", "tech", "finance",
+                      "geopolitical", "action", "question")
+
+
+def legacy_context_flags(text):
+    text_lower = text.lower().strip()
+    return [any(kw in text_lower for kw in words) for words in (
+        bot.GREETING_WORDS, bot.ABOUT_BOT_WORDS, bot.NEWS_EVENT_WORDS, bot.crypto_words,
+        bot.tech_keywords, bot.finance_words, bot.geopolitical_words, bot.action_words,
+        bot.CONTEXT_QUESTION_WORDS)]
+
+
+def context_flags(text):
+    matches = keyword_engine.scan(text.lower().strip())
+    return [matches.has(f"context.{name}") for name in CONTEXT_CATEGORIES]
+
+
+def legacy_detect_calendar(text):
+    """Проверки ключевых слов detect_calendar_input до keyword_engine."""
+    return (any(metric in text for metric in calendar_processor.ECONOMIC_METRICS),
+            any(kw in text.lower() for kw in calendar_processor.CALENDAR_KEYWORDS))
+
+
+def detect_calendar(text):
+    return (keyword_engine.has(text, "calendar.metrics"),
+            keyword_engine.has(text.lower(), "calendar.keywords"))
+
+
+def test_has_matches_any_semantics():
+    engine = KeywordEngine({
+        "coins": ["крипто", "криптовалюта", "eth", "ethereum", "eth"],
+        "question": ["почему", "почему?", "как "],
+    })
+    # Дубликаты убраны, покрытие - только слова без более коротких слов категории
+    assert engine._categories["coins"] == ("крипто", "криптовалюта", "eth", "ethereum")
+    assert engine._covers["coins"] == ("крипто", "eth")
+    assert engine._sub["почему?"] == "почему"
+
+    for text in ("криптовалюта растёт", "ethereum", "почему?", "как дела", "как", "ничего", ""):
+        for category in ("coins", "question"):
+            expected = any(kw in text for kw in engine._categories[category])
+            assert engine.has(text, category) is expected, (text, category)
+
+
+def test_scan_result_is_shared_and_reports_positions():
+    engine = KeywordEngine({"coins": ["eth", "ethereum", "btc"], "greeting": ["привет"]})
+    text = "привет, eth и ethereum, снова eth"
+    matches = engine.scan(text)
+    assert engine.scan(text) is matches
+    assert matches.first(["coins", "greeting"]) == "coins"
+    assert matches.matched("coins") == ["eth", "ethereum"]
+    assert matches.positions("coins")["eth"] == [8, 14, 30]
+    assert matches.categories() == {"coins": [(8, "eth"), (14, "ethereum")], "greeting": [(0, "привет")]}
+    assert engine.stats()["cache_hits"] == 1
+
+    # Перерегистрация сбрасывает кэш результатов
+    engine.register({"coins": ["btc"]})
+    assert not engine.scan(text).has("coins")
+
+
+@pytest.mark.parametrize("text", TEXTS)
+def test_classification_unchanged(text):
+    assert bot.classify_intent(text) == legacy_classify_intent(text)
+    assert context_flags(text) == legacy_context_flags(text)
+    assert detect_calendar(text) == legacy_detect_calendar(text)
+
+    lowered = text.lower()
+    for category in keyword_engine._categories:
+        if category.startswith(("education.", "tips.", "conversation.", "calendar.keywords")):
+            expected = any(kw in lowered for kw in keyword_engine._categories[category])
+            assert keyword_engine.has(lowered, category) is expected, category
+
+
+def test_classifiers_on_long_post():
+    assert bot.analyze_message_context(FORWARDED_POST)["needs_crypto_analysis"] is True
+    assert bot.classify_intent(FORWARDED_POST) == "news_analysis"
+    assert education.get_educational_context(FORWARDED_POST, 1)
+
+
+def test_long_post_benchmark():
+    """
+    Ключевые слова на одно входящее сообщение: classify_intent,
+    analyze_message_context и detect_calendar_input (ai_dialogue, затем
+    process_calendar_with_special_prompt) по одному длинному посту.
+    """
+    posts = [FORWARDED_POST + f" #{i}" for i in range(200)]
+
+    def legacy_pipeline(text):
+        legacy_classify_intent(text)
+        legacy_context_flags(text)
+        legacy_detect_calendar(text)
+        legacy_detect_calendar(text)
+
+    def pipeline(text):
+        bot.classify_intent(text)
+        context_flags(text)
+        detect_calendar(text)
+        detect_calendar(text)
+
+    started = time.process_time()
+    for post in posts:
+        legacy_pipeline(post)
+    legacy = (time.process_time() - started) / len(posts)
+
+    started = time.process_time()
+    for post in posts:
+        pipeline(post)
+    engine = (time.process_time() - started) / len(posts)
+
+    print(f"\nkeyword checks per long post: any() {legacy * 1e6:.1f} µs, keyword_engine {engine * 1e6:.1f} µs")
+    assert engine * 1.2 < legacy
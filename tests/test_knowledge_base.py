@@ -0,0 +1,179 @@
+"""
+Tests for knowledge_base: BM25 inverted index equal to a brute-force BM25
+over all documents, direct answers and prompt snippets for dialogue
+questions, the shorter knowledge prompt and the cost of a lookup.
+"""
+
+import math
+import random
+import time
+from collections import Counter
+
+import pytest
+
+import ai_dialogue
+from education import COURSES_DATA, course_store
+from knowledge_base import (
+    BM25_B, BM25_K1, TITLE_BOOST, KnowledgeBase,
+    course_documents, embedded_lesson_documents, faq_documents, stem, tokenize
+)
+
+FAQ_ROWS = [
+    (1, "Что такое DeFi?", "DeFi - децентрализованные финансы: кредиты, обмен и доход без банка."),
+    (2, "Что такое газ в Ethereum?", "Газ - плата за вычисления в сети Ethereum."),
+]
+
+QUESTIONS = [
+    "что такое DeFi", "как работает стейкинг", "Что такое блокчейн?", "что такое NFT",
+    "объясни layer 2 rollups", "Привет, как дела?", "биткоин упал на 20% что думаешь",
+    "что такое смарт-контракт", "что такое DAO", "газ ethereum", "",
+]
+
+
+@pytest.fixture(scope="module")
+def documents():
+    return (faq_documents(FAQ_ROWS) + embedded_lesson_documents()
+            + course_documents(course_store, COURSES_DATA))
+
+
+@pytest.fixture
+def kb(documents):
+    return KnowledgeBase(documents, answer_threshold=0.9, snippet_threshold=0.5)
+
+
+def brute_force_scores(documents, query):
+    """BM25 по определению: проход по всем документам для каждого запроса."""
+    counts = []
+    for document in documents:
+        terms = Counter(tokenize(document.text))
+        for term in tokenize(document.title):
+            terms[term] += TITLE_BOOST
+        counts.append(terms)
+    average = sum(sum(terms.values()) for terms in counts) / len(counts)
+    scores = {}
+    for doc_index, terms in enumerate(counts):
+        length = sum(terms.values())
+        score = 0.0
+        for term in set(tokenize(query)):
+            tf = terms.get(term, 0)
+            if not tf:
+                continue
+            df = sum(1 for other in counts if term in other)
+            idf = math.log(1 + (len(counts) - df + 0.5) / (df + 0.5))
+            score += idf * tf * (BM25_K1 + 1) / (tf + BM25_K1 * (1 - BM25_B + BM25_B * length / average))
+        if score:
+            scores[doc_index] = score
+    return scores
+
+
+def test_tokenize_drops_question_words_and_endings():
+    assert tokenize("Что такое токены и как работает стейкинг?") == ["токен", "стейкинг"]
+    assert stem("блокчейна") == stem("блокчейн") == "блокчейн"
+    assert stem("rollups") == "rollup"
+    assert stem("2024") == "2024"
+
+
+def test_index_scores_equal_brute_force(documents, kb):
+    rng = random.Random(3)
+    vocabulary = sorted({term for document in documents for term in tokenize(document.text)})
+    queries = QUESTIONS + [" ".join(rng.sample(vocabulary, rng.randint(1, 4))) for _ in range(30)]
+    index = kb._index
+    for query in queries:
+        expected = brute_force_scores(documents, query)
+        scores = index.scores(frozenset(tokenize(query)))
+        assert scores.keys() == expected.keys(), query
+        for doc_index, score in expected.items():
+            assert scores[doc_index] == pytest.approx(score), query
+
+
+def test_lookup_decisions(kb):
+    match = kb.lookup("что такое DeFi")
+    assert match.answers_directly and match.document.doc_id == "faq:1"
+    assert match.document.answer == FAQ_ROWS[0][2]
+
+    # Уроки одной темы с равной уверенностью: отвечает урок для начинающих
+    match = kb.lookup("Что такое блокчейн?")
+    assert match.answers_directly and match.document.doc_id == "lesson:blockchain:beginner"
+    lessons = KnowledgeBase(embedded_lesson_documents())
+    assert lessons.lookup("что такое DeFi").document.doc_id == "lesson:defi:beginner"
+
+    # Тема есть в тексте, но не в заголовке - только справка для ИИ
+    match = kb.lookup("как работает стейкинг")
+    assert match is not None and not match.answers_directly
+    assert 0 < len(match.snippet) <= 710
+
+    # Слова, которых нет в базе, не дают ответа по остальным словам
+    assert kb.lookup("биткоин упал на 20% что думаешь") is None
+    assert kb.lookup("Привет, как дела?") is None
+    assert kb.lookup("") is None
+
+
+def test_long_messages_are_not_answered_directly(documents):
+    """Длинное сообщение - диалог: даже уверенное совпадение уходит в ИИ справкой."""
+    kb = KnowledgeBase(documents, answer_threshold=0.5, max_question_words=12)
+    short = "DeFi кредиты обмен доход без банка"
+    long = short + " и кредиты обмен доход без банка децентрализованные финансы"
+    assert kb.lookup(short).answers_directly
+    match = kb.lookup(long)
+    assert match.document.doc_id == "faq:1" and not match.answers_directly
+
+
+def test_thresholds_and_stats(documents):
+    strict = KnowledgeBase(documents, answer_threshold=1.01, snippet_threshold=1.01)
+    assert strict.lookup("что такое DeFi") is None
+
+    kb = KnowledgeBase(documents)
+    for question in ("что такое DeFi", "что такое DAO", "как работает стейкинг", "Привет!"):
+        kb.lookup(question)
+    stats = kb.stats()
+    assert (stats["queries"], stats["answered"], stats["snippets"]) == (4, 2, 1)
+    assert stats["llm_calls_avoided"] == 0.5
+    assert stats["p50_answer_ms"] > 0
+
+    # Не вопрос или не русский язык: совпадение уходит в ИИ справкой и не считается ответом
+    match = kb.lookup("что такое DeFi", allow_answer=False)
+    assert match.document.doc_id == "faq:1" and not match.answers_directly
+    stats = kb.stats()
+    assert (stats["queries"], stats["answered"], stats["snippets"]) == (5, 2, 2)
+    assert stats["llm_calls_avoided"] == 0.4
+
+    kb.rebuild(faq_documents(FAQ_ROWS))
+    assert len(kb) == 2 and kb.stats()["rebuilds"] == 2
+    assert kb.search("газ ethereum")[0][0].doc_id == "faq:2"
+
+
+def test_course_sections_are_documents(documents):
+    sections = [document for document in documents if document.source == "course"]
+    assert sections
+    for document in sections:
+        assert document.text and "\n## " not in document.text
+        assert not document.title.startswith("#")
+
+
+def test_knowledge_prompt_is_shorter_than_dialogue_prompt(kb):
+    snippet = kb.lookup("как работает стейкинг").snippet
+    prompt = ai_dialogue.build_knowledge_dialogue_prompt(snippet)
+    assert snippet in prompt
+    assert len(prompt) * 3 < len(ai_dialogue.build_dialogue_system_prompt("ru"))
+
+
+@pytest.mark.slow
+def test_lookup_benchmark(documents, kb):
+    """Поиск по базе: BM25 полным проходом по документам против инвертированного индекса."""
+    questions = [q for q in QUESTIONS if q]
+
+    started = time.process_time()
+    for question in questions:
+        brute_force_scores(documents, question)
+    legacy = (time.process_time() - started) / len(questions)
+
+    rounds = 50
+    started = time.process_time()
+    for _ in range(rounds):
+        for question in questions:
+            kb.lookup(question)
+    indexed = (time.process_time() - started) / (rounds * len(questions))
+
+    print(f"\nknowledge lookup over {len(documents)} documents: "
+          f"full scan {legacy * 1e6:.1f} µs, inverted index {indexed * 1e6:.1f} µs")
+    assert indexed * 10 < legacy
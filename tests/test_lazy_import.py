@@ -0,0 +1,67 @@
+"""
+Tests for lazy_import: deferred loading through lazy_callable, background
+warm-up, the -X importtime parser and the bot.py import-time budget.
+"""
+
+import sys
+import textwrap
+
+import pytest
+
+import lazy_import
+from lazy_import import (
+    LAZY_MODULES, check_import_budget, import_time_report, lazy_callable, parse_importtime, warm_up
+)
+
+SAMPLE = textwrap.dedent("""\
+    import time: self [us] | cumulative | imported package
+    import time:       120 |        120 |     _io
+    import time:       300 |        900 |   heavy
+    import time:      5000 |      10000 | bot
+""")
+
+
+@pytest.fixture
+def fake_modules(tmp_path, monkeypatch):
+    (tmp_path / "lazy_fake_sync.py").write_text("def double(x):\n    return x * 2\n")
+    (tmp_path / "lazy_fake_async.py").write_text("async def greet(name):\n    return 'hi ' + name\n")
+    monkeypatch.syspath_prepend(str(tmp_path))
+    yield
+    for name in ("lazy_fake_sync", "lazy_fake_async"):
+        sys.modules.pop(name, None)
+
+
+def test_lazy_callable_imports_on_first_call(fake_modules):
+    double = lazy_callable("lazy_fake_sync", "double")
+    assert "lazy_fake_sync" not in sys.modules
+    assert double(21) == 42
+    assert "lazy_fake_sync" in sys.modules
+    assert double.__name__ == "double"
+    assert "lazy_fake_sync" in lazy_import.stats()["loaded"]
+
+
+@pytest.mark.asyncio
+async def test_lazy_async_callable_and_warm_up(fake_modules):
+    greet = lazy_callable("lazy_fake_async", "greet")
+    loaded = await warm_up(["lazy_fake_async", "lazy_fake_async"])
+    assert list(loaded) == ["lazy_fake_async"]
+    assert await greet("bot") == "hi bot"
+    # Уже загруженные модули повторно не прогреваются
+    assert await warm_up(["lazy_fake_async"]) == {}
+
+
+def test_parse_importtime_and_budget():
+    report = parse_importtime(SAMPLE)
+    assert [(t.module, t.depth, t.cumulative_us) for t in report] == [
+        ("_io", 2, 120), ("heavy", 1, 900), ("bot", 0, 10000)]
+    assert check_import_budget(report, budget_ms=20, forbidden=["heavy"]) == ["heavy is imported eagerly"]
+    assert check_import_budget(report, budget_ms=5, forbidden=[]) == ["import bot: 10 ms > budget 5 ms"]
+
+
+@pytest.mark.slow
+def test_bot_import_stays_within_budget():
+    report = import_time_report("bot", env={"BOT_RUN_MODE": "polling"})
+    # Запас x2 на медленные CI-машины; ленивые модули не должны грузиться вовсе
+    problems = check_import_budget(report, "bot", budget_ms=lazy_import.BOT_IMPORT_BUDGET_MS * 2,
+                                   forbidden=LAZY_MODULES)
+    assert problems == []
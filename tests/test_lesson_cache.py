@@ -0,0 +1,215 @@
+"""
+Tests for lesson_cache: cached AI lessons for /teach served without provider
+calls, stale-while-revalidate refresh, one generation per concurrent miss,
+persistence across processes, background warm-up and the latency of a
+cached lesson against the live provider chain.
+"""
+
+import asyncio
+import os
+import tempfile
+import time
+from unittest.mock import patch
+
+import pytest
+
+import teacher
+from lesson_cache import LessonCache, is_cacheable_lesson
+from storage_router import close_all_pools
+
+PROVIDER_DELAY = 0.05
+
+
+def make_lesson(topic, level, provider="groq"):
+    return {
+        "lesson_title": f"{topic} / {level}",
+        "content": "Текст урока",
+        "key_points": ["Пункт 1", "Пункт 2"],
+        "real_world_example": "Пример",
+        "practice_question": "Вопрос?",
+        "next_topics": ["Тема 1"],
+        "ai_provider": provider,
+    }
+
+
+class FakeGenerator:
+    """Генератор уроков с задержкой провайдера и счётчиком вызовов."""
+
+    def __init__(self, delay=0.0, fail=False):
+        self.delay = delay
+        self.fail = fail
+        self.calls = []
+
+    async def __call__(self, topic, level, language):
+        self.calls.append((topic, level, language))
+        await asyncio.sleep(self.delay)
+        return None if self.fail else make_lesson(topic, level)
+
+
+@pytest.fixture
+def main_db():
+    with tempfile.TemporaryDirectory() as path:
+        yield os.path.join(path, "rvx_bot.db")
+        close_all_pools()
+
+
+def test_only_ai_lessons_are_cacheable():
+    assert is_cacheable_lesson(make_lesson("ai", "expert"))
+    assert not is_cacheable_lesson(None)
+    assert not is_cacheable_lesson({"content": "без заголовка"})
+    assert not is_cacheable_lesson(dict(make_lesson("ai", "expert"), is_fallback=True))
+
+
+@pytest.mark.asyncio
+async def test_miss_generates_once_then_hits(main_db):
+    generator = FakeGenerator(delay=0.01)
+    cache = LessonCache(generator, main_db_path=main_db)
+
+    lessons = await asyncio.gather(*(cache.get("defi", "expert") for _ in range(5)))
+    assert generator.calls == [("defi", "expert", "ru")]
+    assert all(lesson == make_lesson("defi", "expert") for lesson in lessons)
+
+    lesson = await cache.get("defi", "expert")
+    lesson["lesson_title"] = "изменён вызывающим кодом"
+    assert (await cache.get("defi", "expert"))["lesson_title"] == "defi / expert"
+    assert len(generator.calls) == 1
+
+    stats = cache.stats()
+    assert (stats["misses"], stats["hits"], stats["generated"]) == (5, 2, 1)
+
+
+@pytest.mark.asyncio
+async def test_failed_generation_is_not_cached(main_db):
+    generator = FakeGenerator(fail=True)
+    cache = LessonCache(generator, main_db_path=main_db)
+    assert await cache.get("nft", "advanced") is None
+    assert await cache.get("nft", "advanced") is None
+    assert len(generator.calls) == 2
+    assert cache.stats()["failed"] == 2
+
+
+@pytest.mark.asyncio
+async def test_stale_lesson_is_served_and_refreshed_in_background():
+    generator = FakeGenerator(delay=0.02)
+    cache = LessonCache(generator, ttl=60, persist=False)
+    await cache.get("web3", "expert")
+    cache.peek("web3", "expert").created_at -= 3600
+
+    # Устаревший урок отдаётся, не дожидаясь генерации: она ещё не началась
+    lesson = await cache.get("web3", "expert")
+    assert lesson["lesson_title"] == "web3 / expert"
+    assert len(generator.calls) == 1
+
+    await asyncio.gather(*cache._background)
+    assert len(generator.calls) == 2
+    assert cache.peek("web3", "expert").is_fresh(cache.ttl, time.time())
+    stats = cache.stats()
+    assert (stats["stale_hits"], stats["refreshed"]) == (1, 1)
+
+
+@pytest.mark.asyncio
+async def test_lessons_survive_restart_and_are_shared_between_processes(main_db):
+    first = LessonCache(FakeGenerator(), main_db_path=main_db)
+    await first.get("ai", "expert")
+
+    # Новый процесс: урок загружается из БД кэша, ИИ не вызывается
+    generator = FakeGenerator()
+    second = LessonCache(generator, main_db_path=main_db)
+    assert (await second.get("ai", "expert"))["lesson_title"] == "ai / expert"
+
+    # Урок, сгенерированный другим процессом после загрузки
+    await first.get("security", "advanced")
+    assert (await second.get("security", "advanced"))["lesson_title"] == "security / advanced"
+    assert generator.calls == []
+
+
+@pytest.mark.asyncio
+async def test_warm_fills_expected_keys(main_db):
+    keys = [("ai", "advanced", "ru"), ("ai", "expert", "ru"), ("nft", "expert", "ru")]
+    generator = FakeGenerator()
+    cache = LessonCache(generator, main_db_path=main_db, expected=lambda: keys)
+    await cache.get("nft", "expert")
+    assert cache.pending() == keys[:2]
+    assert cache.stats()["coverage"] == pytest.approx(1 / 3)
+
+    assert cache.start_warm(pace=0)
+    assert not cache.start_warm(pace=0)
+    assert await cache._warm_task == 2
+    assert cache.pending() == []
+    assert cache.stats()["coverage"] == 1.0
+    assert not cache.start_warm(pace=0)
+    assert sorted(generator.calls) == sorted(keys)
+
+
+def test_expected_keys_skip_embedded_lessons():
+    from embedded_teacher import get_difficulties_for_topic
+    keys = teacher.lesson_cache_keys()
+    assert keys
+    for topic, level, language in keys:
+        assert topic in teacher.TEACHING_TOPICS and level in teacher.DIFFICULTY_LEVELS
+        assert level not in get_difficulties_for_topic(teacher.convert_topic_name_to_embedded(topic))
+        assert language == "ru"
+
+
+@pytest.fixture
+def teacher_cache(main_db):
+    """teacher.teach_lesson с кэшем во временной БД и медленным Groq."""
+    topic, level = teacher.lesson_cache_keys()[0][:2]
+    calls = []
+
+    async def groq(topic, difficulty_level):
+        calls.append((topic, difficulty_level))
+        await asyncio.sleep(PROVIDER_DELAY)
+        return make_lesson(topic, difficulty_level)
+
+    cache = LessonCache(teacher.generate_ai_lesson, main_db_path=main_db, expected=teacher.lesson_cache_keys)
+    with patch.object(teacher, "lesson_cache", cache), patch.object(teacher, "teach_lesson_via_groq", groq):
+        yield cache, calls, topic, level
+
+
+@pytest.mark.asyncio
+async def test_teach_lesson_uses_cache_for_ai_lessons(teacher_cache):
+    cache, calls, topic, level = teacher_cache
+    first = await teacher.teach_lesson(topic, level)
+    second = await teacher.teach_lesson(topic, level)
+    assert first == second == make_lesson(topic, level)
+    assert calls == [(topic, level)]
+    assert cache.stats()["hit_rate"] == 0.5
+
+
+@pytest.mark.asyncio
+async def test_teach_lesson_fallback_is_not_cached(teacher_cache):
+    cache, calls, topic, level = teacher_cache
+
+    async def no_lesson(topic, difficulty_level):
+        return None
+
+    with patch.object(teacher, "teach_lesson_via_groq", no_lesson), \
+            patch.object(teacher, "teach_lesson_via_mistral", no_lesson), \
+            patch.object(teacher, "teach_lesson_via_deepseek", no_lesson), \
+            patch.object(teacher, "teach_lesson_via_gemini_direct", no_lesson):
+        lesson = await teacher.teach_lesson(topic, level)
+    assert lesson["is_fallback"] is True
+    assert cache.peek(topic, level) is None
+
+
+@pytest.mark.slow
+@pytest.mark.asyncio
+async def test_cached_lesson_benchmark(teacher_cache):
+    """teach_lesson для пары без встроенного урока: генерация ИИ против кэша."""
+    cache, calls, topic, level = teacher_cache
+
+    started = time.perf_counter()
+    await teacher.teach_lesson(topic, level)
+    live = time.perf_counter() - started
+
+    rounds = 200
+    started = time.perf_counter()
+    for _ in range(rounds):
+        await teacher.teach_lesson(topic, level)
+    cached = (time.perf_counter() - started) / rounds
+
+    print(f"\nteach_lesson without embedded lesson: live providers {live * 1e6:.0f} µs "
+          f"(simulated {PROVIDER_DELAY * 1e3:.0f} ms), lesson_cache {cached * 1e6:.1f} µs")
+    assert len(calls) == 1
+    assert cached * 10 < live
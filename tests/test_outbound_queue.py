@@ -0,0 +1,185 @@
+"""
+Tests for outbound_queue: non-blocking sends, per-chat order and pacing,
+edit coalescing, per-chunk retries, RetryAfter, drops and metrics.
+"""
+
+import asyncio
+import time
+from datetime import timedelta
+
+import pytest
+from telegram.error import BadRequest, Forbidden, RetryAfter, TimedOut
+
+import bot as bot_module
+import daily_digest_scheduler
+from broadcast_engine import TokenBucket
+from messages import split_message
+from outbound_queue import OutboundDropped, OutboundQueue
+
+
+class FakeBot:
+    def __init__(self, delay=0.0, failures=None):
+        self.delay = delay
+        # {text: [исключения по порядку попыток]}
+        self.failures = failures or {}
+        self.calls = []
+
+    async def _call(self, method, chat_id, text, **kwargs):
+        self.calls.append((method, chat_id, text, time.monotonic()))
+        await asyncio.sleep(self.delay)
+        errors = self.failures.get(text)
+        if errors:
+            raise errors.pop(0)
+        return {"method": method, "chat_id": chat_id, "text": text}
+
+    async def send_message(self, chat_id, text, **kwargs):
+        return await self._call("send", chat_id, text, **kwargs)
+
+    async def edit_message_text(self, text, chat_id, message_id, **kwargs):
+        return await self._call("edit", chat_id, text, **kwargs)
+
+
+def make_queue(**kwargs):
+    kwargs.setdefault("private_burst", 100)
+    kwargs.setdefault("retry_delay", 0.01)
+    return OutboundQueue(bucket=TokenBucket(rate=1000, capacity=1000), **kwargs)
+
+
+@pytest.mark.asyncio
+async def test_send_is_non_blocking_and_ordered_per_chat():
+    queue = make_queue()
+    bot = FakeBot(delay=0.02)
+    futures = [queue.send(bot, chat_id, f"{chat_id}-{i}") for i in range(5) for chat_id in (1, 2, 3)]
+    # send() только ставит сообщение в очередь чата
+    assert queue.stats()["pending"] == 15 and not bot.calls
+
+    await asyncio.gather(*futures)
+    for chat_id in (1, 2, 3):
+        assert [c[2] for c in bot.calls if c[1] == chat_id] == [f"{chat_id}-{i}" for i in range(5)]
+    stats = queue.stats()
+    assert stats["sent"] == 15 and stats["pending"] == 0 and stats["chats"] == 0
+    assert stats["latency_max_ms"] > 0
+
+
+@pytest.mark.slow
+@pytest.mark.asyncio
+async def test_chats_are_sent_in_parallel():
+    queue = make_queue()
+    bot = FakeBot(delay=0.02)
+    started = time.monotonic()
+    await asyncio.gather(*[queue.send(bot, chat_id, str(i)) for i in range(5) for chat_id in (1, 2, 3)])
+    # Чаты параллельно: 5 x 20 мс, а не 15 x 20 мс
+    assert time.monotonic() - started < 0.25
+
+
+@pytest.mark.asyncio
+async def test_private_chat_pacing():
+    queue = make_queue(private_burst=2, private_rate=20)
+    bot = FakeBot()
+    started = time.monotonic()
+    await asyncio.gather(*[queue.send(bot, 1, str(i)) for i in range(6)])
+    # 2 сразу, затем по одному каждые 50 мс
+    assert time.monotonic() - started >= 0.19
+
+
+@pytest.mark.asyncio
+async def test_consecutive_edits_are_coalesced():
+    queue = make_queue()
+    bot = FakeBot(delay=0.05)
+    first = queue.send(bot, 1, "status")
+    edits = [queue.edit(bot, 1, 77, f"progress {i}") for i in range(5)]
+    results = await asyncio.gather(first, *edits)
+
+    assert [c[2] for c in bot.calls] == ["status", "progress 4"]
+    assert all(result == results[1] for result in results[1:])
+    assert queue.stats()["coalesced"] == 4
+
+    # Правка другого сообщения или после отправки не объединяется
+    await asyncio.gather(queue.edit(bot, 1, 77, "a"), queue.edit(bot, 1, 78, "b"), queue.send(bot, 1, "c"),
+                         queue.edit(bot, 1, 78, "d"))
+    assert [c[2] for c in bot.calls[2:]] == ["a", "b", "c", "d"]
+
+
+@pytest.mark.asyncio
+async def test_only_failed_chunk_is_retried():
+    text = "\n".join(["x" * 40, "y" * 40, "z" * 40])
+    bot = FakeBot(failures={"y" * 40: [TimedOut(), TimedOut()]})
+    queue = make_queue()
+    results = await asyncio.gather(*queue.send_chunks(bot, 5, text, chunk_size=50, reply_markup="kb"))
+
+    assert [c[2][0] for c in bot.calls] == ["x", "y", "y", "y", "z"]
+    assert [r["text"][0] for r in results] == ["x", "y", "z"]
+    assert queue.stats()["retries"] == 2
+
+
+@pytest.mark.asyncio
+async def test_retry_after_pauses_and_resends():
+    bucket = TokenBucket(rate=1000, capacity=1000)
+    queue = OutboundQueue(bucket=bucket, private_burst=100)
+    bot = FakeBot(failures={"hello": [RetryAfter(timedelta(milliseconds=200))]})
+    started = time.monotonic()
+    result = await queue.send(bot, 1, "hello")
+    assert result["text"] == "hello"
+    assert time.monotonic() - started >= 0.19
+    assert queue.stats()["retry_after_pauses"] == 1
+
+
+@pytest.mark.asyncio
+async def test_failed_chunk_stops_rest_and_drops_are_counted():
+    bot = FakeBot(failures={"b" * 10: [Forbidden("blocked")]})
+    queue = make_queue(chat_max_pending=10)
+    futures = queue.send_chunks(bot, 1, "\n".join(["a" * 10, "b" * 10, "c" * 10]), chunk_size=12)
+    results = await asyncio.gather(*futures, return_exceptions=True)
+    assert results[0]["text"] == "a" * 10
+    assert isinstance(results[1], Forbidden)
+    assert isinstance(results[2], OutboundDropped)
+    assert [c[2] for c in bot.calls] == ["a" * 10, "b" * 10]
+
+    small = make_queue(max_pending=2)
+    slow = FakeBot(delay=0.01)
+    futures = [small.send(slow, 1, "1"), small.send(slow, 2, "2"), small.send(slow, 3, "3")]
+    with pytest.raises(OutboundDropped):
+        await futures[2]
+    await asyncio.gather(*futures[:2])
+    assert small.stats()["dropped"] == 1
+
+
+@pytest.mark.asyncio
+async def test_dialogue_reply_retries_broken_html_as_plain_text(monkeypatch):
+    html_text = "<b>Ответ</b> &amp; <i>детали"
+    bot = FakeBot(failures={html_text: [BadRequest("Can't parse entities")]})
+    monkeypatch.setattr(bot_module, "outbound", make_queue())
+    await bot_module.send_dialogue_reply(bot, 1, html_text, reply_markup="kb")
+    assert [c[2] for c in bot.calls] == [html_text, "Ответ & детали"]
+
+    # Не ушёл и простой текст - ошибку получает хендлер (он отправит запасной ответ)
+    bot = FakeBot(failures={"x": [Forbidden("blocked"), Forbidden("blocked")]})
+    with pytest.raises(Forbidden):
+        await bot_module.send_dialogue_reply(bot, 1, "x")
+
+
+@pytest.mark.asyncio
+async def test_digest_sends_numeric_channel_id_as_int(monkeypatch):
+    queue = make_queue()
+    monkeypatch.setattr(daily_digest_scheduler, "outbound", queue)
+    scheduler = daily_digest_scheduler.DailyDigestScheduler()
+    scheduler.bot = FakeBot()
+    await scheduler.send_message_safe("-1001234", "digest")
+    await scheduler.send_message_safe("@channel", "digest")
+    assert [c[1] for c in scheduler.bot.calls] == [-1001234, "@channel"]
+
+
+@pytest.mark.asyncio
+async def test_drain_waits_for_queue():
+    queue = make_queue()
+    bot = FakeBot(delay=0.02)
+    for i in range(3):
+        queue.send(bot, 1, str(i))
+    assert await queue.drain(timeout=1)
+    assert len(bot.calls) == 3
+
+
+def test_split_message_never_exceeds_chunk_size():
+    chunks = split_message("word " * 3000 + "\n" + "A" * 5000, chunk_size=4090)
+    assert all(len(chunk) <= 4090 for chunk in chunks)
+    assert "".join(chunks).replace(" ", "") == ("word" * 3000 + "A" * 5000)
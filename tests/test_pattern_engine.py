@@ -0,0 +1,121 @@
+"""
+Tests for pattern_engine: compiled pattern set equivalent to per-pattern
+re.search/re.findall, unchanged propaganda and scam scores, the shared
+per-text scan and its cost against the per-pattern loops.
+"""
+
+import random
+import re
+import time
+
+import pytest
+
+import ai_dialogue
+import propaganda_detector
+from pattern_engine import PatternEngine, pattern_engine
+
+TEXTS = [
+    "Обычный вопрос: как работает стейкинг эфира и какие там риски?",
+    "СРОЧНО!!! Гарантированный доход 100% прибыль без риска, успей пока не поздно, осталось 5 мест",
+    "Инсайд из надежного источника: скоро 100x, x50 минимум, до луны не долго. Только дураки не купят",
+    "Гарантированный листинг на binance, партнер google, команда молчит по security reasons, давайте в чат",
+    "Наша семья и братство избранных, святой миссии спасение. Крах, паника, кризис, катастрофа!",
+    "крах крах крах, кризис и кризис - вскоре произойдет конец света, больше не будет ничего",
+    "Биткоин упал на 5% после решения ФРС, аналитики ожидают коррекцию. " * 30,
+]
+
+
+def legacy_propaganda_scores(text):
+    """Очки analyze_propaganda в виде цикла re.findall по каждому паттерну."""
+    text_lower = text.lower()
+    scores, evidence, flags = {}, {}, []
+    for manip_type, patterns in propaganda_detector.PROPAGANDA_PATTERNS.items():
+        score, found = 0.0, []
+        for kind, weight in (("keywords", 0.1), ("phrases", 0.2)):
+            for pattern in patterns[kind]:
+                matches = re.findall(pattern, text_lower)
+                found.extend(matches)
+                score += len(matches) * weight
+        if found:
+            scores[manip_type.value], evidence[manip_type.value] = score, found
+    for flag_category, patterns in propaganda_detector.CRYPTO_RED_FLAGS.items():
+        for pattern in patterns:
+            if re.search(pattern, text_lower):
+                flags.append(f"🚩 {flag_category}: {pattern[:30]}")
+    return scores, evidence, flags
+
+
+def legacy_scam_flags(text):
+    text_lower = text.lower()
+    return ([name for name, pattern in ai_dialogue.SCAM_INDICATORS.items() if re.search(pattern, text_lower)],
+            [name for name, pattern in ai_dialogue.URGENCY_PHRASES.items() if re.search(pattern, text_lower)])
+
+
+def test_set_matching_equals_per_pattern_re():
+    patterns = {"double": "аа", "phrase": "б аб", "plus": "а+б", "group": "(аб|ба)", "greedy": "x.*y",
+                "digits": r"x[0-9]+"}
+    engine = PatternEngine(patterns)
+    assert engine.stats()["literal_patterns"] == 2
+    rng = random.Random(7)
+    alphabet = "аб xy0123\n"
+    for _ in range(1500):
+        text = "".join(rng.choice(alphabet) for _ in range(rng.randint(0, 30)))
+        hits = engine.scan(text)
+        for name, pattern in rng.sample(list(patterns.items()), len(patterns)):
+            assert hits.findall(name) == re.findall(pattern, text), (text, name)
+            assert hits.search(name) is (re.search(pattern, text) is not None)
+
+    with pytest.raises(ValueError):
+        engine.register({"empty": "x*"})
+
+
+def test_scan_is_shared_between_detectors():
+    text = "успей купить, 100x гарантированный рост и крах конкурентов " * 2
+    before = pattern_engine.stats()
+    propaganda_detector.analyze_propaganda(text)
+    ai_dialogue.detect_scam_red_flags(text)
+    ai_dialogue.add_scam_warning_if_needed(text, "ответ")
+    after = pattern_engine.stats()
+    assert after["scans"] - before["scans"] == 1
+    assert after["cache_hits"] - before["cache_hits"] == 2
+
+    hits = pattern_engine.scan(text.lower())
+    assert "scam.indicator.moon_promises" in hits.all("scam.")
+    assert hits.count("propaganda.FEAR_MONGERING.keywords.0") == 2
+
+
+@pytest.mark.parametrize("text", TEXTS)
+def test_detector_results_unchanged(text):
+    scores, evidence, flags = legacy_propaganda_scores(text)
+    analysis = propaganda_detector.analyze_propaganda(text)
+    assert analysis["crypto_red_flags"] == flags
+    assert analysis["total_found"] == len(scores)
+    assert analysis["confidence"] == pytest.approx(min(sum(scores.values()) / 15.0, 1.0))
+    for manipulation in analysis["manipulations"]:
+        assert manipulation["score"] == pytest.approx(min(scores[manipulation["type"]], 1.0))
+        assert manipulation["evidence"] == evidence[manipulation["type"]]
+
+    risks = ai_dialogue.detect_scam_red_flags(text)
+    assert (risks["scam_indicators"], risks["urgency_phrases"]) == legacy_scam_flags(text)
+
+
+@pytest.mark.slow
+def test_detectors_benchmark():
+    """Оба детектора по новому тексту: циклы re по паттернам против pattern_engine (отчёт)."""
+    texts = [f"{text} #{i}" for i in range(40) for text in TEXTS]
+
+    started = time.process_time()
+    for text in texts:
+        legacy_propaganda_scores(text)
+        legacy_scam_flags(text)
+    legacy = (time.process_time() - started) / len(texts)
+
+    started = time.process_time()
+    for text in texts:
+        propaganda_detector.analyze_propaganda(text)
+        ai_dialogue.detect_scam_red_flags(text)
+    engine = (time.process_time() - started) / len(texts)
+
+    print(f"\npropaganda + scam per text: per-pattern re {legacy * 1e6:.1f} µs, pattern_engine {engine * 1e6:.1f} µs")
+    # Новый текст стоит примерно столько же, сколько циклы re: проверяется только, что не хуже
+    assert engine < legacy * 1.5
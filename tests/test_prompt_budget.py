@@ -0,0 +1,170 @@
+"""
+Tests for prompt_budget: history selection in the per-mode token budget
+(the legacy context when everything fits), relevance over recency for old
+turns, cached system prompts, prompt tokens recorded from provider usage
+and the size of the prompt sent against the legacy assembly.
+"""
+
+from unittest.mock import patch
+
+import pytest
+
+import ai_dialogue
+from prompt_budget import PromptBudget, estimate_tokens, score_turns
+
+LONG_REPLY = ("Биткоин - первая криптовалюта, сеть работает на proof-of-work, майнеры подтверждают "
+              "блоки примерно раз в десять минут. ") * 3
+
+
+def make_history(contents):
+    return [{"role": "user" if i % 2 == 0 else "assistant", "content": content}
+            for i, content in enumerate(contents)]
+
+
+def long_history():
+    """10 реплик по 300 символов: приветствие, стейкинг, затем разговор о биткоине."""
+    contents = ["Привет! Как дела? " * 20, "Привет! Чем помочь? " * 20,
+                "Расскажи про стейкинг эфира и доходность валидаторов. " * 6,
+                "Стейкинг - блокировка ETH для валидации, доходность валидаторов около 3-4% годовых. " * 4]
+    for day in range(1, 4):
+        contents += [f"День {day}: что с биткоином, почему падает цена? " * 7, f"День {day}: {LONG_REPLY}"]
+    return make_history(contents)
+
+
+class FakeClient:
+    """httpx.Client провайдера: запоминает запросы и отвечает с usage."""
+
+    requests = []
+
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def post(self, url, json=None, headers=None, timeout=None):
+        FakeClient.requests.append(json)
+        return _Response({"choices": [{"message": {"content": "Ответ"}}], "usage": {"prompt_tokens": 1234}})
+
+
+class _Response:
+    status_code = 200
+
+    def __init__(self, data):
+        self._data = data
+
+    def json(self):
+        return self._data
+
+
+def test_estimate_tokens():
+    assert estimate_tokens("") == 0
+    assert estimate_tokens("a" * 400) == 101
+    assert estimate_tokens("я" * 250) == 101
+    assert estimate_tokens("😀" * 10) > 0
+
+
+def test_history_matches_legacy_context_when_it_fits():
+    budget = PromptBudget({"dialogue": 10_000})
+    for history in (
+        [],
+        make_history(["Что такое DeFi?", "DeFi - децентрализованные финансы.", "А риски?"]),
+        make_history(["x" * 500, 12345, "Почему?"]) + ["не словарь"],
+    ):
+        prompt = budget.assemble("dialogue", "SYSTEM", history, "А риски DeFi?")
+        assert prompt.context_str == ai_dialogue.build_context_for_prompt(history)
+        assert prompt.user_content == f"{prompt.context_str}Пользователь: А риски DeFi?"
+        assert prompt.dropped == prompt.compressed == 0
+
+
+def test_long_history_fits_budget_and_keeps_relevant_turns():
+    history = long_history()
+    system = ai_dialogue.build_dialogue_system_prompt("ru")
+    budget = PromptBudget()
+    message = "Какая доходность у стейкинга эфира?"
+    prompt = budget.assemble("dialogue", system, history, message)
+
+    assert prompt.tokens <= prompt.budget
+    legacy = f"{ai_dialogue.build_context_for_prompt(history)}Пользователь: {message}"
+    assert estimate_tokens(system) + estimate_tokens(legacy) > prompt.budget
+    assert prompt.dropped + prompt.compressed > 0
+
+    lines = prompt.context_str.splitlines()[1:-1]
+    # Последний обмен репликами целиком, старая реплика о стейкинге важнее приветствия
+    assert lines[-2:] == [f"Пользователь: {history[-2]['content'][:300]}", f"Помощник: {history[-1]['content'][:300]}"]
+    assert f"Помощник: {history[3]['content'][:300]}" in lines
+    assert f"Пользователь: {history[0]['content'][:300]}" not in lines
+    # Порядок реплик в промпте - хронологический
+    positions = [next(i for i, turn in enumerate(history) if turn["content"].startswith(line.split(": ", 1)[1][:40]))
+                 for line in lines]
+    assert positions == sorted(positions)
+
+
+def test_scores_prefer_recent_and_relevant_turns():
+    turns = [("Пользователь", "стейкинг эфира"), ("Помощник", "погода"), ("Пользователь", "привет")]
+    scores = score_turns(turns, "стейкинг эфира")
+    assert scores[0] > scores[2] > scores[1]
+
+
+def test_system_prompt_prefix_built_once_per_mode_and_language():
+    budget = PromptBudget()
+    calls = []
+
+    def builder(language):
+        calls.append(language)
+        return f"prompt {language}"
+
+    for _ in range(3):
+        for language in ("ru", "uk"):
+            prefix = budget.prefix("dialogue", language, lambda: builder(language))
+            assert prefix.text == f"prompt {language}" and prefix.tokens == estimate_tokens(prefix.text)
+    assert calls == ["ru", "uk"]
+    assert budget.stats()["cached_prefixes"] == 2
+
+
+def test_provider_usage_is_recorded():
+    budget = PromptBudget()
+    budget.record("groq", "dialogue", 100, 120)
+    budget.record("ollama", "dialogue", 80)
+    budget.record("gemini", "geopolitical", 50, None)
+    stats = budget.stats()
+    assert stats["calls"] == 3 and stats["prompt_tokens"] == 120 + 80 + 50
+    assert stats["modes"]["dialogue"]["avg_prompt_tokens"] == 100
+    assert stats["modes"]["dialogue"]["estimate_ratio"] == pytest.approx(100 / 120, abs=1e-3)
+    assert stats["modes"]["geopolitical"]["estimate_ratio"] is None
+
+
+def test_get_ai_response_sends_budgeted_prompt():
+    budget = PromptBudget()
+    FakeClient.requests = []
+    with patch.object(ai_dialogue, "prompt_budget", budget), \
+            patch.object(ai_dialogue, "OLLAMA_ENABLED", False), \
+            patch.object(ai_dialogue, "GROQ_API_KEY", "key"), \
+            patch.object(ai_dialogue.httpx, "Client", FakeClient):
+        for _ in range(2):
+            assert ai_dialogue.get_ai_response_sync("Какая доходность у стейкинга?", long_history()) == "Ответ"
+
+    system, user = FakeClient.requests[0]["messages"]
+    assert system["content"] == ai_dialogue.build_dialogue_system_prompt("ru")
+    assert user["content"].endswith("Пользователь: Какая доходность у стейкинга?")
+    assert estimate_tokens(system["content"]) + estimate_tokens(user["content"]) <= budget.budget_for("dialogue")
+    stats = budget.stats()
+    assert stats["calls"] == 2 and stats["prompt_tokens"] == 2 * 1234
+    assert stats["cached_prefixes"] == 1
+
+
+def test_budgeted_prompt_is_smaller_than_legacy():
+    """Токены промпта диалога с полной историей: как раньше против бюджета режима."""
+    history = long_history()
+    message = "Какая доходность у стейкинга эфира?"
+    system = ai_dialogue.build_dialogue_system_prompt("ru")
+    legacy_tokens = estimate_tokens(system) + estimate_tokens(
+        f"{ai_dialogue.build_context_for_prompt(history)}Пользователь: {message}")
+
+    prompt = PromptBudget().assemble("dialogue", system, history, message)
+    print(f"\ndialogue prompt with 10 history turns: legacy ~{legacy_tokens} tokens, "
+          f"budgeted ~{prompt.tokens}/{prompt.budget} tokens")
+    assert prompt.tokens <= prompt.budget < legacy_tokens
@@ -0,0 +1,122 @@
+"""
+Query-plan regression suite: hot bot queries on a seeded synthetic DB must
+use indices and stay within the stored latency baseline.
+"""
+
+import inspect
+import os
+import sqlite3
+import tempfile
+
+import pytest
+
+import query_plan_audit
+from query_plan_audit import (
+    HOT_QUERIES, HotQuery, build_bot_schema, find_full_scans, load_baseline,
+    normalize_sql, run_audit, seed_synthetic_db
+)
+
+
+@pytest.fixture(scope="module")
+def seeded_db():
+    baseline_scale, _ = load_baseline()
+    with tempfile.TemporaryDirectory() as path:
+        conn = sqlite3.connect(os.path.join(path, "plans.db"))
+        build_bot_schema(conn)
+        counts = seed_synthetic_db(conn, scale=baseline_scale or 0.05)
+        yield conn, counts
+        conn.close()
+
+
+@pytest.fixture(scope="module")
+def report(seeded_db):
+    conn, counts = seeded_db
+    _, baseline = load_baseline()
+    return run_audit(conn, baseline=baseline, row_counts=counts)
+
+
+def test_hot_queries_mirror_bot_source():
+    import bot
+    for query in HOT_QUERIES:
+        source = normalize_sql(inspect.getsource(getattr(bot, query.source)))
+        assert normalize_sql(query.sql) in source, f"{query.name} drifted from bot.{query.source}"
+
+
+def test_seeded_cardinalities(seeded_db):
+    _, counts = seeded_db
+    assert counts["requests"] > counts["users"] * 5
+    assert counts["leaderboard_cache"] == 150
+
+
+def test_no_scan_without_index(report):
+    scans = {r.name: r.full_scans for r in report.results if r.full_scans}
+    assert not scans, report.format()
+
+
+def test_baseline_covers_hot_queries(report):
+    assert all(r.baseline_ms is not None for r in report.results), "baseline missing queries - rerun with --update-baseline"
+
+
+@pytest.mark.slow
+def test_latency_within_baseline(report):
+    regressions = [r.name for r in report.results if r.regression]
+    assert not regressions, report.format()
+
+
+class TestDetection:
+
+    @pytest.fixture
+    def conn(self):
+        conn = sqlite3.connect(":memory:")
+        conn.execute("CREATE TABLE items (id INTEGER PRIMARY KEY, owner INTEGER, kind TEXT, added_at TEXT)")
+        conn.executemany("INSERT INTO items (owner, kind, added_at) VALUES (?, 'a', ?)",
+                         [(i % 50, f"2024-01-{i % 28 + 1:02d}") for i in range(2000)])
+        yield conn
+        conn.close()
+
+    def test_scan_fails_and_gets_recommendation(self, conn):
+        query = HotQuery("items_by_owner", "test",
+                         "SELECT id FROM items WHERE owner = ? AND kind = ? ORDER BY added_at DESC LIMIT ?",
+                         lambda: (3, "a", 10))
+        result = run_audit(conn, [query], repeat=1)
+        assert result.results[0].full_scans == ["items"]
+        assert not result.ok
+        assert result.recommendations["items_by_owner"] == (
+            "CREATE INDEX IF NOT EXISTS idx_items_owner_kind_added_at "
+            "ON items(owner, kind, added_at DESC)"
+        )
+
+        conn.execute(result.recommendations["items_by_owner"])
+        result = run_audit(conn, [query], repeat=1)
+        assert result.ok
+        assert result.recommendations == {}
+
+    def test_allowed_scan(self, conn):
+        query = HotQuery("count", "test", "SELECT COUNT(*) FROM items", allow_scan=("items",))
+        result = run_audit(conn, [query], repeat=1)
+        assert result.ok
+        assert result.results[0].allowed_scans == ["items"]
+
+    def test_latency_regression(self, conn):
+        query = HotQuery("slow", "test", "SELECT COUNT(*) FROM items a JOIN items b ON a.owner = b.owner",
+                         allow_scan=("a", "b", "items"))
+        result = run_audit(conn, [query], baseline={"slow": 0.001}, repeat=1)
+        assert result.results[0].regression
+        assert "latency regression" in result.format()
+
+    def test_find_full_scans(self):
+        plan = ["SCAN users", "SCAN u USING COVERING INDEX idx", "SEARCH r USING INDEX i (user_id=?)",
+                "SCAN CONSTANT ROW", "SCAN q AS x"]
+        assert find_full_scans(plan) == ["users", "q"]
+
+
+def test_cli_writes_report(tmp_path, monkeypatch):
+    monkeypatch.setitem(query_plan_audit.SEED_CARDINALITIES, "requests", 2000)
+    report_path = tmp_path / "report.txt"
+    baseline_path = tmp_path / "baseline.json"
+    assert query_plan_audit.main(["--scale", "0.01", "--baseline", str(baseline_path),
+                                  "--update-baseline", "--report", str(report_path), "--repeat", "1"]) == 0
+    assert "Query plan audit" in report_path.read_text(encoding="utf-8")
+    scale, latency = load_baseline(str(baseline_path))
+    assert scale == 0.01
+    assert set(latency) == {q.name for q in HOT_QUERIES}
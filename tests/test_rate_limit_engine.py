@@ -0,0 +1,158 @@
+"""
+Tests for rate_limit_engine: GCRA decisions, exact Retry-After, per-call
+limits (API keys), idle-key eviction and the legacy limiter adapters.
+"""
+
+import threading
+
+import pytest
+
+from rate_limit_engine import RateLimitEngine, RateLimitPolicy, benchmark, retry_after_header
+
+
+class FakeClock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+class TestGCRA:
+
+    def test_burst_then_exact_retry_after(self, clock):
+        policy = RateLimitPolicy("t", limit=10, window=60, clock=clock)
+        remaining = [policy.hit("a").remaining for _ in range(10)]
+        assert remaining == list(range(9, -1, -1))
+
+        denied = policy.hit("a")
+        assert not denied.allowed
+        assert denied.retry_after == pytest.approx(6.0)
+        assert denied.retry_after_seconds == 6
+
+        clock.now += 5.9
+        assert policy.try_acquire("a") == pytest.approx(0.1)
+        clock.now += 0.1
+        assert policy.try_acquire("a") == 0.0
+
+    def test_steady_rate_after_burst(self, clock):
+        policy = RateLimitPolicy("t", limit=4, window=4, clock=clock)
+        for _ in range(4):
+            policy.hit("a")
+        allowed = 0
+        for _ in range(40):
+            clock.now += 0.25
+            allowed += policy.hit("a").allowed
+        # 1 запрос/с на протяжении 10 секунд
+        assert allowed == 10
+
+    def test_keys_are_independent(self, clock):
+        policy = RateLimitPolicy("t", limit=2, window=60, clock=clock)
+        policy.hit(1)
+        policy.hit(1)
+        assert not policy.hit(1).allowed
+        assert policy.hit(2).allowed
+
+    def test_per_call_limit_override(self, clock):
+        policy = RateLimitPolicy("api_key", limit=1, window=60, clock=clock)
+        results = [policy.hit("rvx_key_x", limit=100).allowed for _ in range(100)]
+        assert all(results)
+        denied = policy.hit("rvx_key_x", limit=100)
+        assert not denied.allowed and denied.limit == 100
+        assert denied.retry_after == pytest.approx(0.6)
+
+    def test_peek_and_reset(self, clock):
+        policy = RateLimitPolicy("t", limit=3, window=30, clock=clock)
+        assert policy.peek("a").remaining == 3
+        for _ in range(3):
+            policy.hit("a")
+        assert policy.peek("a").retry_after_seconds == 10
+        assert policy.limited_keys() == 1
+        policy.reset("a")
+        assert policy.peek("a").allowed
+
+    def test_idle_keys_evicted(self, clock):
+        policy = RateLimitPolicy("t", limit=5, window=10, shards=4, clock=clock)
+        for key in range(1000):
+            policy.hit(key)
+        assert len(policy) == 1000
+        clock.now += 2
+        policy.hit("active")
+        # Один запрос из 5 восстанавливается за 2с - ключи уже простаивают
+        assert policy.evict_idle() == 1000
+        assert len(policy) == 1
+
+    def test_sweep_on_hit_bounds_memory(self, clock):
+        policy = RateLimitPolicy("t", limit=5, window=1, shards=1, sweep_interval=1, clock=clock)
+        for second in range(20):
+            clock.now += 1.5
+            for key in range(100):
+                policy.hit((second, key))
+        assert len(policy) <= 200
+
+    def test_thread_safety(self):
+        policy = RateLimitPolicy("t", limit=50, window=60)
+        results = []
+
+        def worker():
+            results.extend(policy.hit("shared").allowed for _ in range(20))
+
+        threads = [threading.Thread(target=worker) for _ in range(10)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert sum(results) == 50
+
+    def test_retry_after_header(self):
+        assert retry_after_header(0.0) == 0
+        assert retry_after_header(0.2) == 1
+        assert retry_after_header(6.0) == 6
+
+
+def test_engine_registry():
+    engine = RateLimitEngine()
+    policy = engine.policy("ai_user", 10, 60)
+    assert engine.policy("ai_user", 10, 60) is policy
+    assert engine.policy("ai_user", 20, 60).limit == 20
+    policy.hit(1)
+    assert engine.stats()["ai_user"]["tracked_keys"] == 1
+
+
+def test_legacy_adapters():
+    from security_middleware import RateLimiter
+    limiter = RateLimiter(requests_per_minute=2)
+    assert limiter.is_allowed("1.2.3.4") == (True, None)
+    limiter.is_allowed("1.2.3.4")
+    allowed, error = limiter.is_allowed("1.2.3.4")
+    assert not allowed and "retry after 30s" in error
+    assert limiter.get_stats("1.2.3.4")["remaining"] == 0
+
+
+def test_ai_rate_limit_message_has_exact_wait():
+    from ai_dialogue import AI_RATE_LIMIT_REQUESTS, ai_rate_policy, check_ai_rate_limit
+    ai_rate_policy.reset()
+    try:
+        for _ in range(AI_RATE_LIMIT_REQUESTS):
+            check_ai_rate_limit(555)
+        allowed, remaining, message = check_ai_rate_limit(555)
+        assert not allowed and remaining == 0
+        assert f"{ai_rate_policy.peek(555).retry_after_seconds}сек" in message
+    finally:
+        ai_rate_policy.reset()
+
+
+@pytest.mark.slow
+@pytest.mark.timeout(120)
+def test_benchmark_100k_keys():
+    result = benchmark(keys=100_000, hits_per_key=3)
+    print(f"\nGCRA {result['gcra_ops_per_sec']:,.0f} ops/s {result['gcra_memory_mb']:.1f}MB, "
+          f"sliding log {result['sliding_log_ops_per_sec']:,.0f} ops/s {result['sliding_log_memory_mb']:.1f}MB, "
+          f"evict {result['evicted']:,} keys in {result['evict_ms']:.1f}ms")
+    assert result["evicted"] == 100_000
+    assert result["gcra_memory_mb"] < result["sliding_log_memory_mb"]
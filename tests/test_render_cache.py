@@ -0,0 +1,140 @@
+"""
+Tests for render_cache: per-language build-once views, immutability,
+field templating, invalidation from i18n.reload_translations and the
+CPU cost of rendering the /start screen.
+"""
+
+import dataclasses
+import time
+
+import pytest
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+
+import bot
+import i18n
+from render_cache import RenderCache, RenderedView, render_cache, slot, t
+
+
+def make_cache():
+    cache = RenderCache(languages=["ru", "uk"])
+    calls = []
+
+    @cache.view("greeting")
+    def build(language):
+        calls.append(language)
+        text = f"{t('start.title', language)} {{literal}}\n{slot('start.greeting', language)}"
+        keyboard = InlineKeyboardMarkup([[InlineKeyboardButton(language, callback_data="x")]])
+        return RenderedView(text, keyboard, templated=True)
+
+    return cache, calls
+
+
+def test_view_is_built_once_per_language():
+    cache, calls = make_cache()
+    assert cache.warm() == 2
+    first = cache.get("greeting", "uk")
+    assert cache.get("greeting", "uk") is first
+    # Неизвестный язык - язык по умолчанию
+    assert cache.get("greeting", "xx") is cache.get("greeting", "ru")
+    assert calls == ["ru", "uk"]
+    stats = cache.stats()
+    assert stats["builds"] == 2 and stats["hits"] == 4
+
+    with pytest.raises(KeyError):
+        cache.get("missing", "ru")
+
+
+def test_views_are_immutable_and_templated():
+    cache, _ = make_cache()
+    view = cache.get("greeting", "ru")
+    with pytest.raises(dataclasses.FrozenInstanceError):
+        view.text = "changed"
+    with pytest.raises(AttributeError):
+        view.reply_markup.inline_keyboard = ()
+
+    text = view.render(greeting="Привет, {name}")
+    assert text.endswith("👋 Привет, {name}")
+    # Статичные скобки не считаются полями
+    assert "{literal}" in text
+    assert RenderedView("{x}").render(x=1) == "{x}"
+
+
+def test_reload_translations_invalidates():
+    cache, calls = make_cache()
+    i18n.on_translations_reload(cache.invalidate)
+    try:
+        cache.warm()
+        i18n.reload_translations("uk")
+        assert ("greeting", "ru") in cache and ("greeting", "uk") not in cache
+        i18n.reload_translations()
+        assert len(cache) == 0
+        cache.get("greeting", "ru")
+        assert calls == ["ru", "uk", "ru"]
+    finally:
+        i18n._reload_callbacks.remove(cache.invalidate)
+
+
+FIELDS = dict(greeting="Привет, Алекс!", remaining=42, max_requests=bot.MAX_REQUESTS_PER_DAY,
+              level="Новичок", xp=120, courses=1, tests=3)
+
+
+async def legacy_start_render(language):
+    """Сборка приветствия /start так, как хендлер делал до render_cache."""
+    async def text(key, **kwargs):
+        return await i18n.get_text(key, language=language, **kwargs)
+
+    parts = [
+        await text("start.title"), await text("start.subtitle"),
+        await text("start.greeting", greeting=FIELDS["greeting"]), await text("start.path_header"),
+    ]
+    for key in ("feature_analyze", "feature_learn", "feature_tasks", "feature_leaderboard", "profile_header",
+                "benefits_header", "benefit_1", "benefit_2", "benefit_3", "benefit_4", "benefit_5",
+                "cta_header", "cta_text", "cta_help"):
+        parts.append(await text(f"start.{key}"))
+    parts.append(await text("start.limits", remaining=42, max_requests=FIELDS["max_requests"]))
+    parts.append(await text("start.level", level="Новичок", xp=120))
+    parts.append(await text("start.progress", courses=1, tests=3))
+    buttons = [await text(f"menu.{key}") for key in (
+        "teach", "learn", "stats", "leaderboard", "profile", "quests", "resources", "bookmarks",
+        "calculator", "airdrops", "activities", "history", "settings", "help_button")]
+    keyboard = InlineKeyboardMarkup([
+        [InlineKeyboardButton(buttons[i], callback_data=f"b{i}"), InlineKeyboardButton(buttons[i + 1], callback_data=f"b{i + 1}")]
+        for i in range(0, len(buttons), 2)
+    ])
+    return "\n".join(parts), keyboard
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("language", ["ru", "uk"])
+async def test_start_view_matches_translations(language):
+    view = render_cache.get("start", language)
+    text = view.render(**FIELDS)
+    assert "[MISSING" not in text and "{" not in text
+    assert await i18n.get_text("start.greeting", language=language, greeting=FIELDS["greeting"]) in text
+    assert await i18n.get_text("start.limits", language=language, remaining=42,
+                               max_requests=FIELDS["max_requests"]) in text
+    assert await i18n.get_text("start.progress", language=language, courses=1, tests=3) in text
+    buttons = [button for row in view.reply_markup.inline_keyboard for button in row]
+    assert len(buttons) == 14
+    assert buttons[0].text == await i18n.get_text("menu.teach", language=language)
+    assert buttons[-2].callback_data == "settings_menu"
+
+
+@pytest.mark.asyncio
+async def test_start_render_cpu_benchmark():
+    iterations = 300
+    render_cache.warm()
+
+    started = time.process_time()
+    for _ in range(iterations):
+        await legacy_start_render("uk")
+    legacy = (time.process_time() - started) / iterations
+
+    started = time.process_time()
+    for _ in range(iterations):
+        view = render_cache.get("start", "uk")
+        view.render(**FIELDS)
+    cached = (time.process_time() - started) / iterations
+
+    print(f"\n/start render CPU: legacy {legacy * 1e6:.1f} µs, cached {cached * 1e6:.1f} µs")
+    assert cached * 5 < legacy
@@ -0,0 +1,170 @@
+"""
+Tests for reporting_pool: read-only snapshot connections with a query
+time budget, and the capped report runner.
+"""
+
+import asyncio
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from unittest.mock import patch
+
+import pytest
+
+from exceptions import ReportTimeoutError, ReportsBusyError
+from reporting_pool import (
+    ReportRunner, get_reporting_pool, read_only_connection, close_reporting_pools
+)
+from storage_router import close_all_pools
+
+# Recursive CTE that keeps SQLite busy far longer than any test timeout
+SLOW_QUERY = """
+    WITH RECURSIVE n(x) AS (SELECT 1 UNION ALL SELECT x + 1 FROM n WHERE x < 100000000)
+    SELECT COUNT(*) FROM n
+"""
+
+
+@pytest.fixture
+def db_path():
+    with tempfile.TemporaryDirectory() as path:
+        db = os.path.join(path, "rvx_bot.db")
+        conn = sqlite3.connect(db)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("CREATE TABLE users (user_id INTEGER PRIMARY KEY, xp INTEGER)")
+        conn.execute("INSERT INTO users VALUES (1, 10)")
+        conn.commit()
+        conn.close()
+        yield db
+        close_reporting_pools()
+        close_all_pools()
+
+
+class TestReadOnlyConnection:
+
+    def test_writes_are_rejected(self, db_path):
+        with pytest.raises(sqlite3.OperationalError):
+            with read_only_connection(db_path) as conn:
+                conn.execute("UPDATE users SET xp = 0")
+
+    def test_reads_see_a_single_snapshot(self, db_path):
+        writer = sqlite3.connect(db_path)
+        with read_only_connection(db_path) as conn:
+            assert conn.execute("SELECT xp FROM users").fetchone()[0] == 10
+            writer.execute("UPDATE users SET xp = 20")
+            writer.commit()
+            assert conn.execute("SELECT xp FROM users").fetchone()[0] == 10
+        with read_only_connection(db_path) as conn:
+            assert conn.execute("SELECT xp FROM users").fetchone()[0] == 20
+        writer.close()
+
+    def test_query_timeout(self, db_path):
+        started = time.monotonic()
+        with pytest.raises(ReportTimeoutError):
+            with read_only_connection(db_path, timeout=0.05) as conn:
+                conn.execute(SLOW_QUERY).fetchone()
+        assert time.monotonic() - started < 2
+
+        # Pooled connection stays usable after the interrupt
+        with read_only_connection(db_path) as conn:
+            assert conn.execute("SELECT COUNT(*) FROM users").fetchone()[0] == 1
+        assert get_reporting_pool(db_path).get_stats()["timeouts"] == 1
+
+    def test_attached_routes_are_read_only(self, db_path):
+        with read_only_connection(db_path, attach=("cache",)) as conn:
+            databases = {row[1] for row in conn.execute("PRAGMA database_list")}
+            assert "cache_db" in databases
+            with pytest.raises(sqlite3.OperationalError):
+                conn.execute("CREATE TABLE cache_db.probe (id INTEGER)")
+
+
+class TestReportRunner:
+
+    @pytest.mark.asyncio
+    async def test_runs_off_the_event_loop(self):
+        runner = ReportRunner(max_concurrent=1, max_pending=2)
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                ticks += 1
+                await asyncio.sleep(0.01)
+
+        task = asyncio.create_task(ticker())
+        assert await runner.run(time.sleep, 0.2) is None
+        task.cancel()
+        runner.shutdown()
+        assert ticks >= 10
+
+    @pytest.mark.asyncio
+    async def test_rejects_when_queue_full(self):
+        runner = ReportRunner(max_concurrent=1, max_pending=1)
+        release = threading.Event()
+        first = asyncio.create_task(runner.run(release.wait, 5))
+        await asyncio.sleep(0.05)
+
+        with pytest.raises(ReportsBusyError):
+            await runner.run(lambda: None)
+
+        release.set()
+        assert await first is True
+        assert runner.stats == {"completed": 1, "rejected": 1, "failed": 0}
+        runner.shutdown()
+
+    @pytest.mark.asyncio
+    async def test_caps_concurrency(self):
+        runner = ReportRunner(max_concurrent=2, max_pending=10)
+        active = 0
+        peak = 0
+        lock = threading.Lock()
+
+        def report():
+            nonlocal active, peak
+            with lock:
+                active += 1
+                peak = max(peak, active)
+            time.sleep(0.05)
+            with lock:
+                active -= 1
+
+        await asyncio.gather(*(runner.run(report) for _ in range(6)))
+        runner.shutdown()
+        assert peak == 2
+
+
+class TestBotReports:
+
+    def test_global_stats_from_read_only_pool(self, db_path):
+        import bot
+        main_db = os.path.join(os.path.dirname(db_path), "bot.db")
+        with patch('bot.DB_PATH', main_db), patch('bot.db_pool', None):
+            bot.apply_schema_migrations()
+            bot.save_user(5, "reporter", "Reporter")
+            bot.set_cache("k", "v")
+            stats = bot.get_global_stats()
+            admin_stats = bot._collect_admin_stats()
+
+        assert stats["total_users"] == 1
+        assert stats["cache_size"] == 1
+        assert admin_stats["banned_count"] == 0
+        assert admin_stats["total_users"] == 1
+
+    def test_dashboard_metrics_from_read_only_pool(self, db_path):
+        from event_tracker import EventTracker, EventType, create_event, Analytics
+        from admin_dashboard import AdminDashboard
+
+        events_db = os.path.join(os.path.dirname(db_path), "events.db")
+        tracker = EventTracker(events_db)
+        tracker.track(create_event(EventType.USER_START, user_id=1, data={}))
+        tracker.track(create_event(EventType.USER_ANALYZE, user_id=2, data={}))
+
+        dashboard = AdminDashboard.__new__(AdminDashboard)
+        dashboard.tracker = tracker
+        dashboard.analytics = Analytics(tracker)
+        metrics = dashboard.get_dashboard_metrics(hours=24)
+
+        assert metrics["overview"]["dau"] == 2
+        assert metrics["retention"]["active_7d"] == 2
+        assert len(tracker.get_events(hours=24)) == 2
@@ -0,0 +1,220 @@
+"""
+Tests for schema_migrations: versioned, idempotent schema steps with a
+single-SELECT fast path when the schema is current.
+"""
+
+import os
+import sqlite3
+import tempfile
+import time
+from unittest.mock import patch
+
+import pytest
+
+from schema_migrations import (
+    Migration, apply_migrations, ensure_schema, get_schema_version,
+    get_all_schema_versions, latest_version, SCHEMA_VERSION_TABLE
+)
+
+
+@pytest.fixture
+def temp_db():
+    fd, db_path = tempfile.mkstemp(suffix='.db')
+    os.close(fd)
+    yield db_path
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(db_path + suffix):
+            os.remove(db_path + suffix)
+
+
+def _steps(calls):
+    def create_a(cursor):
+        calls.append("a")
+        cursor.execute("CREATE TABLE IF NOT EXISTS a (id INTEGER PRIMARY KEY)")
+
+    def create_b(cursor):
+        calls.append("b")
+        cursor.execute("CREATE TABLE IF NOT EXISTS b (id INTEGER PRIMARY KEY, a_id INTEGER)")
+
+    return [Migration(2, "b", create_b), Migration(1, "a", create_a)]
+
+
+class TestMigrationEngine:
+
+    def test_fresh_db_has_version_zero(self):
+        conn = sqlite3.connect(":memory:")
+        assert get_schema_version(conn, "test") == 0
+        assert get_all_schema_versions(conn) == {}
+
+    def test_steps_applied_in_order_once(self):
+        conn = sqlite3.connect(":memory:")
+        calls = []
+        migrations = _steps(calls)
+
+        assert apply_migrations(conn, "test", migrations) == 2
+        assert calls == ["a", "b"]
+        assert get_schema_version(conn, "test") == 2
+
+        assert apply_migrations(conn, "test", migrations) == 0
+        assert calls == ["a", "b"]
+
+    def test_fast_path_is_single_select(self):
+        conn = sqlite3.connect(":memory:")
+        migrations = _steps([])
+        apply_migrations(conn, "test", migrations)
+
+        statements = []
+        conn.set_trace_callback(statements.append)
+        apply_migrations(conn, "test", migrations)
+        conn.set_trace_callback(None)
+
+        assert len(statements) == 1
+        assert statements[0].lstrip().upper().startswith("SELECT")
+        assert SCHEMA_VERSION_TABLE in statements[0]
+
+    def test_new_step_applies_only_new_step(self):
+        conn = sqlite3.connect(":memory:")
+        calls = []
+        migrations = _steps(calls)
+        apply_migrations(conn, "test", migrations)
+
+        def create_c(cursor):
+            calls.append("c")
+            cursor.execute("CREATE TABLE IF NOT EXISTS c (id INTEGER PRIMARY KEY)")
+
+        assert apply_migrations(conn, "test", migrations + [Migration(3, "c", create_c)]) == 1
+        assert calls == ["a", "b", "c"]
+        assert get_schema_version(conn, "test") == 3
+
+    def test_failed_step_keeps_previous_version(self):
+        conn = sqlite3.connect(":memory:")
+
+        def broken(cursor):
+            cursor.execute("CREATE TABLE half (id INTEGER)")
+            raise RuntimeError("boom")
+
+        migrations = _steps([]) + [Migration(3, "broken", broken)]
+        with pytest.raises(RuntimeError):
+            apply_migrations(conn, "test", migrations)
+
+        assert get_schema_version(conn, "test") == 2
+        tables = {r[0] for r in conn.execute("SELECT name FROM sqlite_master WHERE type='table'")}
+        assert "half" not in tables
+
+    def test_scopes_are_independent(self):
+        conn = sqlite3.connect(":memory:")
+        apply_migrations(conn, "one", _steps([]))
+        assert get_schema_version(conn, "two") == 0
+        assert get_all_schema_versions(conn) == {"one": 2}
+
+    def test_duplicate_versions_rejected(self):
+        conn = sqlite3.connect(":memory:")
+        noop = lambda cursor: None
+        with pytest.raises(ValueError):
+            apply_migrations(conn, "test", [Migration(1, "x", noop), Migration(1, "y", noop)])
+
+    def test_ensure_schema_opens_own_connection(self, temp_db):
+        calls = []
+        assert ensure_schema(temp_db, "test", _steps(calls)) == 2
+        assert ensure_schema(temp_db, "test", _steps(calls)) == 0
+        assert calls == ["a", "b"]
+
+    def test_legacy_step_that_commits_is_recorded(self):
+        conn = sqlite3.connect(":memory:")
+
+        def legacy(cursor):
+            cursor.execute("CREATE TABLE legacy (id INTEGER)")
+            cursor.connection.commit()
+            cursor.executescript("CREATE TABLE IF NOT EXISTS legacy2 (id INTEGER);")
+
+        assert apply_migrations(conn, "test", [Migration(1, "legacy", legacy)]) == 1
+        assert get_schema_version(conn, "test") == 1
+
+
+class TestModuleMigrations:
+
+    def test_event_tracker_audit_auth_scopes(self, temp_db):
+        from event_tracker import EventTracker, EVENT_TRACKER_MIGRATIONS
+        import audit_logger
+        import api_auth_manager
+
+        EventTracker(temp_db)
+        with patch('audit_logger.AUDIT_DB_PATH', temp_db):
+            audit_logger.init_audit_database()
+        with patch('api_auth_manager.DB_PATH', temp_db):
+            api_auth_manager.init_auth_database()
+
+        conn = sqlite3.connect(temp_db)
+        versions = get_all_schema_versions(conn)
+        tables = {r[0] for r in conn.execute("SELECT name FROM sqlite_master WHERE type='table'")}
+        conn.close()
+
+        assert versions["event_tracker"] == latest_version(EVENT_TRACKER_MIGRATIONS)
+        assert versions["audit"] == 1
+        assert versions["auth"] == 1
+        assert {"bot_events", "audit_logs", "api_keys"} <= tables
+        # Лог запросов API - в БД телеметрии, не рядом с api_keys
+        assert "api_usage_log" not in tables
+
+
+class TestBotMigrations:
+
+    def _legacy_startup(self):
+        import bot
+        bot.ensure_conversation_history_columns()
+        bot.init_database()
+        bot.migrate_database()
+        bot.verify_database_schema()
+        bot.create_database_indices()
+
+    def test_apply_schema_migrations_builds_full_schema(self, temp_db):
+        import bot
+        with patch('bot.DB_PATH', temp_db), patch('bot.db_pool', None):
+            assert bot.apply_schema_migrations() == len(bot.BOT_MIGRATIONS)
+            assert bot.apply_schema_migrations() == 0
+            check = bot.verify_database_schema()
+
+        # drops_feed is owned by drops_tracker, not by the bot schema
+        assert set(check['missing_tables']) <= {'drops_feed'}
+        conn = sqlite3.connect(temp_db)
+        assert get_schema_version(conn, bot.BOT_SCHEMA_SCOPE) == latest_version(bot.BOT_MIGRATIONS)
+        assert conn.execute("SELECT COUNT(*) FROM courses").fetchone()[0] > 0
+        indices = {r[0] for r in conn.execute("SELECT name FROM sqlite_master WHERE type='index'")}
+        conn.close()
+        assert {"idx_users_leaderboard_order", "idx_user_questions_user"} <= indices
+        assert "idx_users_leaderboard" not in indices
+
+    def test_existing_legacy_db_is_adopted(self, temp_db):
+        """A DB built by the old startup path gets stamped without data loss."""
+        import bot
+        with patch('bot.DB_PATH', temp_db), patch('bot.db_pool', None):
+            self._legacy_startup()
+            bot.save_user(42, "legacy", "Legacy")
+            assert bot.apply_schema_migrations() == len(bot.BOT_MIGRATIONS)
+
+        conn = sqlite3.connect(temp_db)
+        assert conn.execute("SELECT username FROM users WHERE user_id = 42").fetchone()[0] == "legacy"
+        conn.close()
+
+    @pytest.mark.slow
+    def test_cold_start_benchmark(self, temp_db):
+        """Warm restart: legacy PRAGMA/CREATE path vs single version check."""
+        import bot
+        with patch('bot.DB_PATH', temp_db), patch('bot.db_pool', None):
+            self._legacy_startup()
+            bot.apply_schema_migrations()
+
+            runs = 5
+            started = time.perf_counter()
+            for _ in range(runs):
+                self._legacy_startup()
+            legacy_ms = (time.perf_counter() - started) * 1000 / runs
+
+            started = time.perf_counter()
+            for _ in range(runs):
+                bot.apply_schema_migrations()
+            fast_ms = (time.perf_counter() - started) * 1000 / runs
+
+        print(f"\nschema startup: legacy={legacy_ms:.2f}ms versioned={fast_ms:.2f}ms "
+              f"speedup={legacy_ms / max(fast_ms, 1e-6):.1f}x")
+        assert fast_ms < legacy_ms
@@ -0,0 +1,210 @@
+"""
+Tests for session_store: per-user __slots__ sessions, LRU cap, lazy expiry,
+persistence of quiz/regeneration state and the BotState adapter.
+"""
+
+import sqlite3
+from types import SimpleNamespace
+
+import pytest
+
+import bot
+from session_store import SessionStore, UserSession, measure_memory
+
+
+class FakeClock:
+    def __init__(self, now=1_000_000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    return str(tmp_path / "sessions.db")
+
+
+def test_session_has_no_dict():
+    session = UserSession(1, 0.0)
+    assert not hasattr(session, "__dict__")
+
+
+def test_lru_cap_evicts_least_recently_used(clock):
+    store = SessionStore(max_sessions=3, ttl_seconds=60, clock=clock)
+    for user_id in range(3):
+        store.touch(user_id)
+    store.get(0)
+    store.touch(3)
+    assert len(store) == 3
+    assert store.get(1) is None
+    assert store.get(0) is not None
+    assert store.stats()["evicted"] == 1
+
+
+def test_lazy_expiry_and_partial_sweep(clock):
+    store = SessionStore(max_sessions=100, ttl_seconds=60, clock=clock)
+    for user_id in range(10):
+        store.touch(user_id)
+    clock.now += 61
+    store.touch(99)
+    assert store.get(0) is None
+    # Остальные истёкшие удаляются обходом только по началу LRU
+    assert store.expire() == 9
+    assert len(store) == 1
+
+
+@pytest.mark.asyncio
+async def test_quiz_and_news_survive_restart(clock, db_path):
+    store = SessionStore(clock=clock)
+    store.enable_persistence(db_path)
+    session = store.touch(7)
+    session.quiz = {"course": "defi", "current_q": 2, "responses": [{"is_correct": True}]}
+    session.news = "BTC news"
+    store.mark_dirty(7)
+    store.touch(8).course = "defi"
+    assert await store.aflush() == 1
+
+    restarted = SessionStore(clock=clock)
+    restarted.enable_persistence(db_path)
+    # get() диск не читает - сохранённую сессию поднимает load()
+    assert restarted.get(7) is None
+    restored = await restarted.load(7)
+    assert restored.quiz["current_q"] == 2
+    assert restored.news == "BTC news"
+    # Не отмеченные изменения не пишутся
+    assert await restarted.load(8) is None
+
+    restarted.drop(7)
+    await restarted.aflush()
+    assert await SessionStore(clock=clock).load(7) is None
+    again = SessionStore(clock=clock)
+    again.enable_persistence(db_path)
+    assert await again.load(7) is None
+
+
+@pytest.mark.asyncio
+async def test_evicted_dirty_session_waits_for_flush(clock, db_path):
+    store = SessionStore(max_sessions=1, clock=clock)
+    store.enable_persistence(db_path)
+    store.touch(1).news = "text"
+    store.mark_dirty(1)
+    store.touch(2)
+    assert store.stats()["evicted_pending"] == 1
+    assert await store.aflush() == 1
+    assert store.stats()["evicted_pending"] == 0
+    assert (await store.load(1)).news == "text"
+
+
+@pytest.mark.asyncio
+async def test_load_or_create_keeps_saved_state(clock, db_path):
+    store = SessionStore(clock=clock)
+    store.enable_persistence(db_path)
+    store.touch(1).course = "defi"
+    store.mark_dirty(1)
+    store.flush()
+
+    restarted = SessionStore(clock=clock)
+    restarted.enable_persistence(db_path)
+    assert (await restarted.load_or_create(1)).course == "defi"
+
+
+def test_dropped_session_evicts_without_persistence(clock):
+    store = SessionStore(max_sessions=2, clock=clock)
+    store.touch(1)
+    store.drop(1)
+    for user_id in (1, 2, 3):
+        store.touch(user_id)
+    assert store.stats()["pending_writes"] == 0
+    assert store.stats()["evicted"] == 1
+
+
+@pytest.mark.asyncio
+async def test_eviction_does_not_write_and_failed_flush_is_retried(clock, db_path, monkeypatch):
+    store = SessionStore(max_sessions=1, clock=clock)
+    store.enable_persistence(db_path)
+    store.touch(1).news = "text"
+    store.mark_dirty(1)
+
+    def broken_write(rows, deleted):
+        raise sqlite3.OperationalError("database is locked")
+
+    monkeypatch.setattr(store, "_write", broken_write)
+    # Вытеснение не пишет в БД - touch() из check_flood диск не трогает
+    assert store.touch(2).user_id == 2
+    assert len(store) == 1
+    assert await store.aflush() == 0
+    assert store.stats()["pending_writes"] == 1 and store.stats()["evicted_pending"] == 1
+
+    monkeypatch.undo()
+    assert await store.aflush() == 1
+    assert (await store.load(1)).news == "text"
+
+
+@pytest.mark.asyncio
+async def test_persisted_session_expires(clock, db_path):
+    store = SessionStore(ttl_seconds=60, clock=clock)
+    store.enable_persistence(db_path)
+    store.touch(1).news = "old"
+    store.mark_dirty(1)
+    store.flush()
+
+    clock.now += 120
+    restarted = SessionStore(ttl_seconds=60, clock=clock)
+    restarted.enable_persistence(db_path)
+    assert await restarted.load(1) is None
+
+
+@pytest.mark.asyncio
+async def test_bot_state_adapter():
+    state = bot.BotState(max_sessions=10, ttl_seconds=60)
+    assert await state.check_flood(1, cooldown=60)
+    assert not await state.check_flood(1, cooldown=60)
+
+    await state.set_user_news(1, "text")
+    await state.set_user_course(2, "defi")
+    assert await state.get_user_news(1) == "text"
+    assert await state.get_user_course(2) == "defi"
+    assert await state.get_user_course(3) is None
+
+    assert await state.record_feedback_attempt(5) == 1
+    assert await state.record_feedback_attempt(5) == 2
+    await state.clear_feedback_attempts(5)
+    assert await state.record_feedback_attempt(5) == 1
+
+    stats = state.get_stats()
+    assert stats["active_users"] == 1 and stats["users_in_news"] == 1 and stats["users_in_course"] == 1
+
+    await state.cleanup_user_data(1)
+    assert await state.get_user_news(1) is None
+
+
+@pytest.mark.asyncio
+async def test_quiz_session_restored_after_restart(monkeypatch):
+    state = bot.BotState()
+    monkeypatch.setattr(bot, "bot_state", state)
+    quiz = {"course": "defi", "lesson": 1, "questions": [], "current_q": 1, "responses": [], "correct_count": 1}
+    await state.set_quiz_state(42, quiz)
+
+    # Новый процесс: context.user_data пуст
+    context = SimpleNamespace(user_data={})
+    assert await bot.get_quiz_session(context, 42) == quiz
+    assert context.user_data["quiz_session"] == quiz
+
+    await bot.clear_quiz_session(context, 42)
+    assert "quiz_session" not in context.user_data
+    assert await state.get_quiz_state(42) is None
+
+
+@pytest.mark.slow
+@pytest.mark.timeout(120)
+def test_memory_report_100k_sessions():
+    report = measure_memory(100_000)
+    print(f"\nSessionStore {report['store_mb']:.1f}MB ({report['store_bytes_per_session']:.0f} B/session), "
+          f"dicts {report['dicts_mb']:.1f}MB ({report['dicts_bytes_per_session']:.0f} B/session)")
+    assert report["store_bytes_per_session"] < report["dicts_bytes_per_session"]
@@ -0,0 +1,210 @@
+"""
+Tests for storage_router: telemetry and cache tables in their own SQLite
+files with separate pools, plus ATTACH-based cross-DB reporting.
+"""
+
+import os
+import sqlite3
+import statistics
+import tempfile
+import threading
+import time
+from unittest.mock import patch
+
+import pytest
+
+import storage_router
+from schema_migrations import Migration, get_schema_version
+from storage_router import (
+    ROUTE_MAIN, ROUTE_TELEMETRY, ROUTE_CACHE,
+    route_for_table, resolve_db_path, register_schema, get_pool,
+    routed_connection, attach_routes, attach_alias, close_all_pools
+)
+
+
+@pytest.fixture
+def temp_dir():
+    with tempfile.TemporaryDirectory() as path:
+        yield path
+        close_all_pools()
+
+
+@pytest.fixture
+def main_db(temp_dir):
+    return os.path.join(temp_dir, "rvx_bot.db")
+
+
+@pytest.fixture
+def probe_schema():
+    """Registers a throwaway table in the cache route for the duration of a test."""
+    calls = []
+
+    def create(cursor):
+        calls.append(1)
+        cursor.execute("CREATE TABLE IF NOT EXISTS probe (id INTEGER, hits INTEGER DEFAULT 0)")
+
+    register_schema(ROUTE_CACHE, "test_probe", [Migration(1, "probe", create)])
+    yield calls
+    schemas = storage_router._route_schemas[ROUTE_CACHE]
+    schemas[:] = [(s, m) for s, m in schemas if s != "test_probe"]
+
+
+class TestRouting:
+
+    def test_table_routes(self):
+        for table in ("bot_events", "audit_logs", "api_usage_log", "analytics"):
+            assert route_for_table(table) == ROUTE_TELEMETRY
+        assert route_for_table("cache") == ROUTE_CACHE
+        assert route_for_table("users") == ROUTE_MAIN
+        assert route_for_table("conversation_history") == ROUTE_MAIN
+
+    def test_paths_derived_from_main_db(self, main_db, temp_dir):
+        with patch.dict(os.environ, {}, clear=False):
+            os.environ.pop("TELEMETRY_DB_PATH", None)
+            os.environ.pop("CACHE_DB_PATH", None)
+            assert resolve_db_path(ROUTE_MAIN, main_db) == main_db
+            assert resolve_db_path(ROUTE_TELEMETRY, main_db) == os.path.join(temp_dir, "rvx_bot_telemetry.db")
+            assert resolve_db_path(ROUTE_CACHE, main_db) == os.path.join(temp_dir, "rvx_bot_cache.db")
+
+    def test_env_override(self, main_db, temp_dir):
+        custom = os.path.join(temp_dir, "events.db")
+        with patch.dict(os.environ, {"TELEMETRY_DB_PATH": custom}):
+            assert resolve_db_path(ROUTE_TELEMETRY, main_db) == custom
+
+    def test_unknown_route(self):
+        with pytest.raises(ValueError):
+            resolve_db_path("archive", "/tmp/x.db")
+
+
+class TestPools:
+
+    def test_registered_schema_applied_once_per_file(self, main_db, probe_schema):
+        for _ in range(3):
+            with routed_connection(ROUTE_CACHE, main_db) as conn:
+                conn.execute("INSERT INTO probe (id) VALUES (1)")
+        assert probe_schema == [1]
+
+        conn = sqlite3.connect(resolve_db_path(ROUTE_CACHE, main_db))
+        assert get_schema_version(conn, "test_probe") == 1
+        assert conn.execute("SELECT COUNT(*) FROM probe").fetchone()[0] == 3
+        conn.close()
+
+    def test_route_pragmas(self, main_db):
+        with routed_connection(ROUTE_TELEMETRY, main_db) as conn:
+            assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+            # audit_logs живёт в телеметрии - не synchronous=OFF
+            assert conn.execute("PRAGMA synchronous").fetchone()[0] == 1
+        with routed_connection(ROUTE_CACHE, main_db) as conn:
+            assert conn.execute("PRAGMA synchronous").fetchone()[0] == 0
+
+    def test_connections_are_reused(self, main_db):
+        for _ in range(5):
+            with routed_connection(ROUTE_TELEMETRY, main_db):
+                pass
+        stats = get_pool(ROUTE_TELEMETRY, main_db).get_stats()
+        assert stats["created"] == 1
+        assert stats["reused"] == 4
+
+    def test_rollback_on_error(self, main_db, probe_schema):
+        with pytest.raises(RuntimeError):
+            with routed_connection(ROUTE_CACHE, main_db) as conn:
+                conn.execute("INSERT INTO probe (id) VALUES (1)")
+                raise RuntimeError("boom")
+        with routed_connection(ROUTE_CACHE, main_db) as conn:
+            assert conn.execute("SELECT COUNT(*) FROM probe").fetchone()[0] == 0
+
+    def test_attach_is_idempotent(self, main_db, probe_schema):
+        with routed_connection(ROUTE_CACHE, main_db) as conn:
+            conn.execute("INSERT INTO probe (id, hits) VALUES (1, 3)")
+
+        conn = sqlite3.connect(main_db)
+        attach_routes(conn, main_db)
+        attach_routes(conn, main_db)
+        alias = attach_alias(ROUTE_CACHE)
+        assert conn.execute(f"SELECT SUM(hits) FROM {alias}.probe").fetchone()[0] == 3
+        conn.close()
+
+
+class TestBotRouting:
+
+    def test_cache_and_analytics_leave_main_db(self, main_db):
+        import bot
+        with patch('bot.DB_PATH', main_db), patch('bot.db_pool', None), \
+                patch('bot.ENABLE_ANALYTICS', True):
+            bot.apply_schema_migrations()
+            bot.set_cache("key", "response")
+            assert bot.get_cache("key") == "response"
+            bot.log_analytics_event("probe", 7, {"a": 1})
+            stats = bot.get_global_stats()
+
+        assert stats["cache_size"] == 1
+        assert stats["cache_hits"] == 1
+
+        conn = sqlite3.connect(main_db)
+        assert conn.execute("SELECT COUNT(*) FROM cache").fetchone()[0] == 0
+        assert conn.execute("SELECT COUNT(*) FROM analytics").fetchone()[0] == 0
+        conn.close()
+
+        conn = sqlite3.connect(resolve_db_path(ROUTE_TELEMETRY, main_db))
+        assert conn.execute("SELECT event_type FROM analytics").fetchall() == [("probe",)]
+        conn.close()
+
+
+def _user_write_latencies(user_db: str, telemetry_db: str, writes: int = 40) -> list:
+    """Time user-facing writes while another thread floods telemetry inserts."""
+    conn = sqlite3.connect(user_db, timeout=10.0)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("CREATE TABLE IF NOT EXISTS users (user_id INTEGER PRIMARY KEY, xp INTEGER)")
+    conn.execute("INSERT OR IGNORE INTO users VALUES (1, 0)")
+    conn.commit()
+
+    flood = sqlite3.connect(telemetry_db, timeout=10.0, check_same_thread=False)
+    flood.execute("PRAGMA journal_mode=WAL")
+    flood.execute("CREATE TABLE IF NOT EXISTS bot_events (id INTEGER PRIMARY KEY, data TEXT)")
+    flood.commit()
+
+    stop = threading.Event()
+
+    def flood_worker():
+        payload = "x" * 200
+        while not stop.is_set():
+            flood.execute("BEGIN IMMEDIATE")
+            flood.executemany("INSERT INTO bot_events (data) VALUES (?)", [(payload,)] * 2000)
+            flood.commit()
+
+    worker = threading.Thread(target=flood_worker, daemon=True)
+    worker.start()
+    time.sleep(0.05)
+
+    latencies = []
+    try:
+        for _ in range(writes):
+            started = time.perf_counter()
+            conn.execute("UPDATE users SET xp = xp + 1 WHERE user_id = 1")
+            conn.commit()
+            latencies.append((time.perf_counter() - started) * 1000)
+            time.sleep(0.002)
+    finally:
+        stop.set()
+        worker.join()
+        flood.close()
+        conn.close()
+    return latencies
+
+
+@pytest.mark.slow
+def test_user_write_lock_wait_under_telemetry_flood(temp_dir):
+    """Shared file vs separate telemetry file: user write latency under flood."""
+    shared_db = os.path.join(temp_dir, "shared.db")
+    shared = _user_write_latencies(shared_db, shared_db)
+
+    user_db = os.path.join(temp_dir, "users.db")
+    split = _user_write_latencies(user_db, os.path.join(temp_dir, "telemetry.db"))
+
+    def p95(values):
+        return sorted(values)[int(len(values) * 0.95) - 1]
+
+    print(f"\nuser write under telemetry flood: "
+          f"shared mean={statistics.mean(shared):.2f}ms p95={p95(shared):.2f}ms | "
+          f"split mean={statistics.mean(split):.2f}ms p95={p95(split):.2f}ms")
+    assert statistics.mean(split) < statistics.mean(shared)
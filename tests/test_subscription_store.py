@@ -0,0 +1,142 @@
+"""
+Tests for subscription_store: event-driven channel subscription state,
+bounded in-memory LRU, persistence and short negative caching.
+"""
+
+import sqlite3
+from types import SimpleNamespace
+from unittest.mock import AsyncMock
+
+import pytest
+from telegram.error import NetworkError
+
+import bot
+import subscription_store
+from subscription_store import SOURCE_API, SOURCE_EVENT, SubscriptionStore
+
+CHANNEL = -100123
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    return str(tmp_path / "subs.db")
+
+
+def test_event_state_is_reverified_after_ttl(db_path, monkeypatch):
+    store = SubscriptionStore(db_path, CHANNEL)
+    assert store.get(1) is None
+
+    now = 1_000_000.0
+    monkeypatch.setattr(subscription_store.time, "time", lambda: now)
+    store.record_event(1, "member")
+    store.record_event(2, "left")
+    now += subscription_store.SUBSCRIPTION_CACHE_TTL + 1
+    state = store.get(1)
+    assert state.is_subscribed and state.source == SOURCE_EVENT
+    assert store.get(2).is_subscribed is False
+
+    # Событие вступления могло потеряться - состояние "left" не вечное
+    now += subscription_store.SUBSCRIPTION_VERIFY_TTL
+    assert store.get(1) is None
+    assert store.get(2) is None
+
+
+def test_api_results_expire_by_outcome(db_path, monkeypatch):
+    store = SubscriptionStore(db_path, CHANNEL)
+    now = 1_000_000.0
+    monkeypatch.setattr(subscription_store.time, "time", lambda: now)
+    store.record_check(1, "member")
+    store.record_check(2, "left")
+    store.record_error(3)
+
+    now += subscription_store.SUBSCRIPTION_ERROR_TTL + 1
+    assert store.get(3) is None
+    now += subscription_store.SUBSCRIPTION_CACHE_TTL
+    assert store.get(2) is None
+    assert store.get(1).source == SOURCE_API
+    now += subscription_store.SUBSCRIPTION_VERIFY_TTL
+    assert store.get(1) is None
+
+
+def test_persisted_across_restart_but_errors_are_not(db_path):
+    store = SubscriptionStore(db_path, CHANNEL)
+    store.record_event(1, "administrator")
+    store.record_check(2, "kicked")
+    store.record_error(3)
+
+    restarted = SubscriptionStore(db_path, CHANNEL)
+    assert restarted.get(1).is_subscribed is True
+    assert restarted.get(2).is_subscribed is False
+    assert restarted.get(3) is None
+    assert SubscriptionStore(db_path, -100999).get(1) is None
+
+
+def test_memory_is_bounded(db_path):
+    store = SubscriptionStore(db_path, CHANNEL, max_entries=10)
+    for user_id in range(100):
+        store.record_check(user_id, "member")
+    assert len(store) == 10
+    # Вытесненные записи поднимаются из БД
+    assert store.get(0).is_subscribed is True
+    assert store.stats["db_loads"] == 1
+
+
+def test_invalidate_keeps_event_state(db_path):
+    store = SubscriptionStore(db_path, CHANNEL)
+    store.record_event(1, "member")
+    store.record_check(2, "member")
+    store.invalidate(keep_events=True)
+    assert store.get(1) is not None
+    assert store.get(2) is None
+
+    store.invalidate(1)
+    assert store.get(1) is None
+    conn = sqlite3.connect(db_path)
+    assert conn.execute("SELECT COUNT(*) FROM channel_subscriptions").fetchone()[0] == 0
+    conn.close()
+
+
+@pytest.mark.asyncio
+async def test_bot_check_uses_store_and_events(db_path, monkeypatch):
+    monkeypatch.setattr(bot, "DB_PATH", db_path)
+    monkeypatch.setattr(bot, "MANDATORY_CHANNEL_ID", CHANNEL)
+
+    context = SimpleNamespace(bot=SimpleNamespace(
+        get_chat_member=AsyncMock(return_value=SimpleNamespace(status="left"))
+    ))
+    assert await bot.check_channel_subscription(42, context) is False
+    assert await bot.check_channel_subscription(42, context) is False
+    assert context.bot.get_chat_member.await_count == 1
+
+    # Пользователь вступил в канал - видно сразу, без запроса к API
+    update = SimpleNamespace(chat_member=SimpleNamespace(
+        chat=SimpleNamespace(id=CHANNEL),
+        new_chat_member=SimpleNamespace(user=SimpleNamespace(id=42), status="member")
+    ))
+    await bot.handle_channel_member_update(update, context)
+    assert await bot.check_channel_subscription(42, context) is True
+    assert await bot.check_subscription(42, context) is True
+    assert context.bot.get_chat_member.await_count == 1
+
+    # Ошибка API кэшируется коротко: повторный запрос не уходит
+    context.bot.get_chat_member = AsyncMock(side_effect=NetworkError("timeout"))
+    assert await bot.check_channel_subscription(7, context) is False
+    assert await bot.check_subscription(7, context) is True
+    assert context.bot.get_chat_member.await_count == 1
+
+
+@pytest.mark.asyncio
+async def test_recheck_button_asks_telegram_despite_left_event(db_path, monkeypatch):
+    monkeypatch.setattr(bot, "DB_PATH", db_path)
+    monkeypatch.setattr(bot, "MANDATORY_CHANNEL_ID", CHANNEL)
+    bot.get_subscription_cache().record_event(42, "left")
+
+    # Пользователь вступил, пока бот был выключен: события нет, Telegram знает
+    context = SimpleNamespace(bot=SimpleNamespace(
+        get_chat_member=AsyncMock(return_value=SimpleNamespace(status="member"))
+    ))
+    assert await bot.check_channel_subscription(42, context) is False
+    assert context.bot.get_chat_member.await_count == 0
+    assert await bot.check_channel_subscription(42, context, force=True) is True
+    assert context.bot.get_chat_member.await_count == 1
+    assert await bot.check_channel_subscription(42, context) is True
@@ -0,0 +1,198 @@
+"""
+Tests for update_dispatcher: parallel across users, ordered per user/chat,
+backpressure and metrics - including a replay of a recorded update stream
+through PTB polling against a local fake Bot API server.
+"""
+
+import asyncio
+import time
+from collections import defaultdict
+from types import SimpleNamespace
+
+import pytest
+from telegram import Update
+from telegram.ext import Application, MessageHandler, TypeHandler, filters
+
+import bot
+from inflight_registry import DIALOGUE, CallSuperseded, InflightRegistry
+from tests.fake_bot_api import FakeBotAPI, load_recorded_updates
+from update_dispatcher import BackpressureQueue, UpdateDispatcher, update_order_key
+
+
+def fake_update(user_id=None, chat_id=None):
+    return SimpleNamespace(
+        effective_user=SimpleNamespace(id=user_id) if user_id is not None else None,
+        effective_chat=SimpleNamespace(id=chat_id) if chat_id is not None else None,
+    )
+
+
+class Recorder:
+    def __init__(self, delay=0.02):
+        self.delay = delay
+        self.active = 0
+        self.max_active = 0
+        self.order = defaultdict(list)
+
+    async def handle(self, key, item):
+        self.active += 1
+        self.max_active = max(self.max_active, self.active)
+        await asyncio.sleep(self.delay)
+        self.order[key].append(item)
+        self.active -= 1
+
+
+def test_order_key():
+    assert update_order_key(fake_update(1, 1)) == ("user", 1)
+    assert update_order_key(fake_update(chat_id=-100)) == ("chat", -100)
+    assert update_order_key(fake_update()) is None
+
+
+@pytest.mark.asyncio
+async def test_parallel_across_users_ordered_per_user():
+    dispatcher = UpdateDispatcher(max_concurrent=4)
+    recorder = Recorder()
+    tasks = []
+    for i in range(10):
+        for user_id in range(6):
+            update = fake_update(user_id, user_id)
+            tasks.append(asyncio.ensure_future(
+                dispatcher.process_update(update, recorder.handle(user_id, i))))
+    await asyncio.gather(*tasks)
+
+    assert all(recorder.order[user_id] == list(range(10)) for user_id in range(6))
+    assert recorder.max_active == 4
+    stats = dispatcher.stats()
+    assert stats["processed"] == 60 and stats["pending"] == 0 and stats["lanes"] == 0
+    assert stats["max_depth"] == 60 and stats["wait_max_ms"] > 0
+
+
+@pytest.mark.asyncio
+async def test_waiting_user_does_not_hold_slots():
+    dispatcher = UpdateDispatcher(max_concurrent=2)
+    recorder = Recorder(delay=0.05)
+    # 20 апдейтов одного пользователя и 1 апдейт другого
+    tasks = [asyncio.ensure_future(dispatcher.process_update(fake_update(1), recorder.handle(1, i)))
+             for i in range(20)]
+    started = time.monotonic()
+    await dispatcher.process_update(fake_update(2), recorder.handle(2, 0))
+    assert time.monotonic() - started < 0.2
+    await asyncio.gather(*tasks)
+
+
+@pytest.mark.asyncio
+async def test_on_enqueue_and_unordered_hooks():
+    seen = []
+    dispatcher = UpdateDispatcher(max_concurrent=4, on_enqueue=seen.append,
+                                  unordered=lambda update: getattr(update, "duplicate", False))
+    blocker = asyncio.Event()
+    first = asyncio.ensure_future(dispatcher.process_update(fake_update(1), blocker.wait()))
+    await asyncio.sleep(0)
+
+    duplicate = fake_update(1)
+    duplicate.duplicate = True
+    # Не ждёт первый апдейт пользователя
+    await asyncio.wait_for(dispatcher.process_update(duplicate, asyncio.sleep(0)), timeout=1)
+    blocker.set()
+    await first
+    assert len(seen) == 2
+
+
+@pytest.mark.asyncio
+async def test_backpressure_blocks_put_until_drained():
+    dispatcher = UpdateDispatcher(max_concurrent=1, max_pending=3, resume_pending=1)
+    queue = BackpressureQueue(dispatcher)
+    release = asyncio.Event()
+    tasks = [asyncio.ensure_future(dispatcher.process_update(fake_update(1), release.wait()))
+             for _ in range(3)]
+    await asyncio.sleep(0)
+    assert dispatcher.overloaded()
+
+    update = Update(update_id=1)
+    put = asyncio.ensure_future(queue.put(update))
+    await asyncio.sleep(0.05)
+    assert not put.done() and queue.qsize() == 0
+
+    release.set()
+    await asyncio.wait_for(put, timeout=1)
+    await asyncio.gather(*tasks)
+    assert queue.qsize() == 1
+    assert dispatcher.stats()["backpressure_pauses"] == 1
+
+    # Служебные объекты PTB проходят без ожидания
+    await asyncio.wait_for(queue.put(object()), timeout=1)
+
+
+@pytest.mark.asyncio
+@pytest.mark.integration
+async def test_replay_recorded_stream_through_fake_bot_api():
+    recorded = load_recorded_updates()
+    dispatcher = UpdateDispatcher(max_concurrent=8, max_pending=10, resume_pending=5)
+    handled = defaultdict(list)
+    active = {"now": 0, "max": 0}
+
+    async def on_message(update, context):
+        active["now"] += 1
+        active["max"] = max(active["max"], active["now"])
+        await asyncio.sleep(0.05)  # имитация AI-вызова
+        handled[update.effective_chat.id].append(update.effective_message.text)
+        await context.bot.send_message(update.effective_chat.id, f"re: {update.effective_message.text}")
+        active["now"] -= 1
+
+    async with FakeBotAPI(recorded) as server:
+        application = (
+            Application.builder()
+            .token(server.token)
+            .base_url(server.base_url)
+            .concurrent_updates(dispatcher)
+            .update_queue(BackpressureQueue(dispatcher))
+            .build()
+        )
+        application.add_handler(MessageHandler(filters.TEXT & filters.ChatType.PRIVATE, on_message))
+        application.add_handler(TypeHandler(Update, lambda update, context: asyncio.sleep(0.01)), group=1)
+
+        started = time.monotonic()
+        async with application:
+            await application.start()
+            await application.updater.start_polling(poll_interval=0.01, timeout=0)
+            while not (server.all_delivered and dispatcher.pending == 0):
+                await asyncio.sleep(0.02)
+            elapsed = time.monotonic() - started
+            await application.updater.stop()
+            await application.stop()
+
+    private = [u for u in recorded if "message" in u]
+    expected = defaultdict(list)
+    for update in private:
+        expected[update["message"]["chat"]["id"]].append(update["message"]["text"])
+    assert dict(handled) == dict(expected)
+    assert len(server.calls_of("sendMessage")) == len(private)
+
+    # Параллельно между пользователями: 48 сообщений по 50 мс быстрее последовательных 2.4 с
+    assert 1 < active["max"] <= 8
+    assert elapsed < len(private) * 0.05 / 2
+
+    stats = dispatcher.stats()
+    assert stats["processed"] == len(recorded)
+    assert stats["max_depth"] <= 10
+    assert stats["backpressure_pauses"] >= 1
+
+
+@pytest.mark.asyncio
+async def test_bot_hooks_cancel_dialogue_and_pass_duplicate_taps(monkeypatch):
+    registry = InflightRegistry()
+    monkeypatch.setattr(bot, "inflight", registry)
+    message = Update.de_json(load_recorded_updates()[0], None)
+    user_id = message.effective_user.id
+
+    dialogue = asyncio.ensure_future(registry.run_latest(user_id, DIALOGUE, lambda call: asyncio.sleep(5)))
+    await asyncio.sleep(0)
+    bot.on_update_enqueued(message)
+    with pytest.raises(CallSuperseded):
+        await dialogue
+    assert registry.stats()["cancelled"] == 1
+
+    tap = SimpleNamespace(callback_query=SimpleNamespace(from_user=SimpleNamespace(id=user_id), data="tell_more_1_1"))
+    assert not bot.is_duplicate_callback(tap)
+    call = registry.claim(user_id, "tell_more_1_1")
+    assert bot.is_duplicate_callback(tap)
+    registry.release(call)
@@ -0,0 +1,218 @@
+"""
+Tests for webhook_cluster and shared_state: consistent hashing, partition
+keys, shared backends across processes, and an end-to-end run of the
+master with real worker processes against a local fake Bot API.
+"""
+
+import asyncio
+import multiprocessing
+import socket
+import sys
+import time
+from collections import Counter, defaultdict
+from pathlib import Path
+
+import pytest
+from aiohttp import ClientSession
+
+from rate_limit_engine import RateLimitPolicy
+from shared_state import MemoryBackend, SQLiteBackend
+from subscription_store import SubscriptionStore
+from tests.fake_bot_api import FakeBotAPI, load_recorded_updates
+from webhook_cluster import TELEGRAM_SECRET_HEADER, ClusterMaster, ConsistentHashRing, partition_key
+
+WORKER_APP = Path(__file__).parent / "cluster_worker_app.py"
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def test_hash_ring_balance_and_minimal_movement():
+    keys = [f"user:{i}" for i in range(20000)]
+    ring = ConsistentHashRing(range(4))
+    before = {key: ring.node_for(key) for key in keys}
+    counts = Counter(before.values())
+    assert all(abs(count - 5000) < 1000 for count in counts.values())
+
+    ring.add(4)
+    moved = [key for key in keys if ring.node_for(key) != before[key]]
+    # Переезжают только ключи, доставшиеся новому узлу (~1/5)
+    assert all(ring.node_for(key) == 4 for key in moved)
+    assert 0.1 < len(moved) / len(keys) < 0.3
+
+    ring.remove(4)
+    assert all(ring.node_for(key) == before[key] for key in keys)
+
+
+def test_partition_key():
+    message = load_recorded_updates()[0]
+    assert partition_key(message) == "user:700000000"
+    assert partition_key({"update_id": 2, "channel_post": {"chat": {"id": -100}}}) == "chat:-100"
+    member = {"update_id": 3, "chat_member": {"from": {"id": 1}, "chat": {"id": -100},
+                                              "new_chat_member": {"user": {"id": 42}, "status": "member"}}}
+    assert partition_key(member) == "user:42"
+    assert partition_key({"update_id": 4, "poll": {"id": "p"}}) == "update:4"
+
+
+def _increment(path, times):
+    backend = SQLiteBackend(path)
+    for _ in range(times):
+        backend.update("counters", "hits", lambda value: ((value or 0) + 1, None))
+
+
+def test_sqlite_backend_update_is_atomic_across_processes(tmp_path):
+    path = str(tmp_path / "shared.db")
+    SQLiteBackend(path)
+    processes = [multiprocessing.get_context("fork").Process(target=_increment, args=(path, 100))
+                 for _ in range(4)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join(10)
+    assert SQLiteBackend(path).get("counters", "hits") == 400
+
+
+@pytest.mark.parametrize("kind", ["memory", "sqlite"])
+def test_backend_ttl_and_namespaces(kind, tmp_path):
+    now = [1000.0]
+    if kind == "memory":
+        backend = MemoryBackend(clock=lambda: now[0])
+    else:
+        backend = SQLiteBackend(str(tmp_path / "shared.db"), clock=lambda: now[0])
+    backend.set("a", "k", {"x": 1}, ttl=10)
+    backend.set("b", "k", 2)
+    assert backend.get("a", "k") == {"x": 1}
+    assert backend.count("a") == 1
+    now[0] += 11
+    assert backend.count("a") == 0
+    assert backend.purge_expired() == 1
+    assert backend.get("a", "k") is None
+    assert dict(backend.items("b")) == {"k": 2}
+    assert backend.clear("b") == 1 and backend.get("b", "k") is None
+
+
+def test_rate_limit_policies_share_backend(tmp_path):
+    path = str(tmp_path / "shared.db")
+    # Две политики с одним именем - как в двух воркерах
+    first = RateLimitPolicy("ai_user", limit=3, window=60, backend=SQLiteBackend(path))
+    second = RateLimitPolicy("ai_user", limit=3, window=60, backend=SQLiteBackend(path))
+    assert [first.hit(7).allowed, second.hit(7).allowed, first.hit(7).allowed] == [True, True, True]
+    decision = second.hit(7)
+    assert not decision.allowed and 19 < decision.retry_after <= 20
+    assert first.peek(7).remaining == 0 and len(second) == 1
+    assert first.hit(8).allowed
+    second.reset(7)
+    assert first.hit(7).allowed
+
+
+def test_subscription_invalidation_reaches_other_processes(tmp_path, monkeypatch):
+    monkeypatch.setattr("subscription_store.SUBSCRIPTION_SYNC_INTERVAL", 0)
+    db_path = str(tmp_path / "bot.db")
+    backend = MemoryBackend()
+    worker_a = SubscriptionStore(db_path, -100, backend=backend)
+    worker_b = SubscriptionStore(db_path, -100, backend=backend)
+    worker_b.record_check(5, "member")
+    assert worker_b.get(5).is_subscribed
+
+    worker_a.invalidate()
+    assert worker_b.get(5) is None
+    assert worker_b.stats["resyncs"] == 1
+
+
+def test_single_user_invalidation_keeps_other_entries(tmp_path, monkeypatch):
+    monkeypatch.setattr("subscription_store.SUBSCRIPTION_SYNC_INTERVAL", 0)
+    monkeypatch.setattr("subscription_store.SUBSCRIPTION_INVALIDATION_LOG", 2)
+    db_path = str(tmp_path / "bot.db")
+    backend = MemoryBackend()
+    worker_a = SubscriptionStore(db_path, -100, backend=backend)
+    worker_b = SubscriptionStore(db_path, -100, backend=backend)
+    for user_id in (5, 6, 7):
+        worker_b.record_check(user_id, "member")
+
+    worker_a.invalidate(5)
+    assert worker_b.get(5) is None
+    # Остальные записи остались в LRU: из БД поднят только сброшенный пользователь
+    assert worker_b.get(6).is_subscribed and worker_b.get(7).is_subscribed
+    assert worker_b.stats["db_loads"] == 1
+    assert worker_b.stats["resyncs"] == 0
+
+    # Пропущенные записи вытеснены из журнала - процесс очищает LRU целиком
+    worker_b._next_sync = float("inf")
+    for user_id in (6, 7, 8):
+        worker_a.invalidate(user_id)
+    worker_b._next_sync = 0.0
+    assert worker_b.get(7) is None
+    assert worker_b.stats["resyncs"] == 1 and len(worker_b) == 1
+
+
+@pytest.mark.asyncio
+@pytest.mark.integration
+async def test_cluster_end_to_end(tmp_path):
+    recorded = load_recorded_updates()
+    private = [u for u in recorded if "message" in u]
+    by_user = defaultdict(list)
+    for update in recorded:
+        by_user[partition_key(update)].append(update)
+
+    async with FakeBotAPI() as server:
+        port = free_port()
+        master = ClusterMaster(
+            server.token, workers=3,
+            worker_command=[sys.executable, str(WORKER_APP)],
+            host="127.0.0.1", port=port, worker_base_port=free_port(),
+            webhook_url=f"http://127.0.0.1:{port}/telegram/webhook",
+            secret_token="s3cret", base_url=server.base_url,
+            env={
+                "TELEGRAM_BOT_TOKEN": server.token,
+                "FAKE_BOT_API_URL": server.base_url,
+                "SHARED_STATE_BACKEND": "sqlite",
+                "SHARED_STATE_PATH": str(tmp_path / "shared.db"),
+                "E2E_GLOBAL_LIMIT": "40",
+            },
+        )
+        await master.start()
+        try:
+            url = master.webhook_url
+            async with ClientSession() as session:
+                async with session.post(url, json=recorded[0], headers={TELEGRAM_SECRET_HEADER: "wrong"}) as r:
+                    assert r.status == 403
+
+                async def deliver(updates):
+                    # Как Telegram: апдейты пользователя по очереди, пользователи параллельно
+                    for update in updates:
+                        async with session.post(url, json=update, headers={TELEGRAM_SECRET_HEADER: "s3cret"}) as r:
+                            assert r.status == 200
+
+                await asyncio.gather(*(deliver(updates) for updates in by_user.values()))
+
+            deadline = time.monotonic() + 5
+            while len(server.calls_of("sendMessage")) < len(private) and time.monotonic() < deadline:
+                await asyncio.sleep(0.05)
+        finally:
+            await master.stop()
+
+    set_webhook = server.calls_of("setWebhook")
+    assert set_webhook and set_webhook[0]["params"]["secret_token"] == "s3cret"
+
+    replies = defaultdict(list)
+    for call in sorted(server.calls_of("sendMessage"), key=lambda c: c["at"]):
+        replies[int(call["params"]["chat_id"])].append(call["params"]["text"].split(":", 1))
+    expected = defaultdict(list)
+    for update in private:
+        expected[update["message"]["chat"]["id"]].append(update["message"]["text"])
+
+    workers_used = set()
+    for chat_id, texts in expected.items():
+        assert [text for _, text in replies[chat_id]] == texts
+        owners = {prefix for prefix, _ in replies[chat_id] if prefix != "limited"}
+        assert len(owners) == 1
+        workers_used |= owners
+    assert len(workers_used) > 1
+
+    # Лимит общий для всех процессов
+    limited = sum(prefix == "limited" for texts in replies.values() for prefix, _ in texts)
+    assert limited == len(private) - 40
+    assert master.receiver.stats()["rejected"] == 1
@@ -0,0 +1,34 @@
+"""
+Text Prefilter v1.0
+Дешёвая проверка подстрок перед регулярными выражениями с re.IGNORECASE.
+
+secrets_manager, input_validators и validators.security_validator
+пропускают паттерн, если в text.lower() нет слова, без которого он не
+может совпасть (проверка `in` на C вместо прохода re). Теперь набор
+символов, на которых такая проверка ошибается, и сама проверка - здесь:
+
+- re.IGNORECASE сравнивает İ ı ſ K (U+0130, U+0131, U+017F, U+212A)
+  с ASCII-буквами i, s, k, а str.lower() переводит их в другие символы;
+- hint_text(text) возвращает text.lower() для проверки подсказок или
+  None, если в тексте есть такой символ и подсказкам верить нельзя -
+  тогда паттерны проверяются как раньше, без фильтра.
+"""
+
+from typing import Optional
+
+# Символы, которые re.IGNORECASE сравнивает с ASCII-буквами, а str.lower() - нет (İ ı ſ K)
+IGNORECASE_SPECIALS = ("\u0130", "\u0131", "\u017f", "\u212a")
+
+
+def hint_text(text: str) -> Optional[str]:
+    """text.lower() для проверок `hint in lowered` или None, если фильтр неприменим."""
+    for char in IGNORECASE_SPECIALS:
+        if char in text:
+            return None
+    return text.lower()
+
+
+__all__ = [
+    "IGNORECASE_SPECIALS",
+    "hint_text",
+]
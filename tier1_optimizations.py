@@ -241,8 +241,22 @@ class CacheManager:
         return stats
 
 
-# Global cache manager
-cache_manager = CacheManager(use_redis=True)
+# Global cache manager - создаётся при первом обращении: конструктор
+# подключается к Redis (до 5 с), а бот импортирует модуль только ради пула
+_cache_manager: Optional[CacheManager] = None
+
+
+def get_cache_manager() -> CacheManager:
+    global _cache_manager
+    if _cache_manager is None:
+        _cache_manager = CacheManager(use_redis=True)
+    return _cache_manager
+
+
+def __getattr__(name: str) -> Any:
+    if name == "cache_manager":
+        return get_cache_manager()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 # ============================================================================
@@ -482,13 +496,13 @@ def cache_with_ttl(ttl_seconds: int = 3600):
             cache_key = f"{func.__name__}:{str(args)}:{str(kwargs)}"
             
             # Try to get from cache
-            cached = cache_manager.get(cache_key)
+            cached = get_cache_manager().get(cache_key)
             if cached is not None:
                 return cached
             
             # Execute function and cache result
             result = func(*args, **kwargs)
-            cache_manager.set(cache_key, result, ttl_seconds)
+            get_cache_manager().set(cache_key, result, ttl_seconds)
             return result
         return wrapper
     return decorator
@@ -503,6 +517,7 @@ __all__ = [
     "structured_logger",
     "CacheManager",
     "cache_manager",
+    "get_cache_manager",
     "DatabaseConnectionPool",
     "UserId",
     "MessageId",
@@ -0,0 +1,239 @@
+"""
+Update Dispatcher v1.0
+Конкурентная обработка апдейтов Telegram.
+
+По умолчанию PTB обрабатывает апдейты строго последовательно: 10-секундный
+AI-вызов одного пользователя задерживает всех, кто в очереди за ним.
+UpdateDispatcher (BaseUpdateProcessor для Application.builder().concurrent_updates):
+
+- апдейты разных пользователей обрабатываются параллельно, не больше
+  UPDATE_CONCURRENCY одновременно;
+- апдейты одного пользователя (или чата, если пользователя нет) - строго
+  по порядку получения: у каждого ключа своя FIFO-очередь (asyncio.Lock
+  отдаёт владение ожидающим по порядку), а слот конкурентности берётся
+  только апдейтом в голове очереди - ждущие своей очереди слоты не занимают;
+- backpressure: BackpressureQueue (update_queue приложения) не принимает
+  новые апдейты, пока в обработке UPDATE_MAX_PENDING, и снова открывается
+  при снижении до UPDATE_RESUME_PENDING. Polling при этом не забирает
+  новые апдейты, webhook не отвечает - Telegram придерживает их у себя;
+- метрики: глубина очереди (текущая/максимальная), время ожидания до
+  начала обработки (p50/p95/max), паузы backpressure.
+"""
+
+import asyncio
+import logging
+import os
+import sys
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Hashable, Optional
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+logger = logging.getLogger(__name__)
+
+UPDATE_CONCURRENCY = int(os.getenv("UPDATE_CONCURRENCY", "32"))
+UPDATE_MAX_PENDING = int(os.getenv("UPDATE_MAX_PENDING", "1000"))
+UPDATE_RESUME_PENDING = int(os.getenv("UPDATE_RESUME_PENDING", str(UPDATE_MAX_PENDING * 4 // 5)))
+
+# Сколько последних ожиданий хранить для перцентилей
+WAIT_SAMPLES = 2048
+
+
+def update_order_key(update: object) -> Optional[Hashable]:
+    """Ключ порядка: пользователь, иначе чат. None - порядок не важен."""
+    user = getattr(update, "effective_user", None)
+    if user is not None:
+        return ("user", user.id)
+    chat = getattr(update, "effective_chat", None)
+    if chat is not None:
+        return ("chat", chat.id)
+    return None
+
+
+class _Lane:
+    """Очередь апдейтов одного ключа."""
+
+    __slots__ = ("lock", "size")
+
+    def __init__(self):
+        self.lock = asyncio.Lock()
+        self.size = 0
+
+
+class UpdateDispatcher(BaseUpdateProcessor):
+    """Параллельно между пользователями, по порядку внутри пользователя."""
+
+    def __init__(
+        self,
+        max_concurrent: int = UPDATE_CONCURRENCY,
+        max_pending: int = UPDATE_MAX_PENDING,
+        resume_pending: Optional[int] = None,
+        key_func: Callable[[object], Optional[Hashable]] = update_order_key,
+        on_enqueue: Optional[Callable[[object], None]] = None,
+        unordered: Optional[Callable[[object], bool]] = None,
+    ):
+        # Семафор PTB берётся до do_process_update и не должен ограничивать:
+        # иначе апдейты, ждущие своей очереди, занимали бы его слоты.
+        # Конкурентность ограничивает self._workers.
+        super().__init__(max_concurrent_updates=sys.maxsize)
+        if max_concurrent < 1:
+            raise ValueError("max_concurrent must be a positive integer")
+        self.concurrency = max_concurrent
+        self.max_pending = max_pending
+        self.resume_pending = min(resume_pending if resume_pending is not None else max_pending * 4 // 5,
+                                  max_pending - 1)
+        self.key_func = key_func
+        self.on_enqueue = on_enqueue
+        self.unordered = unordered
+
+        self._workers = asyncio.Semaphore(max_concurrent)
+        self._lanes: Dict[Hashable, _Lane] = {}
+        self._capacity = asyncio.Event()
+        self._capacity.set()
+
+        self.pending = 0
+        self.running = 0
+        self.max_depth = 0
+        self.processed = 0
+        self.failed = 0
+        self.backpressure_pauses = 0
+        self.backpressure_seconds = 0.0
+        self._waits: Deque[float] = deque(maxlen=WAIT_SAMPLES)
+        self.max_wait = 0.0
+
+    async def initialize(self) -> None:
+        logger.info(f"⚡ Диспетчер апдейтов: до {self.concurrency} параллельно, "
+                    f"backpressure при {self.max_pending} в очереди")
+
+    async def shutdown(self) -> None:
+        logger.info(f"⚡ Диспетчер апдейтов остановлен: {self.stats()}")
+
+    # ------------------------------------------------------------ обработка
+
+    async def do_process_update(self, update: object, coroutine: Awaitable[Any]) -> None:
+        enqueued_at = time.monotonic()
+        self.pending += 1
+        self.max_depth = max(self.max_depth, self.pending)
+        if self.on_enqueue is not None:
+            try:
+                self.on_enqueue(update)
+            except Exception as e:
+                logger.warning(f"⚠️ on_enqueue: {e}")
+
+        key = None
+        if self.unordered is None or not self.unordered(update):
+            key = self.key_func(update)
+        lane = None
+        if key is not None:
+            lane = self._lanes.get(key)
+            if lane is None:
+                lane = self._lanes[key] = _Lane()
+            lane.size += 1
+
+        started = False
+        held: Optional[asyncio.Lock] = None
+        try:
+            if lane is not None:
+                await lane.lock.acquire()
+                held = lane.lock
+            try:
+                async with self._workers:
+                    wait = time.monotonic() - enqueued_at
+                    self._waits.append(wait)
+                    self.max_wait = max(self.max_wait, wait)
+                    self.running += 1
+                    started = True
+                    try:
+                        await coroutine
+                        self.processed += 1
+                    except Exception:
+                        # Ошибки хендлеров уже переданы в error handler приложения
+                        self.failed += 1
+                        raise
+                    finally:
+                        self.running -= 1
+            finally:
+                if held is not None:
+                    held.release()
+        finally:
+            if not started and asyncio.iscoroutine(coroutine):
+                # Отмена до начала обработки - корутина так и не запускалась
+                coroutine.close()
+            if lane is not None:
+                lane.size -= 1
+                if lane.size == 0:
+                    del self._lanes[key]
+            self.pending -= 1
+            if self.pending <= self.resume_pending:
+                self._capacity.set()
+
+    # ------------------------------------------------------------ backpressure
+
+    def overloaded(self, queued: int = 0) -> bool:
+        return self.pending + queued >= self.max_pending
+
+    async def wait_for_capacity(self, queued: int = 0) -> None:
+        """Ждёт, пока очередь не опустится до resume_pending (если переполнена)."""
+        if not self.overloaded(queued) and self._capacity.is_set():
+            return
+        self.backpressure_pauses += 1
+        paused_at = time.monotonic()
+        logger.warning(f"🚦 Backpressure: {self.pending} апдейтов в обработке, приём приостановлен")
+        while self.pending + queued > self.resume_pending:
+            self._capacity.clear()
+            await self._capacity.wait()
+            queued = 0
+        paused = time.monotonic() - paused_at
+        self.backpressure_seconds += paused
+        logger.info(f"🚦 Приём апдейтов возобновлён через {paused:.1f}с")
+
+    # ------------------------------------------------------------ метрики
+
+    def wait_percentile(self, percentile: float) -> float:
+        if not self._waits:
+            return 0.0
+        ordered = sorted(self._waits)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * percentile))]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "pending": self.pending,
+            "running": self.running,
+            "waiting": self.pending - self.running,
+            "lanes": len(self._lanes),
+            "max_depth": self.max_depth,
+            "processed": self.processed,
+            "failed": self.failed,
+            "wait_p50_ms": round(self.wait_percentile(0.5) * 1000, 1),
+            "wait_p95_ms": round(self.wait_percentile(0.95) * 1000, 1),
+            "wait_max_ms": round(self.max_wait * 1000, 1),
+            "backpressure_pauses": self.backpressure_pauses,
+            "backpressure_seconds": round(self.backpressure_seconds, 1),
+        }
+
+
+class BackpressureQueue(asyncio.Queue):
+    """
+    update_queue приложения: put() апдейта ждёт, пока диспетчер перегружен.
+    Служебные объекты PTB (сигнал остановки и т.п.) проходят без ожидания.
+    """
+
+    def __init__(self, dispatcher: UpdateDispatcher):
+        super().__init__()
+        self.dispatcher = dispatcher
+
+    async def put(self, item: object) -> None:
+        if isinstance(item, Update):
+            await self.dispatcher.wait_for_capacity(self.qsize())
+        await super().put(item)
+
+
+__all__ = [
+    "UpdateDispatcher",
+    "BackpressureQueue",
+    "update_order_key",
+    "UPDATE_CONCURRENCY",
+    "UPDATE_MAX_PENDING",
+]
@@ -9,6 +9,8 @@ from dataclasses import dataclass
 from typing import List
 import re
 
+from text_prefilter import hint_text
+
 
 @dataclass
 class SecurityValidationResult:
@@ -26,6 +28,29 @@ class SecurityValidationResult:
         return "🚨 " + "\n🚨 ".join(self.threats)
 
 
+# Lowercase substring every match of the pattern must contain: a plain `in`
+# check on text.lower() skips the regex scan for most messages
+_SECURITY_PATTERN_HINTS = {
+    r"DROP\s+TABLE": "drop",
+    r"DELETE\s+FROM": "delete",
+    r"INSERT\s+INTO": "insert",
+    r"UPDATE\s+.*SET": "update",
+    r"UNION\s+SELECT": "union",
+    r"SELECT\s+.*FROM": "select",
+    r"<script[^>]*>": "<script",
+    r"javascript:": "javascript:",
+    r"on\w+\s*=": "=",
+    r"<iframe": "<iframe",
+    r"<embed": "<embed",
+    r";\s*exec\s*\(": "exec",
+    r";\s*eval\s*\(": "eval",
+    r"\|\s*sh": "|",
+    r"`.*`": "`",
+    r"\.\./": "../",
+    r"\.\.\%2f": "..%2f",
+    r"\*\(\|": "*(|",
+}
+
 class SecurityValidator:
     """
     Centralized security validator (DRY principle)
@@ -73,6 +98,12 @@ class SecurityValidator:
     
     MAX_MESSAGE_LENGTH = 5000  # Prevent very large messages
     
+    # Patterns compiled once (re.search with a string re-resolves them on every call)
+    _COMPILED_PATTERNS = [
+        (re.compile(pattern, re.IGNORECASE), description, _SECURITY_PATTERN_HINTS.get(pattern, ""))
+        for pattern, description in DANGEROUS_PATTERNS
+    ]
+    
     @classmethod
     def validate(cls, text: str) -> SecurityValidationResult:
         """
@@ -92,8 +123,12 @@ class SecurityValidator:
             return SecurityValidationResult(is_safe=False, threats=threats)
         
         # Check for dangerous patterns
-        for pattern, description in cls.DANGEROUS_PATTERNS:
-            if re.search(pattern, text, re.IGNORECASE):
+        # None: in the text İ ı ſ K, which IGNORECASE matches but lower() does not
+        lowered = hint_text(text)
+        for pattern, description, hint in cls._COMPILED_PATTERNS:
+            if lowered is not None and hint not in lowered:
+                continue
+            if pattern.search(text):
                 threats.append(description)
         
         return SecurityValidationResult(
@@ -0,0 +1,510 @@
+"""
+Webhook Cluster v1.0
+Приём апдейтов через webhook и обработка в нескольких процессах.
+
+Polling-бот - один процесс: getUpdates нельзя разделить между
+экземплярами (409 Conflict), поэтому пропускная способность упиралась
+в одно ядро. В режиме кластера:
+
+- мастер (BOT_RUN_MODE=webhook) запускает WEBHOOK_WORKERS процессов
+  бота (BOT_RUN_MODE=worker), регистрирует webhook (setWebhook с
+  secret_token) и принимает POST от Telegram;
+- апдейт направляется воркеру по consistent hashing от ключа партиции:
+  пользователь (from / new_chat_member.user), иначе чат, иначе update_id.
+  Все апдейты пользователя обрабатывает один воркер - его сессия, квиз,
+  in-flight вызовы и порядок сообщений остаются в одном процессе;
+- апдейты одного ключа пересылаются воркеру по очереди (FIFO), разные
+  ключи - параллельно. Воркер кладёт апдейт в update_queue приложения,
+  BackpressureQueue задерживает ответ при перегрузке - мастер отвечает
+  Telegram позже, и Telegram придерживает следующие апдейты;
+- общее между процессами состояние (лимиты, поколение кэша подписок)
+  лежит в shared_state (SQLiteBackend в общем файле), глобальные
+  фоновые задачи выполняет только воркер 0.
+
+Запуск одной машины: BOT_RUN_MODE=webhook WEBHOOK_URL=https://.../telegram/webhook python bot.py
+(или python webhook_cluster.py --workers 4).
+"""
+
+import argparse
+import asyncio
+import bisect
+import hashlib
+import logging
+import os
+import secrets
+import signal
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Any, Dict, Generic, Hashable, Iterable, List, Optional, Sequence, TypeVar
+
+from aiohttp import ClientError, ClientSession, ClientTimeout, web
+from telegram import Bot, Update
+from telegram.ext import Application
+
+logger = logging.getLogger(__name__)
+
+WEBHOOK_WORKERS = int(os.getenv("WEBHOOK_WORKERS", "4"))
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8443"))
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/telegram/webhook")
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")
+WEBHOOK_MAX_CONNECTIONS = int(os.getenv("WEBHOOK_MAX_CONNECTIONS", "40"))
+WEBHOOK_WORKER_HOST = os.getenv("WEBHOOK_WORKER_HOST", "127.0.0.1")
+WEBHOOK_WORKER_BASE_PORT = int(os.getenv("WEBHOOK_WORKER_BASE_PORT", "8600"))
+WEBHOOK_READY_TIMEOUT = float(os.getenv("WEBHOOK_READY_TIMEOUT", "60"))
+# Сколько ждать воркер (включая backpressure), прежде чем ответить Telegram ошибкой
+WEBHOOK_FORWARD_TIMEOUT = float(os.getenv("WEBHOOK_FORWARD_TIMEOUT", "50"))
+
+# Переменные окружения воркера
+BOT_WORKER_ID = int(os.getenv("BOT_WORKER_ID", "0"))
+BOT_WORKER_COUNT = int(os.getenv("BOT_WORKER_COUNT", "1"))
+BOT_WORKER_PORT = int(os.getenv("BOT_WORKER_PORT", str(WEBHOOK_WORKER_BASE_PORT)))
+WEBHOOK_INTERNAL_TOKEN = os.getenv("WEBHOOK_INTERNAL_TOKEN", "")
+
+TELEGRAM_SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+INTERNAL_TOKEN_HEADER = "X-RVX-Worker-Token"
+WORKER_UPDATE_PATH = "/update"
+WORKER_HEALTH_PATH = "/health"
+
+HASH_RING_REPLICAS = 160
+
+# Типы апдейтов, у которых пользователь не в "from"
+_MEMBER_UPDATES = ("chat_member", "my_chat_member")
+
+
+# =============================================================================
+# CONSISTENT HASHING
+# =============================================================================
+
+def _hash(value: str) -> int:
+    return int.from_bytes(hashlib.blake2b(value.encode(), digest_size=8).digest(), "big")
+
+
+NodeT = TypeVar("NodeT", bound=Hashable)
+
+
+class ConsistentHashRing(Generic[NodeT]):
+    """
+    Кольцо consistent hashing с виртуальными узлами.
+
+    При добавлении/удалении узла переезжает только ~1/N ключей - у
+    остальных пользователей воркер (и его in-memory состояние) не меняется.
+    """
+
+    def __init__(self, nodes: Iterable[NodeT] = (), replicas: int = HASH_RING_REPLICAS):
+        self.replicas = replicas
+        self._points: List[int] = []
+        self._owners: Dict[int, NodeT] = {}
+        self.nodes: List[NodeT] = []
+        for node in nodes:
+            self.add(node)
+
+    def add(self, node: NodeT) -> None:
+        if node in self.nodes:
+            return
+        self.nodes.append(node)
+        for replica in range(self.replicas):
+            point = _hash(f"{node}#{replica}")
+            if point in self._owners:
+                continue
+            self._owners[point] = node
+            bisect.insort(self._points, point)
+
+    def remove(self, node: NodeT) -> None:
+        if node not in self.nodes:
+            return
+        self.nodes.remove(node)
+        self._points = [p for p in self._points if self._owners[p] != node]
+        self._owners = {p: owner for p, owner in self._owners.items() if owner != node}
+
+    def node_for(self, key: str) -> NodeT:
+        if not self._points:
+            raise LookupError("Hash ring is empty")
+        index = bisect.bisect(self._points, _hash(key))
+        if index == len(self._points):
+            index = 0
+        return self._owners[self._points[index]]
+
+    def __len__(self) -> int:
+        return len(self.nodes)
+
+
+def partition_key(update: Dict[str, Any]) -> str:
+    """
+    Ключ партиции сырого апдейта (dict из webhook).
+
+    Пользователь - тот же, что effective_user в update_dispatcher, кроме
+    chat_member: событие относится к вступившему/вышедшему пользователю.
+    """
+    for kind, payload in update.items():
+        if kind == "update_id" or not isinstance(payload, dict):
+            continue
+        if kind in _MEMBER_UPDATES:
+            member_user = (payload.get("new_chat_member") or {}).get("user")
+            if member_user:
+                return f"user:{member_user['id']}"
+        sender = payload.get("from") or payload.get("user")
+        if sender:
+            return f"user:{sender['id']}"
+        chat = payload.get("chat") or (payload.get("message") or {}).get("chat")
+        if chat:
+            return f"chat:{chat['id']}"
+        break
+    return f"update:{update.get('update_id')}"
+
+
+# =============================================================================
+# RECEIVER (мастер)
+# =============================================================================
+
+class _ForwardLane:
+    __slots__ = ("lock", "size")
+
+    def __init__(self):
+        self.lock = asyncio.Lock()
+        self.size = 0
+
+
+class WebhookReceiver:
+    """aiohttp-приёмник webhook: проверка secret_token и пересылка воркеру партиции."""
+
+    def __init__(self, worker_urls: Sequence[str], secret_token: str = WEBHOOK_SECRET,
+                 internal_token: str = "", path: str = WEBHOOK_PATH,
+                 forward_timeout: float = WEBHOOK_FORWARD_TIMEOUT):
+        if not worker_urls:
+            raise ValueError("At least one worker is required")
+        self.worker_urls = list(worker_urls)
+        self.ring = ConsistentHashRing(range(len(self.worker_urls)))
+        self.secret_token = secret_token
+        self.internal_token = internal_token
+        self.path = path
+        self.forward_timeout = forward_timeout
+        self._lanes: Dict[str, _ForwardLane] = {}
+        self._session: Optional[ClientSession] = None
+        self.received = 0
+        self.rejected = 0
+        self.failed = 0
+        self.per_worker = [0] * len(self.worker_urls)
+
+    def worker_for(self, update: Dict[str, Any]) -> int:
+        return self.ring.node_for(partition_key(update))
+
+    def build_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post(self.path, self.handle)
+        app.router.add_get(WORKER_HEALTH_PATH, self.health)
+        app.on_startup.append(self._open_session)
+        app.on_cleanup.append(self._close_session)
+        return app
+
+    async def _open_session(self, app: web.Application) -> None:
+        self._session = ClientSession(timeout=ClientTimeout(total=self.forward_timeout))
+
+    async def _close_session(self, app: web.Application) -> None:
+        if self._session is not None:
+            await self._session.close()
+
+    async def health(self, request: web.Request) -> web.Response:
+        return web.json_response(self.stats())
+
+    async def handle(self, request: web.Request) -> web.Response:
+        if self.secret_token and request.headers.get(TELEGRAM_SECRET_HEADER) != self.secret_token:
+            self.rejected += 1
+            return web.Response(status=403)
+        try:
+            update = await request.json()
+        except ValueError:
+            self.rejected += 1
+            return web.Response(status=400)
+        self.received += 1
+
+        key = partition_key(update)
+        worker = self.ring.node_for(key)
+        lane = self._lanes.get(key)
+        if lane is None:
+            lane = self._lanes[key] = _ForwardLane()
+        lane.size += 1
+        try:
+            # Следующий апдейт ключа уходит воркеру только после того, как он принял предыдущий
+            async with lane.lock:
+                ok = await self._forward(worker, update)
+        finally:
+            lane.size -= 1
+            if lane.size == 0:
+                del self._lanes[key]
+        if not ok:
+            # Telegram повторит доставку
+            self.failed += 1
+            return web.Response(status=503)
+        self.per_worker[worker] += 1
+        return web.Response(status=200)
+
+    async def _forward(self, worker: int, update: Dict[str, Any]) -> bool:
+        if self._session is None:
+            raise RuntimeError("Receiver session is not open")
+        try:
+            async with self._session.post(
+                self.worker_urls[worker] + WORKER_UPDATE_PATH, json=update,
+                headers={INTERNAL_TOKEN_HEADER: self.internal_token},
+            ) as response:
+                return response.status == 200
+        except (ClientError, asyncio.TimeoutError) as e:
+            logger.warning(f"⚠️ Воркер {worker} не принял апдейт {update.get('update_id')}: {e}")
+            return False
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "workers": len(self.worker_urls),
+            "received": self.received,
+            "rejected": self.rejected,
+            "failed": self.failed,
+            "per_worker": list(self.per_worker),
+            "forwarding": len(self._lanes),
+        }
+
+
+# =============================================================================
+# WORKER INTAKE
+# =============================================================================
+
+class WorkerIntake:
+    """HTTP-вход воркера: апдейты от мастера в update_queue приложения."""
+
+    def __init__(self, application: Application, internal_token: str = WEBHOOK_INTERNAL_TOKEN):
+        self.application = application
+        self.internal_token = internal_token
+        self._runner: Optional[web.AppRunner] = None
+        self.accepted = 0
+
+    def build_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post(WORKER_UPDATE_PATH, self.handle)
+        app.router.add_get(WORKER_HEALTH_PATH, self.health)
+        return app
+
+    async def handle(self, request: web.Request) -> web.Response:
+        if self.internal_token and request.headers.get(INTERNAL_TOKEN_HEADER) != self.internal_token:
+            return web.Response(status=403)
+        try:
+            update = Update.de_json(await request.json(), self.application.bot)
+        except ValueError:
+            return web.Response(status=400)
+        # BackpressureQueue.put ждёт при перегрузке - ответ мастеру задерживается
+        await self.application.update_queue.put(update)
+        self.accepted += 1
+        return web.Response(status=200)
+
+    async def health(self, request: web.Request) -> web.Response:
+        return web.json_response({"worker": BOT_WORKER_ID, "accepted": self.accepted,
+                                  "queued": self.application.update_queue.qsize()})
+
+    async def start(self, host: str, port: int) -> None:
+        self._runner = web.AppRunner(self.build_app())
+        await self._runner.setup()
+        await web.TCPSite(self._runner, host, port).start()
+
+    async def stop(self) -> None:
+        if self._runner is not None:
+            await self._runner.cleanup()
+
+
+def _stop_event_on_signals() -> asyncio.Event:
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except (NotImplementedError, RuntimeError):
+            pass
+    return stop
+
+
+async def serve_worker(application: Application, host: str = WEBHOOK_WORKER_HOST,
+                       port: int = BOT_WORKER_PORT, internal_token: str = WEBHOOK_INTERNAL_TOKEN,
+                       stop_event: Optional[asyncio.Event] = None) -> None:
+    """Запускает приложение и HTTP-вход воркера до SIGTERM/SIGINT (или stop_event)."""
+    stop_event = stop_event or _stop_event_on_signals()
+    intake = WorkerIntake(application, internal_token)
+    async with application:
+        # Как run_polling: post_init после initialize, до start
+        if application.post_init:
+            await application.post_init(application)
+        await application.start()
+        await intake.start(host, port)
+        logger.info(f"👷 Воркер {BOT_WORKER_ID}/{BOT_WORKER_COUNT} принимает апдейты на {host}:{port}")
+        try:
+            await stop_event.wait()
+        finally:
+            await intake.stop()
+            await application.stop()
+            # Как run_polling: post_stop после остановки, до shutdown
+            if application.post_stop:
+                await application.post_stop(application)
+    logger.info(f"👷 Воркер {BOT_WORKER_ID} остановлен, принято апдейтов: {intake.accepted}")
+
+
+# =============================================================================
+# MASTER
+# =============================================================================
+
+class ClusterMaster:
+    """Запускает воркеры, регистрирует webhook и принимает апдейты."""
+
+    def __init__(self, token: str, workers: int = WEBHOOK_WORKERS,
+                 worker_command: Optional[List[str]] = None,
+                 host: str = WEBHOOK_HOST, port: int = WEBHOOK_PORT,
+                 worker_base_port: int = WEBHOOK_WORKER_BASE_PORT,
+                 webhook_url: str = WEBHOOK_URL, secret_token: str = WEBHOOK_SECRET,
+                 base_url: Optional[str] = None, env: Optional[Dict[str, str]] = None):
+        if workers < 1:
+            raise ValueError("workers must be a positive integer")
+        self.token = token
+        self.workers = workers
+        self.worker_command = worker_command or [sys.executable, str(Path(__file__).with_name("bot.py"))]
+        self.host = host
+        self.port = port
+        self.worker_base_port = worker_base_port
+        self.webhook_url = webhook_url
+        self.secret_token = secret_token or secrets.token_urlsafe(32)
+        self.base_url = base_url
+        self.env = env or {}
+        self.internal_token = secrets.token_urlsafe(32)
+        self.worker_urls = [f"http://{WEBHOOK_WORKER_HOST}:{worker_base_port + i}" for i in range(workers)]
+        self.receiver = WebhookReceiver(self.worker_urls, self.secret_token, self.internal_token)
+        self.processes: List[subprocess.Popen] = []
+        self._runner: Optional[web.AppRunner] = None
+
+    def worker_env(self, worker_id: int) -> Dict[str, str]:
+        env = dict(os.environ)
+        env.update(self.env)
+        env.update({
+            "BOT_RUN_MODE": "worker",
+            "BOT_WORKER_ID": str(worker_id),
+            "BOT_WORKER_COUNT": str(self.workers),
+            "BOT_WORKER_PORT": str(self.worker_base_port + worker_id),
+            "WEBHOOK_INTERNAL_TOKEN": self.internal_token,
+        })
+        # Лимиты и поколение кэша подписок - общие для всех воркеров
+        env.setdefault("SHARED_STATE_BACKEND", "sqlite")
+        return env
+
+    def spawn_workers(self) -> None:
+        for worker_id in range(self.workers):
+            self.processes.append(subprocess.Popen(self.worker_command, env=self.worker_env(worker_id)))
+        logger.info(f"👷 Запущено воркеров: {self.workers} (порты {self.worker_base_port}-"
+                    f"{self.worker_base_port + self.workers - 1})")
+
+    async def wait_workers_ready(self, timeout: float = WEBHOOK_READY_TIMEOUT) -> None:
+        deadline = time.monotonic() + timeout
+        pending = set(range(self.workers))
+        async with ClientSession(timeout=ClientTimeout(total=1)) as session:
+            while pending:
+                for worker_id in list(pending):
+                    process = self.processes[worker_id] if worker_id < len(self.processes) else None
+                    if process is not None and process.poll() is not None:
+                        raise RuntimeError(f"Worker {worker_id} exited with code {process.returncode}")
+                    try:
+                        async with session.get(self.worker_urls[worker_id] + WORKER_HEALTH_PATH) as response:
+                            if response.status == 200:
+                                pending.discard(worker_id)
+                    except (ClientError, asyncio.TimeoutError):
+                        pass
+                if pending:
+                    if time.monotonic() > deadline:
+                        raise TimeoutError(f"Workers not ready: {sorted(pending)}")
+                    await asyncio.sleep(0.1)
+        logger.info("👷 Все воркеры готовы")
+
+    async def set_webhook(self) -> None:
+        if not self.webhook_url:
+            logger.warning("⚠️ WEBHOOK_URL не задан - setWebhook пропущен")
+            return
+        kwargs: Dict[str, Any] = {"base_url": self.base_url} if self.base_url else {}
+        async with Bot(self.token, **kwargs) as bot:
+            await bot.set_webhook(
+                self.webhook_url,
+                secret_token=self.secret_token,
+                allowed_updates=Update.ALL_TYPES,
+                max_connections=WEBHOOK_MAX_CONNECTIONS,
+            )
+        logger.info(f"🔗 Webhook зарегистрирован: {self.webhook_url}")
+
+    async def start(self) -> None:
+        self.spawn_workers()
+        try:
+            await self.wait_workers_ready()
+            self._runner = web.AppRunner(self.receiver.build_app())
+            await self._runner.setup()
+            site = web.TCPSite(self._runner, self.host, self.port)
+            await site.start()
+            if not self.port:
+                self.port = self._runner.addresses[0][1]
+            logger.info(f"🌐 Webhook принимается на {self.host}:{self.port}{self.receiver.path}")
+            await self.set_webhook()
+        except BaseException:
+            await self.stop()
+            raise
+
+    async def stop(self) -> None:
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+        self.terminate_workers()
+        logger.info(f"🛑 Кластер остановлен: {self.receiver.stats()}")
+
+    def terminate_workers(self, timeout: float = 15.0) -> None:
+        for process in self.processes:
+            if process.poll() is None:
+                process.terminate()
+        for process in self.processes:
+            try:
+                process.wait(timeout)
+            except subprocess.TimeoutExpired:
+                process.kill()
+        self.processes = []
+
+    async def run(self, stop_event: Optional[asyncio.Event] = None) -> None:
+        stop_event = stop_event or _stop_event_on_signals()
+        await self.start()
+        try:
+            await stop_event.wait()
+        finally:
+            await self.stop()
+
+
+def run_cluster(token: str, workers: int = WEBHOOK_WORKERS, **kwargs) -> None:
+    """Блокирующий запуск мастера (BOT_RUN_MODE=webhook)."""
+    asyncio.run(ClusterMaster(token, workers, **kwargs).run())
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="RVX bot webhook cluster")
+    parser.add_argument("--workers", type=int, default=WEBHOOK_WORKERS)
+    parser.add_argument("--port", type=int, default=WEBHOOK_PORT)
+    parser.add_argument("--url", default=WEBHOOK_URL, help="Public webhook URL for setWebhook")
+    args = parser.parse_args(argv)
+    token = os.getenv("TELEGRAM_BOT_TOKEN", "")
+    if not token:
+        parser.error("TELEGRAM_BOT_TOKEN is not set")
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(name)s: %(message)s")
+    run_cluster(token, args.workers, port=args.port, webhook_url=args.url)
+    return 0
+
+
+__all__ = [
+    "ConsistentHashRing",
+    "partition_key",
+    "WebhookReceiver",
+    "WorkerIntake",
+    "serve_worker",
+    "ClusterMaster",
+    "run_cluster",
+    "WEBHOOK_WORKERS",
+]
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())